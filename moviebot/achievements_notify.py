@@ -71,10 +71,10 @@ def notify_new_achievements(user_id: int, context: Optional[dict] = None):
     context: {film_title, is_cinema} — для кастомизации reason_text.
     """
     try:
-        from moviebot.api.site_stats import _get_user_profile_and_achievements
         from moviebot.bot.bot_init import bot
-        from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
-        from moviebot.scheduler import _onboarding_was_sent, _onboarding_set_sent, _user_has_blocked_bot
+        from moviebot.database.db_connection import db_connection
+        from moviebot.scheduler import _user_has_blocked_bot
+        from moviebot.services.achievement_engine import evaluate_user, mark_notified
         from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     except ImportError as e:
         logger.warning(f"[ACHIEVEMENT NOTIFY] Import error: {e}")
@@ -84,24 +84,13 @@ def notify_new_achievements(user_id: int, context: Optional[dict] = None):
         return
 
     context = context or {}
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
-        if _user_has_blocked_bot(user_id, cursor):
-            return
-
-        _, achievements = _get_user_profile_and_achievements(user_id)
-        newly_earned = []
-        for ach in achievements:
-            if not ach.get('earned'):
-                continue
-            ach_id = ach.get('id')
-            key = f"achievement_notified_{ach_id}"
-            if _onboarding_was_sent(user_id, key, cursor):
-                continue
-            newly_earned.append(ach)
+        with db_connection() as conn:
+            if _user_has_blocked_bot(user_id, conn.cursor()):
+                return
 
+        # Только счётчики и ачивки, входы которых изменились с прошлой проверки
+        newly_earned = evaluate_user(user_id)
         if not newly_earned:
             return
 
@@ -139,17 +128,9 @@ def notify_new_achievements(user_id: int, context: Optional[dict] = None):
 
         try:
             bot.send_message(user_id, text, reply_markup=markup, parse_mode='HTML')
-            for a in newly_earned:
-                _onboarding_set_sent(user_id, f"achievement_notified_{a.get('id', '')}")
+            mark_notified(user_id, [a.get('id') for a in newly_earned])
             logger.info(f"[ACHIEVEMENT NOTIFY] Отправлено user_id={user_id}, ачивки: {[a.get('id') for a in newly_earned]}")
         except Exception as e:
             logger.warning(f"[ACHIEVEMENT NOTIFY] Не удалось отправить user_id={user_id}: {e}")
-    finally:
-        try:
-            cursor.close()
-        except Exception:
-            pass
-        try:
-            conn.close()
-        except Exception:
-            pass
+    except Exception as e:
+        logger.error(f"[ACHIEVEMENT NOTIFY] Ошибка проверки ачивок user_id={user_id}: {e}", exc_info=True)
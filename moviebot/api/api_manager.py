@@ -200,9 +200,15 @@ class APIManager:
             'fallback_threshold': self._fallback_threshold,
             'kp_token_available': self._kp_token_available,
             'poiskkino_token_available': self._poiskkino_token_available,
-            'current_api': self.get_current_api_name()
+            'current_api': self.get_current_api_name(),
+            'film_cache': self._get_film_cache_stats(),
         }
 
+    @staticmethod
+    def _get_film_cache_stats():
+        from moviebot.api.film_cache import get_film_cache
+        return get_film_cache().stats()
+
 
 # Глобальный экземпляр менеджера
 _manager = None
@@ -281,7 +287,21 @@ def with_fallback(func_name):
 # Эти функции будут экспортироваться из kinopoisk_api.py
 
 def extract_movie_info(link_or_id):
-    """Извлекает информацию о фильме/сериале"""
+    """Извлекает информацию о фильме/сериале (через кэш метаданных film_cache)"""
+    from moviebot.api.film_cache import get_film_cache, parse_kp_id
+
+    kp_id = parse_kp_id(link_or_id)
+    if kp_id is None:
+        return _extract_movie_info_uncached(link_or_id)
+    try:
+        return get_film_cache().get_or_fetch(kp_id, lambda: _extract_movie_info_uncached(link_or_id))
+    except Exception as e:
+        logger.error(f"[API Manager] Ошибка кэша extract_movie_info: {e}")
+        return _extract_movie_info_uncached(link_or_id)
+
+
+def _extract_movie_info_uncached(link_or_id):
+    """Извлекает информацию о фильме/сериале напрямую из API (с fallback)"""
     manager = get_api_manager()
     module = manager.get_active_module()
     
@@ -0,0 +1,318 @@
+"""
+Кэш метаданных фильмов перед extract_movie_info.
+
+Два уровня:
+- in-process LRU с TTL (мгновенный ответ при повторном открытии карточки);
+- общая таблица film_cache в PostgreSQL (переживает рестарт и общая для всех воркеров).
+
+Устаревание считается по полям: описание и состав обновляются реже, чем,
+например, признак сериала. Одновременные промахи по одному kp_id схлопываются
+в один запрос к API (single-flight). Если обновить устаревшую запись не удалось
+(ошибка API), отдаётся она же.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+
+# Сколько живёт каждое поле, прежде чем запись считается устаревшей
+FIELD_TTLS = {
+    'title': 30 * DAY,
+    'year': 30 * DAY,
+    'genres': 30 * DAY,
+    'director': 30 * DAY,
+    'actors': 14 * DAY,
+    'description': 14 * DAY,
+    'is_series': 7 * DAY,
+}
+
+MEMORY_MAX_ENTRIES = 5000
+MEMORY_TTL = 6 * 3600
+# Каждый промах extract_movie_info — это два HTTP-запроса (films + staff)
+REQUESTS_PER_FETCH = 2
+
+
+def parse_kp_id(link_or_id):
+    """kp_id из ссылки/строки/числа (та же логика, что в extract_movie_info), либо None"""
+    if isinstance(link_or_id, int):
+        return str(link_or_id)
+    if isinstance(link_or_id, str):
+        link = link_or_id.strip()
+        match = re.search(r'kinopoisk\.ru/(film|series)/(\d+)', link)
+        if match:
+            return match.group(2)
+        if link.isdigit():
+            return link
+    return None
+
+
+class _Flight:
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class FilmCache:
+    """Двухуровневый кэш результатов extract_movie_info по kp_id"""
+
+    def __init__(self, use_db=True, memory_max_entries=MEMORY_MAX_ENTRIES,
+                 memory_ttl=MEMORY_TTL, field_ttls=None):
+        self.use_db = use_db
+        self.memory_max_entries = memory_max_entries
+        self.memory_ttl = memory_ttl
+        self.field_ttls = dict(FIELD_TTLS if field_ttls is None else field_ttls)
+        self._memory = OrderedDict()  # kp_id -> (data, field_fetched_at, cached_at)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._counters = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'stale_refreshes': 0,
+            'coalesced': 0,
+            'api_calls': 0,
+            'api_failures': 0,
+            'stale_served': 0,
+            'db_errors': 0,
+        }
+        self._api_time_total = 0.0
+        self._hit_time_total = 0.0
+
+    # --- публичный API ---
+
+    def get_or_fetch(self, kp_id, loader):
+        """
+        Вернуть данные фильма из кэша либо вызвать loader() (запрос к API).
+        loader должен вернуть dict в формате extract_movie_info или None.
+        Если loader не справился, а в кэше есть устаревшая запись, возвращается она.
+        """
+        kp_id = str(kp_id)
+        started = time.perf_counter()
+
+        data, stale_fields = self._get_memory(kp_id)
+        if data is not None and not stale_fields:
+            self._count('memory_hits', hit_time=time.perf_counter() - started)
+            return dict(data)
+
+        stale_data = data
+        if self.use_db:
+            db_data, db_stale = self._get_db(kp_id)
+            if db_data is not None and not db_stale:
+                self._put_memory(kp_id, db_data[0], db_data[1])
+                self._count('db_hits', hit_time=time.perf_counter() - started)
+                return dict(db_data[0])
+            if db_data is not None:
+                stale_data, stale_fields = db_data[0], db_stale
+
+        if stale_fields:
+            self._count('stale_refreshes')
+        else:
+            stale_data = None
+        return self._fetch_single_flight(kp_id, loader, stale_data)
+
+    def put(self, kp_id, data):
+        """Положить полный результат extract_movie_info в оба уровня кэша"""
+        if not data:
+            return
+        kp_id = str(kp_id)
+        now = time.time()
+        fetched_at = {field: now for field in data}
+        self._put_memory(kp_id, data, fetched_at)
+        if self.use_db:
+            self._put_db(kp_id, data, fetched_at)
+
+    def update_fields(self, kp_id, **fields):
+        """
+        Обновить отдельные поля (например, описание, пришедшее из другого запроса),
+        не сбрасывая свежесть остальных.
+        """
+        kp_id = str(kp_id)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(kp_id)
+            if entry is not None:
+                data, fetched_at, cached_at = entry
+                data = dict(data, **fields)
+                fetched_at = dict(fetched_at, **{f: now for f in fields})
+                self._memory[kp_id] = (data, fetched_at, cached_at)
+        if self.use_db:
+            db_data, _ = self._get_db(kp_id)
+            if db_data is not None:
+                data, fetched_at = db_data
+                data.update(fields)
+                fetched_at.update({f: now for f in fields})
+                self._put_db(kp_id, data, fetched_at)
+
+    def invalidate(self, kp_id):
+        kp_id = str(kp_id)
+        with self._lock:
+            self._memory.pop(kp_id, None)
+        if self.use_db:
+            try:
+                from moviebot.database.db_connection import db_connection
+                with db_connection() as conn:
+                    cur = conn.cursor()
+                    cur.execute('DELETE FROM film_cache WHERE kp_id = %s', (kp_id,))
+            except Exception as e:
+                self._count('db_errors')
+                logger.warning(f"[FILM CACHE] Ошибка удаления kp_id={kp_id}: {e}")
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._memory)
+            api_time = self._api_time_total
+            hit_time = self._hit_time_total
+        hits = counters['memory_hits'] + counters['db_hits'] + counters['coalesced']
+        lookups = hits + counters['api_calls']
+        counters.update({
+            'memory_entries': size,
+            'hit_ratio': round(hits / lookups, 3) if lookups else 0.0,
+            'api_requests_saved': hits * REQUESTS_PER_FETCH,
+            'avg_api_ms': round(api_time * 1000 / counters['api_calls'], 1) if counters['api_calls'] else 0.0,
+            'avg_hit_ms': round(
+                hit_time * 1000 / (counters['memory_hits'] + counters['db_hits']), 3
+            ) if (counters['memory_hits'] + counters['db_hits']) else 0.0,
+        })
+        return counters
+
+    # --- внутреннее ---
+
+    def _count(self, name, hit_time=None):
+        with self._lock:
+            self._counters[name] += 1
+            if hit_time is not None:
+                self._hit_time_total += hit_time
+
+    def _stale_fields(self, data, fetched_at, now):
+        stale = []
+        for field, ttl in self.field_ttls.items():
+            if field not in data:
+                continue
+            if now - fetched_at.get(field, 0) > ttl:
+                stale.append(field)
+        return stale
+
+    def _get_memory(self, kp_id):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(kp_id)
+            if entry is None:
+                return None, None
+            data, fetched_at, cached_at = entry
+            if now - cached_at > self.memory_ttl:
+                del self._memory[kp_id]
+                return None, None
+            self._memory.move_to_end(kp_id)
+        return data, self._stale_fields(data, fetched_at, now)
+
+    def _put_memory(self, kp_id, data, fetched_at):
+        with self._lock:
+            self._memory[kp_id] = (dict(data), dict(fetched_at), time.time())
+            self._memory.move_to_end(kp_id)
+            while len(self._memory) > self.memory_max_entries:
+                self._memory.popitem(last=False)
+
+    def _get_db(self, kp_id):
+        try:
+            from moviebot.database.db_connection import db_connection
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute('SELECT data, field_fetched_at FROM film_cache WHERE kp_id = %s', (kp_id,))
+                row = cur.fetchone()
+        except Exception as e:
+            self._count('db_errors')
+            logger.warning(f"[FILM CACHE] Ошибка чтения kp_id={kp_id}: {e}")
+            return None, None
+        if not row:
+            return None, None
+        data = row['data'] if isinstance(row, dict) else row[0]
+        fetched_at = row['field_fetched_at'] if isinstance(row, dict) else row[1]
+        if isinstance(data, str):
+            data = json.loads(data)
+        if isinstance(fetched_at, str):
+            fetched_at = json.loads(fetched_at)
+        fetched_at = {k: float(v) for k, v in (fetched_at or {}).items()}
+        return (data, fetched_at), self._stale_fields(data, fetched_at, time.time())
+
+    def _put_db(self, kp_id, data, fetched_at):
+        try:
+            from moviebot.database.db_connection import db_connection
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO film_cache (kp_id, data, field_fetched_at, updated_at)
+                    VALUES (%s, %s, %s, NOW())
+                    ON CONFLICT (kp_id) DO UPDATE
+                    SET data = EXCLUDED.data,
+                        field_fetched_at = EXCLUDED.field_fetched_at,
+                        updated_at = NOW()
+                ''', (kp_id, json.dumps(data, ensure_ascii=False), json.dumps(fetched_at)))
+        except Exception as e:
+            self._count('db_errors')
+            logger.warning(f"[FILM CACHE] Ошибка записи kp_id={kp_id}: {e}")
+
+    def _fetch_single_flight(self, kp_id, loader, stale_data=None):
+        with self._lock:
+            flight = self._flights.get(kp_id)
+            leader = flight is None
+            if leader:
+                flight = self._flights[kp_id] = _Flight()
+        if not leader:
+            flight.event.wait()
+            self._count('coalesced')
+            return dict(flight.result) if flight.result else None
+
+        try:
+            self._count('misses')
+            started = time.perf_counter()
+            try:
+                result = loader()
+            except Exception as e:
+                if stale_data is None:
+                    raise
+                logger.warning(f"[FILM CACHE] Ошибка обновления kp_id={kp_id}, отдаём устаревшую запись: {e}")
+                result = None
+            finally:
+                with self._lock:
+                    self._counters['api_calls'] += 1
+                    self._api_time_total += time.perf_counter() - started
+            if result:
+                self.put(kp_id, result)
+            else:
+                self._count('api_failures')
+                if stale_data is not None:
+                    self._count('stale_served')
+                    result = stale_data
+            flight.result = result
+            return dict(result) if result else result
+        finally:
+            with self._lock:
+                self._flights.pop(kp_id, None)
+            flight.event.set()
+
+
+_film_cache = None
+_film_cache_lock = threading.Lock()
+
+
+def get_film_cache():
+    """Глобальный экземпляр кэша метаданных фильмов"""
+    global _film_cache
+    if _film_cache is None:
+        with _film_cache_lock:
+            if _film_cache is None:
+                _film_cache = FilmCache()
+    return _film_cache
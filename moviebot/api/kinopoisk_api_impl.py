@@ -8,46 +8,19 @@ import requests
 import logging
 from datetime import datetime, date
 from moviebot.config import KP_TOKEN
-from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
-
-# Получаем глобальные объекты БД
-conn = get_db_connection()
-cursor = get_db_cursor()
+from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock, db_connection
+from moviebot.database.telemetry import enqueue_api_log
 
 logger = logging.getLogger(__name__)
 
 def log_kinopoisk_api_request(endpoint, method='GET', status_code=None, user_id=None, chat_id=None, kp_id=None):
-    """Логирует запрос к API Кинопоиска в БД"""
-    # Используем локальные соединение и курсор для избежания проблем с закрытыми соединениями
-    conn_local = get_db_connection()
-    cursor_local = get_db_cursor()
-    
-    with db_lock:
-        try:
-            # Самое важное: всегда чистим возможную сломанную транзакцию
-            try:
-                conn_local.rollback()
-            except:
-                pass
+    """Логирует запрос к API Кинопоиска в БД (строка пишется в фоне пачкой, см. database/telemetry.py)"""
+    try:
+        enqueue_api_log(endpoint, method, status_code, user_id, chat_id, kp_id)
+    except Exception as e:
+        logger.error(f"Ошибка логирования API-запроса: {e}", exc_info=True)
 
-            # kp_id приводим к строке (потому что столбец text)
-            kp_id_str = str(kp_id) if kp_id is not None else None
 
-            cursor_local.execute('''
-                INSERT INTO kinopoisk_api_logs 
-                (endpoint, method, status_code, user_id, chat_id, kp_id)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (endpoint, method, status_code, user_id, chat_id, kp_id_str))
-            
-            conn_local.commit()
-            
-        except Exception as e:
-            logger.error(f"Ошибка логирования API-запроса: {e}", exc_info=True)
-            try:
-                conn_local.rollback()
-            except:
-                pass  # если соединение уже мертво — молчим
-        
 def extract_movie_info(link_or_id):
     """
     Извлекает информацию о фильме/сериале по ссылке или kp_id.
@@ -276,7 +249,8 @@ def get_seasons(kp_id, chat_id=None, user_id=None):
                 # Получаем информацию о просмотренных сериях (в группе — общий прогресс по чату)
                 watched_episodes = set()
                 if chat_id:
-                    with db_lock:
+                    with db_connection() as conn:
+                        cursor = conn.cursor()
                         cursor.execute('SELECT id FROM movies WHERE chat_id = %s AND kp_id = %s', (chat_id, str(kp_id)))
                         row = cursor.fetchone()
                         if row:
@@ -383,7 +357,8 @@ def get_seasons(kp_id, chat_id=None, user_id=None):
                     # Получаем информацию о просмотренных сериях (в группе — общий прогресс)
                     watched_episodes = set()
                     if chat_id:
-                        with db_lock:
+                        with db_connection() as conn:
+                            cursor = conn.cursor()
                             cursor.execute('SELECT id FROM movies WHERE chat_id = %s AND kp_id = %s', (chat_id, str(kp_id)))
                             row = cursor.fetchone()
                             if row:
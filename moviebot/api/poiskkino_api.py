@@ -7,11 +7,8 @@ import requests
 import logging
 from datetime import datetime, date
 from moviebot.config import POISKKINO_TOKEN
-from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
-
-# Получаем глобальные объекты БД
-conn = get_db_connection()
-cursor = get_db_cursor()
+from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock, db_connection
+from moviebot.database.telemetry import enqueue_api_log
 
 logger = logging.getLogger(__name__)
 
@@ -19,33 +16,11 @@ BASE_URL = "https://api.poiskkino.dev"
 
 
 def log_poiskkino_api_request(endpoint, method='GET', status_code=None, user_id=None, chat_id=None, kp_id=None):
-    """Логирует запрос к API ПоискКино в БД"""
-    conn_local = get_db_connection()
-    cursor_local = get_db_cursor()
-    
-    with db_lock:
-        try:
-            try:
-                conn_local.rollback()
-            except:
-                pass
-
-            kp_id_str = str(kp_id) if kp_id is not None else None
-
-            cursor_local.execute('''
-                INSERT INTO kinopoisk_api_logs 
-                (endpoint, method, status_code, user_id, chat_id, kp_id)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (f"[POISKKINO]{endpoint}", method, status_code, user_id, chat_id, kp_id_str))
-            
-            conn_local.commit()
-            
-        except Exception as e:
-            logger.error(f"Ошибка логирования PoisKino API-запроса: {e}", exc_info=True)
-            try:
-                conn_local.rollback()
-            except:
-                pass
+    """Логирует запрос к API ПоискКино в БД (строка пишется в фоне пачкой, см. database/telemetry.py)"""
+    try:
+        enqueue_api_log(f"[POISKKINO]{endpoint}", method, status_code, user_id, chat_id, kp_id)
+    except Exception as e:
+        logger.error(f"Ошибка логирования PoisKino API-запроса: {e}", exc_info=True)
 
 
 def _get_headers():
@@ -327,7 +302,8 @@ def get_seasons(kp_id, chat_id=None, user_id=None):
                 # Получаем информацию о просмотренных сериях (в группе — общий прогресс по чату)
                 watched_episodes = set()
                 if chat_id:
-                    with db_lock:
+                    with db_connection() as conn:
+                        cursor = conn.cursor()
                         cursor.execute('SELECT id FROM movies WHERE chat_id = %s AND kp_id = %s', (chat_id, str(kp_id)))
                         row = cursor.fetchone()
                         if row:
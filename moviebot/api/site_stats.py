@@ -1,13 +1,21 @@
 """
 Логика статистики для сайта: персональная и групповая.
+
+Счётчики месяца и вечный профиль читаются из роллапов (stats_monthly_rollups,
+stats_profile_rollups), которые пересчитываются по ключу после изменений
+в сырых таблицах; списки фильмов месяца собираются из строк за месяц.
 """
+import json
 import logging
 from datetime import datetime
 from collections import defaultdict
 from urllib.parse import urlparse
 
 import pytz
-from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
+from psycopg2.extras import execute_values
+
+from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock, db_connection
+from moviebot.api.stats_share_cache import ShareScope, get_share_response_cache, get_share_view_counter
 
 logger = logging.getLogger(__name__)
 
@@ -140,8 +148,324 @@ PERSONAL_ACHIEVEMENTS_DEF = [
 ]
 
 
+# --- Месячные роллапы ---
+# stats_monthly_rollups хранит счётчики (chat_id, month, user_id): просмотры, оценки,
+# кино, гистограммы оценок/жанров/платформ и активность по дням. Ключ (chat_id, month)
+# пересчитывается целиком из сырых строк месяца, когда триггеры на watched_movies,
+# ratings, series_tracking, cinema_screenings, plans и movies увеличили его version
+# (см. init_database). Так роллап остаётся точным при удалениях и переоценках,
+# а эндпоинты не агрегируют историю чата на каждый запрос.
+# stats_profile_rollups — то же для вечных счётчиков профиля (личный чат, планы и MVP во всех
+# чатах); в той же строке движок ачивок (services/achievement_engine.py) хранит полученные
+# и уже объявленные ачивки.
+
+# Строка группы целиком: уникальные фильмы/сериалы и сводка месяца
+ROLLUP_TOTAL_USER_ID = 0
+
+ROLLUP_COUNTERS = (
+    'films_watched', 'series_watched', 'episodes_watched', 'views',
+    'ratings_count', 'rating_sum', 'cinema_visits',
+)
+ROLLUP_HISTOGRAMS = ('rating_breakdown', 'genres', 'platforms', 'activity')
+
+# Сколько устаревших ключей пересчитывает фоновая задача за один запуск
+ROLLUP_REFRESH_BATCH = 200
+
+
+def _empty_rollup_row(user_id):
+    row = {'user_id': user_id}
+    row.update({key: 0 for key in ROLLUP_COUNTERS})
+    row.update({key: {} for key in ROLLUP_HISTOGRAMS})
+    return row
+
+
+def _empty_rating_breakdown():
+    return {str(i): 0 for i in range(1, 11)}
+
+
+def _rollup_rating_breakdown(row):
+    breakdown = _empty_rating_breakdown()
+    for key, count in ((row or {}).get('rating_breakdown') or {}).items():
+        if key in breakdown:
+            breakdown[key] = count
+    return breakdown
+
+
+def _row_day(dt):
+    """День месяца даты просмотра/оценки (для тепловой карты)."""
+    if not dt:
+        return None
+    return getattr(dt, 'day', None) or (int(str(dt)[8:10]) if len(str(dt)) >= 10 else None)
+
+
+def _compute_month_rollup_rows(cur, chat_id, start_ts, end_ts):
+    """Строки роллапа ключа (chat_id, месяц) из сырых таблиц."""
+    if chat_id > 0:
+        user_id = chat_id  # для личного чата chat_id = user_id
+        month_data = _build_personal_month(*_fetch_personal_month(cur, chat_id, user_id, start_ts, end_ts), start_ts)
+        return [_personal_rollup_row(user_id, month_data)]
+    month_rows = _fetch_group_month(cur, chat_id, start_ts, end_ts)
+    genre_rows = _fetch_group_month_genres(cur, chat_id, start_ts, end_ts)
+    return _group_rollup_rows(*month_rows, genre_rows)
+
+
+def refresh_stats_rollup(chat_id, month_start):
+    """
+    Пересчитывает роллап ключа (chat_id, месяц) и возвращает его строки.
+    Версия ключа читается до пересчёта: запись, зафиксированная во время пересчёта,
+    оставит ключ устаревшим, и он будет пересчитан ещё раз.
+    """
+    start_ts, end_ts = _month_range(month_start.month, month_start.year)
+    month = start_ts.date()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (f'stats_rollup:{chat_id}:{month}',))
+        cur.execute("""
+            INSERT INTO stats_rollup_state (chat_id, month) VALUES (%s, %s)
+            ON CONFLICT (chat_id, month) DO NOTHING
+        """, (chat_id, month))
+        cur.execute("SELECT version FROM stats_rollup_state WHERE chat_id = %s AND month = %s", (chat_id, month))
+        row = cur.fetchone()
+        version = row.get('version') if isinstance(row, dict) else row[0]
+
+        rows = _compute_month_rollup_rows(cur, chat_id, start_ts, end_ts)
+
+        cur.execute("DELETE FROM stats_monthly_rollups WHERE chat_id = %s AND month = %s", (chat_id, month))
+        execute_values(
+            cur,
+            f"INSERT INTO stats_monthly_rollups (chat_id, month, user_id, {', '.join(ROLLUP_COUNTERS + ROLLUP_HISTOGRAMS)}) VALUES %s",
+            [
+                (chat_id, month, r['user_id'])
+                + tuple(r[key] for key in ROLLUP_COUNTERS)
+                + tuple(json.dumps(r[key], ensure_ascii=False) for key in ROLLUP_HISTOGRAMS)
+                for r in rows
+            ],
+            template='(' + ', '.join(['%s'] * (3 + len(ROLLUP_COUNTERS)) + ['%s::jsonb'] * len(ROLLUP_HISTOGRAMS)) + ')',
+        )
+        cur.execute("""
+            UPDATE stats_rollup_state
+            SET refreshed_version = GREATEST(refreshed_version, %s), refreshed_at = NOW()
+            WHERE chat_id = %s AND month = %s
+        """, (version, chat_id, month))
+    return rows
+
+
+def _get_month_rollups(chat_id, start_ts):
+    """Роллап месяца {user_id: строка}; устаревший или ещё не посчитанный ключ сначала пересчитывается."""
+    month = start_ts.date()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT s.version, s.refreshed_version, r.*
+            FROM stats_rollup_state s
+            LEFT JOIN stats_monthly_rollups r ON r.chat_id = s.chat_id AND r.month = s.month
+            WHERE s.chat_id = %s AND s.month = %s
+            ORDER BY r.user_id
+        """, (chat_id, month))
+        rows = cur.fetchall()
+    if not rows or rows[0]['version'] > rows[0]['refreshed_version']:
+        rows = refresh_stats_rollup(chat_id, month)
+    return {row['user_id']: row for row in rows if row.get('user_id') is not None}
+
+
+_MONTH_INDEX_SQL = "(EXTRACT(YEAR FROM {0} AT TIME ZONE 'UTC') * 12 + EXTRACT(MONTH FROM {0} AT TIME ZONE 'UTC') - 1)::int"
+
+# Вечные счётчики профиля одним запросом: по личному чату (chat_id = user_id), планы и MVP — по всем чатам
+_PROFILE_COUNTERS_SQL = f"""
+    SELECT
+        (SELECT COUNT(DISTINCT m.id) FROM movies m
+         WHERE m.chat_id = %(uid)s AND (m.is_series IS NULL OR m.is_series = 0)
+           AND (EXISTS (SELECT 1 FROM watched_movies wm WHERE wm.chat_id = m.chat_id AND wm.film_id = m.id AND wm.user_id = %(uid)s)
+                OR EXISTS (SELECT 1 FROM ratings r WHERE r.chat_id = m.chat_id AND r.film_id = m.id AND r.user_id = %(uid)s))
+        ) AS total_films,
+        (SELECT COUNT(DISTINCT st.film_id) FROM series_tracking st
+         WHERE st.chat_id = %(uid)s AND st.user_id = %(uid)s AND st.watched = TRUE) AS total_series,
+        (SELECT COUNT(*) FROM ratings WHERE chat_id = %(uid)s AND user_id = %(uid)s) AS total_ratings,
+        (SELECT AVG(rating)::numeric(4,2) FROM ratings WHERE chat_id = %(uid)s AND user_id = %(uid)s) AS avg_rating,
+        (SELECT COUNT(*) FROM cinema_screenings WHERE chat_id = %(uid)s AND user_id = %(uid)s) AS total_cinema,
+        (SELECT COUNT(DISTINCT st.film_id) FROM series_tracking st
+         JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
+         WHERE st.chat_id = %(uid)s AND st.user_id = %(uid)s AND st.watched = TRUE AND m.is_series != 0) AS completed_series,
+        (SELECT COUNT(*) FROM series_tracking st
+         JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
+         WHERE st.chat_id = %(uid)s AND st.user_id = %(uid)s AND st.watched = TRUE) AS total_episodes,
+        (SELECT COUNT(DISTINCT fg.genre) FROM ratings r
+         JOIN movies m ON m.id = r.film_id AND m.chat_id = r.chat_id
+         JOIN film_genres fg ON fg.kp_id = m.kp_id
+         WHERE r.chat_id = %(uid)s AND r.user_id = %(uid)s) AS unique_genres,
+        (SELECT COUNT(*) FROM plans WHERE user_id = %(uid)s) AS total_plans,
+        (SELECT COUNT(*) FROM mvp_history WHERE user_id = %(uid)s) AS mvp_count,
+        LEAST(
+            (SELECT MIN(watched_at) FROM watched_movies WHERE chat_id = %(uid)s AND user_id = %(uid)s),
+            (SELECT MIN(rated_at) FROM ratings WHERE chat_id = %(uid)s AND user_id = %(uid)s)
+        ) AS first_activity,
+        (SELECT array_agg(DISTINCT {_MONTH_INDEX_SQL.format('t.dt')})
+         FROM (
+             SELECT watched_at AS dt FROM watched_movies WHERE chat_id = %(uid)s AND user_id = %(uid)s AND watched_at IS NOT NULL
+             UNION ALL
+             SELECT rated_at FROM ratings WHERE chat_id = %(uid)s AND user_id = %(uid)s AND rated_at IS NOT NULL
+         ) t) AS active_months
+"""
+
+
+def _has_year_streak(month_indices):
+    """12 месяцев подряд с активностью; month_indices — year * 12 + month - 1"""
+    months = set(month_indices or ())
+    return any(all(m + i in months for i in range(12)) for m in months)
+
+
+def _compute_user_profile_counters(cur, user_id):
+    """Вечные счётчики профиля из сырых таблиц (одним запросом)."""
+    cur.execute(_PROFILE_COUNTERS_SQL, {'uid': user_id})
+    counters = dict(cur.fetchone())
+    counters['first_activity'] = _ensure_tz(counters['first_activity'])
+    counters['year_streak'] = _has_year_streak(counters.pop('active_months'))
+    return counters
+
+
+def _refresh_profile_rollup_row(cur, user_id):
+    """Пересчёт строки stats_profile_rollups в транзакции cur; возвращает обновлённую строку."""
+    cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (f'stats_profile:{user_id}',))
+    cur.execute("""
+        INSERT INTO stats_profile_rollups (user_id) VALUES (%s)
+        ON CONFLICT (user_id) DO NOTHING
+    """, (user_id,))
+    cur.execute("SELECT version FROM stats_profile_rollups WHERE user_id = %s", (user_id,))
+    row = cur.fetchone()
+    version = row.get('version') if isinstance(row, dict) else row[0]
+
+    counters = _compute_user_profile_counters(cur, user_id)
+
+    cur.execute("""
+        UPDATE stats_profile_rollups SET
+            total_films = %(total_films)s, total_series = %(total_series)s,
+            total_ratings = %(total_ratings)s, avg_rating = %(avg_rating)s,
+            total_cinema = %(total_cinema)s, completed_series = %(completed_series)s,
+            total_episodes = %(total_episodes)s, unique_genres = %(unique_genres)s,
+            total_plans = %(total_plans)s, mvp_count = %(mvp_count)s,
+            first_activity = %(first_activity)s, year_streak = %(year_streak)s,
+            refreshed_version = GREATEST(refreshed_version, %(version)s), refreshed_at = NOW()
+        WHERE user_id = %(user_id)s
+        RETURNING *
+    """, dict(counters, version=version, user_id=user_id))
+    return cur.fetchone()
+
+
+def refresh_profile_rollup(user_id):
+    """Пересчитывает вечные счётчики профиля и возвращает строку stats_profile_rollups."""
+    with db_connection() as conn:
+        return _refresh_profile_rollup_row(conn.cursor(), user_id)
+
+
+def _get_profile_rollup(user_id):
+    """Строка stats_profile_rollups; устаревшая или отсутствующая сначала пересчитывается."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM stats_profile_rollups WHERE user_id = %s", (user_id,))
+        row = cur.fetchone()
+    if row is None or row['version'] > row['refreshed_version']:
+        row = refresh_profile_rollup(user_id)
+    return row
+
+
+def refresh_stale_stats_rollups(limit=ROLLUP_REFRESH_BATCH, chat_id=None, only_warm=True):
+    """
+    Фоновый пересчёт устаревших ключей роллапов, чтобы запросы к сайту находили их свежими.
+    only_warm: только ключи, которые уже считались (их смотрят на сайте), — месяцы чатов,
+    которые статистику не открывают, пересчитываются лениво при первом запросе.
+    Возвращает число пересчитанных ключей.
+    """
+    warm_sql = ' AND refreshed_version > 0' if only_warm else ''
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT chat_id, month FROM stats_rollup_state
+            WHERE version > refreshed_version{warm_sql}
+              AND (%s::bigint IS NULL OR chat_id = %s::bigint)
+            ORDER BY month DESC
+            LIMIT %s
+        """, (chat_id, chat_id, limit))
+        keys = [(r['chat_id'], r['month']) for r in cur.fetchall()]
+        cur.execute(f"""
+            SELECT user_id FROM stats_profile_rollups
+            WHERE version > refreshed_version{warm_sql}
+              AND (%s::bigint IS NULL OR user_id = %s::bigint)
+            LIMIT %s
+        """, (chat_id, chat_id, limit))
+        profile_ids = [r['user_id'] for r in cur.fetchall()]
+
+    refreshed = 0
+    for key_chat_id, month in keys:
+        try:
+            refresh_stats_rollup(key_chat_id, month)
+            refreshed += 1
+        except Exception as e:
+            logger.error(f"[STATS ROLLUP] Ошибка пересчёта {key_chat_id} {month}: {e}", exc_info=True)
+    for user_id in profile_ids:
+        try:
+            refresh_profile_rollup(user_id)
+            refreshed += 1
+        except Exception as e:
+            logger.error(f"[STATS ROLLUP] Ошибка пересчёта профиля {user_id}: {e}", exc_info=True)
+    if refreshed:
+        logger.info(f"[STATS ROLLUP] Пересчитано ключей: {refreshed}")
+    return refreshed
+
+
+def rebuild_stats_rollups(chat_id=None):
+    """
+    Полная перестройка роллапов (всех чатов или одного chat_id): помечает устаревшими все
+    существующие ключи, заводит ключи для всех месяцев с активностью в сырых таблицах
+    и пересчитывает их. Нужна после ручных правок БД и изменений, которые триггеры не видят
+    (например, новые жанры фильма в film_genres). Возвращает число пересчитанных ключей.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE stats_rollup_state SET version = version + 1
+            WHERE %s::bigint IS NULL OR chat_id = %s::bigint
+        """, (chat_id, chat_id))
+        cur.execute("""
+            INSERT INTO stats_rollup_state (chat_id, month)
+            SELECT DISTINCT k.chat_id, k.month FROM (
+                SELECT chat_id, date_trunc('month', watched_at AT TIME ZONE 'UTC')::date AS month
+                FROM watched_movies WHERE watched_at IS NOT NULL
+                UNION
+                SELECT chat_id, date_trunc('month', rated_at AT TIME ZONE 'UTC')::date
+                FROM ratings WHERE rated_at IS NOT NULL
+                UNION
+                SELECT chat_id, date_trunc('month', watched_date AT TIME ZONE 'UTC')::date
+                FROM series_tracking WHERE watched = TRUE AND watched_date IS NOT NULL
+                UNION
+                SELECT chat_id, date_trunc('month', screening_date)::date
+                FROM cinema_screenings
+                UNION
+                SELECT chat_id, date_trunc('month', plan_datetime AT TIME ZONE 'UTC')::date
+                FROM plans WHERE plan_type = 'cinema' AND plan_datetime IS NOT NULL
+            ) k
+            WHERE k.chat_id IS NOT NULL AND (%s::bigint IS NULL OR k.chat_id = %s::bigint)
+            ON CONFLICT (chat_id, month) DO NOTHING
+        """, (chat_id, chat_id))
+        cur.execute("""
+            UPDATE stats_profile_rollups SET version = version + 1
+            WHERE %s::bigint IS NULL OR user_id = %s::bigint
+        """, (chat_id, chat_id))
+
+    total = 0
+    while True:
+        refreshed = refresh_stale_stats_rollups(chat_id=chat_id, only_warm=False)
+        if not refreshed:
+            break
+        total += refreshed
+    logger.info(f"[STATS ROLLUP] Перестройка завершена (chat_id={chat_id}), ключей: {total}")
+    return total
+
+
 def _get_user_profile_and_achievements(user_id):
-    """Вычисляет user_profile (alltime) и список вечных ачивок. Без хранения в БД."""
+    """
+    Вычисляет user_profile (alltime) и список вечных ачивок.
+    Вечные счётчики (включая MVP и планы во всех чатах) — из stats_profile_rollups; имя читается напрямую.
+    """
     cur = get_db_cursor()
     chat_id = user_id  # личный чат
 
@@ -163,6 +487,26 @@ def _get_user_profile_and_achievements(user_id):
         'total_plans_alltime': 0,
     }
 
+    rollup = _get_profile_rollup(user_id)
+    profile['total_films_alltime'] = rollup.get('total_films') or 0
+    profile['total_series_alltime'] = rollup.get('total_series') or 0
+    profile['total_ratings_alltime'] = rollup.get('total_ratings') or 0
+    profile['total_cinema_alltime'] = rollup.get('total_cinema') or 0
+    profile['completed_series_alltime'] = rollup.get('completed_series') or 0
+    profile['total_episodes_alltime'] = rollup.get('total_episodes') or 0
+    profile['unique_genres_alltime'] = rollup.get('unique_genres') or 0
+    profile['total_plans_alltime'] = rollup.get('total_plans') or 0
+    profile['mvp_count'] = rollup.get('mvp_count') or 0
+    profile['year_streak'] = bool(rollup.get('year_streak'))
+    avg = rollup.get('avg_rating')
+    profile['avg_rating_alltime'] = round(float(avg), 1) if avg is not None else None
+    first_ts = _ensure_tz(rollup.get('first_activity'))
+    if first_ts:
+        profile['member_since'] = first_ts.strftime('%Y-%m-%d')
+        now = datetime.now(pytz.UTC)
+        months = (now.year - first_ts.year) * 12 + (now.month - first_ts.month)
+        profile['months_since_first_action'] = max(0, months)
+
     with db_lock:
         cur.execute("SELECT name FROM site_sessions WHERE chat_id = %s ORDER BY created_at ASC LIMIT 1", (chat_id,))
         row = cur.fetchone()
@@ -174,137 +518,6 @@ def _get_user_profile_and_achievements(user_id):
             un = row.get('username') if isinstance(row, dict) else row[0]
             profile['username'] = ('@' + un) if un and not str(un).startswith('@') else un
 
-        cur.execute("""
-            SELECT COUNT(DISTINCT wm.film_id) FROM watched_movies wm
-            JOIN movies m ON m.id = wm.film_id AND m.chat_id = wm.chat_id
-            WHERE wm.chat_id = %s AND wm.user_id = %s AND (m.is_series IS NULL OR m.is_series = 0)
-        """, (chat_id, user_id))
-        r = cur.fetchone()
-        films_wm = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        cur.execute("""
-            SELECT COUNT(DISTINCT r.film_id) FROM ratings r
-            JOIN movies m ON m.id = r.film_id AND m.chat_id = r.chat_id
-            WHERE r.chat_id = %s AND r.user_id = %s AND (m.is_series IS NULL OR m.is_series = 0)
-        """, (chat_id, user_id))
-        r = cur.fetchone()
-        films_rat = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        cur.execute("""
-            SELECT COUNT(*) FROM ratings WHERE chat_id = %s AND user_id = %s
-        """, (chat_id, user_id))
-        r = cur.fetchone()
-        profile['total_ratings_alltime'] = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        cur.execute("""
-            SELECT COUNT(*) FROM cinema_screenings WHERE chat_id = %s AND user_id = %s
-        """, (chat_id, user_id))
-        r = cur.fetchone()
-        profile['total_cinema_alltime'] = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        cur.execute("""
-            SELECT COUNT(DISTINCT st.film_id) FROM series_tracking st
-            JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
-            WHERE st.chat_id = %s AND st.user_id = %s AND st.watched = TRUE AND m.is_series != 0
-        """, (chat_id, user_id))
-        r = cur.fetchone()
-        profile['completed_series_alltime'] = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        cur.execute("""
-            SELECT COUNT(*) FROM series_tracking st
-            JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
-            WHERE st.chat_id = %s AND st.user_id = %s AND st.watched = TRUE
-        """, (chat_id, user_id))
-        r = cur.fetchone()
-        profile['total_episodes_alltime'] = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        cur.execute("""
-            SELECT m.genres FROM ratings r
-            JOIN movies m ON m.id = r.film_id AND m.chat_id = r.chat_id
-            WHERE r.chat_id = %s AND r.user_id = %s AND m.genres IS NOT NULL AND m.genres != ''
-        """, (chat_id, user_id))
-        genres_set = set()
-        for row in cur.fetchall():
-            g = row.get('genres') if isinstance(row, dict) else row[0]
-            if g:
-                for part in str(g).replace(',', ' ').split():
-                    if len(part) > 1:
-                        genres_set.add(part.strip())
-        profile['unique_genres_alltime'] = len(genres_set)
-        cur.execute("""
-            SELECT COUNT(DISTINCT m.id) FROM movies m
-            WHERE m.chat_id = %s AND (m.is_series IS NULL OR m.is_series = 0)
-              AND (EXISTS (SELECT 1 FROM watched_movies wm WHERE wm.chat_id = m.chat_id AND wm.film_id = m.id AND wm.user_id = %s)
-                   OR EXISTS (SELECT 1 FROM ratings r WHERE r.chat_id = m.chat_id AND r.film_id = m.id AND r.user_id = %s))
-        """, (chat_id, user_id, user_id))
-        r = cur.fetchone()
-        profile['total_films_alltime'] = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        cur.execute("""
-            SELECT COUNT(DISTINCT st.film_id) FROM series_tracking st
-            WHERE st.chat_id = %s AND st.user_id = %s AND st.watched = TRUE
-        """, (chat_id, user_id))
-        r = cur.fetchone()
-        profile['total_series_alltime'] = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        cur.execute("""
-            SELECT AVG(rating)::numeric(4,2) FROM ratings WHERE chat_id = %s AND user_id = %s
-        """, (chat_id, user_id))
-        r = cur.fetchone()
-        avg = r.get('avg') if isinstance(r, dict) else (r[0] if r and len(r) > 0 else None)
-        profile['avg_rating_alltime'] = round(float(avg), 1) if avg is not None else None
-        first_ts = None
-        for q in [
-            "SELECT MIN(watched_at) AS ts FROM watched_movies WHERE chat_id = %s AND user_id = %s",
-            "SELECT MIN(rated_at) AS ts FROM ratings WHERE chat_id = %s AND user_id = %s",
-        ]:
-            cur.execute(q, (chat_id, user_id))
-            r = cur.fetchone()
-            val = (r.get('ts') if isinstance(r, dict) else (r[0] if r and len(r) > 0 else None)) if r else None
-            if val:
-                dt = _ensure_tz(val)
-                if first_ts is None or (dt and dt < first_ts):
-                    first_ts = dt
-        if first_ts:
-            profile['member_since'] = first_ts.strftime('%Y-%m-%d')
-            now = datetime.now(pytz.UTC)
-            months = (now.year - first_ts.year) * 12 + (now.month - first_ts.month)
-            profile['months_since_first_action'] = max(0, months)
-        cur.execute("""
-            SELECT COUNT(*) FROM mvp_history WHERE user_id = %s
-        """, (user_id,))
-        r = cur.fetchone()
-        mvp_count = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        profile['mvp_count'] = mvp_count
-        cur.execute("""
-            SELECT COUNT(*) FROM plans WHERE user_id = %s
-        """, (user_id,))
-        r = cur.fetchone()
-        profile['total_plans_alltime'] = (r.get('count') if isinstance(r, dict) else r[0]) or 0
-        year_streak = False
-        if first_ts:
-            cur.execute("""
-                SELECT DISTINCT date_trunc('month', t.dt)::date as m
-                FROM (
-                    SELECT watched_at as dt FROM watched_movies WHERE chat_id = %s AND user_id = %s AND watched_at IS NOT NULL
-                    UNION ALL
-                    SELECT rated_at as dt FROM ratings WHERE chat_id = %s AND user_id = %s AND rated_at IS NOT NULL
-                ) t
-                ORDER BY m
-            """, (chat_id, user_id, chat_id, user_id))
-            months_with_activity = []
-            for row in cur.fetchall():
-                m = row.get('m') if isinstance(row, dict) else row[0]
-                if m and hasattr(m, 'year'):
-                    months_with_activity.append((m.year, m.month))
-            months_set = set(months_with_activity)
-            if len(months_set) >= 12:
-                for y, mo in months_set:
-                    needed = []
-                    cy, cmo = y, mo
-                    for _ in range(12):
-                        needed.append((cy, cmo))
-                        if cmo == 12:
-                            cy, cmo = cy + 1, 1
-                        else:
-                            cmo += 1
-                    if all(m in months_set for m in needed):
-                        year_streak = True
-                        break
-        profile['year_streak'] = year_streak
-
     user_profile_out = {
         'username': profile.get('username') or f'user_{user_id}',
         'first_name': profile.get('first_name') or profile.get('username') or f'user_{user_id}',
@@ -372,54 +585,75 @@ def _get_user_profile_and_achievements(user_id):
     return user_profile_out, achievements
 
 
-def get_personal_stats(chat_id, month, year):
-    """Персональная статистика за месяц. chat_id > 0."""
-    conn = get_db_connection()
-    cur = get_db_cursor()
-    start_ts, end_ts = _month_range(month, year)
-    user_id = chat_id  # для личного чата chat_id = user_id
-
-    with db_lock:
-        # Фильмы/сериалы с датой просмотра из watched_movies
-        cur.execute("""
-            SELECT wm.film_id, wm.watched_at, m.kp_id, m.title, m.year, m.genres, m.is_series, m.online_link
-            FROM watched_movies wm
-            JOIN movies m ON m.id = wm.film_id AND m.chat_id = wm.chat_id
-            WHERE wm.chat_id = %s AND wm.user_id = %s
-              AND wm.watched_at >= %s AND wm.watched_at < %s
-        """, (chat_id, user_id, start_ts, end_ts))
-        watched_rows = cur.fetchall()
-
-        # Серии из series_tracking (year, online_link для watched_list)
-        cur.execute("""
-            SELECT st.film_id, st.watched_date, m.kp_id, m.title, m.year, m.is_series, m.online_link
-            FROM series_tracking st
-            JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
-            WHERE st.chat_id = %s AND st.user_id = %s AND st.watched = TRUE
-              AND st.watched_date >= %s AND st.watched_date < %s
-        """, (chat_id, user_id, start_ts, end_ts))
-        series_rows = cur.fetchall()
-
-        # Рейтинги
-        cur.execute("""
-            SELECT r.film_id, r.rating, r.rated_at, m.kp_id, m.title, m.year, m.genres, m.is_series
-            FROM ratings r
-            JOIN movies m ON m.id = r.film_id AND m.chat_id = r.chat_id
-            WHERE r.chat_id = %s AND r.user_id = %s
-        """, (chat_id, user_id))
-        ratings_all = cur.fetchall()
-
-    # Фильтруем рейтинги по месяцу если есть rated_at
-    ratings_in_month = []
-    for r in ratings_all:
-        rt_at = r.get('rated_at') if isinstance(r, dict) else (r[2] if len(r) > 2 else None)
-        if rt_at is not None:
-            dt = _ensure_tz(rt_at)
-            if dt and start_ts <= dt < end_ts:
-                ratings_in_month.append(r)
-        else:
-            ratings_in_month.append(r)  # без даты — включаем (fallback)
+def _fetch_personal_month(cur, chat_id, user_id, start_ts, end_ts):
+    """
+    Сырые строки личной статистики за месяц: (watched_rows, series_rows, ratings_in_month, cinema_rows).
+    Оценки без rated_at попадают в каждый месяц (fallback).
+    """
+    # Фильмы/сериалы с датой просмотра из watched_movies
+    cur.execute("""
+        SELECT wm.film_id, wm.watched_at, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year, COALESCE(f.genres, m.genres) AS genres, m.is_series, m.online_link
+        FROM watched_movies wm
+        JOIN movies m ON m.id = wm.film_id AND m.chat_id = wm.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE wm.chat_id = %s AND wm.user_id = %s
+          AND wm.watched_at >= %s AND wm.watched_at < %s
+    """, (chat_id, user_id, start_ts, end_ts))
+    watched_rows = cur.fetchall()
+
+    # Серии из series_tracking (year, online_link для watched_list)
+    cur.execute("""
+        SELECT st.film_id, st.watched_date, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year, m.is_series, m.online_link
+        FROM series_tracking st
+        JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE st.chat_id = %s AND st.user_id = %s AND st.watched = TRUE
+          AND st.watched_date >= %s AND st.watched_date < %s
+    """, (chat_id, user_id, start_ts, end_ts))
+    series_rows = cur.fetchall()
+
+    # Рейтинги за месяц (фильтр по rated_at в БД, без даты — включаем)
+    cur.execute("""
+        SELECT r.film_id, r.rating, r.rated_at, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year, COALESCE(f.genres, m.genres) AS genres, m.is_series
+        FROM ratings r
+        JOIN movies m ON m.id = r.film_id AND m.chat_id = r.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE r.chat_id = %s AND r.user_id = %s
+          AND (r.rated_at IS NULL OR (r.rated_at >= %s AND r.rated_at < %s))
+    """, (chat_id, user_id, start_ts, end_ts))
+    ratings_in_month = cur.fetchall()
 
+    # Cinema: из cinema_screenings (планы удаляются, записи остаются) + plans для актуальных планов
+    cur.execute("""
+        SELECT cs.film_id, cs.screening_date, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year
+        FROM cinema_screenings cs
+        JOIN movies m ON m.id = cs.film_id AND m.chat_id = cs.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE cs.chat_id = %s AND cs.user_id = %s
+          AND cs.screening_date >= %s AND cs.screening_date < %s
+    """, (chat_id, user_id, start_ts.date(), end_ts.date()))
+    cinema_rows = list(cur.fetchall())
+    # Дополняем планами (если ещё не удалены; в личке chat_id=user_id)
+    cur.execute("""
+        SELECT p.film_id, p.plan_datetime::date, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year
+        FROM plans p
+        JOIN movies m ON m.id = p.film_id AND m.chat_id = p.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE p.chat_id = %s AND p.plan_type = 'cinema' AND (p.user_id = %s OR p.user_id IS NULL)
+          AND p.plan_datetime >= %s AND p.plan_datetime < %s
+          AND NOT EXISTS (
+            SELECT 1 FROM cinema_screenings cs
+            WHERE cs.chat_id = p.chat_id AND cs.user_id = %s AND cs.film_id = p.film_id
+          )
+    """, (chat_id, user_id, start_ts, end_ts, user_id))
+    for row in cur.fetchall():
+        cinema_rows.append(row)
+
+    return watched_rows, series_rows, ratings_in_month, cinema_rows
+
+
+def _build_personal_month(watched_rows, series_rows, ratings_in_month, cinema_rows, start_ts):
+    """Счётчики и списки личной статистики месяца из строк _fetch_personal_month."""
     films_watched = set()
     series_watched = set()
     episodes_count = 0
@@ -449,33 +683,11 @@ def get_personal_stats(chat_id, month, year):
         else:
             films_watched.add(fid)
 
-    # Cinema: из cinema_screenings (планы удаляются, записи остаются) + plans для актуальных планов
-    cinema_rows = []
-    with db_lock:
-        cur.execute("""
-            SELECT cs.film_id, cs.screening_date, m.kp_id, m.title, m.year
-            FROM cinema_screenings cs
-            JOIN movies m ON m.id = cs.film_id AND m.chat_id = cs.chat_id
-            WHERE cs.chat_id = %s AND cs.user_id = %s
-              AND cs.screening_date >= %s AND cs.screening_date < %s
-        """, (chat_id, user_id, start_ts.date(), end_ts.date()))
-        cinema_rows = list(cur.fetchall())
-        # Дополняем планами (если ещё не удалены; в личке chat_id=user_id)
-        cur.execute("""
-            SELECT p.film_id, p.plan_datetime::date, m.kp_id, m.title, m.year
-            FROM plans p
-            JOIN movies m ON m.id = p.film_id AND m.chat_id = p.chat_id
-            WHERE p.chat_id = %s AND p.plan_type = 'cinema' AND (p.user_id = %s OR p.user_id IS NULL)
-              AND p.plan_datetime >= %s AND p.plan_datetime < %s
-              AND NOT EXISTS (
-                SELECT 1 FROM cinema_screenings cs
-                WHERE cs.chat_id = p.chat_id AND cs.user_id = %s AND cs.film_id = p.film_id
-              )
-        """, (chat_id, user_id, start_ts, end_ts, user_id))
-        for row in cur.fetchall():
-            cinema_rows.append(row)
-
     cinema_film_ids = {r.get('film_id') if isinstance(r, dict) else r[0] for r in cinema_rows}
+    # Первая оценка месяца по фильму — для списков
+    film_rating = {}
+    for r in ratings_in_month:
+        film_rating.setdefault(r.get('film_id') if isinstance(r, dict) else r[0], r.get('rating') if isinstance(r, dict) else r[1])
     # Собираем watched для вывода (из watched_movies + series_tracking + ratings) — всё, что в summary
     watched_list = []
     seen = set()
@@ -490,7 +702,7 @@ def get_personal_stats(chat_id, month, year):
         key = (fid, 'wm')
         if key not in seen:
             seen.add(key)
-            rating = next((x.get('rating') for x in ratings_in_month if (x.get('film_id') == fid)), None)
+            rating = film_rating.get(fid)
             watched_list.append({
                 'film_id': fid, 'kp_id': kp_id, 'title': title, 'year': year,
                 'type': 'series' if is_series else 'film',
@@ -523,7 +735,7 @@ def get_personal_stats(chat_id, month, year):
         wd = r.get('watched_date') if isinstance(r, dict) else r[1]
         online_link = r.get('online_link') if isinstance(r, dict) else (r[6] if len(r) > 6 else None)
         date_str = wd.strftime('%Y-%m-%d') if hasattr(wd, 'strftime') else (str(wd)[:10] if wd else '')
-        rating = next((x.get('rating') for x in ratings_in_month if (x.get('film_id') == fid)), None)
+        rating = film_rating.get(fid)
         watched_list.append({
             'film_id': fid, 'kp_id': kp_id, 'title': title, 'year': year,
             'type': 'series' if is_series else 'film',
@@ -567,7 +779,7 @@ def get_personal_stats(chat_id, month, year):
         year = r.get('year') if isinstance(r, dict) else (r[4] if len(r) > 4 else None)
         dt = r.get('screening_date') or r.get('plan_datetime') if isinstance(r, dict) else r[1]
         date_str = dt.strftime('%Y-%m-%d') if hasattr(dt, 'strftime') else (str(dt)[:10] if dt else '')
-        rating = next((x.get('rating') for x in ratings_in_month if (x.get('film_id') == fid)), None)
+        rating = film_rating.get(fid)
         seen.add((fid, 'c'))
         watched_list.append({
             'film_id': fid, 'kp_id': kp_id, 'title': title, 'year': year,
@@ -580,7 +792,7 @@ def get_personal_stats(chat_id, month, year):
     watched_fids = {w.get('film_id') for w in watched_list}
     all_expected = films_watched | series_watched
     missing = all_expected - watched_fids
-    ratings_by_fid = {r.get('film_id') if isinstance(r, dict) else r[0]: r for r in ratings_all}
+    ratings_by_fid = {r.get('film_id') if isinstance(r, dict) else r[0]: r for r in ratings_in_month}
     for fid in missing:
         r = ratings_by_fid.get(fid)
         if r:
@@ -613,10 +825,9 @@ def get_personal_stats(chat_id, month, year):
             plat = _platform_from_link(w.get('online_link'))
             if plat:
                 platform_counts[plat] += 1
-    platforms = [{'platform': k, 'count': v} for k, v in sorted(platform_counts.items(), key=lambda x: -x[1])]
 
     # rating_breakdown
-    rating_breakdown = {str(i): 0 for i in range(1, 11)}
+    rating_breakdown = _empty_rating_breakdown()
     for r in ratings_in_month:
         rt = r.get('rating') if isinstance(r, dict) else r[1]
         if rt and 1 <= rt <= 10:
@@ -644,31 +855,75 @@ def get_personal_stats(chat_id, month, year):
         title = r.get('title') if isinstance(r, dict) else r[3]
         year = r.get('year') if isinstance(r, dict) else r[4]
         date_str = dt.strftime('%Y-%m-%d') if hasattr(dt, 'strftime') else str(dt)[:10]
-        rating = next((x.get('rating') for x in ratings_in_month if x.get('film_id') == fid), None)
+        rating = film_rating.get(fid)
         cinema_list.append({'film_id': fid, 'kp_id': kp_id, 'title': title, 'year': year, 'date': date_str, 'place': None, 'rating': rating})
 
-    # avg_rating
-    total_rating = sum(r.get('rating') or 0 for r in ratings_in_month)
-    count_rating = len(ratings_in_month)
-    avg_rating = round(total_rating / count_rating, 1) if count_rating else None
+    return {
+        'films_watched': films_watched,
+        'series_watched': series_watched,
+        'episodes_count': episodes_count,
+        'cinema_visits': len(cinema_rows),
+        'ratings_count': len(ratings_in_month),
+        'rating_sum': sum(r.get('rating') or 0 for r in ratings_in_month),
+        'rating_breakdown': rating_breakdown,
+        'platform_counts': dict(platform_counts),
+        'watched_list': watched_list,
+        'top_films': top_films,
+        'cinema_list': cinema_list,
+    }
+
+
+def _personal_rollup_row(user_id, month_data):
+    """Строка роллапа личного чата из _build_personal_month."""
+    row = _empty_rollup_row(user_id)
+    row.update({
+        'films_watched': len(month_data['films_watched']),
+        'series_watched': len(month_data['series_watched']),
+        'episodes_watched': month_data['episodes_count'],
+        # total_watched = films + episodes (каждый фильм и каждая серия считаются как 1 просмотр)
+        'views': len(month_data['films_watched']) + month_data['episodes_count'],
+        'ratings_count': month_data['ratings_count'],
+        'rating_sum': month_data['rating_sum'],
+        'cinema_visits': month_data['cinema_visits'],
+        'rating_breakdown': month_data['rating_breakdown'],
+        'platforms': month_data['platform_counts'],
+    })
+    return row
+
+
+def get_personal_stats(chat_id, month, year):
+    """Персональная статистика за месяц. chat_id > 0. Счётчики — из роллапа, списки — из строк месяца."""
+    cur = get_db_cursor()
+    start_ts, end_ts = _month_range(month, year)
+    user_id = chat_id  # для личного чата chat_id = user_id
+
+    rollup = _get_month_rollups(chat_id, start_ts).get(user_id) or _empty_rollup_row(user_id)
+    with db_lock:
+        month_rows = _fetch_personal_month(cur, chat_id, user_id, start_ts, end_ts)
+    month_data = _build_personal_month(*month_rows, start_ts)
+
+    platforms = [
+        {'platform': k, 'count': v}
+        for k, v in sorted((rollup.get('platforms') or {}).items(), key=lambda x: -x[1])
+    ]
+    ratings_count = rollup.get('ratings_count') or 0
+    avg_rating = round(rollup.get('rating_sum', 0) / ratings_count, 1) if ratings_count else None
 
-    # total_watched = films + episodes (каждый фильм и каждая серия считаются как 1 просмотр)
-    total_views = len(films_watched) + episodes_count
     out = {
         'period': {'month': month, 'year': year, 'label': f'{MONTH_NAMES_RU[month - 1]} {year}'},
         'summary': {
-            'films_watched': len(films_watched),
-            'series_watched': len(series_watched),
-            'episodes_watched': episodes_count,
-            'cinema_visits': len(cinema_rows),
-            'total_watched': total_views,
+            'films_watched': rollup.get('films_watched', 0),
+            'series_watched': rollup.get('series_watched', 0),
+            'episodes_watched': rollup.get('episodes_watched', 0),
+            'cinema_visits': rollup.get('cinema_visits', 0),
+            'total_watched': rollup.get('views', 0),
             'avg_rating': avg_rating
         },
-        'top_films': top_films,
-        'cinema': cinema_list,
+        'top_films': month_data['top_films'],
+        'cinema': month_data['cinema_list'],
         'platforms': platforms,
-        'watched': watched_list,
-        'rating_breakdown': rating_breakdown
+        'watched': month_data['watched_list'],
+        'rating_breakdown': _rollup_rating_breakdown(rollup)
     }
     profile, achievements = _get_user_profile_and_achievements(user_id)
     if profile:
@@ -686,9 +941,240 @@ def _ensure_tz(dt):
     return pytz.UTC.localize(dt) if hasattr(dt, 'replace') else dt
 
 
+def _fetch_group_month(cur, chat_id, start_ts, end_ts):
+    """Сырые строки группы за месяц: (wm_rows, st_rows, cinema_rows, ratings_in_month)."""
+    # watched_movies за месяц (фильмы + сериалы)
+    cur.execute("""
+        SELECT wm.film_id, wm.user_id, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year, m.is_series, wm.watched_at
+        FROM watched_movies wm
+        JOIN movies m ON m.id = wm.film_id AND m.chat_id = wm.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE wm.chat_id = %s AND wm.watched_at >= %s AND wm.watched_at < %s
+    """, (chat_id, start_ts, end_ts))
+    wm_rows = cur.fetchall()
+
+    # series_tracking за месяц
+    cur.execute("""
+        SELECT st.film_id, st.user_id, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year, m.is_series, st.watched_date
+        FROM series_tracking st
+        JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE st.chat_id = %s AND st.watched = TRUE
+          AND st.watched_date >= %s AND st.watched_date < %s
+    """, (chat_id, start_ts, end_ts))
+    st_rows = cur.fetchall()
+
+    # Cinema: cinema_screenings (постоянные) + plans (если ещё не удалены)
+    cur.execute("""
+        SELECT cs.film_id, cs.user_id, cs.screening_date, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year
+        FROM cinema_screenings cs
+        JOIN movies m ON m.id = cs.film_id AND m.chat_id = cs.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE cs.chat_id = %s AND cs.screening_date >= %s AND cs.screening_date < %s
+    """, (chat_id, start_ts.date(), end_ts.date()))
+    cinema_rows = list(cur.fetchall())
+    cur.execute("""
+        SELECT p.film_id, p.user_id, p.plan_datetime::date, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year
+        FROM plans p
+        JOIN movies m ON m.id = p.film_id AND m.chat_id = p.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE p.chat_id = %s AND p.plan_type = 'cinema'
+          AND p.plan_datetime >= %s AND p.plan_datetime < %s
+          AND NOT EXISTS (
+            SELECT 1 FROM cinema_screenings cs
+            WHERE cs.chat_id = p.chat_id AND cs.user_id = p.user_id AND cs.film_id = p.film_id
+          )
+    """, (chat_id, start_ts, end_ts))
+    for row in cur.fetchall():
+        cinema_rows.append(row)
+
+    # ratings строго за месяц (rated_at). ТОЛЬКО группа: r.chat_id = группа, фильмы из базы группы.
+    # Без даты — не включаем (данные по группе только за месяц)
+    cur.execute("""
+        SELECT r.rating, r.user_id, r.film_id, r.rated_at, m.kp_id, COALESCE(f.title, m.title) AS title, COALESCE(f.year, m.year) AS year, COALESCE(f.genres, m.genres) AS genres, m.is_series
+        FROM ratings r
+        JOIN movies m ON m.id = r.film_id AND m.chat_id = r.chat_id
+        LEFT JOIN films f ON f.kp_id = m.kp_id
+        WHERE r.chat_id = %s AND r.rated_at >= %s AND r.rated_at < %s
+    """, (chat_id, start_ts, end_ts))
+    ratings_in_month = cur.fetchall()
+
+    return wm_rows, st_rows, cinema_rows, ratings_in_month
+
+
+def _fetch_group_month_genres(cur, chat_id, start_ts, end_ts):
+    """Жанры за месяц по участникам (watched_movies + series_tracking) — GROUP BY по film_genres в БД."""
+    cur.execute("""
+        SELECT fg.genre, w.user_id, COUNT(*) AS cnt
+        FROM (
+            SELECT wm.user_id, m.kp_id
+            FROM watched_movies wm
+            JOIN movies m ON m.id = wm.film_id AND m.chat_id = wm.chat_id
+            WHERE wm.chat_id = %s AND wm.watched_at >= %s AND wm.watched_at < %s
+            UNION ALL
+            SELECT st.user_id, m.kp_id
+            FROM series_tracking st
+            JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
+            WHERE st.chat_id = %s AND st.watched = TRUE
+              AND st.watched_date >= %s AND st.watched_date < %s
+        ) w
+        JOIN film_genres fg ON fg.kp_id = w.kp_id
+        GROUP BY fg.genre, w.user_id
+    """, (chat_id, start_ts, end_ts, chat_id, start_ts, end_ts))
+    return cur.fetchall()
+
+
+def _group_rollup_rows(wm_rows, st_rows, cinema_rows, ratings_in_month, genre_rows):
+    """
+    Строки роллапа группы за месяц: по участнику и ROLLUP_TOTAL_USER_ID с уникальными
+    фильмами/сериалами группы. Оценка = просмотр: оценки месяца считаются просмотрами.
+    Строки без user_id в счётчики участников не попадают.
+    """
+    users = {}
+
+    def user_row(uid):
+        if uid not in users:
+            users[uid] = _empty_rollup_row(uid)
+        return users[uid]
+
+    def add_activity(row, dt):
+        d = _row_day(dt)
+        if d:
+            row['activity'][str(d)] = row['activity'].get(str(d), 0) + 1
+
+    films_watched = set()  # film_id (не сериалы)
+    series_watched = set()
+    episodes_count = 0
+    for r in wm_rows:
+        fid = r.get('film_id') if isinstance(r, dict) else r[0]
+        uid = r.get('user_id') if isinstance(r, dict) else r[1]
+        is_series = r.get('is_series') if isinstance(r, dict) else r[5]
+        dt = r.get('watched_at') if isinstance(r, dict) else r[6]
+        if is_series:
+            series_watched.add(fid)
+            episodes_count += 1
+        else:
+            films_watched.add(fid)
+        if uid:
+            row = user_row(uid)
+            row['views'] += 1
+            add_activity(row, dt)
+    for r in st_rows:
+        fid = r.get('film_id') if isinstance(r, dict) else r[0]
+        uid = r.get('user_id') if isinstance(r, dict) else r[1]
+        is_series = r.get('is_series') if isinstance(r, dict) else r[5]
+        dt = r.get('watched_date') if isinstance(r, dict) else r[6]
+        if is_series:
+            series_watched.add(fid)
+            episodes_count += 1
+        else:
+            films_watched.add(fid)
+        if uid:
+            row = user_row(uid)
+            row['views'] += 1
+            row['episodes_watched'] += 1
+            add_activity(row, dt)
+
+    total = _empty_rollup_row(ROLLUP_TOTAL_USER_ID)
+    total['rating_breakdown'] = _empty_rating_breakdown()
+    for r in ratings_in_month:
+        fid = r.get('film_id') if isinstance(r, dict) else r[2]
+        uid = r.get('user_id') if isinstance(r, dict) else r[1]
+        rt = r.get('rating') if isinstance(r, dict) else r[0]
+        is_series = r.get('is_series') if isinstance(r, dict) else (r[8] if len(r) > 8 else False)
+        rt_at = r.get('rated_at') if isinstance(r, dict) else r[3]
+        if is_series:
+            series_watched.add(fid)
+        else:
+            films_watched.add(fid)
+        valid = rt and 1 <= rt <= 10
+        if valid:
+            total['rating_breakdown'][str(int(rt))] += 1
+        if uid:
+            row = user_row(uid)
+            row['views'] += 1
+            add_activity(row, _ensure_tz(rt_at))
+            if valid:
+                row['ratings_count'] += 1
+                row['rating_sum'] += rt
+
+    for r in cinema_rows:
+        uid = r.get('user_id') if isinstance(r, dict) else r[1]
+        if uid:
+            user_row(uid)['cinema_visits'] += 1
+
+    for r in genre_rows:
+        gen = r.get('genre') if isinstance(r, dict) else r[0]
+        uid = r.get('user_id') if isinstance(r, dict) else r[1]
+        cnt = r.get('cnt') if isinstance(r, dict) else r[2]
+        if uid:
+            genres = user_row(uid)['genres']
+            genres[gen] = genres.get(gen, 0) + cnt
+
+    total.update({
+        'films_watched': len(films_watched),
+        'series_watched': len(series_watched),
+        'episodes_watched': episodes_count,
+        'views': len(films_watched) + len(series_watched),
+        'ratings_count': len(ratings_in_month),
+        'rating_sum': sum(r.get('rating') or 0 for r in ratings_in_month),
+        'cinema_visits': len(cinema_rows),
+    })
+    return [total] + [users[uid] for uid in sorted(users)]
+
+
+def _top_holder(counts, threshold):
+    """
+    user_id с наибольшим счётчиком не ниже threshold; при равенстве — меньший user_id.
+    Результат не зависит от порядка ключей в counts.
+    """
+    candidates = [(-value, uid) for uid, value in counts.items() if uid and value >= threshold]
+    return min(candidates)[1] if candidates else None
+
+
+def _discoverer_film_ids(ratings_in_month):
+    """film_id фильмов месяца с ≥2 оценками, где все оценили 8+ (по возрастанию)."""
+    film_ratings = defaultdict(list)
+    for r in ratings_in_month:
+        fid = r.get('film_id') if isinstance(r, dict) else r[2]
+        rt = r.get('rating') if isinstance(r, dict) else r[0]
+        if fid and rt:
+            film_ratings[fid].append(rt)
+    return sorted(fid for fid, rats in film_ratings.items() if len(rats) >= 2 and all(rt >= 8 for rt in rats))
+
+
+def _group_achievement_holders(rollups, discovered_by):
+    """
+    Обладатели ачивок группы за месяц по строкам роллапа участников {user_id: строка}.
+    discovered_by — {film_id: added_by} для фильмов из _discoverer_film_ids.
+    Победитель — участник с наибольшим счётчиком (просмотры, оценки, походы, серии, жанры,
+    найденные фильмы; для критика и добряка — число оценок), при равенстве — меньший user_id.
+    """
+    rating_count = {uid: r['ratings_count'] for uid, r in rollups.items() if r.get('ratings_count')}
+    strict = {uid: cnt for uid, cnt in rating_count.items() if rollups[uid]['rating_sum'] / cnt < 7}
+    generous = {uid: cnt for uid, cnt in rating_count.items() if rollups[uid]['rating_sum'] / cnt > 8}
+    discoveries = defaultdict(int)
+    for added_by in discovered_by.values():
+        if added_by:
+            discoveries[added_by] += 1
+    return {
+        'cinephile': _top_holder({uid: r.get('views') or 0 for uid, r in rollups.items()}, 10),
+        'strict_critic': _top_holder(strict, 5),
+        'frequent_goer': _top_holder({uid: r.get('cinema_visits') or 0 for uid, r in rollups.items()}, 3),
+        'generous': _top_holder(generous, 5),
+        'binge_watcher': _top_holder({uid: r.get('episodes_watched') or 0 for uid, r in rollups.items()}, 20),
+        'rater': _top_holder(rating_count, 15),
+        'polyglot': _top_holder({uid: len(r.get('genres') or {}) for uid, r in rollups.items()}, 5),
+        'discoverer': _top_holder(discoveries, 1),
+    }
+
+
 def get_group_stats(chat_id, month, year):
-    """Групповая статистика. chat_id < 0."""
-    conn = get_db_connection()
+    """
+    Групповая статистика. chat_id < 0.
+    Сводка, лидерборды, ачивки, жанры и тепловая карта — из роллапа месяца;
+    топ, спорные фильмы, совместимость и списки — из строк месяца.
+    """
     cur = get_db_cursor()
     start_ts, end_ts = _month_range(month, year)
 
@@ -700,17 +1186,19 @@ def get_group_stats(chat_id, month, year):
     # Участники из ratings, watched_movies, series_tracking, plans
     user_ids = set()
     with db_lock:
-        for q in [
-            "SELECT DISTINCT user_id FROM ratings WHERE chat_id = %s",
-            "SELECT DISTINCT user_id FROM watched_movies WHERE chat_id = %s",
-            "SELECT DISTINCT user_id FROM series_tracking WHERE chat_id = %s AND watched = TRUE",
-            "SELECT DISTINCT user_id FROM plans WHERE chat_id = %s AND user_id IS NOT NULL",
-        ]:
-            cur.execute(q, (chat_id,))
-            for r in cur.fetchall():
-                uid = r.get('user_id') if isinstance(r, dict) else r[0]
-                if uid:
-                    user_ids.add(uid)
+        cur.execute("""
+            SELECT user_id FROM ratings WHERE chat_id = %s
+            UNION
+            SELECT user_id FROM watched_movies WHERE chat_id = %s
+            UNION
+            SELECT user_id FROM series_tracking WHERE chat_id = %s AND watched = TRUE
+            UNION
+            SELECT user_id FROM plans WHERE chat_id = %s AND user_id IS NOT NULL
+        """, (chat_id, chat_id, chat_id, chat_id))
+        for r in cur.fetchall():
+            uid = r.get('user_id') if isinstance(r, dict) else r[0]
+            if uid:
+                user_ids.add(uid)
     user_ids = list(user_ids)
     if not user_ids:
         return _empty_group_response(chat_id, group_title, month, year)
@@ -755,219 +1243,77 @@ def get_group_stats(chat_id, month, year):
         cnt_row = cur.fetchone()
         total_films = (cnt_row.get('count') if isinstance(cnt_row, dict) else cnt_row[0]) or 0
 
-    # watched_movies за месяц (фильмы + сериалы)
-    with db_lock:
-        cur.execute("""
-            SELECT wm.film_id, wm.user_id, m.kp_id, m.title, m.year, m.is_series, wm.watched_at, m.genres
-            FROM watched_movies wm
-            JOIN movies m ON m.id = wm.film_id AND m.chat_id = wm.chat_id
-            WHERE wm.chat_id = %s AND wm.watched_at >= %s AND wm.watched_at < %s
-        """, (chat_id, start_ts, end_ts))
-        wm_rows = cur.fetchall()
+    rollups = _get_month_rollups(chat_id, start_ts)
+    group_rollup = rollups.pop(ROLLUP_TOTAL_USER_ID, None) or _empty_rollup_row(ROLLUP_TOTAL_USER_ID)
 
-    # series_tracking за месяц
     with db_lock:
-        cur.execute("""
-            SELECT st.film_id, st.user_id, m.kp_id, m.title, m.year, m.is_series, st.watched_date, m.genres
-            FROM series_tracking st
-            JOIN movies m ON m.id = st.film_id AND m.chat_id = st.chat_id
-            WHERE st.chat_id = %s AND st.watched = TRUE
-              AND st.watched_date >= %s AND st.watched_date < %s
-        """, (chat_id, start_ts, end_ts))
-        st_rows = cur.fetchall()
+        wm_rows, st_rows, cinema_rows, ratings_in_month = _fetch_group_month(cur, chat_id, start_ts, end_ts)
 
-    # Cinema: cinema_screenings (постоянные) + plans (если ещё не удалены)
-    cinema_rows = []
-    with db_lock:
-        cur.execute("""
-            SELECT cs.film_id, cs.user_id, cs.screening_date, m.kp_id, m.title, m.year
-            FROM cinema_screenings cs
-            JOIN movies m ON m.id = cs.film_id AND m.chat_id = cs.chat_id
-            WHERE cs.chat_id = %s AND cs.screening_date >= %s AND cs.screening_date < %s
-        """, (chat_id, start_ts.date(), end_ts.date()))
-        cinema_rows = list(cur.fetchall())
-        cur.execute("""
-            SELECT p.film_id, p.user_id, p.plan_datetime::date, m.kp_id, m.title, m.year
-            FROM plans p
-            JOIN movies m ON m.id = p.film_id AND m.chat_id = p.chat_id
-            WHERE p.chat_id = %s AND p.plan_type = 'cinema'
-              AND p.plan_datetime >= %s AND p.plan_datetime < %s
-              AND NOT EXISTS (
-                SELECT 1 FROM cinema_screenings cs
-                WHERE cs.chat_id = p.chat_id AND cs.user_id = p.user_id AND cs.film_id = p.film_id
-              )
-        """, (chat_id, start_ts, end_ts))
-        for row in cur.fetchall():
-            cinema_rows.append(row)
-
-    # ratings за месяц (rated_at если есть). ТОЛЬКО группа: r.chat_id = группа, фильмы из базы группы.
-    with db_lock:
-        cur.execute("""
-            SELECT r.rating, r.user_id, r.film_id, r.rated_at, m.kp_id, m.title, m.year, m.genres, m.is_series
-            FROM ratings r
-            JOIN movies m ON m.id = r.film_id AND m.chat_id = r.chat_id
-            WHERE r.chat_id = %s
-        """, (chat_id,))
-        ratings_all = cur.fetchall()
-
-    # Фильтруем ratings строго по месяцу (rated_at). Без даты — не включаем (данные по группе только за месяц)
-    ratings_in_month = []
-    for r in ratings_all:
-        rt_at = r.get('rated_at') if isinstance(r, dict) else (r[3] if len(r) > 3 else None)
-        if rt_at is not None:
-            dt = _ensure_tz(rt_at)
-            if dt and start_ts <= dt < end_ts:
-                ratings_in_month.append(r)
-
-    # Агрегация: group_films (уникальные фильмы), group_series, group_episodes
-    # Оценка = просмотр: считаем ratings_in_month как просмотры
-    films_watched = set()  # film_id (не сериалы)
-    series_watched = set()
-    episodes_count = 0
-    uid_watched = defaultdict(int)
-    for r in wm_rows:
-        fid = r.get('film_id') if isinstance(r, dict) else r[0]
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        is_series = r.get('is_series') if isinstance(r, dict) else r[5]
-        if is_series:
-            series_watched.add(fid)
-            episodes_count += 1
-        else:
-            films_watched.add(fid)
-        uid_watched[uid] += 1
-    for r in st_rows:
-        fid = r.get('film_id') if isinstance(r, dict) else r[0]
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        is_series = r.get('is_series') if isinstance(r, dict) else r[4]
-        if is_series:
-            series_watched.add(fid)
-            episodes_count += 1
-        else:
-            films_watched.add(fid)
-        uid_watched[uid] += 1
-    # Оценка = просмотр: каждая оценка за месяц считается просмотром
-    for r in ratings_in_month:
-        fid = r.get('film_id') if isinstance(r, dict) else r[2]
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        is_series = r.get('is_series') if isinstance(r, dict) else (r[8] if len(r) > 8 else False)
-        if is_series:
-            series_watched.add(fid)
-        else:
-            films_watched.add(fid)
-        uid_watched[uid] += 1
+    # Счётчики участников за месяц (просмотры = watched_movies + series_tracking + оценки)
+    uid_watched = {uid: r['views'] for uid, r in rollups.items() if r.get('views')}
+    uid_rating_count = {uid: r['ratings_count'] for uid, r in rollups.items() if r.get('ratings_count')}
+    uid_rating_sum = {uid: r['rating_sum'] for uid, r in rollups.items() if r.get('ratings_count')}
+    uid_cinema = {uid: r['cinema_visits'] for uid, r in rollups.items() if r.get('cinema_visits')}
+    uid_genres = {uid: r['genres'] for uid, r in rollups.items() if r.get('genres')}
 
-    group_films_count = len(films_watched) + len(series_watched)
-
-    # Cinema count
-    uid_cinema = defaultdict(int)
-    for r in cinema_rows:
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        if uid:
-            uid_cinema[uid] += 1
-    group_cinema_count = len(cinema_rows)
-
-    # Ratings per user
-    uid_ratings = defaultdict(list)
-    for r in ratings_in_month:
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        rt = r.get('rating') if isinstance(r, dict) else r[0]
-        if uid and rt and 1 <= rt <= 10:
-            uid_ratings[uid].append(rt)
-
-    rating_breakdown = {str(i): 0 for i in range(1, 11)}
-    for r in ratings_in_month:
-        rt = r.get('rating') if isinstance(r, dict) else r[0]
-        if rt and 1 <= rt <= 10:
-            rating_breakdown[str(int(rt))] = rating_breakdown.get(str(int(rt)), 0) + 1
+    rating_breakdown = _rollup_rating_breakdown(group_rollup)
 
     summary = {
-        'group_films': group_films_count,
-        'group_ratings': len(ratings_in_month),
-        'group_cinema': group_cinema_count,
-        'group_series': len(series_watched),
-        'group_episodes': episodes_count,
+        'group_films': group_rollup.get('films_watched', 0) + group_rollup.get('series_watched', 0),
+        'group_ratings': group_rollup.get('ratings_count', 0),
+        'group_cinema': group_rollup.get('cinema_visits', 0),
+        'group_series': group_rollup.get('series_watched', 0),
+        'group_episodes': group_rollup.get('episodes_watched', 0),
         'active_members': len(user_ids)
     }
 
     # Leaderboard
-    lb_watched = [{'user_id': uid, 'count': c} for uid, c in sorted(uid_watched.items(), key=lambda x: -x[1])]
-    lb_ratings = [{'user_id': uid, 'count': len(rats)} for uid, rats in sorted(uid_ratings.items(), key=lambda x: -len(x[1]))]
+    lb_watched = [{'user_id': uid, 'count': c} for uid, c in sorted(uid_watched.items(), key=lambda x: (-x[1], x[0]))]
+    lb_ratings = [{'user_id': uid, 'count': c} for uid, c in sorted(uid_rating_count.items(), key=lambda x: (-x[1], x[0]))]
     lb_avg = []
-    for uid, rats in uid_ratings.items():
-        avg = round(sum(rats) / len(rats), 1) if rats else 0
+    for uid, cnt in uid_rating_count.items():
+        avg = round(uid_rating_sum[uid] / cnt, 1) if cnt else 0
         lb_avg.append({'user_id': uid, 'value': avg})
-    lb_avg.sort(key=lambda x: -x['value'])
-    lb_cinema = [{'user_id': uid, 'count': c} for uid, c in sorted(uid_cinema.items(), key=lambda x: -x[1])]
+    lb_avg.sort(key=lambda x: (-x['value'], x['user_id']))
+    lb_cinema = [{'user_id': uid, 'count': c} for uid, c in sorted(uid_cinema.items(), key=lambda x: (-x[1], x[0]))]
     leaderboard = {'watched': lb_watched, 'ratings': lb_ratings, 'avg_rating': lb_avg, 'cinema': lb_cinema}
 
     # MVP: кто больше всего смотрел + оценивал
     uid_activity = defaultdict(lambda: {'watched': 0, 'ratings': 0, 'rating_sum': 0})
     for uid, c in uid_watched.items():
         uid_activity[uid]['watched'] = c
-    for uid, rats in uid_ratings.items():
-        uid_activity[uid]['ratings'] = len(rats)
-        uid_activity[uid]['rating_sum'] = sum(rats)
+    for uid, cnt in uid_rating_count.items():
+        uid_activity[uid]['ratings'] = cnt
+        uid_activity[uid]['rating_sum'] = uid_rating_sum[uid]
     mvp_uid = None
     mvp_films = 0
     mvp_ratings = 0
     mvp_avg = 7.0
     if uid_activity:
-        mvp_uid = max(uid_activity, key=lambda u: (uid_activity[u]['watched'] + uid_activity[u]['ratings']))
+        mvp_uid = min(uid_activity, key=lambda u: (-(uid_activity[u]['watched'] + uid_activity[u]['ratings']), u))
         mvp_films = uid_activity[mvp_uid]['watched']
         mvp_ratings = uid_activity[mvp_uid]['ratings']
         if uid_activity[mvp_uid]['ratings']:
             mvp_avg = round(uid_activity[mvp_uid]['rating_sum'] / uid_activity[mvp_uid]['ratings'], 1)
 
-    # Все ачивки по spec
-    def _holder(cond, uid): return uid if cond else None
-    uid_series = defaultdict(int)
-    for r in st_rows:
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        uid_series[uid] += 1
-    uid_genres = defaultdict(set)
-    for r in wm_rows + st_rows:
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        g = r.get('genres') if isinstance(r, dict) else (r[7] if len(r) > 7 else None)
-        if g:
-            for gen in (g or '').split(','):
-                gen = gen.strip()
-                if gen:
-                    uid_genres[uid].add(gen)
-    # Киноман, Оценщик — уже есть mvp_uid. Остальные — ищем лучшего по условию
-    cinephile_uid = max(uid_watched.items(), key=lambda x: x[1])[0] if uid_watched and max(uid_watched.values()) >= 10 else None
-    rater_uid = max(uid_ratings.items(), key=lambda x: len(x[1]))[0] if uid_ratings and max(len(r) for r in uid_ratings.values()) >= 15 else None
-    cinema_uid = max(uid_cinema.items(), key=lambda x: x[1])[0] if uid_cinema and max(uid_cinema.values()) >= 3 else None
-    series_uid = max(uid_series.items(), key=lambda x: x[1])[0] if uid_series and max(uid_series.values()) >= 20 else None
-    strict_uid = None  # средняя < 7 при ≥5 оценках
-    for uid, rats in uid_ratings.items():
-        if len(rats) >= 5 and sum(rats) / len(rats) < 7:
-            strict_uid = uid
-            break
-    generous_uid = None  # средняя > 8 при ≥5 оценках
-    for uid, rats in uid_ratings.items():
-        if len(rats) >= 5 and sum(rats) / len(rats) > 8:
-            generous_uid = uid
-            break
-    polyglot_uid = max(uid_genres.items(), key=lambda x: len(x[1]))[0] if uid_genres and max(len(g) for g in uid_genres.values()) >= 5 else None
     # Первооткрыватель: добавил фильм в базу группы, все оценили ≥8 (за месяц)
-    discoverer_uid = None
-    film_ratings_for_discoverer = defaultdict(list)
-    for r in ratings_in_month:
-        fid = r.get('film_id') if isinstance(r, dict) else r[2]
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        rt = r.get('rating') if isinstance(r, dict) else r[0]
-        if fid and rt:
-            film_ratings_for_discoverer[fid].append({'user_id': uid, 'rating': rt})
-    for fid, rats in film_ratings_for_discoverer.items():
-        if len(rats) >= 2 and all(r['rating'] >= 8 for r in rats):
-            with db_lock:
-                cur.execute("SELECT added_by FROM movies WHERE id = %s AND chat_id = %s", (fid, chat_id))
-                row = cur.fetchone()
-            if row:
-                ab = row.get('added_by') if isinstance(row, dict) else row[0]
-                if ab:
-                    discoverer_uid = ab
-                    break
+    discovered_by = {}
+    discoverer_fids = _discoverer_film_ids(ratings_in_month)
+    if discoverer_fids:
+        with db_lock:
+            cur.execute("SELECT id, added_by FROM movies WHERE chat_id = %s AND id = ANY(%s)", (chat_id, discoverer_fids))
+            for row in cur.fetchall():
+                fid = row.get('id') if isinstance(row, dict) else row[0]
+                discovered_by[fid] = row.get('added_by') if isinstance(row, dict) else row[1]
+    holders = _group_achievement_holders(rollups, discovered_by)
+    cinephile_uid = holders['cinephile']
+    strict_uid = holders['strict_critic']
+    cinema_uid = holders['frequent_goer']
+    generous_uid = holders['generous']
+    series_uid = holders['binge_watcher']
+    rater_uid = holders['rater']
+    polyglot_uid = holders['polyglot']
+    discoverer_uid = holders['discoverer']
     achievements = [
         {'id': 'cinephile', 'icon': '🎬', 'name': 'Киноман', 'description': 'Посмотрел 10+ фильмов за месяц',
          'holder_user_id': cinephile_uid, 'earned': cinephile_uid is not None},
@@ -1016,6 +1362,13 @@ def get_group_stats(chat_id, month, year):
     # Кино: (film_id, user_id) для бейджа
     cinema_film_user = {(r.get('film_id') if isinstance(r, dict) else r[0], r.get('user_id') if isinstance(r, dict) else r[1]) for r in cinema_rows}
 
+    # Первая оценка месяца по (фильм, участник) и по фильму — для списков
+    film_user_rating = {}
+    film_rating = {}
+    for r in ratings_in_month:
+        film_user_rating.setdefault((r.get('film_id'), r.get('user_id')), r.get('rating'))
+        film_rating.setdefault(r.get('film_id'), r.get('rating'))
+
     # Watched list для группы (всё просмотренное за месяц)
     watched_list = []
     seen = set()
@@ -1024,7 +1377,7 @@ def get_group_stats(chat_id, month, year):
         if key in seen:
             return
         seen.add(key)
-        rating = next((r.get('rating') for r in ratings_in_month if r.get('film_id') == fid and r.get('user_id') == uid), None)
+        rating = film_user_rating.get((fid, uid))
         is_cinema = (fid, uid) in cinema_film_user
         watched_list.append({
             'film_id': fid, 'kp_id': kp_id, 'title': title, 'year': year_val,
@@ -1080,7 +1433,7 @@ def get_group_stats(chat_id, month, year):
         title = r.get('title') if isinstance(r, dict) else r[4]
         year = r.get('year') if isinstance(r, dict) else r[5]
         date_str = dt.strftime('%Y-%m-%d') if hasattr(dt, 'strftime') else str(dt)[:10]
-        rating = next((x.get('rating') for x in ratings_in_month if x.get('film_id') == fid), None)
+        rating = film_rating.get(fid)
         cinema_list.append({'film_id': fid, 'kp_id': kp_id, 'title': title, 'year': year, 'date': date_str, 'rating': rating})
 
     # Controversial: фильмы с ≥3 оценками, max spread
@@ -1121,14 +1474,9 @@ def get_group_stats(chat_id, month, year):
 
     # Genres: по жанрам, сколько каждый участник посмотрел
     genre_by_user = defaultdict(lambda: defaultdict(int))
-    for r in wm_rows + st_rows:
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        g = r.get('genres') if isinstance(r, dict) else (r[7] if len(r) > 7 else None)
-        if g:
-            for gen in (g or '').split(','):
-                gen = gen.strip()
-                if gen:
-                    genre_by_user[gen][uid] += 1
+    for uid, user_genres in uid_genres.items():
+        for gen, cnt in user_genres.items():
+            genre_by_user[gen][uid] += cnt
     genres = []
     for genre, by_mem in sorted(genre_by_user.items(), key=lambda x: -sum(x[1].values())):
         genres.append({
@@ -1138,29 +1486,10 @@ def get_group_stats(chat_id, month, year):
     genres = genres[:8]
 
     # Heatmap: день -> {user_id: count}
-    heatmap = defaultdict(lambda: defaultdict(int))
-    for r in wm_rows:
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        dt = r.get('watched_at') if isinstance(r, dict) else r[6]
-        if dt:
-            d = getattr(dt, 'day', None) or (int(str(dt)[8:10]) if len(str(dt)) >= 10 else None)
-            if d:
-                heatmap[str(d)][str(uid)] = heatmap[str(d)].get(str(uid), 0) + 1
-    for r in st_rows:
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        dt = r.get('watched_date') if isinstance(r, dict) else r[6]
-        if dt:
-            d = getattr(dt, 'day', None) or (int(str(dt)[8:10]) if len(str(dt)) >= 10 else None)
-            if d:
-                heatmap[str(d)][str(uid)] = heatmap[str(d)].get(str(uid), 0) + 1
-    for r in ratings_in_month:
-        uid = r.get('user_id') if isinstance(r, dict) else r[1]
-        rt_at = r.get('rated_at') if isinstance(r, dict) else (r[3] if len(r) > 3 else None)
-        if rt_at:
-            dt = _ensure_tz(rt_at)
-            if dt:
-                d = dt.day
-                heatmap[str(d)][str(uid)] = heatmap[str(d)].get(str(uid), 0) + 1
+    heatmap = defaultdict(dict)
+    for uid, r in rollups.items():
+        for day, cnt in (r.get('activity') or {}).items():
+            heatmap[day][str(uid)] = cnt
     heatmap = dict(heatmap)
 
     # public_slug из group_stats_settings
@@ -1312,6 +1641,7 @@ def set_user_stats_settings(user_id, public_enabled=None, visible_blocks=None):
                 (public_enabled, bool(public_enabled), slug, json.dumps(vb), user_id)
             )
         get_db_connection().commit()
+    get_share_response_cache().invalidate_chat(user_id)
     return get_user_stats_settings(user_id)
 
 
@@ -1387,25 +1717,17 @@ def set_group_stats_settings(chat_id, public_enabled=None, visible_blocks=None):
                 (public_enabled, bool(public_enabled), slug, chat_id)
             )
         conn.commit()
+    get_share_response_cache().invalidate_chat(chat_id)
     return get_group_stats_settings(chat_id)
 
 
 def increment_stats_share_view(slug, stats_type, month, year):
-    """Увеличивает счётчик просмотров ссылки на публичную статистику."""
-    cur = get_db_cursor()
-    with db_lock:
-        cur.execute("""
-            INSERT INTO stats_share_views (slug, stats_type, month, year, view_count, updated_at)
-            VALUES (%s, %s, %s, %s, 1, NOW())
-            ON CONFLICT (slug, stats_type, month, year)
-            DO UPDATE SET view_count = stats_share_views.view_count + 1, updated_at = NOW()
-        """, (slug, stats_type, month, year))
-        conn = get_db_connection()
-        conn.commit()
+    """Учитывает просмотр ссылки на публичную статистику (копится в памяти, в БД пишется пачкой)."""
+    get_share_view_counter().add(slug, stats_type, month, year)
 
 
 def get_stats_share_view_count(slug, stats_type, month, year):
-    """Возвращает количество переходов по ссылке за месяц."""
+    """Возвращает количество переходов по ссылке за месяц (записанные + ещё не сброшенные)."""
     cur = get_db_cursor()
     with db_lock:
         cur.execute(
@@ -1413,30 +1735,35 @@ def get_stats_share_view_count(slug, stats_type, month, year):
             (slug, stats_type, month, year)
         )
         row = cur.fetchone()
+    pending = get_share_view_counter().pending(slug, stats_type, month, year)
     if not row:
-        return 0
-    return row.get('view_count', 0) if isinstance(row, dict) else (row[0] or 0)
+        return pending
+    return (row.get('view_count', 0) if isinstance(row, dict) else (row[0] or 0)) + pending
 
 
-def get_public_personal_stats(slug, month, year):
-    """Публичная личная статистика по slug. Без авторизации."""
+def _public_share_target(stats_type, slug):
+    """(chat_id, visible_blocks, err) публичной ссылки: stats_type 'user' или 'group'."""
+    table, id_col = ('user_stats_settings', 'user_id') if stats_type == 'user' else ('group_stats_settings', 'chat_id')
     cur = get_db_cursor()
     with db_lock:
         cur.execute(
-            "SELECT user_id, public_enabled, visible_blocks FROM user_stats_settings WHERE public_slug = %s",
+            f"SELECT {id_col}, public_enabled, visible_blocks FROM {table} WHERE public_slug = %s",
             (slug,)
         )
         row = cur.fetchone()
     if not row:
-        return None, 'User not found'
-    user_id = row.get('user_id') if isinstance(row, dict) else row[0]
+        return None, None, 'User not found' if stats_type == 'user' else 'Group not found'
+    target_id = row.get(id_col) if isinstance(row, dict) else row[0]
     public_enabled = row.get('public_enabled') if isinstance(row, dict) else row[1]
     if not public_enabled:
-        return None, 'Stats are private'
+        return None, None, 'Stats are private'
     vb = row.get('visible_blocks') if isinstance(row, dict) else row[2]
     if isinstance(vb, str):
-        import json
         vb = json.loads(vb) if vb else {}
+    return target_id, vb, None
+
+
+def _build_public_personal_stats(slug, user_id, vb, month, year):
     vb = vb or {
         'summary': True, 'top_films': True, 'rating_breakdown': True,
         'cinema': True, 'platforms': True, 'watched_list': True
@@ -1457,6 +1784,7 @@ def get_public_personal_stats(slug, month, year):
     if not vb.get('watched_list', True):
         data['watched'] = []
     # Имя пользователя
+    cur = get_db_cursor()
     with db_lock:
         cur.execute("SELECT name FROM site_sessions WHERE chat_id = %s ORDER BY created_at DESC LIMIT 1", (user_id,))
         srow = cur.fetchone()
@@ -1468,6 +1796,15 @@ def get_public_personal_stats(slug, month, year):
         username = '@' + username
     data['user'] = {'name': name or slug, 'username': username or slug}
     data['success'] = True
+    return data
+
+
+def get_public_personal_stats(slug, month, year):
+    """Публичная личная статистика по slug. Без авторизации."""
+    user_id, vb, err = _public_share_target('user', slug)
+    if err:
+        return None, err
+    data = _build_public_personal_stats(slug, user_id, vb, month, year)
     try:
         increment_stats_share_view(slug, 'user', month, year)
     except Exception:
@@ -1525,23 +1862,58 @@ def get_stats_debug(chat_id, month, year, is_personal=True):
     return out
 
 
-def get_public_group_stats(slug, month, year):
-    """Публичная групповая статистика по slug."""
-    conn = get_db_connection()
-    cur = get_db_cursor()
-    with db_lock:
-        cur.execute("SELECT chat_id, public_enabled, visible_blocks FROM group_stats_settings WHERE public_slug = %s", (slug,))
-        row = cur.fetchone()
-    if not row:
-        return None, 'Group not found'
-    chat_id = row.get('chat_id') if isinstance(row, dict) else row[0]
-    public_enabled = row.get('public_enabled') if isinstance(row, dict) else row[1]
-    if not public_enabled:
-        return None, 'Stats are private'
+def _build_public_group_stats(slug, chat_id, month, year):
     data = get_group_stats(chat_id, month, year)
     data['group']['public_slug'] = slug
+    return data
+
+
+def get_public_group_stats(slug, month, year):
+    """Публичная групповая статистика по slug."""
+    chat_id, _, err = _public_share_target('group', slug)
+    if err:
+        return None, err
+    data = _build_public_group_stats(slug, chat_id, month, year)
     try:
         increment_stats_share_view(slug, 'group', month, year)
     except Exception:
         pass
     return data, None
+
+
+def get_public_stats_response(stats_type, slug, month, year, render):
+    """
+    Готовый ответ публичной страницы статистики ('user' или 'group') из ShareResponseCache:
+    (CachedShareResponse, None) или (None, err). render(data) -> bytes сериализует данные
+    при промахе. Просмотр учитывается и для ответа из кэша.
+    """
+    err = None
+
+    def build():
+        nonlocal err
+        target_id, vb, err = _public_share_target(stats_type, slug)
+        if err:
+            return None
+        start_ts, _ = _month_range(month, year)
+        scope = ShareScope(target_id, start_ts.date(), stats_type == 'user')
+        cache = get_share_response_cache()
+        try:
+            versions = cache.load_versions(scope)
+        except Exception as e:
+            # Без версий ответ не кэшируется надолго: следующая сверка не совпадёт
+            logger.warning(f"[STATS SHARE] Версии роллапа для {scope} не прочитаны: {e}")
+            versions = None
+        if stats_type == 'user':
+            data = _build_public_personal_stats(slug, target_id, vb, month, year)
+        else:
+            data = _build_public_group_stats(slug, target_id, month, year)
+        return scope, versions, render(data)
+
+    entry = get_share_response_cache().get_or_build((stats_type, slug, month, year), build)
+    if entry is None:
+        return None, err or 'Stats are private'
+    try:
+        increment_stats_share_view(slug, stats_type, month, year)
+    except Exception:
+        pass
+    return entry, None
@@ -0,0 +1,268 @@
+"""
+Кэш ответов публичных страниц статистики и счётчик просмотров ссылок.
+
+/api/site/stats/public/<username> и /api/site/group-stats/public/<slug> открывают сразу
+много людей, когда ссылку присылают в большой чат. Раньше каждый переход пересчитывал
+статистику целиком и делал UPSERT в stats_share_views.
+
+- ответ (готовое JSON-тело) хранится по (тип, slug, месяц, год) вместе со strong ETag;
+  повторный запрос с If-None-Match получает 304 без тела;
+- в течение ttl ответ отдаётся без обращения к БД; после — одним запросом сверяются версии
+  роллапов (stats_rollup_state / stats_profile_rollups), которые триггеры повышают на каждый
+  просмотр, оценку, серию и поход в кино; при совпадении ответ продлевается, иначе пересчитывается;
+- старше max_age ответ пересчитывается в любом случае (имена, планы и прочее вне роллапов);
+- одновременные промахи по одному ключу схлопываются в один пересчёт;
+- просмотры копятся в памяти и пишутся одним многострочным UPSERT раз в flush_interval секунд.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from psycopg2.extras import execute_values
+
+from moviebot.config import (
+    STATS_SHARE_CACHE_TTL, STATS_SHARE_CACHE_MAX_AGE, STATS_SHARE_CACHE_MAX_ENTRIES,
+    STATS_SHARE_VIEWS_FLUSH_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Чьи данные в ответе: chat_id, первый день месяца и личная ли это статистика
+ShareScope = namedtuple('ShareScope', ('chat_id', 'month_start', 'personal'))
+
+
+class CachedShareResponse:
+    __slots__ = ('body', 'etag', 'scope', 'versions', 'created_at', 'checked_at')
+
+    def __init__(self, body, scope, versions, now):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.scope = scope
+        self.versions = versions
+        self.created_at = now
+        self.checked_at = now
+
+
+def load_share_versions(scope):
+    """Версии роллапа месяца и профиля (для личной статистики) — одним запросом"""
+    from moviebot.database.db_connection import db_connection
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT (SELECT version FROM stats_rollup_state WHERE chat_id = %s AND month = %s) AS month_version,
+                   (SELECT version FROM stats_profile_rollups WHERE user_id = %s) AS profile_version
+        """, (scope.chat_id, scope.month_start, scope.chat_id if scope.personal else None))
+        row = cur.fetchone()
+    return row['month_version'], row['profile_version']
+
+
+class ShareResponseCache:
+    """LRU готовых ответов публичных страниц статистики с TTL и сверкой версий роллапов"""
+
+    def __init__(self, ttl=STATS_SHARE_CACHE_TTL, max_age=STATS_SHARE_CACHE_MAX_AGE,
+                 max_entries=STATS_SHARE_CACHE_MAX_ENTRIES, load_versions=load_share_versions,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_entries = max(1, max_entries)
+        self.load_versions = load_versions
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> CachedShareResponse
+        self._lock = threading.Lock()
+        self._build_locks = {}  # key -> [Lock, число ожидающих]
+        self._counters = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stale': 0, 'invalidated': 0, 'errors': 0}
+
+    def get(self, key):
+        """Свежий ответ по ключу либо None (нет, устарел или версии роллапа изменились)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            now = self._clock()
+            if now - entry.created_at >= self.max_age:
+                self._drop(key, entry, 'stale')
+                return None
+            if now - entry.checked_at < self.ttl:
+                self._counters['hits'] += 1
+                return entry
+        try:
+            versions = self.load_versions(entry.scope)
+        except Exception as e:
+            logger.warning(f"[STATS SHARE] Не удалось сверить версии {key}: {e}")
+            with self._lock:
+                self._counters['errors'] += 1
+            return None
+        with self._lock:
+            if versions != entry.versions:
+                self._drop(key, entry, 'stale')
+                return None
+            entry.checked_at = self._clock()
+            self._counters['revalidated'] += 1
+        return entry
+
+    def put(self, key, scope, versions, body):
+        """Кладёт готовое тело ответа; versions — прочитанные ДО расчёта данных"""
+        entry = CachedShareResponse(body, scope, versions, self._clock())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get_or_build(self, key, build):
+        """
+        Ответ из кэша либо build() -> (scope, versions, body) | None под замком ключа:
+        одновременные промахи по одному ключу ждут первого и получают его результат.
+        None от build (нет такой ссылки, статистика закрыта) не кэшируется.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            slot = self._build_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                entry = self.get(key)
+                if entry is not None:
+                    return entry
+                with self._lock:
+                    self._counters['misses'] += 1
+                built = build()
+                if built is None:
+                    return None
+                return self.put(key, *built)
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    self._build_locks.pop(key, None)
+
+    def invalidate_chat(self, chat_id):
+        """Сбрасывает все ответы чата (смена настроек публичности, slug, видимых блоков)"""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if e.scope.chat_id == chat_id]
+            for key in keys:
+                self._drop(key, self._entries[key], 'invalidated')
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _drop(self, key, entry, reason):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        self._counters[reason] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), max_entries=self.max_entries)
+
+
+def write_view_counts_to_db(counts):
+    """Один многострочный UPSERT накопленных просмотров: {(slug, stats_type, month, year): n}"""
+    from moviebot.database.db_connection import db_connection
+    with db_connection() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO stats_share_views (slug, stats_type, month, year, view_count, updated_at)
+            VALUES %s
+            ON CONFLICT (slug, stats_type, month, year)
+            DO UPDATE SET view_count = stats_share_views.view_count + EXCLUDED.view_count, updated_at = NOW()
+        """, [key + (n,) for key, n in counts.items()], template='(%s, %s, %s, %s, %s, NOW())')
+
+
+class ShareViewCounter:
+    """Просмотры публичных ссылок в памяти с фоновым сбросом в stats_share_views"""
+
+    def __init__(self, flush_interval=STATS_SHARE_VIEWS_FLUSH_INTERVAL, write_counts=write_view_counts_to_db,
+                 start_thread=True):
+        self.flush_interval = flush_interval
+        self._write_counts = write_counts
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pending = {}
+        self._stats = {'views': 0, 'written': 0, 'flushes': 0, 'errors': 0}
+        self._thread = None
+        if start_thread:
+            self._thread = threading.Thread(target=self._run, name='share-view-counter', daemon=True)
+            self._thread.start()
+
+    def add(self, slug, stats_type, month, year, n=1):
+        key = (slug, stats_type, int(month), int(year))
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + n
+            self._stats['views'] += n
+
+    def pending(self, slug, stats_type, month, year):
+        """Просмотры, ещё не записанные в БД"""
+        with self._lock:
+            return self._pending.get((slug, stats_type, int(month), int(year)), 0)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Пишет накопленное; при ошибке возвращает счётчики обратно. Возвращает число записанных ключей"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._pending = self._pending, {}
+            if not counts:
+                return 0
+            try:
+                self._write_counts(counts)
+            except Exception as e:
+                logger.error(f"[STATS SHARE] Ошибка записи просмотров ({len(counts)} ссылок): {e}", exc_info=True)
+                with self._lock:
+                    for key, n in counts.items():
+                        self._pending[key] = self._pending.get(key, 0) + n
+                    self._stats['errors'] += 1
+                return 0
+            with self._lock:
+                self._stats['written'] += len(counts)
+                self._stats['flushes'] += 1
+            return len(counts)
+
+    def shutdown(self, timeout=5.0):
+        """Останавливает фоновый поток и записывает остаток"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending))
+
+
+_cache = None
+_counter = None
+_init_lock = threading.Lock()
+
+
+def get_share_response_cache():
+    global _cache
+    if _cache is None:
+        with _init_lock:
+            if _cache is None:
+                _cache = ShareResponseCache()
+    return _cache
+
+
+def get_share_view_counter():
+    """Глобальный счётчик просмотров (создаётся при первом обращении, сбрасывается при выходе)"""
+    global _counter
+    if _counter is None:
+        with _init_lock:
+            if _counter is None:
+                _counter = ShareViewCounter()
+                atexit.register(_counter.shutdown)
+    return _counter
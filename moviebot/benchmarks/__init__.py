@@ -0,0 +1,3 @@
+"""
+Бенчмарки производительности (запускаются вручную, в тесты не входят)
+"""
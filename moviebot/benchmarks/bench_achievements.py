@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: проверка ачивок после действия пользователя (notify_new_achievements).
+
+Строит личные чаты --users пользователей с многолетней историей (как bench_site_stats),
+затем на каждую новую оценку замеряет:
+  - «профиль целиком» — прежний путь: _get_user_profile_and_achievements (профиль устарел
+    после оценки и пересчитывается) + отдельный SELECT settings на каждую полученную ачивку;
+  - «движок» — evaluate_user: строка stats_profile_rollups, пересчёт одним запросом только
+    если триггеры пометили её устаревшей, и проверка порогов в памяти.
+После замеров прогоняет случайные вставки/удаления/изменения по всем таблицам-источникам
+и сверяет строку профиля с пересчётом из истории (_compute_user_profile_counters).
+
+Запуск (нужен локальный PostgreSQL; таблицы статистики и stats_profile_rollups ОЧИЩАЮТСЯ):
+    python -m moviebot.benchmarks.bench_achievements --dsn postgresql://postgres@localhost/moviebot_bench \\
+        --users 5 --films 1500 --events 50
+"""
+import argparse
+import random
+import time
+
+from moviebot.benchmarks.common import prepare_env, format_latencies
+
+USER_BASE = 7000000
+
+
+def old_check(user_id):
+    """Прежний notify_new_achievements до отправки: профиль + was_sent на каждую ачивку"""
+    from moviebot.api.site_stats import _get_user_profile_and_achievements
+    from moviebot.database.db_connection import db_connection
+    _, achievements = _get_user_profile_and_achievements(user_id)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        for ach in achievements:
+            if ach.get('earned'):
+                cur.execute("SELECT value FROM settings WHERE chat_id = %s AND key = %s",
+                            (user_id, f"achievement_notified_{ach.get('id')}"))
+                cur.fetchone()
+
+
+def rate_new_film(conn, user_id, rng):
+    """Оценка ещё не оценённого фильма (триггеры помечают профиль и счётчики)"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT m.id FROM movies m
+        WHERE m.chat_id = %s AND NOT EXISTS (
+            SELECT 1 FROM ratings r WHERE r.chat_id = m.chat_id AND r.film_id = m.id AND r.user_id = %s)
+        ORDER BY random() LIMIT 1
+    """, (user_id, user_id))
+    row = cur.fetchone()
+    if row:
+        cur.execute("INSERT INTO ratings (chat_id, film_id, user_id, rating) VALUES (%s, %s, %s, %s)",
+                    (user_id, row['id'], user_id, rng.randint(1, 10)))
+    conn.commit()
+
+
+def random_change(conn, user_id, rng):
+    """Случайное изменение в одной из таблиц-источников счётчиков"""
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM movies WHERE chat_id = %s ORDER BY random() LIMIT 1", (user_id,))
+    film_id = cur.fetchone()['id']
+    op = rng.choice(['rate', 'unrate', 'watch', 'unwatch', 'cinema', 'uncinema', 'plan', 'unplan',
+                     'episode', 'unepisode', 'is_series', 'mvp', 'mvp_move', 'rerate'])
+    if op == 'rate':
+        cur.execute("""
+            INSERT INTO ratings (chat_id, film_id, user_id, rating, rated_at)
+            VALUES (%s, %s, %s, 7, NOW() - random() * INTERVAL '900 days') ON CONFLICT DO NOTHING
+        """, (user_id, film_id, user_id))
+    elif op == 'unrate':
+        cur.execute("DELETE FROM ratings WHERE chat_id = %s AND film_id = %s AND user_id = %s",
+                    (user_id, film_id, user_id))
+    elif op == 'rerate':
+        cur.execute("UPDATE ratings SET rated_at = NOW() - INTERVAL '1 day' WHERE chat_id = %s AND film_id = %s",
+                    (user_id, film_id))
+    elif op == 'watch':
+        cur.execute("INSERT INTO watched_movies (chat_id, film_id, user_id, watched_at) "
+                    "VALUES (%s, %s, %s, NOW() - random() * INTERVAL '900 days') ON CONFLICT DO NOTHING",
+                    (user_id, film_id, user_id))
+    elif op == 'unwatch':
+        cur.execute("DELETE FROM watched_movies WHERE chat_id = %s AND film_id = %s", (user_id, film_id))
+    elif op == 'cinema':
+        cur.execute("INSERT INTO cinema_screenings (chat_id, user_id, film_id, screening_date) "
+                    "VALUES (%s, %s, %s, CURRENT_DATE) ON CONFLICT DO NOTHING", (user_id, user_id, film_id))
+    elif op == 'uncinema':
+        cur.execute("DELETE FROM cinema_screenings WHERE chat_id = %s AND film_id = %s", (user_id, film_id))
+    elif op == 'plan':
+        cur.execute("INSERT INTO plans (chat_id, film_id, plan_type, plan_datetime, user_id) "
+                    "VALUES (%s, %s, 'home', NOW(), %s)", (user_id, film_id, user_id))
+    elif op == 'unplan':
+        cur.execute("DELETE FROM plans WHERE id = (SELECT MIN(id) FROM plans WHERE user_id = %s)", (user_id,))
+    elif op == 'episode':
+        cur.execute("""
+            INSERT INTO series_tracking (chat_id, film_id, user_id, season_number, episode_number, watched, watched_date)
+            VALUES (%s, %s, %s, 9, %s, TRUE, NOW()) ON CONFLICT DO NOTHING
+        """, (user_id, film_id, user_id, rng.randint(1, 30)))
+    elif op == 'unepisode':
+        cur.execute("DELETE FROM series_tracking WHERE chat_id = %s AND film_id = %s AND season_number = 1",
+                    (user_id, film_id))
+    elif op == 'is_series':
+        cur.execute("UPDATE movies SET is_series = 1 - COALESCE(is_series, 0) WHERE id = %s", (film_id,))
+    elif op == 'mvp':
+        cur.execute("INSERT INTO mvp_history (chat_id, user_id, year, month) VALUES (%s, %s, %s, %s) "
+                    "ON CONFLICT (chat_id, year, month) DO UPDATE SET user_id = EXCLUDED.user_id",
+                    (-1, user_id, rng.randint(2000, 2030), rng.randint(1, 12)))
+    elif op == 'mvp_move':
+        cur.execute("UPDATE mvp_history SET user_id = %s WHERE ctid = (SELECT ctid FROM mvp_history "
+                    "WHERE user_id <> %s LIMIT 1)", (user_id, user_id))
+    conn.commit()
+    return op
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--films', type=int, default=1500)
+    parser.add_argument('--months', type=int, default=36)
+    parser.add_argument('--events', type=int, default=50, help='Оценок на замер')
+    parser.add_argument('--changes', type=int, default=300, help='Случайных изменений для сверки')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    from moviebot.database.db_connection import init_database, db_connection
+    from moviebot.benchmarks.bench_site_stats import generate, reset
+    from moviebot.api.site_stats import _compute_user_profile_counters
+    from moviebot.services.achievement_engine import COUNTERS, evaluate_user
+
+    rng = random.Random(args.seed)
+    init_database()
+    user_ids = [USER_BASE + i for i in range(args.users)]
+    with db_connection() as conn:
+        reset(conn)
+        conn.cursor().execute('TRUNCATE stats_profile_rollups, mvp_history')
+        conn.commit()
+        for i, user_id in enumerate(user_ids):
+            rows = generate(conn, user_id, 1, args.films, args.months, args.seed + i)
+    print(f"Пользователей: {args.users}, личный чат: {rows}")
+
+    for user_id in user_ids:
+        evaluate_user(user_id)  # первая проверка строит строку профиля из истории
+
+    samples_old, samples_new = [], []
+    with db_connection() as conn:
+        for n in range(args.events):
+            user_id = user_ids[n % len(user_ids)]
+            rate_new_film(conn, user_id, rng)
+            started = time.perf_counter()
+            old_check(user_id)
+            samples_old.append(time.perf_counter() - started)
+            rate_new_film(conn, user_id, rng)
+            started = time.perf_counter()
+            evaluate_user(user_id)
+            samples_new.append(time.perf_counter() - started)
+    print(format_latencies('профиль целиком', samples_old))
+    print(format_latencies('движок', samples_new))
+
+    ops = {}
+    with db_connection() as conn:
+        for n in range(args.changes):
+            user_id = rng.choice(user_ids)
+            op = random_change(conn, user_id, rng)
+            ops[op] = ops.get(op, 0) + 1
+            if rng.random() < 0.3:
+                evaluate_user(user_id)
+    for user_id in user_ids:
+        evaluate_user(user_id)
+    drift = {}
+    with db_connection() as conn:
+        cur = conn.cursor()
+        for user_id in user_ids:
+            cur.execute("SELECT * FROM stats_profile_rollups WHERE user_id = %s", (user_id,))
+            row = cur.fetchone()
+            expected = _compute_user_profile_counters(cur, user_id)
+            diff = [name for name in COUNTERS if row[name] != expected[name]]
+            if diff:
+                drift[user_id] = diff
+    print(f"Случайных изменений: {ops}")
+    print(f"Расхождение строки профиля с историей: {drift or 'нет'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Оценка ANN-индексов Шазама: recall@k и задержка против точного IndexFlatL2.
+
+Векторы берутся из data/shazam/tmdb_index.faiss (если есть), иначе генерируются
+кластеризованные синтетические эмбеддинги той же размерности (384, MiniLM).
+Запросы — случайные векторы базы с шумом (похоже на перефразированное описание).
+Для IVF перебираются nprobe, для HNSW — efSearch.
+
+Запуск:
+    python -m moviebot.benchmarks.bench_ann_index --vectors 20000 --queries 200 --k 75
+"""
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+
+from moviebot.benchmarks.common import percentile
+from moviebot.services.ann_index import create_index, default_params
+
+FLAT_PATH = 'data/shazam/tmdb_index.faiss'
+
+
+def load_vectors(path, count, dim, seed):
+    if os.path.exists(path):
+        flat = faiss.read_index(path)
+        print(f"Векторы: {path}, {flat.ntotal} x {flat.d}")
+        return flat.reconstruct_n(0, flat.ntotal)
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 200), dim)).astype('float32')
+    labels = rng.integers(0, len(centers), size=count)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(count, dim)).astype('float32')
+    print(f"Векторы: синтетические, {count} x {dim}")
+    return vectors.astype('float32')
+
+
+def make_queries(vectors, count, seed):
+    rng = np.random.default_rng(seed + 1)
+    picked = vectors[rng.integers(0, len(vectors), size=count)]
+    return (picked + 0.2 * rng.normal(size=picked.shape)).astype('float32')
+
+
+def index_bytes(index):
+    return len(faiss.serialize_index(index))
+
+
+def evaluate(index, queries, truth, k):
+    latencies = []
+    found = 0
+    for q, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found += len(set(ids[0].tolist()) & set(expected.tolist()))
+    return found / truth.size, percentile(latencies, 50), percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flat', default=FLAT_PATH)
+    parser.add_argument('--vectors', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=75, help='search_k в search_movies при top_k=15')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.flat, args.vectors, args.dim, args.seed)
+    queries = make_queries(vectors, args.queries, args.seed)
+    n, dim = vectors.shape
+
+    flat = create_index('flat', vectors, {})
+    _, truth = flat.search(queries, args.k)
+    recall, p50, p99 = evaluate(flat, queries, truth, args.k)
+    print(f"{'тип':<10} {'параметры':<44} {'recall@k':>8} {'p50 мс':>8} {'p99 мс':>8} {'память МБ':>10} {'сборка с':>9}")
+    print(f"{'flat':<10} {'-':<44} {recall:8.3f} {p50:8.2f} {p99:8.2f} {index_bytes(flat) / 1e6:10.1f} {0:9.1f}")
+
+    for index_type in ('ivf_flat', 'ivf_pq', 'hnsw'):
+        params = default_params(index_type, n, dim)
+        started = time.perf_counter()
+        index = create_index(index_type, vectors, params)
+        build_seconds = time.perf_counter() - started
+        size_mb = index_bytes(index) / 1e6
+        if index_type == 'hnsw':
+            sweep = [('ef_search', value) for value in (32, 64, 128, 256)]
+        else:
+            sweep = [('nprobe', value) for value in (4, 8, 16, 32, 64) if value <= params['nlist']]
+        for key, value in sweep:
+            if key == 'nprobe':
+                index.nprobe = value
+            else:
+                index.hnsw.efSearch = value
+            recall, p50, p99 = evaluate(index, queries, truth, args.k)
+            label = ', '.join(f"{k}={v}" for k, v in dict(params, **{key: value}).items())
+            print(f"{index_type:<10} {label:<44} {recall:8.3f} {p50:8.2f} {p99:8.2f} {size_mb:10.1f} {build_seconds:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: отбор чатов и рассылка пятничного напоминания о выходных (check_weekend_schedule).
+
+Строит --chats чатов (часть — группы) с фильмами, частью отключённых напоминаний,
+уведомлений на этой неделе и домашних планов на выходные, затем замеряет:
+  - «по чатам» — прежний путь: на каждый чат get_random_events_enabled,
+    was_event_sent_this_week, настройка отключения, get_notification_settings, дата прошлого
+    напоминания и COUNT планов (замер на --sample чатах, итог пересчитан на все);
+  - «одним запросом» — weekend_schedule_candidates;
+  - рассылку через Broadcaster с имитацией sendMessage (--latency, доля 429 и 403) на
+    --send чатах и оценку dry_run для всех чатов и для 50 000.
+
+Запуск (нужен локальный PostgreSQL; данные чатов бенчмарка удаляются и создаются заново):
+    python -m moviebot.benchmarks.bench_broadcast --chats 50000 --sample 1000 --send 300
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from moviebot.benchmarks.common import prepare_env
+
+CHAT_BASE = 8000000000
+
+
+def seed(conn, chats, now, rng):
+    cur = conn.cursor()
+    low, high = CHAT_BASE, CHAT_BASE + chats
+    for table in ('movies', 'settings', 'event_notifications', 'plans'):
+        cur.execute(f"DELETE FROM {table} WHERE chat_id BETWEEN %s AND %s OR chat_id BETWEEN %s AND %s",
+                    (low, high, -high, -low))
+    # Каждый пятый чат — группа (отрицательный chat_id)
+    chat_ids = [(-1 if n % 5 == 0 else 1) * (CHAT_BASE + n) for n in range(chats)]
+    cur.execute('''
+        INSERT INTO movies (chat_id, link, kp_id, title, watched)
+        SELECT c, 'https://www.kinopoisk.ru/film/' || f || '/', f::text, 'bench', 0
+        FROM unnest(%s::bigint[]) AS c, generate_series(1, 3) AS f
+    ''', (chat_ids,))
+    monday = (now - timedelta(days=now.weekday())).date()
+    settings, events, plans = [], [], []
+    for chat_id in chat_ids:
+        roll = rng.random()
+        if roll < 0.05:
+            settings.append((chat_id, 'random_events_enabled', 'false'))
+        elif roll < 0.10:
+            settings.append((chat_id, 'reminder_weekend_films_disabled', 'true'))
+        elif roll < 0.20:
+            events.append((chat_id, 'premiere_reminder', monday))
+        elif roll < 0.30:
+            plans.append((chat_id, 'home', now + timedelta(days=1)))
+        elif roll < 0.35:
+            settings.append((chat_id, 'notify_home_weekday_hour', '21'))
+        elif roll < 0.37:
+            settings.append((chat_id, 'bot_blocked_by_user', '1'))
+    from psycopg2.extras import execute_values
+    execute_values(cur, "INSERT INTO settings (chat_id, key, value) VALUES %s ON CONFLICT (chat_id, key) DO NOTHING",
+                   settings)
+    execute_values(cur, "INSERT INTO event_notifications (chat_id, event_type, sent_date) VALUES %s "
+                        "ON CONFLICT DO NOTHING", events)
+    execute_values(cur, "INSERT INTO plans (chat_id, plan_type, plan_datetime) VALUES %s", plans)
+    conn.commit()
+    # Статистика для планировщика запросов, как у давно заполненных таблиц
+    for table in ('movies', 'settings', 'event_notifications', 'plans'):
+        cur.execute(f"ANALYZE {table}")
+    conn.commit()
+    return chat_ids
+
+
+def old_weekend_check(scheduler, chat_id, now, counter):
+    """Прежние проверки check_weekend_schedule для одного чата"""
+    from moviebot.database.db_operations import get_notification_settings
+    conn = scheduler._scheduler_conn()
+    cur = conn.cursor()
+    try:
+        counter[0] += 1
+        if not scheduler.get_random_events_enabled(chat_id):
+            return False
+        counter[0] += 1
+        if scheduler.was_event_sent_this_week(chat_id, scheduler.WEEKLY_EVENT_TYPES):
+            return False
+        counter[0] += 1
+        cur.execute("SELECT value FROM settings WHERE chat_id = %s AND key = 'reminder_weekend_films_disabled'",
+                    (chat_id,))
+        row = cur.fetchone()
+        if row and row['value'] == 'true':
+            return False
+        counter[0] += 1
+        notify_settings = get_notification_settings(chat_id)
+        base_minutes = notify_settings.get('home_weekday_hour', 19) * 60 + notify_settings.get('home_weekday_minute', 0)
+        if abs(now.hour * 60 + now.minute - base_minutes) > 30:
+            return False
+        counter[0] += 1
+        cur.execute("SELECT value FROM settings WHERE chat_id = %s AND key = 'last_weekend_reminder_date'", (chat_id,))
+        cur.fetchone()
+        counter[0] += 1
+        cur.execute('''
+            SELECT COUNT(*) FROM plans WHERE chat_id = %s AND plan_type = 'home'
+            AND plan_datetime >= %s AND plan_datetime <= %s
+        ''', (chat_id, now.replace(hour=0, minute=0), now.replace(hour=23, minute=59) + timedelta(days=2)))
+        return cur.fetchone()['count'] == 0
+    finally:
+        cur.close()
+        conn.close()
+
+
+def fake_sender(latency, rate_limited, blocked, rng):
+    """Имитация sendMessage: задержка, часть ответов — 429 (один раз на чат) и 403"""
+    from telebot.apihelper import ApiTelegramException
+    limited_once = set()
+    lock = threading.Lock()
+
+    def send(chat_id):
+        time.sleep(latency)
+        with lock:
+            roll = rng.random()
+            first_try = chat_id not in limited_once
+            limited_once.add(chat_id)
+        if roll < rate_limited and first_try:
+            raise ApiTelegramException('sendMessage', None, {
+                'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': 1}})
+        if roll > 1 - blocked:
+            raise ApiTelegramException('sendMessage', None, {
+                'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'})
+    return send
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--chats', type=int, default=50000)
+    parser.add_argument('--sample', type=int, default=1000, help='чатов для замера прежнего пути')
+    parser.add_argument('--send', type=int, default=300, help='чатов для имитации рассылки')
+    parser.add_argument('--latency', type=float, default=0.15, help='длительность sendMessage, с')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    logging.disable(logging.WARNING)
+    from moviebot.config import PLANS_TZ
+    from moviebot.database.db_connection import init_database, db_connection
+    from moviebot import scheduler
+    from moviebot.services.broadcaster import Broadcaster, estimate_duration
+
+    init_database()
+    scheduler.bot = object()  # проверки планировщика выходят сразу без бота
+    rng = random.Random(args.seed)
+    now = PLANS_TZ.localize(datetime(2026, 10, 16, 19, 5))  # пятница, базовое время по умолчанию
+    with db_connection() as conn:
+        chat_ids = seed(conn, args.chats, now, rng)
+
+    sample = rng.sample(chat_ids, min(args.sample, len(chat_ids)))
+    counter = [0]
+    started = time.perf_counter()
+    old_selected = {chat_id for chat_id in sample if old_weekend_check(scheduler, chat_id, now, counter)}
+    old_elapsed = time.perf_counter() - started
+    scale = len(chat_ids) / max(1, len(sample))
+
+    started = time.perf_counter()
+    candidates = scheduler.weekend_schedule_candidates(now)
+    new_elapsed = time.perf_counter() - started
+    ours = set(chat_ids)
+    new_selected = {chat_id for chat_id in candidates if chat_id in ours}
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT chat_id FROM settings WHERE key = 'bot_blocked_by_user' AND chat_id = ANY(%s)", (sample,))
+        blocked = {row['chat_id'] for row in cur.fetchall()}
+
+    print(f"Чатов: {len(chat_ids)}, кандидатов на напоминание: {len(new_selected)}")
+    print(f"По чатам:       {counter[0] / len(sample):.1f} запросов на чат, "
+          f"{old_elapsed * 1000 / len(sample):.2f} мс на чат, на все чаты ≈ {old_elapsed * scale:.1f} с "
+          f"(≈ {counter[0] * scale:.0f} запросов)")
+    print(f"Одним запросом: 1 запрос, {new_elapsed:.2f} с")
+    # Прежний путь не пропускал заблокировавших бота — их и не считаем расхождением
+    print(f"Расхождение на выборке: {len((old_selected - blocked) ^ (new_selected & set(sample)))} чатов "
+          f"(заблокировавших бота пропущено: {len(old_selected & blocked)})")
+
+    send_chats = candidates[:args.send]
+    broadcaster = Broadcaster(record_blocked=lambda chat_ids: None)
+    result = broadcaster.run('bench', send_chats, fake_sender(args.latency, 0.02, 0.03, rng))
+    estimate = estimate_duration(len(send_chats), broadcaster.workers, broadcaster.rate, args.latency)
+    print(f"Рассылка {len(send_chats)} чатов: {result.elapsed:.1f} с (оценка dry_run {estimate:.1f} с), "
+          f"отправлено {result.sent}, 429 повторено {result.retries}, заблокировали {result.blocked}, "
+          f"ошибок {result.failed}")
+    print(f"Последовательная отправка тех же чатов: ≈ {len(send_chats) * args.latency:.1f} с")
+    for count in (len(new_selected), 50000):
+        print(f"Оценка dry_run для {count} чатов: {estimate_duration(count, latency=args.latency):.0f} с "
+              f"(по одному: {count * args.latency:.0f} с)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: единое глобальное соединение + глобальный db_lock против пула соединений.
+
+N потоков имитируют обработчики: каждый «апдейт» делает несколько коротких
+запросов и в конце закрывает соединение, как это делают хелперы db_operations.
+Замеряется латентность каждого запроса (включая ожидание блокировки/соединения).
+
+Запуск (нужен локальный PostgreSQL):
+    python -m moviebot.benchmarks.bench_db_pool --dsn postgresql://postgres@localhost/moviebot_bench \\
+        --handlers 32 --updates 20
+"""
+import argparse
+import threading
+import time
+
+from moviebot.benchmarks.common import prepare_env, format_latencies
+
+
+QUERIES = [
+    ("SELECT value FROM bench_settings WHERE chat_id = %s AND key = 'watched_emoji'", True),
+    ("SELECT COUNT(*) AS count FROM bench_settings WHERE chat_id = %s", True),
+    ("SELECT pg_sleep(0.002), %s AS chat_id", True),
+]
+
+
+def setup_schema(dsn):
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS bench_settings (
+                chat_id BIGINT, key TEXT, value TEXT, UNIQUE(chat_id, key)
+            )
+        ''')
+        cur.execute('''
+            INSERT INTO bench_settings (chat_id, key, value)
+            SELECT g, 'watched_emoji', '✅' FROM generate_series(1, 1000) g
+            ON CONFLICT DO NOTHING
+        ''')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class LegacySingleConnection:
+    """Поведение до пула: одно соединение на процесс, close() рвёт его для всех"""
+
+    def __init__(self, dsn):
+        import psycopg2
+        from psycopg2.extras import RealDictCursor
+        self._connect = lambda: psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+        self._conn = None
+        self.lock = threading.RLock()
+
+    def get_db_connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self._connect()
+        return self._conn
+
+    def get_db_cursor(self):
+        return self.get_db_connection().cursor()
+
+
+def run_handlers(get_conn, get_cursor, lock, handlers, updates):
+    latencies = []
+    latencies_lock = threading.Lock()
+    errors = []
+
+    def handler(worker_id):
+        local = []
+        for update in range(updates):
+            chat_id = (worker_id * updates + update) % 1000 + 1
+            for sql, _ in QUERIES:
+                started = time.perf_counter()
+                try:
+                    with lock:
+                        conn = get_conn()
+                        cursor = get_cursor()
+                        try:
+                            cursor.execute(sql, (chat_id,))
+                            cursor.fetchall()
+                        finally:
+                            try:
+                                cursor.close()
+                            except Exception:
+                                pass
+                            try:
+                                conn.close()
+                            except Exception:
+                                pass
+                except Exception as e:
+                    errors.append(e)
+                local.append(time.perf_counter() - started)
+        with latencies_lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=handler, args=(i,)) for i in range(handlers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - started, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--handlers', type=int, default=32, help='количество параллельных обработчиков')
+    parser.add_argument('--updates', type=int, default=20, help='апдейтов на обработчик')
+    parser.add_argument('--pool-max', type=int, default=10, help='размер пула (DB_POOL_MAX_CONN)')
+    args = parser.parse_args()
+
+    import os
+    prepare_env(args.dsn)
+    os.environ['DB_POOL_MAX_CONN'] = str(args.pool_max)
+    dsn = os.environ['DATABASE_URL']
+    setup_schema(dsn)
+
+    legacy = LegacySingleConnection(dsn)
+    lat_before, wall_before, err_before = run_handlers(
+        legacy.get_db_connection, legacy.get_db_cursor, legacy.lock, args.handlers, args.updates
+    )
+
+    from moviebot.database import db_connection
+    lat_after, wall_after, err_after = run_handlers(
+        db_connection.get_db_connection, db_connection.get_db_cursor, db_connection.db_lock,
+        args.handlers, args.updates
+    )
+
+    total = args.handlers * args.updates
+    print(f"{args.handlers} обработчиков x {args.updates} апдейтов x {len(QUERIES)} запроса")
+    print(format_latencies('до (1 соединение + db_lock)', lat_before),
+          f" {total / wall_before:8.1f} апд/с  ошибок={len(err_before)}")
+    print(format_latencies(f'после (пул, max={args.pool_max})', lat_after),
+          f" {total / wall_after:8.1f} апд/с  ошибок={len(err_after)}")
+    print(f"Статистика пула: {db_connection.get_pool().stats()}")
+
+
+if __name__ == '__main__':
+    main()
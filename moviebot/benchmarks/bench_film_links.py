@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: фильтры и агрегации по строкам 'a, b, c' (ILIKE, разбор в Python) против связей film_genres/film_people.
+
+Строит синтетическую базу (по умолчанию 100k строк movies в 20 чатах), заполняет
+films и связи штатным бэкфиллом (film_catalog.backfill_films_catalog / backfill_film_links)
+и для нескольких чатов сравнивает запросы рандомайзера (шаги жанра, режиссёра,
+актёра, финальный подбор) и /total в старом и новом виде. Заодно сверяет результаты.
+
+Запуск (нужен локальный PostgreSQL; таблицы movies/ratings/films/film_* ОЧИЩАЮТСЯ):
+    python -m moviebot.benchmarks.bench_film_links --dsn postgresql://postgres@localhost/moviebot_bench \\
+        --movies 100000 --chats 20
+"""
+import argparse
+import os
+import random
+import time
+
+from moviebot.benchmarks.common import prepare_env, format_latencies
+
+GENRES = [
+    'драма', 'мелодрама', 'комедия', 'боевик', 'триллер', 'криминал', 'фантастика', 'фэнтези',
+    'ужасы', 'детектив', 'приключения', 'семейный', 'мультфильм', 'аниме', 'биография', 'история',
+    'военный', 'вестерн', 'мюзикл', 'спорт', 'документальный', 'музыка', 'короткометражка', 'нуар',
+]
+
+NOT_IMPORT_ONLY = '''
+    AND NOT (
+        NOT EXISTS (SELECT 1 FROM ratings r2 WHERE r2.chat_id = m.chat_id AND r2.film_id = m.id
+                    AND (r2.is_imported = FALSE OR r2.is_imported IS NULL))
+        AND EXISTS (SELECT 1 FROM ratings r3 WHERE r3.chat_id = m.chat_id AND r3.film_id = m.id AND r3.is_imported = TRUE)
+    )
+'''
+
+
+def skewed_choice(rng, pool):
+    """Популярные имена встречаются чаще: первое — примерно в 1/sqrt(len(pool)) фильмов"""
+    return pool[int(len(pool) * rng.random() ** 2)]
+
+
+def generate(conn, movies, chats, seed):
+    """Синтетика: films ~ 0.6 * movies различных kp_id, у каждого чата свой набор"""
+    from psycopg2.extras import execute_values
+    rng = random.Random(seed)
+    directors = [f"Режиссёр {i}" for i in range(3000)]
+    actors = [f"Актёр {i}" for i in range(20000)]
+    film_count = max(1, int(movies * 0.6))
+    films = {}
+    for kp in range(1, film_count + 1):
+        genres = ', '.join(rng.sample(GENRES, rng.randint(1, 3)))
+        director = 'Не указан' if rng.random() < 0.03 else skewed_choice(rng, directors)
+        cast = ', '.join(dict.fromkeys(skewed_choice(rng, actors) for _ in range(6)))
+        films[str(kp)] = (f"Фильм {kp}", rng.randint(1950, 2025), genres, director, cast, int(rng.random() < 0.2))
+
+    cur = conn.cursor()
+    cur.execute('TRUNCATE movies, ratings, plans, films, film_genres, film_people, '
+                'films_backfill_done, film_links_backfill_done RESTART IDENTITY CASCADE')
+    kp_ids = list(films)
+    per_chat = movies // chats
+    movie_rows = []
+    for chat in range(1, chats + 1):
+        for kp in rng.sample(kp_ids, min(per_chat, len(kp_ids))):
+            title, year, genres, director, cast, is_series = films[kp]
+            watched = int(rng.random() < 0.4)
+            movie_rows.append((-chat, f"https://kp/{kp}", kp, title, year, genres, director, cast, is_series, watched))
+    execute_values(cur, '''
+        INSERT INTO movies (chat_id, link, kp_id, title, year, genres, director, actors, is_series, watched)
+        VALUES %s RETURNING id, chat_id, watched
+    ''', movie_rows, page_size=5000)
+    cur.execute('SELECT id, chat_id, watched FROM movies')
+    rating_rows = []
+    for movie_id, chat_id, watched in cur.fetchall():
+        if watched:
+            imported = rng.random() < 0.1
+            for user in range(rng.randint(1, 3)):
+                rating_rows.append((chat_id, movie_id, 1000 + user, rng.randint(4, 10), imported))
+        elif rng.random() < 0.05:
+            rating_rows.append((chat_id, movie_id, 1000, rng.randint(4, 10), True))
+    execute_values(cur, 'INSERT INTO ratings (chat_id, film_id, user_id, rating, is_imported) VALUES %s',
+                   rating_rows, page_size=5000)
+    conn.commit()
+    return len(movie_rows), len(rating_rows)
+
+
+def timed(cur, sql, params, samples):
+    started = time.perf_counter()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    samples.append(time.perf_counter() - started)
+    return rows
+
+
+def legacy_genre_step(cur, chat_id, samples):
+    rows = timed(cur, '''
+        SELECT DISTINCT TRIM(UNNEST(string_to_array(m.genres, ', '))) as genre
+        FROM movies m
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+        WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+        AND m.genres IS NOT NULL AND m.genres != '' AND m.genres != '—'
+    ''', (chat_id,), samples)
+    return sorted(r[0] for r in rows)
+
+
+def linked_genre_step(cur, chat_id, samples):
+    rows = timed(cur, '''
+        SELECT DISTINCT fg.genre
+        FROM movies m
+        JOIN film_genres fg ON fg.kp_id = m.kp_id
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+        WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+    ''', (chat_id,), samples)
+    return sorted(r[0] for r in rows)
+
+
+def legacy_director_step(cur, chat_id, genres, samples):
+    sql = '''
+        SELECT m.director, COUNT(*) as cnt
+        FROM movies m
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+        WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+        AND m.director IS NOT NULL AND m.director != 'Не указан' AND m.director != ''
+    '''
+    sql += ' AND (' + ' OR '.join('m.genres ILIKE %s' for _ in genres) + ')'
+    sql += ' GROUP BY m.director ORDER BY cnt DESC LIMIT 10'
+    rows = timed(cur, sql, [chat_id] + [f"%{g}%" for g in genres], samples)
+    return [r[1] for r in rows]
+
+
+def linked_director_step(cur, chat_id, genres, samples):
+    from moviebot.database.film_catalog import GENRES_FILTER_SQL
+    sql = '''
+        SELECT fp.name AS director, COUNT(*) as cnt
+        FROM movies m
+        JOIN film_people fp ON fp.kp_id = m.kp_id AND fp.role = 'director'
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+        WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+    '''
+    sql += ' AND ' + GENRES_FILTER_SQL + ' GROUP BY fp.name ORDER BY cnt DESC, fp.name LIMIT 10'
+    rows = timed(cur, sql, [chat_id, list(genres)], samples)
+    return [r[1] for r in rows]
+
+
+def legacy_actor_step(cur, chat_id, samples):
+    started = time.perf_counter()
+    cur.execute('''
+        SELECT m.actors
+        FROM movies m
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+        WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+        AND m.actors IS NOT NULL AND m.actors != '' AND m.actors != '—'
+    ''', (chat_id,))
+    counts = {}
+    for (actors_str,) in cur.fetchall():
+        for actor in actors_str.split(', '):
+            actor = actor.strip()
+            if actor:
+                counts[actor] = counts.get(actor, 0) + 1
+    top = sorted(counts.values(), reverse=True)[:10]
+    samples.append(time.perf_counter() - started)
+    return top
+
+
+def linked_actor_step(cur, chat_id, samples):
+    rows = timed(cur, '''
+        SELECT fp.name AS actor, COUNT(*) as cnt
+        FROM movies m
+        JOIN film_people fp ON fp.kp_id = m.kp_id AND fp.role = 'actor'
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+        WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+        GROUP BY fp.name ORDER BY cnt DESC, fp.name LIMIT 10
+    ''', (chat_id,), samples)
+    return [r[1] for r in rows]
+
+
+def legacy_final(cur, chat_id, genres, actor, samples):
+    sql = '''
+        SELECT m.id FROM movies m
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+        WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+        AND m.id NOT IN (SELECT film_id FROM plans WHERE chat_id = %s)
+    '''
+    sql += ' AND (' + ' OR '.join('m.genres ILIKE %s' for _ in genres) + ') AND (m.actors ILIKE %s)'
+    rows = timed(cur, sql, [chat_id, chat_id] + [f"%{g}%" for g in genres] + [f"%{actor}%"], samples)
+    return {r[0] for r in rows}
+
+
+def linked_final(cur, chat_id, genres, actor, samples):
+    from moviebot.database.film_catalog import GENRES_FILTER_SQL, ACTORS_FILTER_SQL
+    sql = '''
+        SELECT m.id FROM movies m
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+        WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+        AND m.id NOT IN (SELECT film_id FROM plans WHERE chat_id = %s)
+    '''
+    sql += ' AND ' + GENRES_FILTER_SQL + ' AND ' + ACTORS_FILTER_SQL
+    rows = timed(cur, sql, [chat_id, chat_id, list(genres), [actor]], samples)
+    return {r[0] for r in rows}
+
+
+def legacy_total(cur, chat_id, samples):
+    """Жанры, режиссёры и актёры /total как раньше: GROUP BY строки + разбор в Python"""
+    started = time.perf_counter()
+    cur.execute('SELECT m.genres FROM movies m WHERE m.chat_id = %s AND m.watched = 1' + NOT_IMPORT_ONLY, (chat_id,))
+    genre_counts = {}
+    for (genres,) in cur.fetchall():
+        for g in str(genres).split(', '):
+            if g.strip():
+                genre_counts[g.strip()] = genre_counts.get(g.strip(), 0) + 1
+    cur.execute('''
+        SELECT m.director, AVG(r.rating), COUNT(DISTINCT m.id)
+        FROM movies m
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND (r.is_imported = FALSE OR r.is_imported IS NULL)
+        WHERE m.chat_id = %s AND m.watched = 1 AND m.director IS NOT NULL AND m.director != 'Не указан'
+    ''' + NOT_IMPORT_ONLY + ' GROUP BY m.director', (chat_id,))
+    directors = sorted(((c, a) for d, a, c in cur.fetchall() if a), key=lambda x: (-x[0], -x[1]))[:3]
+    cur.execute('''
+        SELECT m.actors, AVG(r.rating), COUNT(DISTINCT m.id)
+        FROM movies m
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND (r.is_imported = FALSE OR r.is_imported IS NULL)
+        WHERE m.chat_id = %s AND m.watched = 1
+    ''' + NOT_IMPORT_ONLY + ' GROUP BY m.actors', (chat_id,))
+    actor_stats = {}
+    for actors_str, avg_r, film_count in cur.fetchall():
+        if actors_str and avg_r:
+            for a in actors_str.split(', '):
+                stats = actor_stats.setdefault(a.strip(), [0, 0])
+                stats[0] += film_count
+                stats[1] += avg_r * film_count
+    actors = sorted(((c, s / c) for c, s in actor_stats.values()), key=lambda x: (-x[0], -x[1]))[:3]
+    samples.append(time.perf_counter() - started)
+    return max(genre_counts.values()), [d[0] for d in directors], [a[0] for a in actors]
+
+
+def linked_total(cur, chat_id, samples):
+    started = time.perf_counter()
+    cur.execute('''
+        SELECT fg.genre, COUNT(*) AS cnt FROM movies m
+        JOIN film_genres fg ON fg.kp_id = m.kp_id
+        WHERE m.chat_id = %s AND m.watched = 1
+    ''' + NOT_IMPORT_ONLY + ' GROUP BY fg.genre ORDER BY cnt DESC, fg.genre LIMIT 1', (chat_id,))
+    genre_top = cur.fetchone()[1]
+    cur.execute('''
+        SELECT fp.name, AVG(r.rating) AS avg_rating, COUNT(DISTINCT m.id) AS film_count
+        FROM movies m
+        JOIN film_people fp ON fp.kp_id = m.kp_id AND fp.role = 'director'
+        LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND (r.is_imported = FALSE OR r.is_imported IS NULL)
+        WHERE m.chat_id = %s AND m.watched = 1
+    ''' + NOT_IMPORT_ONLY + '''
+        GROUP BY fp.name HAVING AVG(r.rating) IS NOT NULL
+        ORDER BY film_count DESC, avg_rating DESC LIMIT 3
+    ''', (chat_id,))
+    directors = [row[2] for row in cur.fetchall()]
+    cur.execute('''
+        WITH film_ratings AS (
+            SELECT m.id, m.kp_id, AVG(r.rating) AS avg_rating
+            FROM movies m
+            JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND (r.is_imported = FALSE OR r.is_imported IS NULL)
+            WHERE m.chat_id = %s AND m.watched = 1
+            GROUP BY m.id, m.kp_id
+        )
+        SELECT fp.name, AVG(fr.avg_rating) AS avg_rating, COUNT(*) AS film_count
+        FROM film_ratings fr
+        JOIN film_people fp ON fp.kp_id = fr.kp_id AND fp.role = 'actor'
+        GROUP BY fp.name ORDER BY film_count DESC, avg_rating DESC LIMIT 3
+    ''', (chat_id,))
+    actors = [row[2] for row in cur.fetchall()]
+    samples.append(time.perf_counter() - started)
+    return genre_top, directors, actors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--movies', type=int, default=100000)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--sample-chats', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=12)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    import psycopg2
+    from moviebot.database.db_connection import init_database
+    from moviebot.database.film_catalog import backfill_films_catalog, backfill_film_links
+    init_database()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    started = time.perf_counter()
+    movie_rows, rating_rows = generate(conn, args.movies, args.chats, args.seed)
+    print(f"movies: {movie_rows}, ratings: {rating_rows}, генерация {time.perf_counter() - started:.1f} с")
+
+    started = time.perf_counter()
+    backfill_films_catalog()
+    films_done = time.perf_counter()
+    backfill_film_links()
+    links_done = time.perf_counter()
+    # Установившееся состояние после autovacuum: карта видимости для index-only scan и свежая статистика
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('VACUUM ANALYZE movies, ratings, films, film_genres, film_people')
+    conn.autocommit = False
+    cur.execute('SELECT (SELECT COUNT(*) FROM films), (SELECT COUNT(*) FROM film_genres), (SELECT COUNT(*) FROM film_people)')
+    films, genre_links, people_links = cur.fetchone()
+    print(f"films: {films}, film_genres: {genre_links}, film_people: {people_links}; бэкфилл каталога "
+          f"{films_done - started:.1f} с, связей {links_done - films_done:.1f} с")
+
+    rng = random.Random(args.seed)
+    chat_ids = [-chat for chat in rng.sample(range(1, args.chats + 1), min(args.sample_chats, args.chats))]
+    timings = {name: ([], []) for name in ('шаг жанра', 'шаг режиссёра', 'шаг актёра', 'финальный подбор', '/total')}
+    mismatches = {name: 0 for name in timings}
+    substring_extra = 0
+    for chat_id in chat_ids:
+        for _ in range(3):
+            genres = rng.sample(GENRES, 2)
+            cur.execute("SELECT fp.name FROM film_people fp JOIN movies m ON m.kp_id = fp.kp_id "
+                        "WHERE m.chat_id = %s AND fp.role = 'actor' ORDER BY random() LIMIT 1", (chat_id,))
+            actor = cur.fetchone()[0]
+            checks = (
+                ('шаг жанра', lambda s: legacy_genre_step(cur, chat_id, s), lambda s: linked_genre_step(cur, chat_id, s)),
+                ('шаг режиссёра', lambda s: legacy_director_step(cur, chat_id, genres, s),
+                 lambda s: linked_director_step(cur, chat_id, genres, s)),
+                ('шаг актёра', lambda s: legacy_actor_step(cur, chat_id, s), lambda s: linked_actor_step(cur, chat_id, s)),
+                ('финальный подбор', lambda s: legacy_final(cur, chat_id, genres, actor, s),
+                 lambda s: linked_final(cur, chat_id, genres, actor, s)),
+                ('/total', lambda s: legacy_total(cur, chat_id, s), lambda s: linked_total(cur, chat_id, s)),
+            )
+            for name, legacy, linked in checks:
+                before, after = timings[name]
+                expected, actual = legacy(before), linked(after)
+                if name in ('шаг режиссёра', 'финальный подбор'):
+                    # ILIKE '%драма%' находил и 'мелодраму', '%Актёр 1%' — и 'Актёр 12'
+                    if isinstance(actual, set) and not actual <= expected:
+                        mismatches[name] += 1
+                    substring_extra += len(expected - actual) if isinstance(expected, set) else 0
+                elif expected != actual:
+                    mismatches[name] += 1
+            conn.rollback()
+
+    for name, (before, after) in timings.items():
+        print(format_latencies(f"{name}: строки", before))
+        print(format_latencies(f"{name}: связи", after))
+    print(f"Расхождений: {mismatches}; лишних совпадений по подстроке в старом подборе: {substring_extra}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
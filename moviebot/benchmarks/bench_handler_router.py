@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: выбор обработчика апдейта при полном наборе хендлеров бота.
+
+Регистрирует все обработчики в том же порядке, что main.py, строит поток колбэков
+(callback_data по всем известным префиксам и мусорные) и сообщений (команды, обычный
+текст в группе и личке, реплаи на карточки и запросы оценки, пользователи в состояниях)
+и замеряет на апдейт проверку фильтров до первого сработавшего:
+  - «перебор» — как pyTelegramBotAPI: все обработчики по порядку;
+  - «индекс» — HandlerRouter.select + проверка только кандидатов.
+Заодно сверяет, что в обоих случаях выбран один и тот же обработчик.
+
+bot.get_chat / bot.get_me заменяются исключением (проверки уходят в запасную ветку
+по знаку chat.id), иначе перебор упирался бы в сетевые запросы к Telegram.
+
+Запуск (нужен локальный PostgreSQL — модули хендлеров открывают соединение при импорте):
+    python -m moviebot.benchmarks.bench_handler_router --updates 5000
+"""
+import argparse
+import contextlib
+import io
+import logging
+import random
+import time
+
+from moviebot.benchmarks.common import prepare_env, format_latencies
+
+USER_BASE = 500000
+
+
+def register_all_handlers(bot):
+    """Тот же порядок регистрации, что в main.py"""
+    import moviebot.bot.callbacks.ticket_callbacks  # noqa: F401
+    import moviebot.bot.callbacks.film_callbacks  # noqa: F401
+    import moviebot.bot.callbacks.series_callbacks  # noqa: F401
+    import moviebot.bot.callbacks.payment_callbacks  # noqa: F401
+    import moviebot.bot.callbacks.premieres_callbacks  # noqa: F401
+    import moviebot.bot.callbacks.random_callbacks  # noqa: F401
+    import moviebot.bot.handlers.admin  # noqa: F401
+    import moviebot.bot.handlers.promo  # noqa: F401
+    from moviebot.bot.handlers.start import register_start_handlers
+    register_start_handlers(bot)
+    import moviebot.bot.handlers.state_handlers  # noqa: F401
+    import moviebot.bot.handlers.tags  # noqa: F401
+    import moviebot.bot.handlers.text_messages  # noqa: F401
+    from moviebot.bot.handlers.list import register_list_handlers
+    register_list_handlers(bot)
+    from moviebot.bot.handlers.seasons import register_seasons_handlers
+    register_seasons_handlers(bot)
+    from moviebot.bot.handlers.plan import register_plan_handlers
+    register_plan_handlers(bot)
+    from moviebot.bot.handlers.payment import register_payment_handlers
+    register_payment_handlers(bot)
+    from moviebot.bot.handlers.series import register_series_handlers
+    register_series_handlers(bot)
+    from moviebot.bot.handlers.rate import register_rate_handlers
+    register_rate_handlers(bot)
+    from moviebot.bot.handlers.stats import register_stats_handlers
+    register_stats_handlers(bot)
+    import moviebot.bot.handlers.settings_main  # noqa: F401
+    from moviebot.bot.handlers.settings_handler import register_settings_handlers
+    register_settings_handlers(bot)
+    from moviebot.bot.handlers.settings.edit import register_edit_handlers
+    register_edit_handlers(bot)
+    from moviebot.bot.handlers.settings.clean import register_clean_handlers
+    register_clean_handlers(bot)
+    from moviebot.bot.handlers.settings.join import register_join_handlers
+    register_join_handlers(bot)
+    from moviebot.bot.handlers.shazam import register_shazam_handlers
+    register_shazam_handlers(bot)
+    from moviebot.bot.callbacks.film_callbacks import register_film_callbacks
+    register_film_callbacks(bot)
+    from moviebot.bot.callbacks.series_callbacks import register_series_callbacks
+    register_series_callbacks(bot)
+    from moviebot.bot.callbacks.payment_callbacks import register_payment_callbacks
+    register_payment_callbacks(bot)
+    from moviebot.bot.callbacks.premieres_callbacks import register_premieres_callbacks
+    register_premieres_callbacks(bot)
+    from moviebot.bot.callbacks.random_callbacks import register_random_callbacks
+    register_random_callbacks(bot)
+    from moviebot.bot.handlers.text_messages import register_text_message_handlers
+    register_text_message_handlers(bot)
+
+    @bot.callback_query_handler(func=lambda call: 'settings' in call.data.lower())
+    def debug_settings(call):
+        pass
+
+
+def _chat(chat_id):
+    if chat_id > 0:
+        return {'id': chat_id, 'type': 'private', 'first_name': 'bench'}
+    return {'id': chat_id, 'type': 'supergroup', 'title': 'bench'}
+
+
+def make_callbacks(router_index, count, rng):
+    from telebot.types import CallbackQuery
+    values = sorted(router_index.exact) + [p + str(rng.randint(1, 99999)) for p in sorted(router_index.prefixes)]
+    values += ['unknown:1', 'noop', '']
+    updates = []
+    for i in range(count):
+        user_id = USER_BASE + i % 200
+        chat_id = user_id if i % 3 else -1000000000 - i % 50
+        updates.append(CallbackQuery.de_json({
+            'id': str(i), 'chat_instance': 'bench', 'data': rng.choice(values),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+            'message': {'message_id': 10 + i, 'date': 0, 'chat': _chat(chat_id), 'text': 'card'},
+        }))
+    return updates
+
+
+def make_messages(count, rng, bot_id):
+    from telebot.types import Message
+    from moviebot import states
+    # Часть пользователей в состояниях диалогов, часть сообщений бота — карточки и запросы оценки
+    for n in range(40):
+        states.user_search_state[USER_BASE + n] = {'chat_id': USER_BASE + n, 'message_id': 7}
+        states.user_plan_state[USER_BASE + 40 + n] = {'step': 1, 'prompt_message_id': 8}
+        states.bot_messages[900000 + n] = 'https://www.kinopoisk.ru/film/%d/' % (300 + n)
+        states.rating_messages[950000 + n] = 300 + n
+    texts = ['/start', '/list', '/plan', '/rate', '/settings', '/random', 'привет', 'фильм на вечер', '7',
+             'https://www.kinopoisk.ru/film/301/', 'завтра в 20:00']
+    updates = []
+    for i in range(count):
+        user_id = USER_BASE + i % 200
+        chat_id = user_id if i % 2 else -1000000000 - i % 50
+        raw = {
+            'message_id': 100000 + i, 'date': 0, 'chat': _chat(chat_id), 'text': rng.choice(texts),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+        }
+        kind = rng.random()
+        if kind < 0.2:
+            reply_id = rng.choice([900000 + rng.randint(0, 39), 950000 + rng.randint(0, 39), 1])
+            raw['reply_to_message'] = {
+                'message_id': reply_id, 'date': 0, 'chat': _chat(chat_id), 'text': 'Что дальше? Оцените фильм',
+                'from': {'id': bot_id or 1, 'is_bot': True, 'first_name': 'bot'},
+            }
+        updates.append(Message.de_json(raw))
+    return updates
+
+
+def first_match(bot, handlers, update):
+    for handler in handlers:
+        try:
+            if bot._test_message_handler(handler, update):
+                return handler
+        except Exception as e:
+            return ('error', type(e).__name__)
+    return None
+
+
+def measure(bot, router, update_type, handlers, updates):
+    full, routed, mismatches, errors = [], [], 0, 0
+    for update in updates:
+        started = time.perf_counter()
+        expected = first_match(bot, handlers, update)
+        full.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        chosen = first_match(bot, router.select(update_type, handlers, update), update)
+        routed.append(time.perf_counter() - started)
+        if isinstance(expected, tuple):
+            errors += 1  # фильтр упал при переборе; индекс мог его и не вызывать
+        elif chosen is not expected:
+            mismatches += 1
+    return full, routed, mismatches, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    logging.disable(logging.WARNING)
+    from moviebot.bot.bot_init import bot, BOT_ID
+    from moviebot.bot.handler_router import HandlerRouter
+
+    def offline(*_args, **_kwargs):
+        raise RuntimeError('offline')
+
+    bot.get_chat = offline
+    bot.get_me = offline
+    with contextlib.redirect_stdout(io.StringIO()):
+        register_all_handlers(bot)
+    router = HandlerRouter(bot)
+    rng = random.Random(args.seed)
+
+    callbacks = bot.callback_query_handlers
+    messages = bot.message_handlers
+    callback_index = router._index('callback_query', callbacks)
+    message_index = router._index('message', messages)
+    print(f"Колбэков: {len(callbacks)} (по префиксу/значению: {callback_index.indexed}), "
+          f"сообщений: {len(messages)} (с route_guard: {message_index.guarded}, "
+          f"с командами: {sum(1 for h in messages if h['filters'].get('commands'))})")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        cb_full, cb_routed, cb_mismatches, cb_errors = measure(
+            bot, router, 'callback_query', callbacks, make_callbacks(callback_index, args.updates, rng))
+        msg_full, msg_routed, msg_mismatches, msg_errors = measure(
+            bot, router, 'message', messages, make_messages(args.updates, rng, BOT_ID))
+
+    print(format_latencies('колбэк: перебор', cb_full))
+    print(format_latencies('колбэк: индекс', cb_routed))
+    print(format_latencies('сообщение: перебор', msg_full))
+    print(format_latencies('сообщение: индекс', msg_routed))
+    stats = router.stats()
+    print(f"Проверено фильтров на апдейт: {stats['handlers_checked'] / max(1, stats['updates']):.1f} "
+          f"из {stats['handlers_total'] / max(1, stats['updates']):.1f}")
+    print(f"Расхождений в выбранном обработчике: колбэки {cb_mismatches}, сообщения {msg_mismatches} "
+          f"(фильтр с исключением при переборе: {cb_errors} / {msg_errors})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: страницы /list на большом списке непросмотренных фильмов.
+
+Создаёт чат с --movies фильмами (часть просмотрена, часть есть в каталоге films) и
+сравнивает время открытия страниц:
+  - «весь список» — прежний show_list_page: все непросмотренные фильмы чата одним запросом
+    без LIMIT, страница вырезается в Python;
+  - «по номеру» — fetch_unwatched_page без курсора (первая, средняя, последняя страницы);
+  - «листание» — «Вперёд» по курсору с первой страницы до последней.
+Проверяет, что листание по курсору даёт тот же порядок, что и прежний запрос.
+
+Запуск (нужен локальный PostgreSQL; фильмы чата бенчмарка удаляются и создаются заново):
+    python -m moviebot.benchmarks.bench_list_pages --movies 20000
+"""
+import argparse
+import logging
+import time
+
+from moviebot.benchmarks.common import format_latencies, prepare_env
+
+CHAT_ID = 8200000001
+
+_OLD_SQL = '''
+    SELECT DISTINCT m.id, m.kp_id,
+           COALESCE(f.title, m.title) AS title,
+           COALESCE(f.year, m.year) AS year,
+           COALESCE(f.genres, m.genres) AS genres,
+           m.link
+    FROM movies m
+    LEFT JOIN films f ON f.kp_id = m.kp_id
+    WHERE m.chat_id = %s
+      AND m.watched = 0
+    ORDER BY title
+'''
+
+
+def seed(conn, movies):
+    cur = conn.cursor()
+    cur.execute('DELETE FROM movies WHERE chat_id = %s', (CHAT_ID,))
+    cur.execute('''
+        INSERT INTO movies (chat_id, kp_id, title, year, genres, link, watched)
+        SELECT %s, (90000000 + g)::text, 'Фильм ' || md5(g::text), 1950 + g %% 70, 'драма, комедия',
+               'https://www.kinopoisk.ru/film/' || (90000000 + g) || '/', (g %% 4 = 0)::int
+        FROM generate_series(1, %s) g
+    ''', (CHAT_ID, movies))
+    conn.commit()
+    cur.execute('ANALYZE movies')
+    conn.commit()
+
+
+def old_page(chat_id, page):
+    from moviebot.database.db_connection import db_connection
+    from moviebot.database.movie_list import PAGE_SIZE
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(_OLD_SQL, (chat_id,))
+        rows = cur.fetchall()
+    return rows[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+
+
+def timed(func, repeat):
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--movies', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    logging.disable(logging.WARNING)
+    from moviebot.database.db_connection import init_database, db_connection
+    from moviebot.database.movie_list import fetch_unwatched_page, page_count
+
+    init_database()
+    with db_connection() as conn:
+        seed(conn, args.movies)
+
+    page, total, _ = fetch_unwatched_page(CHAT_ID)
+    pages = page_count(total)
+    print(f"Непросмотренных фильмов: {total}, страниц: {pages}")
+    for label, number in (('первая', 1), ('средняя', pages // 2), ('последняя', pages)):
+        print(format_latencies(f"весь список, {label}", timed(lambda: old_page(CHAT_ID, number), args.repeat)))
+        print(format_latencies(f"по номеру, {label}", timed(lambda: fetch_unwatched_page(CHAT_ID, number), args.repeat)))
+
+    seconds, seen, cursor = [], [], None
+    for number in range(1, pages + 1):
+        started = time.perf_counter()
+        _, _, rows = fetch_unwatched_page(CHAT_ID, number, cursor)
+        seconds.append(time.perf_counter() - started)
+        seen.extend(row['id'] for row in rows)
+        cursor = ('a', rows[-1]['id'])
+    print(format_latencies("листание «Вперёд»", seconds))
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM movies WHERE chat_id = %s AND watched = 0 ORDER BY COALESCE(title, ''), id",
+                    (CHAT_ID,))
+        expected = [row['id'] for row in cur.fetchall()]
+        cur.execute('DELETE FROM movies WHERE chat_id = %s', (CHAT_ID,))
+    print(f"Порядок листания {'совпадает' if seen == expected else 'РАСХОДИТСЯ'} с полным списком")
+
+
+if __name__ == '__main__':
+    main()
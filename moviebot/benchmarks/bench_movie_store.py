@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Холодный старт датафрейма Шазама: CSV (pd.read_csv) против колоночного memmap-хранилища.
+
+Каждый вариант загружается в отдельном процессе, чтобы честно измерить время
+и прирост RSS. Данные — data/shazam/tmdb_movies_processed (если есть) или
+синтетический датафрейм того же формата.
+
+Запуск:
+    python -m moviebot.benchmarks.bench_movie_store --movies 20000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from moviebot.services.movie_store import MovieStore, save_movie_store, store_exists
+
+STORE_PATH = 'data/shazam/tmdb_movies_processed'
+SEARCH_COLUMNS = ['imdb_id', 'title', 'year', 'has_overview', 'actors_str', 'director_str', 'genres_str', 'vote_count']
+
+
+def synthetic_processed(count, seed=1):
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(5000)]
+    genres = ['Drama', 'Comedy', 'Action', 'Thriller', 'Horror', 'Romance', 'Crime', 'Adventure']
+    rows = []
+    for i in range(count):
+        overview = ' '.join(rng.choices(words, k=70))
+        actors = ', '.join(f"Actor {rng.randrange(40000)}" for _ in range(10))
+        director = f"Director {rng.randrange(3000)}"
+        movie_genres = rng.sample(genres, 2)
+        rows.append({
+            'imdb_id': f"tt{i:07d}",
+            'title': f"Movie {i}",
+            'year': rng.randrange(1950, 2025),
+            'description': f"Movie {i}. {', '.join(movie_genres)}. Plot: {overview}. Actors: {actors}. Director: {director}",
+            'has_overview': True,
+            'actors_str': actors,
+            'director_str': director,
+            'genres_str': ', '.join(movie_genres),
+            'overview': overview,
+            'genres': json.dumps([{'name': g} for g in movie_genres]),
+            'vote_count': rng.randrange(500, 30000),
+        })
+    return pd.DataFrame(rows)
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(mode, path):
+    """Выполняется в дочернем процессе: загрузка и одно обращение к «холодной» колонке"""
+    before = rss_mb()
+    started = time.perf_counter()
+    if mode == 'csv':
+        movies = pd.read_csv(path)
+        overview = movies.iloc[len(movies) // 2]['overview']
+    else:
+        store = MovieStore(path)
+        movies = store.to_dataframe(SEARCH_COLUMNS)
+        overview = store.value('overview', len(movies) // 2)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'seconds': elapsed, 'rss_mb': rss_mb() - before, 'rows': len(movies), 'ok': bool(overview)}))
+
+
+def run_child(mode, path):
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'moviebot.benchmarks.bench_movie_store', '--child', mode, path], text=True
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movies', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if store_exists(STORE_PATH):
+            df = MovieStore(STORE_PATH).to_dataframe()
+        else:
+            df = synthetic_processed(args.movies)
+        csv_path = os.path.join(tmp, 'movies.csv')
+        store_path = os.path.join(tmp, 'movies_store')
+        df.to_csv(csv_path, index=False)
+        save_movie_store(df, store_path)
+        store_size = sum(os.path.getsize(os.path.join(store_path, name)) for name in os.listdir(store_path))
+        print(f"Фильмов: {len(df)}, CSV: {os.path.getsize(csv_path) / 1e6:.1f} МБ, хранилище: {store_size / 1e6:.1f} МБ")
+
+        for mode, path in (('csv', csv_path), ('memmap', store_path)):
+            runs = [run_child(mode, path) for _ in range(args.repeat)]
+            best = min(runs, key=lambda r: r['seconds'])
+            print(f"{mode:<8} загрузка={best['seconds'] * 1000:8.1f} мс  прирост RSS={best['rss_mb']:7.1f} МБ")
+
+
+if __name__ == '__main__':
+    main()
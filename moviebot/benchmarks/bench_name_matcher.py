@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Поиск имён актёров/режиссёров в запросе Шазама: перебор топ-списка против NameMatcher.
+
+Повторяет шаги search_movies: однословные фамилии и окна из 2–4 слов с
+опечатками до 2. Топ-списки — data/shazam/top_actors.txt / top_directors.txt,
+если они есть, иначе синтетические имена того же объёма.
+
+Запуск:
+    python -m moviebot.benchmarks.bench_name_matcher --actors 500 --directors 100 --queries 50
+"""
+import argparse
+import random
+import time
+from pathlib import Path
+
+from moviebot.benchmarks.common import format_latencies
+from moviebot.services.name_matcher import NameMatcher, levenshtein_distance
+
+TOP_ACTORS_PATH = Path('data/shazam/top_actors.txt')
+TOP_DIRECTORS_PATH = Path('data/shazam/top_directors.txt')
+
+
+def legacy_typos(name, name_set, max_distance=2):
+    if name in name_set:
+        return (True, name)
+    for candidate in name_set:
+        if levenshtein_distance(name, candidate) <= max_distance:
+            return (True, candidate)
+    return (False, None)
+
+
+def legacy_surname(word, name_set):
+    if len(word) < 3:
+        return (False, None)
+    for name in name_set:
+        if name == word or name.endswith(' ' + word):
+            return (True, name)
+    return (False, None)
+
+
+def load_names(path, count, rng):
+    if path.exists():
+        with open(path, encoding='utf-8') as f:
+            return [line.strip().lower() for line in f if line.strip()]
+    syllables = ['an', 'ber', 'co', 'da', 'el', 'fi', 'gor', 'ha', 'ix', 'jo', 'ka', 'lin', 'mo', 'nor', 'son']
+    return [
+        ' '.join(''.join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(2))
+        for _ in range(count)
+    ]
+
+
+def make_queries(actors, count, rng):
+    words = 'a man who lost his memory travels through time to save the world with friends'.split()
+    queries = []
+    for _ in range(count):
+        query = rng.sample(words, 10)
+        if rng.random() < 0.6:
+            name = list(rng.choice(actors))
+            if rng.random() < 0.5:
+                name[rng.randrange(len(name))] = 'x'
+            query.insert(rng.randrange(len(query)), ''.join(name))
+        queries.append(' '.join(query).split())
+    return queries
+
+
+def match_query(words, find_surname, find_typos):
+    found = []
+    for w in words:
+        found.append(find_surname(w))
+    for word_count in range(2, min(5, len(words) + 1)):
+        for i in range(len(words) - word_count + 1):
+            found.append(find_typos(' '.join(words[i:i + word_count])))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--actors', type=int, default=500)
+    parser.add_argument('--directors', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    actors = load_names(TOP_ACTORS_PATH, args.actors, rng)
+    directors = load_names(TOP_DIRECTORS_PATH, args.directors, rng)
+    queries = make_queries(actors, args.queries, rng)
+    actor_set, director_set = set(actors), set(directors)
+
+    started = time.perf_counter()
+    actors_matcher, directors_matcher = NameMatcher(actors), NameMatcher(directors)
+    print(f"Актёров: {len(actors)}, режиссёров: {len(directors)}, построение индекса: "
+          f"{(time.perf_counter() - started) * 1000:.0f} мс, {actors_matcher.stats()}")
+
+    legacy, indexed, mismatches = [], [], 0
+    for words in queries:
+        started = time.perf_counter()
+        expected = match_query(words, lambda w: legacy_surname(w, actor_set) if legacy_surname(w, actor_set)[0]
+                               else legacy_surname(w, director_set), lambda n: legacy_typos(n, actor_set))
+        legacy.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        actual = match_query(words, lambda w: actors_matcher.find_by_surname(w) if actors_matcher.find_by_surname(w)[0]
+                             else directors_matcher.find_by_surname(w), actors_matcher.find)
+        indexed.append(time.perf_counter() - started)
+        mismatches += sum(a[0] != e[0] for a, e in zip(actual, expected))
+
+    print(format_latencies('перебор (как было)', legacy))
+    print(format_latencies('NameMatcher', indexed))
+    print(f"Расхождений found/not found: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
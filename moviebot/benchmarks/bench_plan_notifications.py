@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: запросы пятиминутной проверки планов (check_and_send_plan_notifications).
+
+Строит --plans планов на ближайшие сутки в --chats чатах (часть пользователей со своим
+часовым поясом, часть чатов со своими настройками напоминаний, часть планов — кино с
+билетами) и считает SQL-запросы и время расчёта напоминаний (plan_reminder_jobs):
+  - «по одному» — прежний путь: get_user_timezone_or_default и get_notification_settings
+    на каждый план и каждую группу (чат, дата);
+  - «снимок» — load_settings_snapshot: пояса и настройки всех планов двумя запросами.
+Запросы считаются по всем курсорам RealDictCursor (и пула, и соединений планировщика).
+
+Запуск (нужен локальный PostgreSQL; планы чатов бенчмарка удаляются и создаются заново):
+    python -m moviebot.benchmarks.bench_plan_notifications --plans 3000 --chats 1500
+"""
+import argparse
+import logging
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from moviebot.benchmarks.common import prepare_env
+
+CHAT_BASE = 8100000000
+
+
+@contextmanager
+def count_queries():
+    """Считает execute всех курсоров RealDictCursor внутри блока"""
+    from psycopg2.extras import RealDictCursor
+    counter = [0]
+    original = RealDictCursor.execute
+
+    def execute(cursor, query, vars=None):
+        counter[0] += 1
+        return original(cursor, query, vars)
+
+    RealDictCursor.execute = execute
+    try:
+        yield counter
+    finally:
+        RealDictCursor.execute = original
+
+
+def seed(conn, plans, chats, now, rng):
+    from psycopg2.extras import execute_values
+    cur = conn.cursor()
+    low, high = CHAT_BASE, CHAT_BASE + chats
+    for table in ('plans', 'settings'):
+        cur.execute(f"DELETE FROM {table} WHERE chat_id BETWEEN %s AND %s", (low, high))
+    chat_ids = [CHAT_BASE + n for n in range(chats)]
+    timezones = ('Moscow', 'Yekaterinburg', 'Novosibirsk', 'Vladivostok', 'Kaliningrad')
+    settings = []
+    for chat_id in chat_ids:
+        if rng.random() < 0.3:
+            settings.append((chat_id, 'user_timezone', rng.choice(timezones)))
+        if rng.random() < 0.2:
+            settings.append((chat_id, 'notify_cinema_weekday_hour', str(rng.randint(7, 11))))
+            settings.append((chat_id, 'ticket_before_minutes', str(rng.choice((-1, 0, 10, 30)))))
+    execute_values(cur, "INSERT INTO settings (chat_id, key, value) VALUES %s ON CONFLICT (chat_id, key) DO NOTHING",
+                   settings)
+    rows = []
+    for _ in range(plans):
+        chat_id = rng.choice(chat_ids)
+        cinema = rng.random() < 0.4
+        when = now + timedelta(minutes=rng.randint(-25, 24 * 60 - 5))
+        rows.append((chat_id, chat_id, 'cinema' if cinema else 'home', when,
+                     'file-id' if cinema and rng.random() < 0.7 else None, rng.random() < 0.1))
+    execute_values(cur, "INSERT INTO plans (chat_id, user_id, plan_type, plan_datetime, ticket_file_id, notification_sent) "
+                        "VALUES %s", rows)
+    conn.commit()
+    for table in ('plans', 'settings'):
+        cur.execute(f"ANALYZE {table}")
+    conn.commit()
+    return set(chat_ids)
+
+
+class PerCallSettings:
+    """Прежний путь: каждый пояс и набор настроек — отдельным запросом"""
+
+    def timezone(self, user_id):
+        from moviebot.database.db_operations import get_user_timezone_or_default
+        return get_user_timezone_or_default(user_id)
+
+    def notification_settings(self, chat_id):
+        from moviebot.database.db_operations import get_notification_settings
+        return get_notification_settings(chat_id)
+
+
+def measure(label, func):
+    with count_queries() as counter:
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+    print(f"{label:<14} {counter[0]:>7} запросов, {elapsed * 1000:9.1f} мс")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--plans', type=int, default=3000)
+    parser.add_argument('--chats', type=int, default=1500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    logging.disable(logging.WARNING)
+    import pytz
+    from moviebot.database.db_connection import init_database, db_connection
+    from moviebot import scheduler
+
+    init_database()
+    rng = random.Random(args.seed)
+    now = datetime.now(pytz.utc).replace(microsecond=0)
+    with db_connection() as conn:
+        ours = seed(conn, args.plans, args.chats, now, rng)
+
+    plans = measure("Планы окна:", lambda: [plan for plan in scheduler._fetch_window_plans(now)
+                                             if plan['chat_id'] in ours])
+    old = measure("По одному:", lambda: scheduler.plan_reminder_jobs(plans, now, settings=PerCallSettings()))
+    new = measure("Снимок:", lambda: scheduler.plan_reminder_jobs(plans, now))
+
+    same = (old.jobs == new.jobs and set(old.due) == set(new.due)
+            and old.scope_ids == new.scope_ids and old.scope_prefixes == new.scope_prefixes)
+    print(f"Планов: {len(plans)}, чатов: {len({plan['chat_id'] for plan in plans})}, "
+          f"напоминаний: {len(new.jobs)} на будущее и {len(new.due)} к отправке сразу; "
+          f"результаты {'совпадают' if same else 'РАСХОДЯТСЯ'}")
+
+
+if __name__ == '__main__':
+    main()
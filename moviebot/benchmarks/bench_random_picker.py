@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: шаги мастера /random в режиме «по своей базе» на большом списке чата.
+
+Создаёт чат с --movies непросмотренными фильмами (жанры, режиссёр и актёры в film_genres /
+film_people, часть с импортированными оценками, часть в планах) и проходит мастер
+(периоды → жанры → режиссёры → актёры → случайный фильм) с фильтрами «2000–2010» и «драма»:
+  - «SQL» — прежние запросы каждого шага (шесть COUNT на шаге периодов, выборка всех
+    кандидатов на финале);
+  - «индекс, холодный» — первый проход: индекс строится;
+  - «индекс» — следующие проходы: сверка версии и пересечения масок.
+Проверяет, что наборы периодов, жанров, режиссёров и актёров совпадают.
+
+Запуск (нужен локальный PostgreSQL; фильмы чата бенчмарка удаляются и создаются заново):
+    python -m moviebot.benchmarks.bench_random_picker --movies 5000
+"""
+import argparse
+import logging
+import time
+
+from moviebot.benchmarks.common import format_latencies, prepare_env
+
+CHAT_ID = 8300000001
+KP_BASE = 95000000
+PERIODS = ['2000–2010']
+GENRES = ['драма']
+
+_BASE = '''
+    FROM movies m
+    LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
+    WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
+'''
+_PERIOD_CONDITIONS = {
+    "До 1980": "m.year < 1980", "1980–1990": "(m.year >= 1980 AND m.year <= 1990)",
+    "1990–2000": "(m.year >= 1990 AND m.year <= 2000)", "2000–2010": "(m.year >= 2000 AND m.year <= 2010)",
+    "2010–2020": "(m.year >= 2010 AND m.year <= 2020)", "2020–сейчас": "m.year >= 2020",
+}
+
+
+def seed(conn, movies):
+    cur = conn.cursor()
+    cur.execute('DELETE FROM plans WHERE chat_id = %s', (CHAT_ID,))
+    cur.execute('DELETE FROM ratings WHERE chat_id = %s', (CHAT_ID,))
+    cur.execute('DELETE FROM movies WHERE chat_id = %s', (CHAT_ID,))
+    cur.execute('''
+        INSERT INTO movies (chat_id, kp_id, title, year, link, is_series, watched)
+        SELECT %s, (%s + g)::text, 'Фильм ' || g, 1950 + g %% 75, 'https://www.kinopoisk.ru/film/' || (%s + g) || '/',
+               (g %% 5 = 0)::int, 0
+        FROM generate_series(1, %s) g
+    ''', (CHAT_ID, KP_BASE, KP_BASE, movies))
+    genres = ['драма', 'комедия', 'триллер', 'фантастика', 'мелодрама', 'боевик', 'ужасы', 'детектив']
+    cur.execute('DELETE FROM film_genres WHERE kp_id BETWEEN %s AND %s', (str(KP_BASE), str(KP_BASE + movies)))
+    cur.execute('DELETE FROM film_people WHERE kp_id BETWEEN %s AND %s', (str(KP_BASE), str(KP_BASE + movies)))
+    cur.execute('''
+        INSERT INTO film_genres (kp_id, genre)
+        SELECT DISTINCT (%s + g)::text, (%s::text[])[1 + (g * k) %% 8]
+        FROM generate_series(1, %s) g, generate_series(1, 2) k
+    ''', (KP_BASE, genres, movies))
+    cur.execute('''
+        INSERT INTO film_people (kp_id, role, name, position)
+        SELECT (%s + g)::text, 'director', 'Режиссёр ' || (g %% 400), 0 FROM generate_series(1, %s) g
+    ''', (KP_BASE, movies))
+    cur.execute('''
+        INSERT INTO film_people (kp_id, role, name, position)
+        SELECT DISTINCT ON (g, (g * 7 + k * 131) %% 3000) (%s + g)::text, 'actor', 'Актёр ' || ((g * 7 + k * 131) %% 3000), k
+        FROM generate_series(1, %s) g, generate_series(0, 5) k
+    ''', (KP_BASE, movies))
+    cur.execute('''
+        INSERT INTO ratings (chat_id, film_id, user_id, rating, is_imported)
+        SELECT chat_id, id, 1, 9, TRUE FROM movies WHERE chat_id = %s AND id %% 10 = 0
+    ''', (CHAT_ID,))
+    cur.execute('''
+        INSERT INTO plans (chat_id, film_id, user_id, plan_type, plan_datetime)
+        SELECT chat_id, id, 1, 'home', NOW() + INTERVAL '1 day' FROM movies WHERE chat_id = %s AND id %% 17 = 0
+    ''', (CHAT_ID,))
+    conn.commit()
+    for table in ('movies', 'ratings', 'film_genres', 'film_people', 'plans'):
+        cur.execute(f'ANALYZE {table}')
+    conn.commit()
+
+
+def sql_wizard(cur):
+    """Прежние запросы шагов мастера"""
+    periods = []
+    for label, condition in _PERIOD_CONDITIONS.items():
+        cur.execute(f'SELECT COUNT(DISTINCT m.id) AS count {_BASE} AND {condition}', (CHAT_ID,))
+        if cur.fetchone()['count']:
+            periods.append(label)
+    where = ' AND (' + ' OR '.join(_PERIOD_CONDITIONS[p] for p in PERIODS) + ')'
+    cur.execute(f'SELECT DISTINCT fg.genre {_BASE.replace("WHERE", "JOIN film_genres fg ON fg.kp_id = m.kp_id WHERE", 1)}'
+                f'{where}', (CHAT_ID,))
+    genres = {row['genre'] for row in cur.fetchall()}
+    genre_filter = ' AND EXISTS (SELECT 1 FROM film_genres fg WHERE fg.kp_id = m.kp_id AND fg.genre = ANY(%s))'
+    tops = []
+    for role in ('director', 'actor'):
+        cur.execute(f'''SELECT fp.name, COUNT(*) AS cnt
+                        {_BASE.replace("WHERE", f"JOIN film_people fp ON fp.kp_id = m.kp_id AND fp.role = '{role}' WHERE", 1)}
+                        {where}{genre_filter} GROUP BY fp.name ORDER BY cnt DESC, fp.name LIMIT 10''', (CHAT_ID, GENRES))
+        tops.append([(row['name'], row['cnt']) for row in cur.fetchall()])
+    cur.execute(f'''SELECT m.id, m.title, m.year, m.genres, m.director, m.actors, m.description, m.link, m.kp_id
+                    {_BASE} AND m.id NOT IN (SELECT film_id FROM plans WHERE chat_id = %s){where}{genre_filter}''',
+                (CHAT_ID, CHAT_ID, GENRES))
+    candidates = cur.fetchall()
+    return periods, genres, tops[0], tops[1], len(candidates)
+
+
+def index_wizard():
+    from moviebot.services import random_index
+    periods = random_index.available_periods(CHAT_ID)
+    genres = set(random_index.available_genres(CHAT_ID, None, PERIODS))
+    directors = random_index.top_directors(CHAT_ID, PERIODS, GENRES)
+    actors = random_index.top_actors(CHAT_ID, PERIODS, GENRES)
+    film = random_index.pick_random_film(CHAT_ID, None, PERIODS, GENRES)
+    return periods, genres, directors, actors, film
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--movies', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    logging.disable(logging.WARNING)
+    from moviebot.database.db_connection import init_database, db_connection
+    from moviebot.services import random_index
+
+    init_database()
+    with db_connection() as conn:
+        seed(conn, args.movies)
+
+    seconds, old = [], None
+    for _ in range(args.repeat):
+        with db_connection() as conn:
+            started = time.perf_counter()
+            old = sql_wizard(conn.cursor())
+            seconds.append(time.perf_counter() - started)
+    print(format_latencies("SQL, мастер целиком", seconds))
+
+    random_index.invalidate()
+    started = time.perf_counter()
+    new = index_wizard()
+    print(format_latencies("индекс, холодный", [time.perf_counter() - started]))
+    seconds = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        new = index_wizard()
+        seconds.append(time.perf_counter() - started)
+    print(format_latencies("индекс, мастер целиком", seconds))
+
+    same = old[:4] == new[:4] and (old[4] > 0) == (new[4] is not None)
+    print(f"Кандидатов на финале: {old[4]}; периоды, жанры, режиссёры и актёры "
+          f"{'совпадают' if same else 'РАСХОДЯТСЯ'}")
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        for table in ('plans', 'ratings', 'movies'):
+            cur.execute(f'DELETE FROM {table} WHERE chat_id = %s', (CHAT_ID,))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк фильтрации кандидатов по актёрам/режиссёрам в search_movies (Шазам).
+
+Сравнивает построчный обход датафрейма (movies.iloc + _normalize_text на каждый
+запрос — как было) с MovieAttributeIndex (инвертированный индекс + маски).
+Если есть data/shazam/tmdb_movies_processed (колоночное хранилище) — используется оно,
+иначе генерируется синтетический датафрейм того же формата.
+
+Запуск:
+    python -m moviebot.benchmarks.bench_shazam_filters --movies 20000 --repeat 5
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from moviebot.benchmarks.common import format_latencies
+from moviebot.services.movie_attribute_index import build_attribute_index, normalize_text
+from moviebot.services.movie_store import MovieStore, store_exists
+
+STORE_PATH = 'data/shazam/tmdb_movies_processed'
+
+# (актёры, режиссёры) — фиксированный набор запросов
+QUERIES = [
+    (['tom hanks'], []),
+    (['leonardo dicaprio', 'kate winslet'], []),
+    (['brad pitt', 'edward norton'], ['david fincher']),
+    (['actor 17', 'actor 230'], []),
+    (['actor 5'], []),
+    ([], ['director 3']),
+    (['al pacino', 'robert de niro', 'val kilmer'], ['michael mann']),
+]
+
+
+def synthetic_movies(count, seed=42):
+    rng = random.Random(seed)
+    famous = ['tom hanks', 'leonardo dicaprio', 'kate winslet', 'brad pitt', 'edward norton',
+              'al pacino', 'robert de niro', 'val kilmer']
+    directors = ['david fincher', 'michael mann', 'christopher nolan'] + [f'director {i}' for i in range(2000)]
+    actors = famous + [f'actor {i}' for i in range(30000)]
+    rows = []
+    for i in range(count):
+        cast = rng.sample(actors, 8)
+        rows.append({
+            'imdb_id': f"tt{i:07d}",
+            'title': f"Movie {i}",
+            'actors_str': ', '.join(name.title() for name in cast),
+            'director_str': rng.choice(directors).title(),
+            'genres_str': 'Drama, Crime',
+        })
+    return pd.DataFrame(rows)
+
+
+def legacy_filter(movies, actors, directors):
+    """Построчная фильтрация, как в search_movies до индекса атрибутов"""
+    actors_normalized = [normalize_text(name) for name in actors]
+    directors_normalized = [normalize_text(name) for name in directors]
+    matched = []
+    for idx in range(len(movies)):
+        row = movies.iloc[idx]
+        has_director = False
+        if directors_normalized and pd.notna(row.get('director_str')):
+            director_norm = normalize_text(str(row['director_str']))
+            has_director = any(name in director_norm for name in directors_normalized)
+        some = False
+        if actors_normalized and pd.notna(row.get('actors_str')):
+            movie_actors = [normalize_text(a.strip()) for a in str(row['actors_str']).split(',') if a.strip()]
+            some = any(
+                any(name in actor or actor in name for actor in movie_actors)
+                for name in actors_normalized
+            )
+        if has_director or some:
+            matched.append(idx)
+    return matched
+
+
+def indexed_filter(attribute_index, actors, directors):
+    actors_normalized = [normalize_text(name) for name in actors]
+    mask = attribute_index.actor_mask(actors_normalized, require_all=False)
+    if directors:
+        mask |= attribute_index.director_mask([normalize_text(name) for name in directors])
+    return np.flatnonzero(mask).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movies', type=int, default=20000, help='размер синтетического датафрейма')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data', default=STORE_PATH)
+    args = parser.parse_args()
+
+    if store_exists(args.data):
+        movies = MovieStore(args.data).to_dataframe()
+        print(f"Датафрейм: {args.data}, фильмов: {len(movies)}")
+    else:
+        movies = synthetic_movies(args.movies)
+        print(f"Датафрейм: синтетический, фильмов: {len(movies)}")
+
+    started = time.perf_counter()
+    attribute_index = build_attribute_index(movies)
+    print(f"Построение индекса атрибутов: {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    legacy_times, indexed_times = [], []
+    for _ in range(args.repeat):
+        for actors, directors in QUERIES:
+            started = time.perf_counter()
+            expected = legacy_filter(movies, actors, directors)
+            legacy_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            got = indexed_filter(attribute_index, actors, directors)
+            indexed_times.append(time.perf_counter() - started)
+
+            if got != expected:
+                raise SystemExit(f"Расхождение для {actors} / {directors}: {len(got)} vs {len(expected)}")
+
+    print(format_latencies('построчный обход', legacy_times))
+    print(format_latencies('индекс атрибутов', indexed_times))
+
+
+if __name__ == '__main__':
+    main()
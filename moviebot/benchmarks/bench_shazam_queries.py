@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность текстовых запросов Шазама под конкурентной нагрузкой.
+
+Модель и переводчик заменены моделью стоимости (в контейнере без GPU они
+работают на одном ядре, поэтому вызовы сериализуются общей блокировкой):
+    перевод        = --translate-ms на запрос
+    model.encode() = --encode-base-ms + --encode-item-ms * размер пачки
+Запросы берутся из пула с повторами (распределение Ципфа): одни и те же
+описания фильмов спрашивают постоянно.
+
+Сравниваются: без кэша и батчей (как было) / QueryCache / QueryCache + BatchingEncoder.
+
+Запуск:
+    python -m moviebot.benchmarks.bench_shazam_queries --threads 16 --queries 400
+"""
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+
+from moviebot.benchmarks.common import format_latencies
+from moviebot.services.query_cache import BatchingEncoder, QueryCache
+
+DIM = 384
+
+
+class CostModel:
+    def __init__(self, translate_ms, encode_base_ms, encode_item_ms):
+        self.translate_ms = translate_ms
+        self.encode_base_ms = encode_base_ms
+        self.encode_item_ms = encode_item_ms
+        self.cpu = threading.Lock()
+        self.encode_calls = 0
+
+    def translate(self, text):
+        with self.cpu:
+            time.sleep(self.translate_ms / 1000.0)
+        return f"en:{text}"
+
+    def encode(self, texts):
+        with self.cpu:
+            self.encode_calls += 1
+            time.sleep((self.encode_base_ms + self.encode_item_ms * len(texts)) / 1000.0)
+        return np.stack([np.full(DIM, hash(t) % 997, dtype='float32') for t in texts])
+
+
+def make_workload(pool_size, total, seed):
+    rng = random.Random(seed)
+    pool = [f"фильм про запрос номер {i}" for i in range(pool_size)]
+    weights = [1.0 / (rank + 1) for rank in range(pool_size)]
+    # Вариации регистра/пробелов — «почти одинаковые» запросы
+    return [
+        rng.choice([q, q.upper(), f"  {q}  ", f"{q}!"])
+        for q in rng.choices(pool, weights=weights, k=total)
+    ]
+
+
+def run(workload, threads, search_fn):
+    latencies = []
+    lock = threading.Lock()
+    chunks = [workload[i::threads] for i in range(threads)]
+
+    def worker(queries):
+        for query in queries:
+            started = time.perf_counter()
+            search_fn(query)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--queries', type=int, default=400)
+    parser.add_argument('--pool', type=int, default=150, help='число разных запросов')
+    parser.add_argument('--translate-ms', type=float, default=40)
+    parser.add_argument('--encode-base-ms', type=float, default=25)
+    parser.add_argument('--encode-item-ms', type=float, default=4)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    workload = make_workload(args.pool, args.queries, args.seed)
+    print(f"{args.queries} запросов, {args.threads} потоков, разных запросов в пуле: {args.pool}")
+
+    def scenario(label, use_cache, use_batching):
+        costs = CostModel(args.translate_ms, args.encode_base_ms, args.encode_item_ms)
+        cache = QueryCache() if use_cache else None
+        encoder = BatchingEncoder(costs.encode) if use_batching else None
+
+        def search(query):
+            if cache is not None:
+                results = cache.get_results(query)
+                if results is not None:
+                    return results
+                query_en = cache.get_translation(query)
+                if query_en is None:
+                    query_en = costs.translate(query)
+                    cache.put_translation(query, query_en)
+                embedding = cache.get_embedding(query_en)
+            else:
+                query_en = costs.translate(query)
+                embedding = None
+            if embedding is None:
+                embedding = encoder.encode(query_en) if encoder else costs.encode([query_en])[0]
+                if cache is not None:
+                    cache.put_embedding(query_en, embedding)
+            results = [{'imdb_id': f"tt{int(embedding[0]):07d}"}]
+            if cache is not None:
+                cache.put_results(query, results)
+            return results
+
+        elapsed, latencies = run(workload, args.threads, search)
+        print(f"{label:<26} {len(workload) / elapsed:8.1f} запр/с  encode-вызовов={costs.encode_calls}")
+        print('    ' + format_latencies('задержка', latencies))
+        if encoder is not None:
+            print(f"    энкодер: {encoder.stats()}")
+
+    scenario('без кэша (как было)', use_cache=False, use_batching=False)
+    scenario('кэш', use_cache=True, use_batching=False)
+    scenario('кэш + батчи', use_cache=True, use_batching=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: /api/site/group-stats и /api/site/stats для «тяжёлой» группы с многолетней историей.
+
+Строит синтетическую группу (по умолчанию 25 участников, 4000 фильмов, 36 месяцев
+просмотров, оценок, серий и походов в кино) и личный чат одного из участников,
+затем замеряет get_group_stats / get_personal_stats за текущий месяц:
+  - «роллап устарел» — перед каждым вызовом ключ месяца и профиль помечаются
+    изменёнными (как после новой оценки), вызов пересчитывает их из сырых строк;
+  - «роллап свежий» — счётчики читаются из stats_monthly_rollups / stats_profile_rollups.
+
+Запуск (нужен локальный PostgreSQL; таблицы movies/ratings/watched_movies/series_tracking/
+cinema_screenings/plans/film_genres и роллапы ОЧИЩАЮТСЯ):
+    python -m moviebot.benchmarks.bench_site_stats --dsn postgresql://postgres@localhost/moviebot_bench \\
+        --members 25 --films 4000 --months 36
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from moviebot.benchmarks.common import prepare_env, format_latencies
+
+GROUP_CHAT_ID = -1000000000001
+GENRES = [
+    'драма', 'мелодрама', 'комедия', 'боевик', 'триллер', 'криминал', 'фантастика', 'фэнтези',
+    'ужасы', 'детектив', 'приключения', 'семейный', 'мультфильм', 'аниме', 'биография', 'история',
+]
+LINKS = ['https://www.kinopoisk.ru/film/', 'https://okko.tv/movie/', 'https://www.ivi.ru/watch/', None]
+
+
+def generate(conn, chat_id, members, films, months, seed):
+    """История чата за months месяцев до текущего момента; возвращает число строк по таблицам"""
+    from psycopg2.extras import execute_values
+    rng = random.Random(seed)
+    now = datetime.now(pytz.UTC)
+    start = now - timedelta(days=30 * months)
+    span = (now - start).total_seconds()
+    user_ids = [chat_id] if chat_id > 0 else [5000 + i for i in range(members)]
+
+    def moment():
+        return start + timedelta(seconds=span * rng.random() ** 0.7)
+
+    cur = conn.cursor()
+    movie_rows = []
+    for i in range(films):
+        kp_id = str(abs(chat_id) % 100000 * 100000 + i)
+        is_series = int(rng.random() < 0.2)
+        link = rng.choice(LINKS)
+        movie_rows.append((
+            chat_id, f"https://kp/{kp_id}", kp_id, f"Фильм {i}", rng.randint(1950, 2025),
+            ', '.join(rng.sample(GENRES, rng.randint(1, 3))), is_series, rng.choice(user_ids),
+            link + kp_id if link else None,
+        ))
+    execute_values(cur, '''
+        INSERT INTO movies (chat_id, link, kp_id, title, year, genres, is_series, added_by, online_link)
+        VALUES %s
+    ''', movie_rows, page_size=5000)
+    execute_values(cur, '''
+        INSERT INTO film_genres (kp_id, genre)
+        SELECT DISTINCT kp_id, TRIM(g) FROM (VALUES %s) v(kp_id, genres), UNNEST(string_to_array(genres, ',')) g
+        ON CONFLICT DO NOTHING
+    ''', [(r[2], r[5]) for r in movie_rows], page_size=5000)
+    cur.execute('SELECT id, is_series FROM movies WHERE chat_id = %s', (chat_id,))
+    movies = cur.fetchall()
+
+    watched, ratings, episodes, cinema = [], [], [], []
+    for row in movies:
+        movie_id, is_series = row['id'], row['is_series']
+        for user_id in user_ids:
+            if rng.random() > 0.35:
+                continue
+            when = moment()
+            if is_series:
+                for season in range(1, rng.randint(1, 3) + 1):
+                    for episode in range(1, rng.randint(4, 10) + 1):
+                        episodes.append((chat_id, movie_id, user_id, season, episode, when))
+                        when += timedelta(hours=rng.randint(6, 72))
+            else:
+                watched.append((chat_id, movie_id, user_id, when))
+                if rng.random() < 0.04:
+                    cinema.append((chat_id, user_id, movie_id, when.date()))
+            if rng.random() < 0.8:
+                ratings.append((chat_id, movie_id, user_id, rng.randint(3, 10), when + timedelta(hours=2)))
+    execute_values(cur, 'INSERT INTO watched_movies (chat_id, film_id, user_id, watched_at) VALUES %s',
+                   watched, page_size=5000)
+    execute_values(cur, 'INSERT INTO ratings (chat_id, film_id, user_id, rating, rated_at) VALUES %s',
+                   ratings, page_size=5000)
+    execute_values(cur, '''
+        INSERT INTO series_tracking (chat_id, film_id, user_id, season_number, episode_number, watched, watched_date)
+        SELECT chat_id, film_id, user_id, season_number, episode_number, TRUE, watched_date
+        FROM (VALUES %s) v(chat_id, film_id, user_id, season_number, episode_number, watched_date)
+    ''', episodes, page_size=5000)
+    execute_values(cur, 'INSERT INTO cinema_screenings (chat_id, user_id, film_id, screening_date) VALUES %s',
+                   cinema, page_size=5000)
+    conn.commit()
+    return {'movies': len(movies), 'watched_movies': len(watched), 'ratings': len(ratings),
+            'series_tracking': len(episodes), 'cinema_screenings': len(cinema)}
+
+
+def reset(conn):
+    cur = conn.cursor()
+    cur.execute('''
+        TRUNCATE movies, ratings, watched_movies, series_tracking, cinema_screenings, plans, film_genres,
+                 stats_monthly_rollups, stats_rollup_state, stats_profile_rollups RESTART IDENTITY CASCADE
+    ''')
+    conn.commit()
+
+
+def mark_stale(conn, chat_id, month_start):
+    cur = conn.cursor()
+    cur.execute('UPDATE stats_rollup_state SET version = version + 1 WHERE chat_id = %s AND month = %s',
+                (chat_id, month_start))
+    cur.execute('UPDATE stats_profile_rollups SET version = version + 1 WHERE user_id = %s', (chat_id,))
+    conn.commit()
+
+
+def measure(call, repeats, before=None):
+    samples = []
+    for _ in range(repeats):
+        if before:
+            before()
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--members', type=int, default=25)
+    parser.add_argument('--films', type=int, default=4000)
+    parser.add_argument('--months', type=int, default=36)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    from moviebot.database.db_connection import init_database, db_connection
+    from moviebot.api.site_stats import get_group_stats, get_personal_stats
+
+    init_database()
+    personal_chat_id = 5000
+    with db_connection() as conn:
+        reset(conn)
+        group_rows = generate(conn, GROUP_CHAT_ID, args.members, args.films, args.months, args.seed)
+        personal_rows = generate(conn, personal_chat_id, 1, args.films // 4, args.months, args.seed + 1)
+    with db_connection() as conn:
+        # Установившееся состояние после autovacuum: свежая статистика планировщика
+        conn.autocommit = True
+        conn.cursor().execute('VACUUM ANALYZE movies, ratings, watched_movies, series_tracking, cinema_screenings, film_genres')
+        conn.autocommit = False
+
+    now = datetime.now(pytz.UTC)
+    month, year = now.month, now.year
+    month_start = now.date().replace(day=1)
+    print(f"Группа: {group_rows}")
+    print(f"Личный чат: {personal_rows}")
+
+    for label, chat_id, call in (
+        ('group-stats', GROUP_CHAT_ID, lambda: get_group_stats(GROUP_CHAT_ID, month, year)),
+        ('stats', personal_chat_id, lambda: get_personal_stats(personal_chat_id, month, year)),
+    ):
+        call()  # первый расчёт ключа и профиля
+
+        def stale(chat_id=chat_id):
+            with db_connection() as conn:
+                mark_stale(conn, chat_id, month_start)
+
+        print(format_latencies(f'{label}: роллап устарел', measure(call, args.repeats, stale)))
+        print(format_latencies(f'{label}: роллап свежий', measure(call, args.repeats)))
+
+
+if __name__ == '__main__':
+    main()
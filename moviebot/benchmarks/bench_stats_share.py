@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: публичная ссылка на групповую статистику, которую открывает сразу много людей.
+
+Строит группу (как bench_site_stats), включает публичную ссылку и гоняет
+GET /api/site/group-stats/public/<slug> из --clients потоков через тестовый клиент Flask:
+  - «без кэша»  — max_age=0: каждый запрос пересчитывает статистику (поведение до кэша);
+  - «кэш»       — ответ из ShareResponseCache;
+  - «304»       — клиент присылает If-None-Match с ETag и получает ответ без тела.
+
+Запуск (нужен локальный PostgreSQL; таблицы статистики ОЧИЩАЮТСЯ):
+    python -m moviebot.benchmarks.bench_stats_share --dsn postgresql://postgres@localhost/moviebot_bench \\
+        --clients 8 --requests 20
+"""
+import argparse
+import threading
+import time
+from datetime import datetime
+
+import pytz
+
+from moviebot.benchmarks.common import prepare_env, format_latencies
+
+
+def burst(app, url, clients, requests, headers=None):
+    """clients потоков по requests запросов; возвращает (задержки, статусы, общее время)"""
+    samples, statuses = [], []
+    lock = threading.Lock()
+
+    def client():
+        c = app.test_client()
+        for _ in range(requests):
+            started = time.perf_counter()
+            r = c.get(url, headers=headers or {})
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples.append(elapsed)
+                statuses.append(r.status_code)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, statuses, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--members', type=int, default=25)
+    parser.add_argument('--films', type=int, default=2000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    prepare_env(args.dsn)
+    from moviebot.database.db_connection import init_database, db_connection
+    from moviebot.benchmarks.bench_site_stats import GROUP_CHAT_ID, generate, reset
+    from moviebot.api.site_stats import set_group_stats_settings
+    from moviebot.api.stats_share_cache import get_share_response_cache, get_share_view_counter
+    from moviebot.web.web_app import create_web_app
+
+    init_database()
+    with db_connection() as conn:
+        reset(conn)
+        rows = generate(conn, GROUP_CHAT_ID, args.members, args.films, args.months, args.seed)
+    slug = set_group_stats_settings(GROUP_CHAT_ID, public_enabled=True)['public_slug']
+    app = create_web_app(None)
+    now = datetime.now(pytz.UTC)
+    url = f'/api/site/group-stats/public/{slug}?month={now.month}&year={now.year}'
+    print(f"Группа: {rows}, клиентов: {args.clients}, запросов на клиента: {args.requests}")
+
+    cache = get_share_response_cache()
+    first = app.test_client().get(url)  # роллап месяца посчитан, ответ в кэше
+    etag = first.headers.get('ETag')
+    print(f"Ответ: {len(first.data)} байт, ETag {etag}")
+
+    max_age = cache.max_age
+    cache.max_age = 0
+    # Без кэша пересчёт идёт по одному за раз (single-flight), поэтому запросов меньше
+    samples, _, wall = burst(app, url, args.clients, max(1, args.requests // 4))
+    print(format_latencies('без кэша', samples) + f"  rps={len(samples) / wall:8.1f}")
+    cache.max_age = max_age
+    cache.clear()
+
+    app.test_client().get(url)
+    samples, _, wall = burst(app, url, args.clients, args.requests)
+    print(format_latencies('кэш', samples) + f"  rps={len(samples) / wall:8.1f}")
+    samples, statuses, wall = burst(app, url, args.clients, args.requests, {'If-None-Match': etag})
+    print(format_latencies('304', samples) + f"  rps={len(samples) / wall:8.1f}  304={statuses.count(304)}")
+
+    counter = get_share_view_counter()
+    print(f"Просмотры в памяти: {counter.stats()}, записано ключей при сбросе: {counter.flush()}")
+    print(f"Кэш: {cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
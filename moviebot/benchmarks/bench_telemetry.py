@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: синхронная запись телеметрии (SELECT 1 + INSERT + COMMIT под db_lock) против TelemetryWriter.
+
+N потоков имитируют обработчики: на каждый апдейт — log_request и два
+log_kinopoisk_api_request. Замеряется время, которое логирование добавляет
+к обработчику, и время до полной записи всех строк в БД.
+
+Запуск (нужен локальный PostgreSQL, таблицы stats/kinopoisk_api_logs создаются при отсутствии):
+    python -m moviebot.benchmarks.bench_telemetry --dsn postgresql://postgres@localhost/moviebot_bench \\
+        --handlers 16 --updates 100
+"""
+import argparse
+import threading
+import time
+from datetime import datetime
+
+from moviebot.benchmarks.common import prepare_env, format_latencies
+
+
+def setup_schema(dsn):
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS stats (
+                id SERIAL PRIMARY KEY, user_id BIGINT, username TEXT,
+                command_or_action TEXT, timestamp TEXT, chat_id BIGINT
+            )
+        ''')
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS kinopoisk_api_logs (
+                id SERIAL PRIMARY KEY, endpoint TEXT NOT NULL, method TEXT NOT NULL, status_code INTEGER,
+                timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(), user_id BIGINT, chat_id BIGINT, kp_id TEXT
+            )
+        ''')
+        cur.execute('TRUNCATE stats, kinopoisk_api_logs')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def count_rows(dsn):
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT (SELECT COUNT(*) FROM stats) + (SELECT COUNT(*) FROM kinopoisk_api_logs)')
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def legacy_log_request(lock, user_id, command, chat_id):
+    """Как было: SELECT 1, INSERT, COMMIT под глобальной блокировкой"""
+    from moviebot.database.db_connection import get_db_connection, get_db_cursor
+    conn = get_db_connection()
+    cur = get_db_cursor()
+    try:
+        with lock:
+            cur.execute('SELECT 1')
+            cur.fetchone()
+            cur.execute(
+                'INSERT INTO stats (user_id, username, command_or_action, timestamp, chat_id) VALUES (%s, %s, %s, %s, %s)',
+                (user_id, 'bench', command, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), chat_id),
+            )
+            conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def legacy_log_api(lock, endpoint, kp_id):
+    from moviebot.database.db_connection import get_db_connection, get_db_cursor
+    conn = get_db_connection()
+    cur = get_db_cursor()
+    try:
+        with lock:
+            conn.rollback()
+            cur.execute(
+                'INSERT INTO kinopoisk_api_logs (endpoint, method, status_code, user_id, chat_id, kp_id) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                (endpoint, 'GET', 200, None, None, str(kp_id)),
+            )
+            conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def run(handlers, updates, log_update):
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def handler(worker_id):
+        local = []
+        for update in range(updates):
+            started = time.perf_counter()
+            log_update(worker_id, update)
+            local.append(time.perf_counter() - started)
+        with latencies_lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=handler, args=(i,)) for i in range(handlers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=None, help='DSN локального PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--handlers', type=int, default=16)
+    parser.add_argument('--updates', type=int, default=100)
+    args = parser.parse_args()
+
+    import os
+    prepare_env(args.dsn)
+    dsn = os.environ['DATABASE_URL']
+    setup_schema(dsn)
+    total_rows = args.handlers * args.updates * 3
+
+    lock = threading.RLock()
+
+    def legacy_update(worker_id, update):
+        legacy_log_request(lock, worker_id, f'/cmd{update % 7}', worker_id)
+        legacy_log_api(lock, '/api/v2.2/films', update)
+        legacy_log_api(lock, '/api/v1/staff', update)
+
+    lat_before, wall_before = run(args.handlers, args.updates, legacy_update)
+    rows_before = count_rows(dsn)
+
+    setup_schema(dsn)
+    from moviebot.database.telemetry import get_telemetry_writer, enqueue_request_log, enqueue_api_log
+
+    def telemetry_update(worker_id, update):
+        enqueue_request_log(worker_id, 'bench', f'/cmd{update % 7}', worker_id)
+        enqueue_api_log('/api/v2.2/films', 'GET', 200, kp_id=update)
+        enqueue_api_log('/api/v1/staff', 'GET', 200, kp_id=update)
+
+    lat_after, wall_after = run(args.handlers, args.updates, telemetry_update)
+    started = time.perf_counter()
+    writer = get_telemetry_writer()
+    writer.flush()
+    drained = wall_after + (time.perf_counter() - started)
+    rows_after = count_rows(dsn)
+
+    print(f"{args.handlers} обработчиков x {args.updates} апдейтов x 3 строки = {total_rows} строк")
+    print(format_latencies('синхронно (как было)', lat_before),
+          f" всё записано за {wall_before:6.2f} с, строк в БД: {rows_before}")
+    print(format_latencies('TelemetryWriter', lat_after),
+          f" всё записано за {drained:6.2f} с, строк в БД: {rows_after}")
+    print(f"Статистика: {writer.stats()}")
+    writer.shutdown()
+
+
+if __name__ == '__main__':
+    main()
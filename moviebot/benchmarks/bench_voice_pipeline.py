@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Подготовка голосового сообщения Шазама к распознаванию: временные файлы против декодирования в памяти.
+
+Как было: OGG пишется во временный файл, pydub (ffmpeg) конвертирует его во
+второй временный WAV, faster-whisper снова читает и декодирует WAV с диска.
+Если ffmpeg в системе нет, конвертация эмулируется PyAV с тем же набором
+файловых операций.
+Как стало: decode_ogg_bytes — байты из bot.download_file сразу в float32 16 кГц.
+
+Вторая часть — всплеск голосовых: поток на сообщение против TranscriptionPool.
+Whisper заменён моделью стоимости: --transcribe-ms на секунду аудио, при этом
+одна копия модели (num_workers=1) обслуживает вызовы строго по очереди.
+
+Запуск:
+    python -m moviebot.benchmarks.bench_voice_pipeline --seconds 8 --repeat 30 --burst 24
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from moviebot.benchmarks.common import format_latencies
+from moviebot.services.voice_pipeline import (
+    StageTimer, TranscriptionBusyError, TranscriptionPool, decode_ogg_bytes,
+)
+
+
+def make_voice(seconds, rate=48000, seed=1):
+    """Синтетическое «голосовое»: шум с огибающей в OGG/Opus, как присылает Telegram"""
+    import av
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(rate * seconds)) / rate
+    samples = (0.3 * rng.standard_normal(len(t)) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))).astype('float32')
+    buf = io.BytesIO()
+    container = av.open(buf, 'w', format='ogg')
+    stream = container.add_stream('libopus', rate=rate)
+    stream.layout = 'mono'
+    frame = av.AudioFrame.from_ndarray(samples[None, :], format='flt', layout='mono')
+    frame.sample_rate = rate
+    for packet in stream.encode(frame):
+        container.mux(packet)
+    for packet in stream.encode(None):
+        container.mux(packet)
+    container.close()
+    return buf.getvalue()
+
+
+def legacy_prepare(data, tmp_dir, name):
+    """OGG → файл → WAV-файл → decode_audio(путь), как в старом process_shazam_voice_async"""
+    from faster_whisper.audio import decode_audio
+    ogg_path = os.path.join(tmp_dir, f"{name}.ogg")
+    wav_path = os.path.join(tmp_dir, f"{name}.wav")
+    with open(ogg_path, 'wb') as f:
+        f.write(data)
+    if shutil.which('ffmpeg'):
+        from pydub import AudioSegment
+        AudioSegment.from_ogg(ogg_path).set_frame_rate(16000).set_channels(1).export(wav_path, format='wav')
+    else:
+        import soundfile
+        soundfile.write(wav_path, decode_audio(ogg_path, sampling_rate=16000), 16000, subtype='PCM_16')
+    audio = decode_audio(wav_path, sampling_rate=16000)
+    os.remove(ogg_path)
+    os.remove(wav_path)
+    return audio
+
+
+class WhisperCostModel:
+    def __init__(self, ms_per_second):
+        self.ms_per_second = ms_per_second
+        self.cpu = threading.Lock()
+
+    def __call__(self, audio):
+        with self.cpu:
+            time.sleep(len(audio) / 16000 * self.ms_per_second / 1000.0)
+        return 'текст'
+
+
+def burst(audio, count, transcribe):
+    latencies, rejected = [], []
+    lock = threading.Lock()
+
+    def handler():
+        started = time.perf_counter()
+        try:
+            transcribe(audio)
+        except TranscriptionBusyError:
+            with lock:
+                rejected.append(time.perf_counter() - started)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=handler) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=8.0, help='длительность голосового')
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--burst', type=int, default=24, help='голосовых одновременно')
+    parser.add_argument('--transcribe-ms', type=float, default=60, help='мс распознавания на секунду аудио')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue', type=int, default=8)
+    args = parser.parse_args()
+
+    data = make_voice(args.seconds)
+    converter = 'pydub/ffmpeg' if shutil.which('ffmpeg') else 'эмуляция PyAV (ffmpeg не найден)'
+    print(f"Голосовое {args.seconds:.0f} с, OGG {len(data) / 1024:.1f} КБ, конвертация «как было»: {converter}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy, in_memory = [], []
+        for i in range(args.repeat):
+            started = time.perf_counter()
+            legacy_prepare(data, tmp, f"voice_{i}")
+            legacy.append(time.perf_counter() - started)
+            timer = StageTimer()
+            with timer.stage('decode'):
+                decode_ogg_bytes(data)
+            in_memory.append(timer.timings['decode'])
+    print(format_latencies('временные файлы', legacy))
+    print(format_latencies('в памяти', in_memory))
+
+    audio = decode_ogg_bytes(data)
+    print(f"\nВсплеск из {args.burst} голосовых, распознавание {args.transcribe_ms * args.seconds:.0f} мс на сообщение")
+    latencies, _ = burst(audio, args.burst, WhisperCostModel(args.transcribe_ms))
+    print(format_latencies('поток на сообщение', latencies))
+    pool = TranscriptionPool(WhisperCostModel(args.transcribe_ms), workers=args.workers, max_queue=args.queue)
+    latencies, rejected = burst(audio, args.burst, pool.transcribe)
+    print(format_latencies(f"пул {args.workers}+{args.queue}", latencies))
+    print(f"    отклонено сразу: {len(rejected)}, {pool.stats()}")
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
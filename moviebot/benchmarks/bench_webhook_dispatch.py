@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест /webhook: поток на апдейт (старое поведение) против UpdateDispatcher.
+
+Апдейты берутся из debug_messages.json: если там записаны настоящие Telegram
+Update (есть update_id), они воспроизводятся как есть; иначе по записям строятся
+синтетические сообщения. Поток апдейтов размножается до --count и раскидывается
+по --chats чатам. Обработчик имитирует работу хендлера (sleep + опционально общий lock).
+
+Запуск:
+    python -m moviebot.benchmarks.bench_webhook_dispatch --count 2000 --chats 50 --handler-ms 20
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from moviebot.benchmarks.common import prepare_env
+
+DEFAULT_SOURCE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'debug_messages.json'
+)
+
+
+def load_updates(path, count, chats):
+    """Строит список Telegram Update из записанных сообщений"""
+    import telebot
+
+    with open(path, encoding='utf-8') as f:
+        records = json.load(f)
+    if isinstance(records, dict):
+        records = records.get('result') or records.get('updates') or [records]
+    if not records:
+        records = [{}]
+
+    updates = []
+    for i in range(count):
+        record = records[i % len(records)]
+        chat_id = -1000000000 - (i % chats)
+        if 'update_id' in record:
+            raw = json.loads(json.dumps(record))
+            raw['update_id'] = i
+            for key in ('message', 'edited_message', 'callback_query'):
+                if key in raw:
+                    target = raw[key].get('message', raw[key]) if key == 'callback_query' else raw[key]
+                    target.setdefault('chat', {})['id'] = chat_id
+        else:
+            sender_id = record.get('sender_id') or 100000 + i % chats
+            raw = {
+                'update_id': i,
+                'message': {
+                    'message_id': record.get('id', i),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'bench'},
+                    'from': {'id': sender_id, 'is_bot': False, 'first_name': 'bench'},
+                    'text': 'x' * int(record.get('text_length') or 1),
+                },
+            }
+        updates.append(telebot.types.Update.de_json(raw))
+    return updates
+
+
+def make_handler(handler_ms, shared_lock, order_log, order_lock):
+    """
+    Имитация хендлера: длительность плавает в пределах ±50% (детерминированно по update_id),
+    порядок фиксируется по завершении — именно он виден пользователю в чате.
+    """
+    def handle(update):
+        duration = handler_ms / 1000.0 * (0.5 + (update.update_id * 7919 % 100) / 100.0)
+        if shared_lock is not None:
+            with shared_lock:
+                time.sleep(duration / 4)
+            time.sleep(duration * 3 / 4)
+        else:
+            time.sleep(duration)
+        chat_id = update.message.chat.id if update.message else None
+        with order_lock:
+            order_log.setdefault(chat_id, []).append(update.update_id)
+    return handle
+
+
+def count_order_violations(order_log):
+    return sum(
+        1 for ids in order_log.values()
+        for a, b in zip(ids, ids[1:]) if b < a
+    )
+
+
+def run_thread_per_update(updates, handler):
+    peak_threads = threading.active_count()
+    started = time.perf_counter()
+    threads = []
+    for update in updates:
+        t = threading.Thread(target=handler, args=(update,), daemon=True)
+        t.start()
+        threads.append(t)
+        peak_threads = max(peak_threads, threading.active_count())
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started, peak_threads
+
+
+def run_dispatcher(updates, handler, workers, queue_size):
+    from moviebot.web.update_dispatcher import UpdateDispatcher
+
+    dispatcher = UpdateDispatcher(handler, workers=workers, max_queue=queue_size, name='bench-worker')
+    peak_threads = threading.active_count()
+    started = time.perf_counter()
+    for update in updates:
+        dispatcher.submit(update, timeout=60)
+        peak_threads = max(peak_threads, threading.active_count())
+    dispatcher.join()
+    elapsed = time.perf_counter() - started
+    dispatcher.shutdown()
+    return elapsed, peak_threads, dispatcher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help='файл с записанными апдейтами')
+    parser.add_argument('--count', type=int, default=2000, help='сколько апдейтов воспроизвести')
+    parser.add_argument('--chats', type=int, default=50, help='по скольким чатам распределить апдейты')
+    parser.add_argument('--handler-ms', type=float, default=20, help='имитация времени обработки апдейта')
+    parser.add_argument('--shared-lock', action='store_true',
+                        help='часть обработки под общим lock (как старый глобальный db_lock)')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--queue-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    prepare_env()
+    updates = load_updates(args.source, args.count, args.chats)
+    shared_lock = threading.Lock() if args.shared_lock else None
+
+    log_a, lock_a = {}, threading.Lock()
+    elapsed_a, peak_a = run_thread_per_update(updates, make_handler(args.handler_ms, shared_lock, log_a, lock_a))
+
+    log_b, lock_b = {}, threading.Lock()
+    elapsed_b, peak_b, stats = run_dispatcher(
+        updates, make_handler(args.handler_ms, shared_lock, log_b, lock_b), args.workers, args.queue_size
+    )
+
+    print(f"{args.count} апдейтов, {args.chats} чатов, обработка {args.handler_ms} мс")
+    print(f"поток на апдейт:  {args.count / elapsed_a:8.1f} апд/с  пик потоков={peak_a:<5} "
+          f"нарушений порядка={count_order_violations(log_a)}")
+    print(f"диспетчер ({args.workers} воркеров): {args.count / elapsed_b:8.1f} апд/с  пик потоков={peak_b:<5} "
+          f"нарушений порядка={count_order_violations(log_b)}")
+    print(f"метрики диспетчера: {stats}")
+
+
+if __name__ == '__main__':
+    main()
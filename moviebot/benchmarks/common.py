@@ -0,0 +1,41 @@
+"""
+Общие утилиты для бенчмарков
+"""
+import os
+import sys
+
+# Добавляем родительскую директорию в путь (movie_planner_bot, где находится moviebot)
+_moviebot_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_project_root = os.path.dirname(_moviebot_dir)
+if _project_root not in sys.path:
+    sys.path.insert(0, _project_root)
+
+
+def prepare_env(database_url=None):
+    """
+    moviebot.config требует BOT_TOKEN и DATABASE_URL при импорте.
+    Для локальных замеров подставляем заглушку токена (бот не запускается);
+    telebot проверяет формат «<числовой id>:<секрет>», поэтому id числовой.
+    """
+    os.environ.setdefault('BOT_TOKEN', '123456:benchmark')
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('DATABASE_URL', 'postgresql://postgres@localhost:5432/moviebot_bench')
+
+
+def percentile(values, pct):
+    """Перцентиль методом ближайшего ранга (values не обязаны быть отсортированы)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def format_latencies(label, seconds):
+    """Строка отчёта: количество, p50/p99/max в миллисекундах"""
+    ms = [s * 1000 for s in seconds]
+    return (
+        f"{label:<28} n={len(ms):<7} p50={percentile(ms, 50):8.2f} ms  "
+        f"p99={percentile(ms, 99):8.2f} ms  max={max(ms) if ms else 0:8.2f} ms"
+    )
@@ -4,7 +4,7 @@
 import telebot
 from telebot.types import BotCommand
 import logging
-from moviebot.config import TOKEN
+from moviebot.config import TOKEN, HANDLER_ROUTER_ENABLED
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +30,12 @@ bot = telebot.TeleBot(
 bot.privacy_mode = False
 logger.info("[BOT INIT] Privacy mode отключён — бот видит все сообщения и команды в группах")
 
+# Индекс обработчиков: колбэки по префиксу callback_data, сообщения по команде и состоянию
+if HANDLER_ROUTER_ENABLED:
+    from moviebot.bot.handler_router import HandlerRouter
+    HandlerRouter(bot).install()
+    logger.info("[BOT INIT] Индексированный выбор обработчиков включён")
+
 # Scheduler будет установлен при инициализации в main.py
 scheduler = None
 
@@ -12,8 +12,6 @@ from psycopg2.extras import RealDictCursor
 from moviebot.states import user_plan_state
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 # Глобальный кэш источников (должен быть один раз в начале файла, если нет — добавь)
 if 'streaming_sources_cache' not in globals():
@@ -88,6 +86,8 @@ def add_to_database_callback(call):
                     director = info.get('director')
                     actors = info.get('actors')
 
+                    from moviebot.database.film_catalog import upsert_film
+                    upsert_film(cursor_local, kp_id_str, info)
                     cursor_local.execute('''
                         INSERT INTO movies 
                         (chat_id, link, kp_id, title, year, genres, description, director, actors, is_series, added_by, added_at, source)
@@ -249,6 +249,8 @@ def plan_from_added_callback(call):
                     else:
                         # Добавляем новый
                         is_series_int = 1 if is_series else 0
+                        from moviebot.database.film_catalog import upsert_film
+                        upsert_film(cursor_local, str(kp_id), {'title': title, 'is_series': is_series})
                         cursor_local.execute('''
                             INSERT INTO movies (chat_id, kp_id, title, link, is_series, added_by, added_at, source)
                             VALUES (%s, %s, %s, %s, %s, %s, NOW(), 'plan_button')
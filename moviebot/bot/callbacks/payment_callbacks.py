@@ -22,6 +22,7 @@ from moviebot.config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY
 from moviebot.states import user_payment_state, user_promo_state
 from moviebot.utils.promo import apply_promocode, get_promocode_info
 from moviebot.utils.payments import create_stars_invoice
+from moviebot.utils.entitlements import invalidate_entitlements, invalidate_subscription_owner
 from datetime import datetime, timedelta
 import pytz
 
@@ -1605,8 +1606,11 @@ def register_payment_callbacks(bot_instance):
                                 UPDATE subscriptions 
                                 SET group_size = %s, price = %s
                                 WHERE id = %s
+                                RETURNING chat_id, user_id
                             """, (new_size, new_price_base, subscription_id))
+                            owner = cursor_update.fetchone()
                             conn_update.commit()
+                            invalidate_subscription_owner(owner)
                             logger.info(f"[PAYMENT EXPAND] Обновлен размер подписки {subscription_id} до {new_size}, цена={new_price_base}₽, действует с {next_payment_date}")
                     finally:
                         try:
@@ -3119,8 +3123,11 @@ def register_payment_callbacks(bot_instance):
                                     UPDATE subscriptions 
                                     SET activated_at = %s, expires_at = %s
                                     WHERE id = %s
+                                    RETURNING chat_id, user_id
                                 """, (next_payment_date, expires_at, new_subscription_id))
+                                owner = cursor_update.fetchone()
                                 conn_update.commit()
+                                invalidate_subscription_owner(owner)
                                 logger.info(f"[PAYMENT] Создана новая подписка {new_subscription_id} 'Все режимы' с activated_at={next_payment_date}, expires_at={expires_at}")
                         finally:
                             try:
@@ -3464,8 +3471,11 @@ def register_payment_callbacks(bot_instance):
                                 UPDATE subscriptions 
                                 SET activated_at = %s, expires_at = %s
                                 WHERE id = %s
+                                RETURNING chat_id, user_id
                             """, (next_payment_date, expires_at, new_subscription_id))
+                            owner = cursor_update.fetchone()
                             conn_update.commit()
+                            invalidate_subscription_owner(owner)
                             logger.info(f"[PAYMENT UPGRADE PERIOD] Создана новая подписка {new_subscription_id} с activated_at={next_payment_date}, expires_at={expires_at}")
                     finally:
                         try:
@@ -7267,6 +7277,7 @@ def register_payment_callbacks(bot_instance):
                             """, (chat_id, user_id, sub_type))
                             conn_local.commit()
                             rows_updated = cursor_local.rowcount
+                            invalidate_entitlements(user_id=user_id, chat_id=chat_id)
                     finally:
                         try:
                             cursor_local.close()
@@ -1008,6 +1008,8 @@ def premiere_notify_handler(call):
                 try:
                     # Если фильма нет в базе, добавляем его (но не коммитим пока)
                     if not film_already_in_db:
+                        from moviebot.database.film_catalog import upsert_film
+                        upsert_film(cursor_local, kp_id, info)
                         cursor_local.execute('''
                             INSERT INTO movies (chat_id, link, kp_id, title, year, genres, description, director, actors, is_series, added_by, added_at, source)
                             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), 'link')
@@ -20,7 +20,7 @@ from moviebot.api.kinopoisk_api import get_seasons_data, extract_movie_info
 
 from moviebot.utils.helpers import has_notifications_access, has_series_features_access, maybe_send_series_limit_message
 
-from moviebot.scheduler import send_series_notification, check_series_for_new_episodes
+from moviebot.scheduler import send_series_notification, check_series_for_new_episodes, schedule_series_check
 
 from moviebot.states import user_episodes_state, rating_messages, user_plan_state, user_episode_auto_mark_state
 
@@ -833,12 +833,7 @@ def series_subscribe_callback(call):
             next_check_date = datetime.now(pytz.utc) + timedelta(weeks=3)  # Если нет дат, проверка через 3 недели
         
         logger.info(f"[SERIES SUBSCRIBE] Постановка задачи проверки на {next_check_date}")
-        scheduler.add_job(
-            check_series_for_new_episodes,
-            'date',
-            run_date=next_check_date,
-            args=[kp_id, film_id, chat_id, user_id]
-        )
+        schedule_series_check(scheduler, chat_id, film_id, kp_id, user_id, next_check_date)
         logger.info(f"[SERIES SUBSCRIBE] Задача проверки поставлена успешно")
         
         logger.info(f"[SERIES SUBSCRIBE] Пользователь {user_id} подписался на сериал {title} (kp_id={kp_id})")
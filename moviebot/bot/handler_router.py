@@ -0,0 +1,248 @@
+"""
+Индексированный выбор обработчиков колбэков и сообщений.
+
+pyTelegramBotAPI проверяет фильтры всех ~200 callback_query_handler и ~80 message_handler
+по порядку на каждый апдейт; часть проверок сообщений смотрит состояния, ищет подстроки
+в тексте реплая и даже вызывает bot.get_chat. Роутер отбирает кандидатов заранее,
+а порядок и сами фильтры оставляет прежними — выбранный обработчик тот же, что и без индекса:
+
+- колбэки: из лямбды func=lambda call: call.data.startswith("x:") / call.data == "x" / их
+  or-комбинаций извлекаются префиксы и точные значения; по ним строится хэш-индекс
+  «префикс -> обработчики» (по одному поиску на каждую встречающуюся длину префикса);
+  обработчики с произвольными условиями проверяются всегда;
+- сообщения: индекс по content_type и команде; проверки, помеченные route_guard,
+  вызываются только если пользователь есть в одном из их состояний или реплай адресован
+  сообщению из их состояния (пара «состояние, reply_to message_id»);
+- регистрация не меняется: индекс перестраивается сам, когда добавляются обработчики.
+"""
+import ast
+import inspect
+import logging
+import textwrap
+import threading
+
+from telebot import util
+
+logger = logging.getLogger(__name__)
+
+
+def route_guard(user_states=(), reply_to=(), any_reply=False):
+    """
+    Объявляет необходимое условие проверки сообщения для роутера: проверка может вернуть True,
+    только если from_user.id есть в одном из user_states, ИЛИ reply_to_message.message_id есть
+    в одном из reply_to, ИЛИ (any_reply) сообщение — реплай. Саму проверку не меняет.
+    """
+    def decorate(check):
+        check._route_keys = (
+            tuple(('user', state) for state in user_states)
+            + tuple(('reply', state) for state in reply_to)
+            + ((('reply', None),) if any_reply else ())
+        )
+        return check
+    return decorate
+
+
+def _data_condition(node, arg):
+    """
+    Необходимое условие на call.data из выражения лямбды: (точные, префиксы) или None,
+    если условие не выражается через них.
+    """
+    def is_data(expr):
+        return (isinstance(expr, ast.Attribute) and expr.attr == 'data'
+                and isinstance(expr.value, ast.Name) and expr.value.id == arg)
+
+    def strings(expr):
+        if isinstance(expr, ast.Constant) and isinstance(expr.value, str):
+            return {expr.value}
+        if isinstance(expr, (ast.Tuple, ast.List, ast.Set)) and all(
+                isinstance(e, ast.Constant) and isinstance(e.value, str) for e in expr.elts):
+            return {e.value for e in expr.elts}
+        return None
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'startswith' \
+            and is_data(node.func.value) and len(node.args) == 1 and not node.keywords:
+        values = strings(node.args[0])
+        return (frozenset(), frozenset(values)) if values else None
+    if isinstance(node, ast.Compare) and len(node.ops) == 1:
+        left, right = node.left, node.comparators[0]
+        if isinstance(node.ops[0], ast.Eq):
+            if is_data(right):
+                left, right = right, left
+            values = strings(right) if is_data(left) and isinstance(right, ast.Constant) else None
+            return (frozenset(values), frozenset()) if values else None
+        if isinstance(node.ops[0], ast.In) and is_data(left):
+            values = strings(right) if not isinstance(right, ast.Constant) else None
+            return (frozenset(values), frozenset()) if values else None
+        return None
+    if isinstance(node, ast.BoolOp):
+        parts = [_data_condition(value, arg) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return next((part for part in parts if part is not None), None)
+        if any(part is None for part in parts):
+            return None
+        return (frozenset().union(*(p[0] for p in parts)), frozenset().union(*(p[1] for p in parts)))
+    return None
+
+
+def callback_data_condition(func):
+    """(точные значения, префиксы) call.data, без которых лямбда-фильтр не сработает; иначе None"""
+    code = getattr(func, '__code__', None)
+    if code is None or func.__name__ != '<lambda>' or code.co_argcount != 1:
+        return None
+    try:
+        lines, _ = inspect.getsourcelines(func)
+        tree = ast.parse(textwrap.dedent(''.join(lines)))
+    except (OSError, TypeError, SyntaxError):
+        return None
+    arg = code.co_varnames[0]
+    lambdas = [node for node in ast.walk(tree) if isinstance(node, ast.Lambda) and node.lineno == 1
+               and [a.arg for a in node.args.args] == [arg]]
+    if len(lambdas) != 1:
+        return None
+    return _data_condition(lambdas[0].body, arg)
+
+
+class _CallbackIndex:
+    def __init__(self, handlers):
+        self.exact = {}
+        self.prefixes = {}
+        always = []
+        for position, handler in enumerate(handlers):
+            filters = handler['filters']
+            func = filters.get('func')
+            condition = callback_data_condition(func) if func is not None and len(
+                [v for v in filters.values() if v is not None]) == 1 else None
+            if condition is None:
+                always.append(position)
+                continue
+            exact, prefixes = condition
+            for value in exact:
+                self.exact.setdefault(value, []).append(position)
+            for prefix in prefixes:
+                self.prefixes.setdefault(prefix, []).append(position)
+        self.always = frozenset(always)
+        self.lengths = sorted({len(prefix) for prefix in self.prefixes})
+        self.indexed = len(handlers) - len(always)
+
+    def candidates(self, call):
+        data = call.data
+        if not isinstance(data, str):
+            return self.always
+        found = set(self.always)
+        found.update(self.exact.get(data, ()))
+        for length in self.lengths:
+            if length > len(data):
+                break
+            found.update(self.prefixes.get(data[:length], ()))
+        return found
+
+
+class _MessageIndex:
+    def __init__(self, handlers):
+        self.unkeyed = {}  # content_type -> [позиции обработчиков без условий]
+        self.keyed = {}  # content_type -> {ключ: [позиции]}
+        self.states = {}  # ('user' | 'reply', id(состояния)) -> состояние
+        self.guarded = 0
+        for position, handler in enumerate(handlers):
+            filters = handler['filters']
+            keys = None
+            if filters.get('commands'):
+                keys = [('command', command) for command in filters['commands']]
+            elif getattr(filters.get('func'), '_route_keys', None):
+                keys = []
+                for kind, state in filters['func']._route_keys:
+                    if state is not None:
+                        self.states[(kind, id(state))] = state
+                    keys.append((kind, None if state is None else id(state)))
+                self.guarded += 1
+            for content_type in filters.get('content_types') or (None,):
+                if keys is None:
+                    self.unkeyed.setdefault(content_type, []).append(position)
+                else:
+                    by_key = self.keyed.setdefault(content_type, {})
+                    for key in keys:
+                        by_key.setdefault(key, []).append(position)
+
+    def candidates(self, message):
+        found = set(self.unkeyed.get(message.content_type, ()))
+        found.update(self.unkeyed.get(None, ()))
+        indexes = [index for index in (self.keyed.get(message.content_type), self.keyed.get(None)) if index]
+        if not indexes:
+            return found
+        keys = []
+        if message.content_type == 'text':
+            command = util.extract_command(message.text)
+            if command is not None:
+                keys.append(('command', command))
+        user = getattr(message, 'from_user', None)
+        reply = getattr(message, 'reply_to_message', None)
+        if reply is not None:
+            keys.append(('reply', None))
+        for (kind, state_id), state in self.states.items():
+            if kind == 'user' and user is not None and user.id in state:
+                keys.append((kind, state_id))
+            elif kind == 'reply' and reply is not None and reply.message_id in state:
+                keys.append((kind, state_id))
+        for index in indexes:
+            for key in keys:
+                found.update(index.get(key, ()))
+        return found
+
+
+class HandlerRouter:
+    """Подставляет в цикл pyTelegramBotAPI только обработчики-кандидаты (в исходном порядке)"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._lock = threading.Lock()
+        self._indexes = {}  # update_type -> (id списка, длина, индекс)
+        self._counters = {'updates': 0, 'handlers_total': 0, 'handlers_checked': 0}
+
+    def _index(self, update_type, handlers):
+        cached = self._indexes.get(update_type)
+        if cached is not None and cached[0] == id(handlers) and cached[1] == len(handlers):
+            return cached[2]
+        with self._lock:
+            index = _CallbackIndex(handlers) if update_type == 'callback_query' else _MessageIndex(handlers)
+            self._indexes[update_type] = (id(handlers), len(handlers), index)
+        logger.info(f"[HANDLER ROUTER] Индекс {update_type} перестроен: обработчиков {len(handlers)}")
+        return index
+
+    def select(self, update_type, handlers, update):
+        """Обработчики, фильтры которых могут сработать на update, в порядке регистрации"""
+        if update_type not in ('callback_query', 'message') or not handlers:
+            return handlers
+        positions = self._index(update_type, handlers).candidates(update)
+        selected = [handlers[i] for i in sorted(positions)]
+        with self._lock:
+            self._counters['updates'] += 1
+            self._counters['handlers_total'] += len(handlers)
+            self._counters['handlers_checked'] += len(selected)
+        return selected
+
+    def install(self):
+        """Оборачивает bot._run_middlewares_and_handler; регистрацию обработчиков не трогает"""
+        original = self.bot._run_middlewares_and_handler
+        bot = self.bot
+
+        def run(message, handlers, middlewares, update_type):
+            if handlers is bot.message_handlers or handlers is bot.callback_query_handlers:
+                try:
+                    handlers = self.select(update_type, handlers, message)
+                except Exception as e:
+                    logger.error(f"[HANDLER ROUTER] Ошибка выбора обработчиков, проверяем все: {e}", exc_info=True)
+            return original(message, handlers, middlewares, update_type)
+
+        bot._run_middlewares_and_handler = run
+        bot.handler_router = self
+        return self
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._counters)
+            for update_type, (_, size, index) in self._indexes.items():
+                result[update_type] = {
+                    'handlers': size,
+                    'indexed': index.indexed if update_type == 'callback_query' else index.guarded,
+                }
+        return result
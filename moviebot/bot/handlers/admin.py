@@ -10,10 +10,12 @@ from datetime import datetime
 import pytz
 
 from moviebot.states import user_unsubscribe_state, user_add_admin_state, user_check_state, user_check_receipt_state
+from moviebot.bot.handler_router import route_guard
 
 from moviebot.utils.admin import is_owner, is_admin, add_admin, remove_admin, get_all_admins
 
 from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
+from moviebot.utils.entitlements import invalidate_entitlements
 
 
 logger = logging.getLogger(__name__)
@@ -54,6 +56,10 @@ def cancel_subscription_by_id(target_id, is_group=False):
             
             count = cursor_local.rowcount
             conn_local.commit()
+            if is_group:
+                invalidate_entitlements(chat_id=target_id)
+            else:
+                invalidate_entitlements(user_id=target_id)
             
             if count > 0:
                 return True, f"Отменено подписок: {count}", count
@@ -663,6 +669,7 @@ def admin_back_callback(call):
         logger.error(f"[ADMIN] Ошибка в admin_back_callback: {e}", exc_info=True)
 
 
+@route_guard(reply_to=(user_check_receipt_state,))
 def check_admin_receipt_reply(message):
     """Проверяет, является ли сообщение реплаем на сообщение админу о платеже с файлом"""
     from moviebot.states import user_check_receipt_state
@@ -781,6 +788,7 @@ def handle_admin_receipt_reply(message):
             pass
 
 
+@route_guard(user_states=(user_check_state,))
 def check_check_id_reply(message):
     """Проверяет, является ли сообщение реплаем на сообщение команды /check с ID"""
     from moviebot.states import user_check_state
@@ -881,6 +889,7 @@ def handle_check_id_reply(message):
             pass
 
 
+@route_guard(user_states=(user_check_state,))
 def check_check_receipt_reply(message):
     """Проверяет, является ли сообщение реплаем на сообщение команды /check с файлом"""
     from moviebot.states import user_check_state
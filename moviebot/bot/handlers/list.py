@@ -11,13 +11,12 @@ from moviebot.database.db_operations import log_request
 from moviebot.states import user_list_state, list_messages, user_view_film_state, user_plan_state, user_mark_watched_state
 
 from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
+from moviebot.database.movie_list import fetch_unwatched_page, format_cursor, page_count, parse_cursor
 
 from moviebot.api.kinopoisk_api import extract_movie_info
 
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 
 def register_list_handlers(bot):
@@ -62,7 +61,9 @@ def register_list_handlers(bot):
             return
         
         try:
-            page = int(call.data.split(":")[1])
+            parts = call.data.split(":")
+            page = int(parts[1])
+            cursor = parse_cursor(parts[2]) if len(parts) > 2 else None
             
             state = user_list_state.get(user_id)
             if not state:
@@ -73,7 +74,7 @@ def register_list_handlers(bot):
                 return
             
             chat_id = state['chat_id']
-            show_list_page(bot, chat_id, user_id, page, call.message.message_id)
+            show_list_page(bot, chat_id, user_id, page, call.message.message_id, cursor)
         except Exception as e:
             logger.error(f"[LIST] Ошибка в handle_list_page: {e}", exc_info=True)
             try:
@@ -252,27 +253,15 @@ def register_list_handlers(bot):
                 pass
 
 
-def show_list_page(bot, chat_id, user_id, page=1, message_id=None):
-    """Показывает страницу списка фильмов"""
-    # ВАЖНО: Используем локальные соединения вместо глобальных
-    conn_local = get_db_connection()
-    cursor_local = get_db_cursor()
-    
+def show_list_page(bot, chat_id, user_id, page=1, message_id=None, cursor=None):
+    """
+    Показывает страницу списка фильмов. cursor — (направление, id крайнего фильма соседней
+    страницы) из кнопок «Назад»/«Вперёд», см. database/movie_list.py
+    """
     try:
-        MOVIES_PER_PAGE = 15
-        
-        with db_lock:
-            # Получаем все непросмотренные фильмы, отсортированные по алфавиту
-            cursor_local.execute('''
-                SELECT DISTINCT m.id, m.kp_id, m.title, m.year, m.genres, m.link 
-                FROM movies m
-                WHERE m.chat_id = %s 
-                  AND m.watched = 0
-                ORDER BY m.title
-            ''', (chat_id,))
-            rows = cursor_local.fetchall()
+        page, total_movies, page_movies = fetch_unwatched_page(chat_id, page, cursor)
         
-        if not rows:
+        if not page_movies:
             text = "⏳ Нет непросмотренных фильмов!"
             markup = InlineKeyboardMarkup()
             markup.add(InlineKeyboardButton("◀️ Назад в базу", callback_data="back_to_database"))
@@ -286,14 +275,7 @@ def show_list_page(bot, chat_id, user_id, page=1, message_id=None):
             logger.info(f"✅ Ответ на /list отправлен пользователю {user_id}: нет фильмов")
             return
         else:
-            total_movies = len(rows)
-            total_pages = (total_movies + MOVIES_PER_PAGE - 1) // MOVIES_PER_PAGE
-            page = max(1, min(page, total_pages))
-            
-            # Вычисляем диапазон фильмов для текущей страницы
-            start_idx = (page - 1) * MOVIES_PER_PAGE
-            end_idx = min(start_idx + MOVIES_PER_PAGE, total_movies)
-            page_movies = rows[start_idx:end_idx]
+            total_pages = page_count(total_movies)
             
             # Формируем текст страницы
             text = f"⏳ Непросмотренные фильмы (страница {page}/{total_pages}):\n\n"
@@ -361,9 +343,11 @@ def show_list_page(bot, chat_id, user_id, page=1, message_id=None):
                 # Добавляем кнопки навигации (без кнопки "Страница X/Y")
                 nav_buttons = []
                 if page > 1:
-                    nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"list_page:{page-1}"))
+                    back_cursor = format_cursor('b', page_movies[0]['id'])
+                    nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"list_page:{page-1}:{back_cursor}"))
                 if page < total_pages:
-                    nav_buttons.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"list_page:{page+1}"))
+                    next_cursor = format_cursor('a', page_movies[-1]['id'])
+                    nav_buttons.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"list_page:{page+1}:{next_cursor}"))
                 if nav_buttons:
                     markup.row(*nav_buttons)
             
@@ -399,18 +383,6 @@ def show_list_page(bot, chat_id, user_id, page=1, message_id=None):
     except Exception as e:
         logger.error(f"[LIST] Ошибка в show_list_page: {e}", exc_info=True)
         return None
-    finally:
-        # Закрываем локальные соединения
-        if 'cursor_local' in locals():
-            try:
-                cursor_local.close()
-            except:
-                pass
-        if 'conn_local' in locals():
-            try:
-                conn_local.close()
-            except:
-                pass
 
 
 def handle_view_film_reply_internal(message, state):
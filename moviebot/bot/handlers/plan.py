@@ -103,6 +103,8 @@ def process_plan(bot, user_id, chat_id, link, plan_type, day_or_date, message_da
                     # Обновляем kp_id из info, если он есть
                     if kp_id_from_info:
                         kp_id = kp_id_from_info
+                    from moviebot.database.film_catalog import upsert_film
+                    upsert_film(cursor_local, kp_id, info)
                     cursor_local.execute('INSERT INTO movies (chat_id, link, kp_id, title, year, genres, description, director, actors, is_series) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (chat_id, kp_id) DO UPDATE SET link = EXCLUDED.link, is_series = EXCLUDED.is_series', 
                                  (chat_id, link, kp_id, info['title'], info['year'], info['genres'], info['description'], info['director'], info['actors'], is_series_val))
                     conn_local.commit()
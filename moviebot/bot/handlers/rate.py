@@ -14,8 +14,6 @@ from moviebot.database.db_connection import get_db_connection, get_db_cursor, db
 
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 
 def register_rate_handlers(bot):
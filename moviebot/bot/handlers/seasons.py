@@ -13,13 +13,12 @@ from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from moviebot.database.db_operations import log_request
 from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
+from moviebot.database.film_catalog import save_series_episode_count
 from moviebot.utils.helpers import has_notifications_access, has_series_features_access
 from moviebot.api.kinopoisk_api import get_seasons_data, extract_movie_info
 from moviebot.states import user_episodes_state, user_episode_auto_mark_state
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 
 def get_series_airing_status(kp_id):
@@ -1153,7 +1152,8 @@ def handle_seasons_pagination(call):
             for item in series_data['items']:
                 kp_id = item['kp_id']
                 is_airing, next_ep = get_series_airing_status(kp_id)
-                seasons_count = len(get_seasons_data(str(kp_id))) if get_seasons_data(kp_id) else 0
+                seasons_data = get_seasons_data(str(kp_id))
+                seasons_count = len(seasons_data) if seasons_data else 0
                 
                 # Сериализуем next_ep с обработкой datetime
                 def default_serializer(o):
@@ -1170,6 +1170,7 @@ def handle_seasons_pagination(call):
                             UPDATE movies SET is_ongoing = %s, seasons_count = %s, next_episode = %s, last_api_update = NOW()
                             WHERE chat_id = %s AND kp_id = %s
                         """, (is_airing, seasons_count, next_ep_json, chat_id, kp_id))
+                        save_series_episode_count(cursor_local, kp_id, seasons_data)
                         conn_local.commit()
                 finally:
                     try:
@@ -20,6 +20,8 @@ from moviebot.database.db_operations import (
     get_watched_emojis, get_user_timezone, get_notification_settings, set_notification_setting
 )
 from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
+from moviebot.database.telemetry import discard_request_logs
+from moviebot.database.film_catalog import GENRES_FILTER_SQL, DIRECTORS_FILTER_SQL, ACTORS_FILTER_SQL, upsert_film
 from moviebot.database.db_operations import get_user_timezone_or_default, get_user_films_count
 from moviebot.utils.helpers import extract_film_info_from_existing
 from moviebot.api.kinopoisk_api import search_films, extract_movie_info, get_premieres_for_period, get_seasons_data, search_films_by_filters, get_film_distribution, search_persons, get_staff
@@ -28,6 +30,8 @@ from moviebot.utils.parsing import parse_plan_date_text
 from moviebot.bot.handlers.seasons import get_series_airing_status, count_episodes_for_watch_check
 
 from moviebot.config import KP_TOKEN, PLANS_TZ, TOKEN
+from moviebot.services.kp_import import run_import, claim_interrupted_imports
+from moviebot.services import random_index
 
 from moviebot.states import (
 
@@ -35,6 +39,7 @@ from moviebot.states import (
     user_settings_state, settings_messages, bot_messages, added_movie_messages,
     dice_game_state, user_import_state
 )
+from moviebot.bot.handler_router import route_guard
 from moviebot.bot.handlers.text_messages import expect_text_from_user
 
 from moviebot.utils.parsing import extract_kp_id_from_text, show_timezone_selection, extract_kp_user_id
@@ -94,9 +99,10 @@ def get_film_current_state(chat_id, kp_id, user_id=None):
             logger.info(f"[GET FILM STATE] db_lock получен, выполняем запросы")
             # Получаем информацию о фильме
             cursor_local.execute("""
-                SELECT id, title, watched, is_series
-                FROM movies 
-                WHERE chat_id = %s AND kp_id = %s
+                SELECT m.id, COALESCE(f.title, m.title) AS title, m.watched, m.is_series
+                FROM movies m
+                LEFT JOIN films f ON f.kp_id = m.kp_id
+                WHERE m.chat_id = %s AND m.kp_id = %s
             """, (chat_id, kp_id_str))
             film_row = cursor_local.fetchone()
             logger.info(f"[GET FILM STATE] Запрос к movies выполнен, film_row={film_row is not None}")
@@ -3073,54 +3079,8 @@ def _show_period_step(call, chat_id, user_id):
             logger.info(f"[RANDOM] Kinopoisk mode: showing all periods")
 
         else:
-            # database mode — САМЫЙ ЧАСТЫЙ СЛУЧАЙ → убираем lock полностью
-            base_query = """
-                SELECT COUNT(DISTINCT m.id) AS count
-                FROM movies m
-                LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
-                WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
-            """
-            is_series_filter = ""
-            if content_type == 'films':
-                is_series_filter = "AND m.is_series = 0"
-            elif content_type == 'series':
-                is_series_filter = "AND m.is_series = 1"
-            
-            base_query += f" {is_series_filter}"
-            params = [chat_id]
-            
-            for period in all_periods:
-                if period == "До 1980":
-                    condition = "m.year < 1980"
-                elif period == "1980–1990":
-                    condition = "(m.year >= 1980 AND m.year <= 1990)"
-                elif period == "1990–2000":
-                    condition = "(m.year >= 1990 AND m.year <= 2000)"
-                elif period == "2000–2010":
-                    condition = "(m.year >= 2000 AND m.year <= 2010)"
-                elif period == "2010–2020":
-                    condition = "(m.year >= 2010 AND m.year <= 2020)"
-                elif period == "2020–сейчас":
-                    condition = "m.year >= 2020"
-                else:
-                    continue
-                
-                query = f"{base_query} AND {condition}"
-                
-                conn_local = get_db_connection()
-                cursor_local = get_db_cursor()
-                try:
-                    cursor_local.execute(query, tuple(params))   # ← lock убрали
-                    count_row = cursor_local.fetchone()
-                    count = count_row['count'] if count_row else 0
-                    
-                    if count > 0:
-                        available_periods.append(period)
-                finally:
-                    try: cursor_local.close()
-                    except: pass
-                    try: conn_local.close()
-                    except: pass
+            # database mode — САМЫЙ ЧАСТЫЙ СЛУЧАЙ → периоды с фильмами по индексу фильтров чата
+            available_periods = random_index.available_periods(chat_id, content_type)
         
         logger.info(f"[RANDOM CALLBACK] Available periods: {available_periods}")
         
@@ -4431,19 +4391,7 @@ def ensure_movie_in_database(kp_id, title=None):
                 info = extract_movie_info(link)
                 
                 if info:
-                    cursor_local.execute("""
-                        INSERT INTO films (kp_id, title, year, genres, director, actors, description, is_series)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        kp_id,
-                        info.get('title') or title,
-                        info.get('year'),
-                        info.get('genres'),
-                        info.get('director'),
-                        info.get('actors'),
-                        info.get('description'),
-                        info.get('is_series', False)
-                    ))
+                    upsert_film(cursor_local, kp_id, dict(info, title=info.get('title') or title))
                     conn_local.commit()
                     logger.info(f"[ENSURE MOVIE] Фильм {kp_id} добавлен в базу")
                 else:
@@ -4763,6 +4711,8 @@ def ensure_movie_in_database(chat_id, kp_id, link, info, user_id=None):
                 else:
                     year_value = None
                 
+                from moviebot.database.film_catalog import upsert_film
+                upsert_film(cursor_local, str(kp_id), info)
                 cursor_local.execute('''
                     INSERT INTO movies (chat_id, link, kp_id, title, year, genres, description, director, actors, is_series, added_by, added_at, source)
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), 'link')
@@ -4803,156 +4753,81 @@ def ensure_movie_in_database(chat_id, kp_id, link, info, user_id=None):
         logger.info(f"[ENSURE MOVIE] ===== END (ошибка) =====")
         return None, False
 
-def import_kp_ratings(kp_user_id, chat_id, user_id, max_count=100):
-    """Импортирует оценки из Кинопоиска"""
-    headers = {'X-API-KEY': KP_TOKEN, 'accept': 'application/json'}
-    base_url = f"https://kinopoiskapiunofficial.tech/api/v1/kp_users/{kp_user_id}/votes"
-    
-    imported_count = 0
-    page = 1
-    max_pages = min(75, (max_count + 19) // 20)  # Максимум 75 страниц, по 20 фильмов на странице
-    
+def import_kp_ratings(kp_user_id, chat_id, user_id, max_count=100, on_progress=None, status_message_id=None):
+    """Импортирует оценки из Кинопоиска; возвращает число новых оценок (см. services/kp_import.py)"""
     try:
-        while imported_count < max_count and page <= max_pages:
-            url = f"{base_url}?page={page}"
-            logger.info(f"[IMPORT] Запрос страницы {page}: {url}")
-            
-            response = requests.get(url, headers=headers, timeout=15)
-            if response.status_code != 200:
-                logger.error(f"[IMPORT] Ошибка {response.status_code}: {response.text[:200]}")
-                break
-            
-            data = response.json()
-            items = data.get('items', [])
-            
-            if not items or len(items) == 0:
-                logger.info(f"[IMPORT] Нет больше фильмов на странице {page}")
-                break
-            
-            # Обрабатываем фильмы на странице
-            for item in items:
-                if imported_count >= max_count:
-                    break
-                
-                kp_id = str(item.get('kinopoiskId'))
-                if not kp_id:
-                    continue
-                
-                # Получаем тип (FILM или TV_SERIES) - теперь сохраняем все типы
-                film_type = item.get('type', 'FILM')  # FILM или TV_SERIES
-                
-                user_rating = item.get('userRating')
-                if not user_rating or user_rating < 1 or user_rating > 10:
-                    continue
-                
-                # Получаем год и жанры из данных импорта
-                film_year = item.get('year')
-                film_genres_list = item.get('genres', [])
-                film_genres_str = ', '.join([g.get('genre', '') for g in film_genres_list if g.get('genre')]) if film_genres_list else None
-                
-                # Формируем ссылку в зависимости от типа
-                if film_type == 'TV_SERIES':
-                    link = f"https://www.kinopoisk.ru/series/{kp_id}/"
-                else:
-                    link = f"https://www.kinopoisk.ru/film/{kp_id}/"
-                
-                # Импортированные оценки НЕ добавляют фильмы в базу группы
-                # Они существуют только как оценки в таблице ratings с is_imported = TRUE
-                # Для импортированных оценок используем film_id = NULL или создаем виртуальный film_id
-                conn_local = get_db_connection()
-                cursor_local = get_db_cursor()
-                try:
-                    with db_lock:
-                        # Проверяем, есть ли фильм в базе группы (добавлен через бота)
-                        cursor_local.execute('SELECT id FROM movies WHERE chat_id = %s AND kp_id = %s', (chat_id, str(str(kp_id))))
-                        film_row = cursor_local.fetchone()
-                        
-                        if film_row:
-                            # Фильм уже есть в базе группы - можем добавить импортированную оценку
-                            film_id = film_row.get('id') if isinstance(film_row, dict) else film_row[0]
-                            logger.debug(f"[IMPORT] Фильм {kp_id} уже существует в базе группы, film_id={film_id}")
-                            
-                            # Проверяем, есть ли уже оценка у этого пользователя для этого фильма
-                            cursor_local.execute('''
-                                SELECT rating FROM ratings 
-                                WHERE chat_id = %s AND film_id = %s AND user_id = %s
-                            ''', (chat_id, film_id, user_id))
-                            existing_rating = cursor_local.fetchone()
-                            
-                            if existing_rating:
-                                # Оценка уже есть, пропускаем
-                                cursor_local.execute('SELECT title FROM movies WHERE id = %s', (film_id,))
-                                title_row = cursor_local.fetchone()
-                                title = title_row.get('title') if isinstance(title_row, dict) else (title_row[0] if title_row else 'Неизвестно')
-                                logger.debug(f"[IMPORT] Фильм {title} уже имеет оценку, пропускаем")
-                                continue
-                            
-                            # Добавляем импортированную оценку для существующего фильма
-                            cursor_local.execute('''
-                                INSERT INTO ratings (chat_id, film_id, user_id, rating, is_imported, kp_id, year, genres, type)
-                                VALUES (%s, %s, %s, %s, TRUE, %s, %s, %s, %s)
-                                ON CONFLICT (chat_id, film_id, user_id) DO UPDATE SET rating = EXCLUDED.rating, is_imported = TRUE, kp_id = EXCLUDED.kp_id, year = EXCLUDED.year, genres = EXCLUDED.genres, type = EXCLUDED.type
-                            ''', (chat_id, film_id, user_id, user_rating, kp_id, film_year, film_genres_str, film_type))
-                            conn_local.commit()
-                            
-                            imported_count += 1
-                            cursor_local.execute('SELECT title FROM movies WHERE id = %s', (film_id,))
-                            title_row = cursor_local.fetchone()
-                            title = title_row.get('title') if isinstance(title_row, dict) else (title_row[0] if title_row else 'Неизвестно')
-                            logger.info(f"[IMPORT] Импортирован фильм {title} с оценкой {user_rating}")
-                        else:
-                            # Фильма нет в базе группы - создаем импортированную оценку БЕЗ добавления фильма в movies
-                            # Используем film_id = NULL и kp_id для хранения импортированных оценок
-                            title = item.get('nameRu') or item.get('nameEn') or 'Без названия'
-                            
-                            # Проверяем, есть ли уже импортированная оценка для этого kp_id и пользователя
-                            cursor_local.execute('''
-                                SELECT rating FROM ratings 
-                                WHERE chat_id = %s AND kp_id = %s AND user_id = %s AND film_id IS NULL
-                            ''', (chat_id, kp_id, user_id))
-                            existing_imported_rating = cursor_local.fetchone()
-                            
-                            if existing_imported_rating:
-                                logger.debug(f"[IMPORT] Импортированная оценка для фильма {kp_id} ({title}) уже существует, пропускаем")
-                                continue
-                            
-                            # Добавляем импортированную оценку БЕЗ film_id (film_id = NULL)
-                            cursor_local.execute('''
-                                INSERT INTO ratings (chat_id, film_id, user_id, rating, is_imported, kp_id, year, genres, type)
-                                VALUES (%s, NULL, %s, %s, TRUE, %s, %s, %s, %s)
-                            ''', (chat_id, user_id, user_rating, kp_id, film_year, film_genres_str, film_type))
-                            conn_local.commit()
-                            
-                            imported_count += 1
-                            logger.info(f"[IMPORT] Импортирован фильм {title} (kp_id={kp_id}) с оценкой {user_rating} (без добавления в базу группы)")
-                except Exception as db_error:
-                    logger.error(f"[IMPORT] Ошибка при работе с БД для фильма {kp_id}: {db_error}", exc_info=True)
-                    try:
-                        conn_local.rollback()
-                    except:
-                        pass
-                    continue
-                finally:
-                    try:
-                        cursor_local.close()
-                    except:
-                        pass
-                    try:
-                        conn_local.close()
-                    except:
-                        pass
-            
-            # Если получили меньше 20 фильмов, значит страницы закончились
-            if len(items) < 20:
-                logger.info(f"[IMPORT] Получено меньше 20 фильмов, заканчиваем")
-                break
-            
-            page += 1
-        
-        return imported_count
+        return run_import(kp_user_id, chat_id, user_id, max_count, on_progress=on_progress,
+                          status_message_id=status_message_id).imported
     except Exception as e:
         logger.error(f"[IMPORT] Ошибка при импорте: {e}", exc_info=True)
-        return imported_count
+        return 0
+
+
+def _import_progress_text(kp_user_id, count, imported, page=None, max_pages=None):
+    text = (f"📥 <b>Импорт базы из Кинопоиска</b>\n\n"
+            f"ID пользователя: <code>{kp_user_id}</code>\n"
+            f"Количество: {count}\n\n"
+            f"⏳ Загружено новых оценок: <b>{imported}</b>")
+    if page is not None:
+        text += f" (страница {page} из {max_pages})"
+    return text + "\nВы получите уведомление по завершении."
+
+
+def run_import_with_status(kp_user_id, chat_id, user_id, count, status_message_id):
+    """Импорт с обновлением сообщения о статусе: прогресс не чаще раза в 2 секунды, затем итог"""
+    last_edit = [time.monotonic()]
+
+    def on_progress(imported, page, max_pages):
+        if time.monotonic() - last_edit[0] < 2:
+            return
+        last_edit[0] = time.monotonic()
+        bot.edit_message_text(_import_progress_text(kp_user_id, count, imported, page, max_pages),
+                              chat_id, status_message_id, parse_mode='HTML')
+
+    try:
+        result = run_import(kp_user_id, chat_id, user_id, count, on_progress=on_progress,
+                            status_message_id=status_message_id)
+        if result.complete:
+            text = (f"✅ <b>Импорт завершён!</b>\n\n"
+                    f"ID пользователя: <code>{kp_user_id}</code>\n"
+                    f"Загружено новых оценок: <b>{result.imported}</b>\n\n"
+                    f"Оценки загружены в базу! 🎉")
+        else:
+            text = (f"⚠️ <b>Импорт прерван</b>\n\n"
+                    f"ID пользователя: <code>{kp_user_id}</code>\n"
+                    f"Загружено новых оценок: <b>{result.imported}</b>\n\n"
+                    f"Кинопоиск не ответил. Запустите импорт этого профиля ещё раз — "
+                    f"он продолжится с того же места.")
+        bot.edit_message_text(text, chat_id, status_message_id, parse_mode='HTML')
+        logger.info(f"[IMPORT] Импорт для user_id={user_id}, kp_user_id={kp_user_id}: imported={result.imported}, "
+                    f"complete={result.complete}")
+    except Exception as e:
+        logger.error(f"[IMPORT] Ошибка в фоновом импорте: {e}", exc_info=True)
+        try:
+            bot.edit_message_text(
+                f"❌ <b>Ошибка при импорте</b>\n\n"
+                f"Произошла ошибка: {str(e)[:200]}",
+                chat_id, status_message_id, parse_mode='HTML'
+            )
+        except:
+            pass
+
+
+def resume_interrupted_kp_imports():
+    """Продолжает в фоне импорты, оборванные перезапуском бота"""
+    try:
+        jobs = claim_interrupted_imports()
+    except Exception as e:
+        logger.error(f"[IMPORT] Не удалось получить прерванные импорты: {e}", exc_info=True)
+        return 0
+    for job in jobs:
+        logger.info(f"[IMPORT] Продолжаем импорт kp_user_id={job['kp_user_id']} для chat_id={job['chat_id']}")
+        threading.Thread(
+            target=run_import_with_status,
+            args=(job['kp_user_id'], job['chat_id'], job['user_id'], job['max_count'], job['status_message_id']),
+            daemon=True
+        ).start()
+    return len(jobs)
 
 
 def handle_import_user_id_internal(message, state):
@@ -5018,31 +4893,8 @@ def handle_import_count_callback(call):
         del user_import_state[user_id]
         
         # Запускаем импорт в фоновом потоке
-        
         def background_import():
-            try:
-                imported = import_kp_ratings(kp_user_id, chat_id, user_id, count)
-                
-                # Отправляем результат
-                bot.edit_message_text(
-                    f"✅ <b>Импорт завершён!</b>\n\n"
-                    f"ID пользователя: <code>{kp_user_id}</code>\n"
-                    f"Загружено новых оценок: <b>{imported}</b>\n\n"
-                    f"Оценки загружены в базу! 🎉",
-                    chat_id, status_msg.message_id, parse_mode='HTML'
-                )
-                
-                logger.info(f"[IMPORT] Импорт завершён для user_id={user_id}, kp_user_id={kp_user_id}, imported={imported}")
-            except Exception as e:
-                logger.error(f"[IMPORT] Ошибка в фоновом импорте: {e}", exc_info=True)
-                try:
-                    bot.edit_message_text(
-                        f"❌ <b>Ошибка при импорте</b>\n\n"
-                        f"Произошла ошибка: {str(e)[:200]}",
-                        chat_id, status_msg.message_id, parse_mode='HTML'
-                    )
-                except:
-                    pass
+            run_import_with_status(kp_user_id, chat_id, user_id, count, status_msg.message_id)
         
         # Запускаем в отдельном потоке
         import_thread = threading.Thread(target=background_import, daemon=True)
@@ -5082,6 +4934,9 @@ def handle_clean_confirm_internal(message):
         stats_deleted = 0
         settings_deleted = 0
         tags_deleted = 0
+        # Ещё не записанная телеметрия пользователя иначе вернётся в stats после удаления.
+        # До транзакции: сброс телеметрии не должен ждать блокировок, которые она возьмёт
+        discard_request_logs(chat_id, user_id)
         try:
             with db_lock:
                 # Удаляем оценки пользователя (но не импортированные - они удаляются отдельной командой)
@@ -5199,6 +5054,7 @@ def handle_clean_confirm_internal(message):
         stats_deleted = 0
         settings_deleted = 0
         tags_deleted = 0
+        discard_request_logs(chat_id)
         try:
             with db_lock:
                 cursor_local.execute('DELETE FROM ratings WHERE chat_id = %s', (chat_id,))
@@ -5407,6 +5263,7 @@ def send_event_prompt(bot, message_or_call, state, text, markup=None):
     return sent
 
 # === Текст: название и дата ===
+@route_guard(user_states=(user_ticket_state,))
 def is_event_text(message):
     # Пропускаем, если пользователь в состоянии /add_tags
     from moviebot.bot.handlers.tags import user_add_tag_state
@@ -5464,6 +5321,7 @@ def handle_event_text(message):
                           markup)
 
 # === Фото/файл: один билет ===
+@route_guard(user_states=(user_ticket_state,))
 def is_event_file(message):
     from moviebot.states import is_user_in_valid_ticket_state
     user_id = message.from_user.id
@@ -5566,11 +5424,11 @@ def _show_genre_step(call, chat_id, user_id):
             
             base_query = """
                 SELECT DISTINCT genre FROM (
-                    SELECT DISTINCT TRIM(UNNEST(string_to_array(m.genres, ', '))) as genre
+                    SELECT DISTINCT fg.genre
                     FROM movies m
                     JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id
-                    WHERE m.chat_id = %s AND r.user_id = %s AND r.rating IN (9, 10) AND r.is_imported = TRUE
-                    AND m.genres IS NOT NULL AND m.genres != '' AND m.genres != '—' """ + is_series_filter + """
+                    JOIN film_genres fg ON fg.kp_id = m.kp_id
+                    WHERE m.chat_id = %s AND r.user_id = %s AND r.rating IN (9, 10) AND r.is_imported = TRUE """ + is_series_filter + """
             """
             params = [chat_id, user_id]
             
@@ -5646,10 +5504,10 @@ def _show_genre_step(call, chat_id, user_id):
             # mixed - фильтр не добавляем
             
             base_query = """
-                SELECT DISTINCT TRIM(UNNEST(string_to_array(m.genres, ', '))) as genre
+                SELECT DISTINCT fg.genre
                 FROM movies m
+                JOIN film_genres fg ON fg.kp_id = m.kp_id
                 WHERE m.chat_id = %s """ + is_series_filter + """
-                AND m.genres IS NOT NULL AND m.genres != '' AND m.genres != '—'
                 AND EXISTS (
                     SELECT 1 FROM ratings r 
                     WHERE r.film_id = m.id AND r.chat_id = m.chat_id AND (r.is_imported = FALSE OR r.is_imported IS NULL) 
@@ -5661,27 +5519,13 @@ def _show_genre_step(call, chat_id, user_id):
             
         else:
             # Обычный режим (database) – жанры из непросмотренных фильмов/сериалов чата
-            # Учитываем content_type: films - только фильмы, series - только сериалы, mixed - оба
-            is_series_filter = ""
-            if content_type == 'films':
-                is_series_filter = "AND m.is_series = 0"
-            elif content_type == 'series':
-                is_series_filter = "AND m.is_series = 1"
-            # mixed - фильтр не добавляем
-            
-            base_query = """
-                SELECT DISTINCT TRIM(UNNEST(string_to_array(m.genres, ', '))) as genre
-                FROM movies m
-                LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
-                WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL """ + is_series_filter + """
-                AND m.genres IS NOT NULL AND m.genres != '' AND m.genres != '—'
-            """
-            params = [chat_id]
+            # по индексу фильтров чата (учитывает content_type и периоды)
+            base_query = None
         
         # --------------------- Фильтр по периодам ---------------------
         # Для my_votes фильтр по периодам уже применен в запросе выше
         # Для остальных режимов применяем фильтр здесь
-        if periods and mode != 'my_votes':
+        if periods and base_query is not None and mode != 'my_votes':
             period_conditions = []
             for p in periods:
                 if p == "До 1980":
@@ -5701,26 +5545,30 @@ def _show_genre_step(call, chat_id, user_id):
         
         # --------------------- Выполняем запрос ---------------------
         genres = []  # всегда инициализируем, даже если запрос вернёт пусто
-        conn_local = get_db_connection()
-        cursor_local = get_db_cursor()
-        try:
-            with db_lock:
-                cursor_local.execute(base_query, params)
-                rows = cursor_local.fetchall()
-                
-                for row in rows:
-                    genre = row.get('genre') if isinstance(row, dict) else (row[0] if row else None)
-                    if genre and genre.strip():
-                        genres.append(genre.strip())
-        finally:
-            try:
-                cursor_local.close()
-            except:
-                pass
+        if base_query is None:
+            genres = [genre.strip() for genre in random_index.available_genres(chat_id, content_type, periods)
+                      if genre and genre.strip()]
+        else:
+            conn_local = get_db_connection()
+            cursor_local = get_db_cursor()
             try:
-                conn_local.close()
-            except:
-                pass
+                with db_lock:
+                    cursor_local.execute(base_query, params)
+                    rows = cursor_local.fetchall()
+                    
+                    for row in rows:
+                        genre = row.get('genre') if isinstance(row, dict) else (row[0] if row else None)
+                        if genre and genre.strip():
+                            genres.append(genre.strip())
+            finally:
+                try:
+                    cursor_local.close()
+                except:
+                    pass
+                try:
+                    conn_local.close()
+                except:
+                    pass
         
         # Исключаем нежелательные жанры
         genres = [g for g in genres if g.lower() not in [eg.lower() for eg in EXCLUDED_GENRES]]
@@ -6597,68 +6445,9 @@ def _show_director_step(call, chat_id, user_id):
         periods = state.get('periods', [])
         genres = state.get('genres', [])
         
-        # Формируем WHERE условие с учетом периодов и жанров
-        base_query = """
-            SELECT m.director, COUNT(*) as cnt
-            FROM movies m
-            LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
-            WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
-            AND m.director IS NOT NULL AND m.director != 'Не указан' AND m.director != ''
-        """
-        params = [chat_id]
-        
-        # Добавляем фильтр по периодам, если они выбраны
-        if periods:
-            period_conditions = []
-            for p in periods:
-                if p == "До 1980":
-                    period_conditions.append("m.year < 1980")
-                elif p == "1980–1990":
-                    period_conditions.append("(m.year >= 1980 AND m.year <= 1990)")
-                elif p == "1990–2000":
-                    period_conditions.append("(m.year >= 1990 AND m.year <= 2000)")
-                elif p == "2000–2010":
-                    period_conditions.append("(m.year >= 2000 AND m.year <= 2010)")
-                elif p == "2010–2020":
-                    period_conditions.append("(m.year >= 2010 AND m.year <= 2020)")
-                elif p == "2020–сейчас":
-                    period_conditions.append("m.year >= 2020")
-            if period_conditions:
-                base_query += " AND (" + " OR ".join(period_conditions) + ")"
-        
-        # Добавляем фильтр по жанрам, если они выбраны
-        if genres:
-            genre_conditions = []
-            for genre in genres:
-                genre_conditions.append("m.genres ILIKE %s")
-                params.append(f"%{genre}%")
-            if genre_conditions:
-                base_query += " AND (" + " OR ".join(genre_conditions) + ")"
-        
-        base_query += " GROUP BY m.director"
-        base_query += " ORDER BY cnt DESC LIMIT 10"
-        
-        conn_local = get_db_connection()
-        cursor_local = get_db_cursor()
-        directors = []
-        try:
-            with db_lock:
-                cursor_local.execute(base_query, params)
-                rows = cursor_local.fetchall()
-                for row in rows:
-                    director = row.get('director') if isinstance(row, dict) else (row[0] if len(row) > 0 else None)
-                    if director:
-                        directors.append(director)
-            logger.info(f"[RANDOM] Directors found: {len(directors)}")
-        finally:
-            try:
-                cursor_local.close()
-            except:
-                pass
-            try:
-                conn_local.close()
-            except:
-                pass
+        # Топ-10 режиссёров непросмотренных фильмов с учетом периодов и жанров — по индексу фильтров чата
+        directors = [director for director, _ in random_index.top_directors(chat_id, periods, genres)]
+        logger.info(f"[RANDOM] Directors found: {len(directors)}")
         
         # Если режиссеров нет, пропускаем шаг и переходим к актерам
         if not directors:
@@ -6713,77 +6502,9 @@ def _show_actor_step(call, chat_id, user_id):
         genres = state.get('genres', [])
         directors = state.get('directors', [])
         
-        # Формируем WHERE условие с учетом всех фильтров
-        base_query = """
-            SELECT m.actors 
-            FROM movies m
-            LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
-            WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL
-            AND m.actors IS NOT NULL AND m.actors != '' AND m.actors != '—'
-        """
-        params = [chat_id]
-        
-        # Добавляем фильтр по периодам, если они выбраны
-        if periods:
-            period_conditions = []
-            for p in periods:
-                if p == "До 1980":
-                    period_conditions.append("m.year < 1980")
-                elif p == "1980–1990":
-                    period_conditions.append("(m.year >= 1980 AND m.year <= 1990)")
-                elif p == "1990–2000":
-                    period_conditions.append("(m.year >= 1990 AND m.year <= 2000)")
-                elif p == "2000–2010":
-                    period_conditions.append("(m.year >= 2000 AND m.year <= 2010)")
-                elif p == "2010–2020":
-                    period_conditions.append("(m.year >= 2010 AND m.year <= 2020)")
-                elif p == "2020–сейчас":
-                    period_conditions.append("m.year >= 2020")
-            if period_conditions:
-                base_query += " AND (" + " OR ".join(period_conditions) + ")"
-        
-        # Добавляем фильтр по жанрам, если они выбраны
-        if genres:
-            genre_conditions = []
-            for genre in genres:
-                genre_conditions.append("m.genres ILIKE %s")
-                params.append(f"%{genre}%")
-            if genre_conditions:
-                base_query += " AND (" + " OR ".join(genre_conditions) + ")"
-        
-        # Добавляем фильтр по режиссерам, если они выбраны
-        if directors:
-            director_conditions = []
-            for director in directors:
-                director_conditions.append("m.director = %s")
-                params.append(director)
-            if director_conditions:
-                base_query += " AND (" + " OR ".join(director_conditions) + ")"
-        
-        # Берем топ актёров по частоте
-        actor_counts = {}
-        conn_local = get_db_connection()
-        cursor_local = get_db_cursor()
-        try:
-            with db_lock:
-                cursor_local.execute(base_query, params)
-                for row in cursor_local.fetchall():
-                    actors_str = row.get('actors') if isinstance(row, dict) else (row[0] if len(row) > 0 else None)
-                    if actors_str:
-                        for actor in actors_str.split(', '):
-                            actor = actor.strip()
-                            if actor:
-                                actor_counts[actor] = actor_counts.get(actor, 0) + 1
-            logger.info(f"[RANDOM] Unique actors found: {len(actor_counts)}")
-        finally:
-            try:
-                cursor_local.close()
-            except:
-                pass
-            try:
-                conn_local.close()
-            except:
-                pass
+        # Топ-10 актёров по частоте с учетом всех фильтров — по индексу фильтров чата
+        actor_counts = dict(random_index.top_actors(chat_id, periods, genres, directors))
+        logger.info(f"[RANDOM] Top actors found: {len(actor_counts)}")
         
         # Если актеров нет, пропускаем шаг и переходим к финалу
         if not actor_counts:
@@ -7685,22 +7406,6 @@ def _random_final(call, chat_id, user_id):
         # Получаем content_type из состояния для фильтрации
         content_type = state.get('content_type', 'mixed')  # films, series, mixed
         
-        # Формируем запрос - исключаем фильмы, которые уже запланированы и фильмы с импортированными оценками
-        # Учитываем content_type: films - только фильмы, series - только сериалы, mixed - оба
-        is_series_filter = ""
-        if content_type == 'films':
-            is_series_filter = "AND m.is_series = 0"
-        elif content_type == 'series':
-            is_series_filter = "AND m.is_series = 1"
-        # Если mixed - фильтр не добавляем
-        
-        query = """SELECT m.id, m.title, m.year, m.genres, m.director, m.actors, m.description, m.link, m.kp_id 
-                    FROM movies m
-                    LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id AND r.is_imported = TRUE
-                    WHERE m.chat_id = %s AND m.watched = 0 AND r.id IS NULL """ + is_series_filter + """
-                    AND m.id NOT IN (SELECT film_id FROM plans WHERE chat_id = %s)"""
-        params = [chat_id, chat_id]
-        
         # Фильтр по режиму
         mode = state.get('mode')
         if mode == 'my_votes':
@@ -8117,79 +7822,16 @@ def _random_final(call, chat_id, user_id):
             # Никаких дополнительных фильтров, только базовые (watched = 0, не в планах)
             pass
         
-        # Фильтр по периодам
+        # Фильтры мастера (OR внутри фильтра, AND между фильтрами) и равновероятный выбор среди
+        # непросмотренных фильмов без импортированных оценок и без планов — по индексу фильтров чата
         periods = state.get('periods', [])
-        if periods:
-            period_conditions = []
-            for p in periods:
-                if p == "До 1980":
-                    period_conditions.append("m.year < 1980")
-                elif p == "1980–1990":
-                    period_conditions.append("(m.year >= 1980 AND m.year <= 1990)")
-                elif p == "1990–2000":
-                    period_conditions.append("(m.year >= 1990 AND m.year <= 2000)")
-                elif p == "2000–2010":
-                    period_conditions.append("(m.year >= 2000 AND m.year <= 2010)")
-                elif p == "2010–2020":
-                    period_conditions.append("(m.year >= 2010 AND m.year <= 2020)")
-                elif p == "2020–сейчас":
-                    period_conditions.append("m.year >= 2020")
-            if period_conditions:
-                query += " AND (" + " OR ".join(period_conditions) + ")"
-        
-        # Фильтр по жанрам (можно несколько, OR условие)
         genres = state.get('genres', [])
-        if genres:
-            genre_conditions = []
-            for genre in genres:
-                genre_conditions.append("m.genres ILIKE %s")
-                params.append(f"%{genre}%")
-            if genre_conditions:
-                query += " AND (" + " OR ".join(genre_conditions) + ")"
-        
-        # Фильтр по режиссёрам (можно несколько, OR условие)
         directors = state.get('directors', [])
-        if directors:
-            director_conditions = []
-            for director in directors:
-                director_conditions.append("m.director = %s")
-                params.append(director)
-            if director_conditions:
-                query += " AND (" + " OR ".join(director_conditions) + ")"
-        
-        # Фильтр по актёрам (можно несколько, OR условие)
         actors = state.get('actors', [])
-        if actors:
-            actor_conditions = []
-            for actor in actors:
-                actor_conditions.append("m.actors ILIKE %s")
-                params.append(f"%{actor}%")
-            if actor_conditions:
-                query += " AND (" + " OR ".join(actor_conditions) + ")"
-        
-        logger.info(f"[RANDOM] Query: {query}")
-        logger.info(f"[RANDOM] Params: {params}")
+        movie = random_index.pick_random_film(chat_id, content_type, periods, genres, directors, actors)
+        logger.info(f"[RANDOM] Candidate found: {movie is not None}")
         
-        # Используем get_db_cursor() для получения свежего курсора, чтобы избежать проблем с закрытыми курсорами
-        cursor_local = get_db_cursor()
-        with db_lock:
-            try:
-                cursor_local.execute(query, params)
-                candidates = cursor_local.fetchall()
-                logger.info(f"[RANDOM] Candidates found: {len(candidates)}")
-            except Exception as db_e:
-                logger.error(f"[RANDOM] Ошибка при запросе фильмов: {db_e}", exc_info=True)
-                # Пересоздаем курсор при ошибке
-                cursor_local = get_db_cursor()
-                try:
-                    cursor_local.execute(query, params)
-                    candidates = cursor_local.fetchall()
-                    logger.info(f"[RANDOM] Candidates found: {len(candidates)} (после пересоздания курсора)")
-                except Exception as db_e2:
-                    logger.error(f"[RANDOM] Критическая ошибка при запросе фильмов: {db_e2}", exc_info=True)
-                    candidates = []
-        
-        if not candidates:
+        if not movie:
             # Ищем похожие фильмы из запланированных
             # Учитываем content_type: films - только фильмы, series - только сериалы, mixed - оба
             is_series_filter_similar = ""
@@ -8227,30 +7869,18 @@ def _random_final(call, chat_id, user_id):
             # Фильтр по жанрам (можно несколько, OR условие)
             genres = state.get('genres', [])
             if genres:
-                genre_conditions = []
-                for genre in genres:
-                    genre_conditions.append("m.genres ILIKE %s")
-                    similar_params.append(f"%{genre}%")
-                if genre_conditions:
-                    similar_query += " AND (" + " OR ".join(genre_conditions) + ")"
+                similar_query += " AND " + GENRES_FILTER_SQL
+                similar_params.append(list(genres))
             
             # Фильтр по режиссёрам (можно несколько, OR условие)
             directors = state.get('directors', [])
             if directors:
-                director_conditions = []
-                for director in directors:
-                    director_conditions.append("m.director = %s")
-                    similar_params.append(director)
-                if director_conditions:
-                    similar_query += " AND (" + " OR ".join(director_conditions) + ")"
+                similar_query += " AND " + DIRECTORS_FILTER_SQL
+                similar_params.append(list(directors))
             
             if actors:
-                actor_conditions = []
-                for actor in actors:
-                    actor_conditions.append("m.actors ILIKE %s")
-                    similar_params.append(f"%{actor}%")
-                if actor_conditions:
-                    similar_query += " AND (" + " OR ".join(actor_conditions) + ")"
+                similar_query += " AND " + ACTORS_FILTER_SQL
+                similar_params.append(list(actors))
             
             similar_query += " LIMIT 10"
             
@@ -8336,7 +7966,6 @@ def _random_final(call, chat_id, user_id):
             del user_random_state[user_id]
             return
         
-        movie = random.choice(candidates)
         if isinstance(movie, dict):
             title = movie.get('title')
             year = movie.get('year') or '—'
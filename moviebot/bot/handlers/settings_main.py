@@ -30,8 +30,6 @@ from datetime import datetime, timedelta
 import pytz
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 
 def settings_command(message):
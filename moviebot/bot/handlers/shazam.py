@@ -3,8 +3,6 @@ from moviebot.bot.bot_init import bot
 Обработчики для функции Шазам (поиск фильмов по описанию)
 """
 import logging
-import os
-import tempfile
 from threading import Thread
 from moviebot.bot.bot_init import BOT_ID
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -13,9 +11,9 @@ from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from moviebot.services.shazam_service import (
 
     search_movies,
-    transcribe_voice,
-    convert_ogg_to_wav
+    transcribe_voice_bytes,
 )
+from moviebot.services.voice_pipeline import StageTimer, TranscriptionBusyError
 from moviebot.api.kinopoisk_api import get_film_by_imdb_id, search_films
 
 from moviebot.utils.helpers import (
@@ -26,6 +24,7 @@ from moviebot.utils.helpers import (
 )
 
 from moviebot.states import shazam_state
+from moviebot.bot.handler_router import route_guard
 
 from moviebot.bot.handlers.text_messages import expect_text_from_user
 
@@ -326,54 +325,34 @@ def process_shazam_voice_async(message, loading_msg):
     logger.info(f"[SHAZAM VOICE ASYNC] ===== START: user_id={user_id}, chat_id={chat_id}")
     
     try:
-        # Скачиваем голосовое сообщение
-        logger.info(f"[SHAZAM VOICE ASYNC] Скачиваем голосовое сообщение...")
-        file_info = bot.get_file(message.voice.file_id)
-        logger.info(f"[SHAZAM VOICE ASYNC] file_info получен: file_path={file_info.file_path}, file_size={file_info.file_size}")
-        
-        ogg_path = os.path.join(tempfile.gettempdir(), f"voice_{user_id}_{message.voice.file_id}.ogg")
-        logger.info(f"[SHAZAM VOICE ASYNC] Сохраняем в {ogg_path}")
+        timer = StageTimer()
         
-        downloaded_file = bot.download_file(file_info.file_path)
-        with open(ogg_path, 'wb') as f:
-            f.write(downloaded_file)
-        logger.info(f"[SHAZAM VOICE ASYNC] Файл скачан, размер: {os.path.getsize(ogg_path)} байт")
+        # Скачиваем голосовое сообщение — байты остаются в памяти, на диск ничего не пишем
+        logger.info(f"[SHAZAM VOICE ASYNC] Скачиваем голосовое сообщение...")
+        with timer.stage('download'):
+            file_info = bot.get_file(message.voice.file_id)
+            downloaded_file = bot.download_file(file_info.file_path)
+        logger.info(f"[SHAZAM VOICE ASYNC] Файл скачан: file_path={file_info.file_path}, размер: {len(downloaded_file)} байт")
         
-        # Конвертируем в WAV
-        logger.info(f"[SHAZAM VOICE ASYNC] Конвертируем OGG в WAV...")
-        wav_path = os.path.join(tempfile.gettempdir(), f"voice_{user_id}_{message.voice.file_id}.wav")
-        if not convert_ogg_to_wav(ogg_path, wav_path):
-            logger.error(f"[SHAZAM VOICE ASYNC] Ошибка конвертации OGG в WAV")
+        # Декодируем OGG в памяти и распознаём речь через пул
+        logger.info(f"[SHAZAM VOICE ASYNC] Начинаем распознавание речи...")
+        try:
+            text = transcribe_voice_bytes(downloaded_file, timer=timer)
+        except TranscriptionBusyError as e:
+            logger.warning(f"[SHAZAM VOICE ASYNC] {e}")
             
             markup = InlineKeyboardMarkup()
             markup.add(InlineKeyboardButton("⬅️ Назад", callback_data="shazam:start"))
             
             bot.edit_message_text(
-                "❌ Ошибка конвертации аудио. Попробуйте записать еще раз.",
+                "⏳ Сейчас распознаётся много голосовых. Попробуйте через минуту или опишите фильм текстом.",
                 loading_msg.chat.id,
                 loading_msg.message_id,
                 reply_markup=markup
             )
             shazam_state.pop(user_id, None)
-            try:
-                os.remove(ogg_path)
-            except:
-                pass
             return
-        
-        logger.info(f"[SHAZAM VOICE ASYNC] Конвертация завершена, размер WAV: {os.path.getsize(wav_path)} байт")
-        
-        # Распознаем речь
-        logger.info(f"[SHAZAM VOICE ASYNC] Начинаем распознавание речи...")
-        text = transcribe_voice(wav_path)
-        logger.info(f"[SHAZAM VOICE ASYNC] Распознавание завершено, результат: '{text}'")
-        
-        # Удаляем временные файлы
-        try:
-            os.remove(ogg_path)
-            os.remove(wav_path)
-        except:
-            pass
+        logger.info(f"[SHAZAM VOICE ASYNC] Распознавание завершено, результат: '{text}' ({timer.format()})")
         
         if not text:
             logger.warning(f"[SHAZAM VOICE ASYNC] Не удалось распознать речь")
@@ -405,7 +384,9 @@ def process_shazam_voice_async(message, loading_msg):
         
         # Ищем фильмы (получаем больше кандидатов для фильтрации)
         logger.info(f"[SHAZAM VOICE ASYNC] Начинаем поиск фильмов по запросу: '{text}'")
-        results = search_movies(text, top_k=15)
+        with timer.stage('search'):
+            results = search_movies(text, top_k=15)
+        logger.info(f"[SHAZAM VOICE ASYNC] Время стадий: {timer.format()}")
 
         # === RERANKING по актёрам из OMDB ===
         query_lower = text.lower()
@@ -774,6 +755,7 @@ def register_shazam_handlers(bot):
     
     # ==================== ОБРАБОТЧИКИ ГОЛОСОВЫХ СООБЩЕНИЙ ====================
     
+    @route_guard(user_states=(shazam_state,))
     def is_shazam_voice_in_private(message):
         """Проверка для обработчика голосового сообщения Shazam в ЛС - принимает ЛИБО reply ЛИБО следующее сообщение"""
         if message.chat.type != 'private':
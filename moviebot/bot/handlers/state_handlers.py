@@ -12,6 +12,12 @@ import sys
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from moviebot.bot.bot_init import BOT_ID
+from moviebot.bot.handler_router import route_guard
+from moviebot.states import (
+    user_promo_state, user_promo_admin_state, user_ticket_state, user_search_state, user_import_state,
+    user_edit_state, user_settings_state, user_clean_state, user_unsubscribe_state, user_add_admin_state,
+    user_refund_state, user_cancel_subscription_state
+)
 
 
 logger = logging.getLogger(__name__)
@@ -468,6 +474,7 @@ def handle_rating(message):
 
 # ==================== HANDLER ДЛЯ ПРОМОКОДОВ ====================
 
+@route_guard(user_states=(user_promo_state, user_promo_admin_state))
 def check_promo_message(message):
     """Проверяет, является ли сообщение промокодом"""
     from moviebot.states import user_promo_state, user_promo_admin_state
@@ -668,6 +675,7 @@ def handle_promo(message):
 
 # ==================== HANDLER ДЛЯ БИЛЕТОВ ====================
 
+@route_guard(user_states=(user_ticket_state,))
 def check_ticket_text_reply(message):
     """Аналог check_plan_datetime_reply — точная проверка для текстовых шагов билетов"""
     from moviebot.states import user_ticket_state, is_user_in_valid_ticket_state
@@ -892,6 +900,7 @@ def handle_ticket_text_reply(message):
 
 
 # Сохраняем твой существующий check_ticket_message только для "готово" в upload/add_more
+@route_guard(user_states=(user_ticket_state,))
 def check_ticket_done(message):
     from moviebot.states import user_ticket_state, is_user_in_valid_ticket_state
     user_id = message.from_user.id
@@ -908,6 +917,7 @@ def handle_ticket_done(message):
 
 # ==================== HANDLER ДЛЯ ПОИСКА ====================
 
+@route_guard(user_states=(user_search_state,))
 def check_search_message(message):
     """Проверяет, является ли сообщение запросом поиска"""
     from moviebot.states import user_search_state
@@ -1095,6 +1105,7 @@ def handle_search(message):
 
 # ==================== HANDLER ДЛЯ ИМПОРТА ====================
 
+@route_guard(user_states=(user_import_state,))
 def check_import_message(message):
     """Проверяет, является ли сообщение ответом в состоянии импорта"""
     from moviebot.states import user_import_state
@@ -1166,6 +1177,7 @@ def handle_import(message):
 
 # ==================== HANDLER ДЛЯ РЕДАКТИРОВАНИЯ ====================
 
+@route_guard(user_states=(user_edit_state,))
 def check_edit_message(message):
     """Проверяет, является ли сообщение ответом в состоянии редактирования"""
     from moviebot.states import user_edit_state
@@ -1279,6 +1291,7 @@ def handle_edit(message):
 
 # ==================== HANDLER ДЛЯ НАСТРОЕК ====================
 
+@route_guard(user_states=(user_settings_state,))
 def check_settings_message(message):
     """Проверяет, является ли сообщение ответом в состоянии настроек"""
     from moviebot.states import user_settings_state
@@ -1461,6 +1474,7 @@ def handle_settings(message):
 
 # ==================== HANDLER ДЛЯ ОЧИСТКИ ====================
 
+@route_guard(user_states=(user_clean_state,))
 def check_clean_message(message):
     """Проверяет, является ли сообщение ответом в состоянии очистки"""
     from moviebot.states import user_clean_state
@@ -1563,6 +1577,8 @@ def handle_clean(message):
 
 # ==================== HANDLER ДЛЯ АДМИНСКИХ ФУНКЦИЙ ====================
 
+@route_guard(user_states=(user_unsubscribe_state, user_add_admin_state, user_promo_admin_state,
+                           user_refund_state, user_cancel_subscription_state))
 def check_admin_message(message):
     """Проверяет, является ли сообщение ответом в админском состоянии"""
     # КРИТИЧНО: Проверяем команды САМЫМ ПЕРВЫМ делом, ДО всех остальных проверок
@@ -4,6 +4,7 @@ from moviebot.bot.bot_init import bot, BOT_ID
 """
 import html as html_module
 import logging
+import threading
 from datetime import datetime
 
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -11,12 +12,10 @@ from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from moviebot.database.db_operations import log_request, get_admin_statistics
 
-from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
+from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock, db_connection
 
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 
 def _process_refund(message, charge_id):
@@ -27,7 +26,8 @@ def _process_refund(message, charge_id):
         
         # Ищем платеж в БД по telegram_payment_charge_id
         # Сначала пробуем точное совпадение
-        with db_lock:
+        with db_connection() as conn:
+            cursor = conn.cursor()
             cursor.execute("""
                 SELECT payment_id, user_id, chat_id, amount, status, telegram_payment_charge_id
                 FROM payments 
@@ -40,7 +40,8 @@ def _process_refund(message, charge_id):
             logger.info(f"[REFUND] Точное совпадение не найдено, пробуем поиск по началу charge_id...")
             # Берем первые 50 символов для поиска
             charge_id_prefix = charge_id[:50] if len(charge_id) > 50 else charge_id
-            with db_lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute("""
                     SELECT payment_id, user_id, chat_id, amount, status, telegram_payment_charge_id
                     FROM payments 
@@ -58,7 +59,8 @@ def _process_refund(message, charge_id):
             logger.info(f"[REFUND] Поиск по префиксу не дал результатов, пробуем поиск по части charge_id...")
             # Берем первые 30 символов для более широкого поиска
             charge_id_part = charge_id[:30] if len(charge_id) > 30 else charge_id
-            with db_lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute("""
                     SELECT payment_id, user_id, chat_id, amount, status, telegram_payment_charge_id
                     FROM payments 
@@ -78,7 +80,8 @@ def _process_refund(message, charge_id):
         if not row:
             # Для отладки: показываем последние платежи с telegram_payment_charge_id
             logger.info(f"[REFUND] Платеж не найден. Проверяем последние платежи с telegram_payment_charge_id...")
-            with db_lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute("""
                     SELECT payment_id, user_id, chat_id, amount, status, telegram_payment_charge_id, created_at
                     FROM payments 
@@ -142,7 +145,8 @@ def _process_refund(message, charge_id):
             
             if result_data.get('ok'):
                 # Обновляем статус платежа в БД на 'refunded'
-                with db_lock:
+                with db_connection() as conn:
+                    cursor = conn.cursor()
                     cursor.execute("""
                         UPDATE payments 
                         SET status = 'refunded'
@@ -192,7 +196,8 @@ def register_stats_handlers(bot):
             logger.info(f"Команда /stats от пользователя {message.from_user.id}, chat_id={message.chat.id}")
             chat_id = message.chat.id
             
-            with db_lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
                 # Получаем всех участников из разных источников: stats, ratings, watched_movies, plans
                 all_users = {}
                 
@@ -218,42 +223,14 @@ def register_stats_handlers(bot):
                         'last_activity': last_activity
                     }
                 
-                # Из ratings (оценки)
+                # Из ratings, watched_movies и plans — одним запросом
                 cursor.execute('''
-                    SELECT DISTINCT user_id
-                    FROM ratings
-                    WHERE chat_id = %s AND user_id IS NOT NULL
-                ''', (chat_id,))
-                for row in cursor.fetchall():
-                    user_id = row.get('user_id') if isinstance(row, dict) else row[0]
-                    if user_id not in all_users:
-                        all_users[user_id] = {
-                            'username': None,
-                            'command_count': 0,
-                            'last_activity': None
-                        }
-                
-                # Из watched_movies (просмотренные фильмы)
-                cursor.execute('''
-                    SELECT DISTINCT user_id
-                    FROM watched_movies
-                    WHERE chat_id = %s AND user_id IS NOT NULL
-                ''', (chat_id,))
-                for row in cursor.fetchall():
-                    user_id = row.get('user_id') if isinstance(row, dict) else row[0]
-                    if user_id not in all_users:
-                        all_users[user_id] = {
-                            'username': None,
-                            'command_count': 0,
-                            'last_activity': None
-                        }
-                
-                # Из plans (планы)
-                cursor.execute('''
-                    SELECT DISTINCT user_id
-                    FROM plans
-                    WHERE chat_id = %s AND user_id IS NOT NULL
-                ''', (chat_id,))
+                    SELECT user_id FROM ratings WHERE chat_id = %s AND user_id IS NOT NULL
+                    UNION
+                    SELECT user_id FROM watched_movies WHERE chat_id = %s AND user_id IS NOT NULL
+                    UNION
+                    SELECT user_id FROM plans WHERE chat_id = %s AND user_id IS NOT NULL
+                ''', (chat_id, chat_id, chat_id))
                 for row in cursor.fetchall():
                     user_id = row.get('user_id') if isinstance(row, dict) else row[0]
                     if user_id not in all_users:
@@ -279,61 +256,43 @@ def register_stats_handlers(bot):
                 # Сортируем по количеству команд и последней активности
                 users_stats.sort(key=lambda x: (x['command_count'], x['last_activity'] or ''), reverse=True)
                 
-                # Получаем общую статистику чата (исключаем фильмы, добавленные только через импорт)
+                # Получаем общую статистику чата одним запросом (исключаем фильмы, добавленные только через импорт)
                 # Фильм считается импортированным, если у него есть только импортированные оценки
                 cursor.execute('''
-                    SELECT COUNT(*) FROM movies m
-                    WHERE m.chat_id = %s
-                    AND NOT EXISTS (
-                        SELECT 1 FROM ratings r 
-                        WHERE r.chat_id = m.chat_id 
-                        AND r.film_id = m.id 
-                        AND (r.is_imported = FALSE OR r.is_imported IS NULL)
-                    )
-                    AND EXISTS (
-                        SELECT 1 FROM ratings r 
-                        WHERE r.chat_id = m.chat_id 
-                        AND r.film_id = m.id 
-                        AND r.is_imported = TRUE
-                    )
-                ''', (chat_id,))
-                imported_movies_row = cursor.fetchone()
-                imported_movies_count = imported_movies_row.get('count') if isinstance(imported_movies_row, dict) else (imported_movies_row[0] if imported_movies_row else 0)
-                
-                cursor.execute('SELECT COUNT(*) FROM movies WHERE chat_id = %s', (chat_id,))
-                total_movies_row = cursor.fetchone()
-                total_movies_all = total_movies_row.get('count') if isinstance(total_movies_row, dict) else (total_movies_row[0] if total_movies_row else 0)
-                total_movies = total_movies_all - imported_movies_count
-                
-                cursor.execute('''
-                    SELECT COUNT(*) FROM movies m
-                    WHERE m.chat_id = %s AND m.watched = 1
-                    AND NOT (
-                        NOT EXISTS (
-                            SELECT 1 FROM ratings r 
-                            WHERE r.chat_id = m.chat_id 
-                            AND r.film_id = m.id 
-                            AND (r.is_imported = FALSE OR r.is_imported IS NULL)
-                        )
-                        AND EXISTS (
-                            SELECT 1 FROM ratings r 
-                            WHERE r.chat_id = m.chat_id 
-                            AND r.film_id = m.id 
-                            AND r.is_imported = TRUE
-                        )
+                    SELECT
+                        COUNT(*) FILTER (WHERE NOT m.import_only) AS total_movies,
+                        COUNT(*) FILTER (WHERE NOT m.import_only AND m.watched = 1) AS watched_movies,
+                        (SELECT COUNT(*) FROM ratings
+                         WHERE chat_id = %s AND (is_imported = FALSE OR is_imported IS NULL)) AS total_ratings,
+                        (SELECT COUNT(*) FROM plans WHERE chat_id = %s) AS total_plans
+                    FROM (
+                        SELECT mv.watched,
+                               NOT EXISTS (
+                                   SELECT 1 FROM ratings r 
+                                   WHERE r.chat_id = mv.chat_id 
+                                   AND r.film_id = mv.id 
+                                   AND (r.is_imported = FALSE OR r.is_imported IS NULL)
+                               )
+                               AND EXISTS (
+                                   SELECT 1 FROM ratings r 
+                                   WHERE r.chat_id = mv.chat_id 
+                                   AND r.film_id = mv.id 
+                                   AND r.is_imported = TRUE
+                               ) AS import_only
+                        FROM movies mv
+                        WHERE mv.chat_id = %s
+                    ) m
+                ''', (chat_id, chat_id, chat_id))
+                totals_row = cursor.fetchone()
+                if isinstance(totals_row, dict):
+                    total_movies = totals_row.get('total_movies') or 0
+                    watched_movies = totals_row.get('watched_movies') or 0
+                    total_ratings = totals_row.get('total_ratings') or 0
+                    total_plans = totals_row.get('total_plans') or 0
+                else:
+                    total_movies, watched_movies, total_ratings, total_plans = (
+                        (v or 0) for v in (totals_row or (0, 0, 0, 0))
                     )
-                ''', (chat_id,))
-                watched_movies_row = cursor.fetchone()
-                watched_movies = watched_movies_row.get('count') if isinstance(watched_movies_row, dict) else (watched_movies_row[0] if watched_movies_row else 0)
-                
-                # Исключаем импортированные оценки
-                cursor.execute('SELECT COUNT(*) FROM ratings WHERE chat_id = %s AND (is_imported = FALSE OR is_imported IS NULL)', (chat_id,))
-                total_ratings_row = cursor.fetchone()
-                total_ratings = total_ratings_row.get('count') if isinstance(total_ratings_row, dict) else (total_ratings_row[0] if total_ratings_row else 0)
-                
-                cursor.execute('SELECT COUNT(*) FROM plans WHERE chat_id = %s', (chat_id,))
-                total_plans_row = cursor.fetchone()
-                total_plans = total_plans_row.get('count') if isinstance(total_plans_row, dict) else (total_plans_row[0] if total_plans_row else 0)
                 
                 # Статистика по сериалам (только для групповых чатов)
                 watched_series_count = 0
@@ -341,147 +300,74 @@ def register_stats_handlers(bot):
                 is_group = chat_id < 0
                 
                 if is_group:
-                    from moviebot.api.kinopoisk_api import get_seasons_data
-                    
-                    # Получаем все сериалы группы
-                    cursor.execute('SELECT id, kp_id FROM movies WHERE chat_id = %s AND is_series = 1', (chat_id,))
-                    all_series = cursor.fetchall()
-                    
-                    now = datetime.now()
-                    
-                    for row in all_series:
-                        if isinstance(row, dict):
-                            film_id = row.get('id')
-                            kp_id = row.get('kp_id')
-                        else:
-                            film_id = row.get("id") if isinstance(row, dict) else (row[0] if row else None)
-                            kp_id = row[1]
-                        
-                        # Получаем данные о сезонах
-                        try:
-                            seasons_data = get_seasons_data(kp_id)
-                            if not seasons_data:
-                                continue
-                        except:
-                            continue
-                        
-                        # Проверяем, выходит ли сериал
-                        is_airing = False
-                        for season in seasons_data:
-                            episodes = season.get('episodes', [])
-                            for ep in episodes:
-                                release_str = ep.get('releaseDate', '')
-                                if release_str and release_str != '—':
-                                    try:
-                                        release_date = None
-                                        for fmt in ['%Y-%m-%d', '%d.%m.%Y', '%Y-%m-%dT%H:%M:%S']:
-                                            try:
-                                                release_date = datetime.strptime(release_str.split('T')[0], fmt)
-                                                break
-                                            except:
-                                                continue
-                                        
-                                        if release_date and release_date > now:
-                                            is_airing = True
-                                            break
-                                    except:
-                                        pass
-                            if is_airing:
-                                break
-                        
-                        # Получаем всех пользователей, которые смотрели этот сериал
-                        cursor.execute('''
-                            SELECT DISTINCT user_id 
-                            FROM series_tracking 
-                            WHERE chat_id = %s AND film_id = %s AND watched = TRUE
-                        ''', (chat_id, film_id))
-                        users_watched = cursor.fetchall()
-                        
-                        if not users_watched:
-                            continue
-                        
-                        # Для каждого пользователя проверяем статус просмотра
-                        for user_row in users_watched:
-                            user_id = user_row.get('user_id') if isinstance(user_row, dict) else user_row[0]
-                            
-                            # Получаем просмотренные эпизоды пользователя
-                            cursor.execute('''
-                                SELECT season_number, episode_number 
-                                FROM series_tracking 
-                                WHERE chat_id = %s AND film_id = %s AND user_id = %s AND watched = TRUE
-                            ''', (chat_id, film_id, user_id))
-                            watched_rows = cursor.fetchall()
-                            watched_set = set()
-                            for w_row in watched_rows:
-                                season = w_row.get('season_number') if isinstance(w_row, dict) else w_row[0]
-                                episode = w_row.get('episode_number') if isinstance(w_row, dict) else w_row[1]
-                                watched_set.add((season, episode))
-                            
-                            # Подсчитываем просмотренные и общее количество эпизодов
-                            total_episodes = 0
-                            watched_episodes = 0
-                            all_watched = True
-                            
-                            for season in seasons_data:
-                                episodes = season.get('episodes', [])
-                                season_num = season.get('number', '')
-                                for ep in episodes:
-                                    total_episodes += 1
-                                    ep_num = str(ep.get('episodeNumber', ''))
-                                    if (season_num, ep_num) in watched_set:
-                                        watched_episodes += 1
-                                    else:
-                                        all_watched = False
-                            
-                            # Если все серии просмотрены и сериал не выходит - просмотренный
-                            if all_watched and total_episodes > 0 and not is_airing:
-                                watched_series_count += 1
-                                break  # Считаем сериал один раз для группы
-                            # Если есть просмотренные, но не все - в процессе
-                            elif watched_episodes > 0:
-                                in_progress_series_count += 1
-                                break  # Считаем сериал один раз для группы
-            
-            # Получаем статистику по оценкам участников
-            # Для общей статистики исключаем импортированные, но для каждого пользователя считаем ВСЕ его оценки
-            cursor.execute('''
-                SELECT 
-                    r.user_id,
-                    COUNT(*) as ratings_count,
-                    AVG(r.rating) as avg_rating
-                FROM ratings r
-                WHERE r.chat_id = %s AND (r.is_imported = FALSE OR r.is_imported IS NULL)
-                GROUP BY r.user_id
-                ORDER BY ratings_count DESC
-            ''', (chat_id,))
-            ratings_stats = cursor.fetchall()
-            ratings_by_user = {}
-            for row in ratings_stats:
-                user_id = row.get('user_id') if isinstance(row, dict) else row[0]
-                count = row.get('ratings_count') if isinstance(row, dict) else row[1]
-                avg = row.get('avg_rating') if isinstance(row, dict) else row[2]
-                ratings_by_user[user_id] = {'count': count, 'avg': avg}
-            
-            # Для каждого пользователя добавляем импортированные оценки (только для личной статистики)
-            # Импортированные оценки НЕ учитываются в общей статистике группы, но учитываются в личной статистике пользователя
-            cursor.execute('''
-                SELECT 
-                    r.user_id,
-                    COUNT(*) as imported_count
-                FROM ratings r
-                WHERE r.chat_id = %s AND r.is_imported = TRUE
-                GROUP BY r.user_id
-            ''', (chat_id,))
-            imported_stats = cursor.fetchall()
-            for row in imported_stats:
-                user_id = row.get('user_id') if isinstance(row, dict) else row[0]
-                imported_count = row.get('imported_count') if isinstance(row, dict) else row[1]
-                if user_id in ratings_by_user:
-                    # Добавляем импортированные к существующим (только для отображения личной статистики)
-                    ratings_by_user[user_id]['count'] += imported_count
-                else:
-                    # Если у пользователя только импортированные оценки
-                    ratings_by_user[user_id] = {'count': imported_count, 'avg': None}
+                    # Статус выхода — из кэша movies.is_ongoing (update_series_status_cache),
+                    # число эпизодов — из series_episode_counts; прогресс участников — одним запросом.
+                    # Сериал просмотрен, если кто-то из участников досмотрел все эпизоды и он не выходит;
+                    # иначе, если кто-то что-то смотрел, — в процессе.
+                    cursor.execute('''
+                        SELECT
+                            COUNT(*) FILTER (WHERE s.completed) AS watched_series,
+                            COUNT(*) FILTER (WHERE NOT s.completed) AS in_progress_series
+                        FROM (
+                            SELECT p.film_id,
+                                   BOOL_OR(p.watched_episodes >= ec.episodes_count
+                                           AND NOT COALESCE(m.is_ongoing, FALSE)) AS completed
+                            FROM (
+                                SELECT st.film_id, st.user_id, COUNT(*) AS watched_episodes
+                                FROM series_tracking st
+                                WHERE st.chat_id = %s AND st.watched = TRUE
+                                GROUP BY st.film_id, st.user_id
+                            ) p
+                            JOIN movies m ON m.id = p.film_id AND m.chat_id = %s AND m.is_series = 1
+                            JOIN series_episode_counts ec ON ec.kp_id = m.kp_id AND ec.episodes_count > 0
+                            GROUP BY p.film_id
+                        ) s
+                    ''', (chat_id, chat_id))
+                    series_row = cursor.fetchone()
+                    if series_row:
+                        watched_series_count = (series_row.get('watched_series') if isinstance(series_row, dict) else series_row[0]) or 0
+                        in_progress_series_count = (series_row.get('in_progress_series') if isinstance(series_row, dict) else series_row[1]) or 0
+            
+                # Получаем статистику по оценкам участников
+                # Для общей статистики исключаем импортированные, но для каждого пользователя считаем ВСЕ его оценки
+                cursor.execute('''
+                    SELECT 
+                        r.user_id,
+                        COUNT(*) as ratings_count,
+                        AVG(r.rating) as avg_rating
+                    FROM ratings r
+                    WHERE r.chat_id = %s AND (r.is_imported = FALSE OR r.is_imported IS NULL)
+                    GROUP BY r.user_id
+                    ORDER BY ratings_count DESC
+                ''', (chat_id,))
+                ratings_stats = cursor.fetchall()
+                ratings_by_user = {}
+                for row in ratings_stats:
+                    user_id = row.get('user_id') if isinstance(row, dict) else row[0]
+                    count = row.get('ratings_count') if isinstance(row, dict) else row[1]
+                    avg = row.get('avg_rating') if isinstance(row, dict) else row[2]
+                    ratings_by_user[user_id] = {'count': count, 'avg': avg}
+            
+                # Для каждого пользователя добавляем импортированные оценки (только для личной статистики)
+                # Импортированные оценки НЕ учитываются в общей статистике группы, но учитываются в личной статистике пользователя
+                cursor.execute('''
+                    SELECT 
+                        r.user_id,
+                        COUNT(*) as imported_count
+                    FROM ratings r
+                    WHERE r.chat_id = %s AND r.is_imported = TRUE
+                    GROUP BY r.user_id
+                ''', (chat_id,))
+                imported_stats = cursor.fetchall()
+                for row in imported_stats:
+                    user_id = row.get('user_id') if isinstance(row, dict) else row[0]
+                    imported_count = row.get('imported_count') if isinstance(row, dict) else row[1]
+                    if user_id in ratings_by_user:
+                        # Добавляем импортированные к существующим (только для отображения личной статистики)
+                        ratings_by_user[user_id]['count'] += imported_count
+                    else:
+                        # Если у пользователя только импортированные оценки
+                        ratings_by_user[user_id] = {'count': imported_count, 'avg': None}
             
             # Формируем сообщение
             text = "📊 <b>Детальная статистика группы</b>\n\n"
@@ -547,7 +433,8 @@ def register_stats_handlers(bot):
             logger.info(f"Команда /total от пользователя {message.from_user.id}")
             chat_id = message.chat.id
             
-            with db_lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
                 # Исключаем фильмы, добавленные только через импорт
                 cursor.execute('''
                     SELECT COUNT(*) as count FROM movies m
@@ -597,9 +484,11 @@ def register_stats_handlers(bot):
                     bot.reply_to(message, "📊 Нет данных о вашей статистике.\n\nОцените первый фильм, чтобы статистика начала собираться.")
                     return
                 
-                # Жанры (исключаем импортированные фильмы)
+                # Жанры (исключаем импортированные фильмы) — подсчёт по film_genres в БД
                 cursor.execute('''
-                    SELECT m.genres FROM movies m
+                    SELECT fg.genre, COUNT(*) AS cnt
+                    FROM movies m
+                    JOIN film_genres fg ON fg.kp_id = m.kp_id
                     WHERE m.chat_id = %s AND m.watched = 1
                     AND NOT (
                         NOT EXISTS (
@@ -615,23 +504,21 @@ def register_stats_handlers(bot):
                             AND r.is_imported = TRUE
                         )
                     )
+                    GROUP BY fg.genre
+                    ORDER BY cnt DESC, fg.genre
+                    LIMIT 1
                 ''', (chat_id,))
-                genre_counts = {}
-                for row in cursor.fetchall():
-                    genres = row.get('genres') if isinstance(row, dict) else row[0]
-                    if genres:
-                        for g in str(genres).split(', '):
-                            if g.strip():
-                                genre_counts[g.strip()] = genre_counts.get(g.strip(), 0) + 1
-                fav_genre = max(genre_counts, key=genre_counts.get) if genre_counts else "—"
+                genre_row = cursor.fetchone()
+                fav_genre = (genre_row.get('genre') if isinstance(genre_row, dict) else genre_row[0]) if genre_row else "—"
                 
                 # Режиссёры - используем оценки из таблицы ratings (исключаем импортированные)
                 cursor.execute('''
-                    SELECT m.director, AVG(r.rating) as avg_rating, COUNT(DISTINCT m.id) as film_count
+                    SELECT fp.name AS director, AVG(r.rating) as avg_rating, COUNT(DISTINCT m.id) as film_count
                     FROM movies m
+                    JOIN film_people fp ON fp.kp_id = m.kp_id AND fp.role = 'director'
                     LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id
                         AND (r.is_imported = FALSE OR r.is_imported IS NULL)
-                    WHERE m.chat_id = %s AND m.watched = 1 AND m.director IS NOT NULL AND m.director != %s
+                    WHERE m.chat_id = %s AND m.watched = 1
                     AND NOT (
                         NOT EXISTS (
                             SELECT 1 FROM ratings r2 
@@ -646,70 +533,41 @@ def register_stats_handlers(bot):
                             AND r3.is_imported = TRUE
                         )
                     )
-                    GROUP BY m.director
-                ''', (chat_id, 'Не указан'))
-                director_stats = {}
+                    GROUP BY fp.name
+                    HAVING AVG(r.rating) IS NOT NULL
+                    ORDER BY film_count DESC, avg_rating DESC
+                    LIMIT 3
+                ''', (chat_id,))
+                top_directors = []
                 for row in cursor.fetchall():
-                    d = row.get('director') if isinstance(row, dict) else (row[0] if len(row) > 0 else None)
-                    avg_r = row.get('avg_rating') if isinstance(row, dict) else (row[1] if len(row) > 1 else None)
-                    film_count = row.get('film_count') if isinstance(row, dict) else (row[2] if len(row) > 2 else 0)
-                    if d and avg_r:  # Только если есть неимпортированные оценки
-                        director_stats[d] = {
-                            'count': film_count,
-                            'sum_rating': (avg_r * film_count) if avg_r else 0,
-                            'avg_rating': avg_r if avg_r else 0
-                        }
-                top_directors = sorted(director_stats.items(), key=lambda x: (-x[1]['count'], -x[1]['avg_rating']))[:3]
+                    d = row.get('director') if isinstance(row, dict) else row[0]
+                    avg_r = row.get('avg_rating') if isinstance(row, dict) else row[1]
+                    film_count = row.get('film_count') if isinstance(row, dict) else row[2]
+                    top_directors.append((d, {'count': film_count, 'avg_rating': avg_r}))
                 
-                # Актёры - используем оценки из таблицы ratings (исключаем импортированные)
+                # Актёры - средняя оценка каждого фильма (без импортированных), затем GROUP BY актёру
                 cursor.execute('''
-                    SELECT m.actors, AVG(r.rating) as avg_rating, COUNT(DISTINCT m.id) as film_count
-                    FROM movies m
-                    LEFT JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id
-                        AND (r.is_imported = FALSE OR r.is_imported IS NULL)
-                    WHERE m.chat_id = %s AND m.watched = 1
-                    AND NOT (
-                        NOT EXISTS (
-                            SELECT 1 FROM ratings r2 
-                            WHERE r2.chat_id = m.chat_id 
-                            AND r2.film_id = m.id 
-                            AND (r2.is_imported = FALSE OR r2.is_imported IS NULL)
-                        )
-                        AND EXISTS (
-                            SELECT 1 FROM ratings r3 
-                            WHERE r3.chat_id = m.chat_id 
-                            AND r3.film_id = m.id 
-                            AND r3.is_imported = TRUE
-                        )
+                    WITH film_ratings AS (
+                        SELECT m.id, m.kp_id, AVG(r.rating) AS avg_rating
+                        FROM movies m
+                        JOIN ratings r ON m.id = r.film_id AND m.chat_id = r.chat_id
+                            AND (r.is_imported = FALSE OR r.is_imported IS NULL)
+                        WHERE m.chat_id = %s AND m.watched = 1
+                        GROUP BY m.id, m.kp_id
                     )
-                    GROUP BY m.actors
+                    SELECT fp.name AS actor, AVG(fr.avg_rating) AS avg_rating, COUNT(*) AS film_count
+                    FROM film_ratings fr
+                    JOIN film_people fp ON fp.kp_id = fr.kp_id AND fp.role = 'actor'
+                    GROUP BY fp.name
+                    ORDER BY film_count DESC, avg_rating DESC
+                    LIMIT 3
                 ''', (chat_id,))
-                actor_stats = {}
+                top_actors = []
                 for row in cursor.fetchall():
-                    actors_str = row.get('actors') if isinstance(row, dict) else (row[0] if len(row) > 0 else None)
-                    avg_r = row.get('avg_rating') if isinstance(row, dict) else (row[1] if len(row) > 1 else None)
-                    film_count = row.get('film_count') if isinstance(row, dict) else (row[2] if len(row) > 2 else 0)
-                    if actors_str and avg_r:  # Только если есть неимпортированные оценки
-                        for a in actors_str.split(', '):
-                            a = a.strip()
-                            if a and a != "—":
-                                if a not in actor_stats:
-                                    actor_stats[a] = {'count': 0, 'sum_rating': 0, 'total_ratings': 0}
-                                # Для актеров считаем количество фильмов, где они участвовали
-                                actor_stats[a]['count'] += film_count
-                                # Суммируем средние оценки, умноженные на количество фильмов
-                                if avg_r:
-                                    actor_stats[a]['sum_rating'] += avg_r * film_count
-                                    actor_stats[a]['total_ratings'] += film_count
-                
-                # Пересчитываем средние для актеров
-                for actor in actor_stats:
-                    if actor_stats[actor]['total_ratings'] > 0:
-                        actor_stats[actor]['avg_rating'] = actor_stats[actor]['sum_rating'] / actor_stats[actor]['total_ratings']
-                    else:
-                        actor_stats[actor]['avg_rating'] = 0
-                
-                top_actors = sorted(actor_stats.items(), key=lambda x: (-x[1]['count'], -x[1].get('avg_rating', 0)))[:3]
+                    a = row.get('actor') if isinstance(row, dict) else row[0]
+                    avg_r = row.get('avg_rating') if isinstance(row, dict) else row[1]
+                    film_count = row.get('film_count') if isinstance(row, dict) else row[2]
+                    top_actors.append((a, {'count': film_count, 'avg_rating': avg_r}))
                 
                 # Рассчитываем среднее из ratings (исключаем импортированные)
                 cursor.execute('SELECT AVG(rating) FROM ratings WHERE chat_id = %s AND (is_imported = FALSE OR is_imported IS NULL)', (chat_id,))
@@ -874,6 +732,40 @@ def register_stats_handlers(bot):
             logger.error(f"Ошибка в admin_stats_command: {e}", exc_info=True)
             bot.reply_to(message, f"❌ Ошибка получения статистики: {e}")
 
+    @bot.message_handler(commands=['rebuild_stats'])
+    def rebuild_stats_command(message):
+        """Команда /rebuild_stats [chat_id] - перестройка роллапов статистики сайта (только для администраторов)"""
+        from moviebot.utils.admin import is_admin
+        from moviebot.api.site_stats import rebuild_stats_rollups
+
+        user_id = message.from_user.id
+        if not is_admin(user_id):
+            bot.reply_to(message, "❌ У вас нет доступа к этой команде.")
+            return
+
+        parts = (message.text or '').split()
+        target_chat_id = None
+        if len(parts) >= 2:
+            try:
+                target_chat_id = int(parts[1])
+            except ValueError:
+                bot.reply_to(message, "❌ Использование: /rebuild_stats [chat_id]")
+                return
+
+        logger.info(f"[HANDLER] /rebuild_stats вызван от {user_id}, chat_id={target_chat_id}")
+        scope = f"чата {target_chat_id}" if target_chat_id is not None else "всех чатов"
+        bot.reply_to(message, f"⏳ Перестраиваю роллапы статистики {scope}...")
+
+        def run():
+            try:
+                total = rebuild_stats_rollups(target_chat_id)
+                bot.send_message(message.chat.id, f"✅ Роллапы статистики {scope} перестроены, ключей: {total}")
+            except Exception as e:
+                logger.error(f"Ошибка в rebuild_stats_command: {e}", exc_info=True)
+                bot.send_message(message.chat.id, f"❌ Ошибка перестройки роллапов: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
     @bot.message_handler(commands=['refundstars', 'refund_stars'])
     def refundstars_command(message):
         """Команда для возврата звезд по ID операции (только для администраторов)"""
@@ -6,12 +6,14 @@ import re
 import secrets
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from moviebot.bot.bot_init import bot
-from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
+from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock, db_connection
+from moviebot.database.movie_list import fetch_tag_page, format_cursor, get_tag_counts, page_count, parse_cursor
 from moviebot.utils.admin import is_admin, is_owner
 from moviebot.api.kinopoisk_api import extract_movie_info
 from moviebot.utils.parsing import extract_kp_id_from_text
 from moviebot.bot.handlers.series import ensure_movie_in_database
 from moviebot.states import user_plan_state, user_view_film_state, user_mark_watched_state
+from moviebot.bot.handler_router import route_guard
 
 logger = logging.getLogger(__name__)
 
@@ -170,6 +172,7 @@ def delete_tag_command(message):
             pass
 
 
+@route_guard(user_states=(user_add_tag_state,))
 def check_add_tag_reply(message):
     """Проверяет, является ли сообщение ответом для команды /add_tags - ТОЛЬКО РЕПЛАИ НА ПРОМПТ"""
     # КРИТИЧЕСКОЕ ЛОГИРОВАНИЕ - проверяем, вызывается ли функция вообще
@@ -1632,21 +1635,18 @@ def tags_command(message):
 user_tag_list_state = {}
 
 
-def show_tag_films_page(bot, chat_id, user_id, tag_id, page=1, message_id=None):
-    """Показывает страницу фильмов из подборки (аналогично show_list_page)"""
-    MOVIES_PER_PAGE = 15  # Как в /list
-    
-    conn_local = get_db_connection()
-    cursor_local = get_db_cursor()
-    
+def show_tag_films_page(bot, chat_id, user_id, tag_id, page=1, message_id=None, cursor=None):
+    """
+    Показывает страницу фильмов из подборки (аналогично show_list_page): счётчики одним
+    запросом, фильмы страницы — запросом на страницу, cursor — из кнопок «Назад»/«Вперёд»
+    """
     try:
         # Получаем информацию о теге
-        tag_name = None
-        with db_lock:
-            cursor_local.execute('SELECT name FROM tags WHERE id = %s', (tag_id,))
-            row = cursor_local.fetchone()
-            if row:
-                tag_name = row[0] if isinstance(row, tuple) else row.get('name')
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT name FROM tags WHERE id = %s', (tag_id,))
+            row = cur.fetchone()
+        tag_name = row['name'] if row else None
         
         if not tag_name:
             text = "❌ Подборка не найдена."
@@ -1658,22 +1658,10 @@ def show_tag_films_page(bot, chat_id, user_id, tag_id, page=1, message_id=None):
                 bot.send_message(chat_id, text, reply_markup=markup)
             return
         
-        # Получаем фильмы из подборки
-        with db_lock:
-            cursor_local.execute('''
-                SELECT m.id, m.kp_id, m.title, m.year, m.genres, m.link, m.watched, m.is_series,
-                       COALESCE(AVG(r.rating), 0) as avg_rating
-                FROM user_tag_movies utm
-                INNER JOIN movies m ON utm.film_id = m.id
-                LEFT JOIN ratings r ON m.id = r.film_id AND r.chat_id = %s 
-                    AND (r.is_imported = FALSE OR r.is_imported IS NULL)
-                WHERE utm.user_id = %s AND utm.chat_id = %s AND utm.tag_id = %s
-                GROUP BY m.id, m.kp_id, m.title, m.year, m.genres, m.link, m.watched, m.is_series
-                ORDER BY m.watched ASC, m.title
-            ''', (chat_id, user_id, chat_id, tag_id))
-            rows = cursor_local.fetchall()
+        total_count, watched_count = get_tag_counts(chat_id, user_id, tag_id)
+        page, page_movies = fetch_tag_page(chat_id, user_id, tag_id, total_count, page, cursor)
         
-        if not rows:
+        if not page_movies:
             text = f"📦 <b>{sanitize_tag_name_for_html(tag_name)}</b>\n\nВ этой подборке пока нет фильмов в вашей базе."
             markup = InlineKeyboardMarkup()
             markup.add(InlineKeyboardButton("◀️ Назад к подборкам", callback_data="tags_list"))
@@ -1683,24 +1671,7 @@ def show_tag_films_page(bot, chat_id, user_id, tag_id, page=1, message_id=None):
                 bot.send_message(chat_id, text, parse_mode='HTML', reply_markup=markup)
             return
         
-        # Подсчитываем просмотренные
-        watched_count = len([r for r in rows if (r[6] if isinstance(r, tuple) else r.get('watched'))])
-        total_count = len(rows)
-        
-        # Разделяем на просмотренные и непросмотренные
-        unwatched = [r for r in rows if not (r[6] if isinstance(r, tuple) else r.get('watched'))]
-        watched = [r for r in rows if (r[6] if isinstance(r, tuple) else r.get('watched'))]
-        
-        # Объединяем: сначала непросмотренные, потом просмотренные
-        all_films = unwatched + watched
-        total_movies = len(all_films)
-        total_pages = (total_movies + MOVIES_PER_PAGE - 1) // MOVIES_PER_PAGE
-        page = max(1, min(page, total_pages))
-        
-        # Вычисляем диапазон фильмов для текущей страницы
-        start_idx = (page - 1) * MOVIES_PER_PAGE
-        end_idx = min(start_idx + MOVIES_PER_PAGE, total_movies)
-        page_movies = all_films[start_idx:end_idx]
+        total_pages = page_count(total_count)
         
         # Формируем текст страницы
         text = f"📦 <b>{sanitize_tag_name_for_html(tag_name)}</b>\n\n"
@@ -1769,9 +1740,11 @@ def show_tag_films_page(bot, chat_id, user_id, tag_id, page=1, message_id=None):
             
             nav_buttons = []
             if page > 1:
-                nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"tag_page:{tag_id}:{page-1}"))
+                back_cursor = format_cursor('b', page_movies[0]['id'])
+                nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"tag_page:{tag_id}:{page-1}:{back_cursor}"))
             if page < total_pages:
-                nav_buttons.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"tag_page:{tag_id}:{page+1}"))
+                next_cursor = format_cursor('a', page_movies[-1]['id'])
+                nav_buttons.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"tag_page:{tag_id}:{page+1}:{next_cursor}"))
             if nav_buttons:
                 markup.row(*nav_buttons)
         
@@ -1800,15 +1773,6 @@ def show_tag_films_page(bot, chat_id, user_id, tag_id, page=1, message_id=None):
             
     except Exception as e:
         logger.error(f"[TAG FILMS] Ошибка: {e}", exc_info=True)
-    finally:
-        try:
-            cursor_local.close()
-        except:
-            pass
-        try:
-            conn_local.close()
-        except:
-            pass
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("tag_page:"))
@@ -1822,6 +1786,7 @@ def handle_tag_page(call):
         parts = call.data.split(":")
         tag_id = int(parts[1])
         page = int(parts[2])
+        cursor = parse_cursor(parts[3]) if len(parts) > 3 else None
         
         state = user_tag_list_state.get(user_id)
         if not state or state.get('tag_id') != tag_id:
@@ -1829,7 +1794,7 @@ def handle_tag_page(call):
             return
         
         chat_id = state['chat_id']
-        show_tag_films_page(bot, chat_id, user_id, tag_id, page, call.message.message_id)
+        show_tag_films_page(bot, chat_id, user_id, tag_id, page, call.message.message_id, cursor)
         
     except Exception as e:
         logger.error(f"[TAG PAGE] Ошибка: {e}", exc_info=True)
@@ -11,7 +11,7 @@ from collections import defaultdict
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from moviebot.bot.bot_init import bot, BOT_ID
-from moviebot.database.db_connection import db_lock, get_db_connection, get_db_cursor
+from moviebot.database.db_connection import db_lock, get_db_connection, get_db_cursor, db_connection
 from moviebot.database.db_operations import (
     log_request,
     get_user_timezone_or_default,
@@ -30,8 +30,9 @@ from moviebot.states import (
     user_unsubscribe_state, user_add_admin_state,
     bot_messages, plan_error_messages, list_messages, added_movie_messages,
     rating_messages, plan_notification_messages, settings_messages,
-    user_expected_text, user_mark_watched_state
+    user_expected_text, user_mark_watched_state, user_private_handler_state
 )
+from moviebot.bot.handler_router import route_guard
 from moviebot.utils.parsing import parse_session_time, extract_kp_id_from_text
 from moviebot.utils.helpers import has_pro_access
 from moviebot.bot.handlers.list import handle_view_film_reply_internal
@@ -53,13 +54,11 @@ PROTECT_WINDOW = timedelta(seconds=15)   # 15 секунд — достаточ
 
 # Остальной код файла...
 
-# logger уже создан выше
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 
 # ==================== ОБРАБОТЧИКИ С ПРИОРИТЕТАМИ (ДО main_text_handler) ====================
 
+@route_guard(user_states=(user_settings_state,))
 def add_reactions_check(message):
     """Проверка для обработчика add_reactions"""
     # Пропускаем команды
@@ -124,7 +123,8 @@ def add_reactions(message):
     
     # Сохраняем в БД
     try:
-        with db_lock:
+        with db_connection() as conn:
+            cursor = conn.cursor()
             current_emojis_local = get_watched_emojis(chat_id)
             
             if action == "add":
@@ -155,6 +155,7 @@ def add_reactions(message):
 
 # ==================== ОТДЕЛЬНЫЕ HANDLERS ДЛЯ КОНКРЕТНЫХ СЦЕНАРИЕВ ====================
 
+@route_guard(any_reply=True)
 def check_list_mark_watched_reply(message):
     """Проверка для handler ответа на сообщение из /list с ID фильмов для отметки как просмотренные"""
     if not message.reply_to_message:
@@ -258,6 +259,7 @@ def handle_list_mark_watched_reply(message):
             pass
 
 
+@route_guard(any_reply=True)
 def check_mark_watched_reply(message):
     """Проверка для handler ответа на сообщение об отметке просмотренным из /list"""
     if not message.reply_to_message:
@@ -377,6 +379,7 @@ def handle_mark_watched_reply(message):
             pass
 
 
+@route_guard(any_reply=True)
 def check_list_plan_reply(message):
     """Проверка для handler ответа на промпт планирования из /list"""
     if not message.reply_to_message:
@@ -418,6 +421,7 @@ def handle_list_plan_reply(message):
             pass
 
 
+@route_guard(user_states=(user_edit_state, user_plan_state))
 def check_plan_datetime_reply(message):
     """Проверка для handler ответа на промпт даты/времени планирования (step=3) ИЛИ редактирования (edit_plan_datetime)"""
     # КРИТИЧЕСКИЙ ФИКС: В личке принимаем следующее сообщение, в группах - только реплай
@@ -585,6 +589,7 @@ def handle_plan_datetime_reply(message):
         logger.error(f"[PLAN DATETIME REPLY] ❌ Ошибка: {e}", exc_info=True)
         # Не спамим пользователю лишними сообщениями — только лог
 
+@route_guard(user_states=(user_plan_state,))
 def check_plan_link_reply(message):
     """Проверка для handler ответа на промпт ссылки/ID планирования (step=1)"""
     # КРИТИЧЕСКИЙ ФИКС: В личке принимаем следующее сообщение, в группах - только реплай
@@ -653,6 +658,7 @@ def handle_plan_link_reply(message):
             pass
 
 
+@route_guard(user_states=(user_private_handler_state,), any_reply=True)
 def check_clean_imported_ratings_reply(message):
     """Проверка для handler ответа на сообщение об удалении импортированных оценок"""
     # Проверяем, что это личный чат или реплай на сообщение бота
@@ -731,6 +737,7 @@ def handle_clean_imported_ratings_reply(message):
             pass
 
 
+@route_guard(user_states=(user_import_state,))
 def check_import_user_id_reply(message):
     """Проверка для handler ответа на сообщение об импорте базы из Кинопоиска с ID пользователя"""
     # Проверяем, что это ответ на сообщение бота
@@ -805,6 +812,7 @@ def handle_import_user_id_reply(message):
             pass
 
 
+@route_guard(any_reply=True)
 def check_list_view_film_reply(message):
     """Проверка для handler ответа на промпт просмотра описания из /list"""
     if not message.reply_to_message:
@@ -1314,6 +1322,7 @@ def process_search_query(message, query, reply_to_message=None):
 
 
 # ==================== 1. ОБРАБОТЧИК ДЛЯ ЛС: ТОЛЬКО ЕСЛИ БОТ ОЖИДАЕТ ТЕКСТ ====================
+@route_guard(user_states=(user_expected_text,))
 def is_expected_text_in_private(message):
     """Проверка для обработчика ожидаемого текста в ЛС"""
     # Пропускаем, если пользователь в состоянии /add_tags
@@ -1591,6 +1600,7 @@ def handle_search_reply_direct(message):
 # УДАЛЕНО: check_admin_commands_reply - теперь все обрабатывается через check_admin_message в state_handlers.py
 # Оставляем пустую функцию для совместимости, но она больше не используется
 
+@route_guard(user_states=(user_private_handler_state,), reply_to=(rating_messages,))
 def check_rate_reply(message):
     """Проверка для handler ответа на запрос оценки (реплай или следующее сообщение в личке)"""
     is_private = message.chat.type == 'private'
@@ -1734,7 +1744,8 @@ def handle_rate_list_reply(message):
     results = []
     errors = []
     
-    with db_lock:
+    with db_connection() as conn:
+        cursor = conn.cursor()
         for kp_id_str, rating_str in matches:
             try:
                 kp_id = kp_id_str.strip()
@@ -2583,7 +2594,8 @@ def handle_reaction(reaction):
         logger.info(f"[REACTION] Не найдено в bot_messages и plan_notification_messages для message_id={message_id}")
         # Пробуем найти фильм в БД по последним добавленным фильмам в этом чате
         try:
-            with db_lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
                 # Ищем последние фильмы в этом чате (за последний час)
                 cursor.execute("""
                     SELECT link FROM movies 
@@ -2665,7 +2677,8 @@ def handle_reaction(reaction):
         logger.warning("[REACTION] Не удалось получить user_id")
         return
     
-    with db_lock:
+    with db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute("SELECT id, title FROM movies WHERE link = %s AND chat_id = %s", (link, chat_id))
         film = cursor.fetchone()
         if not film:
@@ -2773,7 +2786,8 @@ def add_emoji_callback(call):
             emojis_str = ''.join(current_emojis)
             
             # Сохраняем в БД
-            with db_lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO settings (chat_id, key, value)
                     VALUES (%s, 'watched_emoji', %s)
@@ -2820,7 +2834,8 @@ def add_custom_emoji_callback(call):
                 emojis_str = emojis_str + (',' + custom_str if emojis_str else custom_str)
             
             # Сохраняем в БД
-            with db_lock:
+            with db_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO settings (chat_id, key, value)
                     VALUES (%s, 'watched_emoji', %s)
@@ -2855,6 +2870,7 @@ def cancel_add_emoji_callback(call):
     except Exception as e:
         logger.error(f"[CANCEL ADD EMOJI] Ошибка: {e}", exc_info=True)
 
+@route_guard(reply_to=(bot_messages,))
 def is_random_instruction_reply(message):
     """Реплай на инструкцию рандома 'Что дальше?'"""
     if not message.reply_to_message:
@@ -2872,6 +2888,7 @@ def is_random_instruction_reply(message):
         return False
     return True
 
+@route_guard(reply_to=(bot_messages,))
 def is_random_film_reply(message):
     if not message.reply_to_message:
         return False
@@ -2919,6 +2936,7 @@ def handle_random_film_plan_reply(message):
         bot.reply_to(message, "Не смог добавить в план :(")
 
 # ======== ОТВЕТЫ НА РАНДОМ И НА ИНСТРУКЦИЮ К РАНДОМУ ========
+@route_guard(reply_to=(bot_messages,))
 def is_random_instruction_reply(message):
     if not message.reply_to_message:
         return False
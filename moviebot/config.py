@@ -28,6 +28,76 @@ FALLBACK_THRESHOLD = int(os.getenv('FALLBACK_THRESHOLD', '20'))
 # Время в секундах до сброса счётчика ошибок (по умолчанию 5 минут)
 FALLBACK_RESET_TIMEOUT = int(os.getenv('FALLBACK_RESET_TIMEOUT', '300'))
 
+# Пул соединений с PostgreSQL
+DB_POOL_MIN_CONN = int(os.getenv('DB_POOL_MIN_CONN', '1'))
+# DB_POOL_MAX_CONN задаётся ниже: по умолчанию зависит от WEBHOOK_WORKERS и SCHEDULER_MAX_WORKERS
+# Сколько секунд ждать свободное соединение, прежде чем выдать ошибку
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Соединение, простоявшее в пуле дольше этого времени, проверяется SELECT 1 перед выдачей
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv('DB_POOL_HEALTHCHECK_IDLE', '30'))
+
+# Обработка /webhook: фиксированный пул воркеров и ограниченная очередь апдейтов
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+# Сколько секунд /webhook ждёт места в полной очереди, прежде чем ответить 503 (Telegram повторит доставку)
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv('WEBHOOK_ENQUEUE_TIMEOUT', '2'))
+
+# Отложенная запись телеметрии (stats, kinopoisk_api_logs): размер буфера, строк в одном INSERT и период сброса
+TELEMETRY_BUFFER_SIZE = int(os.getenv('TELEMETRY_BUFFER_SIZE', '10000'))
+TELEMETRY_BATCH_SIZE = int(os.getenv('TELEMETRY_BATCH_SIZE', '500'))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv('TELEMETRY_FLUSH_INTERVAL', '2'))
+
+# Кэш ответов публичных страниц статистики: период перепроверки версий роллапа, предельный возраст,
+# размер; счётчики просмотров ссылок копятся в памяти и пишутся раз в STATS_SHARE_VIEWS_FLUSH_INTERVAL секунд
+STATS_SHARE_CACHE_TTL = float(os.getenv('STATS_SHARE_CACHE_TTL', '30'))
+STATS_SHARE_CACHE_MAX_AGE = float(os.getenv('STATS_SHARE_CACHE_MAX_AGE', '600'))
+STATS_SHARE_CACHE_MAX_ENTRIES = int(os.getenv('STATS_SHARE_CACHE_MAX_ENTRIES', '2000'))
+STATS_SHARE_VIEWS_FLUSH_INTERVAL = float(os.getenv('STATS_SHARE_VIEWS_FLUSH_INTERVAL', '30'))
+
+# Кэш прав доступа (подписки пользователя и группы) на пару (user_id, chat_id);
+# изменения подписок сбрасывают его сразу, TTL ограничивает устаревание при правках в обход
+ENTITLEMENTS_CACHE_TTL = float(os.getenv('ENTITLEMENTS_CACHE_TTL', '30'))
+ENTITLEMENTS_CACHE_MAX_ENTRIES = int(os.getenv('ENTITLEMENTS_CACHE_MAX_ENTRIES', '10000'))
+
+# Хранилище состояний диалогов (states.py): memory — словари в памяти процесса,
+# postgres — общая таблица bot_state для нескольких воркеров. TTL считается от последней записи:
+# состояния пользователя (ожидание ввода) и сообщения бота (реплаи на карточки, /list, уведомления)
+STATE_STORE_BACKEND = os.getenv('STATE_STORE_BACKEND', 'memory').strip().lower()
+STATE_TTL_CONVERSATION = float(os.getenv('STATE_TTL_CONVERSATION', '86400'))
+STATE_TTL_MESSAGES = float(os.getenv('STATE_TTL_MESSAGES', str(30 * 86400)))
+STATE_MAX_ENTRIES = int(os.getenv('STATE_MAX_ENTRIES', '50000'))
+STATE_STORE_SWEEP_INTERVAL = float(os.getenv('STATE_STORE_SWEEP_INTERVAL', '60'))
+
+# Индекс обработчиков колбэков и сообщений (bot/handler_router.py); false — прежний перебор всех фильтров
+HANDLER_ROUTER_ENABLED = os.getenv('HANDLER_ROUTER_ENABLED', 'true').strip().lower() == 'true'
+
+# Импорт оценок с Кинопоиска (services/kp_import.py): сколько страниц запрашивать наперёд
+# и предел запросов в секунду к kinopoiskapiunofficial.tech на все импорты процесса
+KP_IMPORT_CONCURRENCY = int(os.getenv('KP_IMPORT_CONCURRENCY', '3'))
+KP_IMPORT_REQUESTS_PER_SECOND = float(os.getenv('KP_IMPORT_REQUESTS_PER_SECOND', '5'))
+
+# Рассылки планировщика (services/broadcaster.py): потоки отправки, общий лимит сообщений
+# в секунду, интервал между сообщениями в одну группу и число повторов после 429
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '8'))
+BROADCAST_RATE_PER_SECOND = float(os.getenv('BROADCAST_RATE_PER_SECOND', '25'))
+BROADCAST_GROUP_INTERVAL = float(os.getenv('BROADCAST_GROUP_INTERVAL', '3'))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+
+# Планировщик (services/scheduler_jobs.py): где хранить динамические задачи (postgres — таблица
+# apscheduler_jobs, переживают перезапуск; memory — в памяти процесса) и предел потоков задач
+SCHEDULER_JOBSTORE = os.getenv('SCHEDULER_JOBSTORE', 'postgres').strip().lower()
+SCHEDULER_MAX_WORKERS = int(os.getenv('SCHEDULER_MAX_WORKERS', '10'))
+
+# Верхняя граница пула соединений: каждый воркер /webhook и поток планировщика может держать по
+# соединению, запас — главный поток, запись телеметрии, кэш фильмов, HTTP-запросы сайта
+DB_POOL_HEADROOM = int(os.getenv('DB_POOL_HEADROOM', '5'))
+DB_POOL_MAX_CONN = int(os.getenv('DB_POOL_MAX_CONN', str(WEBHOOK_WORKERS + SCHEDULER_MAX_WORKERS + DB_POOL_HEADROOM)))
+
+# Индекс фильтров /random по базе чата (services/random_index.py): сколько чатов держать в памяти
+# и через сколько секунд строить индекс заново (подхватить изменения метаданных фильмов)
+RANDOM_INDEX_MAX_CHATS = int(os.getenv('RANDOM_INDEX_MAX_CHATS', '256'))
+RANDOM_INDEX_TTL = int(os.getenv('RANDOM_INDEX_TTL', '3600'))
+
 # Логирование токена для отладки (только первые и последние символы)
 if TOKEN:
     token_preview = f"{TOKEN[:10]}...{TOKEN[-10:]}" if len(TOKEN) > 20 else "***"
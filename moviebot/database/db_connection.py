@@ -2,76 +2,449 @@
 Подключение к базе данных и инициализация таблиц
 """
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 import threading
 import logging
-from moviebot.config import DATABASE_URL, DEFAULT_WATCHED_EMOJIS
+import time
+from contextlib import contextmanager
+from moviebot.config import (
+    DATABASE_URL, DEFAULT_WATCHED_EMOJIS,
+    DB_POOL_MIN_CONN, DB_POOL_MAX_CONN, DB_POOL_TIMEOUT, DB_POOL_HEALTHCHECK_IDLE,
+    WEBHOOK_WORKERS, SCHEDULER_MAX_WORKERS,
+)
 
 logger = logging.getLogger(__name__)
 
-# Глобальные переменные для подключения
-_conn = None
-_cursor = None
-# ВАЖНО: Используем RLock (реентерабельный lock) вместо Lock, чтобы избежать дедлоков
-# когда одна функция с db_lock вызывает другую функцию с db_lock в том же потоке
-db_lock = threading.RLock()
 
-def get_db_connection():
-    """Получить подключение к БД"""
-    global _conn
-    if _conn is None or _conn.closed:
-        if not DATABASE_URL:
-            raise ValueError("DATABASE_URL не задан!")
-        try:
-            # Закрываем старое соединение, если оно есть
-            if _conn is not None and not _conn.closed:
+class PoolExhaustedError(psycopg2.OperationalError):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений PostgreSQL.
+
+    - ограничен сверху max_conn, min_conn соединений открываются заранее;
+    - при выдаче соединение, долго лежавшее в пуле, проверяется SELECT 1;
+    - при возврате незавершённая транзакция откатывается, битое соединение выбрасывается;
+    - connection() — контекстный менеджер с транзакцией на время выдачи.
+    """
+
+    def __init__(self, dsn, min_conn=1, max_conn=10, timeout=30.0, healthcheck_idle=30.0, connect=None):
+        if max_conn < 1:
+            raise ValueError("max_conn должен быть >= 1")
+        self._dsn = dsn
+        self._connect = connect or (lambda: psycopg2.connect(dsn, cursor_factory=RealDictCursor))
+        self.min_conn = max(0, min(min_conn, max_conn))
+        self.max_conn = max_conn
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []  # [(conn, returned_at)]
+        self._size = 0  # открытые соединения: в пуле + выданные
+        self._closed = False
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+        for _ in range(self.min_conn):
+            try:
+                conn = self._connect()
+            except Exception as e:
+                logger.warning(f"[DB POOL] Не удалось заранее открыть соединение: {e}")
+                break
+            self._size += 1
+            self._stats['created'] += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def getconn(self, timeout=None):
+        """Взять соединение из пула (блокируется, пока не освободится место)"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            conn, needs_check = self._take(deadline)
+            if conn is None:
                 try:
-                    _conn.close()
-                except:
-                    pass
-            _conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-            logger.info("Подключение к PostgreSQL успешно!")
-        except Exception as e:
-            logger.error(f"Не удалось подключиться к БД: {e}")
-            _conn = None
-            raise
-    return _conn
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+                return conn
+            if needs_check and not self._is_healthy(conn):
+                self.putconn(conn, discard=True)
+                continue
+            with self._cond:
+                self._stats['reused'] += 1
+            return conn
 
-def get_db_cursor():
-    """Получить курсор БД"""
-    global _cursor
-    conn = get_db_connection()
-    # Проверяем, что курсор существует и не закрыт
-    need_new_cursor = False
-    if _cursor is None:
-        need_new_cursor = True
-    else:
+    def _take(self, deadline):
+        """Возвращает (conn, needs_check) или (None, False), если нужно открыть новое соединение"""
+        with self._cond:
+            waited = False
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("пул соединений закрыт")
+                while self._idle:
+                    conn, returned_at = self._idle.pop()
+                    if conn.closed:
+                        self._size -= 1
+                        self._stats['discarded'] += 1
+                        continue
+                    return conn, (time.monotonic() - returned_at) >= self.healthcheck_idle
+                if self._size < self.max_conn:
+                    self._size += 1
+                    return None, False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolExhaustedError(
+                        f"Нет свободных соединений в пуле (max={self.max_conn}) за {self.timeout} с"
+                    )
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+    @staticmethod
+    def _is_healthy(conn):
         try:
-            # Проверяем, закрыт ли курсор
-            if _cursor.closed:
-                need_new_cursor = True
+            cur = conn.cursor()
+            try:
+                cur.execute('SELECT 1')
+                cur.fetchone()
+            finally:
+                cur.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"[DB POOL] Соединение не прошло проверку, пересоздаём: {e}")
+            return False
+
+    def putconn(self, conn, discard=False):
+        """Вернуть соединение в пул; незавершённая транзакция откатывается"""
+        if not discard:
+            try:
+                if conn.closed:
+                    discard = True
+                else:
+                    status = conn.get_transaction_status()
+                    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                        discard = True
+                    elif status != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+                self._stats['discarded'] += 1
             else:
-                # Проверяем, закрыто ли соединение
-                try:
-                    if conn.closed:
-                        need_new_cursor = True
-                except:
-                    need_new_cursor = True
-        except:
-            # Если произошла ошибка при проверке, пересоздаем курсор
-            need_new_cursor = True
-    
-    if need_new_cursor:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard or self._closed:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Соединение на время блока with: commit при успехе, rollback при исключении"""
+        conn = self.getconn(timeout)
         try:
-            if _cursor is not None:
-                try:
-                    _cursor.close()
-                except:
-                    pass
-        except:
-            pass
-        _cursor = conn.cursor()
-    return _cursor
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, size=self._size, idle=len(self._idle), max=self.max_conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Глобальный пул соединений (создаётся при первом обращении)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not DATABASE_URL:
+                    raise ValueError("DATABASE_URL не задан!")
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    min_conn=DB_POOL_MIN_CONN,
+                    max_conn=DB_POOL_MAX_CONN,
+                    timeout=DB_POOL_TIMEOUT,
+                    healthcheck_idle=DB_POOL_HEALTHCHECK_IDLE,
+                )
+                logger.info(f"Пул подключений к PostgreSQL создан (min={DB_POOL_MIN_CONN}, max={DB_POOL_MAX_CONN})")
+                required = WEBHOOK_WORKERS + SCHEDULER_MAX_WORKERS + 1
+                if DB_POOL_MAX_CONN < required:
+                    logger.warning(
+                        f"[DB POOL] DB_POOL_MAX_CONN={DB_POOL_MAX_CONN} меньше, чем нужно воркерам /webhook "
+                        f"({WEBHOOK_WORKERS}) и планировщику ({SCHEDULER_MAX_WORKERS}) с главным потоком: {required}; "
+                        f"при нагрузке потоки будут ждать соединение до DB_POOL_TIMEOUT={DB_POOL_TIMEOUT} с"
+                    )
+    return _pool
+
+
+def db_connection(timeout=None):
+    """
+    Рекомендуемый способ работы с БД в новом коде:
+
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(...)
+
+    Соединение берётся из пула, транзакция фиксируется при выходе из блока.
+    """
+    return get_pool().connection(timeout)
+
+
+# --- Совместимость с get_db_connection()/get_db_cursor() ---
+# Каждый поток получает своё соединение из пула. Повторные вызовы в том же потоке
+# возвращают то же соединение (счётчик ссылок), а close() у полученного объекта
+# не рвёт TCP-соединение, а возвращает его в пул, когда закрыт последний держатель.
+
+class _Checkout:
+    __slots__ = ('conn', 'refs', 'thread')
+
+    def __init__(self, conn, thread):
+        self.conn = conn
+        self.refs = 0
+        self.thread = thread
+
+
+_checkouts = {}
+_checkouts_lock = threading.Lock()
+
+
+def _reap_dead_checkouts():
+    """Возвращает в пул соединения потоков, завершившихся без close()"""
+    with _checkouts_lock:
+        dead = [t for t in _checkouts if not t.is_alive()]
+        stale = [_checkouts.pop(t) for t in dead]
+    for checkout in stale:
+        if checkout.conn is not None:
+            get_pool().putconn(checkout.conn)
+            checkout.conn = None
+    if stale:
+        logger.debug(f"[DB POOL] Возвращено соединений завершившихся потоков: {len(stale)}")
+
+
+def _acquire_checkout():
+    thread = threading.current_thread()
+    with _checkouts_lock:
+        checkout = _checkouts.get(thread)
+        if checkout is not None and checkout.conn is not None and not checkout.conn.closed:
+            checkout.refs += 1
+            return checkout
+    pool = get_pool()
+    if checkout is not None and checkout.conn is not None:
+        # Соединение потока оборвалось — выбрасываем его и берём новое
+        pool.putconn(checkout.conn, discard=True)
+        checkout.conn = None
+    _reap_dead_checkouts()
+    conn = pool.getconn()
+    with _checkouts_lock:
+        if checkout is None or _checkouts.get(thread) is not checkout:
+            checkout = _Checkout(conn, thread)
+            _checkouts[thread] = checkout
+        else:
+            checkout.conn = conn
+        checkout.refs += 1
+        return checkout
+
+
+def _release_checkout(checkout):
+    with _checkouts_lock:
+        checkout.refs -= 1
+        if checkout.refs > 0:
+            return
+        if _checkouts.get(checkout.thread) is checkout:
+            del _checkouts[checkout.thread]
+        conn, checkout.conn = checkout.conn, None
+    if conn is not None:
+        get_pool().putconn(conn)
+
+
+def release_thread_connection():
+    """
+    Возвращает в пул соединение текущего потока, даже если get_db_connection()/get_db_cursor()
+    не закрыли. Вызывается в конце единицы работы долгоживущего потока (апдейт в воркере
+    /webhook, задача планировщика, HTTP-запрос): иначе незакрытое соединение держится до конца
+    жизни потока. Полученные ранее объекты соединения после этого считаются закрытыми.
+    """
+    thread = threading.current_thread()
+    with _checkouts_lock:
+        checkout = _checkouts.pop(thread, None)
+        if checkout is None:
+            return False
+        conn, checkout.conn = checkout.conn, None
+        leaked, checkout.refs = checkout.refs, 0
+    if conn is not None:
+        get_pool().putconn(conn)
+    if leaked:
+        logger.debug(f"[DB POOL] Поток {thread.name} не закрыл соединение ({leaked} держателей) — возвращено в пул")
+    return True
+
+
+def run_in_connection_scope(func, *args, **kwargs):
+    """Выполняет func и возвращает в пул соединение, которое поток взял по ходу"""
+    try:
+        return func(*args, **kwargs)
+    finally:
+        release_thread_connection()
+
+
+class _ConnectionHandle:
+    """Обёртка над соединением потока; close() возвращает его в пул"""
+    __slots__ = ('_checkout', '_released')
+
+    def __init__(self, checkout):
+        object.__setattr__(self, '_checkout', checkout)
+        object.__setattr__(self, '_released', False)
+
+    def _conn(self):
+        conn = self._checkout.conn
+        if self._released or conn is None:
+            raise psycopg2.InterfaceError('connection already closed')
+        return conn
+
+    @property
+    def closed(self):
+        conn = self._checkout.conn
+        if self._released or conn is None:
+            return 1
+        return conn.closed
+
+    def close(self):
+        if self._released:
+            return
+        object.__setattr__(self, '_released', True)
+        _release_checkout(self._checkout)
+
+    def __getattr__(self, name):
+        return getattr(self._conn(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn(), name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self._conn()
+        if exc_type is None:
+            conn.commit()
+        else:
+            conn.rollback()
+        return False
+
+
+class _PooledCursor(RealDictCursor):
+    """Курсор из get_db_cursor(): close() отпускает соединение потока"""
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            checkout = self.__dict__.pop('_checkout', None)
+            if checkout is not None:
+                _release_checkout(checkout)
+
+
+class _ThreadLocalLock:
+    """
+    db_lock раньше сериализовал все запросы на единственном соединении.
+    Теперь у каждого потока своё соединение из пула, поэтому блокировка
+    реентерабельная и локальная для потока: API (with/acquire/release) прежний,
+    но потоки больше не ждут друг друга.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _lock(self):
+        lock = getattr(self._local, 'lock', None)
+        if lock is None:
+            lock = self._local.lock = threading.RLock()
+        return lock
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self._lock().acquire(blocking, timeout)
+
+    def release(self):
+        self._lock().release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+db_lock = _ThreadLocalLock()
+
+
+def get_db_connection():
+    """Получить подключение к БД (соединение текущего потока из пула)"""
+    try:
+        return _ConnectionHandle(_acquire_checkout())
+    except Exception as e:
+        logger.error(f"Не удалось подключиться к БД: {e}")
+        raise
+
+
+def get_db_cursor():
+    """Получить курсор БД на соединении текущего потока"""
+    checkout = _acquire_checkout()
+    try:
+        cursor = checkout.conn.cursor(cursor_factory=_PooledCursor)
+    except Exception:
+        _release_checkout(checkout)
+        raise
+    cursor._checkout = checkout
+    return cursor
+
+def _alter_column_type(cursor, table, column, data_type, using=None):
+    """
+    ALTER COLUMN ... TYPE, только если тип столбца другой. Столбец из UPDATE OF триггера
+    (stats_rollup_*) нельзя переводить даже в тот же тип: ошибка обрывает транзакцию миграций.
+    """
+    cursor.execute('SELECT data_type FROM information_schema.columns WHERE table_name = %s AND column_name = %s',
+                   (table, column))
+    row = cursor.fetchone()
+    if row is None or row['data_type'] == data_type.lower():
+        return False
+    cursor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE {data_type}' + (f' USING {using}' if using else ''))
+    return True
+
 
 def init_database():
     """Инициализация базы данных: создание таблиц и миграции"""
@@ -339,8 +712,8 @@ def init_database():
     
     # Миграции
     try:
-        cursor.execute('ALTER TABLE movies ALTER COLUMN chat_id TYPE BIGINT')
-        logger.info("Миграция: movies.chat_id изменён на BIGINT")
+        if _alter_column_type(cursor, 'movies', 'chat_id', 'BIGINT'):
+            logger.info("Миграция: movies.chat_id изменён на BIGINT")
     except Exception as e:
         logger.debug(f"Миграция movies.chat_id: {e}")
     
@@ -400,29 +773,29 @@ def init_database():
         logger.debug(f"Миграция payments.telegram_payment_charge_id: {e}")
     
     try:
-        cursor.execute('ALTER TABLE settings ALTER COLUMN chat_id TYPE BIGINT')
-        logger.info("Миграция: settings.chat_id изменён на BIGINT")
+        if _alter_column_type(cursor, 'settings', 'chat_id', 'BIGINT'):
+            logger.info("Миграция: settings.chat_id изменён на BIGINT")
     except Exception as e:
         logger.debug(f"Миграция settings.chat_id: {e}")
     
     try:
-        cursor.execute('ALTER TABLE plans ALTER COLUMN chat_id TYPE BIGINT')
-        cursor.execute('ALTER TABLE plans ALTER COLUMN user_id TYPE BIGINT')
-        logger.info("Миграция: plans.chat_id и plans.user_id изменены на BIGINT")
+        changed = _alter_column_type(cursor, 'plans', 'chat_id', 'BIGINT')
+        if _alter_column_type(cursor, 'plans', 'user_id', 'BIGINT') or changed:
+            logger.info("Миграция: plans.chat_id и plans.user_id изменены на BIGINT")
     except Exception as e:
         logger.debug(f"Миграция plans: {e}")
     
     try:
-        cursor.execute('ALTER TABLE stats ALTER COLUMN chat_id TYPE BIGINT')
-        cursor.execute('ALTER TABLE stats ALTER COLUMN user_id TYPE BIGINT')
-        logger.info("Миграция: stats.chat_id и stats.user_id изменены на BIGINT")
+        changed = _alter_column_type(cursor, 'stats', 'chat_id', 'BIGINT')
+        if _alter_column_type(cursor, 'stats', 'user_id', 'BIGINT') or changed:
+            logger.info("Миграция: stats.chat_id и stats.user_id изменены на BIGINT")
     except Exception as e:
         logger.debug(f"Миграция stats: {e}")
     
     try:
-        cursor.execute('ALTER TABLE ratings ALTER COLUMN chat_id TYPE BIGINT')
-        cursor.execute('ALTER TABLE ratings ALTER COLUMN user_id TYPE BIGINT')
-        logger.info("Миграция: ratings.chat_id и ratings.user_id изменены на BIGINT")
+        changed = _alter_column_type(cursor, 'ratings', 'chat_id', 'BIGINT')
+        if _alter_column_type(cursor, 'ratings', 'user_id', 'BIGINT') or changed:
+            logger.info("Миграция: ratings.chat_id и ratings.user_id изменены на BIGINT")
     except Exception as e:
         logger.debug(f"Миграция ratings: {e}")
     
@@ -433,15 +806,16 @@ def init_database():
         logger.debug(f"Миграция ratings.is_imported: {e}")
     
     try:
-        cursor.execute('ALTER TABLE cinema_votes ALTER COLUMN chat_id TYPE BIGINT')
-        cursor.execute('ALTER TABLE cinema_votes ALTER COLUMN message_id TYPE BIGINT')
-        logger.info("Миграция: cinema_votes.chat_id и cinema_votes.message_id изменены на BIGINT")
+        changed = _alter_column_type(cursor, 'cinema_votes', 'chat_id', 'BIGINT')
+        if _alter_column_type(cursor, 'cinema_votes', 'message_id', 'BIGINT') or changed:
+            logger.info("Миграция: cinema_votes.chat_id и cinema_votes.message_id изменены на BIGINT")
     except Exception as e:
         logger.debug(f"Миграция cinema_votes: {e}")
     
     try:
-        cursor.execute("ALTER TABLE plans ALTER COLUMN plan_datetime TYPE TIMESTAMP WITH TIME ZONE USING plan_datetime::TIMESTAMP WITH TIME ZONE")
-        logger.info("Миграция: plan_datetime в plans изменён на TIMESTAMP WITH TIME ZONE")
+        if _alter_column_type(cursor, 'plans', 'plan_datetime', 'TIMESTAMP WITH TIME ZONE',
+                              using='plan_datetime::TIMESTAMP WITH TIME ZONE'):
+            logger.info("Миграция: plan_datetime в plans изменён на TIMESTAMP WITH TIME ZONE")
         conn.commit()
     except Exception as e:
         logger.debug(f"Миграция plan_datetime: {e}")
@@ -953,6 +1327,496 @@ def init_database():
         except Exception:
             pass
 
+    # Общий кэш метаданных фильмов (api/film_cache.py)
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS film_cache (
+                kp_id TEXT PRIMARY KEY,
+                data JSONB NOT NULL,
+                field_fetched_at JSONB NOT NULL DEFAULT '{}'::jsonb,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+        ''')
+        conn.commit()
+        logger.info("Таблица film_cache создана")
+    except Exception as e:
+        logger.debug(f"Таблица film_cache: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Кэш статуса сериалов в movies (используется update_series_status_cache и /stats)
+    try:
+        cursor.execute('ALTER TABLE movies ADD COLUMN IF NOT EXISTS is_ongoing BOOLEAN')
+        cursor.execute('ALTER TABLE movies ADD COLUMN IF NOT EXISTS seasons_count INTEGER')
+        cursor.execute('ALTER TABLE movies ADD COLUMN IF NOT EXISTS next_episode TEXT')
+        cursor.execute('ALTER TABLE movies ADD COLUMN IF NOT EXISTS last_api_update TIMESTAMP WITH TIME ZONE')
+        cursor.execute('ALTER TABLE movies ADD COLUMN IF NOT EXISTS source TEXT')
+        conn.commit()
+    except Exception as e:
+        logger.debug(f"Миграция movies (кэш сериалов): {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Общий каталог фильмов по kp_id (database/film_catalog.py); movies ссылаются на него по kp_id
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS films (
+                kp_id TEXT PRIMARY KEY,
+                title TEXT,
+                year INTEGER,
+                genres TEXT,
+                description TEXT,
+                director TEXT,
+                actors TEXT,
+                is_series INTEGER DEFAULT 0,
+                is_ongoing BOOLEAN,
+                seasons_count INTEGER,
+                next_episode TEXT,
+                last_api_update TIMESTAMP WITH TIME ZONE,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS films_backfill_done (
+                id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_kp_id ON movies (kp_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_films_series_update ON films (last_api_update) WHERE is_series = 1')
+        conn.commit()
+        logger.info("Таблица films создана")
+    except Exception as e:
+        logger.debug(f"Таблица films: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Число эпизодов сериала по kp_id (film_catalog.save_series_episode_count, /stats)
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS series_episode_counts (
+                kp_id TEXT PRIMARY KEY,
+                seasons_count INTEGER,
+                episodes_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+        ''')
+        conn.commit()
+    except Exception as e:
+        logger.debug(f"Таблица series_episode_counts: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Связи каталога: жанры и персоны фильма по отдельным строкам (film_catalog.sync_film_links)
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS film_genres (
+                kp_id TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                PRIMARY KEY (kp_id, genre)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS film_people (
+                kp_id TEXT NOT NULL,
+                role VARCHAR(16) NOT NULL,
+                name TEXT NOT NULL,
+                position SMALLINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (kp_id, role, name)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS film_links_backfill_done (
+                id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_film_genres_genre ON film_genres (genre, kp_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_film_people_role_name ON film_people (role, name, kp_id)')
+        conn.commit()
+        logger.info("Таблицы film_genres/film_people созданы")
+    except Exception as e:
+        logger.debug(f"Таблицы film_genres/film_people: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Месячные роллапы статистики сайта (api/site_stats.py).
+    # Триггеры на сырых таблицах увеличивают version ключа (chat_id, month);
+    # ключ пересчитывается целиком, когда version > refreshed_version.
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_monthly_rollups (
+                chat_id BIGINT NOT NULL,
+                month DATE NOT NULL,
+                user_id BIGINT NOT NULL,
+                films_watched INTEGER NOT NULL DEFAULT 0,
+                series_watched INTEGER NOT NULL DEFAULT 0,
+                episodes_watched INTEGER NOT NULL DEFAULT 0,
+                views INTEGER NOT NULL DEFAULT 0,
+                ratings_count INTEGER NOT NULL DEFAULT 0,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                cinema_visits INTEGER NOT NULL DEFAULT 0,
+                rating_breakdown JSONB NOT NULL DEFAULT '{}'::jsonb,
+                genres JSONB NOT NULL DEFAULT '{}'::jsonb,
+                platforms JSONB NOT NULL DEFAULT '{}'::jsonb,
+                activity JSONB NOT NULL DEFAULT '{}'::jsonb,
+                PRIMARY KEY (chat_id, month, user_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_rollup_state (
+                chat_id BIGINT NOT NULL,
+                month DATE NOT NULL,
+                version BIGINT NOT NULL DEFAULT 1,
+                refreshed_version BIGINT NOT NULL DEFAULT 0,
+                refreshed_at TIMESTAMP WITH TIME ZONE,
+                PRIMARY KEY (chat_id, month)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_profile_rollups (
+                user_id BIGINT PRIMARY KEY,
+                total_films INTEGER NOT NULL DEFAULT 0,
+                total_series INTEGER NOT NULL DEFAULT 0,
+                total_ratings INTEGER NOT NULL DEFAULT 0,
+                avg_rating NUMERIC(4,2),
+                total_cinema INTEGER NOT NULL DEFAULT 0,
+                completed_series INTEGER NOT NULL DEFAULT 0,
+                total_episodes INTEGER NOT NULL DEFAULT 0,
+                unique_genres INTEGER NOT NULL DEFAULT 0,
+                total_plans INTEGER NOT NULL DEFAULT 0,
+                mvp_count INTEGER NOT NULL DEFAULT 0,
+                first_activity TIMESTAMP WITH TIME ZONE,
+                year_streak BOOLEAN NOT NULL DEFAULT FALSE,
+                earned TEXT[],
+                notified TEXT[] NOT NULL DEFAULT '{}',
+                version BIGINT NOT NULL DEFAULT 1,
+                refreshed_version BIGINT NOT NULL DEFAULT 0,
+                refreshed_at TIMESTAMP WITH TIME ZONE
+            )
+        ''')
+        # Планы и MVP во всех чатах, полученные и объявленные ачивки (services/achievement_engine.py).
+        # Строки, посчитанные до появления счётчиков планов и MVP, устаревают и пересчитываются.
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'stats_profile_rollups' AND column_name = 'total_plans'
+        """)
+        profile_counters_added = cursor.fetchone() is None
+        cursor.execute("ALTER TABLE stats_profile_rollups ADD COLUMN IF NOT EXISTS total_plans INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE stats_profile_rollups ADD COLUMN IF NOT EXISTS mvp_count INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE stats_profile_rollups ADD COLUMN IF NOT EXISTS earned TEXT[]")
+        cursor.execute("ALTER TABLE stats_profile_rollups ADD COLUMN IF NOT EXISTS notified TEXT[] NOT NULL DEFAULT '{}'")
+        if profile_counters_added:
+            cursor.execute("UPDATE stats_profile_rollups SET version = version + 1")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_rollup_state_stale ON stats_rollup_state (month) WHERE version > refreshed_version')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_profile_rollups_stale ON stats_profile_rollups (user_id) WHERE version > refreshed_version')
+        # Выборки за месяц по сырым таблицам (пересчёт роллапа и списки фильмов месяца)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ratings_chat_rated_at ON ratings (chat_id, rated_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_watched_movies_chat_watched_at ON watched_movies (chat_id, watched_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_series_tracking_chat_watched_date ON series_tracking (chat_id, watched_date) WHERE watched = TRUE')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION stats_profile_touch(p_user_id BIGINT) RETURNS VOID AS $$
+            BEGIN
+                IF p_user_id > 0 THEN
+                    UPDATE stats_profile_rollups SET version = version + 1 WHERE user_id = p_user_id;
+                END IF;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION stats_rollup_touch(p_chat_id BIGINT, p_value TEXT) RETURNS VOID AS $$
+            BEGIN
+                IF p_chat_id IS NULL THEN
+                    RETURN;
+                END IF;
+                IF p_value IS NULL THEN
+                    -- Без даты строка попадает во все месяцы (или меняется сам фильм) — устаревают все ключи чата
+                    UPDATE stats_rollup_state SET version = version + 1 WHERE chat_id = p_chat_id;
+                ELSE
+                    INSERT INTO stats_rollup_state (chat_id, month)
+                    VALUES (
+                        p_chat_id,
+                        CASE WHEN length(p_value) = 10 THEN date_trunc('month', p_value::date)::date
+                             ELSE date_trunc('month', p_value::timestamptz AT TIME ZONE 'UTC')::date END
+                    )
+                    ON CONFLICT (chat_id, month) DO UPDATE SET version = stats_rollup_state.version + 1;
+                END IF;
+                -- Личный чат: chat_id = user_id владельца профиля
+                PERFORM stats_profile_touch(p_chat_id);
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION stats_rollup_mark_stale() RETURNS TRIGGER AS $$
+            BEGIN
+                -- TG_ARGV[1] = 'user': строка входит в профиль user_id в любом чате (планы)
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM stats_rollup_touch(OLD.chat_id, to_jsonb(OLD) ->> TG_ARGV[0]);
+                    IF TG_ARGV[1] = 'user' THEN
+                        PERFORM stats_profile_touch((to_jsonb(OLD) ->> 'user_id')::bigint);
+                    END IF;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM stats_rollup_touch(NEW.chat_id, to_jsonb(NEW) ->> TG_ARGV[0]);
+                    IF TG_ARGV[1] = 'user' THEN
+                        PERFORM stats_profile_touch((to_jsonb(NEW) ->> 'user_id')::bigint);
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION stats_profile_mark_stale() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM stats_profile_touch(OLD.user_id);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM stats_profile_touch(NEW.user_id);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table, date_column, columns, owner in (
+            ('watched_movies', 'watched_at', 'chat_id, film_id, user_id, watched_at', 'chat'),
+            ('ratings', 'rated_at', 'chat_id, film_id, user_id, rating, rated_at', 'chat'),
+            ('series_tracking', 'watched_date', 'chat_id, film_id, user_id, watched, watched_date', 'chat'),
+            ('cinema_screenings', 'screening_date', 'chat_id, film_id, user_id, screening_date', 'chat'),
+            ('plans', 'plan_datetime', 'chat_id, film_id, user_id, plan_type, plan_datetime', 'user'),
+        ):
+            cursor.execute(f'DROP TRIGGER IF EXISTS stats_rollup_{table} ON {table}')
+            cursor.execute(f'''
+                CREATE TRIGGER stats_rollup_{table}
+                AFTER INSERT OR DELETE OR UPDATE OF {columns} ON {table}
+                FOR EACH ROW EXECUTE FUNCTION stats_rollup_mark_stale('{date_column}', '{owner}')
+            ''')
+        # MVP месяца входит только в профиль
+        cursor.execute('DROP TRIGGER IF EXISTS stats_rollup_mvp_history ON mvp_history')
+        cursor.execute('''
+            CREATE TRIGGER stats_rollup_mvp_history
+            AFTER INSERT OR DELETE OR UPDATE OF user_id ON mvp_history
+            FOR EACH ROW EXECUTE FUNCTION stats_profile_mark_stale()
+        ''')
+        # Смена типа или kp_id (жанры) фильма, удаление фильма меняют счётчики всех месяцев чата
+        cursor.execute('DROP TRIGGER IF EXISTS stats_rollup_movies ON movies')
+        cursor.execute('''
+            CREATE TRIGGER stats_rollup_movies
+            AFTER UPDATE OF is_series, kp_id ON movies
+            FOR EACH ROW WHEN (OLD.is_series IS DISTINCT FROM NEW.is_series OR OLD.kp_id IS DISTINCT FROM NEW.kp_id)
+            EXECUTE FUNCTION stats_rollup_mark_stale()
+        ''')
+        cursor.execute('DROP TRIGGER IF EXISTS stats_rollup_movies_delete ON movies')
+        cursor.execute('''
+            CREATE TRIGGER stats_rollup_movies_delete
+            AFTER DELETE ON movies
+            FOR EACH ROW EXECUTE FUNCTION stats_rollup_mark_stale()
+        ''')
+        conn.commit()
+        logger.info("Роллапы статистики созданы")
+    except Exception as e:
+        logger.debug(f"Роллапы статистики: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Отдельная таблица achievement_counters со своими триггерами заменена строкой
+    # stats_profile_rollups: полученные и объявленные ачивки переносятся, триггеры снимаются.
+    try:
+        cursor.execute("SELECT to_regclass('achievement_counters') IS NOT NULL AS present")
+        row = cursor.fetchone()
+        if row.get('present') if isinstance(row, dict) else row[0]:
+            cursor.execute("""
+                INSERT INTO stats_profile_rollups (user_id, earned, notified)
+                SELECT user_id, earned, notified FROM achievement_counters
+                ON CONFLICT (user_id) DO UPDATE SET earned = EXCLUDED.earned, notified = EXCLUDED.notified
+            """)
+            for table in ('ratings', 'watched_movies', 'series_tracking', 'cinema_screenings', 'plans',
+                          'mvp_history', 'movies'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS achievement_counters_{table} ON {table}')
+            cursor.execute('DROP TRIGGER IF EXISTS achievement_counters_movies_delete ON movies')
+            cursor.execute('DROP FUNCTION IF EXISTS achievement_counters_touch()')
+            cursor.execute('DROP FUNCTION IF EXISTS achievement_counters_movie_touch()')
+            cursor.execute('DROP FUNCTION IF EXISTS achievement_counters_apply(JSONB, INT, TEXT[])')
+            cursor.execute('DROP TABLE achievement_counters')
+            conn.commit()
+            logger.info("Счётчики ачивок перенесены в stats_profile_rollups")
+    except Exception as e:
+        logger.debug(f"Перенос счётчиков ачивок: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Общее хранилище состояний диалогов (services/state_store.py, STATE_STORE_BACKEND=postgres)
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bot_state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at TIMESTAMPTZ NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bot_state_expires ON bot_state (expires_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bot_state_updated ON bot_state (namespace, updated_at)')
+        conn.commit()
+    except Exception as e:
+        logger.debug(f"Таблица bot_state: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Прогресс импорта оценок с Кинопоиска (services/kp_import.py): продолжение с next_page
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS kp_import_jobs (
+                id SERIAL PRIMARY KEY,
+                chat_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                kp_user_id TEXT NOT NULL,
+                max_count INTEGER NOT NULL,
+                next_page INTEGER NOT NULL DEFAULT 1,
+                imported INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'running',
+                status_message_id BIGINT,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                UNIQUE (chat_id, user_id, kp_user_id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_kp_import_jobs_running ON kp_import_jobs (status) WHERE status = 'running'")
+        conn.commit()
+    except Exception as e:
+        logger.debug(f"Таблица kp_import_jobs: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Динамические задачи планировщика (напоминания по планам, уведомления о сериях): переживают перезапуск
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS apscheduler_jobs (
+                id TEXT PRIMARY KEY,
+                next_run_time DOUBLE PRECISION,
+                job_state BYTEA NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_apscheduler_jobs_next_run_time ON apscheduler_jobs (next_run_time)")
+        conn.commit()
+    except Exception as e:
+        logger.debug(f"Таблица apscheduler_jobs: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    # Страницы /list (database/movie_list.py): индекс для keyset-пагинации непросмотренных фильмов
+    # чата по (название, id), фильмы без названия в конце, и число непросмотренных на чат. Счётчик ведёт триггер на movies
+    # (добавление, отметка просмотренным, удаление — любым путём: бот, сайт, импорт); при создании
+    # таблицы он заполняется одним запросом в той же транзакции, что и триггер.
+    # version растёт при каждом таком изменении и при импорте оценки на фильм чата — по нему
+    # индекс /random (services/random_index.py) узнаёт, что базу чата нужно досинхронизировать.
+    try:
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_movies_unwatched_sort
+            ON movies (chat_id, (title IS NULL), (COALESCE(title, '')), id)
+            INCLUDE (title, kp_id, year, genres, link)
+            WHERE watched = 0
+        """)
+        # Прежний индекс ставил фильмы без названия в начало
+        cursor.execute('DROP INDEX IF EXISTS idx_movies_unwatched_title')
+        cursor.execute("SELECT to_regclass('movie_list_counts') IS NOT NULL AS exists")
+        counts_exist = cursor.fetchone()['exists']
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS movie_list_counts (
+                chat_id BIGINT PRIMARY KEY,
+                unwatched INTEGER NOT NULL DEFAULT 0,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute('ALTER TABLE movie_list_counts ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0')
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION movie_list_counts_bump(p_chat_id BIGINT, p_delta INTEGER) RETURNS VOID AS $$
+            BEGIN
+                IF p_chat_id IS NULL THEN
+                    RETURN;
+                END IF;
+                INSERT INTO movie_list_counts (chat_id, unwatched, version) VALUES (p_chat_id, GREATEST(p_delta, 0), 1)
+                ON CONFLICT (chat_id) DO UPDATE SET unwatched = GREATEST(movie_list_counts.unwatched + p_delta, 0),
+                                                    version = movie_list_counts.version + 1;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION movie_list_counts_apply() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE' AND OLD.watched = NEW.watched AND OLD.chat_id = NEW.chat_id THEN
+                    RETURN NULL;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.watched = 0 THEN
+                    PERFORM movie_list_counts_bump(OLD.chat_id, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.watched = 0 THEN
+                    PERFORM movie_list_counts_bump(NEW.chat_id, 1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        # Без UPDATE OF: триггер не должен зависеть от столбцов, иначе не пройдёт миграция movies.chat_id
+        cursor.execute('DROP TRIGGER IF EXISTS movie_list_counts_movies ON movies')
+        cursor.execute("""
+            CREATE TRIGGER movie_list_counts_movies
+            AFTER INSERT OR DELETE OR UPDATE ON movies
+            FOR EACH ROW EXECUTE FUNCTION movie_list_counts_apply()
+        """)
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION movie_list_counts_rating_apply() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_imported AND OLD.film_id IS NOT NULL THEN
+                    PERFORM movie_list_counts_bump(OLD.chat_id, 0);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_imported AND NEW.film_id IS NOT NULL THEN
+                    PERFORM movie_list_counts_bump(NEW.chat_id, 0);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute('DROP TRIGGER IF EXISTS movie_list_counts_ratings ON ratings')
+        cursor.execute("""
+            CREATE TRIGGER movie_list_counts_ratings
+            AFTER INSERT OR DELETE OR UPDATE ON ratings
+            FOR EACH ROW EXECUTE FUNCTION movie_list_counts_rating_apply()
+        """)
+        if not counts_exist:
+            cursor.execute("""
+                INSERT INTO movie_list_counts (chat_id, unwatched)
+                SELECT chat_id, COUNT(*) FROM movies WHERE watched = 0 AND chat_id IS NOT NULL GROUP BY chat_id
+                ON CONFLICT (chat_id) DO UPDATE SET unwatched = EXCLUDED.unwatched
+            """)
+        conn.commit()
+    except Exception as e:
+        logger.debug(f"Счётчики /list: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
     conn.commit()
     logger.info("База данных инициализирована")
 
@@ -7,16 +7,18 @@ import pytz
 import requests
 from datetime import datetime
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock
+from moviebot.database.db_connection import get_db_connection, get_db_cursor, db_lock, db_connection
+from moviebot.database.telemetry import enqueue_request_log
 from moviebot.config import DEFAULT_WATCHED_EMOJIS, KP_TOKEN
+from moviebot.utils.entitlements import (
+    CREATOR_USER_ID, get_entitlements, invalidate_entitlements, invalidate_subscription_owner
+)
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from moviebot.config import DATABASE_URL
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 def get_watched_emoji(chat_id):
 
@@ -160,6 +162,30 @@ def is_watched_emoji(reaction_emoji, chat_id):
 
 
 
+# Поддерживаемые значения настройки user_timezone
+TIMEZONE_NAMES = {
+    'Moscow': 'Europe/Moscow',
+    'Serbia': 'Europe/Belgrade',
+    'Kaliningrad': 'Europe/Kaliningrad',      # -1 МСК
+    'Samara': 'Europe/Samara',                # +1 МСК
+    'Yekaterinburg': 'Asia/Yekaterinburg',    # +2 МСК
+    'Omsk': 'Asia/Omsk',                      # +3 МСК
+    'Novosibirsk': 'Asia/Novosibirsk',        # +4 МСК
+    'Irkutsk': 'Asia/Irkutsk',                # +5 МСК
+    'Yakutsk': 'Asia/Yakutsk',                # +6 МСК
+    'Vladivostok': 'Asia/Vladivostok',        # +7 МСК
+    'Magadan': 'Asia/Magadan',                # +8 МСК
+    'Kamchatka': 'Asia/Kamchatka',            # +9 МСК
+}
+
+
+def timezone_from_setting(tz_name):
+    """pytz-часовой пояс по значению настройки user_timezone или None"""
+    if tz_name in TIMEZONE_NAMES:
+        return pytz.timezone(TIMEZONE_NAMES[tz_name])
+    return None
+
+
 def get_user_timezone(user_id):
     """Получает часовой пояс пользователя. Возвращает pytz.timezone объект или None"""
 
@@ -179,25 +205,7 @@ def get_user_timezone(user_id):
 
         if row:
             tz_name = row.get('value') if isinstance(row, dict) else row[0]
-
-            # Карта поддерживаемых идентификаторов часовых поясов
-            tz_map = {
-                'Moscow': 'Europe/Moscow',
-                'Serbia': 'Europe/Belgrade',
-                'Kaliningrad': 'Europe/Kaliningrad',      # -1 МСК
-                'Samara': 'Europe/Samara',                # +1 МСК
-                'Yekaterinburg': 'Asia/Yekaterinburg',    # +2 МСК
-                'Omsk': 'Asia/Omsk',                      # +3 МСК
-                'Novosibirsk': 'Asia/Novosibirsk',        # +4 МСК
-                'Irkutsk': 'Asia/Irkutsk',                # +5 МСК
-                'Yakutsk': 'Asia/Yakutsk',                # +6 МСК
-                'Vladivostok': 'Asia/Vladivostok',        # +7 МСК
-                'Magadan': 'Asia/Magadan',                # +8 МСК
-                'Kamchatka': 'Asia/Kamchatka',            # +9 МСК
-            }
-
-            if tz_name in tz_map:
-                return pytz.timezone(tz_map[tz_name])
+            return timezone_from_setting(tz_name)
 
         return None
 
@@ -267,8 +275,6 @@ def set_user_timezone(user_id, timezone_name):
 
         logger.error(f"Ошибка установки часового пояса для user_id={user_id}: {e}", exc_info=True)
 
-        conn.rollback()
-
         return False
 
 
@@ -337,68 +343,14 @@ def get_watched_reactions(chat_id):
 # Статистика
 
 def log_request(user_id, username, command_or_action, chat_id=None):
-    """Логирует запрос пользователя в БД"""
-    # ВАЖНО: Используем локальные соединения вместо глобальных
-    conn_local = None
-    cursor_local = None
-    
+    """Логирует запрос пользователя в БД (строка пишется в фоне пачкой, см. database/telemetry.py)"""
     try:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        logger.debug(f"[LOG_REQUEST] Попытка логирования: user_id={user_id}, username={username}, command={command_or_action}, chat_id={chat_id}, timestamp={timestamp}")
-
-        conn_local = get_db_connection()
-        cursor_local = get_db_cursor()
-
-        with db_lock:
-            try:
-                # Проверяем, не в состоянии ли ошибки транзакция
-                try:
-                    cursor_local.execute('SELECT 1')
-                    cursor_local.fetchone()
-                except:
-                    # Если транзакция в состоянии ошибки, откатываем
-                    conn_local.rollback()
-                
-                cursor_local.execute('''
-                    INSERT INTO stats (user_id, username, command_or_action, timestamp, chat_id)
-                    VALUES (%s, %s, %s, %s, %s)
-                ''', (user_id, username, command_or_action, timestamp, chat_id))
-
-                conn_local.commit()
-                logger.debug(f"[LOG_REQUEST] Успешно залогировано: user_id={user_id}, command={command_or_action}, chat_id={chat_id}")
-
-            except Exception as db_error:
-                # КРИТИЧНО: откатываем транзакцию при ошибке
-                try:
-                    conn_local.rollback()
-                except:
-                    pass
-                logger.error(f"[LOG_REQUEST] Ошибка БД при логировании: {db_error}", exc_info=True)
-                # Не делаем raise, чтобы не прерывать выполнение основной логики
-
+        logger.debug(f"[LOG_REQUEST] user_id={user_id}, username={username}, command={command_or_action}, chat_id={chat_id}")
+        if not enqueue_request_log(user_id, username, command_or_action, chat_id):
+            logger.debug(f"[LOG_REQUEST] Буфер телеметрии заполнен, запись отброшена: command={command_or_action}")
     except Exception as e:
+        # Не прерываем выполнение основной логики
         logger.error(f"Ошибка логирования запроса: {e}", exc_info=True)
-        # Убеждаемся, что транзакция откачена
-        if conn_local:
-            try:
-                with db_lock:
-                    conn_local.rollback()
-            except:
-                pass
-    finally:
-        # Закрываем локальные соединения
-        if cursor_local:
-            try:
-                cursor_local.close()
-            except:
-                pass
-        if conn_local:
-            try:
-                conn_local.close()
-            except:
-                pass
-
-            pass
 
 
 def print_daily_stats():
@@ -486,21 +438,47 @@ def get_ratings_info(chat_id, film_id, user_id):
             pass
 
 
+# Настройки времени напоминаний чата: значения по умолчанию и ключи в таблице settings
+NOTIFICATION_DEFAULTS = {
+    'separate_weekdays': 'true',  # По умолчанию разделяем будни и выходные
+    'home_weekday_hour': 19,  # Будни: 19:00
+    'home_weekday_minute': 0,
+    'home_weekend_hour': 9,  # Выходные: 9:00
+    'home_weekend_minute': 0,
+    'cinema_weekday_hour': 9,  # Кино будни: 9:00
+    'cinema_weekday_minute': 0,
+    'cinema_weekend_hour': 9,  # Кино выходные: 9:00
+    'cinema_weekend_minute': 0,
+    'ticket_before_minutes': 10  # За 10 минут по умолчанию
+}
+NOTIFICATION_SETTING_KEYS = {
+    'notify_separate_weekdays': 'separate_weekdays',
+    'notify_home_weekday_hour': 'home_weekday_hour',
+    'notify_home_weekday_minute': 'home_weekday_minute',
+    'notify_home_weekend_hour': 'home_weekend_hour',
+    'notify_home_weekend_minute': 'home_weekend_minute',
+    'notify_cinema_weekday_hour': 'cinema_weekday_hour',
+    'notify_cinema_weekday_minute': 'cinema_weekday_minute',
+    'notify_cinema_weekend_hour': 'cinema_weekend_hour',
+    'notify_cinema_weekend_minute': 'cinema_weekend_minute',
+    'ticket_before_minutes': 'ticket_before_minutes',
+}
+
+
+def _notification_settings_from_rows(rows):
+    """Настройки напоминаний из пар (key, value) таблицы settings поверх значений по умолчанию"""
+    settings = dict(NOTIFICATION_DEFAULTS)
+    for key, value in rows:
+        name = NOTIFICATION_SETTING_KEYS.get(key)
+        if name == 'separate_weekdays':
+            settings[name] = value
+        elif name:
+            settings[name] = int(value) if value else NOTIFICATION_DEFAULTS[name]
+    return settings
+
+
 def get_notification_settings(chat_id):
     """Получает настройки времени напоминаний для чата"""
-    defaults = {
-        'separate_weekdays': 'true',  # По умолчанию разделяем будни и выходные
-        'home_weekday_hour': 19,  # Будни: 19:00
-        'home_weekday_minute': 0,
-        'home_weekend_hour': 9,  # Выходные: 9:00
-        'home_weekend_minute': 0,
-        'cinema_weekday_hour': 9,  # Кино будни: 9:00
-        'cinema_weekday_minute': 0,
-        'cinema_weekend_hour': 9,  # Кино выходные: 9:00
-        'cinema_weekend_minute': 0,
-        'ticket_before_minutes': 10  # За 10 минут по умолчанию
-    }
-    
     # Используем локальное соединение, чтобы не зависеть от глобального курсора
     conn_local = get_db_connection()
     cursor_local = get_db_cursor()
@@ -509,40 +487,9 @@ def get_notification_settings(chat_id):
         with db_lock:
             cursor_local.execute("""
                 SELECT key, value FROM settings 
-                WHERE chat_id = %s AND key IN (
-                    'notify_separate_weekdays', 'notify_home_weekday_hour', 'notify_home_weekday_minute',
-                    'notify_home_weekend_hour', 'notify_home_weekend_minute',
-                    'notify_cinema_weekday_hour', 'notify_cinema_weekday_minute',
-                    'notify_cinema_weekend_hour', 'notify_cinema_weekend_minute',
-                    'ticket_before_minutes'
-                )
-            """, (chat_id,))
+                WHERE chat_id = %s AND key = ANY(%s)
+            """, (chat_id, list(NOTIFICATION_SETTING_KEYS)))
             rows = cursor_local.fetchall()
-            
-            for row in rows:
-                key = row.get('key') if isinstance(row, dict) else row[0]
-                value = row.get('value') if isinstance(row, dict) else row[1]
-                
-                if key == 'notify_separate_weekdays':
-                    defaults['separate_weekdays'] = value
-                elif key == 'notify_home_weekday_hour':
-                    defaults['home_weekday_hour'] = int(value) if value else defaults['home_weekday_hour']
-                elif key == 'notify_home_weekday_minute':
-                    defaults['home_weekday_minute'] = int(value) if value else defaults['home_weekday_minute']
-                elif key == 'notify_home_weekend_hour':
-                    defaults['home_weekend_hour'] = int(value) if value else defaults['home_weekend_hour']
-                elif key == 'notify_home_weekend_minute':
-                    defaults['home_weekend_minute'] = int(value) if value else defaults['home_weekend_minute']
-                elif key == 'notify_cinema_weekday_hour':
-                    defaults['cinema_weekday_hour'] = int(value) if value else defaults['cinema_weekday_hour']
-                elif key == 'notify_cinema_weekday_minute':
-                    defaults['cinema_weekday_minute'] = int(value) if value else defaults['cinema_weekday_minute']
-                elif key == 'notify_cinema_weekend_hour':
-                    defaults['cinema_weekend_hour'] = int(value) if value else defaults['cinema_weekend_hour']
-                elif key == 'notify_cinema_weekend_minute':
-                    defaults['cinema_weekend_minute'] = int(value) if value else defaults['cinema_weekend_minute']
-                elif key == 'ticket_before_minutes':
-                    defaults['ticket_before_minutes'] = int(value) if value else defaults['ticket_before_minutes']
     finally:
         try:
             cursor_local.close()
@@ -553,7 +500,74 @@ def get_notification_settings(chat_id):
         except:
             pass
     
-    return defaults
+    return _notification_settings_from_rows(
+        (row.get('key'), row.get('value')) if isinstance(row, dict) else (row[0], row[1]) for row in rows
+    )
+
+
+class SettingsSnapshot:
+    """
+    Часовые пояса пользователей и настройки напоминаний чатов на один прогон задачи.
+    Загружается пачкой (load_settings_snapshot); id, которых в снимке нет, дочитываются
+    по одному и тоже запоминаются до конца прогона.
+    """
+
+    def __init__(self, timezones=None, notification_settings=None):
+        self._timezones = dict(timezones or {})
+        self._notification_settings = dict(notification_settings or {})
+
+    def timezone(self, user_id):
+        """Как get_user_timezone_or_default"""
+        if user_id not in self._timezones:
+            self._timezones[user_id] = get_user_timezone(user_id) if user_id is not None else None
+        return self._timezones[user_id] or pytz.timezone('Europe/Moscow')
+
+    def notification_settings(self, chat_id):
+        """Как get_notification_settings"""
+        if chat_id not in self._notification_settings:
+            self._notification_settings[chat_id] = get_notification_settings(chat_id)
+        return self._notification_settings[chat_id]
+
+
+def load_settings_snapshot(user_ids=(), chat_ids=()):
+    """Снимок часовых поясов user_ids и настроек напоминаний chat_ids двумя запросами"""
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    chat_ids = sorted({chat_id for chat_id in chat_ids if chat_id is not None})
+    timezones = {user_id: None for user_id in user_ids}
+    rows_by_chat = {chat_id: [] for chat_id in chat_ids}
+
+    conn_local = get_db_connection()
+    cursor_local = get_db_cursor()
+    try:
+        with db_lock:
+            if user_ids:
+                cursor_local.execute(
+                    "SELECT chat_id, value FROM settings WHERE key = 'user_timezone' AND chat_id = ANY(%s)",
+                    (user_ids,)
+                )
+                for row in cursor_local.fetchall():
+                    timezones[row['chat_id']] = timezone_from_setting(row['value'])
+            if chat_ids:
+                cursor_local.execute(
+                    "SELECT chat_id, key, value FROM settings WHERE chat_id = ANY(%s) AND key = ANY(%s)",
+                    (chat_ids, list(NOTIFICATION_SETTING_KEYS))
+                )
+                for row in cursor_local.fetchall():
+                    rows_by_chat[row['chat_id']].append((row['key'], row['value']))
+    finally:
+        try:
+            cursor_local.close()
+        except:
+            pass
+        try:
+            conn_local.close()
+        except:
+            pass
+
+    return SettingsSnapshot(
+        timezones,
+        {chat_id: _notification_settings_from_rows(rows) for chat_id, rows in rows_by_chat.items()}
+    )
 
 
 def set_notification_setting(chat_id, key, value):
@@ -889,9 +903,12 @@ def renew_subscription(subscription_id, period_type):
                 UPDATE subscriptions 
                 SET next_payment_date = %s, expires_at = %s, activated_at = %s
                 WHERE id = %s
+                RETURNING chat_id, user_id
             """, (next_payment_date, expires_at, now, subscription_id))
+            owner = cursor_local.fetchone()
             conn_local.commit()
-            return True
+        invalidate_subscription_owner(owner)
+        return True
     finally:
         try:
             cursor_local.close()
@@ -986,7 +1003,8 @@ def create_subscription(chat_id, user_id, subscription_type, plan_type, period_t
                 """, (subscription_id, feature))
             
             conn_local.commit()
-            return subscription_id
+        invalidate_entitlements(user_id=user_id, chat_id=chat_id)
+        return subscription_id
     finally:
         try:
             cursor_local.close()
@@ -1054,9 +1072,12 @@ def cancel_subscription(subscription_id, user_id):
                 UPDATE subscriptions 
                 SET is_active = FALSE, cancelled_at = %s, payment_method_id = NULL
                 WHERE id = %s AND user_id = %s
+                RETURNING chat_id, user_id
             """, (datetime.now(pytz.UTC), subscription_id, user_id))
+            owner = cursor_local.fetchone()
             conn_local.commit()
-            return cursor_local.rowcount > 0
+        invalidate_subscription_owner(owner)
+        return owner is not None
     finally:
         try:
             cursor_local.close()
@@ -1071,73 +1092,10 @@ def cancel_subscription(subscription_id, user_id):
 def has_subscription_feature(chat_id, user_id, feature_type):
     """Проверяет, есть ли у пользователя/чата доступ к функции"""
     # Специальный доступ для создателя бота (@zap_nikita)
-    if user_id == 301810276:
+    if user_id == CREATOR_USER_ID:
         return True
-    
-    # Используем локальное подключение, чтобы не зависеть от глобального курсора
-    conn_local = get_db_connection()
-    cursor_local = get_db_cursor()
-    
-    try:
-        with db_lock:
-            # Проверяем персональную подписку
-            cursor_local.execute("""
-                SELECT 1 FROM subscriptions s
-                JOIN subscription_features sf ON s.id = sf.subscription_id
-                WHERE s.chat_id = %s AND s.user_id = %s 
-                AND s.subscription_type = 'personal' AND s.is_active = TRUE
-                AND (s.expires_at IS NULL OR s.expires_at > NOW())
-                AND sf.feature_type = %s
-                LIMIT 1
-            """, (chat_id, user_id, feature_type))
-            if cursor_local.fetchone():
-                return True
-            
-            # Проверяем групповую подписку
-            cursor_local.execute("""
-                SELECT s.id, s.group_size 
-                FROM subscriptions s
-                JOIN subscription_features sf ON s.id = sf.subscription_id
-                WHERE s.chat_id = %s 
-                AND s.subscription_type = 'group' 
-                AND s.is_active = TRUE 
-                AND (s.expires_at IS NULL OR s.expires_at > NOW())
-                AND sf.feature_type = %s
-                LIMIT 1
-            """, (chat_id, feature_type))
-            sub_row = cursor_local.fetchone()
-            
-            if not sub_row:
-                return False
-            
-            # Безопасно извлекаем значения
-            if isinstance(sub_row, dict):
-                subscription_id = sub_row['id']
-                group_size = sub_row.get('group_size')  # .get() — безопасно, если нет ключа
-            else:
-                subscription_id = sub_row.get("id") if isinstance(sub_row, dict) else (sub_row[0] if sub_row else None)
-                group_size = sub_row[1] if len(sub_row) > 1 else None  # если только id вернулся
-            
-            # Если есть ограничение по участникам — проверяем membership
-            if group_size is not None:
-                cursor_local.execute("""
-                    SELECT 1 FROM subscription_members
-                    WHERE subscription_id = %s AND user_id = %s
-                    LIMIT 1
-                """, (subscription_id, user_id))
-                if not cursor_local.fetchone():
-                    return False
-            
-            return True
-    finally:
-        try:
-            cursor_local.close()
-        except:
-            pass
-        try:
-            conn_local.close()
-        except:
-            pass
+    # Личная подписка, оформленная в этом чате, либо групповая подписка чата (при group_size — только участникам)
+    return get_entitlements(user_id, chat_id).has_feature(feature_type)
 
 
 def check_user_in_group(bot, user_id, group_username):
@@ -1203,7 +1161,8 @@ def get_active_group_users(chat_id, bot_id=None):
 
     """Получает список групп, где есть и пользователь, и бот"""
     groups = []
-    with db_lock:
+    with db_connection() as conn:
+        cursor = conn.cursor()
         # Получаем группы из stats, где пользователь был активен
         cursor.execute("""
             SELECT DISTINCT chat_id, username
@@ -1342,8 +1301,10 @@ def add_subscription_member(subscription_id, user_id, username=None):
                 VALUES (%s, %s, %s)
                 ON CONFLICT (subscription_id, user_id) DO NOTHING
             """, (subscription_id, user_id, username))
+            added = cursor_local.rowcount > 0
             conn_local.commit()
-            return cursor_local.rowcount > 0
+        invalidate_entitlements(user_id=user_id)
+        return added
     finally:
         try:
             cursor_local.close()
@@ -1366,9 +1327,12 @@ def update_subscription_group_size(subscription_id, new_group_size, additional_p
                 UPDATE subscriptions 
                 SET group_size = %s, price = price + %s
                 WHERE id = %s
+                RETURNING chat_id, user_id
             """, (new_group_size, additional_price, subscription_id))
+            owner = cursor_local.fetchone()
             conn_local.commit()
-            return cursor_local.rowcount > 0
+        invalidate_subscription_owner(owner)
+        return owner is not None
     finally:
         try:
             cursor_local.close()
@@ -1416,9 +1380,12 @@ def update_subscription_plan_type(subscription_id, new_plan_type, new_price):
                 UPDATE subscriptions 
                 SET plan_type = %s, price = %s
                 WHERE id = %s
+                RETURNING chat_id, user_id
             """, (new_plan_type, new_price, subscription_id))
+            owner = cursor_local.fetchone()
             conn_local.commit()
-            return True
+        invalidate_subscription_owner(owner)
+        return True
     finally:
         try:
             cursor_local.close()
@@ -1466,8 +1433,10 @@ def remove_subscription_member(subscription_id, user_id):
                 DELETE FROM subscription_members
                 WHERE subscription_id = %s AND user_id = %s
             """, (subscription_id, user_id))
+            removed = cursor_local.rowcount > 0
             conn_local.commit()
-            return cursor_local.rowcount > 0
+        invalidate_entitlements(user_id=user_id)
+        return removed
     finally:
         try:
             cursor_local.close()
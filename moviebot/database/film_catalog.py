@@ -0,0 +1,383 @@
+"""
+Общий каталог фильмов (таблица films), ключ — kp_id.
+
+Метаданные фильма (название, жанры, описание, режиссёр, актёры, статус сериала)
+хранятся один раз на kp_id, а строки movies остаются членством чата в фильме
+(watched, added_by, online_link и т.д.) и ссылаются на каталог по kp_id.
+Старые колонки метаданных в movies пока сохраняются и пишутся: их читает большая
+часть запросов (title, year, is_ongoing и т.д. прямо из movies), films — источник
+для кода, уже переведённого на JOIN с COALESCE(f.col, m.col).
+
+Жанры, режиссёр и актёры дополнительно разложены по связям film_genres
+(kp_id, genre) и film_people (kp_id, role, name, position): фильтры и
+агрегации по ним идут через индексы, а не через ILIKE по строке 'a, b, c'
+и разбор строк в Python.
+"""
+import logging
+import threading
+
+from moviebot.database.db_connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+FILM_FIELDS = ('title', 'year', 'genres', 'description', 'director', 'actors', 'is_series')
+
+BACKFILL_BATCH_SIZE = 500
+
+# Заглушки extract_movie_info вместо пустых значений — в связи не попадают
+EMPTY_VALUES = ('', '—', 'Не указан')
+
+ROLE_DIRECTOR = 'director'
+ROLE_ACTOR = 'actor'
+
+# Фильтры по связям для запросов к movies m (параметр — список значений, OR между ними)
+GENRES_FILTER_SQL = "EXISTS (SELECT 1 FROM film_genres fg WHERE fg.kp_id = m.kp_id AND fg.genre = ANY(%s))"
+DIRECTORS_FILTER_SQL = (
+    "EXISTS (SELECT 1 FROM film_people fp WHERE fp.kp_id = m.kp_id AND fp.role = 'director' AND fp.name = ANY(%s))"
+)
+ACTORS_FILTER_SQL = (
+    "EXISTS (SELECT 1 FROM film_people fp WHERE fp.kp_id = m.kp_id AND fp.role = 'actor' AND fp.name = ANY(%s))"
+)
+
+
+def _normalize_year(year):
+    """extract_movie_info отдаёт '—', если год неизвестен"""
+    if year in (None, '', '—'):
+        return None
+    try:
+        return int(year)
+    except (ValueError, TypeError):
+        return None
+
+
+def split_film_values(value):
+    """'драма, комедия' → ['драма', 'комедия'] без пустых, заглушек и повторов (порядок сохраняется)"""
+    if not value:
+        return []
+    result = []
+    for item in str(value).split(','):
+        item = item.strip()
+        if item and item not in EMPTY_VALUES and item not in result:
+            result.append(item)
+    return result
+
+
+def _director_names(value):
+    """Режиссёр хранится одним именем целиком (как и раньше в GROUP BY m.director)"""
+    value = str(value).strip() if value else ''
+    return [value] if value not in EMPTY_VALUES else []
+
+
+def sync_film_links(cursor, kp_id, info):
+    """
+    Перестраивает film_genres / film_people для kp_id по метаданным info.
+    Поле со значением None не трогает уже записанные связи (как COALESCE в upsert_film).
+    """
+    kp_id = str(kp_id)
+    if info.get('genres') is not None:
+        cursor.execute('DELETE FROM film_genres WHERE kp_id = %s', (kp_id,))
+        genres = split_film_values(info['genres'])
+        if genres:
+            cursor.execute('''
+                INSERT INTO film_genres (kp_id, genre)
+                SELECT %s, genre FROM UNNEST(%s::text[]) AS genre
+                ON CONFLICT DO NOTHING
+            ''', (kp_id, genres))
+    for role, field, split in ((ROLE_DIRECTOR, 'director', _director_names),
+                               (ROLE_ACTOR, 'actors', split_film_values)):
+        if info.get(field) is None:
+            continue
+        cursor.execute('DELETE FROM film_people WHERE kp_id = %s AND role = %s', (kp_id, role))
+        names = split(info[field])
+        if names:
+            cursor.execute('''
+                INSERT INTO film_people (kp_id, role, name, position)
+                SELECT %s, %s, t.name, t.position - 1
+                FROM UNNEST(%s::text[]) WITH ORDINALITY AS t(name, position)
+                ON CONFLICT DO NOTHING
+            ''', (kp_id, role, names))
+
+
+def upsert_film(cursor, kp_id, info):
+    """
+    Записывает метаданные фильма в каталог в рамках транзакции вызывающего кода.
+    info — dict в формате extract_movie_info (лишние ключи игнорируются).
+    Пустые значения не затирают уже известные.
+    """
+    if not kp_id or not info:
+        return
+    is_series = info.get('is_series')
+    cursor.execute('''
+        INSERT INTO films (kp_id, title, year, genres, description, director, actors, is_series, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (kp_id) DO UPDATE SET
+            title = COALESCE(EXCLUDED.title, films.title),
+            year = COALESCE(EXCLUDED.year, films.year),
+            genres = COALESCE(EXCLUDED.genres, films.genres),
+            description = COALESCE(EXCLUDED.description, films.description),
+            director = COALESCE(EXCLUDED.director, films.director),
+            actors = COALESCE(EXCLUDED.actors, films.actors),
+            is_series = COALESCE(EXCLUDED.is_series, films.is_series),
+            updated_at = NOW()
+    ''', (
+        str(kp_id),
+        info.get('title'),
+        _normalize_year(info.get('year')),
+        info.get('genres'),
+        info.get('description'),
+        info.get('director'),
+        info.get('actors'),
+        None if is_series is None else (1 if is_series else 0),
+    ))
+    sync_film_links(cursor, kp_id, info)
+
+
+def count_series_episodes(seasons_data):
+    """Число эпизодов во всех сезонах ответа get_seasons_data (включая ещё не вышедшие)"""
+    return sum(len(season.get('episodes') or []) for season in (seasons_data or []))
+
+
+def save_series_episode_count(cursor, kp_id, seasons_data):
+    """
+    Сохраняет число сезонов/эпизодов сериала в series_episode_counts в рамках
+    транзакции вызывающего кода. Пустой ответ API не затирает известные значения,
+    а только отмечает попытку (updated_at; для нового сериала — строка с нулями):
+    иначе сериал без данных снова попадает в выборку update_series_status_cache.
+    """
+    if not kp_id:
+        return
+    if not seasons_data:
+        cursor.execute('''
+            INSERT INTO series_episode_counts (kp_id, seasons_count, episodes_count, updated_at)
+            VALUES (%s, 0, 0, NOW())
+            ON CONFLICT (kp_id) DO UPDATE SET updated_at = NOW()
+        ''', (str(kp_id),))
+        return
+    cursor.execute('''
+        INSERT INTO series_episode_counts (kp_id, seasons_count, episodes_count, updated_at)
+        VALUES (%s, %s, %s, NOW())
+        ON CONFLICT (kp_id) DO UPDATE SET
+            seasons_count = EXCLUDED.seasons_count,
+            episodes_count = EXCLUDED.episodes_count,
+            updated_at = NOW()
+    ''', (str(kp_id), len(seasons_data), count_series_episodes(seasons_data)))
+
+
+# Строка каталога из самой полной строки movies для kp_id (с описанием, самой свежей).
+# Уже известные значения каталога не затираются, пустые (в т.ч. у заглушек без названия) дополняются.
+_FILL_FROM_MOVIES_SQL = '''
+    INSERT INTO films (kp_id, title, year, genres, description, director, actors, is_series,
+                       is_ongoing, seasons_count, next_episode, last_api_update)
+    SELECT DISTINCT ON (m.kp_id)
+           m.kp_id, m.title, m.year, m.genres, m.description, m.director, m.actors, m.is_series,
+           m.is_ongoing, m.seasons_count, m.next_episode, m.last_api_update
+    FROM movies m
+    WHERE m.kp_id = ANY(%s)
+    ORDER BY m.kp_id, (m.description IS NOT NULL) DESC, m.last_api_update DESC NULLS LAST, m.id DESC
+    ON CONFLICT (kp_id) DO UPDATE SET
+        title = COALESCE(films.title, EXCLUDED.title),
+        year = COALESCE(films.year, EXCLUDED.year),
+        genres = COALESCE(films.genres, EXCLUDED.genres),
+        description = COALESCE(films.description, EXCLUDED.description),
+        director = COALESCE(films.director, EXCLUDED.director),
+        actors = COALESCE(films.actors, EXCLUDED.actors),
+        is_series = COALESCE(films.is_series, EXCLUDED.is_series),
+        is_ongoing = COALESCE(films.is_ongoing, EXCLUDED.is_ongoing),
+        seasons_count = COALESCE(films.seasons_count, EXCLUDED.seasons_count),
+        next_episode = COALESCE(films.next_episode, EXCLUDED.next_episode),
+        last_api_update = COALESCE(films.last_api_update, EXCLUDED.last_api_update)
+'''
+
+
+def upsert_series_status(cursor, kp_id, is_ongoing, seasons_count, next_episode):
+    """
+    Записывает статус сериала в каталог в рамках транзакции вызывающего кода. Если строки
+    каталога ещё нет (или это заглушка без названия), метаданные берутся из movies,
+    чтобы каталог не пополнялся строками без title/year/genres.
+    """
+    kp_id = str(kp_id)
+    cursor.execute(_FILL_FROM_MOVIES_SQL, ([kp_id],))
+    cursor.execute('''
+        INSERT INTO films (kp_id, is_series, is_ongoing, seasons_count, next_episode, last_api_update)
+        VALUES (%s, 1, %s, %s, %s, NOW())
+        ON CONFLICT (kp_id) DO UPDATE SET
+            is_series = 1,
+            is_ongoing = EXCLUDED.is_ongoing,
+            seasons_count = EXCLUDED.seasons_count,
+            next_episode = EXCLUDED.next_episode,
+            last_api_update = NOW()
+    ''', (kp_id, is_ongoing, seasons_count, next_episode))
+    insert_film_links(cursor, [kp_id])
+
+
+def backfill_films_batch(cursor, after_kp_id, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Переносит в каталог следующую порцию kp_id из movies (keyset по kp_id).
+    Для каждого kp_id берётся самая полная строка (с описанием, самая свежая).
+    Возвращает последний обработанный kp_id или None, если movies закончились.
+    """
+    cursor.execute('''
+        SELECT DISTINCT kp_id FROM movies
+        WHERE kp_id IS NOT NULL AND kp_id > %s
+        ORDER BY kp_id
+        LIMIT %s
+    ''', (after_kp_id, batch_size))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    kp_ids = [row['kp_id'] if isinstance(row, dict) else row[0] for row in rows]
+    cursor.execute(_FILL_FROM_MOVIES_SQL, (kp_ids,))
+    return kp_ids[-1]
+
+
+def backfill_films_catalog(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Онлайн-миграция: заполняет films из существующих movies короткими транзакциями,
+    не блокируя таблицу. Повторный запуск безопасен: известные значения не затираются.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT 1 FROM films_backfill_done LIMIT 1')
+        if cur.fetchone() is not None:
+            return 0
+
+    last_kp_id = ''
+    batches = 0
+    while True:
+        with db_connection() as conn:
+            last_kp_id = backfill_films_batch(conn.cursor(), last_kp_id, batch_size)
+        if last_kp_id is None:
+            break
+        batches += 1
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO films_backfill_done (id) VALUES (1) ON CONFLICT (id) DO NOTHING')
+    logger.info(f"[FILMS CATALOG] Бэкфилл каталога завершён, порций: {batches}")
+    return batches
+
+
+def backfill_film_links_batch(cursor, after_kp_id, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Раскладывает жанры/режиссёра/актёров следующей порции films по связям (keyset по kp_id).
+    Разбор строк тот же, что в split_film_values. Возвращает последний kp_id или None.
+    """
+    cursor.execute('''
+        SELECT kp_id FROM films
+        WHERE kp_id > %s
+        ORDER BY kp_id
+        LIMIT %s
+    ''', (after_kp_id, batch_size))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    kp_ids = [row['kp_id'] if isinstance(row, dict) else row[0] for row in rows]
+    insert_film_links(cursor, kp_ids)
+    return kp_ids[-1]
+
+
+def insert_film_links(cursor, kp_ids):
+    """Добавляет связи жанров/персон kp_ids по строкам films (уже записанные не трогает)"""
+    cursor.execute('''
+        INSERT INTO film_genres (kp_id, genre)
+        SELECT DISTINCT f.kp_id, TRIM(g.genre)
+        FROM films f, UNNEST(string_to_array(f.genres, ',')) AS g(genre)
+        WHERE f.kp_id = ANY(%s) AND TRIM(g.genre) NOT IN %s
+        ON CONFLICT DO NOTHING
+    ''', (kp_ids, EMPTY_VALUES))
+    cursor.execute('''
+        INSERT INTO film_people (kp_id, role, name, position)
+        SELECT f.kp_id, 'director', TRIM(f.director), 0
+        FROM films f
+        WHERE f.kp_id = ANY(%s) AND TRIM(f.director) NOT IN %s
+        ON CONFLICT DO NOTHING
+    ''', (kp_ids, EMPTY_VALUES))
+    cursor.execute('''
+        INSERT INTO film_people (kp_id, role, name, position)
+        SELECT DISTINCT ON (f.kp_id, TRIM(a.name)) f.kp_id, 'actor', TRIM(a.name), a.position - 1
+        FROM films f, UNNEST(string_to_array(f.actors, ',')) WITH ORDINALITY AS a(name, position)
+        WHERE f.kp_id = ANY(%s) AND TRIM(a.name) NOT IN %s
+        ORDER BY f.kp_id, TRIM(a.name), a.position
+        ON CONFLICT DO NOTHING
+    ''', (kp_ids, EMPTY_VALUES))
+
+
+def backfill_film_links(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Онлайн-миграция: заполняет film_genres / film_people из уже существующих films.
+    Новые и обновлённые фильмы раскладываются в upsert_film; повторный запуск безопасен.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT 1 FROM film_links_backfill_done LIMIT 1')
+        if cur.fetchone() is not None:
+            return 0
+
+    last_kp_id = ''
+    batches = 0
+    while True:
+        with db_connection() as conn:
+            last_kp_id = backfill_film_links_batch(conn.cursor(), last_kp_id, batch_size)
+        if last_kp_id is None:
+            break
+        batches += 1
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO film_links_backfill_done (id) VALUES (1) ON CONFLICT (id) DO NOTHING')
+    logger.info(f"[FILMS CATALOG] Бэкфилл связей жанров/персон завершён, порций: {batches}")
+    return batches
+
+
+def fill_film_stubs_batch(cursor, after_kp_id, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Дополняет из movies следующую порцию строк films без названия (keyset по kp_id) и
+    раскладывает их связи. Возвращает последний kp_id или None, если заглушки закончились.
+    """
+    cursor.execute('''
+        SELECT kp_id FROM films
+        WHERE title IS NULL AND kp_id > %s
+        ORDER BY kp_id
+        LIMIT %s
+    ''', (after_kp_id, batch_size))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    kp_ids = [row['kp_id'] if isinstance(row, dict) else row[0] for row in rows]
+    cursor.execute(_FILL_FROM_MOVIES_SQL, (kp_ids,))
+    insert_film_links(cursor, kp_ids)
+    return kp_ids[-1]
+
+
+def fill_film_stubs(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Заглушки films (kp_id и статус сериала без метаданных) оставались после прежнего
+    update_series_status_cache, а бэкфилл их не дополнял. Проверяется при каждом старте;
+    строки, для которых в movies тоже нет названия, просто остаются как есть.
+    """
+    last_kp_id = ''
+    batches = 0
+    while True:
+        with db_connection() as conn:
+            last_kp_id = fill_film_stubs_batch(conn.cursor(), last_kp_id, batch_size)
+        if last_kp_id is None:
+            break
+        batches += 1
+    if batches:
+        logger.info(f"[FILMS CATALOG] Заглушки каталога дополнены из movies, порций: {batches}")
+    return batches
+
+
+def start_films_catalog_backfill():
+    """Запускает бэкфилл каталога и связей жанров/персон в фоновом потоке (не задерживает старт бота)"""
+    def run():
+        try:
+            backfill_films_catalog()
+            fill_film_stubs()
+            backfill_film_links()
+        except Exception as e:
+            logger.error(f"[FILMS CATALOG] Ошибка бэкфилла каталога: {e}", exc_info=True)
+
+    thread = threading.Thread(target=run, name='films-catalog-backfill', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,154 @@
+"""
+Страницы списков фильмов: /list (непросмотренные фильмы чата) и фильмы подборки.
+
+Раньше обработчики выбирали весь список чата (без LIMIT, под db_lock) и резали страницу
+в Python. Теперь страница выбирается запросом на LIMIT строк:
+
+- порядок — (название, id), фильмы без названия в конце, как было при ORDER BY title;
+  «Вперёд»/«Назад» передают в callback_data id крайнего фильма страницы (курсор 'a<id>' —
+  после него, 'b<id>' — перед ним), и запрос продолжает с этого места по индексу
+  idx_movies_unwatched_sort (keyset-пагинация);
+- первая и последняя страницы тоже выбираются по индексу (с начала и с конца), для
+  перехода на произвольный номер остаётся OFFSET по тому же индексу;
+- число непросмотренных фильмов чата берётся из movie_list_counts — его ведёт триггер
+  на movies при добавлении, отметке просмотренным и удалении.
+"""
+import logging
+
+from moviebot.database.db_connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 15
+
+# Ключи сортировки ({t} — алиас movies) — те же выражения, что в индексе idx_movies_unwatched_sort.
+# NULL в строковом сравнении не работает, поэтому вместо NULLS LAST — ключ «title IS NULL» впереди.
+_UNWATCHED_KEYS = ('{t}.title IS NULL', "COALESCE({t}.title, '')", '{t}.id')
+_TAG_KEYS = ('{t}.watched',) + _UNWATCHED_KEYS
+# Ключи keyset-сравнения и ORDER BY внутреннего запроса (направление подставляет _select_page)
+_UNWATCHED_KEYSET = ', '.join(_UNWATCHED_KEYS)
+_TAG_KEYSET = ', '.join(_TAG_KEYS)
+
+
+def _order_by(keys, direction='{direction}'):
+    return ', '.join(f'{key.format(t="m")} {direction}' for key in keys)
+
+
+_UNWATCHED_SELECT = f'''
+    SELECT m.id, m.kp_id,
+           COALESCE(f.title, m.title) AS title,
+           COALESCE(f.year, m.year) AS year,
+           COALESCE(f.genres, m.genres) AS genres,
+           m.link
+    FROM (
+        SELECT m.id, m.kp_id, m.title, m.year, m.genres, m.link
+        FROM movies m
+        WHERE m.chat_id = %(chat_id)s AND m.watched = 0 {{where}}
+        ORDER BY {_order_by(_UNWATCHED_KEYS)}
+        LIMIT %(limit)s OFFSET %(offset)s
+    ) m
+    LEFT JOIN films f ON f.kp_id = m.kp_id
+    ORDER BY {_order_by(_UNWATCHED_KEYS, 'ASC')}
+'''
+
+_TAG_SELECT = f'''
+    SELECT m.id, m.kp_id, m.title, m.year, m.genres, m.link, m.watched, m.is_series,
+           COALESCE((
+               SELECT AVG(r.rating) FROM ratings r
+               WHERE r.film_id = m.id AND r.chat_id = %(chat_id)s
+                 AND (r.is_imported = FALSE OR r.is_imported IS NULL)
+           ), 0) AS avg_rating
+    FROM (
+        SELECT m.id, m.kp_id, m.title, m.year, m.genres, m.link, m.watched, m.is_series
+        FROM user_tag_movies utm
+        INNER JOIN movies m ON utm.film_id = m.id
+        WHERE utm.user_id = %(user_id)s AND utm.chat_id = %(chat_id)s AND utm.tag_id = %(tag_id)s {{where}}
+        ORDER BY {_order_by(_TAG_KEYS)}
+        LIMIT %(limit)s OFFSET %(offset)s
+    ) m
+    ORDER BY {_order_by(_TAG_KEYS, 'ASC')}
+'''
+
+
+def page_count(total, page_size=PAGE_SIZE):
+    return max(1, (total + page_size - 1) // page_size)
+
+
+def parse_cursor(value):
+    """'a123' -> ('a', 123); пусто или мусор -> None"""
+    if value and value[0] in ('a', 'b') and value[1:].isdigit():
+        return value[0], int(value[1:])
+    return None
+
+
+def format_cursor(direction, film_id):
+    return f'{direction}{film_id}'
+
+
+def _select_page(cur, sql, params, page, total, cursor, keyset):
+    """
+    Строки страницы page из total строк: по курсору (direction, film_id) — keyset от этого
+    фильма, первая и последняя — с начала и с конца индекса, остальные — OFFSET.
+    """
+    total_pages = page_count(total)
+    page = max(1, min(page, total_pages))
+    base = dict(params, limit=PAGE_SIZE, offset=0)
+    if cursor:
+        direction, film_id = cursor
+        where = (f'AND ({keyset.format(t="m")}) {">" if direction == "a" else "<"} '
+                 f'(SELECT {keyset.format(t="k")} FROM movies k WHERE k.id = %(cursor_id)s)')
+        cur.execute(sql.format(where=where, direction='ASC' if direction == 'a' else 'DESC'),
+                    dict(base, cursor_id=film_id))
+        rows = cur.fetchall()
+        if rows:
+            return page, rows
+        # Крайний фильм удалили или страница опустела — открываем страницу по номеру
+    if page == total_pages and page > 1:
+        last_size = total - (total_pages - 1) * PAGE_SIZE
+        cur.execute(sql.format(where='', direction='DESC'), dict(base, limit=max(1, last_size)))
+    else:
+        cur.execute(sql.format(where='', direction='ASC'), dict(base, offset=(page - 1) * PAGE_SIZE))
+    return page, cur.fetchall()
+
+
+def get_unwatched_count(chat_id):
+    """Сколько непросмотренных фильмов в чате (movie_list_counts, без подсчёта по movies)"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT unwatched FROM movie_list_counts WHERE chat_id = %s', (chat_id,))
+        row = cur.fetchone()
+    return row['unwatched'] if row else 0
+
+
+def fetch_unwatched_page(chat_id, page=1, cursor=None):
+    """(страница, всего фильмов, строки страницы) непросмотренных фильмов чата"""
+    total = get_unwatched_count(chat_id)
+    if not total:
+        return 1, 0, []
+    with db_connection() as conn:
+        page, rows = _select_page(conn.cursor(), _UNWATCHED_SELECT, {'chat_id': chat_id}, page, total, cursor,
+                                  _UNWATCHED_KEYSET)
+    return page, total, rows
+
+
+def get_tag_counts(chat_id, user_id, tag_id):
+    """(всего, просмотрено) фильмов подборки одним запросом"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE m.watched <> 0) AS watched
+            FROM user_tag_movies utm
+            INNER JOIN movies m ON utm.film_id = m.id
+            WHERE utm.user_id = %s AND utm.chat_id = %s AND utm.tag_id = %s
+        ''', (user_id, chat_id, tag_id))
+        row = cur.fetchone()
+    return row['total'], row['watched']
+
+
+def fetch_tag_page(chat_id, user_id, tag_id, total, page=1, cursor=None):
+    """(страница, строки страницы) фильмов подборки: сначала непросмотренные, внутри — по названию"""
+    if not total:
+        return 1, []
+    params = {'chat_id': chat_id, 'user_id': user_id, 'tag_id': tag_id}
+    with db_connection() as conn:
+        return _select_page(conn.cursor(), _TAG_SELECT, params, page, total, cursor, _TAG_KEYSET)
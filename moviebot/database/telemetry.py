@@ -0,0 +1,218 @@
+"""
+Отложенная пакетная запись телеметрии (stats, kinopoisk_api_logs).
+
+log_request и log_*_api_request вызываются на каждом действии пользователя и
+на каждом запросе к API Кинопоиска. Раньше каждая запись — это SELECT 1,
+INSERT и COMMIT под глобальным db_lock прямо в обработчике. Теперь строки
+складываются в ограниченный буфер в памяти, а фоновый поток пишет их
+многострочным INSERT (execute_values), когда набралось batch_size строк или
+прошло flush_interval секунд.
+
+- буфер ограничен: при переполнении новые строки отбрасываются и считаются в stats()['dropped'];
+- при ошибке записи пачка возвращается в буфер (если есть место) и пишется при следующем сбросе;
+- при завершении процесса (atexit) буфер сбрасывается;
+- перед удалением статистики (/clean) строки чата/пользователя убираются из буфера
+  (discard_request_logs), иначе следующий сброс записал бы их обратно.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+from moviebot.config import TELEMETRY_BUFFER_SIZE, TELEMETRY_BATCH_SIZE, TELEMETRY_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Таблица → колонки в порядке значений в строке
+TELEMETRY_TABLES = {
+    'stats': ('user_id', 'username', 'command_or_action', 'timestamp', 'chat_id'),
+    'kinopoisk_api_logs': ('endpoint', 'method', 'status_code', 'user_id', 'chat_id', 'kp_id', 'timestamp'),
+}
+
+
+def write_batch_to_db(table, columns, rows):
+    """Одна транзакция, один многострочный INSERT на пачку"""
+    from moviebot.database.db_connection import db_connection
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            execute_values(
+                cur,
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s",
+                rows,
+                page_size=len(rows),
+            )
+        finally:
+            cur.close()
+
+
+class TelemetryWriter:
+    """Буфер строк телеметрии с фоновым пакетным сбросом в БД"""
+
+    def __init__(self, tables=TELEMETRY_TABLES, max_buffer=TELEMETRY_BUFFER_SIZE,
+                 batch_size=TELEMETRY_BATCH_SIZE, flush_interval=TELEMETRY_FLUSH_INTERVAL,
+                 write_batch=write_batch_to_db):
+        self.tables = dict(tables)
+        self.max_buffer = max(1, max_buffer)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._write_batch = write_batch
+        self._cond = threading.Condition()
+        self._buffer = deque()  # (table, row)
+        self._flush_lock = threading.Lock()  # сброс выполняет один поток за раз
+        self._closed = False
+        self._stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'flushes': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, table, row):
+        """Добавляет строку в буфер; False, если буфер полон или писатель остановлен"""
+        if table not in self.tables:
+            raise ValueError(f"Неизвестная таблица телеметрии: {table}")
+        with self._cond:
+            if self._closed or len(self._buffer) >= self.max_buffer:
+                self._stats['dropped'] += 1
+                return False
+            self._buffer.append((table, tuple(row)))
+            self._stats['enqueued'] += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def _take(self):
+        with self._cond:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        return batch
+
+    def flush(self):
+        """Синхронно пишет всё, что накоплено в буфере. Возвращает число записанных строк"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take()
+                if not batch:
+                    return written
+                by_table = {}
+                for table, row in batch:
+                    by_table.setdefault(table, []).append(row)
+                failed = False
+                for table, rows in by_table.items():
+                    if not failed:
+                        try:
+                            self._write_batch(table, self.tables[table], rows)
+                        except Exception as e:
+                            logger.error(f"[TELEMETRY] Ошибка записи {len(rows)} строк в {table}: {e}", exc_info=True)
+                            failed = True
+                        else:
+                            written += len(rows)
+                            with self._cond:
+                                self._stats['written'] += len(rows)
+                            continue
+                    self._requeue(table, rows)
+                with self._cond:
+                    self._stats['errors' if failed else 'flushes'] += 1
+                if failed:
+                    # БД недоступна — повторим при следующем сбросе, а не в цикле
+                    return written
+
+    def _requeue(self, table, rows):
+        """Возвращает пачку в начало буфера, не вытесняя новые строки"""
+        with self._cond:
+            room = max(0, self.max_buffer - len(self._buffer))
+            kept = rows[:room]
+            self._stats['dropped'] += len(rows) - len(kept)
+            self._buffer.extendleft((table, row) for row in reversed(kept))
+
+    def shutdown(self, timeout=5.0):
+        """Останавливает фоновый поток и сбрасывает остаток буфера"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        started = time.monotonic()
+        self.flush()
+        with self._cond:
+            left = len(self._buffer)
+        if left:
+            logger.warning(f"[TELEMETRY] При остановке не записано строк: {left}")
+        logger.info(f"[TELEMETRY] Остановлен, финальный сброс за {time.monotonic() - started:.2f} с: {self.stats()}")
+
+    def discard(self, table, **match):
+        """
+        Убирает из буфера строки table, у которых колонки совпадают с match (None — любое
+        значение). Ждёт пачку, которую сейчас пишет фоновый поток: после возврата ни одна
+        подходящая строка, поставленная раньше, не будет записана позже. Возвращает число строк.
+        """
+        columns = self.tables[table]
+        checks = [(columns.index(column), value) for column, value in match.items() if value is not None]
+        with self._flush_lock:
+            with self._cond:
+                kept = deque(
+                    (name, row) for name, row in self._buffer
+                    if name != table or any(row[i] != value for i, value in checks)
+                )
+                discarded = len(self._buffer) - len(kept)
+                self._buffer = kept
+        return discarded
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, buffered=len(self._buffer), max_buffer=self.max_buffer)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_telemetry_writer():
+    """Глобальный писатель телеметрии (создаётся при первом обращении, сбрасывается при выходе)"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = TelemetryWriter()
+                atexit.register(_writer.shutdown)
+                logger.info(
+                    f"[TELEMETRY] Запущен: буфер={TELEMETRY_BUFFER_SIZE}, пачка={TELEMETRY_BATCH_SIZE}, "
+                    f"интервал={TELEMETRY_FLUSH_INTERVAL} с"
+                )
+    return _writer
+
+
+def enqueue_request_log(user_id, username, command_or_action, chat_id=None):
+    """Строка для таблицы stats; время фиксируется в момент вызова, а не записи"""
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return get_telemetry_writer().enqueue('stats', (user_id, username, command_or_action, timestamp, chat_id))
+
+
+def enqueue_api_log(endpoint, method='GET', status_code=None, user_id=None, chat_id=None, kp_id=None):
+    """Строка для таблицы kinopoisk_api_logs (kp_id хранится как text)"""
+    kp_id_str = str(kp_id) if kp_id is not None else None
+    return get_telemetry_writer().enqueue(
+        'kinopoisk_api_logs',
+        (endpoint, method, status_code, user_id, chat_id, kp_id_str, datetime.now(timezone.utc)),
+    )
+
+
+def discard_request_logs(chat_id, user_id=None):
+    """Перед DELETE FROM stats: строки чата (или пользователя в чате), ещё не записанные в stats"""
+    if _writer is None:
+        return 0
+    return _writer.discard('stats', chat_id=chat_id, user_id=user_id)
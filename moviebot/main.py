@@ -63,6 +63,10 @@ from moviebot.bot.bot_init import setup_bot_commands, sync_commands_periodically
 # Инициализация базы данных
 init_database()
 
+# Онлайн-бэкфилл общего каталога фильмов из movies (в фоне, повторный запуск — no-op)
+from moviebot.database.film_catalog import start_films_catalog_backfill
+start_films_catalog_backfill()
+
 # Удаление файла top_actors.txt если установлена переменная окружения
 if os.getenv('DELETE_TOP_ACTORS_FILE', '0').strip().lower() in ('1', 'true', 'yes', 'on'):
     logger.info("DELETE_TOP_ACTORS_FILE=1 - удаляем файл top_actors.txt...")
@@ -79,9 +83,6 @@ if os.getenv('DELETE_TOP_ACTORS_FILE', '0').strip().lower() in ('1', 'true', 'ye
     except Exception as e:
         logger.error(f"❌ Ошибка удаления файла top_actors.txt: {e}", exc_info=True)
 
-# Импорты для бота
-from apscheduler.schedulers.background import BackgroundScheduler
-
 # Импортируем бота из bot_init (он уже создан там)
 from moviebot.bot.bot_init import bot, init_bot_id
 
@@ -110,15 +111,24 @@ try:
 except Exception as e:
     logger.warning(f"Не удалось очистить webhook: {e}")
 
-# Планировщик для уведомлений
-scheduler = BackgroundScheduler()
-scheduler.start()
+# Планировщик для уведомлений: разовые задачи хранятся в apscheduler_jobs и переживают перезапуск.
+# Стартуем на паузе, чтобы сверка напоминаний прошла до запуска сохранённых задач
+from moviebot.services.scheduler_jobs import create_scheduler
+scheduler = create_scheduler()
+scheduler.start(paused=True)
 
 # Устанавливаем экземпляр бота и scheduler в модуле scheduler
-from moviebot.scheduler import set_bot_instance, set_scheduler_instance
+from moviebot.scheduler import set_bot_instance, set_scheduler_instance, reconcile_plan_reminders
 set_bot_instance(bot)
 set_scheduler_instance(scheduler)
 
+try:
+    reconcile_result = reconcile_plan_reminders()
+    logger.info(f"[MAIN] Сверка напоминаний по планам после старта: {reconcile_result._asdict()}")
+except Exception as e:
+    logger.error(f"[MAIN] Ошибка сверки напоминаний по планам: {e}", exc_info=True)
+scheduler.resume()
+
 # Экспортируем scheduler в bot_init для использования в handlers
 from moviebot.bot.bot_init import set_scheduler
 set_scheduler(scheduler)
@@ -137,6 +147,17 @@ scheduler.add_job(
 )
 logger.info("[MAIN] Добавлена фоновая задача обновления кэша сериалов (каждые 24 часа)")
 
+# Пересчёт устаревших роллапов статистики сайта (ключи, которые сайт уже открывал)
+from moviebot.api.site_stats import refresh_stale_stats_rollups
+
+scheduler.add_job(
+    refresh_stale_stats_rollups,
+    'interval',
+    minutes=5,
+    id='refresh_stats_rollups',
+    replace_existing=True
+)
+
 # Настраиваем задачи планировщика
 from moviebot.scheduler import (
     hourly_stats,
@@ -381,6 +402,18 @@ scheduler.add_job(
 # Устанавливаем команды бота
 setup_bot_commands(bot)
 
+# Продолжаем импорты оценок с Кинопоиска, оборванные перезапуском. Импорт, оборванный только что,
+# ещё не считается прерванным (kp_import.RUNNING_STALE_AFTER) — его подберёт периодическая проверка
+from moviebot.bot.handlers.series import resume_interrupted_kp_imports
+resume_interrupted_kp_imports()
+scheduler.add_job(
+    resume_interrupted_kp_imports,
+    'interval',
+    minutes=5,
+    id='resume_interrupted_kp_imports',
+    replace_existing=True
+)
+
 # Watchdog
 try:
     import sys
@@ -8,6 +8,7 @@ import random
 import time
 import pytz
 
+from collections import namedtuple
 from datetime import datetime, timedelta, date
 from typing import Optional
 
@@ -17,17 +18,20 @@ from telebot.apihelper import ApiTelegramException
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from moviebot.config import DATABASE_URL
 
 # 3. APScheduler
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.util import ref_to_obj
 
 # 4. Твои локальные импорты (отсортируй по алфавиту внутри группы)
 from moviebot.bot.bot_init import bot, BOT_ID
 from moviebot.database.db_connection import db_lock
+from moviebot.utils.entitlements import invalidate_entitlements
 from moviebot.config import PLANS_TZ, DATABASE_URL
 
 # Локальные соединения: scheduler не использует глобальные get_db_connection/get_db_cursor
@@ -39,7 +43,11 @@ from moviebot.api.kinopoisk_api import get_external_sources
 
 # Импорт helpers отключён полностью — все нужные функции определены в этом же файле (scheduler.py)
 # from moviebot.utils.helpers import (...)
-from moviebot.database.db_operations import get_user_timezone_or_default, get_notification_settings
+from moviebot.database.db_operations import (
+    get_user_timezone_or_default, timezone_from_setting, load_settings_snapshot
+)
+from moviebot.services.broadcaster import Broadcaster
+from moviebot.services.scheduler_jobs import MISFIRE_GRACE_SECONDS, add_dynamic_job, diff_dynamic_jobs
 from moviebot.bot.handlers.seasons import get_series_airing_status
 from moviebot.utils.helpers import has_notifications_access, has_series_features_access
 
@@ -341,14 +349,18 @@ def send_plan_notification(chat_id, film_id, title, link, plan_type, plan_id=Non
         logger.error(f"[PLAN NOTIFICATION] Ошибка отправки уведомления: {e}", exc_info=True)
 
 
-def send_plan_notification_combined(chat_id, date_str, user_id=None):
-    """Одно утреннее уведомление на день: список всех планов на дату с кнопками к описанию каждого фильма."""
+def send_plan_notification_combined(chat_id, date_str, user_id=None, settings=None):
+    """
+    Одно утреннее уведомление на день: список всех планов на дату с кнопками к описанию каждого фильма.
+    settings — SettingsSnapshot прогона проверки планов (часовой пояс без отдельного запроса).
+    """
 
     if not bot:
         return
-    user_tz = get_user_timezone_or_default(user_id or chat_id if chat_id > 0 else 0)
+    tz_user_id = user_id or chat_id if chat_id > 0 else 0
+    user_tz = settings.timezone(tz_user_id) if settings else get_user_timezone_or_default(tz_user_id)
     try:
-        start_local = datetime.strptime(date_str, '%Y-%m-%d').replace(tzinfo=user_tz)
+        start_local = user_tz.localize(datetime.strptime(date_str, '%Y-%m-%d'))
     except Exception:
         logger.warning(f"[PLAN COMBINED] Неверный date_str: {date_str}")
         return
@@ -475,8 +487,8 @@ def send_plan_notification_combined(chat_id, date_str, user_id=None):
     cursor_update = conn_update.cursor()
     try:
         with db_lock:
-            for p in plans:
-                cursor_update.execute('UPDATE plans SET notification_sent = TRUE WHERE id = %s AND chat_id = %s', (p['plan_id'], chat_id))
+            cursor_update.execute('UPDATE plans SET notification_sent = TRUE WHERE id = ANY(%s) AND chat_id = %s',
+                                  ([p['plan_id'] for p in plans], chat_id))
             conn_update.commit()
         logger.info(f"[PLAN COMBINED] Отправлено объединённое уведомление для {len(plans)} планов в чат {chat_id}")
     except Exception as e:
@@ -586,329 +598,166 @@ def send_ticket_notification(chat_id, plan_id):
             pass
 
 
-def check_and_send_plan_notifications():
-    """Периодическая проверка планов и отправка пропущенных уведомлений"""
-
-    try:
-
-        now_utc = datetime.now(pytz.utc)
-
-        # Проверяем планы на ближайшие сутки и пропущенные за последние 30 минут
-
-        check_start = now_utc - timedelta(minutes=30)
-
-        check_end = now_utc + timedelta(days=1)
-
-        
-
-        # Используем локальное соединение вместо глобального для избежания проблем с закрытыми соединениями
-        
-        conn_local = _scheduler_conn()
-        cursor_local = conn_local.cursor()
-        
-        # КРИТИЧЕСКИЙ ФИКС: Добавляем rollback при ошибках транзакции
-        try:
-            # Сначала делаем rollback на случай если предыдущая транзакция упала
-            try:
-                conn_local.rollback()
-            except:
-                pass
-        except:
-            pass
-        
-        plans = []
-        try:
-            with db_lock:
-                try:
-                    # Проверяем, что курсор не закрыт
-                    if cursor_local.closed:
-                        logger.warning("[PLAN CHECK] Курсор закрыт, создаем новый")
-                        cursor_local.close()
-                        cursor_local = conn_local.cursor()
-                    
-                    cursor_local.execute('''
-
-                        SELECT p.id, p.chat_id, p.film_id, p.plan_type, p.plan_datetime, p.user_id,
-
-                               COALESCE(p.custom_title, m.title, 'Мероприятие') as title, m.link, p.notification_sent, p.ticket_notification_sent, p.ticket_file_id
-
-                        FROM plans p
-
-                        LEFT JOIN movies m ON p.film_id = m.id AND p.chat_id = m.chat_id
-
-                        WHERE p.plan_datetime >= %s 
-
-                          AND p.plan_datetime <= %s
-
-                    ''', (check_start, check_end))
-
-                    plans = cursor_local.fetchall()
-                except Exception as db_e:
-                    logger.error(f"[PLAN CHECK] Ошибка при запросе планов: {db_e}", exc_info=True)
-                    try:
-                        conn_local.rollback()
-                    except:
-                        pass
-                    plans = []
-        except Exception as lock_e:
-            logger.error(f"[PLAN CHECK] Ошибка при блокировке БД: {lock_e}", exc_info=True)
-            plans = []
-
-        
-
-        if not plans:
-            return
-
-        logger.info(f"[PLAN CHECK] Проверяем {len(plans)} планов на уведомления")
-
-        # Группируем планы по (chat_id, дата в TZ пользователя) для одного утреннего уведомления на день
-        groups = {}
-        for plan in plans:
-            if isinstance(plan, dict):
-                plan_id, chat_id, film_id, plan_type, plan_datetime = plan.get('id'), plan.get('chat_id'), plan.get('film_id'), plan.get('plan_type'), plan.get('plan_datetime')
-                user_id = plan.get('user_id')
-            else:
-                plan_id, chat_id, film_id, plan_type, plan_datetime = plan[0], plan[1], plan[2], plan[3], plan[4]
-                user_id = plan[5] if len(plan) > 5 else None
-            user_tz = get_user_timezone_or_default(user_id)
-            if hasattr(plan_datetime, 'astimezone'):
-                plan_dt_local = plan_datetime.astimezone(user_tz) if plan_datetime.tzinfo else user_tz.localize(plan_datetime.replace(tzinfo=None))
-            else:
-                plan_dt_local = datetime.fromisoformat(str(plan_datetime).replace('Z', '+00:00')).astimezone(user_tz)
-            date_key = plan_dt_local.date()
-            key = (chat_id, date_key.isoformat())
-            if key not in groups:
-                groups[key] = {'user_id': user_id, 'date_str': date_key.isoformat(), 'reminder_utc': None}
-            if groups[key]['reminder_utc'] is None:
-                tz_for_reminder = get_user_timezone_or_default(groups[key]['user_id'])
-                now_local = datetime.now(tz_for_reminder)
-                if date_key >= now_local.date():
-                    notify_settings = get_notification_settings(chat_id)
-                    wd = date_key.weekday()
-                    is_weekend = wd >= 5
-                    if notify_settings.get('separate_weekdays') == 'false':
-                        h = notify_settings.get('cinema_weekday_hour', 9)
-                        m = notify_settings.get('cinema_weekday_minute', 0)
-                    elif is_weekend:
-                        h, m = notify_settings.get('cinema_weekend_hour', 9), notify_settings.get('cinema_weekend_minute', 0)
-                    else:
-                        h, m = notify_settings.get('cinema_weekday_hour', 9), notify_settings.get('cinema_weekday_minute', 0)
-                    reminder_local = tz_for_reminder.localize(datetime.combine(date_key, datetime.min.time().replace(hour=h, minute=m)))
-                    groups[key]['reminder_utc'] = reminder_local.astimezone(pytz.utc)
-
-        for key, g in groups.items():
-            chat_id, date_str = key[0], g['date_str']
-            reminder_utc = g.get('reminder_utc')
-            user_id = g.get('user_id')
-            if reminder_utc is None:
-                continue
-            diff = (reminder_utc - now_utc).total_seconds()
-            if diff > 5:
-                job_id = f'plan_reminder_combined_{chat_id}_{date_str}'
-                try:
-                    if not scheduler.get_job(job_id):
-                        scheduler.add_job(
-                            send_plan_notification_combined,
-                            'date',
-                            run_date=reminder_utc,
-                            args=[chat_id, date_str],
-                            kwargs={'user_id': user_id},
-                            id=job_id
-                        )
-                        logger.info(f"[PLAN CHECK] Запланировано объединённое уведомление для чата {chat_id} на {date_str} в {reminder_utc}")
-                except Exception as e:
-                    logger.warning(f"[PLAN CHECK] Не удалось запланировать объединённое уведомление: {e}")
-            elif -1800 <= diff <= 5:
-                try:
-                    job_id = f'plan_reminder_combined_{chat_id}_{date_str}'
-                    if not scheduler.get_job(job_id):
-                        send_plan_notification_combined(chat_id, date_str, user_id=user_id)
-                        logger.info(f"[PLAN CHECK] Объединённое уведомление отправлено сразу для чата {chat_id} на {date_str}")
-                except Exception as e:
-                    logger.error(f"[PLAN CHECK] Ошибка отправки объединённого уведомления: {e}", exc_info=True)
-
-        for plan in plans:
-
-            if isinstance(plan, dict):
-
-                plan_id = plan.get('id')
-
-                chat_id = plan.get('chat_id')
-
-                film_id = plan.get('film_id')
-
-                plan_type = plan.get('plan_type')
-
-                plan_datetime = plan.get('plan_datetime')
-
-                user_id = plan.get('user_id')
-
-                title = plan.get('title')
-
-                link = plan.get('link')
-
-                notification_sent = plan.get('notification_sent', False)
-
-                ticket_notification_sent = plan.get('ticket_notification_sent', False)
+# Окно проверки планов: ближайшие сутки и пропущенные (не больше 30 минут назад) напоминания
+PLAN_CHECK_AHEAD = timedelta(days=1)
+PLAN_MISSED_GRACE = timedelta(seconds=MISFIRE_GRACE_SECONDS)
 
-                ticket_file_id = plan.get('ticket_file_id')
+# Функции задач строкой: задачу из apscheduler_jobs восстановит и процесс после перезапуска
+PLAN_COMBINED_FUNC = 'moviebot.scheduler:send_plan_notification_combined'
+TICKET_NOTIFICATION_FUNC = 'moviebot.scheduler:send_ticket_notification'
 
-            else:
-
-                plan_id = plan[0]
-
-                chat_id = plan[1]
-
-                film_id = plan[2]
-
-                plan_type = plan[3]
-
-                plan_datetime = plan[4]
-
-                user_id = plan[5]
-
-                title = plan[6]
-
-                link = plan[7]
-
-                notification_sent = plan[8] if len(plan) > 8 else False
-
-                ticket_notification_sent = plan[9] if len(plan) > 9 else False
-
-                ticket_file_id = plan[10] if len(plan) > 10 else None
-
-            
-
-            # Получаем часовой пояс пользователя
+PlanReminders = namedtuple('PlanReminders', ('jobs', 'due', 'scope_ids', 'scope_prefixes'))
+ReconcileResult = namedtuple('ReconcileResult', ('plans', 'desired', 'added', 'removed', 'sent_now'))
 
-            user_tz = get_user_timezone_or_default(user_id)
 
-            
+def _plan_datetime_utc(value):
+    if isinstance(value, datetime):
+        return pytz.utc.localize(value) if value.tzinfo is None else value.astimezone(pytz.utc)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).astimezone(pytz.utc)
 
-            # Преобразуем plan_datetime в локальное время пользователя
 
-            if isinstance(plan_datetime, datetime):
+def _combined_reminder_utc(notify_settings, plan_date, user_tz):
+    """Время утреннего объединённого уведомления на дату по настройкам чата"""
+    if notify_settings.get('separate_weekdays') != 'false' and plan_date.weekday() >= 5:
+        h, m = notify_settings.get('cinema_weekend_hour', 9), notify_settings.get('cinema_weekend_minute', 0)
+    else:
+        h, m = notify_settings.get('cinema_weekday_hour', 9), notify_settings.get('cinema_weekday_minute', 0)
+    reminder_local = user_tz.localize(datetime.combine(plan_date, datetime.min.time().replace(hour=h, minute=m)))
+    return reminder_local.astimezone(pytz.utc)
+
+
+def plan_reminder_jobs(plans, now_utc, settings=None):
+    """
+    Какие напоминания нужны по планам окна проверки (PlanReminders):
+      jobs — {job_id: (функция, run_date, args, kwargs)} на будущее;
+      due — {job_id: (функция, args, kwargs)}: время уже наступило, но прошло не больше 30 минут;
+      scope_ids, scope_prefixes — задачи, которые эти планы полностью определяют (для удаления лишних).
+
+    Объединённое уведомление — одно на (чат, дата в TZ пользователя), пока на дату есть план без
+    notification_sent; напоминание с билетами — по плану в кино с билетами без ticket_notification_sent.
+
+    Часовые пояса и настройки напоминаний берутся из settings (SettingsSnapshot); по умолчанию
+    снимок загружается двумя запросами на все планы.
+    """
+    if settings is None:
+        settings = load_settings_snapshot([plan.get('user_id') for plan in plans], [plan['chat_id'] for plan in plans])
+    jobs, due, scope_ids, scope_prefixes = {}, {}, set(), set()
+
+    def place(job_id, func, run_utc, args, kwargs, due_kwargs=None):
+        if (run_utc - now_utc).total_seconds() > 5:
+            jobs[job_id] = (func, run_utc, args, kwargs)
+        elif run_utc >= now_utc - PLAN_MISSED_GRACE:
+            due[job_id] = (func, args, dict(kwargs, **(due_kwargs or {})))
+
+    groups = {}
+    for plan in plans:
+        chat_id, plan_id, user_id = plan['chat_id'], plan['id'], plan.get('user_id')
+        user_tz = settings.timezone(user_id)
+        plan_dt_local = _plan_datetime_utc(plan['plan_datetime']).astimezone(user_tz)
+        group = groups.setdefault((chat_id, plan_dt_local.date()), {'user_id': user_id, 'pending': False})
+        group['pending'] = group['pending'] or not plan.get('notification_sent')
+
+        if plan.get('plan_type') != 'cinema':
+            continue
+        # Напоминание с билетами за N минут до сеанса (-1 — не присылать, 0 — вместе с утренним)
+        scope_prefixes.add(f'ticket_notify_{chat_id}_{plan_id}_')
+        if not plan.get('ticket_file_id') or plan.get('ticket_notification_sent'):
+            continue
+        ticket_before_minutes = settings.notification_settings(chat_id).get('ticket_before_minutes', 10)
+        if ticket_before_minutes <= 0:
+            continue
+        ticket_utc = (plan_dt_local - timedelta(minutes=ticket_before_minutes)).astimezone(pytz.utc)
+        place(f'ticket_notify_{chat_id}_{plan_id}_{int(ticket_utc.timestamp())}',
+              TICKET_NOTIFICATION_FUNC, ticket_utc, [chat_id, plan_id], {})
+
+    for (chat_id, plan_date), group in groups.items():
+        date_str = plan_date.isoformat()
+        job_id = f'plan_reminder_combined_{chat_id}_{date_str}'
+        scope_ids.add(job_id)
+        user_tz = settings.timezone(group['user_id'])
+        if not group['pending'] or plan_date < now_utc.astimezone(user_tz).date():
+            continue
+        reminder_utc = _combined_reminder_utc(settings.notification_settings(chat_id), plan_date, user_tz)
+        # Отправка сразу идёт в этом же прогоне — со снимком настроек; в задачу он не сохраняется
+        place(job_id, PLAN_COMBINED_FUNC, reminder_utc, [chat_id, date_str], {'user_id': group['user_id']},
+              due_kwargs={'settings': settings})
 
-                if plan_datetime.tzinfo is None:
+    return PlanReminders(jobs, due, scope_ids, scope_prefixes)
 
-                    plan_dt_local = pytz.utc.localize(plan_datetime).astimezone(user_tz)
 
-                else:
+def _fetch_window_plans(now_utc):
+    """Планы окна проверки: от now_utc - 30 минут до now_utc + сутки"""
+    conn_local = _scheduler_conn()
+    cursor_local = conn_local.cursor()
+    try:
+        with db_lock:
+            cursor_local.execute('''
+                SELECT p.id, p.chat_id, p.film_id, p.plan_type, p.plan_datetime, p.user_id,
+                       COALESCE(p.custom_title, m.title, 'Мероприятие') as title, m.link,
+                       p.notification_sent, p.ticket_notification_sent, p.ticket_file_id
+                FROM plans p
+                LEFT JOIN movies m ON p.film_id = m.id AND p.chat_id = m.chat_id
+                WHERE p.plan_datetime >= %s AND p.plan_datetime <= %s
+            ''', (now_utc - PLAN_MISSED_GRACE, now_utc + PLAN_CHECK_AHEAD))
+            return cursor_local.fetchall()
+    finally:
+        try:
+            cursor_local.close()
+            conn_local.close()
+        except Exception:
+            pass
 
-                    plan_dt_local = plan_datetime.astimezone(user_tz)
 
+def reconcile_plan_reminders(now_utc=None):
+    """
+    Сверяет напоминания по планам окна с задачами планировщика: недостающие ставит (или сразу
+    отправляет, если их время прошло не больше 30 минут назад), лишние — по удалённым,
+    перенесённым и уже отправленным планам — снимает. Нужные и сохранённые задачи
+    сравниваются одним запросом (diff_dynamic_jobs), поэтому проход после перезапуска
+    не теряет и не дублирует напоминания. Возвращает ReconcileResult.
+    """
+    now_utc = now_utc or datetime.now(pytz.utc)
+    plans = _fetch_window_plans(now_utc)
+    if not plans:
+        return ReconcileResult(0, 0, 0, 0, 0)
+
+    reminders = plan_reminder_jobs(plans, now_utc)
+    desired = set(reminders.jobs) | set(reminders.due)
+    missing, stale = diff_dynamic_jobs(scheduler, desired, reminders.scope_ids, reminders.scope_prefixes)
+
+    removed = 0
+    for job_id in sorted(stale):
+        try:
+            scheduler.remove_job(job_id)
+            removed += 1
+        except JobLookupError:
+            pass
+    added = sent_now = 0
+    for job_id in sorted(missing):
+        try:
+            if job_id in reminders.jobs:
+                func, run_utc, args, kwargs = reminders.jobs[job_id]
+                add_dynamic_job(scheduler, func, run_utc, job_id, args=args, kwargs=kwargs)
+                added += 1
             else:
+                func, args, kwargs = reminders.due[job_id]
+                ref_to_obj(func)(*args, **kwargs)
+                sent_now += 1
+        except Exception as e:
+            logger.error(f"[PLAN CHECK] Не удалось поставить или отправить напоминание {job_id}: {e}", exc_info=True)
 
-                plan_dt_local = datetime.fromisoformat(str(plan_datetime).replace('Z', '+00:00')).astimezone(user_tz)
-
-            
-
-            now_local = datetime.now(user_tz)
-
-            
-
-            if plan_type == 'cinema':
-                # Утреннее напоминание по планам отправляется одним объединённым уведомлением (см. send_plan_notification_combined выше).
-                # Здесь только напоминание с билетами за N минут до сеанса.
-                notify_settings = get_notification_settings(chat_id)
-                ticket_before_minutes = notify_settings.get('ticket_before_minutes', 10)
-                
-                # Если настройка "не присылать отдельно" или "вместе с уведомлением", пропускаем
-                if ticket_before_minutes == -1:  # -1 означает "не присылать отдельно"
-                    ticket_utc = None
-                elif ticket_before_minutes == 0:  # 0 означает "вместе с уведомлением"
-                    # Билеты будут отправлены вместе с основным уведомлением
-                    ticket_utc = None
-                else:
-                    ticket_dt = plan_dt_local - timedelta(minutes=ticket_before_minutes)
-                    ticket_utc = ticket_dt.astimezone(pytz.utc)
-
-                
-
-                # ticket_file_id уже получен из основного запроса выше
-
-                
-
-                if ticket_file_id and ticket_utc:
-
-                    # Планируем напоминание с билетами, если оно еще не запланировано и время еще не прошло
-                    # Проверяем, не было ли уже отправлено уведомление с билетами
-                    ticket_time_diff = (ticket_utc - now_utc).total_seconds()
-                    
-                    if ticket_time_diff > 5 and not ticket_notification_sent:
-
-                        try:
-
-                            job_id = f'ticket_notify_{chat_id}_{plan_id}_{int(ticket_utc.timestamp())}'
-
-                            existing_job = scheduler.get_job(job_id)
-
-                            if not existing_job:
-
-                                scheduler.add_job(
-
-                                    send_ticket_notification,
-
-                                    'date',
-
-                                    run_date=ticket_utc,
-
-                                    args=[chat_id, plan_id],
-
-                                    id=job_id
-
-                                )
-
-                                logger.info(f"[PLAN CHECK] Запланировано уведомление с билетами для плана {plan_id} (фильм {title}) на {ticket_utc}")
-
-                            # Не логируем, если job уже существует - это нормально при периодических проверках
-
-                        except Exception as e:
-
-                            logger.warning(f"[PLAN CHECK] Не удалось запланировать уведомление с билетами для плана {plan_id}: {e}")
-
-                    elif ticket_time_diff <= 5 and ticket_utc >= now_utc - timedelta(minutes=30):
-
-                        # Время напоминания с билетами уже прошло, но не более 30 минут назад - отправляем сразу
-                        # Проверяем, не было ли уже отправлено уведомление с билетами
-                        if not ticket_notification_sent:
-                            try:
-                                # Проверяем, не запланировано ли уже уведомление
-                                job_id = f'ticket_notify_{chat_id}_{plan_id}_{int(ticket_utc.timestamp())}'
-                                existing_job = scheduler.get_job(job_id)
-                                if not existing_job:
-                                    # Отправляем уведомление ВНЕ блокировки
-                                    send_ticket_notification(chat_id, plan_id)
-                                    # Отмечаем как отправленное (send_ticket_notification уже обновляет БД, но на всякий случай)
-                                    try:
-                                        with db_lock:
-                                            cursor_local.execute('UPDATE plans SET ticket_notification_sent = TRUE WHERE id = %s', (plan_id,))
-                                            conn_local.commit()
-                                    except Exception as update_e:
-                                        logger.warning(f"[PLAN CHECK] Не удалось обновить ticket_notification_sent для плана {plan_id}: {update_e}")
-                                    logger.info(f"[PLAN CHECK] Уведомление с билетами отправлено сразу для плана {plan_id} (фильм {title})")
-                                # Не логируем, если job уже существует - это нормально при периодических проверках
-                            except Exception as e:
-                                logger.error(f"[PLAN CHECK] Ошибка отправки уведомления с билетами для плана {plan_id}: {e}", exc_info=True)
-                        else:
-                            logger.info(f"[PLAN CHECK] Уведомление с билетами уже отправлено для плана {plan_id}, пропускаем")
+    if added or removed or sent_now:
+        logger.info(f"[PLAN CHECK] Планов {len(plans)}, напоминаний {len(desired)}: поставлено {added}, "
+                    f"снято {removed}, отправлено сразу {sent_now}")
+    return ReconcileResult(len(plans), len(desired), added, removed, sent_now)
 
-            # Планы дома: утреннее напоминание уходит одним объединённым уведомлением (send_plan_notification_combined).
 
+def check_and_send_plan_notifications():
+    """Периодическая проверка планов и отправка пропущенных уведомлений"""
+    try:
+        reconcile_plan_reminders()
     except Exception as e:
         logger.error(f"[PLAN CHECK] Ошибка при проверке планов: {e}", exc_info=True)
-    finally:
-        # Закрываем локальные соединения
-        if 'cursor_local' in locals():
-            try:
-                cursor_local.close()
-            except:
-                pass
-        if 'conn_local' in locals():
-            try:
-                conn_local.close()
-            except:
-                pass
 
 
 def check_and_send_rate_reminders():
@@ -1430,12 +1279,10 @@ def send_series_notification(chat_id, film_id, kp_id, title, season, episode, us
                 
                 # Ставим уведомление для каждого подписанного пользователя
                 for user_id in subscribers_list:
-                    scheduler.add_job(
-                        send_series_notification,
-                        'date',
-                        run_date=notification_time.astimezone(pytz.utc),
-                        args=[chat_id, film_id, kp_id, title, next_episode['season'], next_episode['episode']],
-                        id=f'series_notification_{chat_id}_{film_id}_{user_id}_{next_episode_date.strftime("%Y%m%d")}'
+                    add_dynamic_job(
+                        scheduler, send_series_notification, notification_time.astimezone(pytz.utc),
+                        f'series_notification_{chat_id}_{film_id}_{user_id}_{next_episode_date.strftime("%Y%m%d")}',
+                        args=[chat_id, film_id, kp_id, title, next_episode['season'], next_episode['episode']]
                     )
                 
                 # Отправляем сообщение о следующей серии
@@ -1453,17 +1300,32 @@ def send_series_notification(chat_id, film_id, kp_id, title, season, episode, us
                 # Нет следующей серии - ставим периодическую проверку
                 check_time = dt.now(pytz.utc) + timedelta(weeks=3)
                 for user_id in subscribers_list:
-                    scheduler.add_job(
-                        check_series_for_new_episodes,
-                        'date',
-                        run_date=check_time,
-                        args=[chat_id, film_id, kp_id, user_id],
-                        id=f'series_check_{chat_id}_{film_id}_{user_id}_{int(check_time.timestamp())}'
-                    )
+                    schedule_series_check(scheduler, chat_id, film_id, kp_id, user_id, check_time)
                 logger.info(f"[SERIES NOTIFICATION] Следующая проверка через 3 недели для {title} (kp_id={kp_id})")
     except Exception as e:
         logger.error(f"[SERIES NOTIFICATION] Ошибка: {e}", exc_info=True)
 
+def series_check_job_id(chat_id, film_id, user_id):
+    """id задачи проверки новых серий: одна ожидающая проверка на подписчика сериала в чате"""
+    return f'series_check_{chat_id}_{film_id}_{user_id}'
+
+
+def schedule_series_check(sched, chat_id, film_id, kp_id, user_id, run_date):
+    """
+    Ставит (или переносит) проверку новых серий для подписчика. Повторная постановка заменяет
+    ожидающую проверку; сохранённые задачи со старыми id (с временем запуска в конце) снимаются.
+    """
+    job_id = series_check_job_id(chat_id, film_id, user_id)
+    add_dynamic_job(sched, check_series_for_new_episodes, run_date, job_id, args=[chat_id, film_id, kp_id, user_id])
+    _, stale = diff_dynamic_jobs(sched, {job_id}, scope_prefixes={f'{job_id}_'})
+    for stale_id in sorted(stale):
+        try:
+            sched.remove_job(stale_id)
+        except JobLookupError:
+            pass
+    return job_id
+
+
 def check_series_for_new_episodes(chat_id, film_id, kp_id, user_id):
     """Проверяет сериал на наличие новых серий и ставит уведомления"""
     try:
@@ -1581,12 +1443,10 @@ def check_series_for_new_episodes(chat_id, film_id, kp_id, user_id):
                     except:
                         pass
             
-            scheduler.add_job(
-                send_series_notification,
-                'date',
-                run_date=notification_time.astimezone(pytz.utc),
-                args=[chat_id, film_id, kp_id, title, next_episode['season'], next_episode['episode']],
-                id=f'series_notification_{chat_id}_{film_id}_{user_id}_{next_episode_date.strftime("%Y%m%d")}'
+            add_dynamic_job(
+                scheduler, send_series_notification, notification_time.astimezone(pytz.utc),
+                f'series_notification_{chat_id}_{film_id}_{user_id}_{next_episode_date.strftime("%Y%m%d")}',
+                args=[chat_id, film_id, kp_id, title, next_episode['season'], next_episode['episode']]
             )
             
             # Отправляем уведомление о найденной новой серии
@@ -1606,13 +1466,7 @@ def check_series_for_new_episodes(chat_id, film_id, kp_id, user_id):
         else:
             # Нет ближайшей даты - ставим следующую проверку через 3 недели
             check_time = dt.now(pytz.utc) + timedelta(weeks=3)
-            scheduler.add_job(
-                check_series_for_new_episodes,
-                'date',
-                run_date=check_time,
-                args=[chat_id, film_id, kp_id, user_id],
-                id=f'series_check_{chat_id}_{film_id}_{user_id}_{int(check_time.timestamp())}'
-            )
+            schedule_series_check(scheduler, chat_id, film_id, kp_id, user_id, check_time)
             logger.info(f"[SERIES CHECK] Следующая проверка через 3 недели для сериала kp_id={kp_id}")
     except Exception as e:
         logger.error(f"[SERIES CHECK] Ошибка: {e}", exc_info=True)
@@ -2374,6 +2228,7 @@ def process_recurring_payments():
                                 """, (now, new_expires_at, new_next_payment, future_subscription_id))
                                 
                                 conn_future.commit()
+                                invalidate_entitlements(user_id=user_id, chat_id=chat_id)
                                 
                                 logger.info(f"[RECURRING PAYMENT] Отменена старая подписка {subscription_id}, активирована новая {future_subscription_id}")
                                 
@@ -2681,141 +2536,60 @@ def mark_event_sent(chat_id, event_type):
             pass
 
 
-def check_weekend_schedule():
-    """Проверяет расписание на выходные (пт-сб-вс) и отправляет уведомление, если нет планов домашнего просмотра.
-    ПРИОРИТЕТ 1: Выполняется только в пятницу, в базовое время уведомлений пользователя.
-    Если на текущей неделе уже было уведомление (нет планов дома/кино/случайное событие), не отправляет."""
-    from moviebot.database.db_operations import get_notification_settings
-    
-    if not bot:
-        return
-    
+# Недельные уведомления (выходные, премьеры, случайные события): не больше одного на неделе
+WEEKLY_EVENT_TYPES = ['weekend_reminder', 'premiere_reminder', 'random_event']
+
+# Условия отбора чата c для рассылок: бот не заблокирован, напоминание не отключено
+_BROADCAST_CHAT_FILTERS = '''
+    NOT EXISTS (
+        SELECT 1 FROM settings b WHERE b.chat_id = c.chat_id AND b.key = 'bot_blocked_by_user'
+        AND (b.value = '1' OR LOWER(b.value) = 'true')
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM settings d WHERE d.chat_id = c.chat_id AND d.key = %(disabled_key)s AND d.value = 'true'
+    )
+'''
+
+# ...и для недельных уведомлений: случайные события включены, на этой неделе уведомлений не было
+_WEEKLY_CHAT_FILTERS = _BROADCAST_CHAT_FILTERS + '''
+    AND NOT EXISTS (
+        SELECT 1 FROM settings r WHERE r.chat_id = c.chat_id AND r.key = 'random_events_enabled'
+        AND r.value IS DISTINCT FROM 'true'
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM event_notifications e WHERE e.chat_id = c.chat_id
+        AND e.event_type = ANY(%(weekly_events)s) AND e.sent_date BETWEEN %(monday)s AND %(sunday)s
+    )
+'''
+
+
+def _week_bounds(now):
+    monday = (now - timedelta(days=now.weekday())).date()
+    return monday, monday + timedelta(days=6)
+
+
+def _setting_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _setting_int(value, default):
+    try:
+        return int(value) if value else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _select_candidates(query, params):
+    """Строки кандидатов на рассылку одним запросом"""
     conn_local = _scheduler_conn()
     cursor_local = conn_local.cursor()
-    
     try:
-        now = datetime.now(PLANS_TZ)
-        current_weekday = now.weekday()
-        
-        # Проверяем только в пятницу (4 = пятница)
-        if current_weekday != 4:
-            return
-        
-        # Получаем все чаты (личные и группы) — уведомление «нет планов дома» и в личку, и в группы
         with db_lock:
-            cursor_local.execute("SELECT DISTINCT chat_id FROM movies")
-            chat_rows = cursor_local.fetchall()
-        
-        for row in chat_rows:
-            chat_id = row.get('chat_id') if isinstance(row, dict) else row[0]
-            
-            # Проверяем, включены ли напоминания (random_events_enabled = общий флаг для этой группы уведомлений)
-            if not get_random_events_enabled(chat_id):
-                continue
-            
-            # ПРИОРИТЕТ: Проверяем, было ли уже отправлено какое-то уведомление на этой неделе
-            if was_event_sent_this_week(chat_id, ['weekend_reminder', 'premiere_reminder', 'random_event']):
-                logger.info(f"[WEEKEND SCHEDULE] Пропуск чата {chat_id} - уже было отправлено уведомление на этой неделе")
-                continue
-            
-            # Проверяем, отключено ли это напоминание
-            with db_lock:
-                cursor_local.execute("SELECT value FROM settings WHERE chat_id = %s AND key = 'reminder_weekend_films_disabled'", (chat_id,))
-                reminder_disabled_row = cursor_local.fetchone()
-            if reminder_disabled_row:
-                is_disabled = reminder_disabled_row.get('value') if isinstance(reminder_disabled_row, dict) else reminder_disabled_row[0]
-                if is_disabled == 'true':
-                    continue
-            
-            # Получаем базовое время уведомлений пользователя (пятница - будний день)
-            notify_settings = get_notification_settings(chat_id)
-            if notify_settings.get('separate_weekdays') == 'false':
-                base_hour = notify_settings.get('home_weekday_hour', 19)
-                base_minute = notify_settings.get('home_weekday_minute', 0)
-            else:
-                base_hour = notify_settings.get('home_weekday_hour', 19)
-                base_minute = notify_settings.get('home_weekday_minute', 0)
-            
-            # Проверяем, подходит ли текущее время (допуск ±30 минут для покрытия разных настроек)
-            current_minutes = now.hour * 60 + now.minute
-            base_minutes = base_hour * 60 + base_minute
-            if abs(current_minutes - base_minutes) > 30:
-                continue
-            
-            # Проверяем, было ли уведомление на этой неделе
-            with db_lock:
-                cursor_local.execute("SELECT value FROM settings WHERE chat_id = %s AND key = 'last_weekend_reminder_date'", (chat_id,))
-                last_date_row = cursor_local.fetchone()
-            
-            # Находим понедельник текущей недели
-            days_since_monday = now.weekday()
-            monday = (now - timedelta(days=days_since_monday)).date()
-            
-            should_send = True
-            if last_date_row:
-                last_date_str = last_date_row.get('value') if isinstance(last_date_row, dict) else last_date_row[0]
-                try:
-                    last_date = datetime.strptime(last_date_str, '%Y-%m-%d').date()
-                    # Если уведомление было на этой неделе (с понедельника), не отправляем
-                    if last_date >= monday:
-                        should_send = False
-                except:
-                    pass
-            
-            if not should_send:
-                continue
-            
-            # Проверяем, есть ли планы на выходные (пт-сб-вс) для домашнего просмотра
-            friday = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            sunday = now.replace(hour=23, minute=59, second=59, microsecond=0) + timedelta(days=2)
-            
-            # Проверяем планы домашнего просмотра на выходные
-            with db_lock:
-                cursor_local.execute('''
-                    SELECT COUNT(*) FROM plans
-                    WHERE chat_id = %s 
-                    AND plan_type = 'home'
-                    AND plan_datetime >= %s 
-                    AND plan_datetime <= %s
-                ''', (chat_id, friday, sunday))
-                home_plans_count = cursor_local.fetchone()
-            home_count = home_plans_count.get('count') if isinstance(home_plans_count, dict) else home_plans_count[0] if home_plans_count else 0
-            
-            # Если нет планов домашнего просмотра, отправляем уведомление
-            if home_count == 0:
-                try:
-                    markup = InlineKeyboardMarkup(row_width=1)
-                    markup.add(InlineKeyboardButton("🎲 Найти фильм", callback_data="rand_final:go"))
-                    markup.add(InlineKeyboardButton("⏰ Настройки напоминаний", callback_data="settings:notifications"))
-                    markup.add(InlineKeyboardButton("❌ Отменить такие уведомления", callback_data="reminder:disable:weekend_films"))
-                    
-                    text = "🎬 На выходных нет запланированных фильмов для домашнего просмотра!\n\n"
-                    text += "Хотите выбрать какой-нибудь фильм из вашей базы?"
-                    
-                    bot.send_message(
-                        chat_id,
-                        text,
-                        reply_markup=markup,
-                        parse_mode='HTML'
-                    )
-                    
-                    # Отмечаем, что событие отправлено
-                    mark_event_sent(chat_id, 'weekend_reminder')
-                    
-                    # Сохраняем дату последнего уведомления
-                    with db_lock:
-                        cursor_local.execute('''
-                            INSERT INTO settings (chat_id, key, value)
-                            VALUES (%s, 'last_weekend_reminder_date', %s)
-                            ON CONFLICT (chat_id, key) DO UPDATE SET value = EXCLUDED.value
-                        ''', (chat_id, now.date().isoformat()))
-                        conn_local.commit()
-                    
-                    logger.info(f"[WEEKEND SCHEDULE] Отправлено уведомление о выходных для чата {chat_id}")
-                except Exception as e:
-                    logger.error(f"[WEEKEND SCHEDULE] Ошибка при отправке уведомления: {e}", exc_info=True)
-    except Exception as e:
-        logger.error(f"[WEEKEND SCHEDULE] Ошибка в check_weekend_schedule: {e}", exc_info=True)
+            cursor_local.execute(query, params)
+            return cursor_local.fetchall()
     finally:
         try:
             cursor_local.close()
@@ -2827,131 +2601,29 @@ def check_weekend_schedule():
             pass
 
 
-def check_premiere_reminder():
-    """Проверяет, нет ли планов в кинотеатре на выходные, и отправляет напоминание с кнопками-премьерами.
-    ПРИОРИТЕТ 2: Выполняется только в четверг. Если на текущей неделе уже было уведомление, не отправляет."""
-    from moviebot.api.kinopoisk_api import get_premieres_for_period
-    
-    if not bot:
+def _record_sent(chat_ids, event_type, date_key, day):
+    """Отметки об отправке для всех чатов рассылки: event_notifications и дата в settings"""
+    if not chat_ids:
         return
-    
     conn_local = _scheduler_conn()
     cursor_local = conn_local.cursor()
-    
     try:
-        now = datetime.now(PLANS_TZ)
-        current_weekday = now.weekday()
-        
-        # Проверяем только в четверг (3 = четверг)
-        if current_weekday != 3:
-            return
-        
-        # Получаем все чаты (личные и группы) — уведомление «нет планов в кино» и в личку, и в группы
         with db_lock:
-            cursor_local.execute("SELECT DISTINCT chat_id FROM movies")
-            chat_rows = cursor_local.fetchall()
-        
-        for row in chat_rows:
-            chat_id = row.get('chat_id') if isinstance(row, dict) else row[0]
-            
-            if not get_random_events_enabled(chat_id):
-                continue
-            
-            # ПРИОРИТЕТ: Проверяем, было ли уже отправлено какое-то уведомление на этой неделе
-            if was_event_sent_this_week(chat_id, ['weekend_reminder', 'premiere_reminder', 'random_event']):
-                logger.info(f"[PREMIERE REMINDER] Пропуск чата {chat_id} - уже было отправлено уведомление на этой неделе")
-                continue
-            
-            with db_lock:
-                cursor_local.execute("SELECT value FROM settings WHERE chat_id = %s AND key = 'reminder_cinema_premieres_disabled'", (chat_id,))
-                reminder_disabled_row = cursor_local.fetchone()
-            if reminder_disabled_row:
-                is_disabled = reminder_disabled_row.get('value') if isinstance(reminder_disabled_row, dict) else reminder_disabled_row[0]
-                if is_disabled == 'true':
-                    continue
-            
-            # Проверяем, есть ли планы в кино на выходные (пт-сб-вс)
-            friday = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)  # Завтра пятница
-            sunday = friday + timedelta(days=2)
-            
-            with db_lock:
-                cursor_local.execute('''
-                    SELECT COUNT(*) FROM plans
-                    WHERE chat_id = %s 
-                    AND plan_type = 'cinema'
-                    AND plan_datetime >= %s 
-                    AND plan_datetime <= %s
-                ''', (chat_id, friday, sunday))
-                cinema_plans_count = cursor_local.fetchone()
-            cinema_count = cinema_plans_count.get('count') if isinstance(cinema_plans_count, dict) else cinema_plans_count[0] if cinema_plans_count else 0
-            
-            # Если нет планов в кино на выходные, отправляем уведомление
-            if cinema_count == 0:
-                # Проверяем, было ли уведомление на этой неделе
-                days_since_monday = now.weekday()
-                monday = (now - timedelta(days=days_since_monday)).date()
-                
-                with db_lock:
-                    cursor_local.execute("SELECT value FROM settings WHERE chat_id = %s AND key = 'last_cinema_reminder_date'", (chat_id,))
-                    last_reminder_row = cursor_local.fetchone()
-                
-                should_send = True
-                if last_reminder_row:
-                    last_reminder_str = last_reminder_row.get('value') if isinstance(last_reminder_row, dict) else last_reminder_row[0]
-                    try:
-                        last_reminder = datetime.strptime(last_reminder_str, '%Y-%m-%d').date()
-                        # Если уведомление было на этой неделе (с понедельника), не отправляем
-                        if last_reminder >= monday:
-                            should_send = False
-                    except:
-                        pass
-                
-                if should_send:
-                    try:
-                        premieres = get_premieres_for_period('current_month')
-                        
-                        text = "🎬 На выходные (пятница, суббота, воскресенье) нет запланированных походов в кино!\n\n"
-                        text += "Посмотрите, какие премьеры сейчас идут:"
-                        
-                        markup = InlineKeyboardMarkup(row_width=1)
-                        
-                        # Добавляем кнопки с несколькими премьерами (до 5)
-                        if premieres:
-                            for i, p in enumerate(premieres[:5], 1):
-                                kp_id = p.get('kinopoiskId') or p.get('filmId')
-                                title = p.get('nameRu') or p.get('nameOriginal') or 'Без названия'
-                                year = p.get('year') or ''
-                                
-                                if kp_id:
-                                    button_text = f"{i}. {title}"
-                                    if year:
-                                        button_text += f" ({year})"
-                                    if len(button_text) > 50:
-                                        button_text = button_text[:47] + "..."
-                                    markup.add(InlineKeyboardButton(button_text, callback_data=f"premiere_detail:{kp_id}:current_month"))
-                        
-                        # Добавляем общую кнопку "Все премьеры"
-                        markup.add(InlineKeyboardButton("📅 Все премьеры", callback_data="start_menu:premieres"))
-                        markup.add(InlineKeyboardButton("⏰ Настройки напоминаний", callback_data="settings:notifications"))
-                        markup.add(InlineKeyboardButton("❌ Отменить такие уведомления", callback_data="reminder:disable:cinema_premieres"))
-                        
-                        bot.send_message(chat_id, text, reply_markup=markup, parse_mode='HTML')
-                        
-                        mark_event_sent(chat_id, 'premiere_reminder')
-                        
-                        with db_lock:
-                            cursor_local.execute('''
-                                INSERT INTO settings (chat_id, key, value)
-                                VALUES (%s, 'last_cinema_reminder_date', %s)
-                                ON CONFLICT (chat_id, key) DO UPDATE SET value = EXCLUDED.value
-                            ''', (chat_id, now.date().isoformat()))
-                            conn_local.commit()
-                        
-                        logger.info(f"[PREMIERE REMINDER] Отправлено напоминание о премьерах для чата {chat_id}")
-                    except Exception as e:
-                        logger.error(f"[PREMIERE REMINDER] Ошибка при отправке напоминания: {e}", exc_info=True)
+            execute_values(cursor_local, '''
+                INSERT INTO event_notifications (chat_id, event_type, sent_date) VALUES %s
+                ON CONFLICT (chat_id, event_type, sent_date) DO NOTHING
+            ''', [(chat_id, event_type, day) for chat_id in chat_ids])
+            execute_values(cursor_local, '''
+                INSERT INTO settings (chat_id, key, value) VALUES %s
+                ON CONFLICT (chat_id, key) DO UPDATE SET value = EXCLUDED.value
+            ''', [(chat_id, date_key, day.isoformat()) for chat_id in chat_ids])
+            conn_local.commit()
     except Exception as e:
-        logger.error(f"[PREMIERE REMINDER] Ошибка в check_premiere_reminder: {e}", exc_info=True)
+        logger.error(f"[BROADCAST] Ошибка записи отметок {event_type}: {e}", exc_info=True)
+        try:
+            conn_local.rollback()
+        except:
+            pass
     finally:
         try:
             cursor_local.close()
@@ -2962,135 +2634,237 @@ def check_premiere_reminder():
         except:
             pass
 
-def check_and_send_random_events():
+
+def weekend_schedule_candidates(now):
+    """
+    Чаты для напоминания «нет планов дома на выходные»: базовое время уведомлений (будни)
+    в пределах ±30 минут от now, напоминание на этой неделе не отправлялось, домашних
+    планов на пт-вс нет.
+    """
+    monday, sunday = _week_bounds(now)
+    friday = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    weekend_end = now.replace(hour=23, minute=59, second=59, microsecond=0) + timedelta(days=2)
+    rows = _select_candidates(f'''
+        SELECT c.chat_id, h.value AS hour, m.value AS minute, l.value AS last_date
+        FROM (SELECT DISTINCT chat_id FROM movies) c
+        LEFT JOIN settings h ON h.chat_id = c.chat_id AND h.key = 'notify_home_weekday_hour'
+        LEFT JOIN settings m ON m.chat_id = c.chat_id AND m.key = 'notify_home_weekday_minute'
+        LEFT JOIN settings l ON l.chat_id = c.chat_id AND l.key = 'last_weekend_reminder_date'
+        WHERE {_WEEKLY_CHAT_FILTERS}
+        AND NOT EXISTS (
+            SELECT 1 FROM plans p WHERE p.chat_id = c.chat_id AND p.plan_type = 'home'
+            AND p.plan_datetime >= %(start)s AND p.plan_datetime <= %(end)s
+        )
+    ''', {'disabled_key': 'reminder_weekend_films_disabled', 'weekly_events': WEEKLY_EVENT_TYPES,
+          'monday': monday, 'sunday': sunday, 'start': friday, 'end': weekend_end})
+
+    current_minutes = now.hour * 60 + now.minute
+    chat_ids = []
+    for row in rows:
+        base_minutes = _setting_int(row['hour'], 19) * 60 + _setting_int(row['minute'], 0)
+        if abs(current_minutes - base_minutes) > 30:
+            continue
+        last_date = _setting_date(row['last_date'])
+        if last_date and last_date >= monday:
+            continue
+        chat_ids.append(row['chat_id'])
+    return chat_ids
+
+
+def check_weekend_schedule(dry_run=False):
+    """Проверяет расписание на выходные (пт-сб-вс) и отправляет уведомление, если нет планов домашнего просмотра.
+    ПРИОРИТЕТ 1: Выполняется только в пятницу, в базовое время уведомлений пользователя.
+    Если на текущей неделе уже было уведомление (нет планов дома/кино/случайное событие), не отправляет."""
+    if not bot:
+        return None
+
+    try:
+        now = datetime.now(PLANS_TZ)
+        # Проверяем только в пятницу (4 = пятница)
+        if now.weekday() != 4 and not dry_run:
+            return None
+
+        chat_ids = weekend_schedule_candidates(now)
+
+        markup = InlineKeyboardMarkup(row_width=1)
+        markup.add(InlineKeyboardButton("🎲 Найти фильм", callback_data="rand_final:go"))
+        markup.add(InlineKeyboardButton("⏰ Настройки напоминаний", callback_data="settings:notifications"))
+        markup.add(InlineKeyboardButton("❌ Отменить такие уведомления", callback_data="reminder:disable:weekend_films"))
+        text = "🎬 На выходных нет запланированных фильмов для домашнего просмотра!\n\n"
+        text += "Хотите выбрать какой-нибудь фильм из вашей базы?"
+
+        def send(chat_id):
+            bot.send_message(chat_id, text, reply_markup=markup, parse_mode='HTML')
+
+        result = Broadcaster().run('weekend_reminder', chat_ids, send, dry_run=dry_run)
+        _record_sent(result.sent_chats, 'weekend_reminder', 'last_weekend_reminder_date', now.date())
+        return result
+    except Exception as e:
+        logger.error(f"[WEEKEND SCHEDULE] Ошибка в check_weekend_schedule: {e}", exc_info=True)
+        return None
+
+
+def premiere_reminder_candidates(now):
+    """Чаты для напоминания о премьерах: планов в кино на пт-вс нет, напоминания на этой неделе не было"""
+    monday, sunday = _week_bounds(now)
+    friday = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)  # Завтра пятница
+    rows = _select_candidates(f'''
+        SELECT c.chat_id, l.value AS last_date
+        FROM (SELECT DISTINCT chat_id FROM movies) c
+        LEFT JOIN settings l ON l.chat_id = c.chat_id AND l.key = 'last_cinema_reminder_date'
+        WHERE {_WEEKLY_CHAT_FILTERS}
+        AND NOT EXISTS (
+            SELECT 1 FROM plans p WHERE p.chat_id = c.chat_id AND p.plan_type = 'cinema'
+            AND p.plan_datetime >= %(start)s AND p.plan_datetime <= %(end)s
+        )
+    ''', {'disabled_key': 'reminder_cinema_premieres_disabled', 'weekly_events': WEEKLY_EVENT_TYPES,
+          'monday': monday, 'sunday': sunday, 'start': friday, 'end': friday + timedelta(days=2)})
+    return [row['chat_id'] for row in rows
+            if not (_setting_date(row['last_date']) and _setting_date(row['last_date']) >= monday)]
+
+
+def check_premiere_reminder(dry_run=False):
+    """Проверяет, нет ли планов в кинотеатре на выходные, и отправляет напоминание с кнопками-премьерами.
+    ПРИОРИТЕТ 2: Выполняется только в четверг. Если на текущей неделе уже было уведомление, не отправляет."""
+    from moviebot.api.kinopoisk_api import get_premieres_for_period
+
+    if not bot:
+        return None
+
+    try:
+        now = datetime.now(PLANS_TZ)
+        # Проверяем только в четверг (3 = четверг)
+        if now.weekday() != 3 and not dry_run:
+            return None
+
+        chat_ids = premiere_reminder_candidates(now)
+        if dry_run:
+            return Broadcaster().run('premiere_reminder', chat_ids, None, dry_run=True)
+        if not chat_ids:
+            return None
+
+        # Премьеры одни на всех — запрашиваем один раз за рассылку
+        premieres = get_premieres_for_period('current_month')
+
+        text = "🎬 На выходные (пятница, суббота, воскресенье) нет запланированных походов в кино!\n\n"
+        text += "Посмотрите, какие премьеры сейчас идут:"
+
+        markup = InlineKeyboardMarkup(row_width=1)
+
+        # Добавляем кнопки с несколькими премьерами (до 5)
+        if premieres:
+            for i, p in enumerate(premieres[:5], 1):
+                kp_id = p.get('kinopoiskId') or p.get('filmId')
+                title = p.get('nameRu') or p.get('nameOriginal') or 'Без названия'
+                year = p.get('year') or ''
+
+                if kp_id:
+                    button_text = f"{i}. {title}"
+                    if year:
+                        button_text += f" ({year})"
+                    if len(button_text) > 50:
+                        button_text = button_text[:47] + "..."
+                    markup.add(InlineKeyboardButton(button_text, callback_data=f"premiere_detail:{kp_id}:current_month"))
+
+        # Добавляем общую кнопку "Все премьеры"
+        markup.add(InlineKeyboardButton("📅 Все премьеры", callback_data="start_menu:premieres"))
+        markup.add(InlineKeyboardButton("⏰ Настройки напоминаний", callback_data="settings:notifications"))
+        markup.add(InlineKeyboardButton("❌ Отменить такие уведомления", callback_data="reminder:disable:cinema_premieres"))
+
+        def send(chat_id):
+            bot.send_message(chat_id, text, reply_markup=markup, parse_mode='HTML')
+
+        result = Broadcaster().run('premiere_reminder', chat_ids, send)
+        _record_sent(result.sent_chats, 'premiere_reminder', 'last_cinema_reminder_date', now.date())
+        return result
+    except Exception as e:
+        logger.error(f"[PREMIERE REMINDER] Ошибка в check_premiere_reminder: {e}", exc_info=True)
+        return None
+
+
+RandomEventCandidate = namedtuple('RandomEventCandidate', ('participant_event', 'last_dice_date', 'active_participants'))
+
+
+def random_event_candidates(now, bot_id=None):
+    """
+    Группы для случайного события: {chat_id: RandomEventCandidate}. participant_event —
+    выбор участника (True) или игра в кубик (False); типы чередуются по датам последнего
+    выбора участника и кубика. last_dice_date и active_participants (писавшие за 30 дней,
+    кроме бота) нужны проверкам кубика — send_dice_game_event их повторно не запрашивает.
+    """
+    monday, sunday = _week_bounds(now)
+    rows = _select_candidates(f'''
+        SELECT c.chat_id, lp.value AS last_participant, ld.value AS last_dice,
+               EXISTS (
+                   SELECT 1 FROM event_notifications x WHERE x.chat_id = c.chat_id AND x.event_type = 'random_event'
+               ) AS had_event,
+               (
+                   SELECT COUNT(DISTINCT s.user_id) FROM stats s
+                   WHERE s.chat_id = c.chat_id AND s.timestamp >= %(active_since)s
+                   AND s.user_id IS DISTINCT FROM %(bot_id)s
+               ) AS active_participants
+        FROM (SELECT DISTINCT chat_id FROM movies WHERE chat_id < 0) c
+        LEFT JOIN settings lp ON lp.chat_id = c.chat_id AND lp.key = 'last_random_participant_date'
+        LEFT JOIN settings ld ON ld.chat_id = c.chat_id AND ld.key = 'last_dice_game_date'
+        WHERE {_WEEKLY_CHAT_FILTERS}
+    ''', {'disabled_key': None, 'weekly_events': WEEKLY_EVENT_TYPES, 'monday': monday, 'sunday': sunday,
+          'active_since': now - timedelta(days=30), 'bot_id': bot_id})
+
+    events = {}
+    for row in rows:
+        last_participant_date = _setting_date(row['last_participant'])
+        last_dice_date = _setting_date(row['last_dice'])
+        # По умолчанию — событие с участником; если последнее было с участником — кубик, и наоборот
+        send_participant_event = True
+        if row['had_event']:
+            if last_participant_date and last_dice_date:
+                send_participant_event = last_dice_date >= last_participant_date
+            elif last_participant_date:
+                send_participant_event = False
+        events[row['chat_id']] = RandomEventCandidate(
+            send_participant_event, last_dice_date, row['active_participants'] or 0)
+    return events
+
+
+def check_and_send_random_events(dry_run=False):
     """Проверяет и отправляет случайные события (ПРИОРИТЕТ 3).
     Работает только в пт/сб/вс, только если на неделе не было других уведомлений.
-    Чередует типы событий: с выбором участника и без (игра в кубик)."""
-    
+    Чередует типы событий: с выбором участника и без (игра в кубик).
+    Группы, включённые события и активные участники берутся из одного запроса
+    random_event_candidates — без bot.get_chat и запросов настроек на каждый чат.
+    Ошибки Telegram из отправки не глотаются: 429 и 403 обрабатывает Broadcaster."""
     if not bot:
-        return
-    
-    conn_local = _scheduler_conn()
-    cursor_local = conn_local.cursor()
-    
+        return None
+
     try:
         now = datetime.now(PLANS_TZ)
-        current_weekday = now.weekday()
-        
         # Проверяем только в пт/сб/вс (4=пятница, 5=суббота, 6=воскресенье)
-        if current_weekday not in [4, 5, 6]:
-            return
-        
-        # Получаем все групповые чаты
-        with db_lock:
-            cursor_local.execute("SELECT DISTINCT chat_id FROM movies")
-            chat_rows = cursor_local.fetchall()
-        
-        for row in chat_rows:
-            chat_id = row.get('chat_id') if isinstance(row, dict) else row[0]
-            
-            # Проверяем, что это групповой чат (не личный)
-            try:
-                chat_info = bot.get_chat(chat_id)
-                if chat_info.type == 'private':
-                    continue
-            except Exception as e:
-                logger.warning(f"[RANDOM EVENTS] Не удалось получить информацию о чате {chat_id}: {e}")
-                continue
-            
-            if not get_random_events_enabled(chat_id):
-                continue
-            
-            # ПРИОРИТЕТ: Проверяем, было ли уже отправлено какое-то уведомление на этой неделе
-            if was_event_sent_this_week(chat_id, ['weekend_reminder', 'premiere_reminder', 'random_event']):
-                logger.info(f"[RANDOM EVENTS] Пропуск чата {chat_id} - уже было отправлено уведомление на этой неделе")
-                continue
-            
-            # Определяем, какой тип события отправить (чередование)
-            # Проверяем, какое событие было последним
-            with db_lock:
-                cursor_local.execute("""
-                    SELECT event_type FROM event_notifications 
-                    WHERE chat_id = %s 
-                    AND event_type = 'random_event'
-                    ORDER BY sent_date DESC 
-                    LIMIT 1
-                """, (chat_id,))
-                last_event_row = cursor_local.fetchone()
-            
-            # Определяем тип события: если последнее было с участником, отправляем кубик, и наоборот
-            send_participant_event = True  # По умолчанию отправляем событие с участником
-            if last_event_row:
-                # Проверяем, было ли последнее событие с участником (по дате последнего выбора участника)
-                with db_lock:
-                    cursor_local.execute(
-                        "SELECT value FROM settings WHERE chat_id = %s AND key = 'last_random_participant_date'",
-                        (chat_id,)
-                    )
-                    last_participant_row = cursor_local.fetchone()
-                    cursor_local.execute(
-                        "SELECT value FROM settings WHERE chat_id = %s AND key = 'last_dice_game_date'",
-                        (chat_id,)
-                    )
-                    last_dice_row = cursor_local.fetchone()
-                
-                last_participant_date = None
-                last_dice_date = None
-                
-                if last_participant_row:
-                    try:
-                        last_participant_date = datetime.strptime(last_participant_row.get('value') if isinstance(last_participant_row, dict) else last_participant_row[0], '%Y-%m-%d').date()
-                    except:
-                        pass
-                
-                if last_dice_row:
-                    try:
-                        last_dice_date = datetime.strptime(last_dice_row.get('value') if isinstance(last_dice_row, dict) else last_dice_row[0], '%Y-%m-%d').date()
-                    except:
-                        pass
-                
-                # Если последнее было с участником, отправляем кубик, и наоборот
-                if last_participant_date and last_dice_date:
-                    # Сравниваем даты: если последнее было с участником (дата больше), отправляем кубик
-                    send_participant_event = last_dice_date >= last_participant_date
-                elif last_participant_date:
-                    send_participant_event = False  # Было с участником, отправляем кубик
-                elif last_dice_date:
-                    send_participant_event = True  # Был кубик, отправляем с участником
-                # Если нет ни одного события, send_participant_event остается True (по умолчанию)
-            
-            # Отправляем соответствующее событие
-            if send_participant_event:
-                # Отправляем событие с выбором участника (собственное соединение — без путаницы с курсором цикла)
-                _send_random_participant_event(chat_id, now)
-            else:
-                # Отправляем событие с игрой в кубик
-                from moviebot.utils.random_events import send_dice_game_event
-                if send_dice_game_event(chat_id, skip_checks=False):
-                    mark_event_sent(chat_id, 'random_event')
-                    with db_lock:
-                        cursor_local.execute('''
-                            INSERT INTO settings (chat_id, key, value)
-                            VALUES (%s, 'last_dice_game_date', %s)
-                            ON CONFLICT (chat_id, key) DO UPDATE SET value = EXCLUDED.value
-                        ''', (chat_id, now.date().isoformat()))
-                        conn_local.commit()
-                    logger.info(f"[RANDOM EVENTS] Отправлено событие с кубиком для чата {chat_id}")
+        if now.weekday() not in [4, 5, 6] and not dry_run:
+            return None
+
+        from moviebot.bot.bot_init import BOT_ID
+        events = random_event_candidates(now, BOT_ID)
+        from moviebot.utils.random_events import send_dice_game_event
+
+        def send(chat_id):
+            candidate = events[chat_id]
+            if candidate.participant_event:
+                # Событие с выбором участника отмечает себя само
+                return _send_random_participant_event(chat_id, now)
+            return send_dice_game_event(chat_id, candidate=candidate)
+
+        result = Broadcaster().run('random_event', list(events), send, dry_run=dry_run)
+        dice_chats = [chat_id for chat_id in result.sent_chats if not events[chat_id].participant_event]
+        _record_sent(dice_chats, 'random_event', 'last_dice_game_date', now.date())
+        return result
     except Exception as e:
         logger.error(f"[RANDOM EVENTS] Ошибка в check_and_send_random_events: {e}", exc_info=True)
-    finally:
-        try:
-            cursor_local.close()
-        except:
-            pass
-        try:
-            conn_local.close()
-        except:
-            pass
+        return None
 
 
 def _send_random_participant_event(chat_id, now):
-    """Отправка события с выбором случайного участника. Собственное соединение к БД — только этот чат, без путаницы с курсором в цикле по чатам."""
+    """Отправка события с выбором случайного участника. Собственное соединение к БД — только этот чат, без путаницы с курсором в цикле по чатам.
+    Возвращает False, если выбрать некого; ошибки отправки поднимаются в Broadcaster (там 429, 403 и счётчик ошибок)."""
     conn_own = None
     cur_own = None
     try:
@@ -3169,9 +2943,6 @@ def _send_random_participant_event(chat_id, now):
 
         logger.info(f"[RANDOM EVENTS] Отправлено событие: чат {chat_id}, выбранный участник user_id={selected_user_id}, callback_data={callback_payload!r}")
         return True
-    except Exception as e:
-        logger.error(f"[RANDOM EVENTS] Ошибка при отправке события с участником: {e}", exc_info=True)
-        return False
     finally:
         if cur_own:
             try:
@@ -3857,209 +3628,84 @@ def check_onboarding_extension_1_2_films():
             pass
 
 
-def check_unwatched_films_notification():
+def unwatched_films_candidates(now_utc):
+    """
+    Чаты для напоминания о непросмотренных фильмах: больше 5 непросмотренных, сегодня
+    уведомлений не было, у кого-то из пользователей чата (личный чат — сам пользователь,
+    группа — писавшие в stats) сейчас 14:00–22:00 и с прошлого напоминания прошло 8–12 дней
+    (в этом интервале — с вероятностью 20%) или больше. {chat_id: число непросмотренных}
+    """
+    today = now_utc.date()
+    default_tz = pytz.timezone('Europe/Moscow')
+    rows = _select_candidates(f'''
+        WITH unwatched AS (
+            SELECT chat_id, COUNT(*) AS unwatched_count FROM movies
+            WHERE watched = 0 GROUP BY chat_id HAVING COUNT(*) > 5
+        ), members AS (
+            SELECT DISTINCT chat_id AS user_id, chat_id FROM movies WHERE chat_id > 0
+            UNION
+            SELECT DISTINCT user_id, chat_id FROM stats WHERE user_id IS NOT NULL AND chat_id < 0
+        )
+        SELECT c.chat_id, c.unwatched_count, l.value AS last_date,
+               ARRAY_AGG(DISTINCT COALESCE(tz.value, '')) AS timezones
+        FROM unwatched c
+        JOIN members mb ON mb.chat_id = c.chat_id
+        LEFT JOIN settings tz ON tz.chat_id = mb.user_id AND tz.key = 'user_timezone'
+        LEFT JOIN settings l ON l.chat_id = c.chat_id AND l.key = 'last_unwatched_films_notification_date'
+        WHERE {_BROADCAST_CHAT_FILTERS}
+        AND NOT EXISTS (SELECT 1 FROM event_notifications e WHERE e.chat_id = c.chat_id AND e.sent_date = %(today)s)
+        GROUP BY c.chat_id, c.unwatched_count, l.value
+    ''', {'disabled_key': 'reminder_unwatched_films_disabled', 'today': today})
+
+    candidates = {}
+    for row in rows:
+        # Во второй половине дня, но не слишком поздно (до 22:00, чтобы не мешать спать)
+        if not any(14 <= now_utc.astimezone(timezone_from_setting(name) or default_tz).hour < 22
+                   for name in row['timezones']):
+            continue
+        last_date = _setting_date(row['last_date'])
+        if last_date:
+            days_since = (today - last_date).days
+            # Примерно раз в 10 дней (8-12 дней - случайный интервал, в нём с вероятностью 1/5)
+            if days_since < 8 or (days_since <= 12 and random.random() >= 0.2):
+                continue
+        candidates[row['chat_id']] = row['unwatched_count']
+    return candidates
+
+
+def check_unwatched_films_notification(dry_run=False):
     """Проверяет и отправляет уведомления о непросмотренных фильмах пользователям с более чем 5 фильмами.
     ПРИОРИТЕТ 4 (ниже остальных): Выполняется только в воскресенье или вторник, после 14:00 по местному времени.
     Примерно раз в 10 дней, не более 1 сообщения в день."""
-    
     if not bot:
-        return
-    
-    conn_local = _scheduler_conn()
-    cursor_local = conn_local.cursor()
-    
+        return None
+
     try:
         now_utc = datetime.now(PLANS_TZ)
-        current_weekday = now_utc.weekday()
-        
         # Проверяем только в воскресенье (6) или вторник (1)
-        if current_weekday not in [1, 6]:  # 1=вторник, 6=воскресенье
-            return
-        
-        # Получаем всех уникальных пользователей из таблицы movies
-        # Используем chat_id = user_id для личных чатов, либо user_id из stats для групповых
-        with db_lock:
-            # Получаем пользователей из личных чатов (chat_id = user_id)
-            cursor_local.execute("""
-                SELECT DISTINCT chat_id as user_id, chat_id as chat_id
-                FROM movies
-                WHERE chat_id > 0
-            """)
-            personal_users = cursor_local.fetchall()
-            
-            # Получаем пользователей из групповых чатов
-            cursor_local.execute("""
-                SELECT DISTINCT user_id, chat_id
-                FROM stats
-                WHERE user_id IS NOT NULL AND chat_id < 0
-            """)
-            group_users = cursor_local.fetchall()
-        
-        all_users = []
-        for row in personal_users:
-            if isinstance(row, dict):
-                all_users.append((row.get('user_id'), row.get('chat_id')))
-            else:
-                all_users.append((row[0], row[0]))
-        
-        for row in group_users:
-            if isinstance(row, dict):
-                all_users.append((row.get('user_id'), row.get('chat_id')))
-            else:
-                all_users.append((row[0], row[1]))
-        
-        # Убираем дубликаты
-        all_users = list(set(all_users))
-        
-        for user_id, chat_id in all_users:
-            try:
-                # Проверяем, что это валидный пользователь
-                if not user_id or not chat_id:
-                    continue
-                
-                # Проверяем часовой пояс пользователя
-                user_tz = get_user_timezone_or_default(user_id)
-                now_user = now_utc.astimezone(user_tz)
-                
-                # Проверяем, что время во второй половине дня (после 14:00)
-                if now_user.hour < 14:
-                    continue
-                
-                # Проверяем, не слишком поздно (до 22:00, чтобы не мешать спать)
-                if now_user.hour >= 22:
-                    continue
-                
-                # Проверяем, не отключены ли уведомления о непросмотренных фильмах
-                with db_lock:
-                    cursor_local.execute("""
-                        SELECT value FROM settings 
-                        WHERE chat_id = %s AND key = 'reminder_unwatched_films_disabled'
-                    """, (chat_id,))
-                    reminder_disabled_row = cursor_local.fetchone()
-                if reminder_disabled_row:
-                    is_disabled = reminder_disabled_row.get('value') if isinstance(reminder_disabled_row, dict) else reminder_disabled_row[0]
-                    if is_disabled == 'true':
-                        continue
-                
-                # Проверяем, не было ли сегодня других уведомлений
-                today = now_utc.date()
-                with db_lock:
-                    cursor_local.execute("""
-                        SELECT id FROM event_notifications 
-                        WHERE chat_id = %s 
-                        AND sent_date = %s
-                    """, (chat_id, today))
-                    today_notifications = cursor_local.fetchone()
-                
-                if today_notifications:
-                    continue
-                
-                # Проверяем, когда последний раз отправлялось это уведомление
-                with db_lock:
-                    cursor_local.execute("""
-                        SELECT value FROM settings 
-                        WHERE chat_id = %s AND key = 'last_unwatched_films_notification_date'
-                    """, (chat_id,))
-                    last_date_row = cursor_local.fetchone()
-                
-                should_send = True
-                if last_date_row:
-                    last_date_str = last_date_row.get('value') if isinstance(last_date_row, dict) else last_date_row[0]
-                    try:
-                        last_date = datetime.strptime(last_date_str, '%Y-%m-%d').date()
-                        days_since = (today - last_date).days
-                        # Отправляем примерно раз в 10 дней (8-12 дней - случайный интервал)
-                        if days_since < 8:
-                            should_send = False
-                        elif days_since > 12:
-                            should_send = True
-                        else:
-                            # В интервале 8-12 дней отправляем с вероятностью 1/5 (20%)
-                            import random
-                            should_send = random.random() < 0.2
-                    except:
-                        pass
-                
-                if not should_send:
-                    continue
-                
-                # Проверяем количество непросмотренных фильмов (watched = FALSE)
-                # Работает и для личных чатов, и для групповых
-                unwatched_count = 0
-                conn_count = _scheduler_conn()
-                cursor_count = None
-                try:
-                    with db_lock:
-                        cursor_count = conn_count.cursor()
-                        cursor_count.execute("""
-                            SELECT COUNT(*) FROM movies
-                            WHERE chat_id = %s AND watched = FALSE
-                        """, (chat_id,))
-                        count_row = cursor_count.fetchone()
-                    unwatched_count = count_row.get('count') if isinstance(count_row, dict) else (count_row[0] if count_row else 0)
-                finally:
-                    if cursor_count:
-                        try:
-                            cursor_count.close()
-                        except:
-                            pass
-                    try:
-                        conn_count.close()
-                    except:
-                        pass
-                
-                # Отправляем только если более 5 непросмотренных фильмов
-                if unwatched_count <= 5:
-                    continue
-                
-                # Отправляем уведомление
-                try:
-                    text = "👋🏻 Привет!\n\n"
-                    text += "У вас есть несколько фильмов, которые вы пока не посмотрели. Может, пора выбрать один из них?"
-                    
-                    # Создаем кнопки: рандом по базе и отключение уведомлений
-                    welcome_markup = InlineKeyboardMarkup(row_width=1)
-                    welcome_markup.add(InlineKeyboardButton("🎲 Рандом по базе", callback_data="rand_mode:database"))
-                    welcome_markup.add(InlineKeyboardButton("❌ Отключить такие уведомления", callback_data="reminder:disable:unwatched_films"))
-                    
-                    bot.send_message(
-                        chat_id,
-                        text,
-                        reply_markup=welcome_markup,
-                        parse_mode='HTML'
-                    )
-                    
-                    # Отмечаем событие
-                    mark_event_sent(chat_id, 'unwatched_films_notification')
-                    
-                    # Сохраняем дату последнего уведомления
-                    with db_lock:
-                        cursor_local.execute('''
-                            INSERT INTO settings (chat_id, key, value)
-                            VALUES (%s, 'last_unwatched_films_notification_date', %s)
-                            ON CONFLICT (chat_id, key) DO UPDATE SET value = EXCLUDED.value
-                        ''', (chat_id, today.isoformat()))
-                        conn_local.commit()
-                    
-                    logger.info(f"[UNWATCHED FILMS] Отправлено уведомление пользователю {user_id} в чат {chat_id} (непросмотренных: {unwatched_count})")
-                except Exception as e:
-                    logger.error(f"[UNWATCHED FILMS] Ошибка отправки уведомления пользователю {user_id}: {e}", exc_info=True)
-            
-            except Exception as e:
-                logger.error(f"[UNWATCHED FILMS] Ошибка обработки пользователя {user_id}: {e}", exc_info=True)
-                continue
-    
+        if now_utc.weekday() not in [1, 6] and not dry_run:
+            return None
+
+        candidates = unwatched_films_candidates(now_utc)
+
+        text = "👋🏻 Привет!\n\n"
+        text += "У вас есть несколько фильмов, которые вы пока не посмотрели. Может, пора выбрать один из них?"
+
+        # Кнопки: рандом по базе и отключение уведомлений
+        welcome_markup = InlineKeyboardMarkup(row_width=1)
+        welcome_markup.add(InlineKeyboardButton("🎲 Рандом по базе", callback_data="rand_mode:database"))
+        welcome_markup.add(InlineKeyboardButton("❌ Отключить такие уведомления", callback_data="reminder:disable:unwatched_films"))
+
+        def send(chat_id):
+            bot.send_message(chat_id, text, reply_markup=welcome_markup, parse_mode='HTML')
+
+        result = Broadcaster().run('unwatched_films_notification', list(candidates), send, dry_run=dry_run)
+        _record_sent(result.sent_chats, 'unwatched_films_notification', 'last_unwatched_films_notification_date',
+                     now_utc.date())
+        return result
     except Exception as e:
         logger.error(f"[UNWATCHED FILMS] Ошибка в check_unwatched_films_notification: {e}", exc_info=True)
-    finally:
-        try:
-            cursor_local.close()
-        except:
-            pass
-        try:
-            conn_local.close()
-        except:
-            pass
+        return None
 
 
 def check_monthly_mvp_and_notify():
@@ -4154,22 +3800,33 @@ def check_monthly_mvp_and_notify():
 
 
 def update_series_status_cache():
-    """Фоновая задача: обновляет статусы сериалов раз в день"""
+    """
+    Фоновая задача: обновляет статусы сериалов раз в день.
+
+    Статус хранится в общем каталоге films, поэтому на каждый сериал уходит
+    один набор запросов к API, сколько бы чатов его ни добавили; затем кэш
+    одним UPDATE раскладывается во все строки movies с этим kp_id. Число
+    эпизодов сохраняется в series_episode_counts (его читает /stats).
+    """
     logger.info("[CACHE] Запуск обновления кэша сериалов")
-    
-    conn_local = None
-    cursor_local = None
-    
+    from moviebot.database.db_connection import db_connection
+    from moviebot.database.film_catalog import save_series_episode_count, upsert_series_status
+
     try:
-        conn_local = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        cursor_local = conn_local.cursor()
-        
-        with db_lock:
+        with db_connection() as conn_local:
+            cursor_local = conn_local.cursor()
+            # Сначала те, что не обновлялись дольше всех: каждая попытка (и с пустым ответом API)
+            # отмечается, поэтому одни и те же 30 сериалов не занимают выборку каждый день
             cursor_local.execute("""
-                SELECT DISTINCT kp_id, chat_id
-                FROM movies
-                WHERE is_series = 1
-                  AND (last_api_update IS NULL OR last_api_update < NOW() - INTERVAL '1 day')
+                SELECT s.kp_id
+                FROM (
+                    SELECT DISTINCT kp_id FROM movies WHERE is_series = 1 AND kp_id IS NOT NULL
+                ) s
+                LEFT JOIN films f ON f.kp_id = s.kp_id
+                LEFT JOIN series_episode_counts ec ON ec.kp_id = s.kp_id
+                WHERE f.last_api_update IS NULL OR f.last_api_update < NOW() - INTERVAL '1 day'
+                   OR ec.kp_id IS NULL
+                ORDER BY GREATEST(f.last_api_update, ec.updated_at) NULLS FIRST, s.kp_id
                 LIMIT 30
             """)
             rows = cursor_local.fetchall()
@@ -4180,11 +3837,6 @@ def update_series_status_cache():
 
         for row in rows:
             kp_id = row['kp_id']
-            chat_id = row['chat_id']
-            
-            if kp_id is None:
-                logger.warning(f"[CACHE] Пропущена запись с kp_id=None: {row}")
-                continue
             
             try:
                 # Основная логика: получаем актуальные данные из Kinopoisk API
@@ -4200,53 +3852,37 @@ def update_series_status_cache():
                 else:
                     next_ep_json = json.dumps(next_ep) if next_ep else None
 
-                # Обновляем — отдельный короткий conn + lock
-                conn_update = psycopg2.connect(DATABASE_URL)
-                cursor_update = conn_update.cursor()
+                # Обновляем каталог и все чаты с этим сериалом — одна короткая транзакция
                 try:
-                    with db_lock:
+                    with db_connection() as conn_update:
+                        cursor_update = conn_update.cursor()
+                        upsert_series_status(cursor_update, kp_id, is_airing, seasons_count, next_ep_json)
+                        save_series_episode_count(cursor_update, kp_id, seasons_data)
                         cursor_update.execute("""
                             UPDATE movies
                             SET is_ongoing = %s, 
                                 seasons_count = %s, 
                                 next_episode = %s, 
                                 last_api_update = NOW()
-                            WHERE chat_id = %s AND kp_id = %s
-                        """, (is_airing, seasons_count, next_ep_json, chat_id, kp_id))
-                    conn_update.commit()
+                            WHERE kp_id = %s
+                        """, (is_airing, seasons_count, next_ep_json, kp_id))
+                        chats_updated = cursor_update.rowcount
                 except Exception as db_e:
                     logger.error(f"[CACHE] Ошибка при обновлении сериала {kp_id}: {db_e}", exc_info=True)
-                    try:
-                        conn_update.rollback()
-                    except:
-                        pass
-                finally:
-                    try:
-                        cursor_update.close()
-                    except:
-                        pass
-                    try:
-                        conn_update.close()
-                    except:
-                        pass
+                    continue
                 
-                logger.info(f"[CACHE] Обновлён кэш для kp_id={kp_id} (chat_id={chat_id}), seasons={seasons_count}, ongoing={is_airing}")
+                logger.info(f"[CACHE] Обновлён кэш для kp_id={kp_id} (чатов: {chats_updated}), seasons={seasons_count}, ongoing={is_airing}")
 
             except Exception as e:
-                logger.error(f"[CACHE] Ошибка обновления kp_id={kp_id} (chat_id={chat_id}): {e}", exc_info=True)
+                logger.error(f"[CACHE] Ошибка обновления kp_id={kp_id}: {e}", exc_info=True)
+                # Отмечаем попытку, чтобы сериал ушёл в конец очереди обновления
+                try:
+                    with db_connection() as conn_attempt:
+                        save_series_episode_count(conn_attempt.cursor(), kp_id, None)
+                except Exception as db_e:
+                    logger.warning(f"[CACHE] Не удалось отметить попытку для kp_id={kp_id}: {db_e}")
         
         logger.info("[CACHE] Обновление кэша сериалов завершено")
         
     except Exception as e:
         logger.error(f"[CACHE] Глобальная ошибка в update_series_status_cache: {e}", exc_info=True)
-    finally:
-        if cursor_local:
-            try:
-                cursor_local.close()
-            except:
-                pass
-        if conn_local:
-            try:
-                conn_local.close()
-            except:
-                pass
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Движок вечных ачивок профиля.
+
+notify_new_achievements вызывается после каждой оценки, просмотра, серии, похода в кино и плана.
+Раньше он пересчитывал весь профиль (_get_user_profile_and_achievements — десяток запросов по
+всей истории пользователя) и затем проверял _onboarding_was_sent отдельным запросом на каждую ачивку.
+
+Теперь счётчики берутся из строки stats_profile_rollups — тех же вечных счётчиков профиля,
+что читает сайт (api/site_stats.py). Триггеры роллапов повышают её version при изменениях
+в ratings, watched_movies, series_tracking, cinema_screenings, plans, mvp_history и movies;
+устаревшая строка пересчитывается одним запросом. Полученные (earned) и уже объявленные
+пользователю (notified) ачивки хранятся в той же строке, так что у «полученных» один источник.
+"""
+import logging
+from datetime import datetime
+
+import pytz
+
+from moviebot.database.db_connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+# Счётчики строки stats_profile_rollups, от которых зависят ачивки
+COUNTERS = (
+    'total_films', 'total_series', 'total_ratings', 'total_cinema', 'completed_series', 'total_episodes',
+    'unique_genres', 'total_plans', 'mvp_count', 'first_activity', 'year_streak',
+)
+
+# Поле профиля из PERSONAL_ACHIEVEMENTS_DEF → счётчик
+PROFILE_KEY_COUNTERS = {
+    'total_films_alltime': 'total_films',
+    'total_ratings_alltime': 'total_ratings',
+    'total_cinema_alltime': 'total_cinema',
+    'completed_series_alltime': 'completed_series',
+    'total_episodes_alltime': 'total_episodes',
+    'unique_genres_alltime': 'unique_genres',
+    'total_plans_alltime': 'total_plans',
+}
+COLLECTOR = {
+    'id': 'collector', 'icon': '🎖️', 'name': 'Коллекционер', 'description': '10 ачивок получено',
+    'rarity': 'rare', 'counter': None, 'target': 10,
+}
+
+_definitions = None
+
+
+def achievement_definitions():
+    """Ачивки профиля со счётчиком и порогом (из PERSONAL_ACHIEVEMENTS_DEF + «Коллекционер»)"""
+    global _definitions
+    if _definitions is None:
+        from moviebot.api.site_stats import PERSONAL_ACHIEVEMENTS_DEF
+        defs = []
+        for ach_id, icon, name, desc, rarity, cond in PERSONAL_ACHIEVEMENTS_DEF:
+            if cond is not None:
+                target, key = cond
+                counter = PROFILE_KEY_COUNTERS[key]
+            else:
+                # Особые ачивки (year_streak, oldtimer, mvp_legend) — см. is_earned
+                counter, target = None, None
+            defs.append({'id': ach_id, 'icon': icon, 'name': name, 'description': desc, 'rarity': rarity,
+                         'counter': counter, 'target': target})
+        defs.append(dict(COLLECTOR))
+        _definitions = defs
+    return _definitions
+
+
+def months_since(first_activity, now):
+    if not first_activity:
+        return 0
+    if first_activity.tzinfo is None:
+        first_activity = pytz.UTC.localize(first_activity)
+    return max(0, (now.year - first_activity.year) * 12 + (now.month - first_activity.month))
+
+
+def is_earned(ach, counters, now):
+    """Условие одной ачивки (кроме «Коллекционера») по счётчикам"""
+    if ach['counter'] is not None:
+        return (counters.get(ach['counter']) or 0) >= ach['target']
+    if ach['id'] == 'year_streak':
+        return bool(counters.get('year_streak'))
+    if ach['id'] == 'oldtimer':
+        return months_since(counters.get('first_activity'), now) >= 12
+    if ach['id'] == 'mvp_legend':
+        return (counters.get('mvp_count') or 0) >= 6
+    return False
+
+
+def evaluate_achievements(counters, now):
+    """Множество полученных ачивок по счётчикам строки профиля (с «Коллекционером»)"""
+    earned = {ach['id'] for ach in achievement_definitions()
+              if ach['id'] != COLLECTOR['id'] and is_earned(ach, counters, now)}
+    if len(earned) >= COLLECTOR['target']:
+        earned.add(COLLECTOR['id'])
+    return earned
+
+
+def evaluate_user(user_id, now=None):
+    """
+    Пересчитывает строку профиля, если она устарела, и возвращает определения ачивок, которые
+    получены, но ещё не объявлены (по порядку определения). Первая проверка переносит
+    отметки achievement_notified_* из settings.
+    """
+    from moviebot.api.site_stats import _refresh_profile_rollup_row
+
+    now = now or datetime.now(pytz.UTC)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (f'stats_profile:{user_id}',))
+        cur.execute("""
+            INSERT INTO stats_profile_rollups (user_id) VALUES (%s)
+            ON CONFLICT (user_id) DO NOTHING
+        """, (user_id,))
+        cur.execute("SELECT * FROM stats_profile_rollups WHERE user_id = %s", (user_id,))
+        row = cur.fetchone()
+        stale = row['version'] > row['refreshed_version']
+        if stale:
+            row = _refresh_profile_rollup_row(cur, user_id)
+        notified = set(row['notified'] or [])
+        if row['earned'] is None:
+            cur.execute("""
+                SELECT substr(key, 22) AS ach_id FROM settings
+                WHERE chat_id = %s AND key LIKE 'achievement\\_notified\\_%%' AND value IN ('1', 'true')
+            """, (user_id,))
+            notified |= {r['ach_id'] for r in cur.fetchall()}
+        earned = evaluate_achievements(row, now)
+        if row['earned'] is None or earned != set(row['earned']):
+            cur.execute("""
+                UPDATE stats_profile_rollups SET earned = %s::text[], notified = %s::text[]
+                WHERE user_id = %s
+            """, (sorted(earned), sorted(notified), user_id))
+    if stale:
+        logger.debug(f"[ACHIEVEMENTS] user_id={user_id}: профиль пересчитан, получено {len(earned)}")
+    return [ach for ach in achievement_definitions() if ach['id'] in earned and ach['id'] not in notified]
+
+
+def mark_notified(user_id, ach_ids):
+    """Отмечает ачивки объявленными (после успешной отправки уведомления)"""
+    if not ach_ids:
+        return
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE stats_profile_rollups
+            SET notified = ARRAY(SELECT DISTINCT unnest(notified || %s::text[]))
+            WHERE user_id = %s
+        """, (list(ach_ids), user_id))
@@ -0,0 +1,164 @@
+"""
+Фабрика FAISS-индексов для семантического поиска Шазама.
+
+Точный IndexFlatL2 (tmdb_index.faiss) остаётся источником векторов: из него
+без повторной генерации эмбеддингов строится приближённый индекс выбранного типа.
+Обученный индекс и параметры поиска сохраняются рядом:
+    tmdb_index.<тип>.faiss  +  tmdb_index.<тип>.json
+и при следующем запуске загружаются, если совпадают тип, параметры, размерность
+и количество векторов.
+
+Типы (SHAZAM_INDEX_TYPE):
+    flat      — точный перебор (как раньше)
+    ivf_flat  — инвертированные списки, полные векторы
+    hnsw      — граф HNSW, без обучения
+    ivf_pq    — инвертированные списки + product quantization (минимум памяти)
+    auto      — flat, если векторов меньше SHAZAM_ANN_MIN_VECTORS, иначе ivf_flat
+"""
+import json
+import logging
+import math
+import os
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq')
+
+SHAZAM_INDEX_TYPE = os.getenv('SHAZAM_INDEX_TYPE', 'auto').strip().lower()
+# На маленьком датасете перебор быстрее и точнее любого ANN — остаёмся на flat
+ANN_MIN_VECTORS = int(os.getenv('SHAZAM_ANN_MIN_VECTORS', '50000'))
+AUTO_INDEX_TYPE = 'ivf_flat'
+
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def resolve_index_type(requested, ntotal, min_vectors=ANN_MIN_VECTORS):
+    """Итоговый тип индекса с учётом auto и размера датасета"""
+    requested = (requested or 'auto').lower()
+    if requested == 'auto':
+        requested = AUTO_INDEX_TYPE if ntotal >= min_vectors else 'flat'
+    if requested not in INDEX_TYPES:
+        logger.warning(f"[ANN INDEX] Неизвестный тип индекса '{requested}', используем flat")
+        return 'flat'
+    if requested != 'flat' and ntotal < min_vectors:
+        logger.info(f"[ANN INDEX] Векторов {ntotal} < {min_vectors} — используем flat вместо {requested}")
+        return 'flat'
+    return requested
+
+
+def default_params(index_type, ntotal, dim):
+    """Параметры построения и поиска; каждый можно переопределить переменной окружения"""
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        # ~4*sqrt(N) списков, но не меньше 39 векторов на центроид для обучения k-means
+        nlist = _env_int('SHAZAM_IVF_NLIST') or max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+        params = {'nlist': nlist, 'nprobe': _env_int('SHAZAM_IVF_NPROBE') or min(nlist, 16)}
+        if index_type == 'ivf_pq':
+            pq_m = _env_int('SHAZAM_PQ_M') or next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0)
+            params.update({'pq_m': pq_m, 'pq_nbits': 8})
+        return params
+    if index_type == 'hnsw':
+        return {
+            'hnsw_m': _env_int('SHAZAM_HNSW_M') or 32,
+            'ef_construction': _env_int('SHAZAM_HNSW_EF_CONSTRUCTION') or 80,
+            'ef_search': _env_int('SHAZAM_HNSW_EF_SEARCH') or 64,
+        }
+    return {}
+
+
+def create_index(index_type, vectors, params):
+    """Строит (и при необходимости обучает) индекс по векторам float32"""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    dim = vectors.shape[1]
+    if index_type == 'flat':
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == 'ivf_flat':
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, params['nlist'])
+    elif index_type == 'ivf_pq':
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, params['nlist'], params['pq_m'], params['pq_nbits'])
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, params['hnsw_m'])
+        index.hnsw.efConstruction = params['ef_construction']
+    else:
+        raise ValueError(f"Неизвестный тип индекса: {index_type}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, params)
+    return index
+
+
+def apply_search_params(index, params):
+    """Параметры поиска не хранятся в файле faiss — выставляем после загрузки"""
+    if 'nprobe' in params and hasattr(index, 'nprobe'):
+        index.nprobe = params['nprobe']
+    if 'ef_search' in params and hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = params['ef_search']
+
+
+def ann_paths(flat_path, index_type):
+    flat_path = Path(flat_path)
+    return (
+        flat_path.with_name(f"{flat_path.stem}.{index_type}.faiss"),
+        flat_path.with_name(f"{flat_path.stem}.{index_type}.json"),
+    )
+
+
+def _load_saved(index_path, meta_path, expected_meta):
+    if not index_path.exists() or not meta_path.exists():
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if any(meta.get(key) != value for key, value in expected_meta.items()):
+            logger.info(f"[ANN INDEX] Параметры {index_path.name} устарели, пересобираем")
+            return None
+        index = faiss.read_index(str(index_path))
+        apply_search_params(index, meta['params'])
+        return index
+    except Exception as e:
+        logger.warning(f"[ANN INDEX] Не удалось загрузить {index_path}: {e}")
+        return None
+
+
+def select_search_index(flat_index, flat_path, index_type=None, min_vectors=ANN_MIN_VECTORS):
+    """
+    Возвращает индекс для поиска: сам flat_index или приближённый индекс,
+    загруженный с диска либо построенный из векторов flat_index.
+    При любой ошибке остаётся точный индекс.
+    """
+    ntotal, dim = flat_index.ntotal, flat_index.d
+    resolved = resolve_index_type(index_type or SHAZAM_INDEX_TYPE, ntotal, min_vectors)
+    if resolved == 'flat':
+        return flat_index
+
+    params = default_params(resolved, ntotal, dim)
+    # mtime точного индекса: после пересборки эмбеддингов сохранённый ANN-индекс устаревает
+    source_mtime = int(Path(flat_path).stat().st_mtime) if Path(flat_path).exists() else None
+    expected_meta = {'index_type': resolved, 'params': params, 'ntotal': ntotal, 'dim': dim, 'source_mtime': source_mtime}
+    index_path, meta_path = ann_paths(flat_path, resolved)
+
+    index = _load_saved(index_path, meta_path, expected_meta)
+    if index is not None:
+        logger.info(f"[ANN INDEX] Загружен {resolved} индекс: {index_path.name}, параметры={params}")
+        return index
+
+    try:
+        started = time.time()
+        vectors = flat_index.reconstruct_n(0, ntotal)
+        index = create_index(resolved, vectors, params)
+        faiss.write_index(index, str(index_path))
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(expected_meta, build_seconds=round(time.time() - started, 2)), f, indent=2)
+        logger.info(f"[ANN INDEX] Построен {resolved} индекс за {time.time() - started:.1f}с, параметры={params}")
+        return index
+    except Exception as e:
+        logger.error(f"[ANN INDEX] Ошибка построения {resolved} индекса, используем flat: {e}", exc_info=True)
+        return flat_index
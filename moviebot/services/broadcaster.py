@@ -0,0 +1,190 @@
+"""
+Рассылка уведомлений планировщика по многим чатам.
+
+Раньше задачи scheduler.py отправляли сообщения по одному в цикле: время рассылки росло
+вместе с числом чатов, а 429 от Telegram просто попадал в лог как ошибка отправки.
+
+- сообщения отправляет пул потоков (BROADCAST_WORKERS) под общим лимитом Telegram
+  (BROADCAST_RATE_PER_SECOND сообщений в секунду на бота) и лимитом на чат: не чаще раза
+  в секунду в личку и раза в BROADCAST_GROUP_INTERVAL секунд в группу;
+- на 429 отправка повторяется через retry_after, и весь пул ждёт столько же;
+- чаты, где бот заблокирован или исключён (403), собираются за рассылку и одной вставкой
+  помечаются в settings (bot_blocked_by_user) — задачи их больше не выбирают;
+- dry_run не отправляет ничего и возвращает оценку длительности рассылки при текущих
+  лимитах (estimate_duration; например, для 50 000 чатов).
+"""
+import heapq
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+from telebot.apihelper import ApiTelegramException
+
+from moviebot.config import (
+    BROADCAST_WORKERS, BROADCAST_RATE_PER_SECOND, BROADCAST_GROUP_INTERVAL, BROADCAST_MAX_RETRIES
+)
+from moviebot.database.db_connection import db_connection
+from moviebot.utils.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+PRIVATE_INTERVAL = 1.0
+# Средняя длительность sendMessage — для оценки рассылки без отправки
+SEND_LATENCY = 0.15
+
+BroadcastResult = namedtuple('BroadcastResult', (
+    'total', 'sent', 'skipped', 'failed', 'blocked', 'retries', 'elapsed', 'sent_chats', 'dry_run'
+))
+
+_last_results = {}
+_results_lock = threading.Lock()
+
+
+def retry_after(exc):
+    """Секунды из ответа 429 или None, если ошибка другая"""
+    if not isinstance(exc, ApiTelegramException) or exc.error_code != 429:
+        return None
+    parameters = (exc.result_json or {}).get('parameters') or {}
+    return float(parameters.get('retry_after') or 1)
+
+
+def is_blocked_error(exc):
+    """Бот заблокирован пользователем, исключён из группы или аккаунт удалён (403)"""
+    return isinstance(exc, ApiTelegramException) and exc.error_code == 403
+
+
+def mark_chats_blocked(chat_ids):
+    """Одной вставкой помечает чаты как заблокировавшие бота"""
+    if not chat_ids:
+        return
+    with db_connection() as conn:
+        execute_values(conn.cursor(), '''
+            INSERT INTO settings (chat_id, key, value) VALUES %s
+            ON CONFLICT (chat_id, key) DO UPDATE SET value = '1'
+        ''', [(chat_id, 'bot_blocked_by_user', '1') for chat_id in sorted(set(chat_ids))])
+    logger.info(f"[BROADCAST] Помечено заблокировавших бота: {len(set(chat_ids))}")
+
+
+def estimate_duration(count, workers=BROADCAST_WORKERS, rate=BROADCAST_RATE_PER_SECOND, latency=SEND_LATENCY):
+    """
+    Сколько секунд займёт рассылка по count чатам (по одному сообщению): моделирует пул
+    из workers потоков с общим лимитом rate в секунду и временем отправки latency.
+    """
+    interval = 1.0 / rate if rate > 0 else 0.0
+    free_at = [0.0] * max(1, workers)
+    next_slot = 0.0
+    finished = 0.0
+    for _ in range(count):
+        worker_free = heapq.heappop(free_at)
+        start = max(worker_free, next_slot)
+        next_slot = start + interval
+        done = start + latency
+        finished = max(finished, done)
+        heapq.heappush(free_at, done)
+    return finished
+
+
+class Broadcaster:
+    """Рассылка send(chat_id) по списку чатов под лимитами Telegram"""
+
+    def __init__(self, workers=BROADCAST_WORKERS, rate=BROADCAST_RATE_PER_SECOND,
+                 group_interval=BROADCAST_GROUP_INTERVAL, max_retries=BROADCAST_MAX_RETRIES,
+                 clock=time.monotonic, sleep=time.sleep, record_blocked=mark_chats_blocked):
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        self._record_blocked = record_blocked
+        self._limiter = RateLimiter(rate, clock=clock, sleep=sleep)
+        self._chat_next = {}
+        self._chat_lock = threading.Lock()
+
+    def _wait_chat(self, chat_id):
+        interval = PRIVATE_INTERVAL if chat_id > 0 else self.group_interval
+        with self._chat_lock:
+            now = self._clock()
+            slot = max(now, self._chat_next.get(chat_id, 0.0))
+            self._chat_next[chat_id] = slot + interval
+        if slot > now:
+            self._sleep(slot - now)
+
+    def _deliver(self, tag, chat_id, send, counters):
+        """'sent' | 'skipped' | 'blocked' | 'failed'"""
+        for attempt in range(self.max_retries + 1):
+            self._wait_chat(chat_id)
+            self._limiter.wait()
+            try:
+                return 'skipped' if send(chat_id) is False else 'sent'
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is not None and attempt < self.max_retries:
+                    logger.warning(f"[BROADCAST] {tag}: 429 для чата {chat_id}, повтор через {delay} с")
+                    self._limiter.pause(delay)
+                    with self._chat_lock:
+                        counters['retries'] += 1
+                        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), self._clock() + delay)
+                    continue
+                if is_blocked_error(e):
+                    logger.info(f"[BROADCAST] {tag}: бот заблокирован в чате {chat_id}")
+                    return 'blocked'
+                logger.error(f"[BROADCAST] {tag}: ошибка отправки в чат {chat_id}: {e}", exc_info=True)
+                return 'failed'
+        return 'failed'
+
+    def run(self, tag, chat_ids, send, dry_run=False):
+        """
+        Вызывает send(chat_id) для каждого чата (send возвращает False, если отправлять
+        передумал); возвращает BroadcastResult. dry_run — только оценка длительности.
+        """
+        chat_ids = list(chat_ids)
+        if dry_run:
+            elapsed = estimate_duration(len(chat_ids), self.workers, self.rate)
+            result = BroadcastResult(len(chat_ids), 0, 0, 0, 0, 0, elapsed, [], True)
+            logger.info(f"[BROADCAST] {tag}: пробный запуск, чатов {len(chat_ids)}, оценка {elapsed:.0f} с")
+            return self._remember(tag, result)
+
+        started = self._clock()
+        counters = {'retries': 0}
+        outcomes = {}
+        if chat_ids:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(chat_ids)),
+                                    thread_name_prefix='broadcast') as pool:
+                futures = {chat_id: pool.submit(self._deliver, tag, chat_id, send, counters) for chat_id in chat_ids}
+                outcomes = {chat_id: future.result() for chat_id, future in futures.items()}
+        by_outcome = {}
+        for chat_id, outcome in outcomes.items():
+            by_outcome.setdefault(outcome, []).append(chat_id)
+        blocked = by_outcome.get('blocked', [])
+        if blocked:
+            try:
+                self._record_blocked(blocked)
+            except Exception as e:
+                logger.error(f"[BROADCAST] {tag}: не удалось записать заблокированные чаты: {e}", exc_info=True)
+        result = BroadcastResult(
+            len(chat_ids), len(by_outcome.get('sent', [])), len(by_outcome.get('skipped', [])),
+            len(by_outcome.get('failed', [])), len(blocked), counters['retries'],
+            self._clock() - started, by_outcome.get('sent', []), False
+        )
+        logger.info(f"[BROADCAST] {tag}: чатов {result.total}, отправлено {result.sent}, пропущено {result.skipped}, "
+                    f"ошибок {result.failed}, заблокировали {result.blocked}, повторов {result.retries}, "
+                    f"{result.elapsed:.1f} с")
+        return self._remember(tag, result)
+
+    def _remember(self, tag, result):
+        with _results_lock:
+            _last_results[tag] = result
+        return result
+
+
+def broadcast_stats():
+    """Итоги последней рассылки каждой задачи (для /metrics)"""
+    with _results_lock:
+        return {
+            tag: {key: value for key, value in result._asdict().items() if key != 'sent_chats'}
+            for tag, result in _last_results.items()
+        }
@@ -0,0 +1,237 @@
+"""
+Импорт оценок пользователя Кинопоиска (/api/v1/kp_users/{id}/votes) в ratings.
+
+Раньше import_kp_ratings качал страницы по одной и на каждый из до 1500 фильмов брал
+соединение, db_lock и делал свои SELECT и INSERT. Теперь:
+
+- страницы запрашиваются заранее в несколько потоков (KP_IMPORT_CONCURRENCY), но не чаще
+  KP_IMPORT_REQUESTS_PER_SECOND; на 429 запрос повторяется после паузы (Retry-After);
+- на страницу — один запрос фильмов группы по kp_id = ANY(...), один запрос уже стоящих
+  оценок и один многострочный INSERT ... ON CONFLICT DO NOTHING;
+- прогресс пишется в kp_import_jobs в той же транзакции, что и оценки страницы: прерванный
+  импорт (ошибка API, перезапуск бота) продолжается со следующей страницы, а не с начала;
+  импорты, оборванные перезапуском, продолжаются при старте (resume_interrupted_kp_imports);
+- on_progress вызывается после каждой страницы — по нему обновляется сообщение о статусе.
+
+Правила импорта прежние: фильм из базы группы получает оценку с film_id, остальные — оценку
+с film_id = NULL и kp_id; уже стоящие оценки не меняются и не считаются; не больше max_count
+новых оценок и не больше 75 страниц по 20.
+"""
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from psycopg2.extras import execute_values
+
+from moviebot.config import KP_TOKEN, KP_IMPORT_CONCURRENCY, KP_IMPORT_REQUESTS_PER_SECOND
+from moviebot.database.db_connection import db_connection
+from moviebot.utils.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+VOTES_URL = "https://kinopoiskapiunofficial.tech/api/v1/kp_users/{kp_user_id}/votes"
+PAGE_SIZE = 20
+MAX_PAGES = 75
+MAX_RETRIES = 3
+# Сколько секунд импорт в статусе 'running' может не записывать страницы, прежде чем
+# считается оборванным (живой импорт обновляет updated_at после каждой страницы)
+RUNNING_STALE_AFTER = 10 * 60
+
+# Оценка со страницы: kp_id, оценка, год, жанры строкой, тип (FILM / TV_SERIES / ...)
+Vote = namedtuple('Vote', ('kp_id', 'rating', 'year', 'genres', 'type'))
+ImportResult = namedtuple('ImportResult', ('imported', 'pages', 'complete', 'resumed_from'))
+
+
+_limiter = RateLimiter(KP_IMPORT_REQUESTS_PER_SECOND)
+
+
+def fetch_votes_page(kp_user_id, page, limiter=_limiter, session=requests):
+    """(status_code, items) страницы оценок; 429 и сетевые ошибки повторяются"""
+    url = VOTES_URL.format(kp_user_id=kp_user_id)
+    headers = {'X-API-KEY': KP_TOKEN, 'accept': 'application/json'}
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.wait()
+        try:
+            response = session.get(url, params={'page': page}, headers=headers, timeout=15)
+        except requests.RequestException as e:
+            logger.warning(f"[IMPORT] Страница {page}: {e}")
+            if attempt == MAX_RETRIES:
+                return None, []
+            time.sleep(2 ** attempt)
+            continue
+        if response.status_code == 429 and attempt < MAX_RETRIES:
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+            logger.warning(f"[IMPORT] Страница {page}: 429, повтор через {delay} с")
+            time.sleep(delay)
+            continue
+        if response.status_code != 200:
+            logger.error(f"[IMPORT] Страница {page}: ошибка {response.status_code}: {response.text[:200]}")
+            return response.status_code, []
+        return 200, response.json().get('items') or []
+    return None, []
+
+
+def parse_votes(items):
+    """Оценки страницы в порядке API; без kp_id, с оценкой вне 1..10 и повторы пропускаются"""
+    votes, seen = [], set()
+    for item in items:
+        kp_id = item.get('kinopoiskId')
+        rating = item.get('userRating')
+        if not kp_id or not rating or rating < 1 or rating > 10:
+            continue
+        kp_id = str(kp_id)
+        if kp_id in seen:
+            continue
+        seen.add(kp_id)
+        genres = ', '.join(g.get('genre', '') for g in item.get('genres') or [] if g.get('genre')) or None
+        votes.append(Vote(kp_id, rating, item.get('year'), genres, item.get('type', 'FILM')))
+    return votes
+
+
+def import_votes(cur, chat_id, user_id, votes, quota):
+    """
+    Записывает новые оценки страницы (не больше quota) тремя запросами; возвращает число
+    добавленных оценок.
+    """
+    if not votes or quota <= 0:
+        return 0
+    kp_ids = [vote.kp_id for vote in votes]
+    cur.execute('SELECT id, kp_id FROM movies WHERE chat_id = %s AND kp_id = ANY(%s)', (chat_id, kp_ids))
+    film_ids = {row['kp_id']: row['id'] for row in cur.fetchall()}
+    cur.execute('''
+        SELECT film_id, kp_id FROM ratings
+        WHERE chat_id = %s AND user_id = %s
+          AND (film_id = ANY(%s) OR (film_id IS NULL AND kp_id = ANY(%s)))
+    ''', (chat_id, user_id, list(film_ids.values()), kp_ids))
+    rated_films, rated_imports = set(), set()
+    for row in cur.fetchall():
+        if row['film_id'] is None:
+            rated_imports.add(row['kp_id'])
+        else:
+            rated_films.add(row['film_id'])
+
+    rows = []
+    for vote in votes:
+        film_id = film_ids.get(vote.kp_id)
+        if film_id is not None:
+            already_rated = film_id in rated_films
+        else:
+            already_rated = vote.kp_id in rated_imports
+        if already_rated:
+            continue
+        rows.append((chat_id, film_id, user_id, vote.rating, vote.kp_id, vote.year, vote.genres, vote.type))
+        if len(rows) >= quota:
+            break
+    if not rows:
+        return 0
+    inserted = execute_values(cur, '''
+        INSERT INTO ratings (chat_id, film_id, user_id, rating, is_imported, kp_id, year, genres, type)
+        SELECT v.chat_id, v.film_id, v.user_id, v.rating, TRUE, v.kp_id, v.year, v.genres, v.type
+        FROM (VALUES %s) AS v(chat_id, film_id, user_id, rating, kp_id, year, genres, type)
+        ON CONFLICT (chat_id, film_id, user_id) DO NOTHING
+        RETURNING id
+    ''', rows, template='(%s::bigint, %s::integer, %s::bigint, %s::integer, %s, %s::integer, %s, %s)',
+        fetch=True)
+    return len(inserted)
+
+
+def _start_job(chat_id, user_id, kp_user_id, max_count, status_message_id):
+    """Строка прогресса: незавершённый импорт того же профиля продолжается, иначе начинается заново"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            INSERT INTO kp_import_jobs (chat_id, user_id, kp_user_id, max_count, status_message_id)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (chat_id, user_id, kp_user_id) DO UPDATE SET
+                max_count = EXCLUDED.max_count,
+                status_message_id = COALESCE(EXCLUDED.status_message_id, kp_import_jobs.status_message_id),
+                next_page = CASE WHEN kp_import_jobs.status = 'done' THEN 1 ELSE kp_import_jobs.next_page END,
+                imported = CASE WHEN kp_import_jobs.status = 'done' THEN 0 ELSE kp_import_jobs.imported END,
+                status = 'running', updated_at = NOW()
+            RETURNING id, next_page, imported
+        ''', (chat_id, user_id, str(kp_user_id), max_count, status_message_id))
+        return cur.fetchone()
+
+
+def _finish_job(job_id, status):
+    with db_connection() as conn:
+        conn.cursor().execute('UPDATE kp_import_jobs SET status = %s, updated_at = NOW() WHERE id = %s',
+                              (status, job_id))
+
+
+def run_import(kp_user_id, chat_id, user_id, max_count=100, on_progress=None, status_message_id=None,
+               fetch_page=fetch_votes_page, concurrency=KP_IMPORT_CONCURRENCY):
+    """
+    Импортирует оценки постранично; on_progress(imported, page, max_pages) — после каждой
+    записанной страницы. Возвращает ImportResult (complete=False — импорт можно продолжить).
+    """
+    job = _start_job(chat_id, user_id, kp_user_id, max_count, status_message_id)
+    first_page, imported = job['next_page'], job['imported']
+    max_pages = min(MAX_PAGES, (max_count + PAGE_SIZE - 1) // PAGE_SIZE)
+    if first_page > 1:
+        logger.info(f"[IMPORT] Продолжаем импорт kp_user_id={kp_user_id} со страницы {first_page}, уже {imported}")
+
+    page, pages, complete = first_page, 0, False
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='kp-import')
+    pending = {}
+    try:
+        while True:
+            if imported >= max_count or page > max_pages:
+                complete = True
+                break
+            # Страницы наперёд, не дальше max_pages
+            ahead = page + len(pending)
+            while len(pending) < max(1, concurrency) and ahead <= max_pages:
+                pending[ahead] = pool.submit(fetch_page, kp_user_id, ahead)
+                ahead += 1
+            status, items = pending.pop(page).result()
+            if status != 200:
+                break
+            if not items:
+                complete = True
+                break
+            with db_connection() as conn:
+                cur = conn.cursor()
+                added = import_votes(cur, chat_id, user_id, parse_votes(items), max_count - imported)
+                cur.execute('''
+                    UPDATE kp_import_jobs SET next_page = %s, imported = imported + %s, updated_at = NOW()
+                    WHERE id = %s
+                ''', (page + 1, added, job['id']))
+            imported += added
+            pages += 1
+            if on_progress is not None:
+                try:
+                    on_progress(imported, page, max_pages)
+                except Exception as e:
+                    logger.warning(f"[IMPORT] Ошибка обновления прогресса: {e}")
+            if len(items) < PAGE_SIZE:
+                complete = True
+                break
+            page += 1
+    finally:
+        for future in pending.values():
+            future.cancel()
+        pool.shutdown(wait=False)
+        _finish_job(job['id'], 'done' if complete else 'interrupted')
+    logger.info(f"[IMPORT] kp_user_id={kp_user_id}, chat_id={chat_id}: +{imported} оценок, страниц {pages}, "
+                f"{'завершён' if complete else 'прерван'}")
+    return ImportResult(imported, pages, complete, first_page if first_page > 1 else None)
+
+
+def claim_interrupted_imports():
+    """
+    Импорты, оборвавшиеся вместе с процессом: status = 'running' без прогресса дольше
+    RUNNING_STALE_AFTER (импорты, которые сейчас идут в другом воркере, не трогаются).
+    Строки сразу помечаются 'resuming' — при нескольких воркерах каждый импорт продолжает только один.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            UPDATE kp_import_jobs SET status = 'resuming', updated_at = NOW()
+            WHERE status = 'running' AND updated_at < NOW() - make_interval(secs => %s)
+            RETURNING chat_id, user_id, kp_user_id, max_count, status_message_id, imported
+        ''', (RUNNING_STALE_AFTER,))
+        return cur.fetchall()
@@ -0,0 +1,171 @@
+"""
+Предвычисленные атрибуты TMDB-датафрейма для фильтрации в search_movies (Шазам).
+
+Строится один раз при загрузке индекса:
+- нормализованные строки актёров/режиссёров/жанров (NumPy-массивы) — для подстрочных
+  проверок через векторные булевы маски;
+- нормализованный список актёров по каждой строке и инвертированный индекс
+  имя актёра → номера строк, чтобы фильтры «все актёры»/«хотя бы один» сводились
+  к пересечению/объединению множеств;
+- словарь imdb_id → номер строки.
+
+Семантика совпадений та же, что у построчного цикла в search_movies:
+актёр из запроса совпадает с актёром фильма, если одно имя — подстрока другого.
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_PUNCT_RE = re.compile(r'[^\w\s]')
+
+# Сколько разрешённых имён из запросов держать в кэше (имя из запроса → совпавшие имена словаря)
+MATCH_CACHE_SIZE = 1024
+
+
+def normalize_text(text):
+    """То же, что shazam_service._normalize_text: нижний регистр, без знаков препинания"""
+    return _PUNCT_RE.sub('', str(text).lower())
+
+
+def normalize_imdb_id(raw):
+    """Приводит imdb_id из CSV (число, '123.0', 'tt0123') к виду tt0000123"""
+    raw = str(raw).strip()
+    cleaned = raw.replace('.0', '').replace('.', '').lstrip('t')
+    if cleaned.isdigit():
+        return f"tt{cleaned.zfill(7)}"
+    return raw
+
+
+class MovieAttributeIndex:
+    """Индекс атрибутов фильмов по номеру строки датафрейма (как в FAISS-индексе)"""
+
+    def __init__(self, df):
+        self.source = df  # датафрейм, по которому построен индекс
+        self.size = len(df)
+        self.has_actors = 'actors_str' in df.columns
+        self.has_directors = 'director_str' in df.columns
+        self.has_genres = 'genres_str' in df.columns
+
+        self.actors_norm, self.actors_present = self._normalized_column(df, 'actors_str')
+        self.directors_norm, self.directors_present = self._normalized_column(df, 'director_str')
+        # Жанры нормализуются как в search_movies: str(NaN) == 'nan'
+        if self.has_genres:
+            self.genres_norm = np.array([normalize_text(v) for v in df['genres_str'].tolist()], dtype=object)
+        else:
+            self.genres_norm = np.full(self.size, '', dtype=object)
+
+        self.actor_lists = []
+        postings = {}
+        if self.has_actors:
+            for row_id, value in enumerate(df['actors_str'].tolist()):
+                if pd.isna(value):
+                    self.actor_lists.append(())
+                    continue
+                names = tuple(normalize_text(a.strip()) for a in str(value).split(',') if a.strip())
+                self.actor_lists.append(names)
+                for name in set(names):
+                    postings.setdefault(name, []).append(row_id)
+        else:
+            self.actor_lists = [()] * self.size
+        self._actor_postings = {name: frozenset(rows) for name, rows in postings.items()}
+        self._actor_vocab = list(self._actor_postings)
+
+        self._imdb_rows = {}
+        if 'imdb_id' in df.columns:
+            for row_id, value in enumerate(df['imdb_id'].tolist()):
+                self._imdb_rows.setdefault(normalize_imdb_id(value), row_id)
+
+        self._match_cache = OrderedDict()
+        self._match_lock = threading.Lock()
+
+    def _normalized_column(self, df, column):
+        if column not in df.columns:
+            return np.full(self.size, '', dtype=object), np.zeros(self.size, dtype=bool)
+        values = df[column]
+        present = values.notna().to_numpy()
+        normalized = np.array(
+            [normalize_text(v) if ok else '' for v, ok in zip(values.tolist(), present)],
+            dtype=object,
+        )
+        return normalized, present
+
+    # --- актёры (поимённое совпадение) ---
+
+    def _matching_actor_names(self, name):
+        """Имена словаря, совпадающие с именем из запроса (одно — подстрока другого)"""
+        with self._match_lock:
+            cached = self._match_cache.get(name)
+            if cached is not None:
+                self._match_cache.move_to_end(name)
+                return cached
+        matched = tuple(n for n in self._actor_vocab if name in n or n in name)
+        with self._match_lock:
+            self._match_cache[name] = matched
+            if len(self._match_cache) > MATCH_CACHE_SIZE:
+                self._match_cache.popitem(last=False)
+        return matched
+
+    def rows_with_actor(self, name):
+        """Множество строк, где есть актёр name (нормализованное имя)"""
+        rows = set()
+        for matched in self._matching_actor_names(name):
+            rows.update(self._actor_postings[matched])
+        return rows
+
+    def actor_mask(self, names, require_all):
+        """Булева маска строк со всеми (require_all) или хотя бы одним из актёров names"""
+        mask = np.zeros(self.size, dtype=bool)
+        sets = [self.rows_with_actor(name) for name in names]
+        if not sets:
+            return mask
+        rows = set.intersection(*sets) if require_all else set.union(*sets)
+        if rows:
+            mask[np.fromiter(rows, dtype=np.int64, count=len(rows))] = True
+        return mask
+
+    def count_actor_matches(self, row_id, names):
+        """Сколько актёров из names есть в фильме row_id"""
+        movie_actors = self.actor_lists[row_id]
+        return sum(
+            1 for name in names
+            if any(name in movie_actor or movie_actor in name for movie_actor in movie_actors)
+        )
+
+    # --- подстрочные проверки по целой строке ---
+
+    @staticmethod
+    def _contains_mask(normalized, present, names):
+        mask = np.zeros(len(normalized), dtype=bool)
+        if not len(normalized):
+            return mask
+        series = pd.Series(normalized)
+        for name in names:
+            mask |= series.str.contains(name, regex=False).to_numpy(dtype=bool)
+        return mask & present
+
+    def director_mask(self, names):
+        """Строки, где строка режиссёров содержит хотя бы одно из имён names"""
+        return self._contains_mask(self.directors_norm, self.directors_present, names)
+
+    def actors_string_mask(self, name):
+        """Строки, где строка актёров целиком содержит name (логика поиска по одному актёру)"""
+        return self._contains_mask(self.actors_norm, self.actors_present, [name])
+
+    def row_for_imdb(self, imdb_id):
+        """Номер строки по нормализованному imdb_id или None"""
+        return self._imdb_rows.get(imdb_id)
+
+
+def build_attribute_index(df):
+    index = MovieAttributeIndex(df)
+    logger.info(
+        f"[ATTR INDEX] Построен индекс атрибутов: фильмов={index.size}, "
+        f"уникальных актёров={len(index._actor_vocab)}"
+    )
+    return index
@@ -0,0 +1,127 @@
+"""
+Колоночное хранилище обработанного TMDB-датасета Шазама (вместо tmdb_movies_processed.csv).
+
+Формат — директория с NumPy-файлами, которые открываются через memmap:
+    manifest.json               — список колонок, их тип и число строк
+    <col>.npy                   — числовые и булевы колонки
+    <col>.codes.npy             — строковые колонки: код значения в словаре (-1 = NaN)
+    <col>.offsets.npy           — границы значений словаря в блобе
+    <col>.blob.npy              — UTF-8 байты уникальных значений подряд
+
+При загрузке в DataFrame материализуются только нужные поиску колонки;
+длинные тексты (description, overview, genres) читаются с диска построчно.
+"""
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+def save_movie_store(df, path):
+    """Сохраняет датафрейм в колоночном формате (атомарно: через временную директорию)"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    columns = []
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            np.save(tmp_path / f'{column}.npy', series.to_numpy())
+            columns.append({'name': column, 'kind': 'numeric'})
+            continue
+        codes, uniques = pd.factorize(series.map(lambda v: v if pd.isna(v) else str(v)), use_na_sentinel=True)
+        encoded = [str(value).encode('utf-8') for value in uniques]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(value) for value in encoded])
+        np.save(tmp_path / f'{column}.codes.npy', codes.astype(np.int32))
+        np.save(tmp_path / f'{column}.offsets.npy', offsets)
+        np.save(tmp_path / f'{column}.blob.npy', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        columns.append({'name': column, 'kind': 'string', 'unique': len(encoded)})
+
+    with open(tmp_path / MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump({'version': FORMAT_VERSION, 'rows': len(df), 'columns': columns}, f, ensure_ascii=False, indent=2)
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    logger.info(f"[MOVIE STORE] Сохранено {len(df)} фильмов, колонок: {len(columns)} → {path}")
+
+
+def store_exists(path):
+    return (Path(path) / MANIFEST).exists()
+
+
+def remove_store(path):
+    path = Path(path)
+    if path.exists():
+        shutil.rmtree(path)
+
+
+class MovieStore:
+    """Открытое (memmap) колоночное хранилище"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия хранилища: {manifest.get('version')}")
+        self.rows = manifest['rows']
+        self.kinds = {column['name']: column['kind'] for column in manifest['columns']}
+        self.columns = [column['name'] for column in manifest['columns']]
+        self._arrays = {}
+
+    def __len__(self):
+        return self.rows
+
+    def _array(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            try:
+                array = np.load(self.path / f'{name}.npy', mmap_mode='r')
+            except ValueError:
+                # Пустой массив (например, колонка целиком из NaN) нельзя отобразить в память
+                array = np.load(self.path / f'{name}.npy')
+            self._arrays[name] = array
+        return array
+
+    def _decode(self, column, code):
+        offsets = self._array(f'{column}.offsets')
+        return bytes(self._array(f'{column}.blob')[offsets[code]:offsets[code + 1]]).decode('utf-8')
+
+    def value(self, column, row):
+        """Одно значение без материализации колонки"""
+        if self.kinds[column] == 'numeric':
+            return self._array(column)[row].item()
+        code = int(self._array(f'{column}.codes')[row])
+        return np.nan if code < 0 else self._decode(column, code)
+
+    def column(self, column):
+        """Колонка целиком (строки декодируются один раз на уникальное значение)"""
+        if self.kinds[column] == 'numeric':
+            return pd.Series(np.asarray(self._array(column)), name=column)
+        offsets = self._array(f'{column}.offsets')
+        blob = bytes(self._array(f'{column}.blob'))
+        uniques = np.empty(len(offsets), dtype=object)  # последний элемент — NaN для кода -1
+        for i in range(len(offsets) - 1):
+            uniques[i] = blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+        uniques[-1] = np.nan
+        return pd.Series(uniques[np.asarray(self._array(f'{column}.codes'))], name=column, dtype=object)
+
+    def to_dataframe(self, columns=None):
+        """DataFrame из выбранных колонок (по умолчанию — всех)"""
+        names = [c for c in (columns or self.columns) if c in self.kinds]
+        return pd.DataFrame({name: self.column(name) for name in names})
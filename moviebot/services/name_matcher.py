@@ -0,0 +1,141 @@
+"""
+Индекс нечёткого поиска имён актёров и режиссёров из топ-списков Шазама.
+
+Строится один раз при загрузке топ-списков:
+- symmetric deletion: для каждого имени хранятся все варианты с удалением
+  до max_distance символов. Если расстояние Левенштейна между запросом и
+  именем <= k, у них найдётся общий вариант, поэтому кандидаты берутся
+  словарём, а точное расстояние считается только для них;
+- фамилия → полные имена: последнее слово имени (или всё имя, если оно из
+  одного слова).
+
+При нескольких подходящих именах выбирается ближайшее по расстоянию, а при
+равенстве — стоящее выше в топ-списке (списки отсортированы по популярности).
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+NAME_MAX_DISTANCE = 2
+# Слишком короткие слова (a, no, jo) не считаем фамилиями
+MIN_SURNAME_LENGTH = 3
+
+
+def levenshtein_distance(s1, s2, max_distance=None):
+    """
+    Расстояние Левенштейна между двумя строками.
+    С max_distance считает только до порога: если расстояние больше, возвращает max_distance + 1.
+    """
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    if max_distance is not None and len(s1) - len(s2) > max_distance:
+        return max_distance + 1
+    if len(s2) == 0:
+        distance = len(s1)
+    else:
+        distance = _bounded_rows(s1, s2, max_distance)
+    if max_distance is not None:
+        return min(distance, max_distance + 1)
+    return distance
+
+
+def _bounded_rows(s1, s2, max_distance):
+    previous_row = list(range(len(s2) + 1))
+    for i, c1 in enumerate(s1):
+        current_row = [i + 1]
+        for j, c2 in enumerate(s2):
+            insertions = previous_row[j + 1] + 1
+            deletions = current_row[j] + 1
+            substitutions = previous_row[j] + (c1 != c2)
+            current_row.append(min(insertions, deletions, substitutions))
+        if max_distance is not None and min(current_row) > max_distance:
+            return max_distance + 1
+        previous_row = current_row
+
+    return previous_row[-1]
+
+
+def _deletes(word, depth):
+    """Все строки, получаемые из word удалением не более depth символов (включая саму word)"""
+    result = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def _surname_key(name):
+    return name.rsplit(' ', 1)[-1]
+
+
+class NameMatcher:
+    """Нечёткий поиск по фиксированному списку имён (в нижнем регистре)"""
+
+    def __init__(self, names, max_distance=NAME_MAX_DISTANCE):
+        self.max_distance = max_distance
+        # Порядок важен: ранг имени = позиция в топ-списке
+        self.names = list(dict.fromkeys(n.strip().lower() for n in names if n and n.strip()))
+        self._rank = {name: rank for rank, name in enumerate(self.names)}
+        self._deletes = {}
+        self._by_surname = {}
+        for rank, name in enumerate(self.names):
+            for variant in _deletes(name, max_distance):
+                self._deletes.setdefault(variant, []).append(rank)
+            self._by_surname.setdefault(_surname_key(name), rank)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._rank
+
+    def candidates(self, name, max_distance=None):
+        """Все имена с расстоянием <= max_distance: список (distance, name) по возрастанию расстояния и ранга"""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        ranks = set()
+        for variant in _deletes(name, max_distance):
+            ranks.update(self._deletes.get(variant, ()))
+        found = []
+        for rank in sorted(ranks):
+            candidate = self.names[rank]
+            distance = levenshtein_distance(name, candidate, max_distance)
+            if distance <= max_distance:
+                found.append((distance, rank, candidate))
+        found.sort()
+        return [(distance, candidate) for distance, _, candidate in found]
+
+    def find(self, name, max_distance=NAME_MAX_DISTANCE):
+        """
+        Ищет имя с учётом опечаток (расстояние Левенштейна <= max_distance).
+
+        Returns:
+            tuple: (found, matched_name) где matched_name - имя из списка или None
+        """
+        if name in self._rank:
+            return (True, name)
+        found = self.candidates(name, max_distance)
+        if found:
+            return (True, found[0][1])
+        return (False, None)
+
+    def find_by_surname(self, word):
+        """
+        Ищет полное имя по фамилии (одно слово). Например, 'tarantino' → 'quentin tarantino'.
+
+        Returns:
+            tuple: (found, matched_name) или (False, None)
+        """
+        if not word:
+            return (False, None)
+        w = word.lower().strip()
+        if len(w) < MIN_SURNAME_LENGTH:
+            return (False, None)
+        rank = self._by_surname.get(w)
+        if rank is None:
+            return (False, None)
+        return (True, self.names[rank])
+
+    def stats(self):
+        return {'names': len(self.names), 'delete_variants': len(self._deletes), 'surnames': len(self._by_surname)}
@@ -0,0 +1,233 @@
+"""
+Кэш текстовых запросов Шазама и батчевый энкодер эмбеддингов.
+
+- QueryCache: LRU с TTL для трёх стадий search_movies —
+  нормализованный запрос → перевод, перевод → эмбеддинг, запрос → результаты.
+  Одни и те же описания фильмов спрашивают постоянно, повтор не должен
+  заново гонять переводчик и SentenceTransformer.
+- BatchingEncoder: одновременные запросы, пришедшие в пределах нескольких
+  миллисекунд, кодируются одним вызовом model.encode().
+"""
+import copy
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_SIZE = int(os.getenv('SHAZAM_QUERY_CACHE_SIZE', '2000'))
+# Перевод и эмбеддинг зависят только от текста — живут долго
+QUERY_CACHE_TTL = int(os.getenv('SHAZAM_QUERY_CACHE_TTL', str(24 * 3600)))
+# Результаты зависят от индекса и жанровой проверки через API — живут меньше
+RESULTS_CACHE_TTL = int(os.getenv('SHAZAM_RESULTS_CACHE_TTL', '3600'))
+ENCODE_BATCH_WAIT_MS = float(os.getenv('SHAZAM_ENCODE_BATCH_MS', '5'))
+ENCODE_MAX_BATCH = int(os.getenv('SHAZAM_ENCODE_MAX_BATCH', '16'))
+
+_SPACES_RE = re.compile(r'\s+')
+_EDGE_PUNCT_RE = re.compile(r'^[\W_]+|[\W_]+$')
+
+
+def normalize_query(text):
+    """Ключ кэша: регистр, лишние пробелы и знаки по краям не различаются"""
+    text = _SPACES_RE.sub(' ', str(text).lower().replace('ё', 'е')).strip()
+    return _EDGE_PUNCT_RE.sub('', text)
+
+
+class _LRU:
+    """OrderedDict с ограничением размера и TTL"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if now - stored_at > self.ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key, value, now):
+        self._data[key] = (value, now)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class QueryCache:
+    """Кэш перевода, эмбеддинга и результатов поиска по тексту запроса"""
+
+    STAGES = ('translation', 'embedding', 'results')
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, results_ttl=RESULTS_CACHE_TTL):
+        self._lock = threading.Lock()
+        self._stages = {
+            'translation': _LRU(max_entries, ttl),
+            'embedding': _LRU(max_entries, ttl),
+            'results': _LRU(max_entries, results_ttl),
+        }
+        self._hits = dict.fromkeys(self.STAGES, 0)
+        self._misses = dict.fromkeys(self.STAGES, 0)
+
+    def _get(self, stage, key):
+        with self._lock:
+            value = self._stages[stage].get(key, time.time())
+            if value is None:
+                self._misses[stage] += 1
+            else:
+                self._hits[stage] += 1
+            return value
+
+    def _put(self, stage, key, value):
+        with self._lock:
+            self._stages[stage].put(key, value, time.time())
+
+    def get_translation(self, query):
+        return self._get('translation', normalize_query(query))
+
+    def put_translation(self, query, translated):
+        self._put('translation', normalize_query(query), translated)
+
+    def get_embedding(self, text):
+        return self._get('embedding', text)
+
+    def put_embedding(self, text, embedding):
+        embedding = np.array(embedding, dtype='float32')
+        embedding.setflags(write=False)
+        self._put('embedding', text, embedding)
+
+    def get_results(self, query, *key_parts):
+        results = self._get('results', (normalize_query(query),) + key_parts)
+        # Обработчики сортируют и дополняют результаты — отдаём копию
+        return copy.deepcopy(results) if results is not None else None
+
+    def put_results(self, query, results, *key_parts):
+        self._put('results', (normalize_query(query),) + key_parts, copy.deepcopy(results))
+
+    def clear(self):
+        with self._lock:
+            for stage in self._stages.values():
+                stage.clear()
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for stage in self.STAGES:
+                total = self._hits[stage] + self._misses[stage]
+                result[stage] = {
+                    'hits': self._hits[stage],
+                    'misses': self._misses[stage],
+                    'hit_rate': round(self._hits[stage] / total, 3) if total else 0.0,
+                    'size': len(self._stages[stage]),
+                }
+            return result
+
+
+class _Pending:
+    __slots__ = ('text', 'event', 'result', 'error')
+
+    def __init__(self, text):
+        self.text = text
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingEncoder:
+    """
+    Собирает тексты, пришедшие почти одновременно, и кодирует их одним вызовом encode_fn(list) -> ndarray.
+    Первый запрос в пачке ждёт не дольше max_wait_ms.
+    """
+
+    def __init__(self, encode_fn, max_batch=ENCODE_MAX_BATCH, max_wait_ms=ENCODE_BATCH_WAIT_MS):
+        self._encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._cond = threading.Condition()
+        self._queue = []
+        self._stats = {'requests': 0, 'batches': 0, 'max_batch_seen': 0}
+        self._thread = threading.Thread(target=self._run, name='shazam-encoder', daemon=True)
+        self._thread.start()
+
+    def encode(self, text, timeout=None):
+        """Эмбеддинг одного текста (float32, shape=(dim,))"""
+        pending = _Pending(text)
+        with self._cond:
+            self._queue.append(pending)
+            self._stats['requests'] += 1
+            self._cond.notify()
+        if not pending.event.wait(timeout):
+            raise TimeoutError("Кодирование запроса не завершилось вовремя")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while len(self._queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            self._stats['batches'] += 1
+            self._stats['max_batch_seen'] = max(self._stats['max_batch_seen'], len(batch))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            # Одинаковые тексты в пачке кодируем один раз
+            texts = list(dict.fromkeys(p.text for p in batch))
+            try:
+                vectors = np.asarray(self._encode_fn(texts), dtype='float32')
+                by_text = dict(zip(texts, vectors))
+                for pending in batch:
+                    pending.result = by_text[pending.text]
+            except Exception as e:
+                logger.error(f"[SHAZAM ENCODER] Ошибка кодирования пачки из {len(texts)}: {e}", exc_info=True)
+                for pending in batch:
+                    pending.error = e
+            for pending in batch:
+                pending.event.set()
+
+    def stats(self):
+        with self._cond:
+            batches = self._stats['batches']
+            return dict(
+                self._stats,
+                avg_batch=round(self._stats['requests'] / batches, 2) if batches else 0.0,
+            )
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """Глобальный кэш запросов Шазама"""
+    global _query_cache
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = QueryCache()
+    return _query_cache
@@ -0,0 +1,274 @@
+"""
+Индекс фильтров /random по базе чата (режим «Рандом по своей базе»).
+
+Раньше каждый шаг мастера (период, жанр, режиссёр, актёр) строил свой SQL по всему списку
+непросмотренных фильмов чата (антиджойн с импортированными оценками, EXISTS по film_genres /
+film_people, шесть COUNT на шаг периода), а финал выбирал всех кандидатов и брал случайного
+в Python. Теперь:
+
+- для чата один раз строится FacetIndex: у каждого фильма — номер бита, у каждого значения
+  фильтра (период, жанр, режиссёр, актёр, фильм/сериал) — битовая маска фильмов (int);
+- шаг мастера — пересечение масок: OR внутри фильтра, AND между фильтрами (как в прежнем
+  SQL), счётчики режиссёров/актёров — popcount пересечения;
+- финал — равновероятный выбор из итоговой маски без запланированных фильмов;
+- индексы живут в памяти процесса (RANDOM_INDEX_MAX_CHATS последних чатов). Перед каждым
+  шагом сверяется movie_list_counts.version чата (его двигает триггер при добавлении,
+  отметке просмотренным, удалении фильма и импорте оценки): если версия изменилась,
+  индекс досинхронизируется — исчезнувшие фильмы снимаются, новые дочитываются по id.
+  Раз в RANDOM_INDEX_TTL секунд индекс строится заново (метаданные фильмов в каталоге).
+"""
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from moviebot.config import RANDOM_INDEX_MAX_CHATS, RANDOM_INDEX_TTL
+from moviebot.database.db_connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+# Периоды мастера и их годы (границы включительно, как в прежних условиях m.year >= a AND m.year <= b)
+PERIODS = (
+    ("До 1980", None, 1979),
+    ("1980–1990", 1980, 1990),
+    ("1990–2000", 1990, 2000),
+    ("2000–2010", 2000, 2010),
+    ("2010–2020", 2010, 2020),
+    ("2020–сейчас", 2020, None),
+)
+
+FACET_GENRE = 'genres'
+FACET_DIRECTOR = 'directors'
+FACET_ACTOR = 'actors'
+
+# Фильмы кандидаты в рандом: непросмотренные и без импортированной оценки
+_FILMS_SQL = '''
+    SELECT m.id, m.kp_id, m.title, m.year, m.link, m.is_series,
+           ARRAY(SELECT fg.genre FROM film_genres fg WHERE fg.kp_id = m.kp_id) AS genres,
+           ARRAY(SELECT fp.name FROM film_people fp WHERE fp.kp_id = m.kp_id AND fp.role = 'director') AS directors,
+           ARRAY(SELECT fp.name FROM film_people fp WHERE fp.kp_id = m.kp_id AND fp.role = 'actor') AS actors
+    FROM movies m
+    WHERE m.chat_id = %(chat_id)s AND m.watched = 0 {where}
+      AND NOT EXISTS (
+          SELECT 1 FROM ratings r
+          WHERE r.film_id = m.id AND r.chat_id = m.chat_id AND r.is_imported = TRUE
+      )
+'''
+_MEMBER_IDS_SQL = '''
+    SELECT m.id FROM movies m
+    WHERE m.chat_id = %(chat_id)s AND m.watched = 0
+      AND NOT EXISTS (
+          SELECT 1 FROM ratings r
+          WHERE r.film_id = m.id AND r.chat_id = m.chat_id AND r.is_imported = TRUE
+      )
+'''
+_VERSION_SQL = 'SELECT version FROM movie_list_counts WHERE chat_id = %s'
+_PLANNED_SQL = 'SELECT DISTINCT film_id FROM plans WHERE chat_id = %s AND film_id IS NOT NULL'
+
+
+def _bit_positions(bits):
+    """Номера установленных битов по возрастанию"""
+    return [pos for pos, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1'] if bits else []
+
+
+class FacetIndex:
+    """Битовые маски фильтров /random для одного чата"""
+
+    def __init__(self, version=0, built_at=None):
+        self.version = version
+        self.built_at = time.monotonic() if built_at is None else built_at
+        self.alive = 0            # фильмы, которые сейчас кандидаты
+        self.films = []           # номер бита -> строка фильма
+        self.positions = {}       # id фильма -> номер бита
+        self.is_series = {0: 0, 1: 0}
+        self.periods = {label: 0 for label, _, _ in PERIODS}
+        self.facets = {FACET_GENRE: {}, FACET_DIRECTOR: {}, FACET_ACTOR: {}}
+        self.lock = threading.RLock()
+
+    @property
+    def size(self):
+        return self.alive.bit_count()
+
+    @property
+    def dead(self):
+        """Сколько битов занято снятыми фильмами (при перестройке освобождаются)"""
+        return len(self.films) - self.size
+
+    def film_ids(self):
+        return {self.films[pos]['id'] for pos in _bit_positions(self.alive)}
+
+    def add_film(self, row):
+        with self.lock:
+            if row['id'] in self.positions:
+                self.remove_film(row['id'])
+            pos = len(self.films)
+            bit = 1 << pos
+            self.films.append({key: row.get(key) for key in ('id', 'kp_id', 'title', 'year', 'link')})
+            self.positions[row['id']] = pos
+            self.alive |= bit
+            if row.get('is_series') in self.is_series:
+                self.is_series[row['is_series']] |= bit
+            year = row.get('year')
+            if year is not None:
+                for label, low, high in PERIODS:
+                    if (low is None or year >= low) and (high is None or year <= high):
+                        self.periods[label] |= bit
+            for facet, values in self.facets.items():
+                for value in set(row.get(facet) or ()):
+                    values[value] = values.get(value, 0) | bit
+
+    def remove_film(self, film_id):
+        with self.lock:
+            pos = self.positions.pop(film_id, None)
+            if pos is not None:
+                self.alive &= ~(1 << pos)
+
+    def match(self, content_type=None, periods=(), genres=(), directors=(), actors=()):
+        """Маска кандидатов: OR значений внутри фильтра, AND между фильтрами"""
+        with self.lock:
+            bits = self.alive
+            if content_type == 'films':
+                bits &= self.is_series[0]
+            elif content_type == 'series':
+                bits &= self.is_series[1]
+            for selected, masks in ((periods, self.periods), (genres, self.facets[FACET_GENRE]),
+                                    (directors, self.facets[FACET_DIRECTOR]), (actors, self.facets[FACET_ACTOR])):
+                if selected:
+                    union = 0
+                    for value in selected:
+                        union |= masks.get(value, 0)
+                    bits &= union
+            return bits
+
+    def available_periods(self, bits):
+        with self.lock:
+            return [label for label, _, _ in PERIODS if self.periods[label] & bits]
+
+    def values(self, facet, bits):
+        """Значения фильтра, у которых есть хотя бы один фильм из bits"""
+        with self.lock:
+            return [value for value, mask in self.facets[facet].items() if mask & bits]
+
+    def top(self, facet, bits, limit=10):
+        """Самые частые значения фильтра среди bits: (значение, число фильмов), как ORDER BY cnt DESC, name"""
+        with self.lock:
+            counts = [(value, (mask & bits).bit_count()) for value, mask in self.facets[facet].items()]
+        counts = [item for item in counts if item[1]]
+        counts.sort(key=lambda item: (-item[1], item[0]))
+        return counts[:limit]
+
+    def pick(self, bits, exclude_ids=(), rng=random):
+        """Случайный фильм из bits (равновероятно), кроме exclude_ids; None, если выбирать не из чего"""
+        with self.lock:
+            for film_id in exclude_ids:
+                pos = self.positions.get(film_id)
+                if pos is not None:
+                    bits &= ~(1 << pos)
+            positions = _bit_positions(bits)
+            return dict(self.films[rng.choice(positions)]) if positions else None
+
+
+def build_index(cur, chat_id, version):
+    index = FacetIndex(version)
+    cur.execute(_FILMS_SQL.format(where=''), {'chat_id': chat_id})
+    for row in cur.fetchall():
+        index.add_film(row)
+    return index
+
+
+def sync_index(cur, index, chat_id, version):
+    """Досинхронизирует index с базой: снимает выбывшие фильмы и дочитывает новые; False — нужна перестройка"""
+    cur.execute(_MEMBER_IDS_SQL, {'chat_id': chat_id})
+    member_ids = {row['id'] for row in cur.fetchall()}
+    current = index.film_ids()
+    removed, added = current - member_ids, member_ids - current
+    if index.dead + len(removed) > max(64, len(member_ids)):
+        return False
+    rows = []
+    if added:
+        cur.execute(_FILMS_SQL.format(where='AND m.id = ANY(%(ids)s)'), {'chat_id': chat_id, 'ids': sorted(added)})
+        rows = cur.fetchall()
+    with index.lock:
+        for film_id in removed:
+            index.remove_film(film_id)
+        for row in rows:
+            index.add_film(row)
+        index.version = version
+    return True
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _read_version(cur, chat_id):
+    cur.execute(_VERSION_SQL, (chat_id,))
+    row = cur.fetchone()
+    return row['version'] if row else 0
+
+
+def get_index(chat_id):
+    """Индекс чата: из кэша (сверка версии одним запросом), досинхронизированный или построенный заново"""
+    with _cache_lock:
+        index = _cache.get(chat_id)
+        if index is not None:
+            _cache.move_to_end(chat_id)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        version = _read_version(cur, chat_id)
+        if index is not None and time.monotonic() - index.built_at > RANDOM_INDEX_TTL:
+            index = None
+        if index is not None and index.version != version and not sync_index(cur, index, chat_id, version):
+            index = None
+        if index is None:
+            index = build_index(cur, chat_id, version)
+            logger.info(f"[RANDOM INDEX] Построен индекс чата {chat_id}: фильмов={index.size}, версия={version}")
+    with _cache_lock:
+        _cache[chat_id] = index
+        _cache.move_to_end(chat_id)
+        while len(_cache) > RANDOM_INDEX_MAX_CHATS:
+            _cache.popitem(last=False)
+    return index
+
+
+def invalidate(chat_id=None):
+    """Сбрасывает индекс чата (или все индексы)"""
+    with _cache_lock:
+        if chat_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(chat_id, None)
+
+
+def available_periods(chat_id, content_type=None):
+    index = get_index(chat_id)
+    return index.available_periods(index.match(content_type))
+
+
+def available_genres(chat_id, content_type=None, periods=()):
+    index = get_index(chat_id)
+    return index.values(FACET_GENRE, index.match(content_type, periods))
+
+
+def top_directors(chat_id, periods=(), genres=(), limit=10):
+    index = get_index(chat_id)
+    return index.top(FACET_DIRECTOR, index.match(None, periods, genres), limit)
+
+
+def top_actors(chat_id, periods=(), genres=(), directors=(), limit=10):
+    index = get_index(chat_id)
+    return index.top(FACET_ACTOR, index.match(None, periods, genres, directors), limit)
+
+
+def pick_random_film(chat_id, content_type=None, periods=(), genres=(), directors=(), actors=()):
+    """Случайный фильм базы чата по фильтрам мастера, кроме запланированных; None — не нашлось"""
+    index = get_index(chat_id)
+    bits = index.match(content_type, periods, genres, directors, actors)
+    if not bits:
+        return None
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(_PLANNED_SQL, (chat_id,))
+        planned = [row['film_id'] for row in cur.fetchall()]
+    return index.pick(bits, planned)
@@ -0,0 +1,223 @@
+"""
+Хранилище и настройка задач APScheduler.
+
+Разовые задачи (объединённое напоминание о планах на день, напоминание с билетами,
+уведомления и проверки сериалов) раньше жили только в памяти процесса: после перезапуска
+их заново собирала пятиминутная проверка планов, а пропущенные больше чем на 30 минут
+терялись. Теперь:
+
+- разовые задачи хранятся в таблице apscheduler_jobs (PostgresJobStore, та же схема, что у
+  SQLAlchemyJobStore) и переживают перезапуск; периодические (cron/interval) по-прежнему
+  в памяти — main.py добавляет их при каждом старте;
+- add_dynamic_job ставит задачу идемпотентно (replace_existing) с запасом на опоздание
+  MISFIRE_GRACE_SECONDS и coalesce;
+- diff_dynamic_jobs одним запросом сравнивает нужные задачи с уже сохранёнными: каких
+  не хватает и какие в проверяемой области лишние (reconcile_plan_reminders в scheduler.py);
+- пул потоков задач ограничен SCHEDULER_MAX_WORKERS; после каждой задачи соединение БД её
+  потока возвращается в пул соединений (потоки пула живут долго).
+"""
+import logging
+import pickle
+
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+from moviebot.config import SCHEDULER_JOBSTORE, SCHEDULER_MAX_WORKERS
+from moviebot.database.db_connection import db_connection, run_in_connection_scope
+
+logger = logging.getLogger(__name__)
+
+DYNAMIC_JOBSTORE = 'dynamic'
+# Напоминание, опоздавшее (перезапуск, занятый пул) не больше чем на 30 минут, ещё отправляется
+MISFIRE_GRACE_SECONDS = 1800
+
+_LOOKUP_SQL = "SELECT job_state FROM apscheduler_jobs WHERE id = %s"
+_ALL_SQL = "SELECT id, job_state FROM apscheduler_jobs ORDER BY next_run_time"
+_DUE_SQL = "SELECT id, job_state FROM apscheduler_jobs WHERE next_run_time <= %s ORDER BY next_run_time"
+_NEXT_RUN_TIME_SQL = '''
+    SELECT next_run_time FROM apscheduler_jobs WHERE next_run_time IS NOT NULL
+    ORDER BY next_run_time LIMIT 1
+'''
+_INSERT_SQL = '''
+    INSERT INTO apscheduler_jobs (id, next_run_time, job_state) VALUES (%s, %s, %s)
+    ON CONFLICT (id) DO NOTHING
+'''
+_UPDATE_SQL = "UPDATE apscheduler_jobs SET next_run_time = %s, job_state = %s WHERE id = %s"
+_DELETE_SQL = "DELETE FROM apscheduler_jobs WHERE id = ANY(%s)"
+_DELETE_ALL_SQL = "DELETE FROM apscheduler_jobs"
+# Нужные задачи без сохранённой (desired_id) и сохранённые в области сверки, но не нужные (job_id)
+_DIFF_SQL = '''
+    SELECT d.id AS desired_id, j.id AS job_id
+    FROM unnest(%(desired)s::text[]) AS d(id)
+    FULL JOIN (
+        SELECT id FROM apscheduler_jobs
+        WHERE id = ANY(%(scope_ids)s) OR id LIKE ANY(%(scope_patterns)s)
+    ) AS j ON j.id = d.id
+    WHERE d.id IS NULL OR j.id IS NULL
+'''
+
+
+def _like_prefix(prefix):
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+class PostgresJobStore(BaseJobStore):
+    """Задачи APScheduler в таблице apscheduler_jobs через пул соединений бота"""
+
+    def __init__(self, pickle_protocol=pickle.HIGHEST_PROTOCOL, connection=db_connection):
+        super().__init__()
+        self.pickle_protocol = pickle_protocol
+        self._connection = connection
+
+    def _execute(self, sql, params=None, fetch=True):
+        """Строки результата (fetch) или число затронутых строк"""
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            return cur.fetchall() if fetch else cur.rowcount
+
+    def _state(self, job):
+        return pickle.dumps(job.__getstate__(), self.pickle_protocol)
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(bytes(job_state))
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, sql, params=None):
+        jobs, failed = [], []
+        for row in self._execute(sql, params):
+            try:
+                jobs.append(self._reconstitute_job(row['job_state']))
+            except Exception:
+                # Функцию задачи переименовали или удалили — такую задачу не восстановить
+                logger.exception(f"[SCHEDULER JOBS] Не удалось восстановить задачу {row['id']}, удаляем")
+                failed.append(row['id'])
+        if failed:
+            self._execute(_DELETE_SQL, (failed,), fetch=False)
+        return jobs
+
+    def lookup_job(self, job_id):
+        rows = self._execute(_LOOKUP_SQL, (job_id,))
+        return self._reconstitute_job(rows[0]['job_state']) if rows else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs(_DUE_SQL, (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        rows = self._execute(_NEXT_RUN_TIME_SQL)
+        return utc_timestamp_to_datetime(rows[0]['next_run_time']) if rows else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs(_ALL_SQL)
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        params = (job.id, datetime_to_utc_timestamp(job.next_run_time), self._state(job))
+        if self._execute(_INSERT_SQL, params, fetch=False) == 0:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        params = (datetime_to_utc_timestamp(job.next_run_time), self._state(job), job.id)
+        if self._execute(_UPDATE_SQL, params, fetch=False) == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        if self._execute(_DELETE_SQL, ([job_id],), fetch=False) == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        self._execute(_DELETE_ALL_SQL, fetch=False)
+
+    def diff_job_ids(self, desired_ids, scope_ids=(), scope_prefixes=()):
+        """(недостающие, лишние) id задач одним запросом, см. diff_dynamic_jobs"""
+        rows = self._execute(_DIFF_SQL, {
+            'desired': sorted(desired_ids),
+            'scope_ids': sorted(scope_ids),
+            'scope_patterns': sorted(_like_prefix(prefix) for prefix in scope_prefixes),
+        })
+        missing = {row['desired_id'] for row in rows if row['desired_id'] is not None}
+        stale = {row['job_id'] for row in rows if row['job_id'] is not None}
+        return missing, stale
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} (apscheduler_jobs)>'
+
+
+class _ConnectionScopedPool:
+    """Пул потоков задач: после каждой задачи соединение БД её потока возвращается в пул соединений"""
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def submit(self, fn, *args, **kwargs):
+        return self._pool.submit(run_in_connection_scope, fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait)
+
+
+class ConnectionScopedThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor планировщика: потоки пула долгоживущие, соединение не должно переживать задачу"""
+
+    def __init__(self, max_workers=10, pool_kwargs=None):
+        super().__init__(max_workers, pool_kwargs)
+        self._pool = _ConnectionScopedPool(self._pool)
+
+
+def create_scheduler(jobstore=SCHEDULER_JOBSTORE, max_workers=SCHEDULER_MAX_WORKERS):
+    """BackgroundScheduler бота: разовые задачи в DYNAMIC_JOBSTORE, ограниченный пул потоков"""
+    dynamic_store = PostgresJobStore() if jobstore == 'postgres' else MemoryJobStore()
+    logger.info(f"[SCHEDULER JOBS] Хранилище разовых задач: {jobstore}, потоков: {max_workers}")
+    return BackgroundScheduler(
+        jobstores={'default': MemoryJobStore(), DYNAMIC_JOBSTORE: dynamic_store},
+        executors={'default': ConnectionScopedThreadPoolExecutor(max_workers)},
+        job_defaults={'coalesce': True, 'max_instances': 1},
+    )
+
+
+def _dynamic_store(scheduler):
+    try:
+        return scheduler._lookup_jobstore(DYNAMIC_JOBSTORE)
+    except KeyError:
+        return None
+
+
+def add_dynamic_job(scheduler, func, run_date, job_id, args=None, kwargs=None):
+    """
+    Разовая задача в хранилище, переживающем перезапуск. func лучше передавать строкой
+    'модуль:функция' — так её найдёт и процесс после перезапуска. Повторная постановка
+    с тем же job_id заменяет задачу, а не дублирует её.
+    """
+    jobstore = DYNAMIC_JOBSTORE if _dynamic_store(scheduler) is not None else 'default'
+    return scheduler.add_job(
+        func, 'date', run_date=run_date, args=args, kwargs=kwargs, id=job_id, jobstore=jobstore,
+        replace_existing=True, misfire_grace_time=MISFIRE_GRACE_SECONDS, coalesce=True,
+    )
+
+
+def diff_dynamic_jobs(scheduler, desired_ids, scope_ids=(), scope_prefixes=()):
+    """
+    Сверка разовых задач: (недостающие, лишние). Недостающие — id из desired_ids, которых нет
+    в хранилище; лишние — сохранённые задачи из области сверки (точные id scope_ids и id,
+    начинающиеся с scope_prefixes), которых нет в desired_ids.
+    """
+    desired_ids = set(desired_ids)
+    store = _dynamic_store(scheduler)
+    if isinstance(store, PostgresJobStore):
+        return store.diff_job_ids(desired_ids, scope_ids, scope_prefixes)
+    existing = {job.id for job in scheduler.get_jobs()}
+    scope_ids = set(scope_ids)
+    prefixes = tuple(scope_prefixes)
+    stale = {job_id for job_id in existing - desired_ids
+             if job_id in scope_ids or (prefixes and job_id.startswith(prefixes))}
+    return desired_ids - existing, stale
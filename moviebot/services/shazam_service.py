@@ -15,6 +15,14 @@ import torch
 import gc
 from tqdm import tqdm
 from datetime import datetime
+from moviebot.services.movie_attribute_index import build_attribute_index, normalize_imdb_id
+from moviebot.services.name_matcher import NameMatcher
+from moviebot.services.ann_index import select_search_index
+from moviebot.services.movie_store import MovieStore, save_movie_store, store_exists, remove_store
+from moviebot.services.query_cache import BatchingEncoder, get_query_cache
+from moviebot.services.voice_pipeline import (
+    WHISPER_WORKERS, StageTimer, TranscriptionPool, decode_ogg_bytes,
+)
 # Whisper заменён на faster-whisper для лучшего качества и производительности
 
 # В начале файла (после всех импортов)
@@ -26,6 +34,12 @@ _index_lock = threading.Lock()
 _model_lock = threading.Lock()
 # Блокировка для загрузки модели Whisper
 _whisper_lock = threading.Lock()
+# Блокировка для построения индекса атрибутов (актёры/режиссёры/жанры)
+_attribute_index_lock = threading.Lock()
+# Блокировка для создания батчевого энкодера запросов
+_encoder_lock = threading.Lock()
+# Блокировка для создания пула распознавания речи
+_transcription_pool_lock = threading.Lock()
 
 # Отключаем ненужный параллелизм, чтобы не было segmentation fault
 os.environ['TOKENIZERS_PARALLELISM'] = 'false'
@@ -41,6 +55,12 @@ _index = None
 _movies_df = None
 _top_actors_set = None  # Множество топ-500 актёров
 _top_directors_set = None  # Множество топ-100 режиссёров
+_top_actors_matcher = None  # NameMatcher по топ-актёрам (опечатки и фамилии)
+_top_directors_matcher = None  # NameMatcher по топ-режиссёрам
+_attribute_index = None  # MovieAttributeIndex для текущего _movies_df
+_movies_store = None  # MovieStore: длинные тексты (description, overview, genres) читаются с диска
+_query_encoder = None  # BatchingEncoder поверх get_model().encode
+_transcription_pool = None  # TranscriptionPool поверх get_whisper()
 
 # Пути — относительные для локального запуска, на Railway работает так же
 CACHE_DIR = Path('cache')
@@ -58,10 +78,15 @@ os.environ['SENTENCE_TRANSFORMERS_HOME'] = str(CACHE_DIR / 'huggingface' / 'sent
 
 TMDB_CSV_PATH = CACHE_DIR / 'tmdb_movies.csv'  # 'cache/tmdb_movies.csv'
 INDEX_PATH = DATA_DIR / 'tmdb_index.faiss'     # 'data/shazam/tmdb_index.faiss'
-DATA_PATH = DATA_DIR / 'tmdb_movies_processed.csv'  # 'data/shazam/tmdb_movies_processed.csv'
+DATA_PATH = DATA_DIR / 'tmdb_movies_processed.csv'  # старый формат, конвертируется в MOVIES_STORE_PATH при первой загрузке
+MOVIES_STORE_PATH = DATA_DIR / 'tmdb_movies_processed'  # колоночное хранилище (memmap), см. movie_store.py
 TOP_ACTORS_PATH = DATA_DIR / 'top_actors.txt'  # Топ-500 актёров
 TOP_DIRECTORS_PATH = DATA_DIR / 'top_directors.txt'  # Топ-100 режиссёров
 
+# Колонки, которые держим в памяти: фильтры, ранжирование и карточка результата.
+# description, overview и genres нужны только для нескольких кандидатов — читаются с диска
+SEARCH_COLUMNS = ['imdb_id', 'title', 'year', 'has_overview', 'actors_str', 'director_str', 'genres_str', 'vote_count']
+
 MIN_VOTE_COUNT = 500
 MAX_MOVIES = 20000
 
@@ -107,6 +132,47 @@ def get_model():
     return _model
 
 
+def get_query_encoder():
+    """Батчевый энкодер запросов: одновременные запросы кодируются одним model.encode()"""
+    global _query_encoder
+    if _query_encoder is None:
+        with _encoder_lock:
+            if _query_encoder is None:
+                model = get_model()
+                _query_encoder = BatchingEncoder(
+                    lambda texts: model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
+                )
+    return _query_encoder
+
+
+def encode_query(query_en):
+    """Эмбеддинг запроса (1, dim) float32 — из кэша или через батчевый энкодер"""
+    cache = get_query_cache()
+    embedding = cache.get_embedding(query_en)
+    if embedding is None:
+        embedding = get_query_encoder().encode(query_en)
+        cache.put_embedding(query_en, embedding)
+    return np.asarray(embedding, dtype='float32').reshape(1, -1)
+
+
+def get_query_stats():
+    """Счётчики кэша запросов и батчевого энкодера (для /metrics)"""
+    result = {'cache': get_query_cache().stats()}
+    if _query_encoder is not None:
+        result['encoder'] = _query_encoder.stats()
+    return result
+
+
+def translate_query_cached(query):
+    """translate_to_english с кэшем по нормализованному запросу"""
+    cache = get_query_cache()
+    query_en = cache.get_translation(query)
+    if query_en is None:
+        query_en = translate_to_english(query)
+        cache.put_translation(query, query_en)
+    return query_en
+
+
 def get_translator():
     global _translator
     if _translator is None:
@@ -162,15 +228,22 @@ def get_whisper():
                     
                     logger.info(f"Загрузка модели faster-whisper: {model_size} (device={device}, compute_type={compute_type})...")
                     logger.info(f"Кэш моделей Whisper: {whisper_cache} (volume на Railway: app/data/shazam/whisper)")
-                    model = WhisperModel(model_size, device=device, compute_type=compute_type, download_root=str(whisper_cache))
+                    # num_workers — сколько transcribe() CTranslate2 выполняет параллельно (по числу воркеров пула)
+                    model = WhisperModel(
+                        model_size, device=device, compute_type=compute_type,
+                        download_root=str(whisper_cache), num_workers=max(1, WHISPER_WORKERS)
+                    )
                     
                     class WhisperWrapper:
                         def __init__(self, model):
                             self.model = model
                             
-                        def __call__(self, audio_path):
+                        def __call__(self, audio):
+                            # audio — путь к файлу или float32 16 кГц (np.ndarray) из decode_ogg_bytes
+                            if not isinstance(audio, np.ndarray):
+                                audio = str(audio)
                             # faster-whisper возвращает генератор, нужно собрать все сегменты
-                            segments, info = self.model.transcribe(str(audio_path), language="ru", beam_size=5)
+                            segments, info = self.model.transcribe(audio, language="ru", beam_size=5)
                             text_parts = []
                             for segment in segments:
                                 text_parts.append(segment.text)
@@ -534,6 +607,54 @@ def transcribe_voice(audio_path):
     return None
 
 
+def _transcribe_audio(audio):
+    """Распознавание уже декодированного аудио (выполняется в потоке пула)"""
+    whisper_model = get_whisper()
+    if not whisper_model:
+        logger.error("Whisper не загрузился")
+        return None
+    return whisper_model(audio).get("text", "").strip()
+
+
+def get_transcription_pool():
+    """Глобальный ограниченный пул распознавания голосовых"""
+    global _transcription_pool
+    if _transcription_pool is None:
+        with _transcription_pool_lock:
+            if _transcription_pool is None:
+                _transcription_pool = TranscriptionPool(_transcribe_audio)
+    return _transcription_pool
+
+
+def get_voice_stats():
+    """Счётчики пула распознавания (для /metrics)"""
+    if _transcription_pool is None:
+        return {}
+    return _transcription_pool.stats()
+
+
+def transcribe_voice_bytes(data, timer=None):
+    """
+    Распознаёт голосовое сообщение из байтов OGG без временных файлов.
+    Стадии decode/transcribe записываются в timer (StageTimer).
+    TranscriptionBusyError пробрасывается — обработчик отвечает «попробуйте позже».
+    """
+    timer = timer or StageTimer()
+    with timer.stage('decode'):
+        audio = decode_ogg_bytes(data)
+    logger.info(f"[TRANSCRIBE] Декодировано {len(audio) / 16000:.1f} с аудио из {len(data)} байт")
+    if not len(audio):
+        logger.warning("[WHISPER] Пустое аудио")
+        return None
+    with timer.stage('transcribe'):
+        text = get_transcription_pool().transcribe(audio)
+    if text:
+        logger.info(f"[WHISPER] Распознано: {text[:120]}...")
+        return text
+    logger.warning("[WHISPER] Пустой результат")
+    return None
+
+
 def convert_ogg_to_wav(ogg_path, wav_path, sample_rate=16000):
     """Оставляем простую конвертацию через pydub (если ещё используешь)"""
     try:
@@ -645,6 +766,42 @@ def _create_top_lists_from_dataframe(df):
     except Exception as e:
         logger.error(f"❌ Ошибка сохранения топ-режиссёров: {e}", exc_info=True)
 
+def _movies_data_exists():
+    return store_exists(MOVIES_STORE_PATH) or DATA_PATH.exists()
+
+
+def _remove_movies_data():
+    remove_store(MOVIES_STORE_PATH)
+    if DATA_PATH.exists():
+        DATA_PATH.unlink()
+
+
+def _load_movies_data():
+    """
+    Открывает колоночное хранилище (при наличии только старого CSV — конвертирует его один раз)
+    и возвращает DataFrame с колонками SEARCH_COLUMNS. Остальные колонки читаются через _movie_text().
+    """
+    global _movies_store
+    if not store_exists(MOVIES_STORE_PATH):
+        logger.info(f"[MOVIE STORE] Конвертация {DATA_PATH} в колоночный формат...")
+        save_movie_store(pd.read_csv(DATA_PATH), MOVIES_STORE_PATH)
+        DATA_PATH.unlink()
+    store = MovieStore(MOVIES_STORE_PATH)
+    movies = store.to_dataframe(SEARCH_COLUMNS)
+    _movies_store = store
+    return movies
+
+
+def _movie_text(movies, idx, column):
+    """Значение колонки для строки idx: из DataFrame, а для длинных текстов — из memmap-хранилища"""
+    if column in movies.columns:
+        return movies.iat[idx, movies.columns.get_loc(column)]
+    store = _movies_store
+    if store is not None and column in store.kinds and len(store) == len(movies):
+        return store.value(column, idx)
+    return ''
+
+
 def build_tmdb_index():
     global _index, _movies_df
 
@@ -657,18 +814,18 @@ def build_tmdb_index():
             if INDEX_PATH.exists():
                 INDEX_PATH.unlink()
                 logger.info("Удален существующий индекс для пересборки")
-            if DATA_PATH.exists():
-                DATA_PATH.unlink()
+            if _movies_data_exists():
+                _remove_movies_data()
                 logger.info("Удалены существующие данные для пересборки")
         except Exception as e:
             logger.warning(f"Ошибка при удалении старого индекса: {e}")
     
     # Проверяем, существует ли индекс - если да, загружаем его вместо пересборки
-    if not force_rebuild and INDEX_PATH.exists() and DATA_PATH.exists():
+    if not force_rebuild and INDEX_PATH.exists() and _movies_data_exists():
         logger.info(f"Индекс уже существует ({INDEX_PATH}), загружаем из файла...")
         try:
             _index = faiss.read_index(str(INDEX_PATH))
-            _movies_df = pd.read_csv(DATA_PATH)
+            _movies_df = _load_movies_data()
             
             # КРИТИЧНО: Проверяем совпадение размерности индекса и текущей модели
             model = get_model()
@@ -683,7 +840,7 @@ def build_tmdb_index():
                 # Удаляем старый индекс, чтобы пересобрать
                 try:
                     INDEX_PATH.unlink()
-                    DATA_PATH.unlink()
+                    _remove_movies_data()
                     logger.info("Старый индекс удален для пересборки")
                 except Exception as e:
                     logger.warning(f"Не удалось удалить старый индекс: {e}")
@@ -708,6 +865,7 @@ def build_tmdb_index():
                         logger.warning("⚠️ Для работы динамического поиска по актёрам/режиссёрам нужно пересобрать индекс с FORCE_REBUILD_INDEX=1")
                 
                 logger.info(f"Индекс успешно загружен из файла, фильмов: {len(_movies_df)}, размерность: {actual_dim}")
+                _index = select_search_index(_index, INDEX_PATH)
                 return _index, _movies_df
         except Exception as e:
             logger.warning(f"Ошибка загрузки существующего индекса: {e}, пересобираем...", exc_info=True)
@@ -1007,12 +1165,12 @@ def build_tmdb_index():
     
     # КЭШИРОВАНИЕ: Проверяем, не были ли эмбеддинги уже сгенерированы
     # Если индекс существует, значит эмбеддинги уже вычислены и сохранены
-    if INDEX_PATH.exists() and DATA_PATH.exists():
+    if INDEX_PATH.exists() and _movies_data_exists():
         logger.info(f"✅ Индекс уже существует ({INDEX_PATH}) - эмбеддинги уже сгенерированы и сохранены")
         logger.info("Загружаем индекс из файла вместо перегенерации эмбеддингов...")
         try:
             _index = faiss.read_index(str(INDEX_PATH))
-            _movies_df = pd.read_csv(DATA_PATH)
+            _movies_df = _load_movies_data()
             
             # Проверяем совпадение размерности с текущей моделью
             model = get_model()
@@ -1025,6 +1183,7 @@ def build_tmdb_index():
                 _movies_df = None
             else:
                 logger.info(f"✅ Индекс загружен из кэша, фильмов: {len(_movies_df)}, размерность: {actual_dim}")
+                _index = select_search_index(_index, INDEX_PATH)
                 return _index, _movies_df
         except Exception as e:
             logger.warning(f"Ошибка загрузки кэшированного индекса: {e}, пересобираем...", exc_info=True)
@@ -1072,9 +1231,13 @@ def build_tmdb_index():
     # Сохраняем индекс в кэш для следующего запуска
     logger.info(f"Сохранение индекса в кэш: {INDEX_PATH}")
     faiss.write_index(index, str(INDEX_PATH))
-    processed.to_csv(DATA_PATH, index=False)
+    save_movie_store(processed, MOVIES_STORE_PATH)
     logger.info("✅ Индекс и эмбеддинги сохранены в кэш")
+    # Дальше работаем с memmap-хранилищем: в памяти остаются только колонки для поиска
+    processed = _load_movies_data()
     
+    # Точный индекс остаётся на диске источником векторов; для поиска может использоваться ANN (SHAZAM_INDEX_TYPE)
+    index = select_search_index(index, INDEX_PATH)
     _index = index
     _movies_df = processed
     
@@ -1083,13 +1246,16 @@ def build_tmdb_index():
 
 def load_top_actors_and_directors():
     """Загружает топ-N актёров и топ-M режиссёров из файлов (N и M берутся из переменных окружения)"""
-    global _top_actors_set, _top_directors_set
+    global _top_actors_set, _top_directors_set, _top_actors_matcher, _top_directors_matcher
     
     if _top_actors_set is not None and _top_directors_set is not None:
         return _top_actors_set, _top_directors_set
     
     _top_actors_set = set()
     _top_directors_set = set()
+    # Порядок строк файла (по популярности) нужен индексу имён для выбора между похожими именами
+    actor_names = []
+    director_names = []
     
     # Загружаем топ-N актёров (количество из переменной окружения)
     logger.info(f"[LOAD TOP LISTS] Проверка файла топ-актёров: {TOP_ACTORS_PATH}")
@@ -1101,7 +1267,8 @@ def load_top_actors_and_directors():
             with open(TOP_ACTORS_PATH, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
                 logger.info(f"[LOAD TOP LISTS] Прочитано строк из файла: {len(lines)}")
-                _top_actors_set = {line.strip().lower() for line in lines if line.strip()}
+                actor_names = [line.strip().lower() for line in lines if line.strip()]
+                _top_actors_set = set(actor_names)
             logger.info(f"✅ Загружено {len(_top_actors_set)} актёров из топ-{TOP_ACTORS_COUNT}")
             if len(_top_actors_set) > 0:
                 logger.info(f"   Примеры первых 5 актёров: {list(_top_actors_set)[:5]}")
@@ -1110,6 +1277,7 @@ def load_top_actors_and_directors():
         except Exception as e:
             logger.error(f"❌ Ошибка загрузки топ-актёров: {e}", exc_info=True)
             _top_actors_set = set()
+            actor_names = []
     else:
         logger.error(f"❌ Файл топ-актёров не найден: {TOP_ACTORS_PATH}")
         logger.error(f"   Абсолютный путь: {TOP_ACTORS_PATH.absolute()}")
@@ -1127,7 +1295,8 @@ def load_top_actors_and_directors():
             with open(TOP_DIRECTORS_PATH, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
                 logger.info(f"[LOAD TOP LISTS] Прочитано строк из файла: {len(lines)}")
-                _top_directors_set = {line.strip().lower() for line in lines if line.strip()}
+                director_names = [line.strip().lower() for line in lines if line.strip()]
+                _top_directors_set = set(director_names)
             logger.info(f"✅ Загружено {len(_top_directors_set)} режиссёров из топ-{TOP_DIRECTORS_COUNT}")
             if len(_top_directors_set) > 0:
                 logger.info(f"   Примеры первых 5 режиссёров: {list(_top_directors_set)[:5]}")
@@ -1136,6 +1305,7 @@ def load_top_actors_and_directors():
         except Exception as e:
             logger.error(f"❌ Ошибка загрузки топ-режиссёров: {e}", exc_info=True)
             _top_directors_set = set()
+            director_names = []
     else:
         logger.error(f"❌ Файл топ-режиссёров не найден: {TOP_DIRECTORS_PATH}")
         logger.error(f"   Абсолютный путь: {TOP_DIRECTORS_PATH.absolute()}")
@@ -1152,11 +1322,21 @@ def load_top_actors_and_directors():
     if len(_top_directors_set) > before:
         logger.info(f"[LOAD TOP LISTS] Добавлено {len(_top_directors_set) - before} режиссёров из кураторского списка")
     
+    _top_actors_matcher = NameMatcher(actor_names)
+    _top_directors_matcher = NameMatcher(director_names + sorted(curated_directors))
+    logger.info(f"[LOAD TOP LISTS] Индекс имён построен: актёры {_top_actors_matcher.stats()}, режиссёры {_top_directors_matcher.stats()}")
+    
     return _top_actors_set, _top_directors_set
 
 
+def get_top_name_matchers():
+    """NameMatcher для топ-актёров и топ-режиссёров (загружает топ-списки при первом вызове)"""
+    load_top_actors_and_directors()
+    return _top_actors_matcher, _top_directors_matcher
+
+
 def get_index_and_movies():
-    global _index, _movies_df
+    global _index, _movies_df, _attribute_index
     
     logger.info("[GET INDEX] Проверка состояния индекса...")
     
@@ -1169,14 +1349,15 @@ def get_index_and_movies():
             if INDEX_PATH.exists():
                 INDEX_PATH.unlink()
                 logger.info("[GET INDEX] Удален существующий индекс")
-            if DATA_PATH.exists():
-                DATA_PATH.unlink()
+            if _movies_data_exists():
+                _remove_movies_data()
                 logger.info("[GET INDEX] Удалены существующие данные")
         except Exception as e:
             logger.warning(f"[GET INDEX] Ошибка при удалении старого индекса: {e}")
         # Сбрасываем глобальные переменные
         _index = None
         _movies_df = None
+        _attribute_index = None
     
     # Сначала проверяем без блокировки, если индекс уже загружен
     if _index is not None and _movies_df is not None:
@@ -1205,6 +1386,8 @@ def get_index_and_movies():
                 logger.info(f"[GET INDEX] Индекс успешно загружен, фильмов: {len(_movies_df)}")
                 # Загружаем топ-списки актёров и режиссёров
                 load_top_actors_and_directors()
+                # Предвычисляем нормализованные атрибуты и инвертированный индекс актёров
+                get_attribute_index(_movies_df)
             else:
                 logger.warning("[GET INDEX] build_tmdb_index() вернул None")
             return _index, _movies_df
@@ -1212,6 +1395,21 @@ def get_index_and_movies():
             logger.error(f"[GET INDEX] Ошибка при загрузке индекса: {e}", exc_info=True)
             return None, None
 
+def get_attribute_index(movies):
+    """
+    Индекс атрибутов (нормализованные актёры/режиссёры/жанры, актёр → строки) для датафрейма movies.
+    Строится один раз на загруженный датафрейм.
+    """
+    global _attribute_index
+    attribute_index = _attribute_index
+    if attribute_index is not None and attribute_index.source is movies:
+        return attribute_index
+    with _attribute_index_lock:
+        if _attribute_index is None or _attribute_index.source is not movies:
+            _attribute_index = build_attribute_index(movies)
+        return _attribute_index
+
+
 def _normalize_text(text):
     """Нормализует текст: приводит к нижнему регистру и убирает знаки препинания"""
     import re
@@ -1220,70 +1418,6 @@ def _normalize_text(text):
     return normalized
 
 
-def _levenshtein_distance(s1, s2):
-    """Вычисляет расстояние Левенштейна между двумя строками"""
-    if len(s1) < len(s2):
-        return _levenshtein_distance(s2, s1)
-    
-    if len(s2) == 0:
-        return len(s1)
-    
-    previous_row = list(range(len(s2) + 1))
-    for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = previous_row[j + 1] + 1
-            deletions = current_row[j] + 1
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
-        previous_row = current_row
-    
-    return previous_row[-1]
-
-
-def _find_name_in_set_with_typos(name, name_set, max_distance=2):
-    """
-    Ищет имя в множестве с учётом опечаток (расстояние Левенштейна <= max_distance).
-    Сначала проверяет точное совпадение, затем ищет с учётом опечаток.
-    
-    Returns:
-        tuple: (found, matched_name) где found - bool, matched_name - найденное имя из set или None
-    """
-    # Сначала проверяем точное совпадение (быстро)
-    if name in name_set:
-        return (True, name)
-    
-    # Если не найдено точно, ищем с учётом опечаток
-    for candidate in name_set:
-        distance = _levenshtein_distance(name, candidate)
-        if distance <= max_distance:
-            return (True, candidate)
-    
-    return (False, None)
-
-
-def _find_name_by_surname(word, name_set):
-    """
-    Ищет полное имя по фамилии (одно слово). Например, 'tarantino' → 'quentin tarantino'.
-    Проверяет: имя заканчивается на ' ' + word или равно word.
-    
-    Returns:
-        tuple: (found, matched_name) или (False, None)
-    """
-    if not word or not name_set:
-        return (False, None)
-    w = word.lower().strip()
-    if len(w) < 3:  # Слишком короткие слова (a, no, jo) не считаем фамилиями
-        return (False, None)
-    for name in name_set:
-        n = name.strip().lower()
-        if n == w:
-            return (True, name)
-        if n.endswith(' ' + w):
-            return (True, name)
-    return (False, None)
-
-
 def _get_actor_position(actors_str, actor_name_normalized):
     """
     Определяет позицию актёра в списке актёров фильма.
@@ -1677,6 +1811,20 @@ def _check_series_keywords(query):
 
 
 def search_movies(query, top_k=15):
+    """Поиск фильмов по описанию; повторные запросы отдаются из кэша результатов"""
+    cache = get_query_cache()
+    # id индекса в ключе: после пересборки индекса старые результаты не используются
+    cached = cache.get_results(query, top_k, FUZZINESS_LEVEL, id(_index))
+    if cached is not None:
+        logger.info(f"[SEARCH MOVIES] Результаты из кэша для запроса: '{query}'")
+        return cached
+    results = _search_movies_uncached(query, top_k)
+    if results:
+        cache.put_results(query, results, top_k, FUZZINESS_LEVEL, id(_index))
+    return results
+
+
+def _search_movies_uncached(query, top_k=15):
     try:
         logger.info(f"[SEARCH MOVIES] Начало поиска для запроса: '{query}' (FUZZINESS_LEVEL={FUZZINESS_LEVEL})")
         
@@ -1697,7 +1845,7 @@ def search_movies(query, top_k=15):
             return []
         
         logger.info(f"[SEARCH MOVIES] Шаг 1: Перевод запроса...")
-        query_en = translate_to_english(query)
+        query_en = translate_query_cached(query)
         logger.info(f"[SEARCH MOVIES] Переведено: '{query}' → '{query_en}'")
         
         # Извлекаем ключевые слова для обычного keyword-матчинга
@@ -1707,6 +1855,7 @@ def search_movies(query, top_k=15):
         
         # Загружаем топ-списки актёров и режиссёров
         top_actors_set, top_directors_set = load_top_actors_and_directors()
+        actors_matcher, directors_matcher = get_top_name_matchers()
         
         # НОВАЯ ЛОГИКА: Пытаемся извлечь ВСЕ имена актёров из запроса (2+ актёра)
         # Проверяем все возможные комбинации слов (2-4 слова)
@@ -1723,14 +1872,14 @@ def search_movies(query, top_k=15):
                     continue
                 added_this_word = False
                 if top_actors_set:
-                    found_actor, matched_actor_name = _find_name_by_surname(w, top_actors_set)
+                    found_actor, matched_actor_name = actors_matcher.find_by_surname(w)
                     if found_actor and matched_actor_name not in found_names:
                         found_names.add(matched_actor_name)
                         mentioned_actors_en.append(('actor', matched_actor_name))
                         logger.info(f"[SEARCH MOVIES] Найдено имя актёра по фамилии (1 слово): '{w}' → '{matched_actor_name}'")
                         added_this_word = True
                 if not added_this_word and top_directors_set:
-                    found_director, matched_director_name = _find_name_by_surname(w, top_directors_set)
+                    found_director, matched_director_name = directors_matcher.find_by_surname(w)
                     if found_director and matched_director_name not in found_names:
                         found_names.add(matched_director_name)
                         mentioned_actors_en.append(('director', matched_director_name))
@@ -1742,7 +1891,7 @@ def search_movies(query, top_k=15):
                     potential_name_normalized = _normalize_text(potential_name)
                     
                     if top_actors_set:
-                        found_actor, matched_actor_name = _find_name_in_set_with_typos(potential_name_normalized, top_actors_set, max_distance=2)
+                        found_actor, matched_actor_name = actors_matcher.find(potential_name_normalized, max_distance=2)
                         if found_actor:
                             if matched_actor_name not in found_names:
                                 found_names.add(matched_actor_name)
@@ -1753,7 +1902,7 @@ def search_movies(query, top_k=15):
                                     logger.info(f"[SEARCH MOVIES] Найдено имя актёра в топ-{TOP_ACTORS_COUNT}: '{matched_actor_name}' ({word_count} слова)")
                     
                     elif top_directors_set:
-                        found_director, matched_director_name = _find_name_in_set_with_typos(potential_name_normalized, top_directors_set, max_distance=2)
+                        found_director, matched_director_name = directors_matcher.find(potential_name_normalized, max_distance=2)
                         if found_director:
                             if matched_director_name not in found_names:
                                 found_names.add(matched_director_name)
@@ -1808,13 +1957,14 @@ def search_movies(query, top_k=15):
             logger.warning("[SEARCH MOVIES] Индекс не найден, возвращаем пустой список")
             return []
         logger.info(f"[SEARCH MOVIES] Индекс получен, фильмов: {len(movies)}")
+        attribute_index = get_attribute_index(movies)
         
         logger.info(f"[SEARCH MOVIES] Шаг 3: Получение модели embeddings...")
-        model = get_model()
+        get_model()
         logger.info(f"[SEARCH MOVIES] Модель получена")
         
         logger.info(f"[SEARCH MOVIES] Шаг 4: Создание эмбеддинга запроса...")
-        query_emb = model.encode([query_en])[0].astype('float32').reshape(1, -1)
+        query_emb = encode_query(query_en)
         logger.info(f"[SEARCH MOVIES] Эмбеддинг создан, размер: {query_emb.shape}")
         
         logger.info(f"[SEARCH MOVIES] Шаг 5: Поиск в индексе...")
@@ -1858,59 +2008,15 @@ def search_movies(query, top_k=15):
             directors_normalized = [_normalize_text(name) for name in mentioned_directors_only]
             actors_normalized = [_normalize_text(name) for name in mentioned_actors_only]
             
-            movies_with_director_and_all_actors = []  # Режиссёр + все актёры (максимальный приоритет)
-            movies_with_director_and_some_actors = []  # Режиссёр + отдельные актёры
-            movies_with_all_actors_no_director = []  # Все актёры, но без режиссёра
-            movies_with_some_actors_no_director = []  # Отдельные актёры, но без режиссёра
+            # Фильтрация через предвычисленный индекс атрибутов: маски вместо обхода всех строк
+            director_match = attribute_index.director_mask(directors_normalized)
+            all_actors_match = attribute_index.actor_mask(actors_normalized, require_all=True)
+            some_actors_match = attribute_index.actor_mask(actors_normalized, require_all=False) & ~all_actors_match
             
-            for idx in range(len(movies)):
-                row = movies.iloc[idx]
-                has_director_match = False
-                has_all_actors = False
-                has_some_actors = False
-                
-                # Проверяем режиссёра
-                if 'director_str' in row.index:
-                    director_str = row.get('director_str', '')
-                    if pd.notna(director_str):
-                        director_str_normalized = _normalize_text(str(director_str))
-                        has_director_match = any(director_name in director_str_normalized for director_name in directors_normalized)
-                
-                # Проверяем актёров
-                # ВАЖНО: Разбиваем actors_str по запятым и проверяем каждое имя отдельно
-                if 'actors_str' in row.index:
-                    actors_str = row.get('actors_str', '')
-                    if pd.notna(actors_str):
-                        # Разбиваем по запятым и нормализуем каждого актёра отдельно
-                        actors_in_movie = [a.strip() for a in str(actors_str).split(',') if a.strip()]
-                        actors_in_movie_normalized = [_normalize_text(actor) for actor in actors_in_movie]
-                        
-                        # Проверяем, есть ли ВСЕ актёры (каждый актёр должен совпадать с одним из актёров в фильме)
-                        has_all_actors = all(
-                            any(actor_name in movie_actor or movie_actor in actor_name 
-                                for movie_actor in actors_in_movie_normalized)
-                            for actor_name in actors_normalized
-                        )
-                        
-                        # Проверяем, есть ли хотя бы один актёр
-                        has_some_actors = any(
-                            any(actor_name in movie_actor or movie_actor in actor_name 
-                                for movie_actor in actors_in_movie_normalized)
-                            for actor_name in actors_normalized
-                        )
-                
-                # Приоритет 1: Режиссёр + все актёры
-                if has_director_match and has_all_actors:
-                    movies_with_director_and_all_actors.append(idx)
-                # Приоритет 2: Режиссёр + отдельные актёры
-                elif has_director_match and has_some_actors:
-                    movies_with_director_and_some_actors.append(idx)
-                # Приоритет 3: Все актёры, но без режиссёра
-                elif not has_director_match and has_all_actors:
-                    movies_with_all_actors_no_director.append(idx)
-                # Приоритет 4: Отдельные актёры, но без режиссёра
-                elif not has_director_match and has_some_actors:
-                    movies_with_some_actors_no_director.append(idx)
+            movies_with_director_and_all_actors = np.flatnonzero(director_match & all_actors_match).tolist()  # Режиссёр + все актёры (максимальный приоритет)
+            movies_with_director_and_some_actors = np.flatnonzero(director_match & some_actors_match).tolist()  # Режиссёр + отдельные актёры
+            movies_with_all_actors_no_director = np.flatnonzero(~director_match & all_actors_match).tolist()  # Все актёры, но без режиссёра
+            movies_with_some_actors_no_director = np.flatnonzero(~director_match & some_actors_match).tolist()  # Отдельные актёры, но без режиссёра
             
             logger.info(f"[SEARCH MOVIES] Найдено фильмов: режиссёр+все актёры={len(movies_with_director_and_all_actors)}, режиссёр+отдельные актёры={len(movies_with_director_and_some_actors)}, все актёры без режиссёра={len(movies_with_all_actors_no_director)}, отдельные актёры без режиссёра={len(movies_with_some_actors_no_director)}")
             
@@ -1976,51 +2082,16 @@ def search_movies(query, top_k=15):
             # Нормализуем все имена для поиска
             actors_normalized = [_normalize_text(name) for name in mentioned_actors_only]
             
-            # Ищем фильмы со ВСЕМИ актёрами (высший приоритет)
-            # ВАЖНО: Разбиваем actors_str по запятым и проверяем каждое имя отдельно
-            for idx in range(len(movies)):
-                row = movies.iloc[idx]
-                if 'actors_str' in row.index:
-                    actors_str = row.get('actors_str', '')
-                    if pd.notna(actors_str):
-                        # Разбиваем по запятым и нормализуем каждого актёра отдельно
-                        actors_in_movie = [a.strip() for a in str(actors_str).split(',') if a.strip()]
-                        actors_in_movie_normalized = [_normalize_text(actor) for actor in actors_in_movie]
-                        
-                        # Проверяем, есть ли ВСЕ актёры (каждый актёр должен совпадать с одним из актёров в фильме)
-                        all_found = all(
-                            any(actor_name in movie_actor or movie_actor in actor_name 
-                                for movie_actor in actors_in_movie_normalized)
-                            for actor_name in actors_normalized
-                        )
-                        if all_found:
-                            movies_with_all_actors.append(idx)
+            # Ищем фильмы со ВСЕМИ актёрами (высший приоритет) — пересечение списков из инвертированного индекса
+            all_actors_match = attribute_index.actor_mask(actors_normalized, require_all=True)
+            movies_with_all_actors = np.flatnonzero(all_actors_match).tolist()
             
             logger.info(f"[SEARCH MOVIES] Найдено фильмов со ВСЕМИ указанными актёрами: {len(movies_with_all_actors)}")
             
-            # Затем ищем фильмы с отдельными актёрами (ниже приоритет)
-            # ВАЖНО: Разбиваем actors_str по запятым и проверяем каждое имя отдельно
+            # Затем ищем фильмы с отдельными актёрами (ниже приоритет) — объединение списков
             logger.info(f"[SEARCH MOVIES] Теперь ищем фильмы с отдельными актёрами...")
-            for idx in range(len(movies)):
-                if idx in movies_with_all_actors:
-                    continue  # Пропускаем фильмы, которые уже найдены
-                
-                row = movies.iloc[idx]
-                if 'actors_str' in row.index:
-                    actors_str = row.get('actors_str', '')
-                    if pd.notna(actors_str):
-                        # Разбиваем по запятым и нормализуем каждого актёра отдельно
-                        actors_in_movie = [a.strip() for a in str(actors_str).split(',') if a.strip()]
-                        actors_in_movie_normalized = [_normalize_text(actor) for actor in actors_in_movie]
-                        
-                        # Проверяем, есть ли хотя бы один актёр
-                        any_found = any(
-                            any(actor_name in movie_actor or movie_actor in actor_name 
-                                for movie_actor in actors_in_movie_normalized)
-                            for actor_name in actors_normalized
-                        )
-                        if any_found:
-                            movies_with_some_actors.append(idx)
+            some_actors_match = attribute_index.actor_mask(actors_normalized, require_all=False) & ~all_actors_match
+            movies_with_some_actors = np.flatnonzero(some_actors_match).tolist()
             
             logger.info(f"[SEARCH MOVIES] Найдено фильмов с отдельными актёрами: {len(movies_with_some_actors)}")
             
@@ -2087,18 +2158,11 @@ def search_movies(query, top_k=15):
             else:
                 logger.info(f"[SEARCH MOVIES] Поиск ВСЕХ фильмов с {'актёром' if is_actor else 'режиссёром'} '{actor_name_for_search}' во всей базе...")
                 
-                actor_movie_indices = []
-                for idx in range(len(movies)):
-                    row = movies.iloc[idx]
-                    
-                    if is_actor and 'actors_str' in row.index:
-                        actors_str = row.get('actors_str', '')
-                        if pd.notna(actors_str) and actor_name_for_search in _normalize_text(actors_str):
-                            actor_movie_indices.append(idx)
-                    elif is_director and not is_actor and 'director_str' in row.index:
-                        director_str = row.get('director_str', '')
-                        if pd.notna(director_str) and actor_name_for_search in _normalize_text(director_str):
-                            actor_movie_indices.append(idx)
+                if is_actor:
+                    actor_movie_mask = attribute_index.actors_string_mask(actor_name_for_search)
+                else:
+                    actor_movie_mask = attribute_index.director_mask([actor_name_for_search])
+                actor_movie_indices = np.flatnonzero(actor_movie_mask).tolist()
                 
                 logger.info(f"[SEARCH MOVIES] Найдено ВСЕГО фильмов с {'актёром' if is_actor else 'режиссёром'} '{actor_name_for_search}': {len(actor_movie_indices)}")
                 
@@ -2115,7 +2179,7 @@ def search_movies(query, top_k=15):
                     
                     for idx in actor_movie_indices:
                         row = movies.iloc[idx]
-                        description = row.get('description', '')
+                        description = _movie_text(movies, idx, 'description')
                         if pd.notna(description) and description:
                             actor_movie_descriptions.append(description)
                             valid_indices.append(idx)
@@ -2166,8 +2230,9 @@ def search_movies(query, top_k=15):
             logger.info(f"[SEARCH MOVIES] Обычный поиск (актёр не найден или не упомянут)...")
             D, I = index.search(query_emb, k=search_k)
             logger.info(f"[SEARCH MOVIES] Поиск завершен, найдено индексов: {len(I[0])}")
-            candidate_indices = I[0].tolist()
-            candidate_distances = [float(D[0][i]) for i in range(len(I[0]))]
+            # ANN-индекс может вернуть -1, если в просмотренных кластерах меньше search_k фильмов
+            candidate_indices = [int(i) for i in I[0] if i >= 0]
+            candidate_distances = [float(d) for d, i in zip(D[0], I[0]) if i >= 0]
             logger.info(f"[SEARCH MOVIES] Обычный поиск, кандидатов: {len(candidate_indices)}")
         
         # Ранжируем кандидаты
@@ -2185,11 +2250,7 @@ def search_movies(query, top_k=15):
             row = movies.iloc[idx]
             imdb_id_raw = str(row['imdb_id']).strip()
             
-            imdb_id_clean = imdb_id_raw.replace('.0', '').replace('.', '').lstrip('t')
-            if imdb_id_clean.isdigit():
-                imdb_id_clean = f"tt{imdb_id_clean.zfill(7)}"
-            else:
-                imdb_id_clean = imdb_id_raw
+            imdb_id_clean = normalize_imdb_id(imdb_id_raw)
             
             if imdb_id_clean != imdb_id_raw:
                 logger.info(f"[SEARCH MOVIES] ID преобразован: '{imdb_id_raw}' → '{imdb_id_clean}'")
@@ -2208,29 +2269,21 @@ def search_movies(query, top_k=15):
             
             # Проверяем режиссёра
             has_director_match = False
-            if mentioned_directors_only and 'director_str' in row.index:
-                director_str = row.get('director_str', '')
-                if pd.notna(director_str):
-                    director_str_normalized = _normalize_text(str(director_str))
-                    directors_names_normalized = [_normalize_text(name) for name in mentioned_directors_only]
-                    has_director_match = any(director_name in director_str_normalized for director_name in directors_names_normalized)
+            if mentioned_directors_only and attribute_index.directors_present[idx]:
+                director_str_normalized = attribute_index.directors_norm[idx]
+                directors_names_normalized = [_normalize_text(name) for name in mentioned_directors_only]
+                has_director_match = any(director_name in director_str_normalized for director_name in directors_names_normalized)
             
             if len(mentioned_actors_only) >= 2:
                 # НОВАЯ ЛОГИКА: 2+ актёра — проверяем, есть ли ВСЕ актёры или отдельные, и режиссёр
                 # ВАЖНО: Разбиваем actors_str по запятым и проверяем каждое имя отдельно
-                actors_str = row.get('actors_str', '')
-                if 'actors_str' in row.index and pd.notna(actors_str):
-                    # Разбиваем по запятым и нормализуем каждого актёра отдельно
-                    actors_in_movie = [a.strip() for a in str(actors_str).split(',') if a.strip()]
-                    actors_in_movie_normalized = [_normalize_text(actor) for actor in actors_in_movie]
+                if attribute_index.actors_present[idx]:
+                    # Актёры фильма уже разбиты по запятым и нормализованы в индексе атрибутов
                     actors_names_normalized = [_normalize_text(name) for name in mentioned_actors_only]
+                    found_count = attribute_index.count_actor_matches(idx, actors_names_normalized)
                     
                     # Проверяем, есть ли ВСЕ актёры (каждый актёр должен совпадать с одним из актёров в фильме)
-                    all_actors_found = all(
-                        any(actor_name in movie_actor or movie_actor in actor_name 
-                            for movie_actor in actors_in_movie_normalized)
-                        for actor_name in actors_names_normalized
-                    )
+                    all_actors_found = found_count == len(actors_names_normalized)
                     
                     if has_director_match and all_actors_found:
                         # МАКСИМАЛЬНЫЙ БУСТ: Режиссёр + все актёры (выше чем только актёры)
@@ -2238,12 +2291,6 @@ def search_movies(query, top_k=15):
                         logger.info(f"[SEARCH MOVIES] Режиссёр {mentioned_directors_only} + ВСЕ актёры {mentioned_actors_only} найдены → +{actor_boost} для {imdb_id_clean}")
                     elif has_director_match:
                         # Режиссёр + отдельные актёры
-                        # ВАЖНО: Разбиваем actors_str по запятым и проверяем каждое имя отдельно
-                        found_count = sum(
-                            1 for actor_name in actors_names_normalized
-                            if any(actor_name in movie_actor or movie_actor in actor_name 
-                                  for movie_actor in actors_in_movie_normalized)
-                        )
                         if found_count > 0:
                             actor_boost = 1500 + (300 * found_count)  # Режиссёр + актёры (выше чем только актёры)
                             logger.info(f"[SEARCH MOVIES] Режиссёр {mentioned_directors_only} + найдено {found_count} из {len(mentioned_actors_only)} актёров → +{actor_boost} для {imdb_id_clean}")
@@ -2253,12 +2300,6 @@ def search_movies(query, top_k=15):
                         logger.info(f"[SEARCH MOVIES] ВСЕ актёры {mentioned_actors_only} найдены (без режиссёра) → +{actor_boost} для {imdb_id_clean}")
                     else:
                         # Отдельные актёры, без режиссёра
-                        # ВАЖНО: Разбиваем actors_str по запятым и проверяем каждое имя отдельно
-                        found_count = sum(
-                            1 for actor_name in actors_names_normalized
-                            if any(actor_name in movie_actor or movie_actor in actor_name 
-                                  for movie_actor in actors_in_movie_normalized)
-                        )
                         if found_count > 0:
                             actor_boost = 300 * found_count  # Только отдельные актёры
                             logger.info(f"[SEARCH MOVIES] Найдено {found_count} из {len(mentioned_actors_only)} актёров (без режиссёра) → +{actor_boost} для {imdb_id_clean}")
@@ -2298,15 +2339,15 @@ def search_movies(query, top_k=15):
             
             # ПРИОРИТЕТ №2: Keyword-матчинг по overview (×25 за каждое совпадение)
             overview_keyword_matches = 0
-            if keywords and 'overview' in row.index:
-                overview_text_normalized = _normalize_text(row.get('overview', ''))
+            if keywords:
+                overview_text_normalized = _normalize_text(_movie_text(movies, idx, 'overview'))
                 overview_keyword_matches = sum(1 for word in keywords if word in overview_text_normalized)
             
             # ПРИОРИТЕТ №3: Буст за жанр (если жанр упомянут в запросе и есть в фильме)
             # Буст зависит от позиции жанра в запросе пользователя (не в API фильма)
             genre_boost = 0
-            if detected_genres and 'genres_str' in row.index:
-                genres_str_normalized = _normalize_text(row.get('genres_str', ''))
+            if detected_genres and attribute_index.has_genres:
+                genres_str_normalized = attribute_index.genres_norm[idx]
                 for genre_info in detected_genres:
                     genre_en = genre_info.get('genre')
                     if genre_en and genre_en in genres_str_normalized:
@@ -2393,7 +2434,7 @@ def search_movies(query, top_k=15):
                 'imdb_id': imdb_id_clean,
                 'title': row['title'],
                 'year': row['year'] if pd.notna(row['year']) else None,
-                'description': row['description'][:500] if 'description' in row.index else '',
+                'description': str(_movie_text(movies, idx, 'description'))[:500],
                 'distance': distance,
                 'has_overview': has_overview,
                 'overview_keyword_matches': overview_keyword_matches,
@@ -2433,24 +2474,15 @@ def search_movies(query, top_k=15):
                 
                 # Находим соответствующий ряд в movies_df по imdb_id
                 matching_row = None
-                for idx, row in movies.iterrows():
-                    row_imdb_id = str(row.get('imdb_id', '')).strip()
-                    # Нормализуем imdb_id для сравнения
-                    row_imdb_id_clean = row_imdb_id.replace('.0', '').replace('.', '').lstrip('t')
-                    if row_imdb_id_clean.isdigit():
-                        row_imdb_id_clean = f"tt{row_imdb_id_clean.zfill(7)}"
-                    else:
-                        row_imdb_id_clean = row_imdb_id
-                    
-                    if row_imdb_id_clean == imdb_id_result:
-                        matching_row = row
-                        break
+                matching_idx = attribute_index.row_for_imdb(imdb_id_result)
+                if matching_idx is not None:
+                    matching_row = movies.iloc[matching_idx]
                 
                 has_genre = False
                 
                 if matching_row is not None:
                     # Проверяем наличие жанра в genres (столбец называется genres, не genres_str)
-                    genres = matching_row.get('genres', '')
+                    genres = _movie_text(movies, matching_idx, 'genres')
                     if pd.notna(genres) and genres:
                         # genres может быть JSON-строкой или уже распарсенным списком
                         try:
@@ -0,0 +1,436 @@
+"""
+Хранилище состояний диалогов (moviebot/states.py) с TTL и ограничением размера.
+
+Раньше состояния были обычными словарями модуля: записи по message_id (bot_messages,
+plan_notification_messages, list_messages, ...) не удалялись никогда, а второй воркер
+не видел состояний первого.
+
+- StateNamespace — словарь (MutableMapping) одного состояния: user_plan_state[user_id],
+  `in`, get, pop, del работают как раньше; у каждого пространства свой TTL (от последней
+  записи) и предельное число записей (лишние вытесняются по LRU);
+- MemoryStateBackend — LRU в памяти процесса (по умолчанию); значения хранятся как есть,
+  поэтому изменения на месте (user_plan_state[user_id]['step'] = 2) видны сразу;
+- PostgresStateBackend — общая для воркеров таблица bot_state с интерфейсом key-value
+  с TTL, как у Redis (get / set с ttl / delete / keys / count); значения — JSON с метками
+  типов (кортежи, множества, даты, словари с нечисловыми ключами не теряются);
+  изменения первого уровня (state['step'] = 2) записываются обратно автоматически,
+  более глубокие нужно записывать присваиванием всего значения.
+  Пространства с shared=False (функции, множества, изменяемые на месте) остаются в памяти;
+- state_store_stats — число записей, пик, вытеснения и истечения по пространствам (/metrics).
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import date, datetime
+
+from moviebot.config import STATE_STORE_BACKEND, STATE_STORE_SWEEP_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class MemoryStateBackend:
+    """LRU в памяти процесса: namespace -> OrderedDict(key -> [value, expires_at])"""
+
+    by_reference = True
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._data = {}
+
+    def _ns(self, namespace):
+        return self._data.setdefault(namespace, OrderedDict())
+
+    def get(self, namespace, key):
+        """(value, expired): value = _MISSING, если записи нет или она истекла"""
+        entries = self._ns(namespace)
+        entry = entries.get(key)
+        if entry is None:
+            return _MISSING, False
+        if entry[1] <= self._clock():
+            del entries[key]
+            return _MISSING, True
+        entries.move_to_end(key)
+        return entry[0], False
+
+    def set(self, namespace, key, value, ttl, max_entries):
+        """Возвращает число вытесненных записей"""
+        entries = self._ns(namespace)
+        entries[key] = [value, self._clock() + ttl]
+        entries.move_to_end(key)
+        evicted = 0
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def delete(self, namespace, key):
+        return self._ns(namespace).pop(key, None) is not None
+
+    def keys(self, namespace):
+        now = self._clock()
+        return [k for k, entry in self._ns(namespace).items() if entry[1] > now]
+
+    def count(self, namespace):
+        return len(self._ns(namespace))
+
+    def sweep(self, namespace, max_entries):
+        """Удаляет истёкшие записи; возвращает (истёкших, вытесненных)"""
+        entries = self._ns(namespace)
+        now = self._clock()
+        expired = [k for k, entry in entries.items() if entry[1] <= now]
+        for key in expired:
+            del entries[key]
+        return len(expired), 0
+
+    def clear(self, namespace):
+        self._ns(namespace).clear()
+
+
+_TAGS = ('__items__', '__tuple__', '__set__', '__datetime__', '__date__')
+
+
+def _encode(value):
+    """JSON с метками типов, которые обычный JSON теряет"""
+    if isinstance(value, dict):
+        if all(isinstance(k, str) for k in value) and not (len(value) == 1 and next(iter(value)) in _TAGS):
+            return {k: _encode(v) for k, v in value.items()}
+        return {'__items__': [[_encode(k), _encode(v)] for k, v in value.items()]}
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(v) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        return {'__set__': [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"значение типа {type(value).__name__} нельзя сохранить в общем хранилище")
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        tag, payload = next(iter(value.items()))
+        if tag == '__items__':
+            return {_hashable(_decode(k)): _decode(v) for k, v in payload}
+        if tag == '__tuple__':
+            return tuple(_decode(v) for v in payload)
+        if tag == '__set__':
+            return {_hashable(_decode(v)) for v in payload}
+        if tag == '__datetime__':
+            return datetime.fromisoformat(payload)
+        if tag == '__date__':
+            return date.fromisoformat(payload)
+    return {k: _decode(v) for k, v in value.items()}
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+def dumps_state(value):
+    return json.dumps(_encode(value), ensure_ascii=False)
+
+
+def loads_state(text):
+    return _decode(json.loads(text))
+
+
+class PostgresStateBackend:
+    """Таблица bot_state (namespace, key, value, expires_at) — общая для всех воркеров"""
+
+    by_reference = False
+
+    def __init__(self, connection_factory=None):
+        self._connection_factory = connection_factory
+
+    def _connection(self):
+        if self._connection_factory is None:
+            from moviebot.database.db_connection import db_connection
+            self._connection_factory = db_connection
+        return self._connection_factory()
+
+    def get(self, namespace, key):
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT value, expires_at <= NOW() AS expired FROM bot_state WHERE namespace = %s AND key = %s
+            """, (namespace, json.dumps(key)))
+            row = cur.fetchone()
+        if row is None:
+            return _MISSING, False
+        if row['expired']:
+            return _MISSING, True
+        return loads_state(row['value']), False
+
+    def set(self, namespace, key, value, ttl, max_entries):
+        payload = dumps_state(value)
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO bot_state (namespace, key, value, expires_at, updated_at)
+                VALUES (%s, %s, %s, NOW() + %s * INTERVAL '1 second', NOW())
+                ON CONFLICT (namespace, key) DO UPDATE
+                SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at, updated_at = NOW()
+            """, (namespace, json.dumps(key), payload, ttl))
+        return 0  # предел размера соблюдает sweep
+
+    def delete(self, namespace, key):
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM bot_state WHERE namespace = %s AND key = %s", (namespace, json.dumps(key)))
+            return cur.rowcount > 0
+
+    def keys(self, namespace):
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT key FROM bot_state WHERE namespace = %s AND expires_at > NOW() ORDER BY updated_at",
+                        (namespace,))
+            return [json.loads(row['key']) for row in cur.fetchall()]
+
+    def count(self, namespace):
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) AS cnt FROM bot_state WHERE namespace = %s", (namespace,))
+            return cur.fetchone()['cnt']
+
+    def sweep(self, namespace, max_entries):
+        """Удаляет истёкшие записи и самые старые сверх max_entries; возвращает (истёкших, вытесненных)"""
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM bot_state WHERE namespace = %s AND expires_at <= NOW()", (namespace,))
+            removed = cur.rowcount
+            cur.execute("""
+                DELETE FROM bot_state WHERE namespace = %s AND key IN (
+                    SELECT key FROM bot_state WHERE namespace = %s ORDER BY updated_at DESC OFFSET %s
+                )
+            """, (namespace, namespace, max_entries))
+            return removed, cur.rowcount
+
+    def clear(self, namespace):
+        with self._connection() as conn:
+            conn.cursor().execute("DELETE FROM bot_state WHERE namespace = %s", (namespace,))
+
+
+class _WriteBackDict(dict):
+    """Значение из общего хранилища: изменения первого уровня записываются обратно"""
+
+    def __init__(self, data, namespace, key):
+        super().__init__(data)
+        self._namespace = namespace
+        self._key = key
+
+    def _save(self):
+        self._namespace[self._key] = dict(self)
+
+    def __setitem__(self, k, v):
+        super().__setitem__(k, v)
+        self._save()
+
+    def __delitem__(self, k):
+        super().__delitem__(k)
+        self._save()
+
+    def pop(self, k, *default):
+        result = super().pop(k, *default)
+        self._save()
+        return result
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._save()
+
+    def setdefault(self, k, default=None):
+        if k in self:
+            return self[k]
+        self[k] = default
+        return default
+
+    def clear(self):
+        super().clear()
+        self._save()
+
+
+class StateNamespace(MutableMapping):
+    """Одно состояние бота (бывший словарь модуля states) поверх бэкенда с TTL и пределом размера"""
+
+    def __init__(self, name, ttl, max_entries, backend, clock=time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._backend = backend
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._last_sweep = clock()
+        self._stats = {'sets': 0, 'hits': 0, 'misses': 0, 'deletes': 0, 'evicted': 0, 'expired': 0,
+                       'peak': 0, 'errors': 0}
+
+    @property
+    def backend_name(self):
+        return 'memory' if self._backend.by_reference else 'shared'
+
+    def _lookup(self, key):
+        with self._lock:
+            value, expired = self._backend.get(self.name, key)
+            if expired:
+                self._stats['expired'] += 1
+            self._stats['misses' if value is _MISSING else 'hits'] += 1
+        if value is not _MISSING and not self._backend.by_reference and type(value) is dict:
+            value = _WriteBackDict(value, self, key)
+        return value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        with self._lock:
+            value, expired = self._backend.get(self.name, key)
+            if expired:
+                self._stats['expired'] += 1
+        return value is not _MISSING
+
+    def __setitem__(self, key, value):
+        if isinstance(value, _WriteBackDict):
+            value = dict(value)
+        with self._lock:
+            try:
+                evicted = self._backend.set(self.name, key, value, self.ttl, self.max_entries)
+            except Exception:
+                self._stats['errors'] += 1
+                raise
+            self._stats['sets'] += 1
+            self._stats['evicted'] += evicted
+            if self._backend.by_reference:
+                self._stats['peak'] = max(self._stats['peak'], self._backend.count(self.name))
+            self._maybe_sweep()
+
+    def __delitem__(self, key):
+        with self._lock:
+            if not self._backend.delete(self.name, key):
+                raise KeyError(key)
+            self._stats['deletes'] += 1
+
+    def pop(self, key, default=_MISSING):
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                if default is _MISSING:
+                    raise KeyError(key)
+                return default
+            self._backend.delete(self.name, key)
+            self._stats['deletes'] += 1
+        return dict(value) if isinstance(value, _WriteBackDict) else value
+
+    def keys(self):
+        """Снимок ключей (не ломается, если состояние меняют из другого потока)"""
+        with self._lock:
+            return self._backend.keys(self.name)
+
+    def items(self):
+        return [(key, value) for key in self.keys() for value in (self.get(key, _MISSING),) if value is not _MISSING]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def clear(self):
+        with self._lock:
+            self._backend.clear(self.name)
+
+    def _maybe_sweep(self):
+        now = self._clock()
+        if now - self._last_sweep < STATE_STORE_SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        self.sweep()
+
+    def sweep(self):
+        """Удаляет истёкшие записи (вызывается при записи не чаще STATE_STORE_SWEEP_INTERVAL)"""
+        with self._lock:
+            try:
+                expired, evicted = self._backend.sweep(self.name, self.max_entries)
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.warning(f"[STATE STORE] Ошибка очистки {self.name}: {e}")
+                return 0
+            self._stats['expired'] += expired
+            self._stats['evicted'] += evicted
+            return expired + evicted
+
+    def stats(self):
+        with self._lock:
+            entries = self._backend.count(self.name)
+            return dict(self._stats, entries=entries, max_entries=self.max_entries, ttl=self.ttl,
+                        backend=self.backend_name)
+
+    def __repr__(self):
+        return f"<StateNamespace {self.name} ({self.backend_name})>"
+
+
+_memory_backend = MemoryStateBackend()
+_shared_backend = None
+_namespaces = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def _get_shared_backend():
+    global _shared_backend
+    if STATE_STORE_BACKEND != 'postgres':
+        return _memory_backend
+    if _shared_backend is None:
+        _shared_backend = PostgresStateBackend()
+    return _shared_backend
+
+
+def state_namespace(name, ttl, max_entries, shared=True):
+    """
+    Регистрирует состояние. shared=False — только память процесса (значения с функциями,
+    множествами или списками, которые меняются на месте).
+    """
+    backend = _get_shared_backend() if shared else _memory_backend
+    namespace = StateNamespace(name, ttl, max_entries, backend)
+    with _registry_lock:
+        _namespaces[name] = namespace
+    return namespace
+
+
+def state_store_stats():
+    """Сводка по всем состояниям для /metrics"""
+    per_namespace = {}
+    for name, namespace in list(_namespaces.items()):
+        try:
+            per_namespace[name] = namespace.stats()
+        except Exception as e:
+            per_namespace[name] = {'error': str(e)}
+    total = sum(s.get('entries', 0) for s in per_namespace.values())
+    return {
+        'backend': STATE_STORE_BACKEND,
+        'entries': total,
+        'evicted': sum(s.get('evicted', 0) for s in per_namespace.values()),
+        'expired': sum(s.get('expired', 0) for s in per_namespace.values()),
+        'namespaces': per_namespace,
+    }
+
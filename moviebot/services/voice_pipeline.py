@@ -0,0 +1,138 @@
+"""
+Голосовые запросы Шазама без временных файлов.
+
+- decode_ogg_bytes: OGG/Opus из Telegram декодируется в памяти (PyAV, тот же
+  декодер, что использует faster-whisper) сразу в float32 16 кГц моно —
+  формат, который WhisperModel.transcribe принимает вместо пути к файлу.
+- TranscriptionPool: ограниченный пул распознавания. Одновременные голосовые
+  выполняются не более чем в `workers` потоках, ещё `max_queue` ждут очереди,
+  остальным сразу отвечаем «занято», а не держим поток обработчика.
+- StageTimer: время стадий download / decode / transcribe / search для логов.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WHISPER_SAMPLE_RATE = 16000
+WHISPER_WORKERS = int(os.getenv('SHAZAM_WHISPER_WORKERS', '2'))
+WHISPER_QUEUE_SIZE = int(os.getenv('SHAZAM_WHISPER_QUEUE_SIZE', '8'))
+# Сколько обработчик ждёт результата распознавания (очередь + сама транскрипция)
+WHISPER_TIMEOUT = float(os.getenv('SHAZAM_WHISPER_TIMEOUT', '120'))
+
+
+class TranscriptionBusyError(Exception):
+    """Все воркеры заняты и очередь распознавания заполнена"""
+
+
+def decode_ogg_bytes(data, sample_rate=WHISPER_SAMPLE_RATE):
+    """
+    Декодирует аудио (OGG/Opus и любой формат, который понимает ffmpeg/PyAV) из байтов.
+    Возвращает np.ndarray float32 в диапазоне [-1, 1], моно, с частотой sample_rate.
+    """
+    if not data:
+        return np.zeros(0, dtype=np.float32)
+    from faster_whisper.audio import decode_audio
+    audio = decode_audio(io.BytesIO(bytes(data)), sampling_rate=sample_rate)
+    return np.ascontiguousarray(audio, dtype=np.float32)
+
+
+class StageTimer:
+    """Последовательные замеры стадий обработки: with timer.stage('decode'): ..."""
+
+    def __init__(self):
+        self.timings = {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def total(self):
+        return sum(self.timings.values())
+
+    def format(self):
+        parts = [f"{name}={seconds * 1000:.0f}мс" for name, seconds in self.timings.items()]
+        parts.append(f"total={self.total() * 1000:.0f}мс")
+        return ' '.join(parts)
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self._timer = timer
+        self._name = name
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._timer.add(self._name, time.perf_counter() - self._started)
+        return False
+
+
+class TranscriptionPool:
+    """
+    Пул распознавания речи поверх transcribe_fn(audio) -> str.
+    В работе и в очереди одновременно не больше workers + max_queue задач.
+    """
+
+    def __init__(self, transcribe_fn, workers=WHISPER_WORKERS, max_queue=WHISPER_QUEUE_SIZE):
+        self._transcribe_fn = transcribe_fn
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shazam-whisper')
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'in_flight': 0}
+
+    def submit(self, audio):
+        """Ставит аудио в очередь; Future с текстом. TranscriptionBusyError, если мест нет"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise TranscriptionBusyError(
+                f"Очередь распознавания заполнена ({self.workers} воркеров, очередь {self.max_queue})"
+            )
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._stats['in_flight'] += 1
+        try:
+            return self._executor.submit(self._run, audio)
+        except Exception:
+            self._release(failed=True)
+            raise
+
+    def transcribe(self, audio, timeout=WHISPER_TIMEOUT):
+        """Синхронное распознавание через пул"""
+        return self.submit(audio).result(timeout=timeout)
+
+    def _run(self, audio):
+        failed = True
+        try:
+            result = self._transcribe_fn(audio)
+            failed = False
+            return result
+        finally:
+            self._release(failed)
+
+    def _release(self, failed):
+        with self._lock:
+            self._stats['in_flight'] -= 1
+            self._stats['failed' if failed else 'completed'] += 1
+        self._slots.release()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, workers=self.workers, max_queue=self.max_queue)
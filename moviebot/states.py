@@ -1,31 +1,41 @@
 """
 Модуль для глобальных состояний бота
+
+Каждое состояние — словарь поверх services.state_store: записи живут не дольше TTL
+с последней записи, размер ограничен STATE_MAX_ENTRIES. При STATE_STORE_BACKEND=postgres
+состояния общие для всех воркеров; изменения значения глубже первого уровня
+(state[user_id]['data']['key'] = ...) нужно сохранять присваиванием state[user_id] = data.
+Состояния с shared=False (функции, множества и вложенные словари, меняемые на месте)
+всегда остаются в памяти процесса.
 """
 import time
 
+from moviebot.config import STATE_MAX_ENTRIES, STATE_TTL_CONVERSATION, STATE_TTL_MESSAGES
+from moviebot.services.state_store import state_namespace
+
 # Состояния планирования
-user_plan_state = {}  # user_id: {'step': int, 'link': str, 'type': str, 'day_or_date': str}
-bot_messages = {}  # message_id: link (храним карточки бота)
-plan_notification_messages = {}  # message_id: {'link': str} (храним сообщения о планах для обработки реакций)
-list_messages = {}  # message_id: chat_id (храним сообщения /list для обработки ответов)
-plan_error_messages = {}  # message_id: {'user_id': int, 'chat_id': int, 'link': str, 'plan_type': str or None, 'day_or_date': str or None, 'missing': str}
+user_plan_state = state_namespace('user_plan_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'step': int, 'link': str, 'type': str, 'day_or_date': str}
+bot_messages = state_namespace('bot_messages', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES)  # message_id: link (храним карточки бота)
+plan_notification_messages = state_namespace('plan_notification_messages', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES)  # message_id: {'link': str} (храним сообщения о планах для обработки реакций)
+list_messages = state_namespace('list_messages', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES)  # message_id: chat_id (храним сообщения /list для обработки ответов)
+plan_error_messages = state_namespace('plan_error_messages', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES)  # message_id: {'user_id': int, 'chat_id': int, 'link': str, 'plan_type': str or None, 'day_or_date': str or None, 'missing': str}
 
 # Состояния настроек
-user_settings_state = {}  # user_id: {'waiting_emoji': bool}
-settings_messages = {}  # message_id: {'user_id': int, 'action': str, 'chat_id': int} - для отслеживания сообщений settings
-user_import_state = {}  # user_id: {'step': str, 'kp_user_id': str, 'count': int} - для импорта базы из Кинопоиска
+user_settings_state = state_namespace('user_settings_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'waiting_emoji': bool}
+settings_messages = state_namespace('settings_messages', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES)  # message_id: {'user_id': int, 'action': str, 'chat_id': int} - для отслеживания сообщений settings
+user_import_state = state_namespace('user_import_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'step': str, 'kp_user_id': str, 'count': int} - для импорта базы из Кинопоиска
 
 # Состояния очистки
-user_clean_state = {}  # user_id: {'action': str, 'target': str}
-clean_votes = {}  # message_id: {'chat_id': int, 'members_count': int, 'voted': set}
-clean_unwatched_votes = {}  # message_id: {'chat_id': int, 'members_count': int, 'voted': set}
+user_clean_state = state_namespace('user_clean_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'action': str, 'target': str}
+clean_votes = state_namespace('clean_votes', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES, shared=False)  # message_id: {'chat_id': int, 'members_count': int, 'voted': set}
+clean_unwatched_votes = state_namespace('clean_unwatched_votes', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES, shared=False)  # message_id: {'chat_id': int, 'members_count': int, 'voted': set}
 
 # Состояния редактирования
-user_edit_state = {}  # user_id: {'action': str, 'plan_id': int, 'step': str, ...}
+user_edit_state = state_namespace('user_edit_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'action': str, 'plan_id': int, 'step': str, ...}
 
 # Состояния работы с билетами (TTL 15 мин — не блокировать часы)
 TICKET_STATE_TTL_SEC = 900
-user_ticket_state = {}  # user_id: {'step': str, 'plan_id': int, 'file_id': str, 'created_at': float, ...}
+user_ticket_state = state_namespace('user_ticket_state', TICKET_STATE_TTL_SEC, STATE_MAX_ENTRIES)  # user_id: {'step': str, 'plan_id': int, 'file_id': str, 'created_at': float, ...}
 
 
 def is_user_in_valid_ticket_state(user_id):
@@ -43,51 +53,51 @@ def is_user_in_valid_ticket_state(user_id):
     return True
 
 # Состояния поиска
-user_search_state = {}  # user_id: {'chat_id': int, 'message_id': int}
+user_search_state = state_namespace('user_search_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'chat_id': int, 'message_id': int}
 
 # Состояния рандома
-user_random_state = {}  # user_id: {'step': str, 'mode': str, ...}
+user_random_state = state_namespace('user_random_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'step': str, 'mode': str, ...}
 
 # Состояния списка
-user_list_state = {}  # user_id: {'chat_id': int, 'page': int}
-user_view_film_state = {}  # user_id: {'chat_id': int} - состояние ожидания ответного сообщения для просмотра страницы фильма
-user_mark_watched_state = {}  # user_id: {'chat_id': int, 'prompt_message_id': int} - состояние ожидания ответного сообщения для отметки фильма просмотренным
+user_list_state = state_namespace('user_list_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'chat_id': int, 'page': int}
+user_view_film_state = state_namespace('user_view_film_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'chat_id': int} - состояние ожидания ответного сообщения для просмотра страницы фильма
+user_mark_watched_state = state_namespace('user_mark_watched_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'chat_id': int, 'prompt_message_id': int} - состояние ожидания ответного сообщения для отметки фильма просмотренным
 
 # Сообщения "Добавлено в базу" для обработки реплаев с оценками
-added_movie_messages = {}  # message_id: {'chat_id': int, 'film_id': int, 'kp_id': str, 'link': str, 'title': str}
+added_movie_messages = state_namespace('added_movie_messages', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES)  # message_id: {'chat_id': int, 'film_id': int, 'kp_id': str, 'link': str, 'title': str}
 
 # Состояния оплаты
-user_payment_state = {}  # user_id: {'step': str, 'subscription_type': str, 'plan_type': str, 'period_type': str, 'chat_id': int, 'group_username': str, 'telegram_username': str}
-user_cancel_subscription_state = {}  # user_id: {'subscription_id': int, 'subscription_type': str, 'chat_id': int}
+user_payment_state = state_namespace('user_payment_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES, shared=False)  # user_id: {'step': str, 'subscription_type': str, 'plan_type': str, 'period_type': str, 'chat_id': int, 'group_username': str, 'telegram_username': str}
+user_cancel_subscription_state = state_namespace('user_cancel_subscription_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'subscription_id': int, 'subscription_type': str, 'chat_id': int}
 
 # Состояния работы с сериалами
-user_episodes_state = {}  # user_id: {'kp_id': str, 'season_num': int, 'episodes': list, ...}
-user_episode_auto_mark_state = {}  # user_id: {'kp_id': str, 'season_num': int, 'episodes': list of (season_num, episode_num)} - последние автоматически отмеченные серии
+user_episodes_state = state_namespace('user_episodes_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'kp_id': str, 'season_num': int, 'episodes': list, ...}
+user_episode_auto_mark_state = state_namespace('user_episode_auto_mark_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'kp_id': str, 'season_num': int, 'episodes': list of (season_num, episode_num)} - последние автоматически отмеченные серии
 
 # Сообщения для обработки оценок
-rating_messages = {}  # message_id: film_id (для обработки реплаев с оценками)
+rating_messages = state_namespace('rating_messages', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES)  # message_id: film_id (для обработки реплаев с оценками)
 
 # Состояния игры с кубиком
-dice_game_state = {}  # chat_id: {'participants': {user_id: dice_value}, 'message_id': int, 'start_time': datetime}
+dice_game_state = state_namespace('dice_game_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES, shared=False)  # chat_id: {'participants': {user_id: dice_value}, 'message_id': int, 'start_time': datetime}
 
 # Состояния возврата звезд
-user_refund_state = {}  # user_id: {'chat_id': int} - состояние ожидания ввода charge_id для возврата
+user_refund_state = state_namespace('user_refund_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'chat_id': int} - состояние ожидания ввода charge_id для возврата
 
 # Состояния промокодов
-user_promo_state = {}  # user_id: {'chat_id': int, 'message_id': int, 'sub_type': str, 'plan_type': str, 'period_type': str, 'group_size': int or None, 'payment_id': str, 'original_price': float} - состояние ожидания ввода промокода
-user_promo_admin_state = {}  # user_id: {} - состояние ожидания ввода промокода для /promo
+user_promo_state = state_namespace('user_promo_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'chat_id': int, 'message_id': int, 'sub_type': str, 'plan_type': str, 'period_type': str, 'group_size': int or None, 'payment_id': str, 'original_price': float} - состояние ожидания ввода промокода
+user_promo_admin_state = state_namespace('user_promo_admin_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {} - состояние ожидания ввода промокода для /promo
 
 # Состояния админских команд
-user_unsubscribe_state = {}  # user_id: {'message_id': int} - состояние ожидания ввода ID для /unsubscribe
-user_add_admin_state = {}  # user_id: {'message_id': int} - состояние ожидания ввода ID для /add_admin
-user_check_state = {}  # user_id: {'step': str, 'message_id': int, 'target_id': int, 'target_name': str} - состояние для команды /check
-user_check_receipt_state = {}  # message_id: {'target_chat_id': int, 'subscription_id': int, 'subscription_type': str} - состояние для обработки чека в реплае на сообщение об оплате
+user_unsubscribe_state = state_namespace('user_unsubscribe_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'message_id': int} - состояние ожидания ввода ID для /unsubscribe
+user_add_admin_state = state_namespace('user_add_admin_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'message_id': int} - состояние ожидания ввода ID для /add_admin
+user_check_state = state_namespace('user_check_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'step': str, 'message_id': int, 'target_id': int, 'target_name': str} - состояние для команды /check
+user_check_receipt_state = state_namespace('user_check_receipt_state', STATE_TTL_MESSAGES, STATE_MAX_ENTRIES)  # message_id: {'target_chat_id': int, 'subscription_id': int, 'subscription_type': str} - состояние для обработки чека в реплае на сообщение об оплате
 
 # Состояния Шазам
-shazam_state = {}  # user_id: {'mode': 'text' or 'voice', 'chat_id': int} - состояние ожидания запроса для Шазам
+shazam_state = state_namespace('shazam_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'mode': 'text' or 'voice', 'chat_id': int} - состояние ожидания запроса для Шазам
 
 # Состояние для личных чатов - ожидание следующего сообщения после промпта handler'а
-user_private_handler_state = {}  # user_id: {'handler': str, 'prompt_message_id': int, 'handler_func': callable}
+user_private_handler_state = state_namespace('user_private_handler_state', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES, shared=False)  # user_id: {'handler': str, 'prompt_message_id': int, 'handler_func': callable}
 
 # Состояние ожидания текстового ввода от пользователя
-user_expected_text = {}  # user_id: {'chat_id': int, 'expected_for': str, 'message_id': int optional}
+user_expected_text = state_namespace('user_expected_text', STATE_TTL_CONVERSATION, STATE_MAX_ENTRIES)  # user_id: {'chat_id': int, 'expected_for': str, 'message_id': int optional}
@@ -0,0 +1,89 @@
+"""
+Тесты движка ачивок services/achievement_engine.py (без БД)
+"""
+import unittest
+from datetime import datetime
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import pytz
+
+from moviebot.api.site_stats import _has_year_streak
+from moviebot.services.achievement_engine import (
+    COUNTERS, PROFILE_KEY_COUNTERS, achievement_definitions, evaluate_achievements, months_since
+)
+
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=pytz.UTC)
+
+
+def _counters(**values):
+    counters = {name: 0 for name in COUNTERS}
+    counters['first_activity'] = None
+    counters['year_streak'] = False
+    counters.update(values)
+    return counters
+
+
+class TestDefinitions(unittest.TestCase):
+    """Каждая ачивка профиля читает счётчик строки stats_profile_rollups"""
+
+    def test_every_achievement_has_known_counter(self):
+        ids = [a['id'] for a in achievement_definitions()]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids[-1], 'collector')
+        for ach in achievement_definitions():
+            if ach['counter'] is not None:
+                self.assertIn(ach['counter'], COUNTERS, ach['id'])
+        self.assertTrue(set(PROFILE_KEY_COUNTERS.values()) <= set(COUNTERS))
+
+
+class TestEvaluateAchievements(unittest.TestCase):
+    """Тесты evaluate_achievements"""
+
+    def test_thresholds(self):
+        earned = evaluate_achievements(_counters(total_ratings=10, total_films=0), NOW)
+        self.assertIn('ratings_10', earned)
+        self.assertNotIn('films_1', earned)
+
+    def test_lost_counters_drop_achievements(self):
+        self.assertEqual(evaluate_achievements(_counters(), NOW), set())
+
+    def test_oldtimer(self):
+        counters = _counters(first_activity=datetime(2025, 9, 1, tzinfo=pytz.UTC))
+        self.assertEqual(evaluate_achievements(counters, NOW), {'oldtimer'})
+
+    def test_collector_follows_earned_count(self):
+        earned = evaluate_achievements(
+            _counters(total_films=10, total_ratings=100, total_cinema=10, total_plans=5), NOW)
+        self.assertEqual(len(earned - {'collector'}), 11)
+        self.assertIn('collector', earned)
+        self.assertNotIn('collector', evaluate_achievements(_counters(total_films=10), NOW))
+
+    def test_year_streak_and_mvp(self):
+        earned = evaluate_achievements(_counters(year_streak=True, mvp_count=6), NOW)
+        self.assertTrue({'year_streak', 'mvp_legend'} <= earned)
+
+
+class TestHelpers(unittest.TestCase):
+    """Тесты _has_year_streak и months_since"""
+
+    def test_year_streak_crosses_year_boundary(self):
+        start = 2024 * 12 + 5  # июнь 2024
+        self.assertTrue(_has_year_streak(range(start, start + 12)))
+        self.assertFalse(_has_year_streak([m for m in range(start, start + 12) if m != start + 6]))
+        self.assertFalse(_has_year_streak([]))
+
+    def test_months_since(self):
+        self.assertEqual(months_since(None, NOW), 0)
+        self.assertEqual(months_since(datetime(2025, 10, 31), NOW), 12)
+        self.assertEqual(months_since(datetime(2026, 11, 1, tzinfo=pytz.UTC), NOW), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Тесты для фабрики FAISS-индексов services/ann_index.py
+"""
+import unittest
+import unittest.mock
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import faiss
+import numpy as np
+
+from moviebot.services import ann_index
+
+
+class TestResolveIndexType(unittest.TestCase):
+    """Тесты выбора типа индекса"""
+
+    def test_auto_uses_flat_for_small_dataset(self):
+        self.assertEqual(ann_index.resolve_index_type('auto', 1000, min_vectors=5000), 'flat')
+        self.assertEqual(ann_index.resolve_index_type('auto', 10000, min_vectors=5000), ann_index.AUTO_INDEX_TYPE)
+
+    def test_explicit_type_falls_back_when_small(self):
+        self.assertEqual(ann_index.resolve_index_type('hnsw', 100, min_vectors=5000), 'flat')
+        self.assertEqual(ann_index.resolve_index_type('hnsw', 10000, min_vectors=5000), 'hnsw')
+
+    def test_unknown_type(self):
+        self.assertEqual(ann_index.resolve_index_type('annoy', 10 ** 6), 'flat')
+
+
+class TestSelectSearchIndex(unittest.TestCase):
+    """Тесты построения и сохранения приближённого индекса"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.flat_path = Path(self.tmp.name) / 'tmdb_index.faiss'
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(2000, 16)).astype('float32')
+        self.flat = faiss.IndexFlatL2(16)
+        self.flat.add(self.vectors)
+        faiss.write_index(self.flat, str(self.flat_path))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_small_dataset_returns_flat(self):
+        self.assertIs(ann_index.select_search_index(self.flat, self.flat_path, 'ivf_flat'), self.flat)
+
+    def test_ivf_built_persisted_and_reloaded(self):
+        index = ann_index.select_search_index(self.flat, self.flat_path, 'ivf_flat', min_vectors=1)
+        self.assertIsInstance(index, faiss.IndexIVFFlat)
+        index_path, meta_path = ann_index.ann_paths(self.flat_path, 'ivf_flat')
+        self.assertTrue(index_path.exists() and meta_path.exists())
+
+        with unittest.mock.patch.object(ann_index, 'create_index', side_effect=AssertionError('не должен пересобираться')):
+            reloaded = ann_index.select_search_index(self.flat, self.flat_path, 'ivf_flat', min_vectors=1)
+        self.assertEqual(reloaded.ntotal, 2000)
+        self.assertEqual(reloaded.nprobe, index.nprobe)
+
+        _, expected = self.flat.search(self.vectors[:5], 1)
+        _, got = reloaded.search(self.vectors[:5], 1)
+        self.assertEqual(got[:, 0].tolist(), expected[:, 0].tolist())
+
+    def test_hnsw_search_params_applied(self):
+        index = ann_index.select_search_index(self.flat, self.flat_path, 'hnsw', min_vectors=1)
+        self.assertEqual(index.hnsw.efSearch, ann_index.default_params('hnsw', 2000, 16)['ef_search'])
+
+    def test_build_error_falls_back_to_flat(self):
+        with unittest.mock.patch.object(ann_index, 'create_index', side_effect=RuntimeError('boom')):
+            index = ann_index.select_search_index(self.flat, self.flat_path, 'ivf_pq', min_vectors=1)
+        self.assertIs(index, self.flat)
+
+
+if __name__ == '__main__':
+    unittest.main()
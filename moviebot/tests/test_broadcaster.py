@@ -0,0 +1,175 @@
+"""
+Тесты рассылки services/broadcaster.py и ограничителя частоты utils/rate_limiter.py (без сети и БД)
+"""
+import unittest
+from datetime import date
+from unittest.mock import Mock, patch
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from telebot.apihelper import ApiTelegramException
+
+from moviebot.scheduler import RandomEventCandidate
+from moviebot.services.broadcaster import Broadcaster, estimate_duration
+from moviebot.utils import random_events
+from moviebot.utils.rate_limiter import RateLimiter
+
+
+def _api_error(code, retry_after=None):
+    result_json = {'error_code': code, 'description': 'error'}
+    if retry_after is not None:
+        result_json['parameters'] = {'retry_after': retry_after}
+    return ApiTelegramException('sendMessage', None, result_json)
+
+
+class FakeTime:
+    """Часы, которые двигает только sleep"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_requests_are_spaced(self):
+        fake = FakeTime()
+        limiter = RateLimiter(4, clock=fake.clock, sleep=lambda seconds: fake.sleeps.append(seconds))
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(fake.sleeps, [0.25, 0.5])
+
+    def test_pause_delays_next_slot(self):
+        fake = FakeTime()
+        limiter = RateLimiter(10, clock=fake.clock, sleep=fake.sleep)
+        limiter.wait()
+        limiter.pause(5)
+        limiter.wait()
+        self.assertEqual(fake.now, 5)
+
+
+class TestBroadcaster(unittest.TestCase):
+    """Исходы отправки, 429 и заблокировавшие бота"""
+
+    def setUp(self):
+        self.fake = FakeTime()
+        self.recorded = []
+        self.broadcaster = Broadcaster(workers=1, rate=100, group_interval=3, max_retries=2,
+                                       clock=self.fake.clock, sleep=self.fake.sleep,
+                                       record_blocked=self.recorded.append)
+
+    def test_outcomes_and_bulk_blocked(self):
+        attempts = {}
+
+        def send(chat_id):
+            attempts[chat_id] = attempts.get(chat_id, 0) + 1
+            if chat_id == 2 and attempts[chat_id] == 1:
+                raise _api_error(429, retry_after=7)
+            if chat_id in (3, 4):
+                raise _api_error(403)
+            if chat_id == 5:
+                raise _api_error(400)
+            if chat_id == 6:
+                return False
+
+        result = self.broadcaster.run('test', [1, 2, 3, 4, 5, 6], send)
+        self.assertEqual((result.sent, result.skipped, result.blocked, result.failed, result.retries),
+                         (2, 1, 2, 1, 1))
+        self.assertEqual(sorted(result.sent_chats), [1, 2])
+        self.assertEqual(attempts[2], 2)
+        self.assertEqual(self.recorded, [[3, 4]])
+        self.assertGreaterEqual(self.fake.now, 7)
+
+    def test_retries_are_bounded(self):
+        def send(chat_id):
+            raise _api_error(429, retry_after=1)
+
+        result = self.broadcaster.run('test', [1], send)
+        self.assertEqual((result.failed, result.retries), (1, 2))
+
+    def test_group_messages_are_spaced(self):
+        self.broadcaster.run('test', [-10], lambda chat_id: None)
+        self.broadcaster.run('test', [-10], lambda chat_id: None)
+        self.assertGreaterEqual(self.fake.now, 3)
+
+    def test_dry_run_does_not_send(self):
+        result = self.broadcaster.run('test', list(range(1, 101)), lambda chat_id: self.fail('отправка'),
+                                      dry_run=True)
+        self.assertEqual((result.total, result.sent, result.dry_run), (100, 0, True))
+        self.assertAlmostEqual(result.elapsed, estimate_duration(100, 1, 100))
+
+
+class TestDiceGameBroadcast(unittest.TestCase):
+    """Кубик в рассылке: данные отбора не запрашиваются заново, 429 и 403 доходят до Broadcaster"""
+
+    def setUp(self):
+        self.fake = FakeTime()
+        self.recorded = []
+        self.broadcaster = Broadcaster(workers=1, rate=100, group_interval=3, max_retries=2,
+                                       clock=self.fake.clock, sleep=self.fake.sleep,
+                                       record_blocked=self.recorded.append)
+        self.bot = Mock()
+        self.bot.get_chat_member_count.return_value = 3
+        patcher = patch.object(random_events, 'bot', self.bot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.dict(random_events.dice_game_state, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.candidate = RandomEventCandidate(False, None, 2)
+
+    def _send(self, chat_id):
+        return random_events.send_dice_game_event(chat_id, candidate=self.candidate)
+
+    def test_rate_limit_and_blocked_reach_broadcaster(self):
+        attempts = {}
+
+        def send_message(chat_id, **kwargs):
+            attempts[chat_id] = attempts.get(chat_id, 0) + 1
+            if chat_id == -1 and attempts[chat_id] == 1:
+                raise _api_error(429, retry_after=5)
+            if chat_id == -2:
+                raise _api_error(403)
+            if chat_id == -3:
+                raise _api_error(400)
+            return Mock(message_id=1)
+
+        self.bot.send_message.side_effect = send_message
+        result = self.broadcaster.run('random_event', [-1, -2, -3], self._send)
+        self.assertEqual((result.sent, result.blocked, result.failed, result.skipped, result.retries),
+                         (1, 1, 1, 0, 1))
+        self.assertEqual(self.recorded, [[-2]])
+        self.bot.get_chat.assert_not_called()
+        self.bot.get_me.assert_not_called()
+
+    def test_recent_game_and_inactive_chat_are_skipped(self):
+        self.candidate = RandomEventCandidate(False, date.today(), 2)
+        self.assertIs(self._send(-1), False)
+        self.candidate = RandomEventCandidate(False, None, 0)
+        self.assertIs(self._send(-1), False)
+        self.bot.send_message.assert_not_called()
+
+
+class TestEstimate(unittest.TestCase):
+    def test_rate_or_workers_bound(self):
+        # Упор в лимит: 1000 сообщений при 25 в секунду — около 40 секунд
+        self.assertAlmostEqual(estimate_duration(1000, workers=8, rate=25, latency=0.15), 40.11, places=2)
+        # Упор в потоки: 2 потока по 0.5 с на сообщение
+        self.assertAlmostEqual(estimate_duration(10, workers=2, rate=1000, latency=0.5), 2.5, places=2)
+        self.assertEqual(estimate_duration(0), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
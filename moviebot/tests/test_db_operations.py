@@ -27,8 +27,11 @@ from moviebot.database.db_operations import (
     get_subscription_by_id,
     set_notification_setting,
     get_user_groups,
-    is_bot_participant
+    is_bot_participant,
+    load_settings_snapshot,
+    get_notification_settings
 )
+from moviebot.utils.entitlements import Entitlements, PersonalSubscription
 
 
 class TestDBOperations(unittest.TestCase):
@@ -122,38 +125,25 @@ class TestDBOperations(unittest.TestCase):
         # Не должно быть вызовов к БД для создателя
         mock_get_cursor.assert_not_called()
     
-    @patch('moviebot.database.db_operations.get_db_connection')
-    @patch('moviebot.database.db_operations.get_db_cursor')
-    @patch('moviebot.database.db_operations.db_lock')
-    def test_has_subscription_feature_no_access(self, mock_lock, mock_get_cursor, mock_get_conn):
+    @patch('moviebot.database.db_operations.get_entitlements')
+    def test_has_subscription_feature_no_access(self, mock_get_entitlements):
         """Тест has_subscription_feature - нет доступа"""
-        mock_cursor = Mock()
-        mock_cursor.fetchone.return_value = None  # Нет персональной подписки
-        mock_get_cursor.return_value = mock_cursor
-        mock_conn = Mock()
-        mock_get_conn.return_value = mock_conn
+        mock_get_entitlements.return_value = Entitlements(self.test_user_id, self.test_chat_id, (), ())
         
         result = has_subscription_feature(self.test_chat_id, self.test_user_id, 'notifications')
         
         self.assertFalse(result)
-        mock_cursor.close.assert_called_once()
+        mock_get_entitlements.assert_called_once_with(self.test_user_id, self.test_chat_id)
     
-    @patch('moviebot.database.db_operations.get_db_connection')
-    @patch('moviebot.database.db_operations.get_db_cursor')
-    @patch('moviebot.database.db_operations.db_lock')
-    def test_has_subscription_feature_personal(self, mock_lock, mock_get_cursor, mock_get_conn):
+    @patch('moviebot.database.db_operations.get_entitlements')
+    def test_has_subscription_feature_personal(self, mock_get_entitlements):
         """Тест has_subscription_feature - есть персональная подписка"""
-        mock_cursor = Mock()
-        # Первый вызов - есть персональная подписка
-        mock_cursor.fetchone.return_value = {'id': 1}
-        mock_get_cursor.return_value = mock_cursor
-        mock_conn = Mock()
-        mock_get_conn.return_value = mock_conn
+        sub = PersonalSubscription('notifications', None, self.test_chat_id, frozenset({'notifications'}))
+        mock_get_entitlements.return_value = Entitlements(self.test_user_id, self.test_chat_id, (sub,), ())
         
         result = has_subscription_feature(self.test_chat_id, self.test_user_id, 'notifications')
         
         self.assertTrue(result)
-        mock_cursor.close.assert_called_once()
     
     @patch('moviebot.database.db_operations.get_db_connection')
     @patch('moviebot.database.db_operations.get_db_cursor')
@@ -299,5 +289,66 @@ class TestDBOperations(unittest.TestCase):
         mock_conn.close.assert_called_once()
 
 
+class TestSettingsSnapshot(unittest.TestCase):
+    """Снимок часовых поясов и настроек напоминаний для задач планировщика"""
+
+    @patch('moviebot.database.db_operations.get_db_connection')
+    @patch('moviebot.database.db_operations.get_db_cursor')
+    @patch('moviebot.database.db_operations.db_lock')
+    def test_two_queries_for_all_ids(self, mock_lock, mock_get_cursor, mock_get_conn):
+        """Пояса и настройки всех id — двумя запросами, без дочитывания по одному"""
+        mock_cursor = Mock()
+        mock_cursor.fetchall.side_effect = [
+            [{'chat_id': 1, 'value': 'Omsk'}, {'chat_id': 2, 'value': 'Unknown'}],
+            [{'chat_id': 1, 'key': 'ticket_before_minutes', 'value': '30'},
+             {'chat_id': 3, 'key': 'notify_separate_weekdays', 'value': 'false'},
+             {'chat_id': 3, 'key': 'notify_cinema_weekday_hour', 'value': '8'}],
+        ]
+        mock_get_cursor.return_value = mock_cursor
+        mock_get_conn.return_value = Mock()
+
+        snapshot = load_settings_snapshot([1, 2, None, 1], [1, 3])
+
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+        self.assertEqual(mock_cursor.execute.call_args_list[0][0][1], ([1, 2],))
+        self.assertEqual(snapshot.timezone(1).zone, 'Asia/Omsk')
+        self.assertEqual(snapshot.timezone(2).zone, 'Europe/Moscow')
+        self.assertEqual(snapshot.timezone(None).zone, 'Europe/Moscow')
+        self.assertEqual(snapshot.notification_settings(1)['ticket_before_minutes'], 30)
+        settings = snapshot.notification_settings(3)
+        self.assertEqual((settings['separate_weekdays'], settings['cinema_weekday_hour'],
+                          settings['ticket_before_minutes']), ('false', 8, 10))
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+
+    @patch('moviebot.database.db_operations.get_notification_settings')
+    @patch('moviebot.database.db_operations.get_user_timezone')
+    def test_missing_ids_are_loaded_once(self, mock_get_tz, mock_get_settings):
+        """id вне снимка дочитываются по одному и запоминаются до конца прогона"""
+        from moviebot.database.db_operations import SettingsSnapshot
+        mock_get_tz.return_value = None
+        mock_get_settings.return_value = {'ticket_before_minutes': 5}
+        snapshot = SettingsSnapshot()
+        for _ in range(3):
+            snapshot.timezone(7)
+            snapshot.notification_settings(-7)
+        mock_get_tz.assert_called_once_with(7)
+        mock_get_settings.assert_called_once_with(-7)
+
+    @patch('moviebot.database.db_operations.get_db_connection')
+    @patch('moviebot.database.db_operations.get_db_cursor')
+    @patch('moviebot.database.db_operations.db_lock')
+    def test_get_notification_settings_defaults(self, mock_lock, mock_get_cursor, mock_get_conn):
+        """get_notification_settings: сохранённые значения поверх значений по умолчанию"""
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [{'key': 'notify_home_weekday_hour', 'value': '21'},
+                                             {'key': 'ticket_before_minutes', 'value': ''}]
+        mock_get_cursor.return_value = mock_cursor
+        mock_get_conn.return_value = Mock()
+        settings = get_notification_settings(5)
+        self.assertEqual((settings['home_weekday_hour'], settings['ticket_before_minutes'],
+                          settings['separate_weekdays']), (21, 10, 'true'))
+        self.assertEqual(mock_cursor.execute.call_args[0][1][0], 5)
+
+
 if __name__ == '__main__':
     unittest.main()
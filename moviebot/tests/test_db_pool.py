@@ -0,0 +1,196 @@
+"""
+Тесты для пула соединений database/db_connection.py
+"""
+import unittest
+from unittest.mock import Mock, patch
+import sys
+import os
+import threading
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from psycopg2 import extensions
+
+from moviebot.database import db_connection
+from moviebot.database.db_connection import ConnectionPool, PoolExhaustedError
+
+
+def make_fake_conn():
+    conn = Mock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Тесты ConnectionPool"""
+
+    def make_pool(self, **kwargs):
+        self.created = []
+
+        def connect():
+            conn = make_fake_conn()
+            self.created.append(conn)
+            return conn
+
+        params = dict(min_conn=0, max_conn=2, timeout=0.2, healthcheck_idle=60)
+        params.update(kwargs)
+        return ConnectionPool('postgresql://test', connect=connect, **params)
+
+    def test_min_conn_opened_upfront(self):
+        pool = self.make_pool(min_conn=2)
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_connection_is_reused(self):
+        pool = self.make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(len(self.created), 1)
+
+    def test_exhausted_pool_times_out(self):
+        pool = self.make_pool(max_conn=1)
+        pool.getconn()
+        with self.assertRaises(PoolExhaustedError):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiter_gets_returned_connection(self):
+        pool = self.make_pool(max_conn=1, timeout=2)
+        conn = pool.getconn()
+        timer = threading.Timer(0.05, pool.putconn, args=(conn,))
+        timer.start()
+        self.assertIs(pool.getconn(), conn)
+        timer.join()
+
+    def test_putconn_rolls_back_open_transaction(self):
+        pool = self.make_pool()
+        conn = pool.getconn()
+        conn.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_INTRANS
+        pool.putconn(conn)
+        conn.rollback.assert_called_once()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_broken_connection_discarded(self):
+        pool = self.make_pool()
+        conn = pool.getconn()
+        conn.closed = 2
+        pool.putconn(conn)
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertIsNot(pool.getconn(), conn)
+
+    def test_healthcheck_on_borrow_replaces_dead_connection(self):
+        pool = self.make_pool(healthcheck_idle=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.cursor.return_value.execute.side_effect = Exception('server closed the connection')
+        fresh = pool.getconn()
+        self.assertIsNot(fresh, conn)
+        conn.close.assert_called_once()
+
+    def test_connection_context_commits_and_rolls_back(self):
+        pool = self.make_pool()
+        with pool.connection() as conn:
+            pass
+        conn.commit.assert_called_once()
+        with self.assertRaises(ValueError):
+            with pool.connection() as conn:
+                raise ValueError('boom')
+        conn.rollback.assert_called()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+
+class TestThreadBoundConnections(unittest.TestCase):
+    """Тесты совместимого API get_db_connection()/get_db_cursor()"""
+
+    def setUp(self):
+        self.pool = ConnectionPool(
+            'postgresql://test', min_conn=0, max_conn=3, timeout=0.2,
+            connect=make_fake_conn,
+        )
+        patcher = patch.object(db_connection, '_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(db_connection._checkouts.clear)
+
+    def test_same_thread_shares_connection(self):
+        conn_a = db_connection.get_db_connection()
+        conn_b = db_connection.get_db_connection()
+        self.assertIs(conn_a._checkout.conn, conn_b._checkout.conn)
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_nested_close_keeps_outer_connection(self):
+        outer = db_connection.get_db_connection()
+        inner = db_connection.get_db_connection()
+        inner.close()
+        inner.close()  # повторный close не должен отпускать чужую ссылку
+        self.assertFalse(outer.closed)
+        self.assertTrue(inner.closed)
+        outer.close()
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+    def test_different_threads_get_different_connections(self):
+        raw = []
+
+        def worker():
+            conn = db_connection.get_db_connection()
+            raw.append(conn._checkout.conn)
+            conn.close()
+
+        main_conn = db_connection.get_db_connection()
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIsNot(raw[0], main_conn._checkout.conn)
+        main_conn.close()
+
+    def test_dead_thread_connection_is_reclaimed(self):
+        thread = threading.Thread(target=db_connection.get_db_connection)
+        thread.start()
+        thread.join()
+        self.assertEqual(self.pool.stats()['idle'], 0)
+        db_connection.get_db_connection().close()
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_release_thread_connection_returns_unclosed_checkout(self):
+        # Обработчик взял соединение и курсор и не закрыл их: поток воркера живёт дальше
+        conn = db_connection.get_db_connection()
+        db_connection.get_db_cursor()
+        self.assertTrue(db_connection.release_thread_connection())
+        self.assertEqual(self.pool.stats()['idle'], 1)
+        self.assertTrue(conn.closed)
+        conn.close()
+        self.assertFalse(db_connection.release_thread_connection())
+        # Следующая единица работы получает соединение заново
+        fresh = db_connection.get_db_connection()
+        self.assertFalse(fresh.closed)
+        fresh.close()
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_run_in_connection_scope_releases_on_error(self):
+        def handler():
+            db_connection.get_db_connection()
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            db_connection.run_in_connection_scope(handler)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+    def test_db_lock_does_not_block_other_threads(self):
+        acquired = []
+        with db_connection.db_lock:
+            thread = threading.Thread(
+                target=lambda: acquired.append(db_connection.db_lock.acquire(timeout=0.5))
+            )
+            thread.start()
+            thread.join()
+        self.assertEqual(acquired, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Тесты снимка прав доступа и его кэша utils/entitlements.py
+"""
+import unittest
+from datetime import datetime, timedelta
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import pytz
+
+from moviebot.utils.entitlements import (
+    ALL_FEATURES, EntitlementCache, Entitlements, GroupSubscription, PersonalSubscription
+)
+
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=pytz.UTC)
+USER = 42
+GROUP = -100
+
+
+def _personal(plan, expires_at=None, chat_id=USER):
+    features = ALL_FEATURES if plan == 'all' else frozenset({plan})
+    return PersonalSubscription(plan, expires_at, chat_id, features)
+
+
+def _group(plan, group_size=None, is_member=False, expires_at=None, sub_id=1):
+    features = ALL_FEATURES if plan == 'all' else frozenset({plan})
+    return GroupSubscription(sub_id, plan, expires_at, group_size, is_member, features)
+
+
+class TestEntitlements(unittest.TestCase):
+    """Тесты Entitlements"""
+
+    def test_personal_plan_works_in_any_chat(self):
+        ent = Entitlements(USER, GROUP, (_personal('all'),), ())
+        self.assertTrue(ent.has_plan(('all',), NOW))
+        self.assertTrue(ent.has_plan(('tickets', 'all'), NOW))
+        self.assertFalse(Entitlements(USER, GROUP, (_personal('tickets'),), ()).has_plan(('all',), NOW))
+
+    def test_expiry_checked_at_question_time(self):
+        ent = Entitlements(USER, USER, (_personal('all', NOW + timedelta(minutes=1)),), ())
+        self.assertTrue(ent.has_plan(('all',), NOW))
+        self.assertFalse(ent.has_plan(('all',), NOW + timedelta(minutes=2)))
+
+    def test_group_subscription_members(self):
+        limited = Entitlements(USER, GROUP, (), (_group('all', group_size=5, is_member=False),))
+        self.assertFalse(limited.has_plan(('all',), NOW))
+        member = Entitlements(USER, GROUP, (), (_group('all', group_size=5, is_member=True),))
+        self.assertTrue(member.has_plan(('all',), NOW))
+        open_group = Entitlements(USER, GROUP, (), (_group('notifications'),))
+        self.assertTrue(open_group.has_plan(('notifications', 'all'), NOW))
+        self.assertFalse(open_group.has_plan(('all',), NOW))
+
+    def test_latest_active_group_subscription_decides(self):
+        expired = _group('all', expires_at=NOW - timedelta(days=1), sub_id=2)
+        ent = Entitlements(USER, GROUP, (), (expired, _group('recommendations', sub_id=1)))
+        self.assertEqual(ent.group_subscription(NOW).id, 1)
+        self.assertFalse(ent.has_plan(('all',), NOW))
+
+    def test_group_ignored_in_personal_chat(self):
+        ent = Entitlements(USER, USER, (), (_group('all'),))
+        self.assertFalse(ent.has_plan(('all',), NOW))
+
+    def test_has_feature_personal_only_in_its_chat(self):
+        ent = Entitlements(USER, GROUP, (_personal('all', chat_id=USER),), ())
+        self.assertFalse(ent.has_feature('tickets', NOW))
+        ent = Entitlements(USER, USER, (_personal('all', chat_id=USER),), ())
+        self.assertTrue(ent.has_feature('tickets', NOW))
+        ent = Entitlements(USER, GROUP, (), (_group('tickets', group_size=3, is_member=True),))
+        self.assertTrue(ent.has_feature('tickets', NOW))
+        self.assertFalse(ent.has_feature('notifications', NOW))
+
+
+class TestEntitlementCache(unittest.TestCase):
+    """Тесты EntitlementCache"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.loads = []
+
+        def load(user_id, chat_id):
+            self.loads.append((user_id, chat_id))
+            return Entitlements(user_id, chat_id, (), ())
+
+        self.cache = EntitlementCache(ttl=30, max_entries=3, load=load, clock=lambda: self.now)
+
+    def test_hit_within_ttl(self):
+        first = self.cache.get(USER, GROUP)
+        self.now += 10
+        self.assertIs(self.cache.get(USER, GROUP), first)
+        self.assertEqual(len(self.loads), 1)
+        self.now += 30
+        self.cache.get(USER, GROUP)
+        self.assertEqual(len(self.loads), 2)
+
+    def test_invalidate_by_user_and_chat(self):
+        self.cache.get(USER, GROUP)
+        self.cache.get(USER, USER)
+        self.cache.get(7, GROUP)
+        self.assertEqual(self.cache.invalidate(user_id=USER), 2)
+        self.assertEqual(self.cache.invalidate(chat_id=GROUP), 1)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_load_racing_invalidation_is_not_stored(self):
+        def load(user_id, chat_id):
+            self.cache.invalidate(user_id=user_id)  # подписку изменили, пока шла загрузка
+            return Entitlements(user_id, chat_id, (), ())
+
+        self.cache._load = load
+        self.cache.get(USER, GROUP)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_lru_bound(self):
+        for user_id in range(5):
+            self.cache.get(user_id, GROUP)
+        self.assertEqual(self.cache.stats()['entries'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
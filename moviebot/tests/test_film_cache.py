@@ -0,0 +1,147 @@
+"""
+Тесты для кэша метаданных фильмов api/film_cache.py
+"""
+import unittest
+from unittest.mock import Mock, patch
+import sys
+import os
+import threading
+import time
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.api.film_cache import FilmCache, parse_kp_id
+
+
+FILM = {
+    'kp_id': '326',
+    'title': 'Побег из Шоушенка',
+    'year': 1994,
+    'genres': 'драма',
+    'director': 'Фрэнк Дарабонт',
+    'actors': 'Тим Роббинс, Морган Фриман',
+    'description': 'Бухгалтер Энди Дюфрейн...',
+    'is_series': False,
+}
+
+
+class TestFilmCache(unittest.TestCase):
+    """Тесты FilmCache (только in-memory уровень)"""
+
+    def setUp(self):
+        self.cache = FilmCache(use_db=False)
+
+    def test_parse_kp_id(self):
+        self.assertEqual(parse_kp_id('https://www.kinopoisk.ru/series/464963/'), '464963')
+        self.assertEqual(parse_kp_id(' 326 '), '326')
+        self.assertEqual(parse_kp_id(326), '326')
+        self.assertIsNone(parse_kp_id('not a link'))
+
+    def test_second_lookup_is_memory_hit(self):
+        loader = Mock(return_value=dict(FILM))
+        self.assertEqual(self.cache.get_or_fetch('326', loader), FILM)
+        self.assertEqual(self.cache.get_or_fetch('326', loader), FILM)
+        loader.assert_called_once()
+        stats = self.cache.stats()
+        self.assertEqual(stats['memory_hits'], 1)
+        self.assertEqual(stats['api_calls'], 1)
+        self.assertEqual(stats['api_requests_saved'], 2)
+
+    def test_returned_dict_is_a_copy(self):
+        self.cache.get_or_fetch('326', Mock(return_value=dict(FILM)))
+        result = self.cache.get_or_fetch('326', Mock())
+        result['title'] = 'changed'
+        self.assertEqual(self.cache.get_or_fetch('326', Mock())['title'], FILM['title'])
+
+    def test_failed_fetch_not_cached(self):
+        loader = Mock(side_effect=[None, dict(FILM)])
+        self.assertIsNone(self.cache.get_or_fetch('326', loader))
+        self.assertEqual(self.cache.get_or_fetch('326', loader), FILM)
+        self.assertEqual(self.cache.stats()['api_failures'], 1)
+
+    def test_stale_field_triggers_refresh(self):
+        self.cache.field_ttls['description'] = 0.01
+        loader = Mock(return_value=dict(FILM))
+        self.cache.get_or_fetch('326', loader)
+        time.sleep(0.02)
+        self.cache.get_or_fetch('326', loader)
+        self.assertEqual(loader.call_count, 2)
+        self.assertEqual(self.cache.stats()['stale_refreshes'], 1)
+
+    def test_stale_entry_served_when_refresh_fails(self):
+        self.cache.field_ttls['description'] = 0.01
+        self.cache.get_or_fetch('326', Mock(return_value=dict(FILM)))
+        time.sleep(0.02)
+        self.assertEqual(self.cache.get_or_fetch('326', Mock(return_value=None)), FILM)
+        self.assertEqual(self.cache.get_or_fetch('326', Mock(side_effect=RuntimeError('API 500'))), FILM)
+        stats = self.cache.stats()
+        self.assertEqual(stats['stale_served'], 2)
+        self.assertEqual(stats['api_failures'], 2)
+
+    def test_error_without_cached_entry_propagates(self):
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_fetch('326', Mock(side_effect=RuntimeError('API 500')))
+
+    def test_update_fields_refreshes_only_given_fields(self):
+        self.cache.field_ttls['description'] = 0.05
+        self.cache.get_or_fetch('326', Mock(return_value=dict(FILM)))
+        time.sleep(0.06)
+        self.cache.update_fields('326', description='Новое описание')
+        loader = Mock()
+        self.assertEqual(self.cache.get_or_fetch('326', loader)['description'], 'Новое описание')
+        loader.assert_not_called()
+
+    def test_lru_eviction(self):
+        cache = FilmCache(use_db=False, memory_max_entries=2)
+        for kp_id in ('1', '2', '3'):
+            cache.get_or_fetch(kp_id, Mock(return_value=dict(FILM, kp_id=kp_id)))
+        self.assertEqual(cache.stats()['memory_entries'], 2)
+        loader = Mock(return_value=dict(FILM, kp_id='1'))
+        cache.get_or_fetch('1', loader)
+        loader.assert_called_once()
+
+    def test_concurrent_misses_single_flight(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_loader():
+            calls.append(1)
+            release.wait(1)
+            return dict(FILM)
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_fetch('326', slow_loader)))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [FILM] * 5)
+        self.assertEqual(self.cache.stats()['coalesced'], 4)
+
+
+class TestExtractMovieInfoUsesCache(unittest.TestCase):
+    """extract_movie_info в api_manager идёт через кэш"""
+
+    @patch('moviebot.api.api_manager._extract_movie_info_uncached')
+    def test_extract_movie_info_cached(self, mock_uncached):
+        from moviebot.api import api_manager
+        cache = FilmCache(use_db=False)
+        mock_uncached.return_value = dict(FILM)
+        with patch('moviebot.api.film_cache.get_film_cache', return_value=cache):
+            api_manager.extract_movie_info('https://www.kinopoisk.ru/film/326/')
+            api_manager.extract_movie_info(326)
+        mock_uncached.assert_called_once_with('https://www.kinopoisk.ru/film/326/')
+
+
+if __name__ == '__main__':
+    unittest.main()
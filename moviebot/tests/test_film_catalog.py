@@ -0,0 +1,168 @@
+"""
+Тесты для общего каталога фильмов database/film_catalog.py
+"""
+import unittest
+from unittest.mock import Mock
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.database.film_catalog import (
+    upsert_film, backfill_films_batch, split_film_values, sync_film_links, backfill_film_links_batch,
+    count_series_episodes, save_series_episode_count, upsert_series_status, fill_film_stubs_batch
+)
+
+
+class TestFilmCatalog(unittest.TestCase):
+    """Тесты функций каталога films"""
+
+    def test_upsert_film_normalizes_values(self):
+        cursor = Mock()
+        upsert_film(cursor, 326, {'title': 'Фильм', 'year': '—', 'is_series': True, 'link': 'x'})
+        params = cursor.execute.call_args_list[0][0][1]
+        self.assertEqual(params[0], '326')
+        self.assertEqual(params[1], 'Фильм')
+        self.assertIsNone(params[2])
+        self.assertEqual(params[7], 1)
+
+    def test_upsert_film_keeps_unknown_is_series(self):
+        cursor = Mock()
+        upsert_film(cursor, '326', {'title': 'Фильм', 'year': '1994'})
+        params = cursor.execute.call_args_list[0][0][1]
+        self.assertEqual(params[2], 1994)
+        self.assertIsNone(params[7])
+
+    def test_upsert_film_without_info_is_noop(self):
+        cursor = Mock()
+        upsert_film(cursor, '326', None)
+        cursor.execute.assert_not_called()
+
+    def test_backfill_batch_returns_last_kp_id(self):
+        cursor = Mock()
+        cursor.fetchall.return_value = [{'kp_id': '1'}, {'kp_id': '2'}]
+        self.assertEqual(backfill_films_batch(cursor, '', batch_size=2), '2')
+        self.assertEqual(cursor.execute.call_count, 2)
+        self.assertEqual(cursor.execute.call_args[0][1], (['1', '2'],))
+
+    def test_backfill_fills_stub_columns_without_overwriting(self):
+        cursor = Mock()
+        cursor.fetchall.return_value = [{'kp_id': '1'}]
+        backfill_films_batch(cursor, '')
+        sql = ' '.join(cursor.execute.call_args[0][0].split())
+        self.assertIn('ON CONFLICT (kp_id) DO UPDATE SET title = COALESCE(films.title, EXCLUDED.title)', sql)
+        self.assertNotIn('DO NOTHING', sql)
+
+    def test_series_status_creates_catalog_row_from_movies(self):
+        # Статус сериала не создаёт строку каталога без названия: сначала метаданные из movies
+        cursor = Mock()
+        upsert_series_status(cursor, 42, True, 3, None)
+        calls = cursor.execute.call_args_list
+        self.assertIn('FROM movies m', calls[0][0][0])
+        self.assertEqual(calls[0][0][1], (['42'],))
+        self.assertIn('is_ongoing = EXCLUDED.is_ongoing', calls[1][0][0])
+        self.assertEqual(calls[1][0][1], ('42', True, 3, None))
+        self.assertTrue(all(call[0][1][0] == ['42'] for call in calls[2:]))
+
+    def test_fill_stubs_batch(self):
+        cursor = Mock()
+        cursor.fetchall.return_value = [{'kp_id': '5'}, {'kp_id': '7'}]
+        self.assertEqual(fill_film_stubs_batch(cursor, ''), '7')
+        self.assertIn('title IS NULL', cursor.execute.call_args_list[0][0][0])
+        self.assertEqual(cursor.execute.call_args_list[1][0][1], (['5', '7'],))
+        cursor.fetchall.return_value = []
+        self.assertIsNone(fill_film_stubs_batch(cursor, '7'))
+
+    def test_backfill_batch_done(self):
+        cursor = Mock()
+        cursor.fetchall.return_value = []
+        self.assertIsNone(backfill_films_batch(cursor, '9'))
+        cursor.execute.assert_called_once()
+
+
+class TestFilmLinks(unittest.TestCase):
+    """Тесты связей film_genres / film_people"""
+
+    def statements(self, cursor):
+        return [(' '.join(c[0][0].split()), c[0][1]) for c in cursor.execute.call_args_list]
+
+    def test_split_film_values(self):
+        self.assertEqual(split_film_values('драма, комедия,  драма'), ['драма', 'комедия'])
+        self.assertEqual(split_film_values('—'), [])
+        self.assertEqual(split_film_values(None), [])
+
+    def test_upsert_film_syncs_links(self):
+        cursor = Mock()
+        upsert_film(cursor, 326, {
+            'title': 'Фильм', 'genres': 'драма, криминал', 'director': 'Фрэнк Дарабонт',
+            'actors': 'Тим Роббинс, Морган Фриман',
+        })
+        statements = self.statements(cursor)
+        self.assertIn(('DELETE FROM film_genres WHERE kp_id = %s', ('326',)), statements)
+        inserts = [params for sql, params in statements if sql.startswith('INSERT INTO film_')]
+        self.assertEqual(inserts, [
+            ('326', ['драма', 'криминал']),
+            ('326', 'director', ['Фрэнк Дарабонт']),
+            ('326', 'actor', ['Тим Роббинс', 'Морган Фриман']),
+        ])
+
+    def test_placeholders_clear_links(self):
+        cursor = Mock()
+        sync_film_links(cursor, '1', {'genres': '—', 'director': 'Не указан', 'actors': '—'})
+        statements = self.statements(cursor)
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(all(sql.startswith('DELETE') for sql, _ in statements))
+
+    def test_missing_fields_keep_links(self):
+        cursor = Mock()
+        sync_film_links(cursor, '1', {'title': 'Фильм', 'is_series': True})
+        cursor.execute.assert_not_called()
+
+    def test_backfill_links_batch(self):
+        cursor = Mock()
+        cursor.fetchall.return_value = [('1',), ('2',)]
+        self.assertEqual(backfill_film_links_batch(cursor, '', batch_size=2), '2')
+        self.assertEqual(cursor.execute.call_count, 4)
+        for call in cursor.execute.call_args_list[1:]:
+            self.assertEqual(call[0][1][0], ['1', '2'])
+
+    def test_backfill_links_done(self):
+        cursor = Mock()
+        cursor.fetchall.return_value = []
+        self.assertIsNone(backfill_film_links_batch(cursor, '9'))
+        cursor.execute.assert_called_once()
+
+
+class TestSeriesEpisodeCounts(unittest.TestCase):
+    """Тесты кэша числа эпизодов series_episode_counts"""
+
+    def test_count_series_episodes(self):
+        seasons = [{'number': 1, 'episodes': [{}, {}]}, {'number': 2, 'episodes': None}, {'number': 3, 'episodes': [{}]}]
+        self.assertEqual(count_series_episodes(seasons), 3)
+        self.assertEqual(count_series_episodes(None), 0)
+
+    def test_save_series_episode_count(self):
+        cursor = Mock()
+        save_series_episode_count(cursor, 42, [{'episodes': [{}, {}]}, {'episodes': [{}]}])
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn('series_episode_counts', sql)
+        self.assertEqual(params, ('42', 2, 3))
+
+    def test_empty_seasons_keep_counts(self):
+        # Пустой ответ только отмечает попытку: известные числа не затираются
+        cursor = Mock()
+        save_series_episode_count(cursor, '42', [])
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn('DO UPDATE SET updated_at = NOW()', sql)
+        self.assertNotIn('episodes_count = EXCLUDED', sql)
+        self.assertEqual(params, ('42',))
+        save_series_episode_count(cursor, None, [])
+        cursor.execute.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
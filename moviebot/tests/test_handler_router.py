@@ -0,0 +1,146 @@
+"""
+Тесты индексированного выбора обработчиков bot/handler_router.py
+"""
+import unittest
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import telebot
+from telebot.types import CallbackQuery, Message
+
+from moviebot.bot.handler_router import HandlerRouter, callback_data_condition, route_guard
+
+
+def _callback(data):
+    return CallbackQuery.de_json({
+        'id': '1', 'chat_instance': 'x', 'data': data,
+        'from': {'id': 5, 'is_bot': False, 'first_name': 'u'},
+        'message': {'message_id': 1, 'date': 0, 'chat': {'id': 5, 'type': 'private'}, 'text': 'card'},
+    })
+
+
+def _message(text, user_id=5, reply_to=None, content_type='text'):
+    raw = {'message_id': 100, 'date': 0, 'chat': {'id': -1, 'type': 'group', 'title': 'g'},
+           'from': {'id': user_id, 'is_bot': False, 'first_name': 'u'}}
+    if content_type == 'text':
+        raw['text'] = text
+    else:
+        raw['voice'] = {'file_id': 'f', 'file_unique_id': 'u', 'duration': 1}
+    if reply_to is not None:
+        raw['reply_to_message'] = {'message_id': reply_to, 'date': 0, 'chat': raw['chat'], 'text': 'prompt',
+                                   'from': {'id': 1, 'is_bot': True, 'first_name': 'bot'}}
+    return Message.de_json(raw)
+
+
+class TestCallbackCondition(unittest.TestCase):
+    """Извлечение префиксов и точных значений из лямбд"""
+
+    def test_supported_forms(self):
+        self.assertEqual(callback_data_condition(lambda call: call.data.startswith("a:")),
+                         (frozenset(), frozenset({'a:'})))
+        self.assertEqual(callback_data_condition(lambda c: c.data and c.data.startswith(("b:", "c:"))),
+                         (frozenset(), frozenset({'b:', 'c:'})))
+        self.assertEqual(callback_data_condition(lambda call: call.data == "x" or call.data.startswith("y:")),
+                         (frozenset({'x'}), frozenset({'y:'})))
+        self.assertEqual(callback_data_condition(lambda call: call.data in ("p", "q")),
+                         (frozenset({'p', 'q'}), frozenset()))
+
+    def test_arbitrary_conditions_are_not_indexed(self):
+        self.assertIsNone(callback_data_condition(lambda call: 'settings' in call.data.lower()))
+        self.assertIsNone(callback_data_condition(lambda call: call.data.startswith("a:") or call.from_user.id == 1))
+        self.assertIsNone(callback_data_condition(lambda call: not call.data.startswith("a:")))
+
+
+class TestHandlerRouter(unittest.TestCase):
+    """Выбранный обработчик совпадает с перебором pyTelegramBotAPI"""
+
+    def setUp(self):
+        self.bot = telebot.TeleBot('1:test', threaded=False)
+        self.router = HandlerRouter(self.bot)
+        self.calls = []
+
+    def _record(self, name):
+        def handler(update):
+            self.calls.append(name)
+        handler.__name__ = name
+        return handler
+
+    def _dispatch(self, handlers, update, update_type):
+        for handler in self.router.select(update_type, handlers, update):
+            if self.bot._test_message_handler(handler, update):
+                return handler['function'].__name__
+        return None
+
+    def _expected(self, handlers, update):
+        for handler in handlers:
+            if self.bot._test_message_handler(handler, update):
+                return handler['function'].__name__
+        return None
+
+    def test_callbacks_keep_registration_order(self):
+        bot = self.bot
+        bot.callback_query_handler(func=lambda call: call.data.startswith("plan"))(self._record('plan_any'))
+        bot.callback_query_handler(func=lambda call: call.data.startswith("plan_type:"))(self._record('plan_type'))
+        bot.callback_query_handler(func=lambda call: call.data == "cancel")(self._record('cancel'))
+        bot.callback_query_handler(func=lambda call: 'debug' in call.data)(self._record('debug'))
+        handlers = bot.callback_query_handlers
+        for data in ('plan_type:home', 'planner', 'cancel', 'cancel2', 'x_debug', 'other', ''):
+            call = _callback(data)
+            self.assertEqual(self._dispatch(handlers, call, 'callback_query'), self._expected(handlers, call), data)
+        self.assertEqual(len(self.router.select('callback_query', handlers, _callback('other'))), 1)
+
+    def test_index_rebuilds_on_new_handlers(self):
+        bot = self.bot
+        bot.callback_query_handler(func=lambda call: call.data.startswith("a:"))(self._record('a'))
+        self.assertIsNone(self._dispatch(bot.callback_query_handlers, _callback('b:1'), 'callback_query'))
+        bot.callback_query_handler(func=lambda call: call.data.startswith("b:"))(self._record('b'))
+        self.assertEqual(self._dispatch(bot.callback_query_handlers, _callback('b:1'), 'callback_query'), 'b')
+
+    def test_messages_by_command_state_and_reply(self):
+        bot = self.bot
+        user_state = {}
+        reply_state = {}
+
+        @route_guard(user_states=(user_state,))
+        def in_state(message):
+            return message.from_user.id in user_state
+
+        @route_guard(reply_to=(reply_state,))
+        def reply_to_card(message):
+            return bool(message.reply_to_message) and message.reply_to_message.message_id in reply_state
+
+        bot.message_handler(commands=['start'])(self._record('start'))
+        bot.message_handler(func=in_state)(self._record('state'))
+        bot.message_handler(func=reply_to_card)(self._record('card'))
+        bot.message_handler(content_types=['voice'])(self._record('voice'))
+        bot.message_handler(func=lambda m: True)(self._record('fallback'))
+        handlers = bot.message_handlers
+
+        cases = [_message('/start'), _message('hi'), _message('hi', reply_to=77), _message('', content_type='voice')]
+        for message in cases:
+            self.assertEqual(self._dispatch(handlers, message, 'message'), self._expected(handlers, message))
+        self.assertEqual(self._dispatch(handlers, _message('hi'), 'message'), 'fallback')
+
+        user_state[5] = {'step': 1}
+        reply_state[77] = 'https://www.kinopoisk.ru/film/1/'
+        self.assertEqual(self._dispatch(handlers, _message('hi'), 'message'), 'state')
+        self.assertEqual(self._dispatch(handlers, _message('hi', user_id=6, reply_to=77), 'message'), 'card')
+        self.assertEqual(self._dispatch(handlers, _message('/start'), 'message'), 'start')
+
+    def test_install_filters_handlers_passed_by_telebot(self):
+        self.bot.callback_query_handler(func=lambda call: call.data.startswith("a:"))(self._record('a'))
+        self.bot.callback_query_handler(func=lambda call: call.data.startswith("b:"))(self._record('b'))
+        self.router.install()
+        self.bot.process_new_callback_query([_callback('b:1')])
+        self.assertEqual(self.calls, ['b'])
+        self.assertEqual(self.router.stats()['handlers_checked'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+Тесты импорта оценок с Кинопоиска services/kp_import.py (без БД и сети)
+"""
+import unittest
+from contextlib import contextmanager
+from unittest.mock import patch
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.services import kp_import
+from moviebot.services.kp_import import Vote, import_votes, parse_votes, run_import
+
+
+def _item(kp_id, rating=8, **extra):
+    item = {'kinopoiskId': kp_id, 'userRating': rating, 'year': 2000, 'type': 'FILM',
+            'genres': [{'genre': 'драма'}, {'genre': 'комедия'}]}
+    item.update(extra)
+    return item
+
+
+class FakeCursor:
+    """Отвечает на два SELECT import_votes заранее заданными строками"""
+
+    def __init__(self, movies=(), ratings=()):
+        self.results = [list(movies), list(ratings)]
+        self.queries = []
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+
+    def fetchall(self):
+        return self.results.pop(0) if self.results else []
+
+
+def fake_execute_values(cur, sql, rows, template=None, fetch=False):
+    cur.inserted = list(rows)
+    return [{'id': n} for n, _ in enumerate(rows)]
+
+
+class TestParseVotes(unittest.TestCase):
+    """Разбор страницы API"""
+
+    def test_invalid_and_duplicate_items_are_skipped(self):
+        votes = parse_votes([
+            _item(1), _item(None), _item(2, rating=0), _item(3, rating=11), _item(1, rating=5),
+            _item(4, genres=[], type='TV_SERIES'),
+        ])
+        self.assertEqual([v.kp_id for v in votes], ['1', '4'])
+        self.assertEqual(votes[0], Vote('1', 8, 2000, 'драма, комедия', 'FILM'))
+        self.assertEqual((votes[1].genres, votes[1].type), (None, 'TV_SERIES'))
+
+
+class TestImportVotes(unittest.TestCase):
+    """Запись страницы тремя запросами"""
+
+    def setUp(self):
+        patcher = patch.object(kp_import, 'execute_values', fake_execute_values)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_existing_ratings_are_not_reimported(self):
+        votes = parse_votes([_item(1), _item(2), _item(3), _item(4)])
+        # 1 и 2 — фильмы группы (у 1 уже есть оценка), 3 — уже импортирован без film_id
+        cur = FakeCursor(movies=[{'id': 11, 'kp_id': '1'}, {'id': 12, 'kp_id': '2'}],
+                         ratings=[{'film_id': 11, 'kp_id': '1'}, {'film_id': None, 'kp_id': '3'}])
+        self.assertEqual(import_votes(cur, -5, 7, votes, quota=10), 2)
+        self.assertEqual([(row[1], row[4]) for row in cur.inserted], [(12, '2'), (None, '4')])
+        self.assertEqual(len(cur.queries), 2)
+        self.assertEqual(cur.queries[0][1], (-5, ['1', '2', '3', '4']))
+
+    def test_quota_limits_rows(self):
+        cur = FakeCursor()
+        self.assertEqual(import_votes(cur, -5, 7, parse_votes([_item(n) for n in range(1, 6)]), quota=2), 2)
+        self.assertEqual([row[4] for row in cur.inserted], ['1', '2'])
+        self.assertEqual(import_votes(FakeCursor(), -5, 7, parse_votes([_item(1)]), quota=0), 0)
+
+
+class TestRunImport(unittest.TestCase):
+    """Конвейер страниц и продолжение с сохранённой страницы"""
+
+    def setUp(self):
+        self.job = {'id': 1, 'next_page': 1, 'imported': 0}
+        self.progress_updates = []
+        self.finished = []
+
+        @contextmanager
+        def fake_connection():
+            yield type('Conn', (), {'cursor': lambda conn: FakeCursor()})()
+
+        def fake_import(cur, chat_id, user_id, votes, quota):
+            return min(len(votes), quota)
+
+        for target, value in (('db_connection', fake_connection), ('import_votes', fake_import),
+                              ('_start_job', lambda *args: dict(self.job)),
+                              ('_finish_job', lambda job_id, status: self.finished.append(status))):
+            patcher = patch.object(kp_import, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _fetch(self, pages, fail_on=None):
+        requested = []
+
+        def fetch(kp_user_id, page):
+            requested.append(page)
+            if page == fail_on:
+                return 500, []
+            return 200, [_item(page * 100 + n) for n in range(pages.get(page, 0))]
+        return fetch, requested
+
+    def test_stops_on_short_page_and_reports_progress(self):
+        fetch, requested = self._fetch({1: 20, 2: 20, 3: 5})
+        result = run_import('42', -5, 7, max_count=200, fetch_page=fetch, concurrency=3,
+                            on_progress=lambda *args: self.progress_updates.append(args))
+        self.assertEqual((result.imported, result.pages, result.complete), (45, 3, True))
+        self.assertEqual(self.progress_updates, [(20, 1, 10), (40, 2, 10), (45, 3, 10)])
+        self.assertEqual(requested[:3], [1, 2, 3])
+        self.assertEqual(self.finished, ['done'])
+
+    def test_max_count_bounds_pages(self):
+        fetch, requested = self._fetch({n: 20 for n in range(1, 10)})
+        result = run_import('42', -5, 7, max_count=50, fetch_page=fetch, concurrency=5)
+        self.assertEqual((result.imported, result.complete), (50, True))
+        self.assertLessEqual(max(requested), 3)
+
+    def test_failed_page_interrupts_and_resume_starts_after_it(self):
+        fetch, _ = self._fetch({1: 20, 2: 20, 3: 20}, fail_on=2)
+        result = run_import('42', -5, 7, max_count=60, fetch_page=fetch, concurrency=2)
+        self.assertEqual((result.imported, result.complete), (20, False))
+        self.assertEqual(self.finished, ['interrupted'])
+
+        self.job.update(next_page=2, imported=20)
+        fetch, requested = self._fetch({1: 20, 2: 20, 3: 20})
+        result = run_import('42', -5, 7, max_count=60, fetch_page=fetch, concurrency=2)
+        self.assertEqual((result.imported, result.complete, result.resumed_from), (60, True, 2))
+        self.assertNotIn(1, requested)
+
+
+
+class TestClaimInterruptedImports(unittest.TestCase):
+    """Продолжаются только импорты без прогресса дольше RUNNING_STALE_AFTER"""
+
+    def test_only_stale_running_jobs_are_claimed(self):
+        cur = FakeCursor(movies=[{'chat_id': -5}])
+
+        @contextmanager
+        def fake_connection():
+            yield type('Conn', (), {'cursor': lambda conn: cur})()
+
+        with patch.object(kp_import, 'db_connection', fake_connection):
+            self.assertEqual(kp_import.claim_interrupted_imports(), [{'chat_id': -5}])
+        query, params = cur.queries[0]
+        self.assertIn("status = 'running' AND updated_at < NOW() - make_interval(secs => %s)", query)
+        self.assertEqual(params, (kp_import.RUNNING_STALE_AFTER,))
+
+
+if __name__ == '__main__':
+    unittest.main()
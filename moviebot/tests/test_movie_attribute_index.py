@@ -0,0 +1,74 @@
+"""
+Тесты для индекса атрибутов фильмов services/movie_attribute_index.py
+"""
+import unittest
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import numpy as np
+import pandas as pd
+
+from moviebot.services.movie_attribute_index import MovieAttributeIndex, normalize_imdb_id, normalize_text
+
+
+def legacy_actor_rows(df, names, require_all):
+    """Построчная проверка из search_movies (эталон)"""
+    rows = []
+    for idx in range(len(df)):
+        actors_str = df.iloc[idx].get('actors_str')
+        if not pd.notna(actors_str):
+            continue
+        movie_actors = [normalize_text(a.strip()) for a in str(actors_str).split(',') if a.strip()]
+        check = all if require_all else any
+        if check(any(n in a or a in n for a in movie_actors) for n in names):
+            rows.append(idx)
+    return rows
+
+
+class TestMovieAttributeIndex(unittest.TestCase):
+    """Тесты MovieAttributeIndex"""
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'imdb_id': ['tt0000001', '2.0', 'tt0000003', 'tt0000004'],
+            'actors_str': ['Tom Hanks, Meg Ryan', 'Tom Hanks Jr., Robin Wright', None, "Brad Pitt, Edward Norton, Meat Loaf"],
+            'director_str': ['Nora Ephron', 'Robert Zemeckis', 'David Fincher', None],
+            'genres_str': ['Comedy, Romance', 'Drama', None, 'Drama'],
+        })
+        self.index = MovieAttributeIndex(self.df)
+
+    def test_actor_mask_matches_row_loop(self):
+        for names in (['tom hanks'], ['tom'], ['tom hanks', 'robin wright'], ['brad pitt', 'meg ryan'], ['nobody']):
+            for require_all in (True, False):
+                got = np.flatnonzero(self.index.actor_mask(names, require_all)).tolist()
+                self.assertEqual(got, legacy_actor_rows(self.df, names, require_all), (names, require_all))
+
+    def test_director_mask_skips_missing(self):
+        self.assertEqual(np.flatnonzero(self.index.director_mask(['fincher'])).tolist(), [2])
+        self.assertEqual(np.flatnonzero(self.index.director_mask(['nora ephron', 'zemeckis'])).tolist(), [0, 1])
+
+    def test_actors_string_mask_is_substring_of_whole_string(self):
+        self.assertEqual(np.flatnonzero(self.index.actors_string_mask('tom hanks')).tolist(), [0, 1])
+
+    def test_count_actor_matches(self):
+        self.assertEqual(self.index.count_actor_matches(3, ['brad pitt', 'edward norton', 'al pacino']), 2)
+        self.assertEqual(self.index.count_actor_matches(2, ['brad pitt']), 0)
+
+    def test_genres_normalized_like_search(self):
+        self.assertEqual(self.index.genres_norm[0], 'comedy romance')
+        self.assertEqual(self.index.genres_norm[2], 'nan')
+
+    def test_imdb_lookup(self):
+        self.assertEqual(normalize_imdb_id('2.0'), 'tt0000002')
+        self.assertEqual(self.index.row_for_imdb('tt0000002'), 1)
+        self.assertIsNone(self.index.row_for_imdb('tt9999999'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Тесты выбора страниц /list и подборок database/movie_list.py (без БД: запросы записываются)
+"""
+import unittest
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.database import movie_list
+from moviebot.database.movie_list import PAGE_SIZE, _select_page, page_count, parse_cursor
+
+SQL = 'SELECT {where} ORDER BY x {direction}'
+KEYSET = '{t}.title, {t}.id'
+
+
+class FakeCursor:
+    """Записывает запросы и отдаёт заранее заданные результаты по очереди"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.queries = []
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+
+    def fetchall(self):
+        return self.results.pop(0) if self.results else []
+
+
+class TestCursorParsing(unittest.TestCase):
+    """Курсор в callback_data"""
+
+    def test_parse_cursor(self):
+        self.assertEqual(parse_cursor('a123'), ('a', 123))
+        self.assertEqual(parse_cursor('b7'), ('b', 7))
+        for value in (None, '', 'a', 'c12', 'a1x', '5'):
+            self.assertIsNone(parse_cursor(value))
+
+    def test_page_count(self):
+        self.assertEqual([page_count(n) for n in (0, 1, PAGE_SIZE, PAGE_SIZE + 1)], [1, 1, 1, 2])
+
+
+class TestSelectPage(unittest.TestCase):
+    """Какой запрос строит _select_page"""
+
+    def test_forward_cursor_uses_keyset(self):
+        cur = FakeCursor([{'id': 1}])
+        page, rows = _select_page(cur, SQL, {'chat_id': 5}, 3, 100, ('a', 42), KEYSET)
+        self.assertEqual((page, rows), (3, [{'id': 1}]))
+        query, params = cur.queries[0]
+        self.assertIn('(m.title, m.id) > (SELECT k.title, k.id FROM movies k WHERE k.id = %(cursor_id)s)', query)
+        self.assertTrue(query.endswith('ASC'))
+        self.assertEqual((params['cursor_id'], params['offset'], params['limit']), (42, 0, PAGE_SIZE))
+
+    def test_backward_cursor_reads_descending(self):
+        cur = FakeCursor([{'id': 1}])
+        _select_page(cur, SQL, {}, 2, 100, ('b', 42), KEYSET)
+        query, _ = cur.queries[0]
+        self.assertIn('(m.title, m.id) < (SELECT', query)
+        self.assertTrue(query.endswith('DESC'))
+
+    def test_empty_cursor_page_falls_back_to_offset(self):
+        # Крайний фильм удалён — страница открывается по номеру
+        cur = FakeCursor([], [{'id': 2}])
+        page, rows = _select_page(cur, SQL, {}, 3, 100, ('a', 42), KEYSET)
+        self.assertEqual((page, rows), (3, [{'id': 2}]))
+        query, params = cur.queries[1]
+        self.assertNotIn('cursor_id', query)
+        self.assertEqual(params['offset'], 2 * PAGE_SIZE)
+
+    def test_last_page_is_read_from_the_end(self):
+        cur = FakeCursor([{'id': 3}])
+        page, _ = _select_page(cur, SQL, {}, 99, 2 * PAGE_SIZE + 4, None, KEYSET)
+        query, params = cur.queries[0]
+        self.assertEqual(page, 3)
+        self.assertTrue(query.endswith('DESC'))
+        self.assertEqual((params['limit'], params['offset']), (4, 0))
+
+    def test_single_page_reads_from_start(self):
+        cur = FakeCursor([{'id': 3}])
+        page, _ = _select_page(cur, SQL, {}, 1, 4, None, KEYSET)
+        query, params = cur.queries[0]
+        self.assertEqual(page, 1)
+        self.assertTrue(query.endswith('ASC'))
+        self.assertEqual((params['limit'], params['offset']), (PAGE_SIZE, 0))
+
+    def test_templates_have_placeholders(self):
+        for sql in (movie_list._UNWATCHED_SELECT, movie_list._TAG_SELECT):
+            formatted = sql.format(where='', direction='ASC')
+            self.assertIn('LIMIT %(limit)s OFFSET %(offset)s', formatted)
+            self.assertNotIn('{', formatted)
+
+    def test_order_matches_keyset_with_null_titles_last(self):
+        # ORDER BY и keyset-сравнение — одни и те же выражения, фильмы без названия в конце
+        for sql, keys, keyset in ((movie_list._UNWATCHED_SELECT, movie_list._UNWATCHED_KEYS, movie_list._UNWATCHED_KEYSET),
+                                  (movie_list._TAG_SELECT, movie_list._TAG_KEYS, movie_list._TAG_KEYSET)):
+            self.assertEqual(keyset, ', '.join(keys))
+            order = ', '.join(f'{key.format(t="m")} DESC' for key in keys)
+            self.assertIn(f'ORDER BY {order}', sql.format(where='', direction='DESC'))
+            self.assertLess(keyset.index('title IS NULL'), keyset.index('COALESCE'))
+
+
+if __name__ == '__main__':
+    unittest.main()
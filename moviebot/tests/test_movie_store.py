@@ -0,0 +1,75 @@
+"""
+Тесты для колоночного хранилища services/movie_store.py
+"""
+import unittest
+import sys
+import os
+import tempfile
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import numpy as np
+import pandas as pd
+
+from moviebot.services.movie_store import MovieStore, save_movie_store, store_exists, remove_store
+
+
+class TestMovieStore(unittest.TestCase):
+    """Тесты MovieStore"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'movies')
+        self.df = pd.DataFrame({
+            'imdb_id': ['tt0000001', 'tt0000002', 'tt0000003'],
+            'year': [1999, 2004, 2010],
+            'has_overview': [True, False, True],
+            'genres_str': ['Drama', 'Drama', None],
+            'overview': ['Тёмный рыцарь', '', 'Сон во сне'],
+            'vote_count': [1500.0, np.nan, 800.0],
+        })
+        save_movie_store(self.df, self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        loaded = MovieStore(self.path).to_dataframe()
+        self.assertEqual(list(loaded.columns), list(self.df.columns))
+        self.assertEqual(loaded['imdb_id'].tolist(), self.df['imdb_id'].tolist())
+        self.assertEqual(loaded['year'].tolist(), [1999, 2004, 2010])
+        self.assertEqual(loaded['has_overview'].tolist(), [True, False, True])
+        self.assertEqual(loaded['overview'].tolist(), ['Тёмный рыцарь', '', 'Сон во сне'])
+        self.assertTrue(pd.isna(loaded['genres_str'][2]))
+        self.assertTrue(pd.isna(loaded['vote_count'][1]))
+
+    def test_selected_columns_only(self):
+        loaded = MovieStore(self.path).to_dataframe(['imdb_id', 'year', 'missing'])
+        self.assertEqual(list(loaded.columns), ['imdb_id', 'year'])
+
+    def test_value_reads_single_row(self):
+        store = MovieStore(self.path)
+        self.assertEqual(store.value('overview', 2), 'Сон во сне')
+        self.assertEqual(store.value('year', 1), 2004)
+        self.assertTrue(pd.isna(store.value('genres_str', 2)))
+
+    def test_dictionary_encoding(self):
+        store = MovieStore(self.path)
+        self.assertEqual(len(store._array('genres_str.offsets')) - 1, 1)  # 'Drama' хранится один раз
+
+    def test_all_nan_column(self):
+        save_movie_store(pd.DataFrame({'genres': [None, None]}), self.path)
+        self.assertTrue(MovieStore(self.path).to_dataframe()['genres'].isna().all())
+
+    def test_remove(self):
+        self.assertTrue(store_exists(self.path))
+        remove_store(self.path)
+        self.assertFalse(store_exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Тесты для индекса имён services/name_matcher.py
+
+Эталон — прежний перебор всего топ-списка (_find_name_in_set_with_typos / _find_name_by_surname).
+"""
+import unittest
+import sys
+import os
+import random
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.services.name_matcher import NameMatcher, levenshtein_distance
+
+
+def reference_levenshtein(s1, s2):
+    if len(s1) < len(s2):
+        return reference_levenshtein(s2, s1)
+    if len(s2) == 0:
+        return len(s1)
+    previous_row = list(range(len(s2) + 1))
+    for i, c1 in enumerate(s1):
+        current_row = [i + 1]
+        for j, c2 in enumerate(s2):
+            current_row.append(min(previous_row[j + 1] + 1, current_row[j] + 1, previous_row[j] + (c1 != c2)))
+        previous_row = current_row
+    return previous_row[-1]
+
+
+def reference_typo_matches(name, names, max_distance=2):
+    """Все имена, которые мог вернуть прежний перебор (он брал первое по порядку обхода set)"""
+    if name in names:
+        return {name}
+    return {c for c in names if reference_levenshtein(name, c) <= max_distance}
+
+
+def reference_surname_matches(word, names):
+    w = word.lower().strip()
+    if len(w) < 3:
+        return set()
+    return {n for n in names if n == w or n.endswith(' ' + w)}
+
+
+NAMES = [
+    'tom hanks', 'tom hardy', 'tom holland', 'leonardo dicaprio', 'brad pitt', 'morgan freeman',
+    'samuel l jackson', 'scarlett johansson', 'robert de niro', 'al pacino', 'joel coen', 'ethan coen',
+    'quentin tarantino', 'christopher nolan', 'denis villeneuve', 'zendaya', 'cher', 'ryan gosling',
+    'ryan reynolds', 'emma stone', 'emma watson', 'jim carrey', 'jim caviezel', 'keanu reeves',
+]
+
+
+def make_typos(rng, name, count):
+    alphabet = 'abcdefghijklmnopqrstuvwxyz '
+    result = []
+    for _ in range(count):
+        chars = list(name)
+        for _ in range(rng.randint(1, 3)):
+            op = rng.choice(('sub', 'ins', 'del'))
+            pos = rng.randrange(len(chars) + (op == 'ins'))
+            if op == 'sub' and chars:
+                chars[pos % len(chars)] = rng.choice(alphabet)
+            elif op == 'ins':
+                chars.insert(pos, rng.choice(alphabet))
+            elif chars:
+                del chars[pos % len(chars)]
+        result.append(''.join(chars))
+    return result
+
+
+class TestNameMatcher(unittest.TestCase):
+    """Тесты NameMatcher"""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(7)
+        first = ['john', 'jane', 'mark', 'maria', 'anna', 'ivan', 'peter', 'paul', 'sara', 'lee']
+        last = ['smith', 'smyth', 'jones', 'johns', 'brown', 'braun', 'miller', 'moller', 'davis', 'davies']
+        synthetic = [f"{f} {l}" for f in first for l in last]
+        cls.names = NAMES + synthetic
+        cls.matcher = NameMatcher(cls.names)
+        queries = list(cls.names) + ['tarantino', 'nolan', 'coen', 'hanks', 'a', 'the movie', 'space']
+        for name in cls.names:
+            queries.extend(make_typos(rng, name, 2))
+        cls.queries = queries
+
+    def test_levenshtein_matches_reference(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            a = ''.join(rng.choices('abc ', k=rng.randint(0, 8)))
+            b = ''.join(rng.choices('abc ', k=rng.randint(0, 8)))
+            expected = reference_levenshtein(a, b)
+            self.assertEqual(levenshtein_distance(a, b), expected)
+            self.assertEqual(levenshtein_distance(a, b, 2), min(expected, 3))
+
+    def test_typo_search_equivalent_to_linear_scan(self):
+        name_set = set(self.names)
+        for query in self.queries:
+            expected = reference_typo_matches(query, name_set)
+            found, matched = self.matcher.find(query, max_distance=2)
+            self.assertEqual(found, bool(expected), query)
+            if found:
+                self.assertIn(matched, expected, query)
+            candidates = {name for _, name in self.matcher.candidates(query, 2)}
+            if query not in name_set:
+                self.assertEqual(candidates, expected, query)
+
+    def test_smaller_distance(self):
+        name_set = set(self.names)
+        for query in self.queries[::3]:
+            found, matched = self.matcher.find(query, max_distance=1)
+            expected = reference_typo_matches(query, name_set, max_distance=1)
+            self.assertEqual(found, bool(expected), query)
+
+    def test_surname_equivalent_to_linear_scan(self):
+        name_set = set(self.names)
+        words = {w for name in self.names for w in name.split()} | {'ab', 'villeneuve', 'unknown', 'Tarantino '}
+        for word in words:
+            expected = reference_surname_matches(word, name_set)
+            found, matched = self.matcher.find_by_surname(word)
+            self.assertEqual(found, bool(expected), word)
+            if found:
+                self.assertIn(matched, expected, word)
+
+    def test_ties_prefer_top_list_order(self):
+        self.assertEqual(self.matcher.find_by_surname('coen'), (True, 'joel coen'))
+        self.assertEqual(self.matcher.find('tom hankz'), (True, 'tom hanks'))
+        self.assertEqual(self.matcher.find('ryan goslin'), (True, 'ryan gosling'))
+
+    def test_empty(self):
+        matcher = NameMatcher([])
+        self.assertEqual(matcher.find('tom hanks'), (False, None))
+        self.assertEqual(matcher.find_by_surname('hanks'), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Тесты для кэша запросов и батчевого энкодера services/query_cache.py
+"""
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import numpy as np
+
+from moviebot.services.query_cache import BatchingEncoder, QueryCache, normalize_query
+
+
+class TestQueryCache(unittest.TestCase):
+    """Тесты QueryCache"""
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query('  Фильм   про ЁЛКУ!! '), 'фильм про елку')
+
+    def test_near_identical_queries_share_translation(self):
+        cache = QueryCache()
+        cache.put_translation('Фильм про ёлку', 'movie about a christmas tree')
+        self.assertEqual(cache.get_translation('  фильм про елку?'), 'movie about a christmas tree')
+        self.assertEqual(cache.stats()['translation']['hits'], 1)
+
+    def test_results_are_copied(self):
+        cache = QueryCache()
+        results = [{'imdb_id': 'tt1'}]
+        cache.put_results('запрос', results, 15)
+        results[0]['imdb_id'] = 'changed'
+        cached = cache.get_results('запрос', 15)
+        cached[0]['kp_id'] = 1
+        self.assertEqual(cache.get_results('запрос', 15), [{'imdb_id': 'tt1'}])
+        self.assertIsNone(cache.get_results('запрос', 5))
+
+    def test_ttl_and_lru(self):
+        cache = QueryCache(max_entries=2, ttl=10, results_ttl=10)
+        with patch('moviebot.services.query_cache.time.time', return_value=1000):
+            cache.put_embedding('a', [1.0])
+            cache.put_embedding('b', [2.0])
+            cache.get_embedding('a')
+            cache.put_embedding('c', [3.0])  # вытесняет 'b'
+            self.assertIsNone(cache.get_embedding('b'))
+            self.assertEqual(cache.get_embedding('a').tolist(), [1.0])
+        with patch('moviebot.services.query_cache.time.time', return_value=1011):
+            self.assertIsNone(cache.get_embedding('a'))
+
+
+class TestBatchingEncoder(unittest.TestCase):
+    """Тесты BatchingEncoder"""
+
+    def test_concurrent_requests_share_one_call(self):
+        calls = []
+        release = threading.Event()
+
+        def encode(texts):
+            calls.append(list(texts))
+            release.wait(1)
+            return np.array([[len(t)] for t in texts], dtype='float32')
+
+        encoder = BatchingEncoder(encode, max_batch=8, max_wait_ms=200)
+        results = {}
+
+        def worker(text):
+            results[text] = encoder.encode(text, timeout=5)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in ('a', 'bb', 'ccc', 'bb')]
+        for t in threads:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(calls[0]), ['a', 'bb', 'ccc'])  # дубликаты кодируются один раз
+        self.assertEqual(results['ccc'].tolist(), [3.0])
+
+    def test_error_propagates(self):
+        def encode(texts):
+            raise RuntimeError('boom')
+
+        encoder = BatchingEncoder(encode, max_wait_ms=1)
+        with self.assertRaises(RuntimeError):
+            encoder.encode('x', timeout=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Тесты индекса фильтров /random services/random_index.py (без БД: строки фильмов задаются в тесте)
+"""
+import random
+import unittest
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.services import random_index
+from moviebot.services.random_index import (
+    FACET_ACTOR, FACET_DIRECTOR, FACET_GENRE, FacetIndex, sync_index
+)
+
+
+def _film(film_id, year=2000, is_series=0, genres=(), directors=(), actors=()):
+    return {'id': film_id, 'kp_id': str(1000 + film_id), 'title': f'Фильм {film_id}', 'year': year,
+            'link': None, 'is_series': is_series, 'genres': list(genres), 'directors': list(directors),
+            'actors': list(actors)}
+
+
+FILMS = [
+    _film(1, 1975, genres=['драма'], directors=['Тарковский'], actors=['Солоницын', 'Гринько']),
+    _film(2, 1990, genres=['драма', 'комедия'], directors=['Рязанов'], actors=['Мягков']),
+    _film(3, 2015, is_series=1, genres=['комедия'], directors=['Рязанов'], actors=['Мягков', 'Гринько']),
+    _film(4, None, genres=['ужасы'], actors=['Гринько']),
+]
+
+
+class FakeCursor:
+    """Отвечает на запросы sync_index: id кандидатов и строки новых фильмов"""
+
+    def __init__(self, member_ids, films):
+        self.member_ids = member_ids
+        self.films = {film['id']: film for film in films}
+        self.result = []
+        self.fetched_ids = None
+
+    def execute(self, sql, params=None):
+        if sql is random_index._MEMBER_IDS_SQL:
+            self.result = [{'id': film_id} for film_id in self.member_ids]
+        else:
+            self.fetched_ids = params['ids']
+            self.result = [self.films[film_id] for film_id in params['ids']]
+
+    def fetchall(self):
+        return self.result
+
+
+class TestFacetIndex(unittest.TestCase):
+    """Пересечения масок повторяют условия прежнего SQL"""
+
+    def setUp(self):
+        self.index = FacetIndex()
+        for film in FILMS:
+            self.index.add_film(film)
+
+    def _ids(self, bits):
+        return sorted(self.index.films[pos]['id'] for pos in random_index._bit_positions(bits))
+
+    def test_filters_or_within_and_between(self):
+        index = self.index
+        self.assertEqual(self._ids(index.match(genres=['драма', 'ужасы'])), [1, 2, 4])
+        self.assertEqual(self._ids(index.match(genres=['комедия'], directors=['Рязанов'])), [2, 3])
+        self.assertEqual(self._ids(index.match('films', genres=['комедия'])), [2])
+        self.assertEqual(self._ids(index.match('mixed', actors=['Гринько'])), [1, 3, 4])
+        self.assertEqual(index.match(genres=['вестерн']), 0)
+
+    def test_periods_share_boundary_years_and_skip_unknown(self):
+        # 1990 попадает в оба соседних периода, фильм без года — ни в один
+        self.assertEqual(self._ids(self.index.match(periods=['1980–1990'])), [2])
+        self.assertEqual(self._ids(self.index.match(periods=['1990–2000'])), [2])
+        self.assertEqual(self.index.available_periods(self.index.match('films')),
+                         ['До 1980', '1980–1990', '1990–2000'])
+
+    def test_top_orders_by_count_then_name(self):
+        self.assertEqual(self.index.top(FACET_ACTOR, self.index.alive), [('Гринько', 3), ('Мягков', 2), ('Солоницын', 1)])
+        self.assertEqual(self.index.top(FACET_DIRECTOR, self.index.match(genres=['драма']), limit=1),
+                         [('Рязанов', 1)])
+        self.assertEqual(sorted(self.index.values(FACET_GENRE, self.index.match(periods=['2010–2020']))), ['комедия'])
+
+    def test_pick_is_uniform_and_skips_excluded(self):
+        rng = random.Random(7)
+        bits = self.index.match(actors=['Гринько'])
+        picks = [self.index.pick(bits, exclude_ids=[4], rng=rng)['id'] for _ in range(2000)]
+        self.assertEqual(set(picks), {1, 3})
+        self.assertAlmostEqual(picks.count(1) / len(picks), 0.5, delta=0.05)
+        self.assertIsNone(self.index.pick(bits, exclude_ids=[1, 3, 4]))
+
+    def test_removed_film_drops_out_of_every_facet(self):
+        self.index.remove_film(3)
+        self.assertEqual(self._ids(self.index.match(genres=['комедия'])), [2])
+        self.assertEqual(self.index.top(FACET_ACTOR, self.index.alive)[0], ('Гринько', 2))
+        self.assertEqual((self.index.size, self.index.dead), (3, 1))
+
+
+class TestSyncIndex(unittest.TestCase):
+    """Досинхронизация после добавления, отметки просмотренным и импорта оценок"""
+
+    def test_sync_reads_only_new_films(self):
+        index = FacetIndex(version=1)
+        for film in FILMS[:3]:
+            index.add_film(film)
+        # Фильм 2 посмотрели, добавили фильм 4
+        cur = FakeCursor([1, 3, 4], FILMS)
+        self.assertTrue(sync_index(cur, index, chat_id=5, version=3))
+        self.assertEqual(cur.fetched_ids, [4])
+        self.assertEqual((index.film_ids(), index.version), ({1, 3, 4}, 3))
+        self.assertEqual(self.index_ids(index, index.match(actors=['Мягков'])), [3])
+
+    def test_many_removals_ask_for_rebuild(self):
+        index = FacetIndex()
+        films = [_film(n) for n in range(1, 201)]
+        for film in films:
+            index.add_film(film)
+        self.assertFalse(sync_index(FakeCursor([1, 2], films), index, chat_id=5, version=2))
+
+    @staticmethod
+    def index_ids(index, bits):
+        return sorted(index.films[pos]['id'] for pos in random_index._bit_positions(bits))
+
+
+if __name__ == '__main__':
+    unittest.main()
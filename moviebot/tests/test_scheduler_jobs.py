@@ -0,0 +1,275 @@
+"""
+Тесты хранилища задач планировщика services/scheduler_jobs.py и сверки напоминаний
+по планам (reconcile_plan_reminders) при перезапуске (без БД: таблица apscheduler_jobs в памяти)
+"""
+import threading
+import time
+import unittest
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+import sys
+import os
+
+import pytz
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from moviebot import scheduler as plan_scheduler
+from moviebot.database import db_connection
+from moviebot.database.db_connection import ConnectionPool
+from moviebot.database.db_operations import NOTIFICATION_DEFAULTS, SettingsSnapshot
+from moviebot.services import scheduler_jobs
+from moviebot.services.scheduler_jobs import (
+    DYNAMIC_JOBSTORE, PostgresJobStore, add_dynamic_job, diff_dynamic_jobs
+)
+
+MSK = pytz.timezone('Europe/Moscow')
+
+
+class FakeJobTable:
+    """apscheduler_jobs в памяти: отвечает на запросы PostgresJobStore; переживает «перезапуск»"""
+
+    def __init__(self):
+        self.rows = {}  # id -> (next_run_time, job_state)
+
+    @contextmanager
+    def connection(self):
+        yield type('Conn', (), {'cursor': lambda conn: FakeCursor(self.rows)})()
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+        self.rowcount = 0
+
+    def _ordered(self, keep=lambda next_run_time: True):
+        ids = sorted((job_id for job_id, (nrt, _) in self.rows.items() if keep(nrt)),
+                     key=lambda job_id: (self.rows[job_id][0] is None, self.rows[job_id][0] or 0))
+        return [{'id': job_id, 'job_state': self.rows[job_id][1]} for job_id in ids]
+
+    def execute(self, sql, params=None):
+        rows = self.rows
+        if sql is scheduler_jobs._LOOKUP_SQL:
+            self.result = [{'job_state': rows[params[0]][1]}] if params[0] in rows else []
+        elif sql is scheduler_jobs._ALL_SQL:
+            self.result = self._ordered()
+        elif sql is scheduler_jobs._DUE_SQL:
+            self.result = self._ordered(lambda nrt: nrt is not None and nrt <= params[0])
+        elif sql is scheduler_jobs._NEXT_RUN_TIME_SQL:
+            times = sorted(nrt for nrt, _ in rows.values() if nrt is not None)
+            self.result = [{'next_run_time': times[0]}] if times else []
+        elif sql is scheduler_jobs._INSERT_SQL:
+            self.rowcount = 0 if params[0] in rows else 1
+            rows.setdefault(params[0], (params[1], params[2]))
+        elif sql is scheduler_jobs._UPDATE_SQL:
+            self.rowcount = int(params[2] in rows)
+            if self.rowcount:
+                rows[params[2]] = (params[0], params[1])
+        elif sql is scheduler_jobs._DELETE_SQL:
+            self.rowcount = sum(rows.pop(job_id, None) is not None for job_id in params[0])
+        elif sql is scheduler_jobs._DELETE_ALL_SQL:
+            self.rowcount = len(rows)
+            rows.clear()
+        elif sql is scheduler_jobs._DIFF_SQL:
+            prefixes = tuple(p[:-1].replace('\\_', '_') for p in params['scope_patterns'])
+            scoped = {job_id for job_id in rows
+                      if job_id in params['scope_ids'] or (prefixes and job_id.startswith(prefixes))}
+            desired = set(params['desired'])
+            self.result = ([{'desired_id': job_id, 'job_id': None} for job_id in desired - set(rows)] +
+                           [{'desired_id': None, 'job_id': job_id} for job_id in scoped - desired])
+        else:
+            raise AssertionError(f'Неожиданный запрос: {sql}')
+
+    def fetchall(self):
+        return self.result
+
+
+def _start_process(table):
+    """Новый «процесс»: свой планировщик над той же таблицей, на паузе (задачи запускает тест)"""
+    store = PostgresJobStore(connection=table.connection)
+    sched = BackgroundScheduler(jobstores={'default': MemoryJobStore(), DYNAMIC_JOBSTORE: store}, timezone=pytz.utc)
+    sched.start(paused=True)
+    plan_scheduler.set_scheduler_instance(sched)
+    return sched, store
+
+
+def _fire_due(store, now):
+    """Выполняет наступившие задачи так же, как планировщик: задача снимается и вызывается один раз"""
+    for job in store.get_due_jobs(now):
+        store.remove_job(job.id)
+        job.func(*job.args, **job.kwargs)
+
+
+class TestRestartMidWindow(unittest.TestCase):
+    """Перезапуск посреди окна напоминаний: ничего не теряется и не отправляется дважды"""
+
+    def setUp(self):
+        self.table = FakeJobTable()
+        self.sent = []
+        self.now = datetime(2030, 3, 4, 5, 0, tzinfo=pytz.utc)  # понедельник, 08:00 МСК
+        self.plans = [
+            self._plan(1, 101, 'home', self.now.replace(hour=17)),
+            self._plan(2, 102, 'cinema', self.now.replace(hour=5, minute=40), ticket='file-2'),
+            self._plan(3, 103, 'cinema', self.now.replace(hour=8), ticket='file-3'),
+        ]
+        for target, value in (
+            ('_fetch_window_plans', lambda now_utc: [dict(plan) for plan in self.plans]),
+            ('load_settings_snapshot', lambda user_ids, chat_ids: SettingsSnapshot(
+                {user_id: MSK for user_id in user_ids}, {chat_id: dict(NOTIFICATION_DEFAULTS) for chat_id in chat_ids})),
+            ('send_plan_notification_combined', self._send_combined),
+            ('send_ticket_notification', self._send_ticket),
+        ):
+            patcher = patch.object(plan_scheduler, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(plan_scheduler.set_scheduler_instance, None)
+
+    def _plan(self, plan_id, chat_id, plan_type, when, ticket=None):
+        return {'id': plan_id, 'chat_id': chat_id, 'user_id': chat_id, 'plan_type': plan_type,
+                'plan_datetime': when, 'notification_sent': False, 'ticket_notification_sent': False,
+                'ticket_file_id': ticket}
+
+    def _send_combined(self, chat_id, date_str, user_id=None, settings=None):
+        for plan in self.plans:
+            if plan['chat_id'] == chat_id and plan['plan_datetime'].astimezone(MSK).date().isoformat() == date_str:
+                plan['notification_sent'] = True
+        self.sent.append(('combined', chat_id, date_str))
+
+    def _send_ticket(self, chat_id, plan_id):
+        next(plan for plan in self.plans if plan['id'] == plan_id)['ticket_notification_sent'] = True
+        self.sent.append(('ticket', chat_id, plan_id))
+
+    def test_restart_keeps_each_reminder_exactly_once(self):
+        sched, store = _start_process(self.table)
+        result = plan_scheduler.reconcile_plan_reminders(self.now)
+        # Утренние уведомления трёх чатов (09:00 МСК) и два напоминания с билетами
+        self.assertEqual((result.added, result.sent_now), (5, 0))
+        sched.shutdown(wait=False)
+
+        # Пока бот лежал: наступило напоминание с билетами плана 2, план 3 перенесли на час
+        now = self.now.replace(minute=35)
+        self.plans[2]['plan_datetime'] = self.now.replace(hour=9)
+        sched, store = _start_process(self.table)
+        result = plan_scheduler.reconcile_plan_reminders(now)
+        self.assertEqual((result.added, result.removed, result.sent_now), (1, 1, 0))
+        self.assertNotIn(f'ticket_notify_103_3_{int(self.now.replace(hour=7, minute=50).timestamp())}', self.table.rows)
+        self.assertEqual(len(self.table.rows), 5)
+
+        # Дальше время идёт своим чередом, пятиминутная проверка продолжает сверку
+        for step in (now, self.now.replace(hour=6, minute=5), self.now.replace(hour=8, minute=55)):
+            _fire_due(store, step)
+            result = plan_scheduler.reconcile_plan_reminders(step)
+            self.assertEqual((result.added, result.sent_now), (0, 0))
+        sched.shutdown(wait=False)
+
+        self.assertEqual(Counter(self.sent), Counter({
+            ('ticket', 102, 2): 1, ('ticket', 103, 3): 1,
+            ('combined', 101, '2030-03-04'): 1, ('combined', 102, '2030-03-04'): 1,
+            ('combined', 103, '2030-03-04'): 1,
+        }))
+        self.assertEqual(self.table.rows, {})
+
+    def test_reminder_missed_during_downtime_is_sent_once(self):
+        # Задача не успела сохраниться (или её сняли): опоздание до 30 минут отправляется сразу
+        now = self.now.replace(minute=34)
+        _start_process(self.table)
+        self.plans = self.plans[1:2]
+        result = plan_scheduler.reconcile_plan_reminders(now)
+        self.assertEqual((result.added, result.sent_now), (1, 1))
+        result = plan_scheduler.reconcile_plan_reminders(now + timedelta(minutes=5))
+        self.assertEqual((result.added, result.sent_now), (0, 0))
+        self.assertEqual(self.sent, [('ticket', 102, 2)])
+
+
+class TestPostgresJobStore(unittest.TestCase):
+    """Хранилище поверх apscheduler_jobs"""
+
+    def setUp(self):
+        self.table = FakeJobTable()
+        self.store = PostgresJobStore(connection=self.table.connection)
+        self.sched = BackgroundScheduler(jobstores={DYNAMIC_JOBSTORE: self.store}, timezone=pytz.utc)
+        self.sched.start(paused=True)
+        self.addCleanup(self.sched.shutdown, False)
+        self.run_date = datetime(2030, 1, 1, tzinfo=pytz.utc)
+
+    def test_readding_replaces_job(self):
+        add_dynamic_job(self.sched, 'builtins:print', self.run_date, 'job', args=['a'])
+        add_dynamic_job(self.sched, 'builtins:print', self.run_date, 'job', args=['b'])
+        jobs = self.sched.get_jobs()
+        self.assertEqual([(job.id, job.args, job.misfire_grace_time) for job in jobs],
+                         [('job', ('b',), scheduler_jobs.MISFIRE_GRACE_SECONDS)])
+
+    def test_series_check_rescheduling_keeps_one_job(self):
+        legacy_id = f'series_check_1_2_3_{int(self.run_date.timestamp())}'
+        add_dynamic_job(self.sched, 'builtins:print', self.run_date, legacy_id)
+        add_dynamic_job(self.sched, 'builtins:print', self.run_date, 'series_check_1_2_34')
+        plan_scheduler.schedule_series_check(self.sched, 1, 2, '555', 3, self.run_date)
+        later = self.run_date + timedelta(weeks=3)
+        job_id = plan_scheduler.schedule_series_check(self.sched, 1, 2, '555', 3, later)
+        self.assertEqual(job_id, 'series_check_1_2_3')
+        jobs = {job.id: job for job in self.sched.get_jobs()}
+        self.assertEqual(set(jobs), {'series_check_1_2_3', 'series_check_1_2_34'})
+        self.assertEqual(jobs['series_check_1_2_3'].next_run_time, later)
+        self.assertEqual(jobs['series_check_1_2_3'].args, (1, 2, '555', 3))
+
+    def test_unrestorable_job_is_removed(self):
+        add_dynamic_job(self.sched, 'builtins:print', self.run_date, 'job')
+        self.table.rows['broken'] = (0.0, b'not a pickle')
+        with self.assertLogs('moviebot.services.scheduler_jobs', 'ERROR'):
+            self.assertEqual([job.id for job in self.sched.get_jobs()], ['job'])
+        self.assertNotIn('broken', self.table.rows)
+
+    def test_memory_store_diff_matches_scope(self):
+        sched = BackgroundScheduler(timezone=pytz.utc)
+        sched.start(paused=True)
+        self.addCleanup(sched.shutdown, False)
+        for job_id in ('ticket_notify_1_2_100', 'ticket_notify_1_20_100', 'plan_reminder_combined_1_x', 'other'):
+            add_dynamic_job(sched, 'builtins:print', self.run_date, job_id)
+        missing, stale = diff_dynamic_jobs(sched, {'ticket_notify_1_2_200', 'plan_reminder_combined_1_x'},
+                                           scope_ids={'plan_reminder_combined_1_x'},
+                                           scope_prefixes={'ticket_notify_1_2_'})
+        self.assertEqual((missing, stale), ({'ticket_notify_1_2_200'}, {'ticket_notify_1_2_100'}))
+
+
+class TestConnectionScopedExecutor(unittest.TestCase):
+    """Потоки пула задач долгоживущие: незакрытое задачей соединение возвращается в пул"""
+
+    def test_job_connection_is_released(self):
+        pool = ConnectionPool('postgresql://test', min_conn=0, max_conn=2, timeout=0.2,
+                              connect=lambda: Mock(closed=0, get_transaction_status=Mock(return_value=0)))
+        patcher = patch.object(db_connection, '_pool', pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sched = BackgroundScheduler(executors={'default': scheduler_jobs.ConnectionScopedThreadPoolExecutor(2)},
+                                    timezone=pytz.utc)
+        sched.start()
+        self.addCleanup(sched.shutdown, False)
+        ran = threading.Event()
+
+        def job():
+            db_connection.get_db_connection()  # задача не закрывает соединение
+            ran.set()
+
+        for _ in range(3):
+            ran.clear()
+            sched.add_job(job)
+            self.assertTrue(ran.wait(2))
+            deadline = time.monotonic() + 2
+            while pool.stats()['idle'] != pool.stats()['size'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(pool.stats()['idle'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+"""
+Тесты роллапов статистики сайта api/site_stats.py (строки роллапа из строк месяца)
+"""
+import unittest
+from collections import defaultdict
+from datetime import datetime
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import pytz
+
+from moviebot.api.site_stats import (
+    ROLLUP_TOTAL_USER_ID, _group_rollup_rows, _build_personal_month, _personal_rollup_row,
+    _rollup_rating_breakdown, _group_achievement_holders, _discoverer_film_ids
+)
+
+START = datetime(2026, 10, 1, tzinfo=pytz.UTC)
+
+
+def _at(day):
+    return datetime(2026, 10, day, 12, 0, tzinfo=pytz.UTC)
+
+
+class TestGroupRollupRows(unittest.TestCase):
+    """Тесты _group_rollup_rows"""
+
+    def setUp(self):
+        self.wm_rows = [
+            {'film_id': 1, 'user_id': 10, 'is_series': False, 'watched_at': _at(3)},
+            {'film_id': 1, 'user_id': 11, 'is_series': False, 'watched_at': _at(3)},
+            {'film_id': 2, 'user_id': None, 'is_series': False, 'watched_at': _at(4)},
+        ]
+        self.st_rows = [
+            {'film_id': 5, 'user_id': 10, 'is_series': True, 'watched_date': _at(5)},
+            {'film_id': 5, 'user_id': 10, 'is_series': True, 'watched_date': _at(6)},
+        ]
+        self.ratings = [
+            {'rating': 9, 'user_id': 10, 'film_id': 1, 'rated_at': _at(3), 'is_series': False},
+            {'rating': 6, 'user_id': 11, 'film_id': 3, 'rated_at': _at(7), 'is_series': False},
+        ]
+        self.cinema = [{'film_id': 3, 'user_id': 11, 'screening_date': _at(7).date()}]
+        self.genres = [{'genre': 'драма', 'user_id': 10, 'cnt': 2}, {'genre': 'драма', 'user_id': None, 'cnt': 1}]
+
+    def test_total_row_counts_unique_films(self):
+        rows = _group_rollup_rows(self.wm_rows, self.st_rows, self.cinema, self.ratings, self.genres)
+        total = rows[0]
+        self.assertEqual(total['user_id'], ROLLUP_TOTAL_USER_ID)
+        self.assertEqual(total['films_watched'], 3)
+        self.assertEqual(total['series_watched'], 1)
+        self.assertEqual(total['episodes_watched'], 2)
+        self.assertEqual(total['ratings_count'], 2)
+        self.assertEqual(total['rating_sum'], 15)
+        self.assertEqual(total['cinema_visits'], 1)
+        self.assertEqual(_rollup_rating_breakdown(total)['9'], 1)
+
+    def test_user_rows_sorted_and_skip_missing_user(self):
+        rows = _group_rollup_rows(self.wm_rows, self.st_rows, self.cinema, self.ratings, self.genres)
+        self.assertEqual([r['user_id'] for r in rows], [ROLLUP_TOTAL_USER_ID, 10, 11])
+        u10, u11 = rows[1], rows[2]
+        # 1 фильм + 2 серии + 1 оценка
+        self.assertEqual(u10['views'], 4)
+        self.assertEqual(u10['episodes_watched'], 2)
+        self.assertEqual(u10['genres'], {'драма': 2})
+        self.assertEqual(u10['activity'], {'3': 2, '5': 1, '6': 1})
+        self.assertEqual((u11['ratings_count'], u11['rating_sum'], u11['cinema_visits']), (1, 6, 1))
+
+    def test_empty_month(self):
+        rows = _group_rollup_rows([], [], [], [], [])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['views'], 0)
+
+
+def _row_level_holders(wm_rows, st_rows, cinema_rows, ratings, genre_rows, discovered_by):
+    """Ачивки группы напрямую из строк месяца: больший счётчик, затем меньший user_id."""
+    views, episodes, cinema, genres = defaultdict(int), defaultdict(int), defaultdict(int), defaultdict(set)
+    user_ratings = defaultdict(list)
+    for r in wm_rows:
+        views[r['user_id']] += 1
+    for r in st_rows:
+        views[r['user_id']] += 1
+        episodes[r['user_id']] += 1
+    for r in ratings:
+        views[r['user_id']] += 1
+        user_ratings[r['user_id']].append(r['rating'])
+    for r in cinema_rows:
+        cinema[r['user_id']] += 1
+    for r in genre_rows:
+        genres[r['user_id']].add(r['genre'])
+    discoveries = defaultdict(int)
+    for added_by in discovered_by.values():
+        if added_by:
+            discoveries[added_by] += 1
+
+    def winner(counts, threshold):
+        ranked = sorted(((uid, c) for uid, c in counts.items() if c >= threshold), key=lambda x: (-x[1], x[0]))
+        return ranked[0][0] if ranked else None
+
+    return {
+        'cinephile': winner(views, 10),
+        'strict_critic': winner({u: len(r) for u, r in user_ratings.items() if sum(r) / len(r) < 7}, 5),
+        'frequent_goer': winner(cinema, 3),
+        'generous': winner({u: len(r) for u, r in user_ratings.items() if sum(r) / len(r) > 8}, 5),
+        'binge_watcher': winner(episodes, 20),
+        'rater': winner({u: len(r) for u, r in user_ratings.items()}, 15),
+        'polyglot': winner({u: len(g) for u, g in genres.items()}, 5),
+        'discoverer': winner(discoveries, 1),
+    }
+
+
+class TestGroupAchievementHolders(unittest.TestCase):
+    """Тесты _group_achievement_holders: роллап совпадает с расчётом по строкам, ничьи — меньшему user_id"""
+
+    def setUp(self):
+        # 30 и 20 — равные строгие критики, 50 и 40 — равные добряки; строки идут от большего user_id
+        self.ratings = []
+        for uid in (30, 20):
+            self.ratings += [{'rating': 6, 'user_id': uid, 'film_id': 100 + i, 'rated_at': _at(3), 'is_series': False}
+                             for i in range(15)]
+        for uid in (50, 40):
+            self.ratings += [{'rating': 9, 'user_id': uid, 'film_id': 200 + i, 'rated_at': _at(4), 'is_series': False}
+                             for i in range(5)]
+        self.st_rows = [{'film_id': 300, 'user_id': uid, 'is_series': True, 'watched_date': _at(5)}
+                        for uid in (30, 20) for _ in range(20)]
+        self.wm_rows = [{'film_id': 400, 'user_id': 50, 'is_series': False, 'watched_at': _at(6)}]
+        self.cinema = [{'film_id': 100, 'user_id': uid, 'screening_date': _at(7).date()}
+                       for uid in (30, 20) for _ in range(3)]
+        self.genres = [{'genre': g, 'user_id': uid, 'cnt': 1}
+                       for uid in (30, 20) for g in ('драма', 'комедия', 'ужасы', 'триллер', 'мультфильм')]
+        # Фильмы 200–204 оценили 8+ оба участника: по два нашли 50 и 40, у одного автор неизвестен
+        self.discovered_by = {200: 50, 201: 50, 202: 40, 203: 40, 204: None}
+
+    def _rollup_holders(self, wm_rows, st_rows, cinema, ratings, genres):
+        rows = _group_rollup_rows(wm_rows, st_rows, cinema, ratings, genres)
+        rollups = {r['user_id']: r for r in rows if r['user_id'] != ROLLUP_TOTAL_USER_ID}
+        return _group_achievement_holders(rollups, self.discovered_by)
+
+    def test_discoverer_films_need_two_high_ratings(self):
+        ratings = self.ratings + [{'rating': 9, 'user_id': 40, 'film_id': 500, 'rated_at': _at(8)}]
+        self.assertEqual(_discoverer_film_ids(ratings), [200, 201, 202, 203, 204])
+
+    def test_rollup_matches_row_level_with_ties(self):
+        expected = _row_level_holders(self.wm_rows, self.st_rows, self.cinema, self.ratings, self.genres,
+                                      self.discovered_by)
+        self.assertEqual(expected, {
+            'cinephile': 20, 'strict_critic': 20, 'frequent_goer': 20, 'generous': 40,
+            'binge_watcher': 20, 'rater': 20, 'polyglot': 20, 'discoverer': 40,
+        })
+        holders = self._rollup_holders(self.wm_rows, self.st_rows, self.cinema, self.ratings, self.genres)
+        self.assertEqual(holders, expected)
+
+    def test_holders_do_not_depend_on_row_order(self):
+        forward = self._rollup_holders(self.wm_rows, self.st_rows, self.cinema, self.ratings, self.genres)
+        backward = self._rollup_holders(self.wm_rows[::-1], self.st_rows[::-1], self.cinema[::-1],
+                                        self.ratings[::-1], self.genres[::-1])
+        rows = _group_rollup_rows(self.wm_rows, self.st_rows, self.cinema, self.ratings, self.genres)
+        rollups = {r['user_id']: r for r in rows if r['user_id'] != ROLLUP_TOTAL_USER_ID}
+        shuffled = _group_achievement_holders(dict(sorted(rollups.items(), reverse=True)),
+                                              dict(reversed(list(self.discovered_by.items()))))
+        self.assertEqual(forward, backward)
+        self.assertEqual(forward, shuffled)
+
+    def test_thresholds_not_met(self):
+        self.assertEqual(set(_group_achievement_holders({}, {}).values()), {None})
+
+
+class TestPersonalRollupRow(unittest.TestCase):
+    """Тесты _build_personal_month и _personal_rollup_row"""
+
+    def test_counts_films_episodes_and_ratings(self):
+        watched_rows = [{'film_id': 1, 'watched_at': _at(2), 'kp_id': '1', 'title': 'A', 'year': 1998,
+                         'is_series': False, 'online_link': 'https://okko.tv/movie/1'}]
+        series_rows = [
+            {'film_id': 5, 'watched_date': _at(4), 'kp_id': '5', 'title': 'S', 'year': 2020, 'is_series': True},
+            {'film_id': 5, 'watched_date': _at(8), 'kp_id': '5', 'title': 'S', 'year': 2020, 'is_series': True},
+        ]
+        ratings = [
+            {'film_id': 1, 'rating': 8, 'rated_at': _at(2), 'kp_id': '1', 'title': 'A', 'year': 1998, 'is_series': False},
+            {'film_id': 7, 'rating': 10, 'rated_at': _at(9), 'kp_id': '7', 'title': 'B', 'year': 2001, 'is_series': False},
+        ]
+        month = _build_personal_month(watched_rows, series_rows, ratings, [], START)
+        row = _personal_rollup_row(42, month)
+        self.assertEqual(row['user_id'], 42)
+        self.assertEqual(row['films_watched'], 2)
+        self.assertEqual(row['series_watched'], 1)
+        self.assertEqual(row['episodes_watched'], 2)
+        self.assertEqual(row['views'], 4)
+        self.assertEqual((row['ratings_count'], row['rating_sum']), (2, 18))
+        self.assertEqual(row['rating_breakdown']['8'], 1)
+        self.assertEqual({w['film_id']: w['rating'] for w in month['watched_list']}, {1: 8, 5: None, 7: 10})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Тесты хранилища состояний диалогов services/state_store.py (без БД)
+"""
+import unittest
+from datetime import datetime
+import sys
+import os
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.services.state_store import (
+    MemoryStateBackend, StateNamespace, dumps_state, loads_state
+)
+
+
+class FakeSharedBackend(MemoryStateBackend):
+    """Как общее хранилище: значения хранятся сериализованными, не по ссылке"""
+
+    by_reference = False
+
+    def get(self, namespace, key):
+        value, expired = super().get(namespace, key)
+        return (loads_state(value) if isinstance(value, str) else value), expired
+
+    def set(self, namespace, key, value, ttl, max_entries):
+        return super().set(namespace, key, dumps_state(value), ttl, max_entries)
+
+
+class TestMemoryNamespace(unittest.TestCase):
+    """Тесты StateNamespace поверх памяти"""
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = lambda: self.now
+        self.state = StateNamespace('test_state', ttl=60, max_entries=3, backend=MemoryStateBackend(clock), clock=clock)
+
+    def test_dict_interface(self):
+        self.state[1] = {'step': 1}
+        self.assertIn(1, self.state)
+        self.state[1]['step'] = 2  # изменение на месте, как в обработчиках
+        self.assertEqual(self.state[1]['step'], 2)
+        self.assertEqual(self.state.get(2, 'нет'), 'нет')
+        self.assertEqual(self.state.pop(1), {'step': 2})
+        self.assertIsNone(self.state.pop(1, None))
+        with self.assertRaises(KeyError):
+            del self.state[1]
+        with self.assertRaises(KeyError):
+            self.state[1]
+
+    def test_ttl_counts_from_last_write(self):
+        self.state[1] = 'a'
+        self.now += 50
+        self.state[1] = 'b'
+        self.now += 50
+        self.assertEqual(self.state.get(1), 'b')
+        self.now += 11
+        self.assertNotIn(1, self.state)
+        self.assertEqual(self.state.stats()['expired'], 1)
+
+    def test_lru_bound(self):
+        for key in range(3):
+            self.state[key] = key
+        self.state.get(0)  # 0 использовался недавно — вытесняется 1
+        self.state[3] = 3
+        self.assertEqual(sorted(self.state.keys()), [0, 2, 3])
+        stats = self.state.stats()
+        self.assertEqual((stats['entries'], stats['evicted'], stats['peak']), (3, 1, 3))
+
+    def test_iteration_is_a_snapshot(self):
+        for key in range(3):
+            self.state[key] = key
+        for key in self.state:
+            del self.state[key]
+        self.assertEqual(len(self.state), 0)
+        self.assertEqual(list(self.state.items()), [])
+
+    def test_periodic_sweep_drops_expired(self):
+        self.state[1] = 'a'
+        self.state[2] = 'b'
+        self.now += 61
+        self.assertEqual(self.state.stats()['entries'], 2)  # истёкшие ещё лежат
+        self.now += 60
+        self.state[3] = 'c'  # запись запускает очистку
+        self.assertEqual(self.state.stats()['entries'], 1)
+
+
+class TestSharedNamespace(unittest.TestCase):
+    """Тесты сериализации и обратной записи для общего хранилища"""
+
+    def setUp(self):
+        self.state = StateNamespace('shared_state', ttl=60, max_entries=10, backend=FakeSharedBackend())
+
+    def test_roundtrip_keeps_types(self):
+        value = {
+            'episodes': [(1, 2), (1, 3)],
+            'voted': {5, 6},
+            'participants': {42: {'value': 6}},
+            'start_time': datetime(2026, 10, 17, 12, 0),
+            'link': 'https://www.kinopoisk.ru/film/1/',
+            'nested': {'__tuple__': 'не метка'},
+        }
+        self.assertEqual(loads_state(dumps_state(value)), value)
+
+    def test_unsupported_value_is_rejected(self):
+        with self.assertRaises(TypeError):
+            dumps_state({'handler_func': len})
+
+    def test_first_level_changes_are_written_back(self):
+        self.state[7] = {'step': 1}
+        self.state[7]['step'] = 2
+        self.state[7].pop('missing', None)
+        self.state[7]['extra'] = (1, 2)
+        self.assertEqual(self.state[7], {'step': 2, 'extra': (1, 2)})
+        self.assertEqual(type(self.state.pop(7)), dict)
+
+
+if __name__ == '__main__':
+    unittest.main()
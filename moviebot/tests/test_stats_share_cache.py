@@ -0,0 +1,153 @@
+"""
+Тесты кэша ответов публичной статистики и счётчика просмотров api/stats_share_cache.py
+"""
+import unittest
+from datetime import date
+import sys
+import os
+import threading
+import time
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.api.stats_share_cache import ShareResponseCache, ShareScope, ShareViewCounter
+
+SCOPE = ShareScope(-100, date(2026, 10, 1), False)
+KEY = ('group', 'g1', 10, 2026)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestShareResponseCache(unittest.TestCase):
+    """Тесты ShareResponseCache"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.versions = (3, None)
+        self.loads = 0
+
+        def load_versions(scope):
+            self.loads += 1
+            return self.versions
+
+        self.cache = ShareResponseCache(ttl=30, max_age=600, max_entries=2, load_versions=load_versions,
+                                        clock=self.clock)
+
+    def test_hit_within_ttl_without_version_check(self):
+        entry = self.cache.put(KEY, SCOPE, (3, None), b'{"a": 1}')
+        self.clock.now += 10
+        self.assertIs(self.cache.get(KEY), entry)
+        self.assertEqual(self.loads, 0)
+        self.assertEqual(len(entry.etag), 40)
+
+    def test_revalidates_after_ttl(self):
+        entry = self.cache.put(KEY, SCOPE, (3, None), b'{}')
+        self.clock.now += 31
+        self.assertIs(self.cache.get(KEY), entry)
+        self.assertEqual(self.loads, 1)
+        # Продлено: следующий запрос в пределах ttl версий не читает
+        self.clock.now += 10
+        self.cache.get(KEY)
+        self.assertEqual(self.loads, 1)
+
+    def test_version_change_drops_entry(self):
+        self.cache.put(KEY, SCOPE, (3, None), b'{}')
+        self.versions = (4, None)
+        self.clock.now += 31
+        self.assertIsNone(self.cache.get(KEY))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_max_age_drops_entry(self):
+        self.cache.put(KEY, SCOPE, (3, None), b'{}')
+        self.clock.now += 601
+        self.assertIsNone(self.cache.get(KEY))
+        self.assertEqual(self.loads, 0)
+
+    def test_version_load_error_is_miss(self):
+        self.cache.put(KEY, SCOPE, (3, None), b'{}')
+        self.cache.load_versions = _raise_db_down
+        self.clock.now += 31
+        self.assertIsNone(self.cache.get(KEY))
+        self.assertEqual(self.cache.stats()['errors'], 1)
+
+    def test_invalidate_chat(self):
+        self.cache.put(KEY, SCOPE, (3, None), b'{}')
+        self.cache.put(('user', 'u', 10, 2026), ShareScope(7, SCOPE.month_start, True), (1, 1), b'{}')
+        self.assertEqual(self.cache.invalidate_chat(-100), 1)
+        self.assertIsNone(self.cache.get(KEY))
+        self.assertIsNotNone(self.cache.get(('user', 'u', 10, 2026)))
+
+    def test_lru_bound(self):
+        for i in range(3):
+            self.cache.put(('group', str(i), 10, 2026), SCOPE, (3, None), b'{}')
+        self.assertIsNone(self.cache.get(('group', '0', 10, 2026)))
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+    def test_get_or_build_does_not_cache_errors(self):
+        self.assertIsNone(self.cache.get_or_build(KEY, lambda: None))
+        entry = self.cache.get_or_build(KEY, lambda: (SCOPE, (3, None), b'{}'))
+        self.assertEqual(entry.body, b'{}')
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.05)
+            return SCOPE, (3, None), b'{"x": 1}'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_build(KEY, build)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({r.etag for r in results}, {results[0].etag})
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+
+def _raise_db_down(scope):
+    raise RuntimeError('db down')
+
+
+class TestShareViewCounter(unittest.TestCase):
+    """Тесты ShareViewCounter"""
+
+    def test_views_aggregated_into_one_write(self):
+        writes = []
+        counter = ShareViewCounter(write_counts=writes.append, start_thread=False)
+        for _ in range(5):
+            counter.add('g1', 'group', 10, 2026)
+        counter.add('u1', 'user', '10', '2026')
+        self.assertEqual(counter.pending('g1', 'group', 10, 2026), 5)
+        self.assertEqual(counter.flush(), 2)
+        self.assertEqual(writes, [{('g1', 'group', 10, 2026): 5, ('u1', 'user', 10, 2026): 1}])
+        self.assertEqual(counter.pending('g1', 'group', 10, 2026), 0)
+        self.assertEqual(counter.flush(), 0)
+
+    def test_failed_write_keeps_counts(self):
+        def fail(counts):
+            raise RuntimeError('db down')
+
+        counter = ShareViewCounter(write_counts=fail, start_thread=False)
+        counter.add('g1', 'group', 10, 2026, n=3)
+        self.assertEqual(counter.flush(), 0)
+        counter.add('g1', 'group', 10, 2026)
+        self.assertEqual(counter.pending('g1', 'group', 10, 2026), 4)
+        self.assertEqual(counter.stats()['errors'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
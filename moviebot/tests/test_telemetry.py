@@ -0,0 +1,170 @@
+"""
+Тесты для отложенной записи телеметрии database/telemetry.py
+"""
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.database import telemetry
+from moviebot.database.telemetry import TelemetryWriter
+
+
+class FakeDB:
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+        self.written = threading.Event()
+
+    def write_batch(self, table, columns, rows):
+        if self.fail:
+            raise RuntimeError('db down')
+        self.batches.append((table, columns, list(rows)))
+        self.written.set()
+
+    def rows(self, table):
+        return [row for t, _, rows in self.batches if t == table for row in rows]
+
+
+class TestTelemetryWriter(unittest.TestCase):
+    """Тесты TelemetryWriter"""
+
+    def make_writer(self, **kwargs):
+        self.db = FakeDB()
+        params = dict(max_buffer=100, batch_size=10, flush_interval=60, write_batch=self.db.write_batch)
+        params.update(kwargs)
+        writer = TelemetryWriter(**params)
+        self.addCleanup(writer.shutdown)
+        return writer
+
+    def test_size_trigger_writes_multi_row_batch(self):
+        writer = self.make_writer(batch_size=5)
+        for i in range(5):
+            self.assertTrue(writer.enqueue('stats', (i, 'user', 'cmd', '2026-01-01 00:00:00', 1)))
+        self.assertTrue(self.db.written.wait(5))
+        table, columns, rows = self.db.batches[0]
+        self.assertEqual(table, 'stats')
+        self.assertEqual(columns[0], 'user_id')
+        self.assertEqual(len(rows), 5)
+
+    def test_time_trigger(self):
+        writer = self.make_writer(flush_interval=0.05)
+        writer.enqueue('stats', (1, 'user', 'cmd', 'ts', 1))
+        self.assertTrue(self.db.written.wait(5))
+        self.assertEqual(len(self.db.rows('stats')), 1)
+
+    def test_groups_rows_by_table(self):
+        writer = self.make_writer()
+        writer.enqueue('stats', (1, 'user', 'cmd', 'ts', 1))
+        writer.enqueue('kinopoisk_api_logs', ('/films', 'GET', 200, None, None, '1', 'ts'))
+        writer.enqueue('stats', (2, 'user', 'cmd', 'ts', 1))
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual([b[0] for b in self.db.batches], ['stats', 'kinopoisk_api_logs'])
+        self.assertEqual([r[0] for r in self.db.rows('stats')], [1, 2])
+
+    def test_bounded_buffer_drops(self):
+        writer = self.make_writer(max_buffer=3, batch_size=100)
+        results = [writer.enqueue('stats', (i, 'u', 'c', 'ts', 1)) for i in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(writer.stats()['dropped'], 2)
+
+    def test_failed_batch_is_retried(self):
+        writer = self.make_writer()
+        self.db.fail = True
+        writer.enqueue('stats', (1, 'u', 'c', 'ts', 1))
+        writer.enqueue('kinopoisk_api_logs', ('/films', 'GET', 200, None, None, None, 'ts'))
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.stats()['buffered'], 2)
+        self.db.fail = False
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(writer.stats()['errors'], 1)
+
+    def test_shutdown_flushes_and_rejects(self):
+        writer = self.make_writer()
+        writer.enqueue('stats', (1, 'u', 'c', 'ts', 1))
+        writer.shutdown()
+        self.assertEqual(len(self.db.rows('stats')), 1)
+        self.assertFalse(writer.enqueue('stats', (2, 'u', 'c', 'ts', 1)))
+
+    def test_discard_removes_only_matching_rows(self):
+        writer = self.make_writer()
+        writer.enqueue('stats', (1, 'u', 'c', 'ts', -5))
+        writer.enqueue('stats', (2, 'u', 'c', 'ts', -5))
+        writer.enqueue('stats', (1, 'u', 'c', 'ts', 7))
+        writer.enqueue('kinopoisk_api_logs', ('/films', 'GET', 200, 1, -5, None, 'ts'))
+        self.assertEqual(writer.discard('stats', chat_id=-5, user_id=1), 1)
+        self.assertEqual(writer.discard('stats', chat_id=-5), 1)
+        writer.flush()
+        self.assertEqual(self.db.rows('stats'), [(1, 'u', 'c', 'ts', 7)])
+        self.assertEqual(len(self.db.rows('kinopoisk_api_logs')), 1)
+
+    def test_discard_waits_for_batch_being_written(self):
+        # Пачка, взятая фоновым потоком до /clean, должна оказаться в БД до DELETE
+        writer = self.make_writer()
+        started, release = threading.Event(), threading.Event()
+
+        def slow_write(table, columns, rows):
+            started.set()
+            release.wait(5)
+            self.db.write_batch(table, columns, rows)
+
+        writer._write_batch = slow_write
+        writer.enqueue('stats', (1, 'u', 'c', 'ts', -5))
+        flusher = threading.Thread(target=writer.flush)
+        flusher.start()
+        self.assertTrue(started.wait(5))
+        result = []
+        discarder = threading.Thread(target=lambda: result.append(writer.discard('stats', chat_id=-5)))
+        discarder.start()
+        discarder.join(0.1)
+        self.assertTrue(discarder.is_alive())
+        release.set()
+        flusher.join(5)
+        discarder.join(5)
+        self.assertEqual((result, len(self.db.rows('stats'))), ([0], 1))
+
+    def test_discard_request_logs_without_writer(self):
+        with patch.object(telemetry, '_writer', None):
+            self.assertEqual(telemetry.discard_request_logs(-5), 0)
+
+    def test_unknown_table(self):
+        writer = self.make_writer()
+        with self.assertRaises(ValueError):
+            writer.enqueue('users', (1,))
+
+
+class TestEnqueueHelpers(unittest.TestCase):
+    """Тесты enqueue_request_log / enqueue_api_log"""
+
+    def setUp(self):
+        self.db = FakeDB()
+        self.writer = TelemetryWriter(flush_interval=60, write_batch=self.db.write_batch)
+        self.addCleanup(self.writer.shutdown)
+        patcher = patch('moviebot.database.telemetry.get_telemetry_writer', return_value=self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_request_log_row(self):
+        telemetry.enqueue_request_log(1, 'user', '/start', 42)
+        self.writer.flush()
+        user_id, username, command, timestamp, chat_id = self.db.rows('stats')[0]
+        self.assertEqual((user_id, username, command, chat_id), (1, 'user', '/start', 42))
+        self.assertRegex(timestamp, r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+    def test_api_log_row(self):
+        telemetry.enqueue_api_log('/api/v2.2/films/1', 'GET', 200, kp_id=1)
+        self.writer.flush()
+        row = self.db.rows('kinopoisk_api_logs')[0]
+        self.assertEqual(row[:6], ('/api/v2.2/films/1', 'GET', 200, None, None, '1'))
+        self.assertIsNotNone(row[6].tzinfo)
+
+
+if __name__ == '__main__':
+    unittest.main()
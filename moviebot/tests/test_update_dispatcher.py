@@ -0,0 +1,132 @@
+"""
+Тесты для диспетчера апдейтов web/update_dispatcher.py
+"""
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+import sys
+import os
+import threading
+import time
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from moviebot.database import db_connection
+from moviebot.database.db_connection import ConnectionPool
+from moviebot.web import update_dispatcher
+from moviebot.web.update_dispatcher import UpdateDispatcher, QueueFullError, get_update_chat_key
+
+
+def message_update(update_id, chat_id):
+    chat = SimpleNamespace(id=chat_id)
+    return SimpleNamespace(update_id=update_id, message=SimpleNamespace(chat=chat))
+
+
+class TestUpdateChatKey(unittest.TestCase):
+    """Тесты определения ключа чата"""
+
+    def test_message_chat(self):
+        self.assertEqual(get_update_chat_key(message_update(1, -100)), -100)
+
+    def test_callback_query_uses_message_chat(self):
+        update = SimpleNamespace(
+            update_id=2, message=None,
+            callback_query=SimpleNamespace(
+                message=SimpleNamespace(chat=SimpleNamespace(id=-5)),
+                from_user=SimpleNamespace(id=7),
+            ),
+        )
+        self.assertEqual(get_update_chat_key(update), -5)
+
+    def test_pre_checkout_uses_user(self):
+        update = SimpleNamespace(update_id=3, pre_checkout_query=SimpleNamespace(from_user=SimpleNamespace(id=42)))
+        self.assertEqual(get_update_chat_key(update), 42)
+
+    def test_unknown_update_not_grouped(self):
+        self.assertEqual(get_update_chat_key(SimpleNamespace(update_id=9)), ('update', 9))
+
+
+class TestUpdateDispatcher(unittest.TestCase):
+    """Тесты UpdateDispatcher"""
+
+    def test_same_chat_processed_in_order(self):
+        seen = []
+
+        def handler(update):
+            time.sleep(0.001)
+            seen.append(update.update_id)
+
+        dispatcher = UpdateDispatcher(handler, workers=4, max_queue=100)
+        for i in range(30):
+            dispatcher.submit(message_update(i, 1))
+        self.assertTrue(dispatcher.join(5))
+        dispatcher.shutdown()
+        self.assertEqual(seen, list(range(30)))
+
+    def test_different_chats_run_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=2)
+        dispatcher = UpdateDispatcher(lambda update: barrier.wait(), workers=3, max_queue=10)
+        for chat_id in (1, 2, 3):
+            dispatcher.submit(message_update(chat_id, chat_id))
+        self.assertTrue(dispatcher.join(5))
+        dispatcher.shutdown()
+        self.assertEqual(dispatcher.stats()['failed'], 0)
+
+    def test_full_queue_rejects(self):
+        release = threading.Event()
+        dispatcher = UpdateDispatcher(lambda update: release.wait(2), workers=1, max_queue=2)
+        dispatcher.submit(message_update(0, 1))
+        time.sleep(0.05)  # первый апдейт взят воркером
+        dispatcher.submit(message_update(1, 1))
+        dispatcher.submit(message_update(2, 1))
+        with self.assertRaises(QueueFullError):
+            dispatcher.submit(message_update(3, 1), timeout=0.05)
+        release.set()
+        dispatcher.join(5)
+        dispatcher.shutdown()
+        stats = dispatcher.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['processed'], 3)
+        self.assertEqual(stats['max_queue_depth'], 2)
+
+    def test_handler_error_does_not_stop_worker(self):
+        def handler(update):
+            if update.update_id == 0:
+                raise ValueError('boom')
+
+        dispatcher = UpdateDispatcher(handler, workers=1, max_queue=10)
+        dispatcher.submit(message_update(0, 1))
+        dispatcher.submit(message_update(1, 1))
+        dispatcher.join(5)
+        dispatcher.shutdown()
+        stats = dispatcher.stats()
+        self.assertEqual((stats['failed'], stats['processed']), (1, 1))
+
+
+class TestWebhookDispatcher(unittest.TestCase):
+    """Диспетчер /webhook возвращает соединение воркера в пул после каждого апдейта"""
+
+    def test_worker_connection_released_after_update(self):
+        pool = ConnectionPool('postgresql://test', min_conn=0, max_conn=2, timeout=0.2,
+                              connect=lambda: Mock(closed=0, get_transaction_status=Mock(return_value=0)))
+        for patcher in (patch.object(db_connection, '_pool', pool), patch.object(update_dispatcher, '_dispatcher', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Обработчик берёт соединение и не закрывает его; воркеров больше, чем соединений в пуле
+        bot = SimpleNamespace(process_new_updates=lambda updates: db_connection.get_db_connection())
+        dispatcher = update_dispatcher.get_update_dispatcher(bot)
+        self.addCleanup(dispatcher.shutdown)
+        for update_id in range(20):
+            dispatcher.submit(message_update(update_id, update_id))
+        self.assertTrue(dispatcher.join(5))
+        stats = dispatcher.stats()
+        self.assertEqual((stats['processed'], stats['failed']), (20, 0))
+        self.assertEqual(pool.stats()['idle'], pool.stats()['size'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Тесты для голосового конвейера Шазама services/voice_pipeline.py
+"""
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import io
+import threading
+
+# Добавляем путь к проекту (родительская директория moviebot)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import numpy as np
+
+from moviebot.services.voice_pipeline import (
+    StageTimer, TranscriptionBusyError, TranscriptionPool, decode_ogg_bytes,
+)
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+def make_ogg_opus(seconds=1.0, rate=48000):
+    """Синусоида 440 Гц в OGG/Opus — как голосовое из Telegram"""
+    buf = io.BytesIO()
+    container = av.open(buf, 'w', format='ogg')
+    stream = container.add_stream('libopus', rate=rate)
+    stream.layout = 'mono'
+    t = np.arange(int(rate * seconds)) / rate
+    samples = (0.5 * np.sin(2 * np.pi * 440 * t)).astype('float32')
+    frame = av.AudioFrame.from_ndarray(samples[None, :], format='flt', layout='mono')
+    frame.sample_rate = rate
+    for packet in stream.encode(frame):
+        container.mux(packet)
+    for packet in stream.encode(None):
+        container.mux(packet)
+    container.close()
+    return buf.getvalue()
+
+
+@unittest.skipIf(av is None, "PyAV не установлен")
+class TestDecodeOggBytes(unittest.TestCase):
+    """Тесты decode_ogg_bytes"""
+
+    def test_decodes_to_16khz_float32(self):
+        audio = decode_ogg_bytes(make_ogg_opus(seconds=1.0))
+        self.assertEqual(audio.dtype, np.float32)
+        self.assertEqual(audio.ndim, 1)
+        self.assertAlmostEqual(len(audio) / 16000, 1.0, delta=0.05)
+        self.assertLessEqual(float(np.abs(audio).max()), 1.0)
+
+    def test_no_temp_files(self):
+        with patch('tempfile.NamedTemporaryFile') as named, patch('tempfile.mkstemp') as mkstemp:
+            decode_ogg_bytes(make_ogg_opus(seconds=0.5))
+        named.assert_not_called()
+        mkstemp.assert_not_called()
+
+    def test_empty_bytes(self):
+        self.assertEqual(len(decode_ogg_bytes(b'')), 0)
+
+
+class TestTranscriptionPool(unittest.TestCase):
+    """Тесты TranscriptionPool"""
+
+    def test_transcribe(self):
+        pool = TranscriptionPool(lambda audio: f"len={len(audio)}", workers=1, max_queue=0)
+        self.assertEqual(pool.transcribe(np.zeros(5, dtype='float32'), timeout=5), 'len=5')
+        stats = pool.stats()
+        self.assertEqual((stats['completed'], stats['in_flight']), (1, 0))
+        pool.shutdown()
+
+    def test_rejects_when_full(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def transcribe(audio):
+            started.set()
+            release.wait(5)
+            return 'ok'
+
+        pool = TranscriptionPool(transcribe, workers=1, max_queue=1)
+        running = pool.submit('a')
+        started.wait(5)
+        queued = pool.submit('b')
+        with self.assertRaises(TranscriptionBusyError):
+            pool.submit('c')
+        release.set()
+        self.assertEqual(running.result(5), 'ok')
+        self.assertEqual(queued.result(5), 'ok')
+        # Места освободились — снова принимаем
+        self.assertEqual(pool.transcribe('d', timeout=5), 'ok')
+        self.assertEqual(pool.stats()['rejected'], 1)
+        pool.shutdown()
+
+    def test_error_releases_slot(self):
+        def transcribe(audio):
+            raise RuntimeError('boom')
+
+        pool = TranscriptionPool(transcribe, workers=1, max_queue=0)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                pool.transcribe('a', timeout=5)
+        self.assertEqual(pool.stats()['failed'], 2)
+        pool.shutdown()
+
+
+class TestStageTimer(unittest.TestCase):
+    """Тесты StageTimer"""
+
+    def test_stages(self):
+        timer = StageTimer()
+        with patch('moviebot.services.voice_pipeline.time.perf_counter', side_effect=[0.0, 0.25, 1.0, 1.5]):
+            with timer.stage('download'):
+                pass
+            with timer.stage('decode'):
+                pass
+        self.assertEqual(timer.timings, {'download': 0.25, 'decode': 0.5})
+        self.assertEqual(timer.format(), 'download=250мс decode=500мс total=750мс')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+"""
+Права доступа пользователя в чате по подпискам — одним запросом и с кэшем.
+
+Один колбэк проверяет has_series_features_access, has_tickets_access, has_pro_access,
+has_recommendations_access и has_subscription_feature; раньше каждая проверка заново читала
+subscriptions, subscription_features и subscription_members.
+
+- load_entitlements читает одним запросом личные подписки пользователя и групповые подписки
+  чата вместе с их функциями и участием пользователя в групповой подписке;
+- Entitlements — неизменяемый снимок, по которому отвечают все проверки доступа; срок
+  действия подписок сверяется в момент вопроса, поэтому истёкшая подписка не даёт доступа
+  даже из кэша;
+- EntitlementCache хранит снимки по (user_id, chat_id) не дольше ttl; создание, продление,
+  отмена подписки, смена тарифа и участников сбрасывают затронутые записи сразу.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+import pytz
+
+from moviebot.config import ENTITLEMENTS_CACHE_TTL, ENTITLEMENTS_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# Специальный доступ для создателя бота (@zap_nikita): личная подписка 'all' навсегда
+CREATOR_USER_ID = 301810276
+ALL_FEATURES = frozenset(('notifications', 'recommendations', 'tickets'))
+
+# Личная подписка: тариф, окончание, чат оформления, функции
+PersonalSubscription = namedtuple('PersonalSubscription', ('plan_type', 'expires_at', 'chat_id', 'features'))
+# Групповая подписка чата: участие пользователя учитывается, если задан group_size
+GroupSubscription = namedtuple('GroupSubscription', ('id', 'plan_type', 'expires_at', 'group_size', 'is_member',
+                                                     'features'))
+
+
+def _is_active(expires_at, now):
+    if expires_at is None:  # lifetime
+        return True
+    if isinstance(expires_at, str):
+        expires_at = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
+    if expires_at.tzinfo is None:
+        expires_at = pytz.UTC.localize(expires_at)
+    return expires_at > now
+
+
+class Entitlements(namedtuple('Entitlements', ('user_id', 'chat_id', 'personal', 'groups'))):
+    """
+    Снимок прав пользователя в чате. personal — личные подписки (по activated_at),
+    groups — групповые подписки чата (самая свежая первой).
+    """
+    __slots__ = ()
+
+    def has_personal_plan(self, plans, now=None):
+        now = now or datetime.now(pytz.UTC)
+        return any(sub.plan_type in plans and _is_active(sub.expires_at, now) for sub in self.personal)
+
+    def group_subscription(self, now=None):
+        """Действующая групповая подписка чата (как get_active_group_subscription_by_chat_id)"""
+        now = now or datetime.now(pytz.UTC)
+        for sub in self.groups:
+            if _is_active(sub.expires_at, now):
+                return sub
+        return None
+
+    def has_plan(self, plans, now=None):
+        """
+        Доступ по тарифам plans: личная подписка с таким тарифом в любом чате либо
+        групповая подписка этого чата (при ограничении по участникам — только участникам).
+        """
+        now = now or datetime.now(pytz.UTC)
+        if self.has_personal_plan(plans, now):
+            return True
+        if self.chat_id >= 0:
+            return False
+        group = self.group_subscription(now)
+        if group is None or group.plan_type not in plans:
+            return False
+        return group.group_size is None or group.is_member
+
+    def has_feature(self, feature, now=None):
+        """Функция подписки в этом чате (как has_subscription_feature)"""
+        if self.user_id == CREATOR_USER_ID:
+            return True
+        now = now or datetime.now(pytz.UTC)
+        for sub in self.personal:
+            if sub.chat_id == self.chat_id and feature in sub.features and _is_active(sub.expires_at, now):
+                return True
+        for sub in self.groups:
+            if feature in sub.features and _is_active(sub.expires_at, now):
+                return sub.group_size is None or sub.is_member
+        return False
+
+
+def load_entitlements(user_id, chat_id):
+    """Личные подписки пользователя и групповые подписки чата — одним запросом"""
+    from moviebot.database.db_connection import db_connection
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT s.id, s.subscription_type, s.plan_type, s.chat_id, s.expires_at, s.group_size,
+                   COALESCE(array_agg(sf.feature_type) FILTER (WHERE sf.feature_type IS NOT NULL), '{}') AS features,
+                   s.subscription_type = 'group' AND EXISTS (
+                       SELECT 1 FROM subscription_members sm WHERE sm.subscription_id = s.id AND sm.user_id = %(user_id)s
+                   ) AS is_member
+            FROM subscriptions s
+            LEFT JOIN subscription_features sf ON sf.subscription_id = s.id
+            WHERE s.is_active = TRUE AND (s.expires_at IS NULL OR s.expires_at > NOW())
+              AND ((s.subscription_type = 'personal' AND s.user_id = %(user_id)s)
+                   OR (s.subscription_type = 'group' AND s.chat_id = %(chat_id)s))
+            GROUP BY s.id
+            ORDER BY s.subscription_type, s.activated_at ASC NULLS LAST
+        """, {'user_id': user_id, 'chat_id': chat_id})
+        rows = cur.fetchall()
+
+    personal, groups = [], []
+    if user_id == CREATOR_USER_ID:
+        personal.append(PersonalSubscription('all', None, None, ALL_FEATURES))
+    for row in rows:
+        features = frozenset(row['features'] or ())
+        if row['subscription_type'] == 'personal':
+            personal.append(PersonalSubscription(row['plan_type'], row['expires_at'], row['chat_id'], features))
+        else:
+            groups.append(GroupSubscription(row['id'], row['plan_type'], row['expires_at'], row['group_size'],
+                                            bool(row['is_member']), features))
+    groups.reverse()  # самая свежая групповая подписка первой
+    return Entitlements(user_id, chat_id, tuple(personal), tuple(groups))
+
+
+class EntitlementCache:
+    """LRU снимков прав по (user_id, chat_id) с TTL и явным сбросом"""
+
+    def __init__(self, ttl=ENTITLEMENTS_CACHE_TTL, max_entries=ENTITLEMENTS_CACHE_MAX_ENTRIES,
+                 load=load_entitlements, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._load = load
+        self._clock = clock
+        self._entries = OrderedDict()  # (user_id, chat_id) -> (Entitlements, loaded_at)
+        self._lock = threading.Lock()
+        # Растёт при каждом сбросе: снимок, загруженный до сброса, в кэш не кладётся
+        self._generation = 0
+        self._counters = {'hits': 0, 'misses': 0, 'invalidated': 0}
+
+    def get(self, user_id, chat_id):
+        key = (user_id, chat_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[0]
+            self._counters['misses'] += 1
+            generation = self._generation
+        entitlements = self._load(user_id, chat_id)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (entitlements, self._clock())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entitlements
+
+    def invalidate(self, user_id=None, chat_id=None):
+        """
+        Сбрасывает снимки пользователя (во всех чатах) и чата (у всех пользователей);
+        без аргументов — все. Возвращает число сброшенных записей.
+        """
+        with self._lock:
+            self._generation += 1
+            if user_id is None and chat_id is None:
+                keys = list(self._entries)
+            else:
+                keys = [k for k in self._entries if k[0] == user_id or k[1] == chat_id]
+            for key in keys:
+                del self._entries[key]
+            self._counters['invalidated'] += len(keys)
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), max_entries=self.max_entries)
+
+
+_cache = None
+_init_lock = threading.Lock()
+
+
+def get_entitlement_cache():
+    global _cache
+    if _cache is None:
+        with _init_lock:
+            if _cache is None:
+                _cache = EntitlementCache()
+    return _cache
+
+
+def get_entitlements(user_id, chat_id):
+    """Права пользователя в чате (из кэша либо одним запросом)"""
+    return get_entitlement_cache().get(user_id, chat_id)
+
+
+def invalidate_entitlements(user_id=None, chat_id=None):
+    """Вызывать после любого изменения подписок, их функций и участников"""
+    dropped = get_entitlement_cache().invalidate(user_id=user_id, chat_id=chat_id)
+    logger.debug(f"[ENTITLEMENTS] Сброшено {dropped} записей (user_id={user_id}, chat_id={chat_id})")
+    return dropped
+
+
+def invalidate_subscription_owner(row):
+    """Сброс по строке подписки (RETURNING chat_id, user_id): её владелец и её чат"""
+    if row:
+        invalidate_entitlements(user_id=row.get('user_id'), chat_id=row.get('chat_id'))
@@ -12,8 +12,6 @@ from moviebot.database.db_connection import get_db_connection, get_db_cursor, db
 from moviebot.bot.bot_init import bot
 
 logger = logging.getLogger(__name__)
-conn = get_db_connection()
-cursor = get_db_cursor()
 
 def extract_kp_id_from_text(text):
     """Извлекает kp_id из текста (URL или просто число)"""
@@ -66,32 +66,44 @@ def _mark_event_sent(chat_id, event_type):
             pass
 
 
-def send_dice_game_event(chat_id, skip_checks=False):
+def send_dice_game_event(chat_id, skip_checks=False, candidate=None):
     """
     Общая функция для отправки события игры в кубик
     
     Args:
         chat_id: ID чата
         skip_checks: Если True, пропускает проверки на активных участников и время (для примеров из настроек)
+        candidate: RandomEventCandidate из рассылки (scheduler.random_event_candidates) — чат уже
+            выбран как группа с включёнными событиями, дата последней игры и число активных
+            участников известны и повторно не запрашиваются. Ошибки Telegram в этом режиме
+            не глотаются: 429, 403 и неудачные отправки обрабатывает Broadcaster.
     
     Returns:
         bool: True если событие успешно отправлено, False иначе
     """
+    broadcast = candidate is not None
     try:
         now = datetime.now(plans_tz)
         
         # Проверяем, что это групповой чат (не личный)
-        try:
-            chat_info = bot.get_chat(chat_id)
-            if chat_info.type == 'private':
-                logger.warning(f"[DICE GAME] Чат {chat_id} является личным, пропускаем")
+        if not broadcast:
+            try:
+                chat_info = bot.get_chat(chat_id)
+                if chat_info.type == 'private':
+                    logger.warning(f"[DICE GAME] Чат {chat_id} является личным, пропускаем")
+                    return False
+            except Exception as e:
+                logger.warning(f"[DICE GAME] Не удалось получить информацию о чате {chat_id}: {e}")
                 return False
-        except Exception as e:
-            logger.warning(f"[DICE GAME] Не удалось получить информацию о чате {chat_id}: {e}")
-            return False
         
+        # В рассылке события уже включены (отбор random_event_candidates) — проверяем только 14 дней
+        if broadcast:
+            last_date = candidate.last_dice_date
+            if last_date and (now.date() - last_date).days < 14:
+                logger.info(f"[DICE GAME] Для чата {chat_id} прошло только {(now.date() - last_date).days} дней с последнего события (нужно 14)")
+                return False
         # Проверяем, включены ли случайные события (если не пропускаем проверки)
-        if not skip_checks:
+        elif not skip_checks:
             if not _get_random_events_enabled(chat_id):
                 logger.info(f"[DICE GAME] Случайные события выключены для чата {chat_id}")
                 return False
@@ -130,15 +142,21 @@ def send_dice_game_event(chat_id, skip_checks=False):
                 chat_members_count = bot.get_chat_member_count(chat_id)
                 total_participants = max(1, chat_members_count - 1)
             except Exception as e:
+                if broadcast and isinstance(e, ApiTelegramException):
+                    raise
                 logger.warning(f"[DICE GAME] Не удалось получить количество участников чата {chat_id}: {e}")
                 return False
-            
+        
+        if not skip_checks and broadcast:
+            active_participants = candidate.active_participants
+        elif not skip_checks:
+            from moviebot.bot.bot_init import BOT_ID
             threshold_time = (now - timedelta(days=30)).isoformat()
             conn_local = get_db_connection()
             cursor_local = get_db_cursor()
             try:
                 with db_lock:
-                    bot_id = bot.get_me().id
+                    bot_id = BOT_ID if BOT_ID is not None else bot.get_me().id
                     cursor_local.execute('''
                         SELECT COUNT(DISTINCT user_id) AS count
                         FROM stats 
@@ -157,7 +175,8 @@ def send_dice_game_event(chat_id, skip_checks=False):
                     conn_local.close()
                 except:
                     pass
-            
+        
+        if not skip_checks:
             required_participants = int(total_participants * 0.65)
             if active_participants < required_participants:
                 logger.info(f"[DICE GAME] Для чата {chat_id} недостаточно активных участников ({active_participants} из {required_participants})")
@@ -198,12 +217,18 @@ def send_dice_game_event(chat_id, skip_checks=False):
                     
                     current_chat_id = new_chat_id
                 except Exception as e2:
+                    if broadcast:
+                        raise
                     logger.error(f"[DICE GAME] Не удалось отправить сообщение даже в новый чат {new_chat_id}: {e2}", exc_info=True)
                     return False
             else:
+                if broadcast:
+                    raise
                 logger.error(f"[DICE GAME] Ошибка Telegram API при отправке в чат {chat_id}: {e}", exc_info=True)
                 return False
         except Exception as e:
+            if broadcast:
+                raise
             logger.error(f"[DICE GAME] Непредвиденная ошибка при отправке в чат {chat_id}: {e}", exc_info=True)
             return False
         
@@ -222,8 +247,8 @@ def send_dice_game_event(chat_id, skip_checks=False):
         except Exception as dice_e:
             logger.error(f"[DICE GAME] Ошибка при автоматическом броске кубика: {dice_e}", exc_info=True)
         
-        # Отмечаем, что событие отправлено (если не пропускаем проверки)
-        if not skip_checks:
+        # Отмечаем, что событие отправлено (если не пропускаем проверки; рассылка пишет отметки сама, одной вставкой)
+        if not skip_checks and not broadcast:
             _mark_event_sent(current_chat_id, 'random_event')
             
             # Сохраняем дату последнего запуска
@@ -251,6 +276,8 @@ def send_dice_game_event(chat_id, skip_checks=False):
         return True
         
     except Exception as e:
+        if broadcast:
+            raise
         logger.error(f"[DICE GAME] Критическая ошибка в send_dice_game_event: {e}", exc_info=True)
         return False
 
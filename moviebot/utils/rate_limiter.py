@@ -0,0 +1,32 @@
+"""
+Ограничение частоты запросов к внешним API, общее для потоков процесса.
+
+RateLimiter раздаёт потокам слоты не чаще rate в секунду; pause сдвигает все следующие
+слоты (ответ 429 с retry_after — ждать должны все, а не только получивший его поток).
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """Не чаще rate запросов в секунду на все потоки"""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            self._sleep(slot - now)
+
+    def pause(self, seconds):
+        """Следующие слоты — не раньше чем через seconds"""
+        with self._lock:
+            self._next = max(self._next, self._clock() + seconds)
@@ -0,0 +1,215 @@
+"""
+Диспетчер апдейтов Telegram для /webhook.
+
+- фиксированный пул воркеров вместо нового потока на каждый апдейт;
+- ограниченная очередь: при переполнении submit() ждёт и затем отказывает,
+  /webhook отвечает 503 и Telegram доставит апдейт повторно;
+- апдейты одного чата обрабатываются строго по порядку, разные чаты — параллельно.
+- воркеры живут долго, поэтому соединение БД, взятое при обработке апдейта, возвращается
+  в пул сразу после него (run_in_connection_scope).
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def get_update_chat_key(update):
+    """
+    Ключ упорядочивания апдейта: id чата (или пользователя, если чата нет).
+    Апдейты без чата/пользователя получают уникальный ключ и не упорядочиваются.
+    """
+    for attr in ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                 'message_reaction', 'message_reaction_count', 'my_chat_member',
+                 'chat_member', 'chat_join_request'):
+        obj = getattr(update, attr, None)
+        chat = getattr(obj, 'chat', None) if obj is not None else None
+        if chat is not None and getattr(chat, 'id', None) is not None:
+            return chat.id
+    callback = getattr(update, 'callback_query', None)
+    if callback is not None:
+        message = getattr(callback, 'message', None)
+        chat = getattr(message, 'chat', None) if message is not None else None
+        if chat is not None and getattr(chat, 'id', None) is not None:
+            return chat.id
+        user = getattr(callback, 'from_user', None)
+        if user is not None:
+            return user.id
+    for attr in ('pre_checkout_query', 'shipping_query', 'inline_query', 'chosen_inline_result'):
+        obj = getattr(update, attr, None)
+        user = getattr(obj, 'from_user', None) if obj is not None else None
+        if user is not None:
+            return user.id
+    poll_answer = getattr(update, 'poll_answer', None)
+    if poll_answer is not None and getattr(poll_answer, 'user', None) is not None:
+        return poll_answer.user.id
+    return ('update', getattr(update, 'update_id', id(update)))
+
+
+class QueueFullError(Exception):
+    """Очередь апдейтов переполнена"""
+
+
+class UpdateDispatcher:
+    """Пул воркеров с ограниченной очередью и последовательной обработкой в пределах чата"""
+
+    def __init__(self, handler, workers=8, max_queue=1000, key_func=get_update_chat_key, name='update-worker'):
+        self._handler = handler
+        self._key_func = key_func
+        self.workers = workers
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._pending = {}  # chat_key -> deque[(item, enqueued_at)]
+        self._ready = deque()  # chat_key, готовые к обработке (не заняты воркером)
+        self._busy = set()  # chat_key, которые сейчас обрабатываются
+        self._size = 0
+        self._stopping = False
+        self._stats = {
+            'submitted': 0,
+            'processed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'blocked_submits': 0,
+            'max_queue_depth': 0,
+        }
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._handle_time_total = 0.0
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'{name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, item, timeout=0.0):
+        """
+        Поставить апдейт в очередь. Если очередь полна, ждёт до timeout секунд
+        и затем бросает QueueFullError.
+        """
+        key = self._key_func(item)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._size >= self.max_queue:
+                self._stats['blocked_submits'] += 1
+                while self._size >= self.max_queue and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['rejected'] += 1
+                        raise QueueFullError(f"очередь апдейтов заполнена ({self.max_queue})")
+                    self._cond.wait(remaining)
+            if self._stopping:
+                raise QueueFullError("диспетчер остановлен")
+            queue = self._pending.get(key)
+            if queue is None:
+                queue = self._pending[key] = deque()
+                if key not in self._busy:
+                    self._ready.append(key)
+            queue.append((item, time.monotonic()))
+            self._size += 1
+            self._stats['submitted'] += 1
+            if self._size > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = self._size
+            self._cond.notify_all()
+
+    def _next(self):
+        with self._cond:
+            while not self._ready:
+                if self._stopping and self._size == 0:
+                    return None, None, None
+                self._cond.wait()
+            key = self._ready.popleft()
+            queue = self._pending[key]
+            item, enqueued_at = queue.popleft()
+            if not queue:
+                del self._pending[key]
+            self._busy.add(key)
+            self._size -= 1
+            waited = time.monotonic() - enqueued_at
+            self._wait_time_total += waited
+            if waited > self._wait_time_max:
+                self._wait_time_max = waited
+            self._cond.notify_all()
+            return key, item, waited
+
+    def _done(self, key, ok, elapsed):
+        with self._cond:
+            self._busy.discard(key)
+            self._stats['processed' if ok else 'failed'] += 1
+            self._handle_time_total += elapsed
+            if key in self._pending:
+                self._ready.append(key)
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            key, item, _ = self._next()
+            if key is None:
+                return
+            started = time.monotonic()
+            ok = True
+            try:
+                self._handler(item)
+            except Exception as e:
+                ok = False
+                logger.error(f"[DISPATCHER] Ошибка обработки апдейта (chat={key}): {e}", exc_info=True)
+            self._done(key, ok, time.monotonic() - started)
+
+    def join(self, timeout=None):
+        """Дождаться, пока очередь опустеет и все апдейты обработаются"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._size or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, wait=True, timeout=None):
+        """Остановить приём; воркеры доработают очередь и завершатся"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            done = self._stats['processed'] + self._stats['failed']
+            started = done + len(self._busy)
+            return dict(
+                self._stats,
+                workers=self.workers,
+                max_queue=self.max_queue,
+                queue_depth=self._size,
+                busy_chats=len(self._busy),
+                waiting_chats=len(self._pending),
+                avg_wait_ms=round(self._wait_time_total * 1000 / started, 2) if started else 0.0,
+                max_wait_ms=round(self._wait_time_max * 1000, 2),
+                avg_handle_ms=round(self._handle_time_total * 1000 / done, 2) if done else 0.0,
+            )
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_update_dispatcher(bot=None):
+    """Глобальный диспетчер для /webhook (создаётся при первом вызове с bot)"""
+    global _dispatcher
+    if _dispatcher is None and bot is not None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                from moviebot.config import WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE
+                from moviebot.database.db_connection import run_in_connection_scope
+                _dispatcher = UpdateDispatcher(
+                    lambda update: run_in_connection_scope(bot.process_new_updates, [update]),
+                    workers=WEBHOOK_WORKERS,
+                    max_queue=WEBHOOK_QUEUE_SIZE,
+                    name='webhook-worker',
+                )
+                logger.info(f"[DISPATCHER] Запущен: воркеров={WEBHOOK_WORKERS}, очередь={WEBHOOK_QUEUE_SIZE}")
+    return _dispatcher
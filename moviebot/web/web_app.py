@@ -12,6 +12,9 @@ import threading
 # Импорт yookassa удален, используется moviebot.api.yookassa_api
 from dotenv import load_dotenv
 from moviebot.services.shazam_service import init_shazam_index
+from moviebot.web.update_dispatcher import get_update_dispatcher, QueueFullError
+from moviebot.config import WEBHOOK_ENQUEUE_TIMEOUT
+from moviebot.utils.entitlements import invalidate_entitlements
 
 # Загружаем переменные окружения из .env файла (для локальной разработки)
 # В Railway переменные окружения уже доступны через os.getenv()
@@ -73,6 +76,12 @@ def create_web_app(bot):
     except Exception as e:
         logger.warning(f"[WEB APP] init_database при старте: {e}", exc_info=True)
 
+    @app.teardown_request
+    def release_db_connection(exc):
+        """Соединение, которое обработчик взял через get_db_connection() и не закрыл, — обратно в пул"""
+        from moviebot.database.db_connection import release_thread_connection
+        release_thread_connection()
+
     @app.route('/webhook', methods=['POST', 'GET'])
     def webhook():
         logger.info("=" * 80)
@@ -106,19 +115,16 @@ def create_web_app(bot):
                 if update.pre_checkout_query:
                     logger.info("[WEBHOOK] PRE_CHECKOUT_QUERY пришел! (хотя для Stars не должен)")
                 
-                # КРИТИЧНО: Обрабатываем update в отдельном потоке, чтобы сразу вернуть 200
-                # Это предотвращает 499 ошибки (timeout) от Telegram
-                def process_update_async():
-                    try:
-                        bot.process_new_updates([update])
-                        logger.info("[WEBHOOK] ✅ Обновление успешно обработано")
-                    except Exception as process_e:
-                        logger.error(f"[WEBHOOK] Ошибка при обработке update: {process_e}", exc_info=True)
-                
-                # Запускаем обработку в отдельном потоке
-                process_thread = threading.Thread(target=process_update_async, daemon=True)
-                process_thread.start()
-                logger.info("[WEBHOOK] Обработка update запущена в фоновом потоке")
+                # КРИТИЧНО: Обрабатываем update в пуле воркеров, чтобы сразу вернуть 200
+                # Это предотвращает 499 ошибки (timeout) от Telegram.
+                # Апдейты одного чата обрабатываются по порядку, разных чатов — параллельно.
+                try:
+                    get_update_dispatcher(bot).submit(update, timeout=WEBHOOK_ENQUEUE_TIMEOUT)
+                except QueueFullError as queue_e:
+                    # Telegram повторит доставку при не-2xx ответе
+                    logger.warning(f"[WEBHOOK] {queue_e}, отвечаем 503")
+                    return '', 503
+                logger.info("[WEBHOOK] Update поставлен в очередь обработки")
             else:
                 logger.warning("[WEBHOOK] Update не распарсился")
         except Exception as e:
@@ -286,6 +292,7 @@ def create_web_app(bot):
                                             WHERE chat_id = %s AND subscription_type = 'group' AND is_active = TRUE
                                         """, (datetime.now(pytz.UTC), chat_id))
                                     conn_lifetime.commit()
+                                    invalidate_entitlements(user_id=user_id, chat_id=chat_id)
                                     cancelled_count = cursor_lifetime.rowcount
                                     if cancelled_count > 0:
                                         logger.info(f"[YOOKASSA LIFETIME] Отменено {cancelled_count} активных подписок для {subscription_type} (user_id={user_id}, chat_id={chat_id})")
@@ -364,6 +371,7 @@ def create_web_app(bot):
                                             WHERE chat_id = %s AND subscription_type = 'group' AND is_active = TRUE
                                         """, (datetime.now(pytz.UTC), chat_id))
                                     conn_lifetime.commit()
+                                    invalidate_entitlements(user_id=user_id, chat_id=chat_id)
                                     cancelled_count = cursor_lifetime.rowcount
                                     if cancelled_count > 0:
                                         logger.info(f"[YOOKASSA LIFETIME] Дополнительно отменено {cancelled_count} активных подписок для {subscription_type} (user_id={user_id}, chat_id={chat_id})")
@@ -526,6 +534,7 @@ def create_web_app(bot):
                                             WHERE id = %s
                                         """, (new_period_type, new_full_price, next_payment, expires_at, now, period_sub_id))
                                         conn_period.commit()
+                                        invalidate_entitlements(user_id=user_id, chat_id=chat_id)
                                         
                                         logger.info(f"[YOOKASSA PERIOD UPGRADE] Обновлена подписка {period_sub_id}: period_type={new_period_type}, price={new_full_price}₽, next_payment={next_payment}")
                                         
@@ -596,6 +605,7 @@ def create_web_app(bot):
                                                     WHERE chat_id = %s AND subscription_type = 'group' AND is_active = TRUE
                                                 """, (datetime.now(pytz.UTC), chat_id))
                                             conn_lifetime.commit()
+                                            invalidate_entitlements(user_id=user_id, chat_id=chat_id)
                                             cancelled_count = cursor_lifetime.rowcount
                                             logger.info(f"[YOOKASSA LIFETIME] Отменено {cancelled_count} активных подписок для {subscription_type} (user_id={user_id}, chat_id={chat_id})")
                                     finally:
@@ -670,6 +680,7 @@ def create_web_app(bot):
                                                 WHERE chat_id = %s AND subscription_type = 'group' AND is_active = TRUE
                                             """, (datetime.now(pytz.UTC), chat_id))
                                         conn_lifetime.commit()
+                                        invalidate_entitlements(user_id=user_id, chat_id=chat_id)
                                         cancelled_count = cursor_lifetime.rowcount
                                         logger.info(f"[YOOKASSA LIFETIME] Отменено {cancelled_count} активных подписок для {subscription_type} (user_id={user_id}, chat_id={chat_id})")
                                 finally:
@@ -923,6 +934,7 @@ def create_web_app(bot):
                                             WHERE chat_id = %s AND subscription_type = 'group' AND is_active = TRUE
                                         """, (datetime.now(pytz.UTC), chat_id))
                                     conn_lifetime.commit()
+                                    invalidate_entitlements(user_id=user_id, chat_id=chat_id)
                                     cancelled_count = cursor_lifetime.rowcount
                                     if cancelled_count > 0:
                                         logger.info(f"[YOOKASSA LIFETIME] Отменено {cancelled_count} активных подписок для {subscription_type} (user_id={user_id}, chat_id={chat_id})")
@@ -1281,6 +1293,61 @@ def create_web_app(bot):
                 'error': str(e)
             }), 503
     
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Счётчики внутренних компонентов (пул БД, кэши) в JSON; только для владельца и админов"""
+        chat_id = _site_token_to_chat_id()
+        if chat_id is None:
+            return jsonify({"success": False, "error": "Не авторизован"}), 401
+        from moviebot.utils.admin import is_admin, is_owner
+        if not (is_owner(chat_id) or is_admin(chat_id)):
+            return jsonify({"success": False, "error": "Forbidden"}), 403
+        result = {}
+        try:
+            from moviebot.database.db_connection import get_pool
+            result['db_pool'] = get_pool().stats()
+        except Exception as e:
+            result['db_pool'] = {'error': str(e)}
+        try:
+            from moviebot.database.telemetry import get_telemetry_writer
+            result['telemetry'] = get_telemetry_writer().stats()
+        except Exception as e:
+            result['telemetry'] = {'error': str(e)}
+        try:
+            from moviebot.api.film_cache import get_film_cache
+            result['film_cache'] = get_film_cache().stats()
+        except Exception as e:
+            result['film_cache'] = {'error': str(e)}
+        try:
+            from moviebot.services.shazam_service import get_query_stats, get_voice_stats
+            result['shazam_queries'] = get_query_stats()
+            result['shazam_voice'] = get_voice_stats()
+        except Exception as e:
+            result['shazam_queries'] = {'error': str(e)}
+        try:
+            from moviebot.api.stats_share_cache import get_share_response_cache, get_share_view_counter
+            result['stats_share_cache'] = get_share_response_cache().stats()
+            result['stats_share_views'] = get_share_view_counter().stats()
+        except Exception as e:
+            result['stats_share_cache'] = {'error': str(e)}
+        try:
+            from moviebot.services.state_store import state_store_stats
+            result['state_store'] = state_store_stats()
+        except Exception as e:
+            result['state_store'] = {'error': str(e)}
+        try:
+            from moviebot.services.broadcaster import broadcast_stats
+            result['broadcasts'] = broadcast_stats()
+        except Exception as e:
+            result['broadcasts'] = {'error': str(e)}
+        router = getattr(bot, 'handler_router', None)
+        if router is not None:
+            result['handler_router'] = router.stats()
+        dispatcher = get_update_dispatcher()
+        if dispatcher is not None:
+            result['webhook_dispatcher'] = dispatcher.stats()
+        return jsonify(result), 200
+
     @app.route('/yookassa/webhook', methods=['POST', 'GET'])
     def yookassa_webhook():
         """Обработчик webhook от ЮKassa (старый путь для совместимости)"""
@@ -1996,6 +2063,8 @@ def create_web_app(bot):
             cursor = get_db_cursor()
             # Без db_lock как просил пользователь
             online_link = data.get('online_link')
+            from moviebot.database.film_catalog import upsert_film
+            upsert_film(cursor, str(kp_id), dict(info, is_series=is_series))
             cursor.execute("""
                 INSERT INTO movies (chat_id, link, kp_id, title, year, genres, description, director, actors, is_series, online_link, added_by, added_at)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
@@ -2692,6 +2761,8 @@ def create_web_app(bot):
                         info = extract_movie_info(link)
                         if info:
                             with db_lock:
+                                from moviebot.database.film_catalog import upsert_film
+                                upsert_film(cursor, str(kp_id), dict(info, is_series=is_series))
                                 cursor.execute("""
                                     INSERT INTO movies (chat_id, kp_id, title, year, link, is_series, online_link, added_by, added_at)
                                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
@@ -3437,6 +3508,18 @@ def create_web_app(bot):
             data['share_views'] = get_stats_share_view_count(slug, 'group', month, year)
         return jsonify(data)
 
+    def _render_json(data):
+        """Тело ответа так же, как его сериализует jsonify"""
+        return jsonify(data).get_data()
+
+    def _share_response(entry):
+        """Ответ публичной страницы из кэша: strong ETag, 304 на совпавший If-None-Match"""
+        response = app.response_class(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+        # Браузер хранит ответ, но каждый раз перепроверяет его по ETag
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
     @app.route('/api/site/stats/public/<path:username>', methods=['GET', 'OPTIONS'])
     def site_stats_public(username):
         if request.method == 'OPTIONS':
@@ -3454,8 +3537,8 @@ def create_web_app(bot):
             month = datetime.now(pytz.UTC).month
             year = datetime.now(pytz.UTC).year
         try:
-            from moviebot.api.site_stats import get_public_personal_stats
-            data, err = get_public_personal_stats(slug, month, year)
+            from moviebot.api.site_stats import get_public_stats_response
+            entry, err = get_public_stats_response('user', slug, month, year, _render_json)
         except Exception as e:
             logger.exception("site_stats_public error for slug=%s: %s", slug, e)
             return jsonify({"success": False, "error": "Ошибка загрузки статистики", "debug": str(e)}), 500
@@ -3463,7 +3546,7 @@ def create_web_app(bot):
             if err == 'User not found':
                 return jsonify({"success": False, "error": "Пользователь не найден"}), 404
             return jsonify({"success": False, "error": "Статистика недоступна"}), 403
-        return jsonify(data)
+        return _share_response(entry)
 
     @app.route('/api/site/stats/settings', methods=['GET', 'PUT', 'OPTIONS'])
     def site_stats_settings():
@@ -3500,13 +3583,13 @@ def create_web_app(bot):
         if not (1 <= month <= 12) or not (2020 <= year <= 2030):
             month = datetime.now(pytz.UTC).month
             year = datetime.now(pytz.UTC).year
-        from moviebot.api.site_stats import get_public_group_stats
-        data, err = get_public_group_stats(slug, month, year)
+        from moviebot.api.site_stats import get_public_stats_response
+        entry, err = get_public_stats_response('group', slug, month, year, _render_json)
         if err:
             if err == 'Group not found':
                 return jsonify({"success": False, "error": "Группа не найдена"}), 404
             return jsonify({"success": False, "error": "Статистика недоступна"}), 403
-        return jsonify(data)
+        return _share_response(entry)
 
     logger.info(f"[WEB APP] ===== FLASK ПРИЛОЖЕНИЕ СОЗДАНО =====")
     logger.info(f"[WEB APP] Зарегистрированные роуты: {[str(rule) for rule in app.url_map.iter_rules()]}")